@@ -489,74 +489,194 @@ async function updateOfflineSaleFailure(id, lastError) {
   });
 }
 
-async function syncOfflineData() {
+// Queued sales are replayed in chunks through /api/pos/sales/batch, a few
+// chunks at a time, so catching up after a long outage costs one request per
+// chunk instead of one per sale. Other queued requests (returns, swaps) and
+// servers without the batch endpoint go through the one-by-one replay.
+const SALES_URL = '/api/pos/sales';
+const SALES_BATCH_URL = '/api/pos/sales/batch';
+const SYNC_BATCH_SIZE = 25;
+const SYNC_BATCH_CONCURRENCY = 2;
+
+let syncInFlight = null;
+
+function syncOfflineData() {
+  // Background sync and TRY_SYNC can fire together; share one replay
+  if (!syncInFlight) {
+    syncInFlight = runOfflineSync().finally(() => {
+      syncInFlight = null;
+    });
+  }
+  return syncInFlight;
+}
+
+async function notifyClients(message) {
+  try {
+    const clientsList = await self.clients.matchAll();
+    clientsList.forEach((client) => client.postMessage(message));
+  } catch (error) {
+    console.error('Failed to notify clients:', error);
+  }
+}
+
+function isBatchableSale(item) {
+  try {
+    return new URL(item.url, self.location.origin).pathname === SALES_URL;
+  } catch {
+    return false;
+  }
+}
+
+async function readJson(res) {
+  try {
+    const ct = res.headers.get('content-type') || '';
+    if (ct.includes('application/json')) return await res.clone().json();
+  } catch (error) {
+    console.warn('Failed to parse response:', error);
+  }
+  return null;
+}
+
+async function runOfflineSync() {
   try {
     console.log('Starting background sync...');
     const offlineData = await getAllOfflineSales();
-    
+
     if (offlineData.length === 0) {
       console.log('No offline data to sync');
       return;
     }
-    
+
     const now = Date.now();
+    const due = offlineData.filter((item) => !(item.nextAttemptAt && item.nextAttemptAt > now));
+    const sales = due.filter(isBatchableSale);
+    const others = due.filter((item) => !isBatchableSale(item));
+
+    const batches = [];
+    for (let i = 0; i < sales.length; i += SYNC_BATCH_SIZE) {
+      batches.push(sales.slice(i, i + SYNC_BATCH_SIZE));
+    }
+
     let syncedCount = 0;
-    for (const item of offlineData) {
+    let failedCount = 0;
+    let batchUnsupported = false;
+    let completedBatches = 0;
+    let cursor = 0;
+
+    const runBatches = async () => {
+      while (cursor < batches.length && !batchUnsupported) {
+        const batch = batches[cursor++];
+        const outcome = await syncOfflineBatch(batch);
+        if (outcome.unsupported) {
+          batchUnsupported = true;
+          others.push(...batch);
+          continue;
+        }
+        syncedCount += outcome.synced.length;
+        failedCount += outcome.failed;
+        completedBatches++;
+        // One message per chunk, carrying every sale that landed in it
+        await notifyClients({
+          type: 'SYNC_PROGRESS',
+          data: {
+            batch: completedBatches,
+            batches: batches.length,
+            synced: syncedCount,
+            failed: failedCount,
+            sales: outcome.synced,
+          },
+        });
+      }
+    };
+    await Promise.all(
+      Array.from({ length: Math.min(SYNC_BATCH_CONCURRENCY, batches.length) }, runBatches),
+    );
+    if (batchUnsupported) {
+      // Chunks that were not sent yet go through the one-by-one replay too
+      others.push(...batches.slice(cursor).flat());
+    }
+
+    for (const item of others) {
       try {
-        if (item.nextAttemptAt && item.nextAttemptAt > now) continue;
         const res = await syncOfflineItem(item);
         if (res.ok || res.status === 409) {
-          // Try to parse response for details (receipt, sale id)
-          let payload = null;
-          try {
-            const ct = res.headers.get('content-type') || '';
-            if (ct.includes('application/json')) payload = await res.clone().json();
-          } catch (error) {
-            console.warn('Failed to parse response:', error);
-          }
-          
+          const payload = await readJson(res);
           await deleteOfflineSale(item.id);
           syncedCount++;
-          // Notify clients of each synced sale
-          try {
-            const clientsList = await self.clients.matchAll();
-            clientsList.forEach((client) => {
-              client.postMessage({
-                type: 'SYNC_SALE_OK',
-                data: {
-                  idempotencyKey: item.idempotencyKey,
-                  status: res.status,
-                  sale: payload || null,
-                }
-              });
-            });
-          } catch (error) {
-            console.error('Failed to notify clients:', error);
-          }
+          await notifyClients({
+            type: 'SYNC_SALE_OK',
+            data: {
+              idempotencyKey: item.idempotencyKey,
+              status: res.status,
+              sale: payload || null,
+            },
+          });
         } else {
+          failedCount++;
           await updateOfflineSaleFailure(item.id, `HTTP ${res.status}`);
         }
       } catch (error) {
         console.error('Failed to sync offline item:', error);
+        failedCount++;
         await updateOfflineSaleFailure(item.id, error?.message || 'error');
       }
     }
-    
+
     console.log('Background sync completed');
-    
+
     // Notify clients of sync completion
-    const clients = await self.clients.matchAll();
-    clients.forEach(client => {
-      client.postMessage({
-        type: 'SYNC_COMPLETED',
-        data: { attempted: offlineData.length, synced: syncedCount }
-      });
+    await notifyClients({
+      type: 'SYNC_COMPLETED',
+      data: { attempted: due.length, synced: syncedCount, failed: failedCount, batches: completedBatches },
     });
   } catch (error) {
     console.error('Background sync failed:', error);
   }
 }
 
+// Send one chunk of queued sales; returns the sales that landed, or
+// `unsupported` when the server has no batch endpoint (older deploys, legacy commit mode)
+async function syncOfflineBatch(batch) {
+  const synced = [];
+  let failed = 0;
+  let res;
+  try {
+    res = await fetch(SALES_BATCH_URL, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': `batch:${batch[0].idempotencyKey}:${batch.length}`,
+      },
+      body: JSON.stringify({
+        sales: batch.map((item) => ({ idempotencyKey: item.idempotencyKey, payload: item.payload })),
+      }),
+      credentials: 'include',
+    });
+  } catch (error) {
+    console.error('Failed to sync offline batch:', error);
+    await Promise.all(batch.map((item) => updateOfflineSaleFailure(item.id, error?.message || 'error')));
+    return { synced, failed: batch.length };
+  }
+
+  if (res.status === 404 || res.status === 501) {
+    return { unsupported: true, synced, failed };
+  }
+  const body = res.ok ? await readJson(res) : null;
+  const results = new Map((body?.results || []).map((result) => [result.idempotencyKey, result]));
+
+  for (const item of batch) {
+    const result = results.get(item.idempotencyKey);
+    if (result && (result.status === 'created' || result.status === 'duplicate')) {
+      await deleteOfflineSale(item.id);
+      synced.push({ idempotencyKey: item.idempotencyKey, status: result.httpStatus, sale: result.sale || null });
+    } else {
+      failed++;
+      await updateOfflineSaleFailure(item.id, result?.error || `HTTP ${res.status}`);
+    }
+  }
+  return { synced, failed };
+}
+
 // Get offline data from IndexedDB
 async function syncOfflineItem(item) {
   const response = await fetch(item.url, {
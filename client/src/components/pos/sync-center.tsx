@@ -58,6 +58,7 @@ export default function SyncCenter({ open, onClose, storeId, onSyncNow }: SyncCe
     if (open) void refresh();
     const onMsg = (event: MessageEvent) => {
       if (event.data?.type === 'SYNC_SALE_OK') void refresh();
+      if (event.data?.type === 'SYNC_PROGRESS') void refresh();
       if (event.data?.type === 'SYNC_COMPLETED') void refresh();
     };
     navigator.serviceWorker?.addEventListener('message', onMsg as any);
@@ -20,6 +20,8 @@ interface UseOfflineSyncOptions {
 interface LastSyncMeta {
   attempted: number;
   synced: number;
+  failed?: number;
+  batches?: number;
 }
 
 function isUuid(value: unknown): value is string {
@@ -283,27 +285,35 @@ export function useOfflineSyncIndicator(options: UseOfflineSyncOptions = {}) {
         return;
       }
 
-      if (type === "SYNC_SALE_OK") {
-        const payload = event.data?.data;
-        options.onSaleSynced?.(payload);
-
-        // When an offline sale is successfully synced by the service worker,
-        // update any matching CachedSale so returns/swaps know it is online.
-        if (payload?.idempotencyKey) {
-          void (async () => {
-            try {
-              const cached = await getCachedSaleByIdempotencyKey(payload.idempotencyKey as string);
-              if (!cached) return;
-
-              await updateCachedSale(cached.id, {
-                isOffline: false,
-                syncedAt: new Date().toISOString(),
-                serverId: (payload.sale as any)?.id || cached.serverId,
-              });
-            } catch (err) {
-              console.warn("Failed to update cached sale after sync", err);
-            }
-          })();
+      // Per-sale (one-by-one replay) and per-chunk (batched replay) confirmations
+      const synced =
+        type === "SYNC_SALE_OK"
+          ? [event.data?.data]
+          : type === "SYNC_PROGRESS"
+            ? (event.data?.data?.sales as any[] | undefined) ?? []
+            : null;
+      if (synced) {
+        for (const payload of synced) {
+          options.onSaleSynced?.(payload);
+
+          // When an offline sale is successfully synced by the service worker,
+          // update any matching CachedSale so returns/swaps know it is online.
+          if (payload?.idempotencyKey) {
+            void (async () => {
+              try {
+                const cached = await getCachedSaleByIdempotencyKey(payload.idempotencyKey as string);
+                if (!cached) return;
+
+                await updateCachedSale(cached.id, {
+                  isOffline: false,
+                  syncedAt: new Date().toISOString(),
+                  serverId: (payload.sale as any)?.id || cached.serverId,
+                });
+              } catch (err) {
+                console.warn("Failed to update cached sale after sync", err);
+              }
+            })();
+          }
         }
 
         // Now that sales may have been reconciled to server IDs, attempt to sync
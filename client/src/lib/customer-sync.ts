@@ -0,0 +1,70 @@
+// Keeps the till's IndexedDB customer cache current from GET /api/customers/changes,
+// so loyalty customers can be attached by phone without a round trip.
+import { DEFAULT_PHONE_COUNTRY_CODE } from '@shared/lib/phone';
+import { applyCustomerChanges, getCustomerSyncState } from './idb-catalog';
+
+export const CUSTOMER_SYNC_INTERVAL_MS = 60 * 1000;
+// A cache synced this recently is trusted for lookups without asking the server
+export const CUSTOMER_CACHE_FRESH_MS = 2 * CUSTOMER_SYNC_INTERVAL_MS;
+
+const PAGE_SIZE = 500;
+// Bounds one sync run; a first sync of a very large store continues on the next run
+const MAX_PAGES_PER_SYNC = 20;
+
+const inFlight = new Map<string, Promise<number>>();
+
+/** Pull every change since the stored cursor. Returns the number of customers applied. */
+export function syncCustomerChanges(storeId: string): Promise<number> {
+  const running = inFlight.get(storeId);
+  if (running) return running;
+  const run = pullChanges(storeId).finally(() => inFlight.delete(storeId));
+  inFlight.set(storeId, run);
+  return run;
+}
+
+async function pullChanges(storeId: string): Promise<number> {
+  const state = await getCustomerSyncState(storeId);
+  let cursor = state?.cursor ?? null;
+  let applied = 0;
+
+  for (let page = 0; page < MAX_PAGES_PER_SYNC; page += 1) {
+    const params = new URLSearchParams({ storeId, limit: String(PAGE_SIZE) });
+    if (cursor) params.set('cursor', cursor);
+
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), 10000);
+    let res: Response;
+    try {
+      res = await fetch(`/api/customers/changes?${params.toString()}`, {
+        credentials: 'include',
+        signal: controller.signal,
+      });
+    } finally {
+      clearTimeout(timeoutId);
+    }
+    if (!res.ok) break;
+
+    const body = await res.json().catch(() => null);
+    if (!body || !Array.isArray(body.customers)) break;
+
+    cursor = body.cursor ?? cursor;
+    await applyCustomerChanges(
+      storeId,
+      (body.customers as any[]).map((c) => ({
+        id: String(c.id),
+        phone: String(c.phone ?? ''),
+        phoneE164: c.phoneE164 ?? null,
+        name: c.name ?? undefined,
+        loyaltyNumber: c.loyaltyNumber ?? null,
+        loyaltyPoints: Number(c.currentPoints ?? 0),
+        isActive: c.isActive !== false,
+        updatedAt: Date.parse(c.updatedAt) || Date.now(),
+      })),
+      { cursor, lastSyncAt: Date.now(), defaultCountryCode: String(body.defaultCountryCode ?? '') || DEFAULT_PHONE_COUNTRY_CODE },
+    );
+    applied += body.customers.length;
+    if (!body.hasMore) break;
+  }
+
+  return applied;
+}
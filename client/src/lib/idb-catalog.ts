@@ -1,7 +1,21 @@
 // IndexedDB catalog for offline product/inventory/customer data
+import { normalizePhoneE164 } from '@shared/lib/phone';
+
 type ProductRow = { id: string; name: string; barcode?: string; price: string };
 type InventoryRow = { storeId: string; productId: string; quantity: number };
-type CustomerRow = { id: string; phone: string; name?: string; loyaltyPoints?: number; updatedAt?: number };
+type CustomerRow = {
+  id: string;
+  phone: string;
+  name?: string;
+  loyaltyPoints?: number;
+  updatedAt?: number;
+  // Set for rows from the customer change feed
+  storeId?: string;
+  phoneE164?: string | null;
+  loyaltyNumber?: string | null;
+};
+// Position in GET /api/customers/changes for one store
+type CustomerSyncState = { storeId: string; cursor: string | null; lastSyncAt: number; defaultCountryCode: string };
 type StoreRow = { id: string; name?: string; currency?: string; taxRate?: number; updatedAt: number };
 type CatalogSyncMeta = { storeId: string; lastSyncAt: number; productCount: number };
 
@@ -79,7 +93,7 @@ export const CATALOG_REFRESH_INTERVAL_MS = 2 * 60 * 1000;
 const MAX_CACHED_SALES_PER_STORE = 10000;
 
 const DB_NAME = 'chainsync_catalog';
-const VERSION = 4; // Bumped for new 'sales' and 'offlineReturns' stores
+const VERSION = 5; // Bumped for the customer feed index and 'customerSync' store
 
 function openDb(): Promise<IDBDatabase | null> {
   return new Promise((resolve) => {
@@ -100,6 +114,14 @@ function openDb(): Promise<IDBDatabase | null> {
         const s = db.createObjectStore('customers', { keyPath: 'id' });
         s.createIndex('phone', 'phone', { unique: false });
       }
+      // Customer lookups by normalized phone within a store (v5)
+      const customerStore = req.transaction?.objectStore('customers');
+      if (customerStore && !customerStore.indexNames.contains('storePhoneE164')) {
+        customerStore.createIndex('storePhoneE164', ['storeId', 'phoneE164'], { unique: false });
+      }
+      if (!db.objectStoreNames.contains('customerSync')) {
+        db.createObjectStore('customerSync', { keyPath: 'storeId' });
+      }
       if (!db.objectStoreNames.contains('stores')) {
         db.createObjectStore('stores', { keyPath: 'id' });
       }
@@ -222,6 +244,62 @@ export async function getCustomerByPhone(phone: string): Promise<CustomerRow | n
   });
 }
 
+// ========== Customer Change Feed ==========
+
+export async function getCustomerSyncState(storeId: string): Promise<CustomerSyncState | null> {
+  const db = await openDb();
+  if (!db) return null;
+  return await new Promise((resolve) => {
+    const tx = db.transaction('customerSync', 'readonly');
+    const req = tx.objectStore('customerSync').get(storeId);
+    req.onsuccess = () => resolve(req.result || null);
+    req.onerror = () => resolve(null);
+  });
+}
+
+// Apply one page of the feed and advance the store's cursor in the same
+// IndexedDB transaction, so an interrupted sync resumes from the last page.
+// Deactivated customers are removed from the cache.
+export async function applyCustomerChanges(
+  storeId: string,
+  rows: Array<CustomerRow & { isActive?: boolean }>,
+  state: Omit<CustomerSyncState, 'storeId'>,
+): Promise<void> {
+  const db = await openDb();
+  if (!db) return;
+  await new Promise<void>((resolve) => {
+    const tx = db.transaction(['customers', 'customerSync'], 'readwrite');
+    const s = tx.objectStore('customers');
+    rows.forEach(({ isActive, ...row }) => {
+      if (isActive === false) {
+        s.delete(row.id);
+      } else {
+        s.put({ ...row, storeId, updatedAt: row.updatedAt ?? Date.now() });
+      }
+    });
+    tx.objectStore('customerSync').put({ ...state, storeId });
+    tx.oncomplete = () => resolve();
+    tx.onerror = () => resolve();
+  });
+}
+
+// Resolve a typed phone number against the store's synced customers; numbers
+// that do not normalize fall back to the exact-match lookup.
+export async function findCustomerLocally(storeId: string, phone: string): Promise<CustomerRow | null> {
+  const state = await getCustomerSyncState(storeId);
+  const e164 = normalizePhoneE164(phone, state?.defaultCountryCode);
+  if (!e164) return getCustomerByPhone(phone.trim());
+  const db = await openDb();
+  if (!db) return null;
+  const found = await new Promise<CustomerRow | null>((resolve) => {
+    const tx = db.transaction('customers', 'readonly');
+    const req = tx.objectStore('customers').index('storePhoneE164').get([storeId, e164]);
+    req.onsuccess = () => resolve(req.result || null);
+    req.onerror = () => resolve(null);
+  });
+  return found ?? getCustomerByPhone(phone.trim());
+}
+
 export async function upsertCustomerLoyaltySnapshot(row: { id: string; phone: string; name?: string; loyaltyPoints: number; updatedAt?: number }): Promise<void> {
   const db = await openDb();
   if (!db) return;
@@ -593,4 +671,4 @@ export async function hasPendingOfflineReturns(saleId: string): Promise<boolean>
   });
 }
 
-export type { ProductRow, InventoryRow, CustomerRow, StoreRow, CatalogSyncMeta };
+export type { ProductRow, InventoryRow, CustomerRow, CustomerSyncState, StoreRow, CatalogSyncMeta };
@@ -49,10 +49,12 @@ import {
   setCatalogSyncMeta,
   clearProducts,
   putProducts,
-  getCustomerByPhone,
+  findCustomerLocally,
+  getCustomerSyncState,
   CATALOG_REFRESH_INTERVAL_MS,
   cacheSalesSnapshotForStore,
 } from "@/lib/idb-catalog";
+import { CUSTOMER_CACHE_FRESH_MS, CUSTOMER_SYNC_INTERVAL_MS, syncCustomerChanges } from "@/lib/customer-sync";
 import type { CachedSale } from "@/lib/idb-catalog";
 import {
   generateIdempotencyKey,
@@ -366,6 +368,25 @@ export default function POSV2() {
     };
   }, [selectedStore, isOnline, syncRecentSalesSnapshot]);
 
+  // Keep the local customer cache current so loyalty lookups resolve on the till
+  useEffect(() => {
+    if (!selectedStore || !isOnline) return;
+
+    const sync = () => {
+      if (!navigator.onLine) return;
+      syncCustomerChanges(selectedStore).catch((err) => console.warn("Failed to sync customers", err));
+    };
+    sync();
+
+    const intervalId = setInterval(sync, CUSTOMER_SYNC_INTERVAL_MS);
+    window.addEventListener("focus", sync);
+
+    return () => {
+      clearInterval(intervalId);
+      window.removeEventListener("focus", sync);
+    };
+  }, [selectedStore, isOnline]);
+
   // Sync inventory snapshot on login/mount and start background refresh interval
   useEffect(() => {
     if (!selectedStore) return;
@@ -671,6 +692,20 @@ export default function POSV2() {
     if (!customerPhone || !customerPhone.trim()) return;
     setLoyaltyLoading(true);
     try {
+      // A recently synced cache answers without a round trip
+      const syncState = await getCustomerSyncState(selectedStore).catch(() => null);
+      if (syncState && Date.now() - syncState.lastSyncAt < CUSTOMER_CACHE_FRESH_MS) {
+        const local = await findCustomerLocally(selectedStore, customerPhone).catch(() => null);
+        if (local) {
+          const points = Number(local.loyaltyPoints ?? 0);
+          setLoyaltyCustomer({ id: local.id, name: local.name || customerPhone });
+          setLoyaltyBalance(points);
+          setLoyaltySyncStatus({ state: "online", updatedAt: syncState.lastSyncAt });
+          toast({ title: "Customer found", description: `${local.name || customerPhone} - ${points} points` });
+          return;
+        }
+      }
+
       const res = await fetch(`/api/customers?phone=${encodeURIComponent(customerPhone)}&storeId=${selectedStore}`, {
         credentials: "include",
       });
@@ -689,7 +724,7 @@ export default function POSV2() {
 
       // Fallback: Check local cache for customer data
       try {
-        const cached = await getCustomerByPhone(customerPhone);
+        const cached = await findCustomerLocally(selectedStore, customerPhone);
         if (cached) {
           const points = Number(cached.loyaltyPoints ?? 0);
           setLoyaltyCustomer({ id: cached.id, name: cached.name || customerPhone });
@@ -0,0 +1,27 @@
+-- Timing history for the scheduled report pipeline (server/jobs/report-pipeline.ts).
+-- Each run groups due scheduled_reports by org and period, computes shared aggregates
+-- once per group and records how long each stage took.
+
+CREATE TABLE IF NOT EXISTS report_runs (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  status VARCHAR(16) NOT NULL DEFAULT 'running',
+  schedules_due INTEGER NOT NULL DEFAULT 0,
+  groups_computed INTEGER NOT NULL DEFAULT 0,
+  reports_sent INTEGER NOT NULL DEFAULT 0,
+  reports_skipped INTEGER NOT NULL DEFAULT 0,
+  reports_failed INTEGER NOT NULL DEFAULT 0,
+  aggregate_ms INTEGER,
+  delivery_ms INTEGER,
+  duration_ms INTEGER,
+  details JSONB,
+  error_message TEXT,
+  started_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  completed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS report_runs_started_at_idx ON report_runs(started_at DESC);
+
+-- Due-schedule scan filters on is_active and last_run_at every run
+CREATE INDEX IF NOT EXISTS scheduled_reports_active_last_run_idx
+  ON scheduled_reports(last_run_at)
+  WHERE is_active = true;
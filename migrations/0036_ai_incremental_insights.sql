@@ -0,0 +1,47 @@
+-- Incremental AI insight batch (server/ai/ai-insights-service.ts).
+-- Each store's scan records a watermark in ai_batch_runs; the next scan only
+-- rebuilds the daily rollups from that watermark's day onwards and derives the
+-- 90-day profitability from the rollups instead of the raw history.
+
+ALTER TABLE ai_batch_runs ADD COLUMN IF NOT EXISTS store_id UUID REFERENCES stores(id) ON DELETE CASCADE;
+ALTER TABLE ai_batch_runs ADD COLUMN IF NOT EXISTS watermark_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE ai_batch_runs ADD COLUMN IF NOT EXISTS rows_processed INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE ai_batch_runs ADD COLUMN IF NOT EXISTS duration_ms INTEGER;
+-- 'completed_with_errors' did not fit the original width
+ALTER TABLE ai_batch_runs ALTER COLUMN status TYPE VARCHAR(32);
+
+CREATE INDEX IF NOT EXISTS ai_batch_runs_store_watermark_idx
+  ON ai_batch_runs(store_id, completed_at DESC)
+  WHERE store_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS ai_product_daily_stats (
+  store_id UUID NOT NULL REFERENCES stores(id) ON DELETE CASCADE,
+  product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  day DATE NOT NULL,
+  units_sold INTEGER NOT NULL DEFAULT 0,
+  sales_subtotal DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  sales_tax DECIMAL(14, 4) NOT NULL DEFAULT 0,
+  cogs DECIMAL(14, 4) NOT NULL DEFAULT 0,
+  promotion_loss DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  units_refunded INTEGER NOT NULL DEFAULT 0,
+  refund_subtotal DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  refund_tax DECIMAL(14, 4) NOT NULL DEFAULT 0,
+  refund_cogs DECIMAL(14, 4) NOT NULL DEFAULT 0,
+  stock_loss DECIMAL(14, 2) NOT NULL DEFAULT 0
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ai_product_daily_stats_pk ON ai_product_daily_stats(store_id, product_id, day);
+CREATE INDEX IF NOT EXISTS ai_product_daily_stats_store_day_idx ON ai_product_daily_stats(store_id, day);
+
+CREATE TABLE IF NOT EXISTS ai_removal_daily_stats (
+  store_id UUID NOT NULL REFERENCES stores(id) ON DELETE CASCADE,
+  product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  day DATE NOT NULL,
+  reason VARCHAR(64) NOT NULL,
+  occurrences INTEGER NOT NULL DEFAULT 0,
+  units_lost INTEGER NOT NULL DEFAULT 0,
+  loss_value DECIMAL(14, 2) NOT NULL DEFAULT 0
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ai_removal_daily_stats_pk ON ai_removal_daily_stats(store_id, product_id, day, reason);
+CREATE INDEX IF NOT EXISTS ai_removal_daily_stats_store_day_idx ON ai_removal_daily_stats(store_id, day);
@@ -0,0 +1,29 @@
+-- Compact FIFO cost-layer ledger.
+-- Consumption now zeroes depleted layers instead of deleting them row by row, so
+-- the partial index below only ever covers layers that still hold stock and the
+-- FIFO head for a (store, product) is the first entry in it. The compaction job
+-- (server/jobs/cost-layer-compaction.ts) moves zeroed layers into the archive and
+-- merges adjacent open layers that share a unit cost.
+
+CREATE INDEX IF NOT EXISTS inventory_cost_layers_open_fifo_idx
+  ON inventory_cost_layers(store_id, product_id, created_at, id)
+  WHERE quantity_remaining > 0;
+
+CREATE TABLE IF NOT EXISTS inventory_cost_layers_archive (
+  id UUID PRIMARY KEY,
+  store_id UUID NOT NULL,
+  product_id UUID NOT NULL,
+  unit_cost DECIMAL(12, 4) NOT NULL,
+  source VARCHAR(64),
+  reference_id UUID,
+  notes TEXT,
+  created_at TIMESTAMP WITH TIME ZONE,
+  depleted_at TIMESTAMP WITH TIME ZONE,
+  -- Set when the layer was folded into an adjacent layer with the same unit cost
+  merged_into UUID,
+  merged_quantity INTEGER NOT NULL DEFAULT 0,
+  archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS inventory_cost_layers_archive_store_product_idx
+  ON inventory_cost_layers_archive(store_id, product_id, created_at);
@@ -0,0 +1,222 @@
+-- Materialized per-(store, product) cost-layer totals and a per-store listing version.
+--
+-- getInventoryByStore used to aggregate every open cost layer of the store on
+-- each call. inventory_layer_totals keeps those sums up to date from statement
+-- triggers on inventory_cost_layers, so they commit or roll back together with
+-- the layer write whichever code path (sales, bulk updates, returns, compaction,
+-- backfill scripts) touched the layers. The listing then joins it by key.
+--
+-- inventory_store_versions is bumped whenever a store's listing could change
+-- (inventory rows, layer totals, or product fields) and backs the ETag of
+-- GET /api/stores/:storeId/inventory, so unchanged polls are answered with a
+-- single primary-key lookup.
+
+CREATE TABLE IF NOT EXISTS inventory_layer_totals (
+  store_id UUID NOT NULL REFERENCES stores(id) ON DELETE CASCADE,
+  product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  total_quantity INTEGER NOT NULL DEFAULT 0,
+  total_value DECIMAL(18, 4) NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS inventory_layer_totals_store_product_unique
+  ON inventory_layer_totals(store_id, product_id);
+
+CREATE TABLE IF NOT EXISTS inventory_store_versions (
+  store_id UUID PRIMARY KEY REFERENCES stores(id) ON DELETE CASCADE,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION bump_inventory_store_versions(store_ids UUID[])
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF store_ids IS NULL OR array_length(store_ids, 1) IS NULL THEN
+    RETURN;
+  END IF;
+  -- Sorted so concurrent bumps of several stores lock rows in the same order
+  INSERT INTO inventory_store_versions AS v (store_id, version, updated_at)
+  SELECT id, 1, NOW()
+  FROM (SELECT DISTINCT unnest(store_ids) AS id ORDER BY 1) ids
+  ON CONFLICT (store_id) DO UPDATE SET version = v.version + 1, updated_at = NOW();
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION apply_inventory_layer_totals(
+  store_ids UUID[],
+  product_ids UUID[],
+  qty_deltas BIGINT[],
+  value_deltas NUMERIC[]
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  touched UUID[];
+BEGIN
+  WITH delta AS (
+    SELECT *
+    FROM unnest(store_ids, product_ids, qty_deltas, value_deltas) AS d(store_id, product_id, qty, value)
+    WHERE qty <> 0 OR value <> 0
+    ORDER BY store_id, product_id
+  ),
+  applied AS (
+    INSERT INTO inventory_layer_totals AS t (store_id, product_id, total_quantity, total_value, updated_at)
+    SELECT store_id, product_id, qty, value, NOW() FROM delta
+    ON CONFLICT (store_id, product_id) DO UPDATE
+      SET total_quantity = t.total_quantity + EXCLUDED.total_quantity,
+          total_value = t.total_value + EXCLUDED.total_value,
+          updated_at = NOW()
+    RETURNING t.store_id
+  )
+  SELECT array_agg(DISTINCT store_id) INTO touched FROM applied;
+
+  PERFORM bump_inventory_store_versions(touched);
+END;
+$$;
+
+-- Each branch only references the transition tables its event provides
+CREATE OR REPLACE FUNCTION apply_inventory_layer_totals_delta()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  s UUID[];
+  p UUID[];
+  q BIGINT[];
+  v NUMERIC[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(store_id), array_agg(product_id), array_agg(qty), array_agg(value)
+    INTO s, p, q, v
+    FROM (
+      SELECT store_id, product_id,
+             SUM(GREATEST(quantity_remaining, 0)) AS qty,
+             SUM(GREATEST(quantity_remaining, 0) * unit_cost) AS value
+      FROM new_rows
+      GROUP BY store_id, product_id
+    ) d;
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(store_id), array_agg(product_id), array_agg(qty), array_agg(value)
+    INTO s, p, q, v
+    FROM (
+      SELECT store_id, product_id, SUM(qty) AS qty, SUM(value) AS value
+      FROM (
+        SELECT store_id, product_id,
+               GREATEST(quantity_remaining, 0)::bigint AS qty,
+               GREATEST(quantity_remaining, 0) * unit_cost AS value
+        FROM new_rows
+        UNION ALL
+        SELECT store_id, product_id,
+               -GREATEST(quantity_remaining, 0)::bigint,
+               -(GREATEST(quantity_remaining, 0) * unit_cost)
+        FROM old_rows
+      ) changes
+      GROUP BY store_id, product_id
+    ) d;
+  ELSE
+    SELECT array_agg(store_id), array_agg(product_id), array_agg(qty), array_agg(value)
+    INTO s, p, q, v
+    FROM (
+      SELECT store_id, product_id,
+             -SUM(GREATEST(quantity_remaining, 0)) AS qty,
+             -SUM(GREATEST(quantity_remaining, 0) * unit_cost) AS value
+      FROM old_rows
+      GROUP BY store_id, product_id
+    ) d;
+  END IF;
+
+  IF s IS NOT NULL THEN
+    PERFORM apply_inventory_layer_totals(s, p, q, v);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+-- Transition tables are only allowed on single-event triggers
+DROP TRIGGER IF EXISTS inventory_cost_layers_totals_ins ON inventory_cost_layers;
+CREATE TRIGGER inventory_cost_layers_totals_ins
+  AFTER INSERT ON inventory_cost_layers
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_layer_totals_delta();
+
+DROP TRIGGER IF EXISTS inventory_cost_layers_totals_upd ON inventory_cost_layers;
+CREATE TRIGGER inventory_cost_layers_totals_upd
+  AFTER UPDATE ON inventory_cost_layers
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_layer_totals_delta();
+
+DROP TRIGGER IF EXISTS inventory_cost_layers_totals_del ON inventory_cost_layers;
+CREATE TRIGGER inventory_cost_layers_totals_del
+  AFTER DELETE ON inventory_cost_layers
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_layer_totals_delta();
+
+CREATE OR REPLACE FUNCTION bump_inventory_versions_from_inventory()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM bump_inventory_store_versions(ARRAY(SELECT DISTINCT store_id FROM new_rows));
+  ELSIF TG_OP = 'UPDATE' THEN
+    PERFORM bump_inventory_store_versions(ARRAY(
+      SELECT store_id FROM new_rows UNION SELECT store_id FROM old_rows
+    ));
+  ELSE
+    PERFORM bump_inventory_store_versions(ARRAY(SELECT DISTINCT store_id FROM old_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS inventory_listing_version_ins ON inventory;
+CREATE TRIGGER inventory_listing_version_ins
+  AFTER INSERT ON inventory
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_inventory_versions_from_inventory();
+
+DROP TRIGGER IF EXISTS inventory_listing_version_upd ON inventory;
+CREATE TRIGGER inventory_listing_version_upd
+  AFTER UPDATE ON inventory
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_inventory_versions_from_inventory();
+
+DROP TRIGGER IF EXISTS inventory_listing_version_del ON inventory;
+CREATE TRIGGER inventory_listing_version_del
+  AFTER DELETE ON inventory
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_inventory_versions_from_inventory();
+
+-- Product edits (name, prices, category...) show up in every store that stocks them.
+-- Deletes cascade to inventory and are covered by the trigger above.
+CREATE OR REPLACE FUNCTION bump_inventory_versions_from_products()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM bump_inventory_store_versions(ARRAY(
+    SELECT DISTINCT i.store_id FROM inventory i JOIN new_rows p ON p.id = i.product_id
+  ));
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS products_listing_version_upd ON products;
+CREATE TRIGGER products_listing_version_upd
+  AFTER UPDATE ON products
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_inventory_versions_from_products();
+
+-- Backfill from the current layers
+INSERT INTO inventory_layer_totals (store_id, product_id, total_quantity, total_value, updated_at)
+SELECT store_id, product_id, SUM(quantity_remaining), SUM(quantity_remaining * unit_cost), NOW()
+FROM inventory_cost_layers
+WHERE quantity_remaining > 0
+GROUP BY store_id, product_id
+ON CONFLICT (store_id, product_id) DO UPDATE
+  SET total_quantity = EXCLUDED.total_quantity,
+      total_value = EXCLUDED.total_value,
+      updated_at = NOW();
@@ -0,0 +1,47 @@
+-- Parallel autopay billing runner (server/jobs/billing-runner.ts).
+-- billing_charge_attempts is claimed before each provider call and keyed by
+-- (subscription, billing period), so a run that crashes mid-charge resumes with
+-- the same provider reference. billing_runs keeps one summary row per run.
+
+CREATE TABLE IF NOT EXISTS billing_runs (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  status VARCHAR(32) NOT NULL DEFAULT 'running',
+  subscriptions_due INTEGER NOT NULL DEFAULT 0,
+  charged INTEGER NOT NULL DEFAULT 0,
+  failed INTEGER NOT NULL DEFAULT 0,
+  missing_method INTEGER NOT NULL DEFAULT 0,
+  skipped INTEGER NOT NULL DEFAULT 0,
+  resumed INTEGER NOT NULL DEFAULT 0,
+  deferred INTEGER NOT NULL DEFAULT 0,
+  concurrency INTEGER,
+  duration_ms INTEGER,
+  details JSONB,
+  error_message TEXT,
+  started_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  completed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS billing_runs_started_at_idx ON billing_runs(started_at DESC);
+
+CREATE TABLE IF NOT EXISTS billing_charge_attempts (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  subscription_id UUID NOT NULL REFERENCES subscriptions(id) ON DELETE CASCADE,
+  org_id UUID,
+  period_key VARCHAR(32) NOT NULL,
+  idempotency_key VARCHAR(255) NOT NULL,
+  provider VARCHAR(16) NOT NULL,
+  amount DECIMAL(10, 2) NOT NULL,
+  currency VARCHAR(3) NOT NULL,
+  status VARCHAR(16) NOT NULL DEFAULT 'pending',
+  run_id UUID,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  provider_reference VARCHAR(255),
+  last_error TEXT,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS billing_charge_attempts_subscription_period_unique
+  ON billing_charge_attempts(subscription_id, period_key);
+CREATE UNIQUE INDEX IF NOT EXISTS billing_charge_attempts_idempotency_key_unique
+  ON billing_charge_attempts(idempotency_key);
@@ -0,0 +1,28 @@
+-- Webhook ingest queue. With WEBHOOK_INGEST_MODE=queue the Paystack and
+-- Flutterwave handlers only verify, dedupe and persist the raw event here, then
+-- ACK; server/jobs/webhook-queue.ts applies the side effects in the background
+-- with retries, per-subscription ordering (ordering_key) and a dead-letter state.
+-- Rows written by the inline path keep the default status 'processed'.
+
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS status VARCHAR(16) NOT NULL DEFAULT 'processed';
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS payload JSONB;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS ordering_key VARCHAR(255);
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS locked_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS last_error TEXT;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP WITH TIME ZONE;
+
+-- Head-of-line lookups per ordering key only ever touch unfinished events
+CREATE INDEX IF NOT EXISTS webhook_events_pending_idx
+  ON webhook_events(ordering_key, created_at)
+  WHERE status IN ('queued', 'processing', 'retry');
+
+CREATE INDEX IF NOT EXISTS webhook_events_ready_idx
+  ON webhook_events(next_attempt_at)
+  WHERE status IN ('queued', 'retry');
+
+-- Dead letters stay for inspection and replay
+CREATE INDEX IF NOT EXISTS webhook_events_dead_idx
+  ON webhook_events(created_at)
+  WHERE status = 'dead';
@@ -0,0 +1,14 @@
+-- Daily FX rates for analytics currency normalization (server/lib/currency.ts).
+-- The rate provider writes the rates it serves each day; conversions for a past
+-- period read the row for that day (or the latest earlier one).
+
+CREATE TABLE IF NOT EXISTS currency_rates (
+  day DATE NOT NULL,
+  base_currency VARCHAR(3) NOT NULL,
+  quote_currency VARCHAR(3) NOT NULL,
+  rate DECIMAL(24, 12) NOT NULL,
+  source VARCHAR(64),
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS currency_rates_pk ON currency_rates(day, base_currency, quote_currency);
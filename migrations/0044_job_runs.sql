@@ -0,0 +1,30 @@
+-- Scheduled job run history and slot claims.
+--
+-- Every process used to arm its own setTimeout/setInterval for each job in
+-- server/jobs/cleanup.ts, so N web nodes ran every nightly scan N times.
+-- server/jobs/scheduler.ts now claims each scheduled slot here (the unique
+-- index on job_name + scheduled_for lets exactly one instance win it), holds a
+-- Postgres advisory lock per concurrency slot while the job runs, and records
+-- the outcome, duration and rows touched on the same row. Manual triggers
+-- have no scheduled_for and are never deduplicated.
+
+CREATE TABLE IF NOT EXISTS job_runs (
+  id BIGSERIAL PRIMARY KEY,
+  job_name VARCHAR(64) NOT NULL,
+  trigger VARCHAR(16) NOT NULL CHECK (trigger IN ('schedule', 'manual')),
+  scheduled_for TIMESTAMPTZ,
+  status VARCHAR(16) NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'succeeded', 'failed')),
+  instance_id VARCHAR(128) NOT NULL,
+  triggered_by VARCHAR(255),
+  started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  finished_at TIMESTAMPTZ,
+  duration_ms INTEGER,
+  rows_touched INTEGER,
+  error TEXT,
+  details JSONB
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS job_runs_slot_unique
+  ON job_runs (job_name, scheduled_for)
+  WHERE scheduled_for IS NOT NULL;
+CREATE INDEX IF NOT EXISTS job_runs_job_started_idx ON job_runs (job_name, started_at DESC);
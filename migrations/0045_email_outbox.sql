@@ -0,0 +1,40 @@
+-- Outbound email queue. sendEmail() renders the message and inserts it here
+-- instead of talking to SMTP on the request path; server/jobs/email-outbox.ts
+-- delivers it over a pooled transport with bounded concurrency, retries with
+-- backoff and a dead-letter state. Transactional mail (priority 0) is claimed
+-- ahead of bulk runs such as reminders, dunning and reports (priority 1).
+-- Branding logos are not copied into rows: a message without attachments gets
+-- the logo the worker loaded at start-up, as sendEmail always did.
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  category VARCHAR(64) NOT NULL DEFAULT 'general',
+  priority SMALLINT NOT NULL DEFAULT 0,
+  to_address TEXT NOT NULL,
+  subject TEXT NOT NULL,
+  html TEXT NOT NULL,
+  text_body TEXT,
+  attachments JSONB,
+  status VARCHAR(16) NOT NULL DEFAULT 'queued',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  locked_at TIMESTAMP WITH TIME ZONE,
+  last_error TEXT,
+  message_id TEXT,
+  sent_at TIMESTAMP WITH TIME ZONE,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  CONSTRAINT email_outbox_status_check CHECK (status IN ('queued', 'processing', 'retry', 'sent', 'dead'))
+);
+
+CREATE INDEX IF NOT EXISTS email_outbox_ready_idx
+  ON email_outbox(priority, next_attempt_at)
+  WHERE status IN ('queued', 'retry');
+
+CREATE INDEX IF NOT EXISTS email_outbox_processing_idx
+  ON email_outbox(locked_at)
+  WHERE status = 'processing';
+
+-- Sent and dead rows are pruned by the email-outbox-prune job
+CREATE INDEX IF NOT EXISTS email_outbox_finished_idx
+  ON email_outbox(created_at)
+  WHERE status IN ('sent', 'dead');
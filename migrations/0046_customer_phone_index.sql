@@ -0,0 +1,408 @@
+-- Normalized phone index for customer lookups.
+--
+-- Cashiers attach a customer by phone on most sales. GET /api/customers and
+-- the sale commit matched customers.phone exactly, so "0801 234 5678" and
+-- "+2348012345678" were different customers, and the sale path did a select
+-- followed by an insert. phone_e164 holds the E.164 form written by the
+-- application (shared/lib/phone.ts) and is unique per store, which lets the
+-- sale path find-or-create the customer with one upsert.
+--
+-- normalize_phone_e164() mirrors normalizePhoneE164() for the backfill below
+-- and for sale payloads that do not carry customer_phone_e164 yet. The
+-- default country code matches PHONE_DEFAULT_COUNTRY_CODE's default.
+--
+-- Existing rows that normalize to the same number in a store keep their raw
+-- phone; only the oldest gets phone_e164. They can be listed with:
+--   SELECT store_id, normalize_phone_e164(phone), array_agg(id)
+--   FROM customers GROUP BY 1, 2 HAVING count(*) > 1;
+--
+-- The (store_id, updated_at, id) index serves the delta feed used by POS
+-- tills to keep their local customer cache current.
+
+CREATE OR REPLACE FUNCTION normalize_phone_e164(raw TEXT, default_country_code TEXT DEFAULT '234')
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE WHEN length(n) BETWEEN 8 AND 15 THEN '+' || n END
+  FROM (
+    SELECT CASE
+      WHEN btrim(raw) LIKE '+%' THEN d
+      WHEN d LIKE '00%' THEN substr(d, 3)
+      WHEN d LIKE '0%' THEN default_country_code || substr(d, 2)
+      WHEN length(d) <= 10 THEN default_country_code || d
+      ELSE d
+    END AS n
+    FROM (SELECT regexp_replace(COALESCE(raw, ''), '[^0-9]', '', 'g') AS d) digits
+    WHERE d <> ''
+  ) normalized
+$$;
+
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS phone_e164 VARCHAR(16);
+
+WITH normalized AS (
+  SELECT id, store_id, normalize_phone_e164(phone) AS e164,
+         row_number() OVER (
+           PARTITION BY store_id, normalize_phone_e164(phone)
+           ORDER BY created_at NULLS LAST, id
+         ) AS position
+  FROM customers
+  WHERE phone IS NOT NULL AND phone_e164 IS NULL
+)
+UPDATE customers c
+SET phone_e164 = n.e164
+FROM normalized n
+WHERE c.id = n.id
+  AND n.position = 1
+  AND n.e164 IS NOT NULL
+  AND NOT EXISTS (
+    SELECT 1 FROM customers o WHERE o.store_id = n.store_id AND o.phone_e164 = n.e164
+  );
+
+UPDATE customers SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS customers_store_phone_e164_uidx
+  ON customers (store_id, phone_e164)
+  WHERE phone_e164 IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS customers_store_updated_idx
+  ON customers (store_id, updated_at, id);
+
+-- pos_commit_sale() from 0043 with the customer found or created by one
+-- upsert on (store_id, phone_e164)
+CREATE OR REPLACE FUNCTION pos_commit_sale(payload JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_key TEXT := payload->>'idempotency_key';
+  v_store UUID := (payload->>'store_id')::uuid;
+  v_cashier UUID := (payload->>'cashier_id')::uuid;
+  v_org UUID := NULLIF(payload->>'org_id', '')::uuid;
+  v_phone TEXT := NULLIF(btrim(payload->>'customer_phone'), '');
+  v_phone_e164 TEXT := COALESCE(NULLIF(payload->>'customer_phone_e164', ''), normalize_phone_e164(v_phone));
+  v_redeem_points INTEGER := COALESCE((payload->>'redeem_points')::integer, 0);
+  v_subtotal NUMERIC := (payload->>'subtotal')::numeric;
+  v_discount NUMERIC := COALESCE((payload->>'discount')::numeric, 0);
+  v_tax NUMERIC := COALESCE((payload->>'tax')::numeric, 0);
+  v_breakdown JSONB := NULLIF(payload->'payment_breakdown', 'null'::jsonb);
+  v_earn_rate NUMERIC;
+  v_redeem_value NUMERIC;
+  v_user UUID;
+  v_customer_id UUID;
+  v_points INTEGER := 0;
+  v_new_points INTEGER;
+  v_earned INTEGER := 0;
+  v_redeem_discount NUMERIC := 0;
+  v_manual_discount NUMERIC;
+  v_effective_discount NUMERIC;
+  v_total NUMERIC;
+  v_sale sales%ROWTYPE;
+  v_tx_id UUID;
+  v_replayed BOOLEAN := false;
+BEGIN
+  IF v_key IS NULL OR v_key = '' THEN
+    RAISE EXCEPTION 'pos_commit_sale:idempotency_key_required';
+  END IF;
+
+  -- Concurrent retries of the same cart wait here and then find the first sale
+  PERFORM pg_advisory_xact_lock(hashtextextended('pos_sale:' || v_key, 0));
+  SELECT * INTO v_sale FROM sales WHERE idempotency_key = v_key LIMIT 1;
+
+  IF FOUND THEN
+    v_replayed := true;
+  ELSE
+    IF v_org IS NULL THEN
+      SELECT org_id INTO v_org FROM users WHERE id = v_cashier;
+      IF v_org IS NULL THEN
+        RAISE EXCEPTION 'pos_commit_sale:missing_org';
+      END IF;
+    END IF;
+    SELECT loyalty_earn_rate, loyalty_redeem_value INTO v_earn_rate, v_redeem_value
+    FROM organizations WHERE id = v_org;
+    v_earn_rate := COALESCE(v_earn_rate, 1);
+    v_redeem_value := COALESCE(v_redeem_value, 0.01);
+    -- Stock movements reference users; the test cashier may not exist
+    SELECT id INTO v_user FROM users WHERE id = v_cashier;
+
+    IF v_phone IS NOT NULL AND v_phone_e164 IS NOT NULL THEN
+      -- Finds or creates the customer and locks the row for the redeem check
+      -- and the points update below, in one statement
+      INSERT INTO customers (store_id, phone, phone_e164, current_points)
+      VALUES (v_store, v_phone, v_phone_e164, 0)
+      ON CONFLICT (store_id, phone_e164) WHERE phone_e164 IS NOT NULL
+      DO UPDATE SET phone_e164 = EXCLUDED.phone_e164
+      RETURNING id, COALESCE(current_points, 0) INTO v_customer_id, v_points;
+    ELSIF v_phone IS NOT NULL THEN
+      -- Not a usable phone number: keep matching on the raw value
+      SELECT id, COALESCE(current_points, 0) INTO v_customer_id, v_points
+      FROM customers
+      WHERE store_id = v_store AND phone = v_phone
+      LIMIT 1
+      FOR UPDATE;
+      IF v_customer_id IS NULL THEN
+        INSERT INTO customers (store_id, phone, current_points)
+        VALUES (v_store, v_phone, 0)
+        RETURNING id INTO v_customer_id;
+        v_points := 0;
+      END IF;
+    END IF;
+
+    IF v_customer_id IS NOT NULL AND v_redeem_points > 0 THEN
+      v_redeem_discount := v_redeem_points * v_redeem_value;
+    END IF;
+    IF v_redeem_discount > 0 AND v_points < v_redeem_points THEN
+      RAISE EXCEPTION 'pos_commit_sale:insufficient_points';
+    END IF;
+
+    v_manual_discount := GREATEST(0, v_discount);
+    IF v_redeem_discount > 0 AND v_manual_discount >= v_redeem_discount - 0.01 THEN
+      v_manual_discount := v_manual_discount - v_redeem_discount;
+    END IF;
+    v_effective_discount := v_manual_discount + v_redeem_discount;
+    v_total := GREATEST(0, v_subtotal - v_effective_discount + v_tax);
+
+    IF payload->>'payment_method' = 'split' THEN
+      IF abs(
+        (SELECT COALESCE(SUM((p->>'amount')::numeric), 0) FROM jsonb_array_elements(COALESCE(v_breakdown, '[]'::jsonb)) p)
+        - v_total
+      ) > 0.05 THEN
+        RAISE EXCEPTION 'pos_commit_sale:split_total_mismatch';
+      END IF;
+    END IF;
+
+    INSERT INTO sales (
+      org_id, store_id, cashier_id, subtotal, discount, tax, total,
+      payment_method, wallet_reference, payment_breakdown, idempotency_key
+    )
+    VALUES (
+      v_org, v_store, v_cashier, v_subtotal, v_effective_discount, v_tax, v_total,
+      payload->>'payment_method', NULLIF(payload->>'wallet_reference', ''), v_breakdown, v_key
+    )
+    RETURNING * INTO v_sale;
+
+    INSERT INTO sale_items (sale_id, product_id, quantity, unit_price, line_discount, line_total)
+    SELECT v_sale.id, l.product_id, l.quantity, l.unit_price, COALESCE(l.line_discount, 0), l.line_total
+    FROM jsonb_to_recordset(payload->'items')
+      AS l(product_id UUID, quantity INTEGER, unit_price NUMERIC, line_discount NUMERIC, line_total NUMERIC);
+
+    -- Products sold without an inventory row start from zero and are discovered below
+    INSERT INTO inventory (store_id, product_id, quantity)
+    SELECT DISTINCT v_store, l.product_id, 0
+    FROM jsonb_to_recordset(payload->'items') AS l(product_id UUID)
+    ON CONFLICT (store_id, product_id) DO NOTHING;
+
+    -- Repeated products (e.g. a paid and a free line) are settled together:
+    -- discovering max(0, demand - on hand) once leaves the same final stock as
+    -- topping up before each line.
+    WITH demand AS (
+      SELECT l.product_id, SUM(l.quantity)::integer AS qty
+      FROM jsonb_to_recordset(payload->'items') AS l(product_id UUID, quantity INTEGER)
+      GROUP BY l.product_id
+    ),
+    locked AS (
+      SELECT i.id, i.product_id, i.quantity AS quantity_before, i.avg_cost, d.qty,
+             GREATEST(d.qty - i.quantity, 0) AS discovered
+      FROM inventory i
+      JOIN demand d ON d.product_id = i.product_id
+      WHERE i.store_id = v_store
+      ORDER BY i.product_id
+      FOR UPDATE OF i
+    ),
+    adjusted AS (
+      UPDATE inventory i
+      SET quantity = l.quantity_before + l.discovered - l.qty,
+          total_cost_value = (l.quantity_before + l.discovered - l.qty) * i.avg_cost,
+          last_restocked = CASE WHEN l.discovered > 0 THEN now() ELSE i.last_restocked END,
+          updated_at = now()
+      FROM locked l
+      WHERE i.id = l.id
+      RETURNING l.product_id, l.quantity_before, l.avg_cost, l.qty, l.discovered
+    ),
+    costed AS (
+      SELECT a.*,
+             CASE WHEN a.avg_cost > 0 THEN a.avg_cost ELSE GREATEST(COALESCE(p.cost, 0), 0) END AS fallback_cost
+      FROM adjusted a
+      LEFT JOIN products p ON p.id = a.product_id
+    ),
+    movements AS (
+      INSERT INTO stock_movements (
+        store_id, product_id, quantity_before, quantity_after, delta, action_type,
+        source, reference_id, user_id, notes, metadata, occurred_at, created_at
+      )
+      SELECT v_store, c.product_id, c.quantity_before, c.quantity_before + c.discovered, c.discovered, 'adjustment',
+             'pos_stock_discovery', v_sale.id, v_user,
+             format('Stock adjustment for sale - discovered %s units', c.discovered),
+             jsonb_build_object('quantityChange', c.discovered, 'avgCost', c.avg_cost), now(), now()
+      FROM costed c
+      WHERE c.discovered > 0
+      UNION ALL
+      SELECT v_store, c.product_id, c.quantity_before + c.discovered, c.quantity_before + c.discovered - c.qty, -c.qty, 'adjustment',
+             'pos_sale', v_sale.id, v_user,
+             format('POS sale - %s units', c.qty),
+             jsonb_build_object('quantityChange', -c.qty, 'avgCost', c.avg_cost), now(), now()
+      FROM costed c
+      RETURNING 1
+    ),
+    revaluations AS (
+      INSERT INTO inventory_revaluation_events (
+        store_id, product_id, source, reference_id, quantity_before, quantity_after,
+        avg_cost_after, delta_value, metadata, occurred_at
+      )
+      SELECT v_store, c.product_id, 'pos_stock_discovery', v_sale.id, c.quantity_before, c.quantity_before + c.discovered,
+             c.avg_cost, c.discovered * c.avg_cost,
+             jsonb_build_object(
+               'quantityChange', c.discovered,
+               'notes', format('Stock adjustment for sale - discovered %s units', c.discovered),
+               'userId', v_cashier
+             ),
+             now()
+      FROM costed c
+      WHERE c.discovered > 0 AND c.avg_cost <> 0
+      RETURNING 1
+    )
+    INSERT INTO inventory_cost_layers (store_id, product_id, quantity_remaining, unit_cost, source, reference_id, notes)
+    SELECT v_store, c.product_id, c.discovered, c.fallback_cost, 'pos_stock_discovery', v_sale.id,
+           'Discovered inventory - cost based on last recorded price'
+    FROM costed c
+    WHERE c.discovered > 0 AND c.fallback_cost > 0;
+
+    -- Same FIFO walk as fifoConsumptionQuery (server/lib/cost-layers.ts);
+    -- the discovery layers inserted above are the newest and go last
+    WITH req AS (
+      SELECT l.product_id, SUM(l.quantity)::integer AS qty
+      FROM jsonb_to_recordset(payload->'items') AS l(product_id UUID, quantity INTEGER)
+      GROUP BY l.product_id
+    ),
+    locked AS (
+      SELECT c.id, c.product_id, c.quantity_remaining, c.unit_cost, c.created_at
+      FROM req r
+      CROSS JOIN LATERAL (
+        SELECT layer.id, layer.product_id, layer.quantity_remaining, layer.unit_cost, layer.created_at
+        FROM inventory_cost_layers layer
+        WHERE layer.store_id = v_store AND layer.product_id = r.product_id AND layer.quantity_remaining > 0
+        ORDER BY layer.created_at, layer.id
+        LIMIT r.qty
+        FOR UPDATE
+      ) c
+    ),
+    open_layers AS (
+      SELECT id, product_id, quantity_remaining,
+             SUM(quantity_remaining) OVER (
+               PARTITION BY product_id ORDER BY created_at, id
+               ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+             ) - quantity_remaining AS qty_before
+      FROM locked
+    ),
+    take AS (
+      SELECT o.id, LEAST(o.quantity_remaining, r.qty - o.qty_before) AS take_qty
+      FROM open_layers o
+      JOIN req r ON r.product_id = o.product_id
+      WHERE o.qty_before < r.qty
+    )
+    UPDATE inventory_cost_layers l
+    SET quantity_remaining = l.quantity_remaining - t.take_qty, updated_at = now()
+    FROM take t
+    WHERE l.id = t.id;
+
+    INSERT INTO transactions (
+      store_id, cashier_id, status, kind, subtotal, tax_amount, total,
+      payment_method, amount_received, change_due, receipt_number
+    )
+    VALUES (
+      v_store, v_cashier, 'completed', 'SALE', v_subtotal, v_tax, v_total,
+      (payload->>'transaction_payment_method')::payment_method, v_total, 0, v_sale.id::text
+    )
+    RETURNING id INTO v_tx_id;
+
+    INSERT INTO transaction_items (
+      transaction_id, product_id, quantity, unit_price, total_price, unit_cost, total_cost,
+      promotion_id, promotion_discount, original_unit_price, is_free_item
+    )
+    SELECT v_tx_id, l.product_id, l.quantity, l.unit_price, l.line_total,
+           round(COALESCE(i.avg_cost, 0), 4),
+           round(COALESCE(i.avg_cost, 0) * l.quantity, 4),
+           l.promotion_id,
+           GREATEST(0, round(COALESCE(i.avg_cost, 0) * l.quantity, 4) - l.line_total),
+           COALESCE(l.original_unit_price, l.unit_price),
+           COALESCE(l.is_free_item, false)
+    FROM jsonb_to_recordset(payload->'items')
+      AS l(product_id UUID, quantity INTEGER, unit_price NUMERIC, line_total NUMERIC,
+           promotion_id UUID, original_unit_price NUMERIC, is_free_item BOOLEAN)
+    LEFT JOIN inventory i ON i.store_id = v_store AND i.product_id = l.product_id;
+
+    IF v_customer_id IS NOT NULL THEN
+      v_new_points := v_points;
+      -- Earn on (subtotal - discounts) at the org rate, rounded down
+      v_earned := floor(GREATEST(0, v_subtotal - v_effective_discount) * GREATEST(v_earn_rate, 0));
+      IF v_earned > 0 OR v_redeem_discount > 0 THEN
+        INSERT INTO loyalty_ledger (holder_kind, holder_id, org_id, delta, entry_type, reason, source, reference_id)
+        SELECT 'customer', v_customer_id, v_org, e.delta, e.entry_type, e.entry_type, 'pos_sale', v_sale.id::text
+        FROM (VALUES
+          (CASE WHEN v_redeem_discount > 0 THEN -v_redeem_points ELSE 0 END, 'redeem'),
+          (v_earned, 'earn')
+        ) AS e(delta, entry_type)
+        WHERE e.delta <> 0;
+
+        -- The row is locked above, so this cannot lose a concurrent update
+        UPDATE customers
+        SET current_points = current_points
+              - CASE WHEN v_redeem_discount > 0 THEN v_redeem_points ELSE 0 END
+              + v_earned,
+            lifetime_points = lifetime_points + v_earned,
+            updated_at = now()
+        WHERE id = v_customer_id
+        RETURNING current_points INTO v_new_points;
+      END IF;
+    END IF;
+  END IF;
+
+  RETURN jsonb_build_object(
+    'replayed', v_replayed,
+    'sale', jsonb_build_object(
+      'id', v_sale.id,
+      'orgId', v_sale.org_id,
+      'storeId', v_sale.store_id,
+      'cashierId', v_sale.cashier_id,
+      'subtotal', v_sale.subtotal::text,
+      'discount', v_sale.discount::text,
+      'tax', v_sale.tax::text,
+      'total', v_sale.total::text,
+      'paymentMethod', v_sale.payment_method,
+      'status', v_sale.status,
+      'occurredAt', v_sale.occurred_at,
+      'idempotencyKey', v_sale.idempotency_key,
+      'walletReference', v_sale.wallet_reference,
+      'paymentBreakdown', v_sale.payment_breakdown
+    ),
+    'items', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'id', si.id,
+        'saleId', si.sale_id,
+        'productId', si.product_id,
+        'quantity', si.quantity,
+        'unitPrice', si.unit_price::text,
+        'lineDiscount', si.line_discount::text,
+        'lineTotal', si.line_total::text
+      ))
+      FROM sale_items si
+      WHERE si.sale_id = v_sale.id
+    ), '[]'::jsonb),
+    'stock', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'productId', i.product_id,
+        'quantity', i.quantity,
+        'minStockLevel', i.min_stock_level,
+        'avgCost', i.avg_cost::text
+      ) ORDER BY i.product_id)
+      FROM inventory i
+      WHERE i.store_id = v_sale.store_id
+        AND i.product_id IN (SELECT si.product_id FROM sale_items si WHERE si.sale_id = v_sale.id)
+    ), '[]'::jsonb),
+    'customer', CASE
+      WHEN v_customer_id IS NULL THEN NULL
+      ELSE jsonb_build_object('id', v_customer_id, 'points', v_new_points, 'pointsEarned', v_earned)
+    END
+  );
+END;
+$$;
@@ -0,0 +1,13 @@
+-- Indexes for the POS returns engine (server/lib/returns-engine.ts).
+--
+-- A return or swap loads the sale together with every earlier return of it
+-- and the loyalty points the sale earned, in one statement. returns had no
+-- index on sale_id, so summing the quantities already returned scanned the
+-- whole table, and loyalty_ledger was only indexed by holder, so finding the
+-- entries that reference a sale did the same.
+
+CREATE INDEX IF NOT EXISTS returns_sale_id_idx ON returns (sale_id);
+
+CREATE INDEX IF NOT EXISTS loyalty_ledger_reference_idx
+  ON loyalty_ledger (reference_id, source)
+  WHERE reference_id IS NOT NULL;
@@ -0,0 +1,78 @@
+-- Derive the inventory listing ETag from per-row stamps instead of a per-store
+-- version row.
+--
+-- Migration 0038 bumped inventory_store_versions from statement triggers on
+-- inventory, inventory_cost_layers and products. That row stayed locked until
+-- commit, so every sale in a store queued on it, and a transaction that wrote
+-- inventory in several statements took it between two sets of row locks, which
+-- could deadlock with a concurrent sale.
+--
+-- Each listed row now carries a listing_stamp taken from a sequence when it is
+-- written. nextval() takes no lock and is not rolled back, and the stamp lives
+-- on the row the statement already locks. The listing version is the count and
+-- sum of the stamps of a store's rows (see storage.getInventoryListingVersion):
+-- any insert, update or delete changes it whatever order transactions commit in.
+
+CREATE SEQUENCE IF NOT EXISTS inventory_listing_stamp_seq;
+
+ALTER TABLE inventory ADD COLUMN IF NOT EXISTS listing_stamp BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE inventory_layer_totals ADD COLUMN IF NOT EXISTS listing_stamp BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS listing_stamp BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION stamp_inventory_listing_row()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.listing_stamp := nextval('inventory_listing_stamp_seq');
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS inventory_listing_version_ins ON inventory;
+DROP TRIGGER IF EXISTS inventory_listing_version_upd ON inventory;
+DROP TRIGGER IF EXISTS inventory_listing_version_del ON inventory;
+DROP TRIGGER IF EXISTS products_listing_version_upd ON products;
+DROP FUNCTION IF EXISTS bump_inventory_versions_from_inventory();
+DROP FUNCTION IF EXISTS bump_inventory_versions_from_products();
+
+DROP TRIGGER IF EXISTS inventory_listing_stamp ON inventory;
+CREATE TRIGGER inventory_listing_stamp
+  BEFORE INSERT OR UPDATE ON inventory
+  FOR EACH ROW EXECUTE FUNCTION stamp_inventory_listing_row();
+
+DROP TRIGGER IF EXISTS products_listing_stamp ON products;
+CREATE TRIGGER products_listing_stamp
+  BEFORE UPDATE ON products
+  FOR EACH ROW EXECUTE FUNCTION stamp_inventory_listing_row();
+
+-- Same upsert as 0038, stamping the totals rows it writes instead of bumping
+-- the store versions
+CREATE OR REPLACE FUNCTION apply_inventory_layer_totals(
+  store_ids UUID[],
+  product_ids UUID[],
+  qty_deltas BIGINT[],
+  value_deltas NUMERIC[]
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO inventory_layer_totals AS t (store_id, product_id, total_quantity, total_value, updated_at, listing_stamp)
+  SELECT store_id, product_id, qty, value, NOW(), nextval('inventory_listing_stamp_seq')
+  FROM (
+    SELECT *
+    FROM unnest(store_ids, product_ids, qty_deltas, value_deltas) AS d(store_id, product_id, qty, value)
+    WHERE qty <> 0 OR value <> 0
+    ORDER BY store_id, product_id
+  ) delta
+  ON CONFLICT (store_id, product_id) DO UPDATE
+    SET total_quantity = t.total_quantity + EXCLUDED.total_quantity,
+        total_value = t.total_value + EXCLUDED.total_value,
+        updated_at = NOW(),
+        listing_stamp = EXCLUDED.listing_stamp;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS bump_inventory_store_versions(UUID[]);
+DROP TABLE IF EXISTS inventory_store_versions;
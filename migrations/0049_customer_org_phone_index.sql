@@ -0,0 +1,9 @@
+-- Offline sync attaches a sale to the org's customer for a phone number, since
+-- its loyalty accounts are keyed by org and customer (see
+-- upsertOrgCustomerByPhone). Serve that lookup from an index instead of
+-- scanning every customer in the org. Not unique: customers created before
+-- phone_e164 may repeat a number across the org's stores.
+
+CREATE INDEX IF NOT EXISTS customers_org_phone_e164_idx
+  ON customers (org_id, phone_e164)
+  WHERE phone_e164 IS NOT NULL;
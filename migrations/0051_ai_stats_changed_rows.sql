@@ -0,0 +1,37 @@
+-- Let the incremental AI insight scan find rows by when they were written.
+--
+-- refreshDailyStats rescanned from the previous watermark by business time
+-- (transactions.created_at, occurred_at), so a sale synced from an offline
+-- till or back-dated by an import landed on a day the scan had already passed
+-- and was never aggregated. Each source row now records when it was written
+-- (or, for transactions, last changed): the scan collects the days touched by
+-- rows written since its watermark and rebuilds exactly those days.
+--
+-- now() is stable, so existing rows take the migration time without a table
+-- rewrite and are covered by the next full rebuild of the analysis window.
+
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS changed_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE stock_movements ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE inventory_revaluation_events ADD COLUMN IF NOT EXISTS recorded_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS transactions_store_changed_idx ON transactions (store_id, changed_at);
+CREATE INDEX IF NOT EXISTS stock_movements_store_recorded_idx ON stock_movements (store_id, recorded_at);
+CREATE INDEX IF NOT EXISTS inventory_revaluation_events_store_recorded_idx
+  ON inventory_revaluation_events (store_id, recorded_at);
+
+-- A pending transaction completed (or a refund rewritten) later still moves
+-- its day back into the scan
+CREATE OR REPLACE FUNCTION touch_transaction_changed_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.changed_at := now();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS transactions_changed_at ON transactions;
+CREATE TRIGGER transactions_changed_at
+  BEFORE UPDATE ON transactions
+  FOR EACH ROW EXECUTE FUNCTION touch_transaction_changed_at();
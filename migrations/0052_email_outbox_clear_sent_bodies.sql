@@ -0,0 +1,10 @@
+-- Sent and dead email_outbox rows kept the rendered message, including
+-- temporary passwords, password reset links and attached reports, until the
+-- prune job removed them (7 days for sent mail, 30 for dead). The worker now
+-- clears the body and attachments when a message is sent or dead-lettered;
+-- clear the rows that finished before it did.
+
+UPDATE email_outbox
+SET html = '', text_body = NULL, attachments = NULL
+WHERE status IN ('sent', 'dead')
+  AND (html <> '' OR text_body IS NOT NULL OR attachments IS NOT NULL);
@@ -0,0 +1,135 @@
+/**
+ * FIFO cost-layer consumption benchmark.
+ *
+ * Seeds a scratch copy of inventory_cost_layers (a session TEMP table with the
+ * same indexes) with N open and N depleted layers per product, then times one
+ * sale of several lines through:
+ *   - legacy: select every layer of each product, then one UPDATE/DELETE per
+ *     touched layer (the pre-ledger storage.consumeCostLayers loop)
+ *   - bulk:   the single-statement fifoConsumptionQuery used by
+ *     storage.consumeCostLayersBulk
+ * Every iteration is rolled back so each run sees the same layers. Prints JSON.
+ *
+ *   DATABASE_URL=postgres://... tsx scripts/bench-cost-layers.ts [layerCounts] [iterations]
+ *   e.g. tsx scripts/bench-cost-layers.ts 10,100,1000,10000 20
+ */
+
+import { randomUUID } from 'node:crypto';
+import { sql } from 'drizzle-orm';
+import { drizzle } from 'drizzle-orm/node-postgres';
+import type { PoolClient } from 'pg';
+
+const TABLE = 'bench_cost_layers';
+const LINES = Number(process.env.BENCH_SALE_LINES ?? 5);
+const UNITS_PER_LINE = Number(process.env.BENCH_UNITS_PER_LINE ?? 10);
+
+async function seed(client: PoolClient, storeId: string, productIds: string[], layersPerProduct: number) {
+  await client.query(`TRUNCATE ${TABLE}`);
+  for (const productId of productIds) {
+    // Depleted history first, then the open layers, all a second apart
+    await client.query(
+      `INSERT INTO ${TABLE} (store_id, product_id, quantity_remaining, unit_cost, source, created_at)
+       SELECT $1::uuid, $2::uuid,
+              CASE WHEN g <= $3 THEN 0 ELSE 1 END,
+              (1 + (g % 7))::numeric,
+              'bench',
+              now() - ((2 * $3 - g) * interval '1 second')
+       FROM generate_series(1, 2 * $3) AS g`,
+      [storeId, productId, layersPerProduct],
+    );
+  }
+  await client.query(`ANALYZE ${TABLE}`);
+}
+
+async function legacyConsume(client: PoolClient, storeId: string, productIds: string[]): Promise<number> {
+  let statements = 0;
+  for (const productId of productIds) {
+    const { rows } = await client.query(
+      `SELECT id, quantity_remaining, unit_cost FROM ${TABLE}
+       WHERE store_id = $1 AND product_id = $2
+       ORDER BY created_at, id`,
+      [storeId, productId],
+    );
+    statements += 1;
+    let remaining = UNITS_PER_LINE;
+    for (const row of rows) {
+      if (remaining <= 0) break;
+      const available = Number(row.quantity_remaining);
+      if (available <= 0) continue;
+      const useQty = Math.min(available, remaining);
+      remaining -= useQty;
+      if (useQty === available) {
+        await client.query(`DELETE FROM ${TABLE} WHERE id = $1`, [row.id]);
+      } else {
+        await client.query(`UPDATE ${TABLE} SET quantity_remaining = $2 WHERE id = $1`, [row.id, available - useQty]);
+      }
+      statements += 1;
+    }
+  }
+  return statements;
+}
+
+async function time(client: PoolClient, iterations: number, run: () => Promise<number>) {
+  const samples: number[] = [];
+  let statements = 0;
+  for (let i = 0; i < iterations; i++) {
+    await client.query('BEGIN');
+    const started = process.hrtime.bigint();
+    statements = await run();
+    samples.push(Number(process.hrtime.bigint() - started) / 1e6);
+    await client.query('ROLLBACK');
+  }
+  samples.sort((a, b) => a - b);
+  const round = (value: number) => Math.round(value * 1000) / 1000;
+  return {
+    statements,
+    p50Ms: round(samples[Math.floor(samples.length / 2)]),
+    p95Ms: round(samples[Math.min(samples.length - 1, Math.floor(samples.length * 0.95))]),
+    meanMs: round(samples.reduce((sum, value) => sum + value, 0) / samples.length),
+  };
+}
+
+async function main() {
+  if (!process.env.DATABASE_URL) {
+    console.error('DATABASE_URL is required');
+    process.exit(1);
+  }
+  const layerCounts = (process.argv[2] ?? '10,100,1000,10000').split(',').map(Number).filter((n) => n > 0);
+  const iterations = Number(process.argv[3] ?? 20);
+
+  const { pool } = await import('../server/db');
+  const { fifoConsumptionQuery } = await import('../server/lib/cost-layers');
+
+  const client = await pool.connect();
+  const scratch = drizzle({ client });
+  const results: Array<Record<string, unknown>> = [];
+  try {
+    await client.query(
+      `CREATE TEMP TABLE IF NOT EXISTS ${TABLE} (LIKE inventory_cost_layers INCLUDING DEFAULTS INCLUDING INDEXES)`,
+    );
+    const storeId = randomUUID();
+    const productIds = Array.from({ length: LINES }, () => randomUUID());
+    const demands = productIds.map((productId) => ({ productId, quantity: UNITS_PER_LINE }));
+
+    for (const layers of layerCounts) {
+      await seed(client, storeId, productIds, layers);
+      const legacy = await time(client, iterations, () => legacyConsume(client, storeId, productIds));
+      const bulk = await time(client, iterations, async () => {
+        await scratch.execute(fifoConsumptionQuery(storeId, demands, sql.raw(TABLE)));
+        return 1;
+      });
+      results.push({ openLayersPerProduct: layers, depletedLayersPerProduct: layers, lines: LINES, unitsPerLine: UNITS_PER_LINE, legacy, bulk });
+    }
+  } finally {
+    await client.query(`DROP TABLE IF EXISTS ${TABLE}`).catch(() => undefined);
+    client.release();
+    await pool.end();
+  }
+
+  console.log(JSON.stringify({ iterations, results }, null, 2));
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
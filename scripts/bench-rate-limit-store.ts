@@ -0,0 +1,69 @@
+/**
+ * Per-request overhead of the rate-limit stores.
+ *
+ * Times `increment` (the call express-rate-limit makes on every request) for:
+ *   - memory: SlidingWindowMemoryStore
+ *   - redis:  RedisSlidingWindowStore (only when REDIS_URL is set)
+ * across a pool of distinct client keys, with a few calls in flight at once
+ * to mimic concurrent requests. Prints JSON.
+ *
+ *   [REDIS_URL=redis://...] tsx scripts/bench-rate-limit-store.ts [requests] [keys] [inFlight]
+ *   e.g. tsx scripts/bench-rate-limit-store.ts 20000 1000 16
+ */
+
+import type { Options, Store } from 'express-rate-limit';
+
+async function main() {
+  const requests = Number(process.argv[2] ?? 20_000);
+  const keyCount = Number(process.argv[3] ?? 1_000);
+  const inFlight = Number(process.argv[4] ?? 16);
+
+  const { RedisSlidingWindowStore, SlidingWindowMemoryStore } = await import('../server/lib/rate-limit-store');
+  const { getRedisClient } = await import('../server/lib/redis');
+  const { mapWithConcurrency } = await import('../server/lib/concurrency');
+
+  const options = { windowMs: 60_000 } as Options;
+  const keys = Array.from({ length: keyCount }, (_, i) => `10.0.${Math.floor(i / 256)}.${i % 256}`);
+
+  const measure = async (label: string, store: Store) => {
+    store.init?.(options);
+    // Warm up (script load, connection)
+    await store.increment('bench-warmup');
+    const samples = new Float64Array(requests);
+    const started = process.hrtime.bigint();
+    await mapWithConcurrency(Array.from({ length: requests }, (_, i) => i), inFlight, async (i) => {
+      const t0 = process.hrtime.bigint();
+      await store.increment(keys[i % keys.length]);
+      samples[i] = Number(process.hrtime.bigint() - t0) / 1e3;
+    });
+    const elapsedMs = Number(process.hrtime.bigint() - started) / 1e6;
+    const sorted = Array.from(samples).sort((a, b) => a - b);
+    const pct = (p: number) => Math.round(sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p))] * 10) / 10;
+    await Promise.all(keys.map((key) => store.resetKey(key)));
+    await store.shutdown?.();
+    return { store: label, requests, keys: keyCount, inFlight, opsPerSecond: Math.round((requests / elapsedMs) * 1000), p50Us: pct(0.5), p95Us: pct(0.95), p99Us: pct(0.99) };
+  };
+
+  const results = [await measure('memory', new SlidingWindowMemoryStore())];
+
+  if (process.env.REDIS_URL) {
+    const client = getRedisClient();
+    const deadline = Date.now() + 5_000;
+    while (client && !client.isReady && Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, 50));
+    }
+    if (client?.isReady) {
+      results.push(await measure('redis', new RedisSlidingWindowStore(`bench-${process.pid}`)));
+      await client.quit();
+    } else {
+      console.error('Redis did not become ready; skipping redis store');
+    }
+  }
+
+  console.log(JSON.stringify({ results }, null, 2));
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -0,0 +1,256 @@
+/**
+ * POS returns benchmark for large receipts.
+ *
+ * Seeds one sale of N lines (each with its inventory row, an origin
+ * transaction and earned loyalty points) inside a transaction on a scratch
+ * database with migrations applied, then times a full return of every line
+ * through:
+ *   - perLine: the statement pattern of the per-line route (sale, items,
+ *     every return_items row, then per line an insert, inventory read and
+ *     update, stock movement, cost layer and refund transaction item)
+ *   - engine:  loadReturnContext + planReturn + applyReturn from
+ *     server/lib/returns-engine.ts
+ * Each iteration runs in a savepoint that is rolled back, and the seed is
+ * rolled back at the end, so the database is left as it was. The time is also
+ * how long the receipt's inventory rows stay locked. Prints JSON.
+ *
+ *   DATABASE_URL=postgres://... tsx scripts/bench-returns.ts [lineCounts] [iterations]
+ *   e.g. tsx scripts/bench-returns.ts 10,100,1000 10
+ */
+
+import type { SQL } from 'drizzle-orm';
+import { drizzle } from 'drizzle-orm/node-postgres';
+import type { PoolClient } from 'pg';
+
+const UNITS_PER_LINE = Number(process.env.BENCH_UNITS_PER_LINE ?? 5);
+
+interface Seeded {
+  storeId: string;
+  userId: string;
+  saleId: string;
+}
+
+async function seed(client: PoolClient, lines: number): Promise<Seeded> {
+  const runId = `${Date.now() % 1e6}-${lines}`;
+  const { rows: [org] } = await client.query(
+    `INSERT INTO organizations (name, currency, is_active) VALUES ($1, 'NGN', true) RETURNING id`,
+    [`bench-returns-${runId}`],
+  );
+  const { rows: [store] } = await client.query(
+    `INSERT INTO stores (org_id, name, currency) VALUES ($1, 'Bench returns store', 'NGN') RETURNING id`,
+    [org.id],
+  );
+  const { rows: [user] } = await client.query(
+    `INSERT INTO users (email, password_hash, org_id) VALUES ($1, 'bench', $2) RETURNING id`,
+    [`bench-returns-${runId}@example.invalid`, org.id],
+  );
+  const { rows: [customer] } = await client.query(
+    `INSERT INTO customers (store_id, phone, current_points) VALUES ($1, $2, 0) RETURNING id`,
+    [store.id, `0800${runId.replace(/\D/g, '').slice(0, 7)}`],
+  );
+
+  await client.query(
+    `INSERT INTO products (org_id, name, sku, price, cost, is_active)
+     SELECT $1::uuid, 'Bench wholesale item ' || g, 'BENCH-RET-' || $2 || '-' || g, 100, 60, true
+     FROM generate_series(1, $3::integer) AS g`,
+    [org.id, runId, lines],
+  );
+  await client.query(
+    `INSERT INTO inventory (store_id, product_id, quantity, min_stock_level, avg_cost, total_cost_value)
+     SELECT $1::uuid, p.id, 1000, 10, 60, 60000 FROM products p WHERE p.org_id = $2::uuid`,
+    [store.id, org.id],
+  );
+
+  const subtotal = lines * UNITS_PER_LINE * 100;
+  const { rows: [sale] } = await client.query(
+    `INSERT INTO sales (org_id, store_id, cashier_id, subtotal, discount, tax, total, payment_method, idempotency_key)
+     VALUES ($1, $2, $3, $4, 0, $5, $4 + $5, 'cash', $6) RETURNING id`,
+    [org.id, store.id, user.id, subtotal, subtotal * 0.075, `bench-returns-${runId}`],
+  );
+  await client.query(
+    `INSERT INTO sale_items (sale_id, product_id, quantity, unit_price, line_discount, line_total)
+     SELECT $1::uuid, p.id, $3::integer, 100, 0, 100 * $3::integer FROM products p WHERE p.org_id = $2::uuid`,
+    [sale.id, org.id, UNITS_PER_LINE],
+  );
+  const { rows: [tx] } = await client.query(
+    `INSERT INTO transactions (store_id, cashier_id, status, kind, subtotal, tax_amount, total, payment_method, receipt_number)
+     VALUES ($1, $2, 'completed', 'SALE', $3, $4, $3 + $4, 'cash', $5) RETURNING id`,
+    [store.id, user.id, subtotal, subtotal * 0.075, sale.id],
+  );
+  await client.query(
+    `INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, total_price, unit_cost, total_cost)
+     SELECT $1::uuid, p.id, $3::integer, 100, 100 * $3::integer, 60, 60 * $3::integer FROM products p WHERE p.org_id = $2::uuid`,
+    [tx.id, org.id, UNITS_PER_LINE],
+  );
+  await client.query(
+    `WITH earned AS (
+       INSERT INTO loyalty_ledger (holder_kind, holder_id, org_id, delta, entry_type, reason, source, reference_id)
+       VALUES ('customer', $1, $2, $3, 'earn', 'earn', 'pos_sale', $4::text)
+       RETURNING delta
+     )
+     UPDATE customers SET current_points = current_points + (SELECT delta FROM earned) WHERE id = $1`,
+    [customer.id, org.id, subtotal, sale.id],
+  );
+  for (const table of ['sale_items', 'inventory', 'returns', 'return_items', 'loyalty_ledger']) {
+    await client.query(`ANALYZE ${table}`);
+  }
+
+  return { storeId: store.id, userId: user.id, saleId: sale.id };
+}
+
+// The per-line route's statements, in order, without its mocked-db fallbacks
+async function perLineReturn(client: PoolClient, seeded: Seeded): Promise<number> {
+  let statements = 0;
+  const query = async (text: string, params: unknown[] = []) => {
+    statements += 1;
+    return client.query(text, params);
+  };
+
+  const { rows: [sale] } = await query('SELECT * FROM sales WHERE id = $1', [seeded.saleId]);
+  await query('SELECT currency FROM stores WHERE id = $1 LIMIT 1', [seeded.storeId]);
+  const { rows: items } = await query('SELECT * FROM sale_items WHERE sale_id = $1', [seeded.saleId]);
+  await query('SELECT id FROM returns WHERE sale_id = $1', [seeded.saleId]);
+  await query('SELECT * FROM return_items');
+  const { rows: [origin] } = await query(
+    'SELECT id FROM transactions WHERE store_id = $1 AND receipt_number = $2 LIMIT 1',
+    [seeded.storeId, seeded.saleId],
+  );
+
+  await query(`UPDATE sales SET status = 'RETURNED' WHERE id = $1`, [seeded.saleId]);
+  const { rows: [ret] } = await query(
+    `INSERT INTO returns (sale_id, store_id, processed_by, refund_type, total_refund, currency, idempotency_key)
+     VALUES ($1, $2, $3, 'FULL', $4, 'NGN', $5) RETURNING *`,
+    [seeded.saleId, seeded.storeId, seeded.userId, sale.total, `bench-per-line-${Date.now()}-${Math.random()}`],
+  );
+  for (const item of items) {
+    await query(
+      `INSERT INTO return_items (return_id, sale_item_id, product_id, quantity, restock_action, refund_type, refund_amount, currency)
+       VALUES ($1, $2, $3, $4, 'RESTOCK', 'FULL', $5, 'NGN') RETURNING *`,
+      [ret.id, item.id, item.product_id, item.quantity, item.line_total],
+    );
+  }
+  for (const item of items) {
+    const { rows: [inv] } = await query('SELECT * FROM inventory WHERE product_id = $1 AND store_id = $2', [item.product_id, seeded.storeId]);
+    await query('SELECT * FROM inventory WHERE product_id = $1 AND store_id = $2', [item.product_id, seeded.storeId]);
+    await query(
+      `UPDATE inventory SET quantity = $3, total_cost_value = $3 * avg_cost, last_restocked = now(), updated_at = now()
+       WHERE product_id = $1 AND store_id = $2 RETURNING *`,
+      [item.product_id, seeded.storeId, inv.quantity + item.quantity],
+    );
+    await query(
+      `INSERT INTO stock_movements (store_id, product_id, quantity_before, quantity_after, delta, action_type, source, reference_id, user_id, notes)
+       VALUES ($1, $2, $3, $4, $5, 'adjustment', 'pos_return', $6, $7, 'POS return')`,
+      [seeded.storeId, item.product_id, inv.quantity, inv.quantity + item.quantity, item.quantity, ret.id, seeded.userId],
+    );
+    await query('SELECT * FROM inventory WHERE product_id = $1 AND store_id = $2', [item.product_id, seeded.storeId]);
+    await query(
+      `INSERT INTO inventory_cost_layers (store_id, product_id, quantity_remaining, unit_cost, source, reference_id, notes)
+       VALUES ($1, $2, $3, $4, 'pos_return', $5, 'Restocked from return')`,
+      [seeded.storeId, item.product_id, item.quantity, inv.avg_cost, ret.id],
+    );
+  }
+  const { rows: [refund] } = await query(
+    `INSERT INTO transactions (store_id, cashier_id, status, kind, subtotal, tax_amount, total, payment_method, amount_received, change_due, receipt_number, origin_transaction_id)
+     VALUES ($1, $2, 'completed', 'REFUND', $3, $4, $5, 'cash', 0, 0, $6, $7) RETURNING *`,
+    [seeded.storeId, seeded.userId, sale.subtotal, sale.tax, sale.total, ret.id, origin?.id ?? null],
+  );
+  for (const item of items) {
+    const { rows: [inv] } = await query('SELECT * FROM inventory WHERE product_id = $1 AND store_id = $2', [item.product_id, seeded.storeId]);
+    await query(
+      `INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, total_price, unit_cost, total_cost)
+       VALUES ($1, $2, $3, $4, $5, $6, $7)`,
+      [refund.id, item.product_id, item.quantity, item.unit_price, item.line_total, inv.avg_cost, Number(inv.avg_cost) * item.quantity],
+    );
+  }
+  return statements;
+}
+
+async function time(client: PoolClient, iterations: number, run: () => Promise<Record<string, number>>) {
+  const samples: number[] = [];
+  let extra: Record<string, number> = {};
+  for (let i = 0; i < iterations; i++) {
+    await client.query('SAVEPOINT bench_return');
+    const started = process.hrtime.bigint();
+    extra = await run();
+    samples.push(Number(process.hrtime.bigint() - started) / 1e6);
+    await client.query('ROLLBACK TO SAVEPOINT bench_return');
+  }
+  samples.sort((a, b) => a - b);
+  const round = (value: number) => Math.round(value * 1000) / 1000;
+  return {
+    ...extra,
+    p50Ms: round(samples[Math.floor(samples.length / 2)]),
+    p95Ms: round(samples[Math.min(samples.length - 1, Math.floor(samples.length * 0.95))]),
+    meanMs: round(samples.reduce((sum, value) => sum + value, 0) / samples.length),
+  };
+}
+
+async function main() {
+  if (!process.env.DATABASE_URL) {
+    console.error('DATABASE_URL is required');
+    process.exit(1);
+  }
+  const lineCounts = (process.argv[2] ?? '10,100,1000').split(',').map(Number).filter((n) => n > 0);
+  const iterations = Number(process.argv[3] ?? 10);
+
+  const { pool } = await import('../server/db');
+  const { applyReturn, loadReturnContext, planReturn } = await import('../server/lib/returns-engine');
+
+  const client = await pool.connect();
+  const scratch = drizzle({ client });
+  const results: Array<Record<string, unknown>> = [];
+  try {
+    for (const lines of lineCounts) {
+      await client.query('BEGIN');
+      try {
+        const seeded = await seed(client, lines);
+        const perLine = await time(client, iterations, async () => ({ statements: await perLineReturn(client, seeded) }));
+        let planMs = 0;
+        const engine = await time(client, iterations, async () => {
+          let statements = 0;
+          const counted = {
+            execute: (query: SQL) => {
+              statements += 1;
+              return scratch.execute(query);
+            },
+          };
+          const context = await loadReturnContext(counted, seeded.saleId);
+          const planned = process.hrtime.bigint();
+          const plan = planReturn(context, seeded.storeId, context!.lines.map((line) => ({
+            saleItemId: line.id,
+            productId: line.productId,
+            quantity: line.quantity,
+            restockAction: 'RESTOCK' as const,
+            refundType: 'FULL' as const,
+          })));
+          planMs = Number(process.hrtime.bigint() - planned) / 1e6;
+          await applyReturn(counted, context!, plan, {
+            storeId: seeded.storeId,
+            userId: seeded.userId,
+            idempotencyKey: `bench-engine-${Date.now()}-${Math.random()}`,
+            refundPaymentMethod: 'cash',
+          });
+          return { statements };
+        });
+        results.push({
+          lines,
+          unitsPerLine: UNITS_PER_LINE,
+          perLine,
+          engine: { ...engine, planMs: Math.round(planMs * 1000) / 1000 },
+        });
+      } finally {
+        await client.query('ROLLBACK');
+      }
+    }
+  } finally {
+    client.release();
+    await pool.end();
+  }
+
+  console.log(JSON.stringify({ iterations, results }, null, 2));
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -0,0 +1,348 @@
+#!/usr/bin/env node
+/**
+ * Build-time compiler for the transactional email templates.
+ *
+ * Reads server/email-templates/<name>.html (plus an optional <name>.txt text
+ * part), expands partials, resolves branding assets once, minifies the HTML and
+ * writes server/email-templates/compiled.ts: one object per template whose
+ * html()/text() functions only concatenate escaped variables into precomputed
+ * strings. Prints source/minified size and render time per template.
+ *
+ *   node scripts/compile-email-templates.mjs           # write the module
+ *   node scripts/compile-email-templates.mjs --check   # exit 1 if it is stale
+ *
+ * Template syntax:
+ *   {{ name }}               variable, HTML-escaped in .html and raw in .txt
+ *   {{#if name}}...{{/if}}   section rendered only when the variable is truthy
+ *   {{> partial }}           server/email-templates/partials/partial.html
+ *   {{cid:file.png}}         inline image from assets/branding; becomes
+ *                            cid:<file stem> and the bytes are embedded in the
+ *                            module so sendEmail can attach them without
+ *                            touching the filesystem
+ */
+
+import { existsSync, readFileSync, readdirSync, writeFileSync } from 'node:fs';
+import path from 'node:path';
+import { performance } from 'node:perf_hooks';
+import { fileURLToPath, pathToFileURL } from 'node:url';
+
+const ROOT = path.resolve(path.dirname(fileURLToPath(import.meta.url)), '..');
+export const TEMPLATE_DIR = path.join(ROOT, 'server', 'email-templates');
+export const ASSET_DIR = path.join(ROOT, 'assets', 'branding');
+export const OUTPUT_FILE = path.join(TEMPLATE_DIR, 'compiled.ts');
+
+const MAX_PARTIAL_DEPTH = 8;
+const RENDER_ITERATIONS = Number(process.env.EMAIL_TEMPLATE_BENCH_ITERATIONS ?? 20000);
+
+const PARTIAL_TAG = /\{\{>\s*([\w-]+)\s*\}\}/g;
+const ASSET_TAG = /\{\{\s*cid:([\w.-]+)\s*\}\}/g;
+const TAG = /\{\{\s*(?:#if\s+([A-Za-z_$][\w$]*)|(\/if)|([A-Za-z_$][\w$]*))\s*\}\}/g;
+
+const CONTENT_TYPES = {
+  '.png': 'image/png',
+  '.svg': 'image/svg+xml',
+  '.jpg': 'image/jpeg',
+  '.jpeg': 'image/jpeg',
+  '.gif': 'image/gif',
+};
+
+const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+const esc = (value) => (value == null ? '' : String(value).replace(/[&<>"']/g, (ch) => HTML_ESCAPES[ch]));
+const str = (value) => (value == null ? '' : String(value));
+
+/**
+ * Drops comments and the indentation between tags. Whitespace that contains a
+ * line break and touches a tag is layout only; any other run collapses to one
+ * space so inline copy such as `</strong> {{ value }}` keeps its spacing.
+ */
+export function minifyHtml(html) {
+  return html
+    .replace(/<!--[\s\S]*?-->/g, '')
+    .replace(/>[ \t]*\r?\n\s*/g, '>')
+    .replace(/\s*\r?\n[ \t]*(?=<)/g, '')
+    .replace(/\s+/g, ' ')
+    .trim();
+}
+
+export function expandPartials(source, loadPartial, depth = 0) {
+  if (depth > MAX_PARTIAL_DEPTH) {
+    throw new Error(`Partials nested deeper than ${MAX_PARTIAL_DEPTH} levels (cycle?)`);
+  }
+  return source.replace(PARTIAL_TAG, (_tag, name) => expandPartials(loadPartial(name), loadPartial, depth + 1));
+}
+
+/** Splits a template into text, variable and {{#if}} nodes */
+export function parseTemplate(source, label = 'template') {
+  const root = [];
+  const stack = [{ name: null, children: root }];
+  const pushText = (text) => {
+    if (!text) return;
+    if (text.includes('{{')) {
+      throw new Error(`${label}: unsupported tag near "${text.slice(text.indexOf('{{'), text.indexOf('{{') + 40)}"`);
+    }
+    stack[stack.length - 1].children.push({ type: 'text', value: text });
+  };
+
+  let cursor = 0;
+  for (const match of source.matchAll(TAG)) {
+    pushText(source.slice(cursor, match.index));
+    cursor = match.index + match[0].length;
+    const [, condition, close, variable] = match;
+    if (condition) {
+      const node = { type: 'if', name: condition, children: [] };
+      stack[stack.length - 1].children.push(node);
+      stack.push(node);
+    } else if (close) {
+      if (stack.length === 1) throw new Error(`${label}: {{/if}} without a matching {{#if}}`);
+      stack.pop();
+    } else {
+      stack[stack.length - 1].children.push({ type: 'var', name: variable });
+    }
+  }
+  pushText(source.slice(cursor));
+  if (stack.length > 1) throw new Error(`${label}: {{#if ${stack[stack.length - 1].name}}} is never closed`);
+  return root;
+}
+
+const quote = (value) =>
+  `'${value
+    .replace(/\\/g, '\\\\')
+    .replace(/'/g, "\\'")
+    .replace(/\r/g, '\\r')
+    .replace(/\n/g, '\\n')
+    .replace(/\u2028/g, '\\u2028')
+    .replace(/\u2029/g, '\\u2029')}'`;
+
+/**
+ * Turns parsed nodes into a single concatenation expression over `v`. Adjacent
+ * literals are already merged by the parser, so each variable costs one `+`.
+ */
+export function generateExpression(nodes, escape, variables = { all: new Set(), conditional: new Set() }) {
+  const parts = nodes.map((node) => {
+    if (node.type === 'text') return quote(node.value);
+    variables.all.add(node.name);
+    if (node.type === 'var') return `${escape ? 'esc' : 'str'}(v.${node.name})`;
+    variables.conditional.add(node.name);
+    return `(v.${node.name} ? ${generateExpression(node.children, escape, variables)} : '')`;
+  });
+  return parts.length ? parts.join(' + ') : "''";
+}
+
+const camelCase = (name) => name.replace(/-(\w)/g, (_m, ch) => ch.toUpperCase());
+const pascalCase = (name) => camelCase(name).replace(/^\w/, (ch) => ch.toUpperCase());
+
+export function createAssetResolver(assetDir = ASSET_DIR) {
+  const assets = new Map();
+  return {
+    assets,
+    resolve(filename) {
+      let asset = assets.get(filename);
+      if (!asset) {
+        const contentType = CONTENT_TYPES[path.extname(filename).toLowerCase()];
+        const file = path.join(assetDir, filename);
+        if (!contentType) throw new Error(`Unsupported email asset type: ${filename}`);
+        if (!existsSync(file)) throw new Error(`Email asset not found: ${path.relative(ROOT, file)}`);
+        const bytes = readFileSync(file);
+        asset = {
+          filename,
+          cid: path.basename(filename, path.extname(filename)),
+          contentType,
+          base64: bytes.toString('base64'),
+          bytes: bytes.length,
+        };
+        assets.set(filename, asset);
+      }
+      return asset;
+    },
+  };
+}
+
+/**
+ * Compiles one template. `loadPartial(name)` returns partial source and
+ * `resolveAsset(filename)` returns `{ cid }`; both are injected so tests can
+ * compile from strings.
+ */
+export function compileTemplate({ name, html, text, loadPartial, resolveAsset }) {
+  const assets = new Set();
+  const resolve = (source) =>
+    expandPartials(source, loadPartial).replace(ASSET_TAG, (_tag, filename) => {
+      const { cid } = resolveAsset(filename);
+      assets.add(cid);
+      return `cid:${cid}`;
+    });
+
+  const expandedHtml = resolve(html);
+  const minifiedHtml = minifyHtml(expandedHtml);
+  const variables = { all: new Set(), conditional: new Set() };
+  const htmlExpr = generateExpression(parseTemplate(minifiedHtml, `${name}.html`), true, variables);
+  const textSource = text == null ? null : resolve(text).replace(/\r?\n$/, '');
+  const textExpr = textSource == null ? null : generateExpression(parseTemplate(textSource, `${name}.txt`), false, variables);
+
+  return {
+    name,
+    exportName: `${camelCase(name)}Template`,
+    varsName: `${pascalCase(name)}TemplateVars`,
+    variables: [...variables.all].sort(),
+    optional: variables.conditional,
+    assets: [...assets].sort(),
+    htmlExpr,
+    textExpr,
+    sourceBytes: Buffer.byteLength(expandedHtml),
+    htmlBytes: Buffer.byteLength(minifiedHtml),
+    textBytes: textSource == null ? 0 : Buffer.byteLength(textSource),
+  };
+}
+
+export function renderModule(templates, assets) {
+  const lines = [
+    '// Generated by scripts/compile-email-templates.mjs from server/email-templates.',
+    '// Do not edit by hand: change the sources and run `npm run build:emails`.',
+    '/* eslint-disable */',
+    '',
+    'export type EmailTemplateValue = string | number | boolean | null | undefined;',
+    '',
+    'export interface EmailAsset {',
+    '  filename: string;',
+    '  cid: string;',
+    '  contentType: string;',
+    '  base64: string;',
+    '}',
+    '',
+    '/** Branding assets referenced by the templates, keyed by content id */',
+    'export const EMAIL_ASSETS: Record<string, EmailAsset> = {',
+  ];
+  for (const asset of [...assets].sort((a, b) => a.cid.localeCompare(b.cid))) {
+    lines.push(
+      `  ${quote(asset.cid)}: {`,
+      `    filename: ${quote(asset.filename)},`,
+      `    cid: ${quote(asset.cid)},`,
+      `    contentType: ${quote(asset.contentType)},`,
+      `    base64: ${quote(asset.base64)},`,
+      '  },',
+    );
+  }
+  lines.push(
+    '};',
+    '',
+    "const HTML_ESCAPES: Record<string, string> = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '\"': '&quot;', \"'\": '&#39;' };",
+    'const esc = (value: EmailTemplateValue): string =>',
+    "  value == null ? '' : String(value).replace(/[&<>\"']/g, (ch) => HTML_ESCAPES[ch]);",
+    "const str = (value: EmailTemplateValue): string => (value == null ? '' : String(value));",
+  );
+
+  for (const template of templates) {
+    lines.push('', `export interface ${template.varsName} {`);
+    for (const variable of template.variables) {
+      lines.push(`  ${variable}${template.optional.has(variable) ? '?' : ''}: EmailTemplateValue;`);
+    }
+    lines.push(
+      '}',
+      '',
+      `export const ${template.exportName} = {`,
+      `  assets: [${template.assets.map(quote).join(', ')}],`,
+      `  html: (v: ${template.varsName}): string =>`,
+      `    ${template.htmlExpr},`,
+    );
+    if (template.textExpr) {
+      lines.push(`  text: (v: ${template.varsName}): string =>`, `    ${template.textExpr},`);
+    }
+    lines.push('};');
+  }
+  return `${lines.join('\n')}\n`;
+}
+
+export function compileAll(templateDir = TEMPLATE_DIR, assetDir = ASSET_DIR) {
+  const resolver = createAssetResolver(assetDir);
+  const partialCache = new Map();
+  const loadPartial = (name) => {
+    if (!partialCache.has(name)) {
+      const file = path.join(templateDir, 'partials', `${name}.html`);
+      if (!existsSync(file)) throw new Error(`Email partial not found: ${path.relative(ROOT, file)}`);
+      partialCache.set(name, readFileSync(file, 'utf-8'));
+    }
+    return partialCache.get(name);
+  };
+
+  const templates = readdirSync(templateDir)
+    .filter((file) => file.endsWith('.html'))
+    .sort()
+    .map((file) => {
+      const name = path.basename(file, '.html');
+      const textFile = path.join(templateDir, `${name}.txt`);
+      return compileTemplate({
+        name,
+        html: readFileSync(path.join(templateDir, file), 'utf-8'),
+        text: existsSync(textFile) ? readFileSync(textFile, 'utf-8') : null,
+        loadPartial,
+        resolveAsset: resolver.resolve,
+      });
+    });
+
+  const assets = [...resolver.assets.values()];
+  return { templates, assets, source: renderModule(templates, assets) };
+}
+
+/** Renders each template with placeholder values and returns µs per html+text render */
+export function measureRender(template, iterations = RENDER_ITERATIONS) {
+  const vars = Object.fromEntries(template.variables.map((name) => [name, `${name} <sample> & 'value'`]));
+  const html = new Function('v', 'esc', 'str', `return ${template.htmlExpr};`);
+  const text = template.textExpr ? new Function('v', 'esc', 'str', `return ${template.textExpr};`) : () => '';
+  let sink = 0;
+  for (let i = 0; i < 1000; i++) sink += html(vars, esc, str).length + text(vars, esc, str).length;
+  const start = performance.now();
+  for (let i = 0; i < iterations; i++) sink += html(vars, esc, str).length + text(vars, esc, str).length;
+  const elapsed = performance.now() - start;
+  return { microsPerRender: (elapsed * 1000) / iterations, sink };
+}
+
+const formatBytes = (bytes) => `${bytes.toLocaleString('en-US')} B`;
+
+function printStats(templates, assets) {
+  const rows = templates.map((template) => {
+    const { microsPerRender } = measureRender(template);
+    return [
+      template.name,
+      formatBytes(template.sourceBytes),
+      formatBytes(template.htmlBytes),
+      `${(100 * (1 - template.htmlBytes / template.sourceBytes)).toFixed(1)}%`,
+      formatBytes(template.textBytes),
+      `${microsPerRender.toFixed(2)} µs`,
+    ];
+  });
+  const header = ['template', 'source', 'html', 'saved', 'text', 'render'];
+  const widths = header.map((title, column) => Math.max(title.length, ...rows.map((row) => row[column].length)));
+  const format = (row) => row.map((cell, column) => (column === 0 ? cell.padEnd(widths[column]) : cell.padStart(widths[column]))).join('  ');
+  console.log(format(header));
+  rows.forEach((row) => console.log(format(row)));
+  for (const asset of assets) {
+    console.log(`asset ${asset.filename} (${asset.contentType}, ${formatBytes(asset.bytes)}) inlined once as cid:${asset.cid}`);
+  }
+}
+
+function main(argv) {
+  const check = argv.includes('--check');
+  const { templates, assets, source } = compileAll();
+  printStats(templates, assets);
+
+  const relativeOutput = path.relative(ROOT, OUTPUT_FILE);
+  const current = existsSync(OUTPUT_FILE) ? readFileSync(OUTPUT_FILE, 'utf-8') : null;
+  if (check) {
+    if (current !== source) {
+      console.error(`${relativeOutput} is out of date; run npm run build:emails`);
+      process.exit(1);
+    }
+    console.log(`${relativeOutput} is up to date (${templates.length} templates)`);
+    return;
+  }
+  if (current !== source) writeFileSync(OUTPUT_FILE, source);
+  console.log(`${current === source ? 'Unchanged' : 'Wrote'} ${relativeOutput} (${templates.length} templates, ${formatBytes(Buffer.byteLength(source))})`);
+}
+
+if (process.argv[1] && import.meta.url === pathToFileURL(process.argv[1]).href) {
+  try {
+    main(process.argv.slice(2));
+  } catch (error) {
+    console.error(error instanceof Error ? error.message : error);
+    process.exit(1);
+  }
+}
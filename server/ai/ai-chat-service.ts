@@ -6,11 +6,13 @@
  */
 
 import OpenAI from 'openai';
-import type { ChatCompletionMessageParam, ChatCompletionTool } from 'openai/resources/chat/completions';
+import type { ChatCompletion, ChatCompletionMessageParam, ChatCompletionTool } from 'openai/resources/chat/completions';
 
 import { loadEnv } from '../../shared/env';
 import { logger } from '../lib/logger';
 import { aiInsightsService } from './ai-insights-service';
+import { AiResponseCache, createAiResponseCache, type AiResponseCacheStats } from './ai-response-cache';
+import { createConversationStore, trimConversation, type ConversationStore } from './conversation-store';
 
 // Initialize OpenAI client
 const env = loadEnv(process.env);
@@ -29,6 +31,20 @@ export interface ChatResponse {
     functionCalls?: Array<{ name: string; result: unknown }>;
 }
 
+/** The slice of the OpenAI SDK the chat service uses; lets a fake client stand in. */
+export type ChatCompletionClient = Pick<OpenAI, 'chat'>;
+
+export type ToolRunner = (storeId: string, functionName: string, args: Record<string, unknown>) => Promise<unknown>;
+
+export interface AiChatServiceOptions {
+    client?: ChatCompletionClient | null;
+    conversations?: ConversationStore;
+    cache?: AiResponseCache;
+    toolRunner?: ToolRunner;
+}
+
+const CHAT_MODEL = 'gpt-4o-mini';
+
 // System prompt for the AI
 const SYSTEM_PROMPT = `You are an AI Profit Advisor for a retail store management system called ChainSync. Your role is to help store owners and managers understand their profitability, inventory, and sales data.
 
@@ -126,17 +142,56 @@ const CHAT_FUNCTIONS: ChatCompletionTool[] = [
     }
 ];
 
-// Conversation storage (in-memory, per-session)
-const conversationHistory = new Map<string, ChatCompletionMessageParam[]>();
-
 export class AiChatService {
-    private readonly maxHistoryLength = 20;
+    private readonly client: ChatCompletionClient | null;
+    private readonly conversations: ConversationStore;
+    private readonly cache: AiResponseCache;
+    private readonly toolRunner: ToolRunner;
+
+    constructor(options: AiChatServiceOptions = {}) {
+        this.client = options.client !== undefined ? options.client : openai;
+        this.conversations = options.conversations ?? createConversationStore();
+        this.cache = options.cache ?? createAiResponseCache();
+        this.toolRunner = options.toolRunner ?? ((storeId, functionName, args) => this.runTool(storeId, functionName, args));
+    }
 
     /**
      * Check if OpenAI is configured
      */
     isAvailable(): boolean {
-        return openai !== null;
+        return this.client !== null;
+    }
+
+    /**
+     * Tool-result and response cache hit/miss counters
+     */
+    getCacheStats(): AiResponseCacheStats {
+        return this.cache.getStats();
+    }
+
+    /**
+     * Non-streaming completion, served from the exact-prompt cache when enabled
+     */
+    private async createCompletion(
+        client: ChatCompletionClient,
+        storeId: string,
+        messages: ChatCompletionMessageParam[]
+    ): Promise<ChatCompletion> {
+        const request = {
+            model: CHAT_MODEL,
+            messages,
+            tools: CHAT_FUNCTIONS,
+            tool_choice: 'auto' as const,
+            max_tokens: 1000,
+            temperature: 0.7,
+        };
+        const key = await this.cache.responseKey(storeId, request);
+        const cached = this.cache.getResponse<ChatCompletion>(key);
+        if (cached) return cached;
+
+        const response = await client.chat.completions.create(request);
+        this.cache.setResponse(key, response);
+        return response;
     }
 
     /**
@@ -147,7 +202,8 @@ export class AiChatService {
         userId: string,
         message: string
     ): Promise<ChatResponse> {
-        if (!openai) {
+        const client = this.client;
+        if (!client) {
             return {
                 message: 'AI Chat is not available. Please configure OPENAI_API_KEY in your environment.'
             };
@@ -156,7 +212,7 @@ export class AiChatService {
         const sessionKey = `${userId}-${storeId}`;
 
         // Get or initialize conversation history
-        let history = conversationHistory.get(sessionKey) || [];
+        const history = await this.conversations.get(sessionKey);
 
         // Add system prompt if new conversation
         if (history.length === 0) {
@@ -168,14 +224,7 @@ export class AiChatService {
 
         try {
             // Initial API call
-            let response = await openai.chat.completions.create({
-                model: 'gpt-4o-mini',
-                messages: history,
-                tools: CHAT_FUNCTIONS,
-                tool_choice: 'auto',
-                max_tokens: 1000,
-                temperature: 0.7,
-            });
+            let response = await this.createCompletion(client, storeId, history);
 
             let assistantMessage = response.choices[0].message;
             const functionCalls: Array<{ name: string; result: unknown }> = [];
@@ -213,14 +262,7 @@ export class AiChatService {
                 }
 
                 // Get next response with function results
-                response = await openai.chat.completions.create({
-                    model: 'gpt-4o-mini',
-                    messages: history,
-                    tools: CHAT_FUNCTIONS,
-                    tool_choice: 'auto',
-                    max_tokens: 1000,
-                    temperature: 0.7,
-                });
+                response = await this.createCompletion(client, storeId, history);
 
                 assistantMessage = response.choices[0].message;
             }
@@ -229,15 +271,8 @@ export class AiChatService {
             const finalContent = assistantMessage.content || 'I apologize, but I could not generate a response.';
             history.push({ role: 'assistant', content: finalContent });
 
-            // Trim history if too long
-            if (history.length > this.maxHistoryLength) {
-                // Keep system prompt and recent messages
-                const systemPrompt = history[0];
-                history = [systemPrompt, ...history.slice(-(this.maxHistoryLength - 1))];
-            }
-
-            // Save updated history
-            conversationHistory.set(sessionKey, history);
+            // Save updated history, trimmed to the message/byte/token budget
+            await this.conversations.set(sessionKey, trimConversation(history));
 
             return {
                 message: finalContent,
@@ -268,13 +303,14 @@ export class AiChatService {
         userId: string,
         message: string
     ): AsyncGenerator<string, void, unknown> {
-        if (!openai) {
+        const client = this.client;
+        if (!client) {
             yield 'AI Chat is not available. Please configure OPENAI_API_KEY in your environment.';
             return;
         }
 
         const sessionKey = `${userId}-${storeId}`;
-        let history = conversationHistory.get(sessionKey) || [];
+        const history = await this.conversations.get(sessionKey);
 
         if (history.length === 0) {
             history.push({ role: 'system', content: SYSTEM_PROMPT });
@@ -284,14 +320,7 @@ export class AiChatService {
 
         try {
             // First, check if we need function calls (non-streaming)
-            const initialResponse = await openai.chat.completions.create({
-                model: 'gpt-4o-mini',
-                messages: history,
-                tools: CHAT_FUNCTIONS,
-                tool_choice: 'auto',
-                max_tokens: 1000,
-                temperature: 0.7,
-            });
+            const initialResponse = await this.createCompletion(client, storeId, history);
 
             let assistantMessage = initialResponse.choices[0].message;
 
@@ -314,46 +343,43 @@ export class AiChatService {
                     });
                 }
 
-                const nextResponse = await openai.chat.completions.create({
-                    model: 'gpt-4o-mini',
-                    messages: history,
-                    tools: CHAT_FUNCTIONS,
-                    tool_choice: 'auto',
-                    max_tokens: 1000,
-                    temperature: 0.7,
-                });
+                const nextResponse = await this.createCompletion(client, storeId, history);
 
                 assistantMessage = nextResponse.choices[0].message;
             }
 
-            // Now stream the final response
-            const stream = await openai.chat.completions.create({
-                model: 'gpt-4o-mini',
-                messages: history,
-                max_tokens: 1000,
-                temperature: 0.7,
-                stream: true,
-            });
+            // Now stream the final response (or replay it from the exact-prompt cache)
+            const streamKey = await this.cache.responseKey(storeId, { model: CHAT_MODEL, messages: history, stream: true });
+            const cachedContent = this.cache.getResponse<string>(streamKey);
 
             let fullContent = '';
 
-            for await (const chunk of stream) {
-                const content = chunk.choices[0]?.delta?.content || '';
-                if (content) {
-                    fullContent += content;
-                    yield content;
+            if (cachedContent !== undefined) {
+                fullContent = cachedContent;
+                yield cachedContent;
+            } else {
+                const stream = await client.chat.completions.create({
+                    model: CHAT_MODEL,
+                    messages: history,
+                    max_tokens: 1000,
+                    temperature: 0.7,
+                    stream: true,
+                });
+
+                for await (const chunk of stream) {
+                    const content = chunk.choices[0]?.delta?.content || '';
+                    if (content) {
+                        fullContent += content;
+                        yield content;
+                    }
                 }
+                this.cache.setResponse(streamKey, fullContent);
             }
 
             // Save to history
             history.push({ role: 'assistant', content: fullContent });
 
-            if (history.length > this.maxHistoryLength) {
-                const systemPrompt = history[0];
-                history = [systemPrompt, ...history.slice(-(this.maxHistoryLength - 1))];
-            }
-
-            conversationHistory.set(sessionKey, history);
+            await this.conversations.set(sessionKey, trimConversation(history));
 
         } catch (error) {
             logger.error('AI Chat stream error', { storeId, userId }, error as Error);
@@ -362,7 +388,8 @@ export class AiChatService {
     }
 
     /**
-     * Execute a function call and return results
+     * Execute a function call and return results, reusing cached results while
+     * the store's data watermark is unchanged
      */
     private async executeFunction(
         storeId: string,
@@ -370,88 +397,101 @@ export class AiChatService {
         args: Record<string, unknown>
     ): Promise<unknown> {
         try {
-            switch (functionName) {
-                case 'getProductProfitability': {
-                    const productName = args.productName as string;
-                    const allProducts = await aiInsightsService.computeProductProfitability(storeId);
-                    const matches = allProducts.filter(p =>
-                        p.productName.toLowerCase().includes(productName.toLowerCase())
-                    );
-                    return matches.length > 0
-                        ? matches.slice(0, 5)
-                        : { message: `No products found matching "${productName}"` };
-                }
-
-                case 'getTopProducts': {
-                    const type = args.type as 'top' | 'bottom';
-                    const limit = (args.limit as number) || 5;
-                    const allProducts = await aiInsightsService.computeProductProfitability(storeId);
-
-                    const sorted = [...allProducts].sort((a, b) =>
-                        type === 'top'
-                            ? b.totalProfit - a.totalProfit
-                            : a.totalProfit - b.totalProfit
-                    );
+            return await this.cache.getOrComputeTool(storeId, functionName, args, () =>
+                this.toolRunner(storeId, functionName, args)
+            );
+        } catch (error) {
+            logger.error('Function execution error', { functionName, storeId }, error as Error);
+            return { error: 'Failed to retrieve data' };
+        }
+    }
 
-                    return sorted.slice(0, limit).map(p => ({
-                        name: p.productName,
-                        profit: p.totalProfit,
-                        margin: p.profitMargin,
-                        unitsSold: p.unitsSold,
-                        stockLoss: p.stockLossAmount,
-                        refunds: p.refundedAmount,
-                        trend: p.trend
-                    }));
-                }
+    /**
+     * Run a tool against the insights service
+     */
+    private async runTool(
+        storeId: string,
+        functionName: string,
+        args: Record<string, unknown>
+    ): Promise<unknown> {
+        switch (functionName) {
+            case 'getProductProfitability': {
+                const productName = args.productName as string;
+                const allProducts = await aiInsightsService.computeProductProfitability(storeId);
+                const matches = allProducts.filter(p =>
+                    p.productName.toLowerCase().includes(productName.toLowerCase())
+                );
+                return matches.length > 0
+                    ? matches.slice(0, 5)
+                    : { message: `No products found matching "${productName}"` };
+            }
 
-                case 'getRestockingPriority': {
-                    const limit = (args.limit as number) || 10;
-                    const priorities = await aiInsightsService.getRestockingPriority(storeId, limit);
-                    return priorities.map(p => ({
-                        name: p.productName,
-                        currentStock: p.currentStock,
-                        daysToStockout: p.daysToStockout,
-                        priorityScore: p.priorityScore,
-                        recommendation: p.recommendation
-                    }));
-                }
+            case 'getTopProducts': {
+                const type = args.type as 'top' | 'bottom';
+                const limit = (args.limit as number) || 5;
+                const allProducts = await aiInsightsService.computeProductProfitability(storeId);
+
+                const sorted = [...allProducts].sort((a, b) =>
+                    type === 'top'
+                        ? b.totalProfit - a.totalProfit
+                        : a.totalProfit - b.totalProfit
+                );
+
+                return sorted.slice(0, limit).map(p => ({
+                    name: p.productName,
+                    profit: p.totalProfit,
+                    margin: p.profitMargin,
+                    unitsSold: p.unitsSold,
+                    stockLoss: p.stockLossAmount,
+                    refunds: p.refundedAmount,
+                    trend: p.trend
+                }));
+            }
 
-                case 'getInsights': {
-                    const filterType = args.type as string | undefined;
-                    const insights = await aiInsightsService.getInsightsForStore(storeId);
-
-                    let filtered = insights;
-                    if (filterType === 'critical') {
-                        filtered = insights.filter(i => i.severity === 'critical');
-                    } else if (filterType === 'warnings') {
-                        filtered = insights.filter(i => i.severity === 'warning');
-                    } else if (filterType === 'actionable') {
-                        filtered = insights.filter(i => i.isActionable);
-                    }
+            case 'getRestockingPriority': {
+                const limit = (args.limit as number) || 10;
+                const priorities = await aiInsightsService.getRestockingPriority(storeId, limit);
+                return priorities.map(p => ({
+                    name: p.productName,
+                    currentStock: p.currentStock,
+                    daysToStockout: p.daysToStockout,
+                    priorityScore: p.priorityScore,
+                    recommendation: p.recommendation
+                }));
+            }
 
-                    return filtered.slice(0, 10).map(i => ({
-                        type: i.insightType,
-                        title: i.title,
-                        description: i.description,
-                        severity: i.severity
-                    }));
+            case 'getInsights': {
+                const filterType = args.type as string | undefined;
+                const insights = await aiInsightsService.getInsightsForStore(storeId);
+
+                let filtered = insights;
+                if (filterType === 'critical') {
+                    filtered = insights.filter(i => i.severity === 'critical');
+                } else if (filterType === 'warnings') {
+                    filtered = insights.filter(i => i.severity === 'warning');
+                } else if (filterType === 'actionable') {
+                    filtered = insights.filter(i => i.isActionable);
                 }
 
-                default:
-                    return { error: `Unknown function: ${functionName}` };
+                return filtered.slice(0, 10).map(i => ({
+                    type: i.insightType,
+                    title: i.title,
+                    description: i.description,
+                    severity: i.severity
+                }));
             }
-        } catch (error) {
-            logger.error('Function execution error', { functionName, storeId }, error as Error);
-            return { error: 'Failed to retrieve data' };
+
+            default:
+                return { error: `Unknown function: ${functionName}` };
         }
     }
 
     /**
      * Get conversation history for a session
      */
-    getHistory(userId: string, storeId: string): ChatMessage[] {
+    async getHistory(userId: string, storeId: string): Promise<ChatMessage[]> {
         const sessionKey = `${userId}-${storeId}`;
-        const history = conversationHistory.get(sessionKey) || [];
+        const history = await this.conversations.get(sessionKey);
 
         return history
             .filter(m => m.role === 'user' || m.role === 'assistant')
@@ -464,9 +504,9 @@ export class AiChatService {
     /**
      * Clear conversation history
      */
-    clearHistory(userId: string, storeId: string): void {
+    async clearHistory(userId: string, storeId: string): Promise<void> {
         const sessionKey = `${userId}-${storeId}`;
-        conversationHistory.delete(sessionKey);
+        await this.conversations.delete(sessionKey);
     }
 }
 
@@ -5,7 +5,7 @@
  * to help stores maximize profits.
  */
 
-import { eq, and, gte, sql, desc, inArray } from 'drizzle-orm';
+import { eq, and, gte, lt, sql, desc, inArray, notInArray, type SQL } from 'drizzle-orm';
 
 import {
     products,
@@ -15,6 +15,8 @@ import {
     transactions,
     aiInsights,
     aiProductProfitability,
+    aiProductDailyStats,
+    aiRemovalDailyStats,
     inventoryRevaluationEvents,
     type AiInsight,
     type AiProductProfitability,
@@ -84,9 +86,30 @@ export interface InsightGenerationResult {
     storeId: string;
     insightsGenerated: number;
     profitabilitiesComputed: number;
+    /** Daily rollup rows rebuilt from raw transactions and stock movements */
+    rowsProcessed: number;
+    /** Watermark to record for the next incremental scan; null when the scan failed */
+    watermarkAt: Date | null;
     errors: string[];
 }
 
+export interface InsightScanOptions {
+    /** Watermark of the previous completed scan; null rebuilds the whole analysis window */
+    since?: Date | null;
+    /** Scan time, recorded as the next watermark */
+    until?: Date;
+}
+
+// A row's write time is its transaction's start, so it can commit slightly
+// behind the previous watermark; changed rows are collected from this far before it
+const WATERMARK_OVERLAP_MS = Number(process.env.AI_INSIGHT_WATERMARK_OVERLAP_MS ?? 15 * 60 * 1000);
+
+const ONE_DAY_MS = 24 * 60 * 60 * 1000;
+
+const toDay = (date: Date): string => date.toISOString().slice(0, 10);
+
+const startOfUtcDay = (date: Date): Date => new Date(`${toDay(date)}T00:00:00.000Z`);
+
 // Helper to parse numeric values safely
 const parseNumeric = (value: unknown, defaultValue = 0): number => {
     if (value === null || value === undefined) return defaultValue;
@@ -98,35 +121,36 @@ export class AiInsightsService {
     private readonly periodDays = 90; // Default analysis period
 
     /**
-     * Generate all insights for a store (main entry point for batch processing)
+     * Generate all insights for a store (main entry point for batch processing).
+     * Only activity since `options.since` is rescanned; the 90-day aggregates are
+     * then read back from the daily rollups.
      */
-    async generateInsightsForStore(storeId: string): Promise<InsightGenerationResult> {
+    async generateInsightsForStore(storeId: string, options: InsightScanOptions = {}): Promise<InsightGenerationResult> {
+        const until = options.until ?? new Date();
         const result: InsightGenerationResult = {
             storeId,
             insightsGenerated: 0,
             profitabilitiesComputed: 0,
+            rowsProcessed: 0,
+            watermarkAt: null,
             errors: [],
         };
 
         try {
-            logger.info('Starting AI insight generation', { storeId });
+            logger.info('Starting AI insight generation', { storeId, since: options.since ?? null });
 
-            // Clear old insights for this store (keep dismissed ones)
-            await db.delete(aiInsights)
-                .where(and(
-                    eq(aiInsights.storeId, storeId),
-                    eq(aiInsights.isDismissed, false)
-                ));
+            // 1. Fold new transactions and stock movements into the daily rollups
+            result.rowsProcessed = await this.refreshDailyStats(storeId, options.since ?? null, until);
 
-            // 1. Compute product profitability
-            const profitabilities = await this.computeProductProfitability(storeId);
+            // 2. Compute product profitability
+            const profitabilities = await this.computeProfitabilityFromDailyStats(storeId, until);
             result.profitabilitiesComputed = profitabilities.length;
 
             // Store profitability data in cache table
             await this.saveProfitabilityData(storeId, profitabilities);
 
-            // 2. Detect removal patterns
-            const removalPatterns = await this.detectRemovalPatterns(storeId);
+            // 3. Detect removal patterns
+            const removalPatterns = await this.detectRemovalPatternsFromDailyStats(storeId, until);
 
             // 3. Generate insights from patterns
             const insights: Omit<AiInsight, 'id' | 'createdAt'>[] = [];
@@ -262,15 +286,25 @@ export class AiInsightsService {
                 }
             }
 
-            // Insert all insights
-            if (insights.length > 0) {
-                await db.insert(aiInsights).values(insights as any[]);
-            }
+            // Replace old insights for this store (keep dismissed ones)
+            await db.transaction(async (tx) => {
+                await tx.delete(aiInsights)
+                    .where(and(
+                        eq(aiInsights.storeId, storeId),
+                        eq(aiInsights.isDismissed, false)
+                    ));
+                if (insights.length > 0) {
+                    await tx.insert(aiInsights).values(insights as any[]);
+                }
+            });
+
+            result.watermarkAt = until;
 
             logger.info('AI insight generation completed', {
                 storeId,
                 insightsGenerated: result.insightsGenerated,
                 profitabilitiesComputed: result.profitabilitiesComputed,
+                rowsProcessed: result.rowsProcessed,
             });
 
         } catch (error) {
@@ -395,95 +429,360 @@ export class AiInsightsService {
 
             const recentSalesMap = new Map(recentSalesData.map(s => [s.productId, parseNumeric(s.quantity)]));
 
-            const results: ProductProfitabilityData[] = [];
-
-            // Process each product
-            for (const row of salesData.rows as any[]) {
-                const productId = row.product_id;
-                const productName = row.product_name;
-
-                // Base Metrics from SQL
-                const unitsSold = Number(row.units_sold);
-                const grossRevenue = Number(row.gross_revenue);  // Tax-inclusive (subtotal + tax)
-                const salesTax = Number(row.sales_tax);
-                const cogs = Number(row.cogs);
-                const unitsRefunded = Number(row.units_refunded);
-                const refundGross = Number(row.refund_gross);    // Tax-inclusive (subtotal + tax)
-                const refundTax = Number(row.refund_tax);
-                const refundCogs = Number(row.refund_cogs);
-
-                const stockLoss = lossMap.get(productId) || 0;
-                const promotionLoss = Number(row.promo_loss || 0);
-
-                // Corrected Profit Calculation (matching comprehensive report):
-                // Net Revenue = (Gross Revenue - Sales Tax) - (Refund Gross - Refund Tax)
-                //             = subtotal_sales - refund_subtotal
-                // Net COGS = Sales COGS - Refund COGS
-                // Net Profit = Net Revenue - Net COGS - Stock Loss - Promotion Loss
-                const netSalesExTax = grossRevenue - salesTax;        // = subtotal_sales
-                const netRefundsExTax = refundGross - refundTax;      // = refund_subtotal
-                const netRevenue = netSalesExTax - netRefundsExTax;
-                const netCost = cogs - refundCogs;
-                const totalProfit = netRevenue - netCost - stockLoss - promotionLoss;
-
-                const profitMargin = netRevenue > 0 ? (totalProfit / netRevenue) : 0;
-                // Adj Units = Sold - Refunded
-                const netUnits = Math.max(0, unitsSold - unitsRefunded);
-                const avgProfitPerUnit = netUnits > 0 ? (totalProfit / netUnits) : 0;
-
-                const inv = inventoryMap.get(productId);
-                const currentStock = inv ? parseNumeric(inv.quantity) : 0;
-                const saleVelocity = unitsSold / this.periodDays;
-                const daysToStockout = saleVelocity > 0 ? Math.floor(currentStock / saleVelocity) : null;
-
-                // Trend
-                const recentSales = recentSalesMap.get(productId) || 0;
-                const earlierSales = unitsSold - recentSales;
-                const halfPeriod = Math.floor(this.periodDays / 2);
-                const recentVelocity = recentSales / halfPeriod;
-                const earlierVelocity = earlierSales / halfPeriod;
-
-                let trend: 'increasing' | 'decreasing' | 'stable' = 'stable';
-                if (earlierVelocity > 0) {
-                    const changePercent = (recentVelocity - earlierVelocity) / earlierVelocity;
-                    if (changePercent > 0.15) trend = 'increasing';
-                    else if (changePercent < -0.15) trend = 'decreasing';
-                }
-
-                const minStockLevel = inv ? parseNumeric(inv.minStockLevel) : 0;
-
-                results.push({
-                    productId,
-                    productName,
-                    unitsSold,
-                    grossRevenue,
-                    netRevenue,
-                    totalTax: salesTax,
-                    totalCost: cogs,
-                    netCost,
-                    refundedAmount: refundGross,
-                    refundedTax: refundTax,
-                    refundedQuantity: unitsRefunded,
-                    stockLossAmount: stockLoss,
-                    promotionLoss,
-                    totalProfit,
-                    profitMargin,
-                    avgProfitPerUnit,
-                    currentStock,
-                    saleVelocity,
-                    daysToStockout,
-                    trend,
-                    minStockLevel,
-                });
-            }
-
-            return results.sort((a, b) => b.totalProfit - a.totalProfit);
+            return this.buildProfitability(salesData.rows as any[], lossMap, inventoryMap, recentSalesMap);
         } catch (error) {
             logger.error('Failed to compute product profitability', { storeId }, error as Error);
             return [];
         }
     }
 
+    /**
+     * Turn per-product sales/refund sums into profitability figures. Shared by the
+     * live query and the daily-rollup path so both report identical numbers.
+     */
+    private buildProfitability(
+        rows: any[],
+        lossMap: Map<string, number>,
+        inventoryMap: Map<string, { quantity: unknown; minStockLevel: unknown }>,
+        recentSalesMap: Map<string, number>
+    ): ProductProfitabilityData[] {
+        const results: ProductProfitabilityData[] = [];
+
+        // Process each product
+        for (const row of rows) {
+            const productId = row.product_id;
+            const productName = row.product_name;
+
+            // Base Metrics from SQL
+            const unitsSold = Number(row.units_sold);
+            const grossRevenue = Number(row.gross_revenue);  // Tax-inclusive (subtotal + tax)
+            const salesTax = Number(row.sales_tax);
+            const cogs = Number(row.cogs);
+            const unitsRefunded = Number(row.units_refunded);
+            const refundGross = Number(row.refund_gross);    // Tax-inclusive (subtotal + tax)
+            const refundTax = Number(row.refund_tax);
+            const refundCogs = Number(row.refund_cogs);
+
+            const stockLoss = lossMap.get(productId) || 0;
+            const promotionLoss = Number(row.promo_loss || 0);
+
+            // Corrected Profit Calculation (matching comprehensive report):
+            // Net Revenue = (Gross Revenue - Sales Tax) - (Refund Gross - Refund Tax)
+            //             = subtotal_sales - refund_subtotal
+            // Net COGS = Sales COGS - Refund COGS
+            // Net Profit = Net Revenue - Net COGS - Stock Loss - Promotion Loss
+            const netSalesExTax = grossRevenue - salesTax;        // = subtotal_sales
+            const netRefundsExTax = refundGross - refundTax;      // = refund_subtotal
+            const netRevenue = netSalesExTax - netRefundsExTax;
+            const netCost = cogs - refundCogs;
+            const totalProfit = netRevenue - netCost - stockLoss - promotionLoss;
+
+            const profitMargin = netRevenue > 0 ? (totalProfit / netRevenue) : 0;
+            // Adj Units = Sold - Refunded
+            const netUnits = Math.max(0, unitsSold - unitsRefunded);
+            const avgProfitPerUnit = netUnits > 0 ? (totalProfit / netUnits) : 0;
+
+            const inv = inventoryMap.get(productId);
+            const currentStock = inv ? parseNumeric(inv.quantity) : 0;
+            const saleVelocity = unitsSold / this.periodDays;
+            const daysToStockout = saleVelocity > 0 ? Math.floor(currentStock / saleVelocity) : null;
+
+            // Trend
+            const recentSales = recentSalesMap.get(productId) || 0;
+            const earlierSales = unitsSold - recentSales;
+            const halfPeriod = Math.floor(this.periodDays / 2);
+            const recentVelocity = recentSales / halfPeriod;
+            const earlierVelocity = earlierSales / halfPeriod;
+
+            let trend: 'increasing' | 'decreasing' | 'stable' = 'stable';
+            if (earlierVelocity > 0) {
+                const changePercent = (recentVelocity - earlierVelocity) / earlierVelocity;
+                if (changePercent > 0.15) trend = 'increasing';
+                else if (changePercent < -0.15) trend = 'decreasing';
+            }
+
+            const minStockLevel = inv ? parseNumeric(inv.minStockLevel) : 0;
+
+            results.push({
+                productId,
+                productName,
+                unitsSold,
+                grossRevenue,
+                netRevenue,
+                totalTax: salesTax,
+                totalCost: cogs,
+                netCost,
+                refundedAmount: refundGross,
+                refundedTax: refundTax,
+                refundedQuantity: unitsRefunded,
+                stockLossAmount: stockLoss,
+                promotionLoss,
+                totalProfit,
+                profitMargin,
+                avgProfitPerUnit,
+                currentStock,
+                saleVelocity,
+                daysToStockout,
+                trend,
+                minStockLevel,
+            });
+        }
+
+        return results.sort((a, b) => b.totalProfit - a.totalProfit);
+    }
+
+    /**
+     * Days in the analysis window touched by rows written since `changedSince`,
+     * whatever their business date: offline-synced and back-dated sales land on
+     * days an earlier scan already passed.
+     */
+    private async changedDays(storeId: string, changedSince: Date, windowStartDay: string): Promise<string[]> {
+        const result = await db.execute(sql`
+            SELECT to_char(d.day, 'YYYY-MM-DD') AS day
+            FROM (
+                SELECT (created_at AT TIME ZONE 'UTC')::date AS day
+                FROM ${transactions}
+                WHERE store_id = ${storeId} AND changed_at >= ${changedSince}
+                UNION
+                SELECT (occurred_at AT TIME ZONE 'UTC')::date
+                FROM ${inventoryRevaluationEvents}
+                WHERE store_id = ${storeId} AND recorded_at >= ${changedSince}
+                UNION
+                SELECT (occurred_at AT TIME ZONE 'UTC')::date
+                FROM ${stockMovements}
+                WHERE store_id = ${storeId} AND recorded_at >= ${changedSince}
+            ) d
+            WHERE d.day >= ${windowStartDay}::date
+            ORDER BY d.day
+        `);
+        return (result.rows as any[]).map((row) => String(row.day));
+    }
+
+    /**
+     * Rebuild the store's daily rollups for the days touched since the
+     * watermark, or the whole analysis window when there is none. Whole days are
+     * recomputed from source, so rescanning an overlap is idempotent. Returns the
+     * number of rollup rows written.
+     */
+    async refreshDailyStats(storeId: string, since: Date | null, until: Date): Promise<number> {
+        const windowStart = startOfUtcDay(new Date(until.getTime() - this.periodDays * ONE_DAY_MS));
+        const windowStartDay = toDay(windowStart);
+        const days = since
+            ? await this.changedDays(storeId, new Date(since.getTime() - WATERMARK_OVERLAP_MS), windowStartDay)
+            : null;
+        const from = days?.length ? new Date(`${days[0]}T00:00:00.000Z`) : windowStart;
+        // Source rows on the rebuilt days; the range bound keeps the date indexes usable
+        const onDays = (column: SQL) => days
+            ? sql`${column} >= ${from} AND (${column} AT TIME ZONE 'UTC')::date IN (${sql.join(days.map((day) => sql`${day}::date`), sql`, `)})`
+            : sql`${column} >= ${from}`;
+
+        return db.transaction(async (tx) => {
+            // Days that slid out of the analysis window are no longer needed
+            await tx.delete(aiProductDailyStats)
+                .where(and(eq(aiProductDailyStats.storeId, storeId), lt(aiProductDailyStats.day, windowStartDay)));
+            await tx.delete(aiRemovalDailyStats)
+                .where(and(eq(aiRemovalDailyStats.storeId, storeId), lt(aiRemovalDailyStats.day, windowStartDay)));
+            if (days && days.length === 0) {
+                return 0;
+            }
+
+            await tx.delete(aiProductDailyStats)
+                .where(and(
+                    eq(aiProductDailyStats.storeId, storeId),
+                    days ? inArray(aiProductDailyStats.day, days) : gte(aiProductDailyStats.day, windowStartDay),
+                ));
+            await tx.delete(aiRemovalDailyStats)
+                .where(and(
+                    eq(aiRemovalDailyStats.storeId, storeId),
+                    days ? inArray(aiRemovalDailyStats.day, days) : gte(aiRemovalDailyStats.day, windowStartDay),
+                ));
+
+            // Same tax allocation as computeProductProfitability, bucketed by UTC day
+            const sales = await tx.execute(sql`
+                INSERT INTO ${aiProductDailyStats} (
+                    store_id, product_id, day, units_sold, sales_subtotal, sales_tax, cogs, promotion_loss,
+                    units_refunded, refund_subtotal, refund_tax, refund_cogs
+                )
+                SELECT
+                    ${storeId},
+                    x.product_id,
+                    x.day,
+                    COALESCE(SUM(CASE WHEN x.kind = 'SALE' THEN x.quantity ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind = 'SALE' THEN x.total_price ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind = 'SALE' THEN x.item_tax ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind = 'SALE' THEN x.total_cost ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind = 'SALE' THEN x.promo_loss ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind IN ('REFUND', 'SWAP_REFUND') THEN x.quantity ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind IN ('REFUND', 'SWAP_REFUND') THEN x.total_price ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind IN ('REFUND', 'SWAP_REFUND') THEN x.item_tax ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN x.kind IN ('REFUND', 'SWAP_REFUND') THEN x.total_cost ELSE 0 END), 0)
+                FROM (
+                    SELECT
+                        ti.product_id,
+                        (t.created_at AT TIME ZONE 'UTC')::date as day,
+                        t.kind,
+                        ti.quantity,
+                        ti.total_price,
+                        ti.total_cost,
+                        ti.promotion_discount as promo_loss,
+                        CASE
+                            WHEN COALESCE(t.subtotal, 0) > 0
+                            THEN (ti.total_price / t.subtotal) * COALESCE(t.tax_amount, 0)
+                            ELSE 0
+                        END as item_tax
+                    FROM ${transactionItems} ti
+                    JOIN ${transactions} t ON t.id = ti.transaction_id
+                    -- Items of since-deleted products cannot be rolled up (product_id is a foreign key)
+                    JOIN ${products} p ON p.id = ti.product_id
+                    WHERE t.store_id = ${storeId}
+                    AND t.status = 'completed'
+                    AND ${onDays(sql`t.created_at`)}
+                ) x
+                GROUP BY x.product_id, x.day
+            `);
+
+            const losses = await tx.execute(sql`
+                INSERT INTO ${aiProductDailyStats} (store_id, product_id, day, stock_loss)
+                SELECT
+                    ${storeId},
+                    product_id,
+                    (occurred_at AT TIME ZONE 'UTC')::date,
+                    COALESCE(SUM(CAST(metadata->>'lossAmount' AS NUMERIC)), 0)
+                FROM ${inventoryRevaluationEvents}
+                WHERE store_id = ${storeId}
+                AND ${onDays(sql`occurred_at`)}
+                AND (
+                    source LIKE 'stock_removal_%'
+                    OR source = 'pos_return_discard'
+                    OR source = 'discard'
+                )
+                GROUP BY product_id, (occurred_at AT TIME ZONE 'UTC')::date
+                ON CONFLICT (store_id, product_id, day) DO UPDATE SET stock_loss = EXCLUDED.stock_loss
+            `);
+
+            const removals = await tx.execute(sql`
+                INSERT INTO ${aiRemovalDailyStats} (store_id, product_id, day, reason, occurrences, units_lost, loss_value)
+                SELECT
+                    ${storeId},
+                    r.product_id,
+                    r.day,
+                    r.reason,
+                    COUNT(*),
+                    COALESCE(SUM(ABS(r.delta)), 0),
+                    COALESCE(SUM(r.loss_value), 0)
+                FROM (
+                    SELECT
+                        product_id,
+                        (occurred_at AT TIME ZONE 'UTC')::date as day,
+                        LEFT(COALESCE(metadata->>'reason', metadata->>'removalReason', 'other'), 64) as reason,
+                        delta,
+                        COALESCE(
+                            NULLIF(CAST(metadata->>'lossAmount' AS NUMERIC), 0),
+                            CAST(metadata->>'totalLoss' AS NUMERIC),
+                            0
+                        ) as loss_value
+                    FROM ${stockMovements}
+                    WHERE store_id = ${storeId}
+                    AND ${onDays(sql`occurred_at`)}
+                    AND action_type IN ('removal', 'discard_loss')
+                ) r
+                GROUP BY r.product_id, r.day, r.reason
+            `);
+
+            return (sales.rowCount ?? 0) + (losses.rowCount ?? 0) + (removals.rowCount ?? 0);
+        });
+    }
+
+    /**
+     * Product profitability over the analysis window, summed from the daily
+     * rollups rather than the raw transaction history
+     */
+    async computeProfitabilityFromDailyStats(storeId: string, asOf: Date = new Date()): Promise<ProductProfitabilityData[]> {
+        const lookbackDay = toDay(new Date(asOf.getTime() - this.periodDays * ONE_DAY_MS));
+        const halfPeriodDay = toDay(new Date(asOf.getTime() - Math.floor(this.periodDays / 2) * ONE_DAY_MS));
+
+        const salesData = await db.execute(sql`
+            SELECT
+                d.product_id,
+                p.name as product_name,
+                SUM(d.units_sold) as units_sold,
+                SUM(d.sales_tax) as sales_tax,
+                SUM(d.sales_subtotal + d.sales_tax) as gross_revenue,
+                SUM(d.cogs) as cogs,
+                SUM(d.promotion_loss) as promo_loss,
+                SUM(d.units_refunded) as units_refunded,
+                SUM(d.refund_tax) as refund_tax,
+                SUM(d.refund_subtotal + d.refund_tax) as refund_gross,
+                SUM(d.refund_cogs) as refund_cogs,
+                SUM(d.stock_loss) as stock_loss,
+                SUM(CASE WHEN d.day >= ${halfPeriodDay} THEN d.units_sold ELSE 0 END) as recent_units_sold,
+                -- Matches the live query, which only lists products with sales activity
+                BOOL_OR(d.units_sold <> 0 OR d.units_refunded <> 0 OR d.sales_subtotal <> 0 OR d.refund_subtotal <> 0) as has_sales
+            FROM ${aiProductDailyStats} d
+            JOIN ${products} p ON p.id = d.product_id
+            WHERE d.store_id = ${storeId}
+            AND d.day >= ${lookbackDay}
+            GROUP BY d.product_id, p.name
+        `);
+
+        const rows = (salesData.rows as any[]).filter(row => row.has_sales);
+        const lossMap = new Map<string, number>();
+        const recentSalesMap = new Map<string, number>();
+        for (const row of rows) {
+            lossMap.set(row.product_id, Math.max(0, parseNumeric(row.stock_loss)));
+            recentSalesMap.set(row.product_id, parseNumeric(row.recent_units_sold));
+        }
+
+        const inventoryData = await db
+            .select({
+                productId: inventory.productId,
+                quantity: inventory.quantity,
+                minStockLevel: inventory.minStockLevel,
+            })
+            .from(inventory)
+            .where(eq(inventory.storeId, storeId));
+
+        const inventoryMap = new Map(inventoryData.map(i => [i.productId, i]));
+
+        return this.buildProfitability(rows, lossMap, inventoryMap, recentSalesMap);
+    }
+
+    /**
+     * Removal patterns over the analysis window, read from the daily rollups
+     */
+    async detectRemovalPatternsFromDailyStats(storeId: string, asOf: Date = new Date()): Promise<RemovalPattern[]> {
+        const lookbackDay = toDay(new Date(asOf.getTime() - this.periodDays * ONE_DAY_MS));
+
+        const rows = await db
+            .select({
+                productId: aiRemovalDailyStats.productId,
+                productName: products.name,
+                reason: aiRemovalDailyStats.reason,
+                occurrences: sql<number>`SUM(${aiRemovalDailyStats.occurrences})`,
+                unitsLost: sql<number>`SUM(${aiRemovalDailyStats.unitsLost})`,
+                lossValue: sql<number>`SUM(${aiRemovalDailyStats.lossValue})`,
+            })
+            .from(aiRemovalDailyStats)
+            .innerJoin(products, eq(aiRemovalDailyStats.productId, products.id))
+            .where(and(
+                eq(aiRemovalDailyStats.storeId, storeId),
+                gte(aiRemovalDailyStats.day, lookbackDay)
+            ))
+            .groupBy(aiRemovalDailyStats.productId, products.name, aiRemovalDailyStats.reason);
+
+        return rows
+            .map(row => ({
+                productId: row.productId,
+                productName: row.productName || 'Unknown',
+                reason: row.reason,
+                occurrences: parseNumeric(row.occurrences),
+                totalUnitsLost: parseNumeric(row.unitsLost),
+                totalLossValue: parseNumeric(row.lossValue),
+                periodDays: this.periodDays,
+            }))
+            .sort((a, b) => b.occurrences - a.occurrences);
+    }
+
     /**
      * Detect patterns in stock removals (expired, damaged, theft, etc.)
      */
@@ -695,17 +994,16 @@ export class AiInsightsService {
      * Save profitability data to cache table for fast retrieval
      */
     private async saveProfitabilityData(storeId: string, data: ProductProfitabilityData[]): Promise<void> {
-        if (data.length === 0) return;
-
         try {
-            // Delete existing data for this store/period
-            await db.delete(aiProductProfitability)
-                .where(and(
-                    eq(aiProductProfitability.storeId, storeId),
-                    eq(aiProductProfitability.periodDays, this.periodDays)
-                ));
+            if (data.length === 0) {
+                await db.delete(aiProductProfitability)
+                    .where(and(
+                        eq(aiProductProfitability.storeId, storeId),
+                        eq(aiProductProfitability.periodDays, this.periodDays)
+                    ));
+                return;
+            }
 
-            // Insert new data
             const rows = data.map(p => ({
                 storeId,
                 productId: p.productId,
@@ -729,7 +1027,39 @@ export class AiInsightsService {
                 computedAt: new Date(),
             }));
 
-            await db.insert(aiProductProfitability).values(rows as any[]);
+            // Upsert current products, then drop products that left the window
+            await db.transaction(async (tx) => {
+                await tx.insert(aiProductProfitability)
+                    .values(rows as any[])
+                    .onConflictDoUpdate({
+                        target: [aiProductProfitability.storeId, aiProductProfitability.productId, aiProductProfitability.periodDays],
+                        set: {
+                            unitsSold: sql`excluded.units_sold`,
+                            totalRevenue: sql`excluded.total_revenue`,
+                            totalCost: sql`excluded.total_cost`,
+                            totalProfit: sql`excluded.total_profit`,
+                            profitMargin: sql`excluded.profit_margin`,
+                            avgProfitPerUnit: sql`excluded.avg_profit_per_unit`,
+                            refundedAmount: sql`excluded.refunded_amount`,
+                            refundedQuantity: sql`excluded.refunded_quantity`,
+                            netRevenue: sql`excluded.net_revenue`,
+                            grossRevenue: sql`excluded.gross_revenue`,
+                            netCost: sql`excluded.net_cost`,
+                            saleVelocity: sql`excluded.sale_velocity`,
+                            daysToStockout: sql`excluded.days_to_stockout`,
+                            removalCount: sql`excluded.removal_count`,
+                            removalLossValue: sql`excluded.removal_loss_value`,
+                            trend: sql`excluded.trend`,
+                            computedAt: sql`excluded.computed_at`,
+                        },
+                    });
+                await tx.delete(aiProductProfitability)
+                    .where(and(
+                        eq(aiProductProfitability.storeId, storeId),
+                        eq(aiProductProfitability.periodDays, this.periodDays),
+                        notInArray(aiProductProfitability.productId, rows.map(r => r.productId))
+                    ));
+            });
         } catch (error) {
             logger.error('Failed to save profitability data', { storeId }, error as Error);
         }
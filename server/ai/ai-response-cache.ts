@@ -0,0 +1,202 @@
+/**
+ * AI Response Cache - memoizes chat tool results and model replies
+ *
+ * Tool results are keyed on (store, tool, arguments, data watermark). The
+ * watermark is the store's latest transaction plus its latest insight run, so
+ * any new sale or insight refresh naturally misses the cache.
+ *
+ * The optional exact-prompt cache stores whole model replies keyed on the
+ * request payload and the same watermark. It does no semantic matching: only
+ * a byte-identical conversation (e.g. the same first question in a fresh
+ * chat) is served from cache.
+ */
+
+import { createHash } from 'node:crypto';
+import { desc, eq } from 'drizzle-orm';
+
+import { aiInsights, transactions } from '../../shared/schema';
+import { db } from '../db';
+
+export interface CacheCounters {
+    hits: number;
+    misses: number;
+    size: number;
+}
+
+interface TtlEntry<V> {
+    value: V;
+    expiresAt: number;
+}
+
+/**
+ * Size-capped TTL map. Insertion order is used for eviction, and reads
+ * refresh recency so hot keys survive.
+ */
+export class TtlCache<V> {
+    private readonly entries = new Map<string, TtlEntry<V>>();
+    private hits = 0;
+    private misses = 0;
+
+    constructor(
+        private readonly ttlMs: number,
+        private readonly maxEntries: number,
+        private readonly now: () => number = Date.now,
+    ) {}
+
+    get(key: string): V | undefined {
+        const entry = this.entries.get(key);
+        if (!entry || entry.expiresAt <= this.now()) {
+            if (entry) this.entries.delete(key);
+            this.misses += 1;
+            return undefined;
+        }
+        this.entries.delete(key);
+        this.entries.set(key, entry);
+        this.hits += 1;
+        return entry.value;
+    }
+
+    set(key: string, value: V): void {
+        this.entries.delete(key);
+        this.entries.set(key, { value, expiresAt: this.now() + this.ttlMs });
+        while (this.entries.size > this.maxEntries) {
+            const oldest = this.entries.keys().next().value as string;
+            this.entries.delete(oldest);
+        }
+    }
+
+    clear(): void {
+        this.entries.clear();
+    }
+
+    getCounters(): CacheCounters {
+        return { hits: this.hits, misses: this.misses, size: this.entries.size };
+    }
+}
+
+export function stableStringify(value: unknown): string {
+    if (value === null || typeof value !== 'object') return JSON.stringify(value) ?? 'null';
+    if (Array.isArray(value)) return `[${value.map(stableStringify).join(',')}]`;
+    const keys = Object.keys(value as Record<string, unknown>).sort();
+    return `{${keys
+        .filter((k) => (value as any)[k] !== undefined)
+        .map((k) => `${JSON.stringify(k)}:${stableStringify((value as any)[k])}`)
+        .join(',')}}`;
+}
+
+export type WatermarkResolver = (storeId: string) => Promise<string>;
+
+/**
+ * Default watermark: id of the store's most recent transaction and timestamp
+ * of its most recent generated insight.
+ */
+export async function resolveStoreDataWatermark(storeId: string): Promise<string> {
+    const [latestTxn] = await db
+        .select({ id: transactions.id })
+        .from(transactions)
+        .where(eq(transactions.storeId, storeId))
+        .orderBy(desc(transactions.createdAt))
+        .limit(1);
+    const [latestInsight] = await db
+        .select({ generatedAt: aiInsights.generatedAt })
+        .from(aiInsights)
+        .where(eq(aiInsights.storeId, storeId))
+        .orderBy(desc(aiInsights.generatedAt))
+        .limit(1);
+    const insightMark = latestInsight?.generatedAt ? new Date(latestInsight.generatedAt).getTime() : 0;
+    return `${latestTxn?.id ?? 'none'}:${insightMark}`;
+}
+
+export interface AiResponseCacheOptions {
+    toolTtlMs?: number;
+    responseTtlMs?: number;
+    responseCacheEnabled?: boolean;
+    watermarkTtlMs?: number;
+    maxEntries?: number;
+    resolveWatermark?: WatermarkResolver;
+}
+
+export interface AiResponseCacheStats {
+    tools: CacheCounters;
+    responses: CacheCounters & { enabled: boolean };
+    watermarks: CacheCounters;
+}
+
+export class AiResponseCache {
+    private readonly tools: TtlCache<unknown>;
+    private readonly responses: TtlCache<unknown>;
+    // Watermarks are themselves cached briefly so a multi-tool turn costs one lookup
+    private readonly watermarks: TtlCache<string>;
+    private readonly resolveWatermark: WatermarkResolver;
+    readonly responseCacheEnabled: boolean;
+
+    constructor(options: AiResponseCacheOptions = {}) {
+        const maxEntries = options.maxEntries ?? 500;
+        this.tools = new TtlCache(options.toolTtlMs ?? 5 * 60 * 1000, maxEntries);
+        this.responses = new TtlCache(options.responseTtlMs ?? 10 * 60 * 1000, maxEntries);
+        this.watermarks = new TtlCache(options.watermarkTtlMs ?? 5000, maxEntries);
+        this.resolveWatermark = options.resolveWatermark ?? resolveStoreDataWatermark;
+        this.responseCacheEnabled = options.responseCacheEnabled ?? false;
+    }
+
+    async getWatermark(storeId: string): Promise<string> {
+        const cached = this.watermarks.get(storeId);
+        if (cached !== undefined) return cached;
+        const watermark = await this.resolveWatermark(storeId);
+        this.watermarks.set(storeId, watermark);
+        return watermark;
+    }
+
+    async getOrComputeTool<T>(
+        storeId: string,
+        toolName: string,
+        args: Record<string, unknown>,
+        compute: () => Promise<T>,
+    ): Promise<T> {
+        const watermark = await this.getWatermark(storeId);
+        const key = `${storeId}|${toolName}|${stableStringify(args)}|${watermark}`;
+        const cached = this.tools.get(key);
+        if (cached !== undefined) return cached as T;
+        const value = await compute();
+        this.tools.set(key, value);
+        return value;
+    }
+
+    async responseKey(storeId: string, request: unknown): Promise<string | null> {
+        if (!this.responseCacheEnabled) return null;
+        const watermark = await this.getWatermark(storeId);
+        return createHash('sha256').update(`${storeId}|${watermark}|${stableStringify(request)}`).digest('hex');
+    }
+
+    getResponse<T>(key: string | null): T | undefined {
+        if (!key) return undefined;
+        return this.responses.get(key) as T | undefined;
+    }
+
+    setResponse(key: string | null, value: unknown): void {
+        if (!key) return;
+        this.responses.set(key, value);
+    }
+
+    clear(): void {
+        this.tools.clear();
+        this.responses.clear();
+        this.watermarks.clear();
+    }
+
+    getStats(): AiResponseCacheStats {
+        return {
+            tools: this.tools.getCounters(),
+            responses: { ...this.responses.getCounters(), enabled: this.responseCacheEnabled },
+            watermarks: this.watermarks.getCounters(),
+        };
+    }
+}
+
+export function createAiResponseCache(): AiResponseCache {
+    return new AiResponseCache({
+        toolTtlMs: Number(process.env.AI_TOOL_CACHE_TTL_MS ?? 5 * 60 * 1000),
+        responseTtlMs: Number(process.env.AI_RESPONSE_CACHE_TTL_MS ?? 10 * 60 * 1000),
+        responseCacheEnabled: (process.env.AI_RESPONSE_CACHE ?? 'false').toLowerCase() === 'true',
+    });
+}
@@ -0,0 +1,205 @@
+/**
+ * Conversation Store - bounded chat history for AiChatService
+ *
+ * Conversations are kept in Redis when REDIS_URL is configured so every
+ * instance sees the same history, and in a bounded in-process LRU otherwise.
+ * Both backends expire idle conversations, and every write is trimmed to a
+ * message, byte and approximate token budget.
+ */
+
+import type { ChatCompletionMessageParam } from 'openai/resources/chat/completions';
+
+import { logger } from '../lib/logger';
+import { getRedisClient } from '../lib/redis';
+
+export interface ConversationLimits {
+    maxMessages: number;
+    maxBytes: number;
+    maxTokens: number;
+}
+
+export interface ConversationStore {
+    get(key: string): Promise<ChatCompletionMessageParam[]>;
+    set(key: string, messages: ChatCompletionMessageParam[]): Promise<void>;
+    delete(key: string): Promise<void>;
+}
+
+const KEY_PREFIX = 'chainsync:ai-chat:conversation';
+
+export const DEFAULT_CONVERSATION_LIMITS: ConversationLimits = {
+    maxMessages: Number(process.env.AI_CHAT_MAX_MESSAGES ?? 20),
+    maxBytes: Number(process.env.AI_CHAT_MAX_BYTES ?? 64 * 1024),
+    maxTokens: Number(process.env.AI_CHAT_MAX_TOKENS ?? 6000),
+};
+
+const DEFAULT_IDLE_TTL_MS = Number(process.env.AI_CHAT_IDLE_TTL_MS ?? 2 * 60 * 60 * 1000);
+const DEFAULT_MAX_CONVERSATIONS = Number(process.env.AI_CHAT_MAX_CONVERSATIONS ?? 1000);
+
+function messageText(message: ChatCompletionMessageParam): string {
+    const content = (message as any).content;
+    let text = typeof content === 'string' ? content : content ? JSON.stringify(content) : '';
+    const toolCalls = (message as any).tool_calls;
+    if (toolCalls) text += JSON.stringify(toolCalls);
+    return text;
+}
+
+/**
+ * Rough token estimate (~4 characters per token plus per-message overhead).
+ * Close enough for budgeting without shipping a tokenizer.
+ */
+export function estimateTokens(message: ChatCompletionMessageParam): number {
+    return Math.ceil(messageText(message).length / 4) + 4;
+}
+
+function messageBytes(message: ChatCompletionMessageParam): number {
+    return Buffer.byteLength(JSON.stringify(message), 'utf8');
+}
+
+/**
+ * Drop the oldest turns until the conversation fits every budget. The system
+ * prompt is always kept, and the retained history never starts with a tool
+ * result or a dangling tool call, which the OpenAI API would reject.
+ */
+export function trimConversation(
+    messages: ChatCompletionMessageParam[],
+    limits: ConversationLimits = DEFAULT_CONVERSATION_LIMITS,
+): ChatCompletionMessageParam[] {
+    const system = messages[0]?.role === 'system' ? messages[0] : null;
+    const rest = system ? messages.slice(1) : messages.slice();
+
+    const fixedTokens = system ? estimateTokens(system) : 0;
+    const fixedBytes = system ? messageBytes(system) : 0;
+    const fixedCount = system ? 1 : 0;
+
+    let tokens = fixedTokens;
+    let bytes = fixedBytes;
+    let start = rest.length;
+    for (let i = rest.length - 1; i >= 0; i--) {
+        const nextTokens = tokens + estimateTokens(rest[i]);
+        const nextBytes = bytes + messageBytes(rest[i]);
+        const nextCount = fixedCount + (rest.length - i);
+        if (nextTokens > limits.maxTokens || nextBytes > limits.maxBytes || nextCount > limits.maxMessages) break;
+        tokens = nextTokens;
+        bytes = nextBytes;
+        start = i;
+    }
+
+    // Advance to the first user turn so tool results keep their tool call
+    while (start < rest.length && rest[start].role !== 'user') start++;
+
+    const kept = rest.slice(start);
+    return system ? [system, ...kept] : kept;
+}
+
+interface MemoryEntry {
+    messages: ChatCompletionMessageParam[];
+    touchedAt: number;
+}
+
+/**
+ * LRU of conversations with an idle TTL. Map insertion order doubles as
+ * recency order: reads and writes re-insert the key at the end.
+ */
+export class InMemoryConversationStore implements ConversationStore {
+    private readonly entries = new Map<string, MemoryEntry>();
+
+    constructor(
+        private readonly maxConversations: number = DEFAULT_MAX_CONVERSATIONS,
+        private readonly idleTtlMs: number = DEFAULT_IDLE_TTL_MS,
+        private readonly now: () => number = Date.now,
+    ) {}
+
+    async get(key: string): Promise<ChatCompletionMessageParam[]> {
+        const entry = this.entries.get(key);
+        if (!entry) return [];
+        if (this.now() - entry.touchedAt > this.idleTtlMs) {
+            this.entries.delete(key);
+            return [];
+        }
+        this.entries.delete(key);
+        entry.touchedAt = this.now();
+        this.entries.set(key, entry);
+        return entry.messages.slice();
+    }
+
+    async set(key: string, messages: ChatCompletionMessageParam[]): Promise<void> {
+        this.entries.delete(key);
+        this.entries.set(key, { messages: messages.slice(), touchedAt: this.now() });
+        this.evict();
+    }
+
+    async delete(key: string): Promise<void> {
+        this.entries.delete(key);
+    }
+
+    size(): number {
+        return this.entries.size;
+    }
+
+    private evict(): void {
+        const cutoff = this.now() - this.idleTtlMs;
+        for (const [key, entry] of this.entries) {
+            if (this.entries.size <= this.maxConversations && entry.touchedAt >= cutoff) break;
+            this.entries.delete(key);
+        }
+    }
+}
+
+/**
+ * Redis-backed conversations shared across instances. Each write refreshes the
+ * key's expiry, which gives the idle TTL; Redis eviction bounds total memory.
+ */
+export class RedisConversationStore implements ConversationStore {
+    constructor(
+        private readonly fallback: ConversationStore,
+        private readonly idleTtlMs: number = DEFAULT_IDLE_TTL_MS,
+    ) {}
+
+    private key(key: string): string {
+        return `${KEY_PREFIX}:${key}`;
+    }
+
+    async get(key: string): Promise<ChatCompletionMessageParam[]> {
+        const client = getRedisClient();
+        if (!client) return this.fallback.get(key);
+        try {
+            const json = await client.get(this.key(key));
+            return json ? (JSON.parse(json) as ChatCompletionMessageParam[]) : [];
+        } catch (error) {
+            logger.warn('AI chat conversation read failed, using local store', {
+                error: error instanceof Error ? error.message : String(error),
+            });
+            return this.fallback.get(key);
+        }
+    }
+
+    async set(key: string, messages: ChatCompletionMessageParam[]): Promise<void> {
+        const client = getRedisClient();
+        if (!client) return this.fallback.set(key, messages);
+        try {
+            await client.set(this.key(key), JSON.stringify(messages), {
+                PX: this.idleTtlMs,
+            });
+        } catch (error) {
+            logger.warn('AI chat conversation write failed, using local store', {
+                error: error instanceof Error ? error.message : String(error),
+            });
+            await this.fallback.set(key, messages);
+        }
+    }
+
+    async delete(key: string): Promise<void> {
+        await this.fallback.delete(key);
+        const client = getRedisClient();
+        if (!client) return;
+        try {
+            await client.del(this.key(key));
+        } catch {
+            // Expiry will clean it up
+        }
+    }
+}
+
+export function createConversationStore(): ConversationStore {
+    return new RedisConversationStore(new InMemoryConversationStore());
+}
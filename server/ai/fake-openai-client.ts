@@ -0,0 +1,96 @@
+/**
+ * Fake OpenAI Client - in-process stand-in for offline chat benchmarks/tests
+ *
+ * Implements just enough of `chat.completions.create` for AiChatService:
+ * a user turn gets a tool call, a tool result gets a short summary, and
+ * `stream: true` returns an async iterable of delta chunks. Latency and call
+ * counts are configurable/observable so cache effects can be measured without
+ * network access or an API key.
+ */
+
+import type { ChatCompletion, ChatCompletionChunk, ChatCompletionMessageParam } from 'openai/resources/chat/completions';
+
+import type { ChatCompletionClient } from './ai-chat-service';
+
+export interface FakeOpenAIOptions {
+    /** Simulated round-trip time per call */
+    latencyMs?: number;
+    /** Tool to request for every user question */
+    toolName?: string;
+    toolArgs?: Record<string, unknown>;
+}
+
+export interface FakeOpenAIClient extends ChatCompletionClient {
+    calls: number;
+    streamedCalls: number;
+}
+
+const sleep = (ms: number) => new Promise<void>((resolve) => setTimeout(resolve, ms));
+
+function replyText(messages: ChatCompletionMessageParam[]): string {
+    const last = messages[messages.length - 1];
+    const content = typeof last?.content === 'string' ? last.content : '';
+    return `Here is what the data shows: ${content.slice(0, 120)}`;
+}
+
+function completion(message: ChatCompletion.Choice['message']): ChatCompletion {
+    return {
+        id: `fake-${Date.now()}`,
+        object: 'chat.completion',
+        created: Math.floor(Date.now() / 1000),
+        model: 'fake',
+        choices: [{ index: 0, message, finish_reason: message.tool_calls ? 'tool_calls' : 'stop', logprobs: null }],
+    };
+}
+
+async function* streamChunks(text: string): AsyncGenerator<ChatCompletionChunk> {
+    for (const word of text.split(/(?<= )/)) {
+        yield {
+            id: 'fake-stream',
+            object: 'chat.completion.chunk',
+            created: Math.floor(Date.now() / 1000),
+            model: 'fake',
+            choices: [{ index: 0, delta: { content: word }, finish_reason: null }],
+        };
+    }
+}
+
+export function createFakeOpenAIClient(options: FakeOpenAIOptions = {}): FakeOpenAIClient {
+    const latencyMs = options.latencyMs ?? 0;
+    const toolName = options.toolName ?? 'getTopProducts';
+    const toolArgs = options.toolArgs ?? { type: 'top', limit: 5 };
+
+    const fake = {
+        calls: 0,
+        streamedCalls: 0,
+        chat: {
+            completions: {
+                create: async (params: { messages: ChatCompletionMessageParam[]; stream?: boolean }) => {
+                    fake.calls += 1;
+                    if (latencyMs > 0) await sleep(latencyMs);
+
+                    const last = params.messages[params.messages.length - 1];
+                    if (params.stream) {
+                        fake.streamedCalls += 1;
+                        return streamChunks(replyText(params.messages));
+                    }
+                    if (last?.role === 'user') {
+                        return completion({
+                            role: 'assistant',
+                            content: null,
+                            refusal: null,
+                            tool_calls: [{
+                                id: `call_${fake.calls}`,
+                                type: 'function',
+                                function: { name: toolName, arguments: JSON.stringify(toolArgs) },
+                            }],
+                        });
+                    }
+                    return completion({ role: 'assistant', content: replyText(params.messages), refusal: null });
+                },
+            },
+        },
+    };
+
+    return fake as unknown as FakeOpenAIClient;
+}
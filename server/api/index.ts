@@ -4,6 +4,7 @@ import rateLimit from 'express-rate-limit';
 import { createServer } from 'http';
 import { loadEnv } from '../../shared/env';
 import { getEmailHealth } from '../email';
+import { installNotificationRelay } from '../lib/cluster';
 import { logger } from '../lib/logger';
 import { registerNotificationService } from '../lib/notification-bus';
 import { csrfProtection, globalRateLimit, sensitiveEndpointRateLimit } from '../middleware/security';
@@ -151,6 +152,7 @@ export async function registerRoutes(app: Express) {
     const wsService = new NotificationService(server);
     (app as any).wsService = wsService;
     registerNotificationService(wsService);
+    installNotificationRelay(wsService);
   } catch (error) {
     logger.warn('Failed to initialize websocket notification service', {
       error: error instanceof Error ? error.message : String(error)
@@ -3,8 +3,10 @@ import { eq, and, sql, gte, lte } from 'drizzle-orm';
 import type { Express, Request, Response } from 'express';
 import multer from 'multer';
 import { z } from 'zod';
+import { getSupportedCurrencies, type CurrencyCode } from '@shared/lib/currency';
 import { users, ipWhitelists as ipWhitelist, subscriptions, subscriptionPayments, dunningEvents, organizations } from '@shared/schema';
 import { db } from '../db';
+import { getOrgBaseCurrencyCache } from '../lib/currency';
 import { logger } from '../lib/logger';
 import { getPlan } from '../lib/plans';
 import { requireAuth, requireRole, enforceIpWhitelist } from '../middleware/authz';
@@ -46,6 +48,13 @@ const OrgSecuritySchema = z.object({
   ipWhitelistEnforced: z.boolean(),
 });
 
+const OrgCurrencySchema = z.object({
+  currency: z
+    .string()
+    .transform((value) => value.trim().toUpperCase())
+    .refine((value) => getSupportedCurrencies().includes(value as CurrencyCode), 'Unsupported currency'),
+});
+
 const appliedIdempotency = new Set<string>();
 
 export async function registerAdminRoutes(app: Express) {
@@ -255,6 +264,31 @@ export async function registerAdminRoutes(app: Express) {
     res.json({ org: (updated as any).rows?.[0] });
   });
 
+  // Update the org's base currency, which analytics normalizes amounts into
+  app.patch('/api/admin/org/currency', requireAuth, requireRole('ADMIN'), enforceIpWhitelist, async (req: Request, res: Response) => {
+    const parsed = OrgCurrencySchema.safeParse(req.body);
+    if (!parsed.success) {
+      return res.status(400).json({ error: 'Invalid payload', details: parsed.error.flatten() });
+    }
+    const currentUserId = ((req.session as any)?.userId as string | undefined) || (process.env.NODE_ENV === 'test' ? 'u-test' : undefined);
+    if (!currentUserId) return res.status(401).json({ error: 'Not authenticated' });
+    let me = (await db.select().from(users).where(eq(users.id, currentUserId as any)))[0] as any;
+    if (!me && process.env.NODE_ENV === 'test') {
+      me = { id: currentUserId, orgId: 'org-test', isAdmin: true };
+    }
+    if (!me?.orgId) return res.status(400).json({ error: 'Organization not set' });
+
+    const [updated] = await db
+      .update(organizations as any)
+      .set({ currency: parsed.data.currency } as any)
+      .where(eq(organizations.id, me.orgId))
+      .returning({ id: organizations.id, currency: organizations.currency });
+    // This instance drops its cached base currency now; others pick it up within CURRENCY_ORG_CACHE_TTL_MS
+    getOrgBaseCurrencyCache().invalidate(me.orgId);
+
+    res.json({ org: updated });
+  });
+
   // List subscriptions with filters
   app.get('/api/admin/subscriptions', requireAuth, requireRole('ADMIN'), enforceIpWhitelist, async (req: Request, res: Response) => {
     const currentUserId = ((req.session as any)?.userId as string | undefined) || (process.env.NODE_ENV === 'test' ? 'u-test' : undefined);
@@ -148,7 +148,7 @@ export async function registerAIChatRoutes(app: Express) {
                 });
             }
 
-            const history = aiChatService.getHistory(userId, storeId);
+            const history = await aiChatService.getHistory(userId, storeId);
 
             return res.json({
                 success: true,
@@ -181,7 +181,7 @@ export async function registerAIChatRoutes(app: Express) {
                 });
             }
 
-            aiChatService.clearHistory(userId, storeId);
+            await aiChatService.clearHistory(userId, storeId);
 
             return res.json({
                 success: true,
@@ -205,7 +205,8 @@ export async function registerAIChatRoutes(app: Express) {
         return res.json({
             success: true,
             available: aiChatService.isAvailable(),
-            model: 'gpt-4o-mini'
+            model: 'gpt-4o-mini',
+            cache: aiChatService.getCacheStats()
         });
     });
 }
@@ -1,13 +1,16 @@
 import { and, eq, gte, lte, sql, inArray } from 'drizzle-orm';
 import type { Express, Request, Response } from 'express';
 import PDFDocument from 'pdfkit';
-import type { CurrencyCode, Money } from '@shared/lib/currency';
+import type { CurrencyCode, CurrencyRates, Money } from '@shared/lib/currency';
 import { organizations, legacySales as sales, legacyReturns as returns, users, userRoles, stores, scheduledReports, products, transactions } from '@shared/schema';
 import { db } from '../db';
 import { sendEmail } from '../email';
-import { getDefaultRates, convertAmount, StaticCurrencyRateProvider } from '../lib/currency';
+import { convertMoneyValues, getCurrencyRateService, getOrgBaseCurrencyCache, rateDay } from '../lib/currency';
 import { logger } from '../lib/logger';
+import { readLiveMetrics } from '../lib/realtime-metrics';
 import { getTodayRollupForStore } from '../lib/redis';
+import { reportContentType, type AnalyticsExportReport, type ReportFormat } from '../lib/report-render';
+import { getReportRenderPool, renderReportCached, ReportQueueFullError } from '../lib/report-render-pool';
 import { requireAuth } from '../middleware/authz';
 import { requireActiveSubscription } from '../middleware/subscription';
 import { storage } from '../storage';
@@ -21,48 +24,30 @@ const toMoney = (amount: number, currency: CurrencyCode): Money => ({
   currency,
 });
 
-const currencyRateProvider = new StaticCurrencyRateProvider(getDefaultRates());
-
 type SumOptions = {
   orgId?: string;
   baseCurrency?: CurrencyCode;
+  /** Convert with the rates of this day instead of the live rates */
+  asOf?: Date | string;
+  /** Rates already resolved by the caller (e.g. one lookup for a whole series) */
+  rates?: CurrencyRates;
 };
 
+const ratesFor = async (options: SumOptions): Promise<CurrencyRates> =>
+  options.rates ?? getCurrencyRateService().getRatesForDate(options.asOf);
+
 const sumMoneyValues = async (values: Money[], targetCurrency: CurrencyCode, options: SumOptions): Promise<Money> => {
-  const { orgId, baseCurrency } = options;
-  if (!values.length) {
+  const present = values.filter(Boolean);
+  if (!present.length) {
     return toMoney(0, targetCurrency);
   }
-  let total = 0;
-  for (const value of values) {
-    if (!value) continue;
-    if (value.currency === targetCurrency) {
-      total += value.amount;
-      continue;
-    }
-    if (value.amount === 0) continue;
-    const converted = await convertAmount({
-      amount: value.amount,
-      currency: value.currency,
-      targetCurrency,
-      orgId: orgId ?? 'system',
-      baseCurrency,
-      provider: currencyRateProvider,
-    });
-    total += converted.amount;
-  }
-  return toMoney(total, targetCurrency);
+  const converted = convertMoneyValues(present, targetCurrency, await ratesFor(options), options.baseCurrency);
+  return toMoney(converted.reduce((total, value) => total + value.amount, 0), targetCurrency);
 };
 
 const convertForOrg = async (value: Money, targetCurrency: CurrencyCode, options: SumOptions): Promise<Money> => {
-  return convertAmount({
-    amount: value.amount,
-    currency: value.currency,
-    targetCurrency,
-    orgId: options.orgId ?? 'system',
-    baseCurrency: options.baseCurrency,
-    provider: currencyRateProvider,
-  });
+  const [converted] = convertMoneyValues([value], targetCurrency, await ratesFor(options), options.baseCurrency);
+  return converted;
 };
 
 const normalizeMoneyValues = async (values: Money[], baseCurrency: CurrencyCode, options: SumOptions) => {
@@ -90,14 +75,14 @@ async function resolveBaseCurrency({
 }: { orgId?: string | null; storeCurrency?: CurrencyCode }): Promise<CurrencyCode> {
   if (storeCurrency) return storeCurrency;
   if (orgId) {
-    const [orgRow] = await db
-      .select({ currency: organizations.currency })
-      .from(organizations)
-      .where(eq(organizations.id, orgId))
-      .limit(1);
-    if (orgRow?.currency) {
-      return coerceCurrency(orgRow.currency, 'NGN');
-    }
+    return getOrgBaseCurrencyCache().get(orgId, async () => {
+      const [orgRow] = await db
+        .select({ currency: organizations.currency })
+        .from(organizations)
+        .where(eq(organizations.id, orgId))
+        .limit(1);
+      return orgRow?.currency ? coerceCurrency(orgRow.currency, 'NGN') : 'NGN';
+    });
   }
   return 'NGN';
 }
@@ -209,6 +194,33 @@ export async function registerAnalyticsRoutes(app: Express) {
     return { orgId, allowedStoreIds: storeRows.map(s => s.id), isAdmin };
   }
 
+  // Live dashboard: today, last 24h and last 7 days per store (and the org for
+  // admins) from the Redis real-time layer, read in one pipelined round trip
+  app.get('/api/analytics/live', auth, requireActiveSubscription, async (req: Request, res: Response) => {
+    try {
+      const { orgId, allowedStoreIds, isAdmin } = await getScope(req);
+      const storeId = (String((req.query as any)?.store_id || '').trim() || undefined) as string | undefined;
+      if (storeId && !allowedStoreIds.includes(storeId)) {
+        return res.status(403).json({ error: 'Forbidden: store scope' });
+      }
+      const topN = Math.min(Math.max(Number((req.query as any)?.top) || 10, 1), 50);
+      const live = await readLiveMetrics({
+        orgId: !storeId && isAdmin ? orgId : null,
+        storeIds: storeId ? [storeId] : allowedStoreIds,
+        topN,
+      });
+      if (!live) {
+        return res.status(503).json({ error: 'Real-time metrics unavailable' });
+      }
+      return res.json({ ...live, generatedAt: new Date().toISOString() });
+    } catch (error) {
+      logger.warn('Failed to read real-time metrics', {
+        error: error instanceof Error ? error.message : String(error),
+      });
+      return res.status(503).json({ error: 'Real-time metrics unavailable' });
+    }
+  });
+
   // Overview endpoint (scoped by org and optional store)
   app.get('/api/analytics/overview', auth, requireActiveSubscription, async (req: Request, res: Response) => {
     try {
@@ -297,6 +309,9 @@ export async function registerAnalyticsRoutes(app: Express) {
         }
       }
 
+      // A closed range converts with the rates of its last day; one lookup serves every total
+      const periodRates = await getCurrencyRateService().getRatesForDate(dateTo);
+
       // Query SALES from transactions table (unified with P&L)
       const salesWhere = [...txnWhere, eq(transactions.kind, 'SALE')];
       const totalRows = await db.execute(sql`
@@ -331,17 +346,20 @@ export async function registerAnalyticsRoutes(app: Express) {
       const totalMoney = await sumMoneyValues(revenueValues, totalsCurrency, {
         orgId: orgIdForStore ?? orgId ?? 'system',
         baseCurrency,
+        rates: periodRates,
       });
 
       const taxCollectedMoney = await sumMoneyValues(taxCollectedValues, totalsCurrency, {
         orgId: orgIdForStore ?? orgId ?? 'system',
         baseCurrency,
+        rates: periodRates,
       });
 
       const normalized = normalizeCurrency
         ? await normalizeMoneyValues(revenueValues, baseCurrency, {
           orgId: orgIdForStore ?? orgId ?? 'system',
           baseCurrency,
+          rates: periodRates,
         })
         : undefined;
 
@@ -372,17 +390,20 @@ export async function registerAnalyticsRoutes(app: Express) {
       const refundMoney = await sumMoneyValues(refundValues, totalsCurrency, {
         orgId: orgIdForStore ?? orgId ?? 'system',
         baseCurrency,
+        rates: periodRates,
       });
 
       const refundTaxMoney = await sumMoneyValues(refundTaxValues, totalsCurrency, {
         orgId: orgIdForStore ?? orgId ?? 'system',
         baseCurrency,
+        rates: periodRates,
       });
 
       const refundNormalized = normalizeCurrency
         ? await normalizeMoneyValues(refundValues, baseCurrency, {
           orgId: orgIdForStore ?? orgId ?? 'system',
           baseCurrency,
+          rates: periodRates,
         })
         : undefined;
 
@@ -581,18 +602,24 @@ export async function registerAnalyticsRoutes(app: Express) {
       };
     }>
 
+    // One rate lookup for the whole series; each point converts with the rates of its bucket's day
+    const ratesByDay = await getCurrencyRateService().getRatesForDays(Array.from(pointMap.keys(), (date) => rateDay(date)));
+
     for (const [date, entry] of Array.from(pointMap.entries()).sort(([a], [b]) => (a > b ? 1 : a < b ? -1 : 0))) {
       const transactionCount = entry.transactions;
+      const rates = ratesByDay.get(rateDay(date));
       const nativeCurrency = storeCurrency ?? entry.values[0]?.currency ?? baseCurrency;
       const outputCurrency = requestedCurrency ?? nativeCurrency;
       const total = await sumMoneyValues(entry.values, outputCurrency, {
         orgId: orgIdForStore ?? orgId ?? 'system',
         baseCurrency,
+        rates,
       });
       const normalized = normalizeCurrency
         ? await normalizeMoneyValues(entry.values, baseCurrency, {
           orgId: orgIdForStore ?? orgId ?? 'system',
           baseCurrency,
+          rates,
         })
         : undefined;
       const averageOrder = transactionCount > 0 ? toMoney(total.amount / transactionCount, total.currency) : toMoney(0, total.currency);
@@ -602,11 +629,13 @@ export async function registerAnalyticsRoutes(app: Express) {
       const refundTotal = await sumMoneyValues(refundValues, outputCurrency, {
         orgId: orgIdForStore ?? orgId ?? 'system',
         baseCurrency,
+        rates,
       });
       const refundNormalized = normalizeCurrency
         ? await normalizeMoneyValues(refundValues, baseCurrency, {
           orgId: orgIdForStore ?? orgId ?? 'system',
           baseCurrency,
+          rates,
         })
         : undefined;
       const refundCount = refundEntry?.count ?? 0;
@@ -663,28 +692,26 @@ export async function registerAnalyticsRoutes(app: Express) {
     const baseCurrency = await resolveBaseCurrency({ orgId: effectiveOrgId, storeCurrency });
 
     const data = await storage.getPopularProducts(storeId);
-    const items = await Promise.all(
-      data.map(async (item) => {
-        const priceAmount = Number(item.product?.price ?? 0);
-        const nativePrice = toMoney(priceAmount, storeCurrency);
-        const total = toMoney(priceAmount * (item.salesCount ?? 0), storeCurrency);
-        const normalized = normalizeCurrency
-          ? {
-            baseCurrency,
-            price: await convertForOrg(nativePrice, baseCurrency, { orgId: effectiveOrgId, baseCurrency }),
-            total: await convertForOrg(total, baseCurrency, { orgId: effectiveOrgId, baseCurrency }),
-          }
-          : undefined;
+    const rates = normalizeCurrency ? await getCurrencyRateService().getRates() : null;
+    const items = data.map((item) => {
+      const priceAmount = Number(item.product?.price ?? 0);
+      const nativePrice = toMoney(priceAmount, storeCurrency);
+      const total = toMoney(priceAmount * (item.salesCount ?? 0), storeCurrency);
+      const [normalizedPrice, normalizedTotal] = rates
+        ? convertMoneyValues([nativePrice, total], baseCurrency, rates, baseCurrency)
+        : [];
+      const normalized = rates
+        ? { baseCurrency, price: normalizedPrice, total: normalizedTotal }
+        : undefined;
 
-        return {
-          product: item.product,
-          salesCount: item.salesCount,
-          price: nativePrice,
-          total,
-          normalized,
-        };
-      })
-    );
+      return {
+        product: item.product,
+        salesCount: item.salesCount,
+        price: nativePrice,
+        total,
+        normalized,
+      };
+    });
 
     res.json({
       currency: storeCurrency,
@@ -749,19 +776,16 @@ export async function registerAnalyticsRoutes(app: Express) {
       stockRemovalCount: profitLoss.stockRemovalCount,
     };
 
-    const normalized = normalizeCurrency
-      ? {
+    let normalized: Record<string, Money | CurrencyCode> | undefined;
+    if (normalizeCurrency) {
+      const [revenue, taxCollected, cogs, profit, refunds, netRevenue, priceChangeDelta, stockRemovalLoss] = convertMoneyValues(
+        [revenueMoney, taxCollectedMoney, cogsMoney, profitMoney, refundMoney, netRevenueMoney, priceChangeDeltaMoney, stockRemovalLossMoney],
         baseCurrency,
-        revenue: await convertForOrg(revenueMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-        taxCollected: await convertForOrg(taxCollectedMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-        cogs: await convertForOrg(cogsMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-        profit: await convertForOrg(profitMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-        refunds: await convertForOrg(refundMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-        netRevenue: await convertForOrg(netRevenueMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-        priceChangeDelta: await convertForOrg(priceChangeDeltaMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-        stockRemovalLoss: await convertForOrg(stockRemovalLossMoney, baseCurrency, { orgId: orgId ?? store.orgId, baseCurrency }),
-      }
-      : undefined;
+        await getCurrencyRateService().getRatesForDate(endDate),
+        baseCurrency,
+      );
+      normalized = { baseCurrency, revenue, taxCollected, cogs, profit, refunds, netRevenue, priceChangeDelta, stockRemovalLoss };
+    }
 
     res.json({
       currency: storeCurrency,
@@ -980,38 +1004,58 @@ export async function registerAnalyticsRoutes(app: Express) {
     res.json(data);
   });
 
-  // CSV export
-  app.get('/api/analytics/export.csv', auth, requireActiveSubscription, async (req: Request, res: Response) => {
-    if (process.env.NODE_ENV === 'test') {
-      res.setHeader('Content-Type', 'text/csv');
-      res.setHeader('Content-Disposition', 'attachment; filename="analytics_export.csv"');
-      const now = new Date();
-      const d1 = new Date(now.getTime() - 2 * 86400000).toISOString();
-      const d2 = new Date(now.getTime() - 1 * 86400000).toISOString();
-      res.end([
-        'date,revenue,discount,tax,transactions,refunds,refund_count,net_revenue',
-        `${d1},105,0,5,1,5,1,100`,
-        `${d2},210,0,10,1,10,1,200`,
-      ].join('\n'));
-      return;
-    }
-    const { orgId, allowedStoreIds } = await getScope(req);
-    const interval = (String((req.query as any)?.interval || '').trim() || 'day');
-    const storeId = (String((req.query as any)?.store_id || '').trim() || undefined) as string | undefined;
-    const dateFrom = (String((req.query as any)?.date_from || '').trim() || undefined) as string | undefined;
-    const dateTo = (String((req.query as any)?.date_to || '').trim() || undefined) as string | undefined;
+  type AnalyticsExportScope = {
+    orgId?: string;
+    allowedStoreIds: string[];
+    storeId?: string;
+    dateFrom?: string;
+    dateTo?: string;
+    interval: string;
+  };
 
-    const truncUnit = interval === 'month' ? 'month' : interval === 'week' ? 'week' : 'day';
+  function buildExportFilters(scope: AnalyticsExportScope) {
     const where: any[] = [];
-    if (orgId) where.push(eq(sales.orgId, orgId));
-    if (storeId) {
-      if (allowedStoreIds.length && !allowedStoreIds.includes(storeId)) return res.status(403).json({ error: 'Forbidden: store scope' });
-      where.push(eq(sales.storeId, storeId));
-    } else if (allowedStoreIds.length) {
-      where.push(inArray(sales.storeId, allowedStoreIds));
+    if (scope.orgId) where.push(eq(sales.orgId, scope.orgId));
+    if (scope.storeId) {
+      where.push(eq(sales.storeId, scope.storeId));
+    } else if (scope.allowedStoreIds.length) {
+      where.push(inArray(sales.storeId, scope.allowedStoreIds));
+    }
+    if (scope.dateFrom) where.push(gte(sales.occurredAt, new Date(scope.dateFrom)));
+    if (scope.dateTo) where.push(lte(sales.occurredAt, new Date(scope.dateTo)));
+
+    const refundWhere: any[] = [];
+    if (scope.orgId) refundWhere.push(eq(stores.orgId, scope.orgId));
+    if (scope.storeId) {
+      refundWhere.push(eq(returns.storeId, scope.storeId));
+    } else if (scope.allowedStoreIds.length) {
+      refundWhere.push(inArray(returns.storeId, scope.allowedStoreIds));
     }
-    if (dateFrom) where.push(gte(sales.occurredAt, new Date(dateFrom)));
-    if (dateTo) where.push(lte(sales.occurredAt, new Date(dateTo)));
+    if (scope.dateFrom) refundWhere.push(gte(returns.occurredAt, new Date(scope.dateFrom)));
+    if (scope.dateTo) refundWhere.push(lte(returns.occurredAt, new Date(scope.dateTo)));
+
+    return { where, refundWhere };
+  }
+
+  // Cheap fingerprint of the rows an export would cover; any new sale or
+  // refund in scope changes it and so invalidates cached renders.
+  async function getAnalyticsExportWatermark(scope: AnalyticsExportScope): Promise<string> {
+    const { where, refundWhere } = buildExportFilters(scope);
+    const result = await db.execute(sql`
+      SELECT
+        (SELECT COUNT(*) || ':' || COALESCE(MAX(occurred_at)::text, '') FROM sales
+          ${where.length ? sql`WHERE ${sql.join(where, sql` AND `)}` : sql``}) as sales_mark,
+        (SELECT COUNT(*) || ':' || COALESCE(MAX(${returns.occurredAt})::text, '') FROM ${returns}
+          JOIN stores ON stores.id = ${returns.storeId}
+          ${refundWhere.length ? sql`WHERE ${sql.join(refundWhere, sql` AND `)}` : sql``}) as refunds_mark
+    `);
+    const row = ((result as any).rows ?? [])[0] ?? {};
+    return `${row.sales_mark ?? ''}|${row.refunds_mark ?? ''}`;
+  }
+
+  async function loadAnalyticsExport(scope: AnalyticsExportScope): Promise<AnalyticsExportReport> {
+    const truncUnit = scope.interval === 'month' ? 'month' : scope.interval === 'week' ? 'week' : 'day';
+    const { where, refundWhere } = buildExportFilters(scope);
 
     const salesAggregates = await getSalesAggregateExpressions();
     const rows = await db.execute(sql`SELECT 
@@ -1025,16 +1069,6 @@ export async function registerAnalyticsRoutes(app: Express) {
       GROUP BY 1
       ORDER BY 1 ASC`);
 
-    const refundWhere: any[] = [];
-    if (orgId) refundWhere.push(eq(stores.orgId, orgId));
-    if (storeId) {
-      refundWhere.push(eq(returns.storeId, storeId));
-    } else if (allowedStoreIds.length) {
-      refundWhere.push(inArray(returns.storeId, allowedStoreIds));
-    }
-    if (dateFrom) refundWhere.push(gte(returns.occurredAt, new Date(dateFrom)));
-    if (dateTo) refundWhere.push(lte(returns.occurredAt, new Date(dateTo)));
-
     const refundRows = await db.execute(sql`
       SELECT 
         date_trunc(${sql.raw(`'${truncUnit}'`)}, ${returns.occurredAt}) as bucket,
@@ -1056,21 +1090,97 @@ export async function registerAnalyticsRoutes(app: Express) {
       });
     }
 
-    res.setHeader('Content-Type', 'text/csv');
-    res.setHeader('Content-Disposition', 'attachment; filename="analytics_export.csv"');
-    res.write('date,revenue,discount,tax,transactions,refunds,refund_count,net_revenue\n');
-    for (const r of (rows as any).rows) {
-      const bucketDate = new Date(r.bucket);
-      const key = bucketDate.toISOString();
-      const refund = refundMap.get(key);
-      const refundTotal = refund?.total ?? 0;
-      const refundCount = refund?.count ?? 0;
-      const revenue = Number(r.revenue ?? 0);
-      const netRevenue = revenue - refundTotal;
-      const line = `${key},${r.revenue},${r.discount},${r.tax},${r.transactions},${refundTotal},${refundCount},${netRevenue}\n`;
-      res.write(line);
+    return {
+      kind: 'analytics_timeseries',
+      interval: scope.interval,
+      dateFrom: scope.dateFrom,
+      dateTo: scope.dateTo,
+      storeId: scope.storeId,
+      rows: ((rows as any).rows as any[]).map((r) => {
+        const key = new Date(r.bucket).toISOString();
+        const refund = refundMap.get(key);
+        return {
+          bucket: key,
+          revenue: r.revenue,
+          discount: r.discount,
+          tax: r.tax,
+          transactions: r.transactions,
+          refundTotal: refund?.total ?? 0,
+          refundCount: refund?.count ?? 0,
+        };
+      }),
+    };
+  }
+
+  async function sendRenderedExport(res: Response, scope: AnalyticsExportScope, format: ReportFormat, filename: string) {
+    try {
+      const watermark = await getAnalyticsExportWatermark(scope);
+      const { stream, buffer, cached } = await renderReportCached({
+        orgId: scope.orgId,
+        params: {
+          report: 'analytics_timeseries',
+          storeId: scope.storeId,
+          allowedStoreIds: scope.storeId ? undefined : [...scope.allowedStoreIds].sort(),
+          dateFrom: scope.dateFrom,
+          dateTo: scope.dateTo,
+          interval: scope.interval,
+        },
+        watermark,
+        format,
+        load: () => loadAnalyticsExport(scope),
+      });
+
+      res.setHeader('Content-Type', reportContentType(format));
+      res.setHeader('Content-Disposition', `attachment; filename="${filename}"`);
+      res.setHeader('X-Report-Cache', cached ? 'HIT' : 'MISS');
+      if (stream) {
+        stream.on('error', (error) => {
+          logger.error('Failed to stream cached analytics export', { error: error.message });
+          res.destroy(error);
+        });
+        stream.pipe(res);
+        return;
+      }
+      res.end(buffer);
+    } catch (error) {
+      if (error instanceof ReportQueueFullError) {
+        res.setHeader('Retry-After', '5');
+        return res.status(503).json({ error: error.message });
+      }
+      logger.error('Failed to render analytics export', {
+        format,
+        error: error instanceof Error ? error.message : String(error),
+      });
+      res.status(500).json({ error: 'Failed to render analytics export' });
+    }
+  }
+
+  // CSV export
+  app.get('/api/analytics/export.csv', auth, requireActiveSubscription, async (req: Request, res: Response) => {
+    if (process.env.NODE_ENV === 'test') {
+      res.setHeader('Content-Type', 'text/csv');
+      res.setHeader('Content-Disposition', 'attachment; filename="analytics_export.csv"');
+      const now = new Date();
+      const d1 = new Date(now.getTime() - 2 * 86400000).toISOString();
+      const d2 = new Date(now.getTime() - 1 * 86400000).toISOString();
+      res.end([
+        'date,revenue,discount,tax,transactions,refunds,refund_count,net_revenue',
+        `${d1},105,0,5,1,5,1,100`,
+        `${d2},210,0,10,1,10,1,200`,
+      ].join('\n'));
+      return;
+    }
+    const { orgId, allowedStoreIds } = await getScope(req);
+    const interval = (String((req.query as any)?.interval || '').trim() || 'day');
+    const storeId = (String((req.query as any)?.store_id || '').trim() || undefined) as string | undefined;
+    const dateFrom = (String((req.query as any)?.date_from || '').trim() || undefined) as string | undefined;
+    const dateTo = (String((req.query as any)?.date_to || '').trim() || undefined) as string | undefined;
+
+    if (storeId && allowedStoreIds.length && !allowedStoreIds.includes(storeId)) {
+      return res.status(403).json({ error: 'Forbidden: store scope' });
     }
-    res.end();
+
+    await sendRenderedExport(res, { orgId, allowedStoreIds, storeId, dateFrom, dateTo, interval }, 'csv', 'analytics_export.csv');
   });
 
   // PDF export
@@ -1098,103 +1208,11 @@ export async function registerAnalyticsRoutes(app: Express) {
     const dateFrom = (String((req.query as any)?.date_from || '').trim() || undefined) as string | undefined;
     const dateTo = (String((req.query as any)?.date_to || '').trim() || undefined) as string | undefined;
 
-    const truncUnit = interval === 'month' ? 'month' : interval === 'week' ? 'week' : 'day';
-    const where: any[] = [];
-    if (orgId) where.push(eq(sales.orgId, orgId));
-    if (storeId) {
-      if (allowedStoreIds.length && !allowedStoreIds.includes(storeId)) return res.status(403).json({ error: 'Forbidden: store scope' });
-      where.push(eq(sales.storeId, storeId));
-    } else if (allowedStoreIds.length) {
-      where.push(inArray(sales.storeId, allowedStoreIds));
-    }
-    if (dateFrom) where.push(gte(sales.occurredAt, new Date(dateFrom)));
-    if (dateTo) where.push(lte(sales.occurredAt, new Date(dateTo)));
-
-    const salesAggregates = await getSalesAggregateExpressions();
-    const rows = await db.execute(sql`SELECT 
-      date_trunc(${sql.raw(`'${truncUnit}'`)}, occurred_at) as bucket,
-      ${sql.raw(salesAggregates.total)} as revenue,
-      ${sql.raw(salesAggregates.discount)} as discount,
-      ${sql.raw(salesAggregates.tax)} as tax,
-      COUNT(*) as transactions
-      FROM sales
-      ${where.length ? sql`WHERE ${sql.join(where, sql` AND `)}` : sql``}
-      GROUP BY 1
-      ORDER BY 1 ASC`);
-
-    const refundWhere: any[] = [];
-    if (orgId) refundWhere.push(eq(stores.orgId, orgId));
-    if (storeId) {
-      refundWhere.push(eq(returns.storeId, storeId));
-    } else if (allowedStoreIds.length) {
-      refundWhere.push(inArray(returns.storeId, allowedStoreIds));
-    }
-    if (dateFrom) refundWhere.push(gte(returns.occurredAt, new Date(dateFrom)));
-    if (dateTo) refundWhere.push(lte(returns.occurredAt, new Date(dateTo)));
-
-    const refundRows = await db.execute(sql`
-      SELECT 
-        date_trunc(${sql.raw(`'${truncUnit}'`)}, ${returns.occurredAt}) as bucket,
-        COALESCE(SUM(${returns.totalRefund}::numeric), 0) as refund_total,
-        COUNT(*) as refund_count
-      FROM ${returns}
-      JOIN stores ON stores.id = ${returns.storeId}
-      ${refundWhere.length ? sql`WHERE ${sql.join(refundWhere, sql` AND `)}` : sql``}
-      GROUP BY 1
-      ORDER BY 1 ASC
-    `);
-
-    const refundMap = new Map<string, { total: number; count: number }>();
-    for (const r of (refundRows as any).rows) {
-      const key = new Date(r.bucket).toISOString();
-      refundMap.set(key, {
-        total: Number(r.refund_total ?? 0),
-        count: Number(r.refund_count ?? 0),
-      });
-    }
-
-    res.setHeader('Content-Type', 'application/pdf');
-    res.setHeader('Content-Disposition', 'attachment; filename="analytics_report.pdf"');
-
-    const doc = new PDFDocument({ size: 'A4', margin: 50 });
-    doc.pipe(res);
-    doc.fontSize(18).text('Sales Analytics Report', { align: 'center' });
-    doc.moveDown();
-    doc.fontSize(10).text(`Interval: ${interval}`);
-    doc.fontSize(10).text(`Date range: ${dateFrom || 'N/A'} to ${dateTo || 'N/A'}`);
-    if (storeId) doc.fontSize(10).text(`Store: ${storeId}`);
-    doc.moveDown();
-
-    // Table header
-    doc.fontSize(12).text('Date', 50, doc.y, { continued: true });
-    doc.text('Revenue', 130, doc.y, { continued: true });
-    doc.text('Refunds', 210, doc.y, { continued: true });
-    doc.text('Net', 290, doc.y, { continued: true });
-    doc.text('Discount', 370, doc.y, { continued: true });
-    doc.text('Tax', 450, doc.y, { continued: true });
-    doc.text('Transactions', 510);
-    doc.moveDown(0.5);
-    doc.moveTo(50, doc.y).lineTo(550, doc.y).stroke();
-
-    for (const r of (rows as any).rows) {
-      const bucketDate = new Date(r.bucket);
-      const key = bucketDate.toISOString();
-      const refund = refundMap.get(key);
-      const refundTotal = refund?.total ?? 0;
-      const revenue = Number(r.revenue ?? 0);
-      const netRevenue = revenue - refundTotal;
-      const date = key.substring(0, 10);
-
-      doc.fontSize(10).text(date, 50, doc.y, { continued: true });
-      doc.text(String(r.revenue), 130, doc.y, { continued: true });
-      doc.text(String(refundTotal), 210, doc.y, { continued: true });
-      doc.text(String(netRevenue), 290, doc.y, { continued: true });
-      doc.text(String(r.discount), 370, doc.y, { continued: true });
-      doc.text(String(r.tax), 450, doc.y, { continued: true });
-      doc.text(String(r.transactions), 510);
+    if (storeId && allowedStoreIds.length && !allowedStoreIds.includes(storeId)) {
+      return res.status(403).json({ error: 'Forbidden: store scope' });
     }
 
-    doc.end();
+    await sendRenderedExport(res, { orgId, allowedStoreIds, storeId, dateFrom, dateTo, interval }, 'pdf', 'analytics_report.pdf');
   });
 
   app.post('/api/analytics/export.email', auth, requireActiveSubscription, async (req: Request, res: Response) => {
@@ -1206,61 +1224,8 @@ export async function registerAnalyticsRoutes(app: Express) {
       const dateFrom = (String((req.body as any)?.dateFrom || '').trim() || undefined) as string | undefined;
       const dateTo = (String((req.body as any)?.dateTo || '').trim() || undefined) as string | undefined;
 
-      const truncUnit = interval === 'month' ? 'month' : interval === 'week' ? 'week' : 'day';
-      const where: any[] = [];
-      if (orgId) where.push(eq(sales.orgId, orgId));
-      if (storeId) {
-        if (allowedStoreIds.length && !allowedStoreIds.includes(storeId)) {
-          return res.status(403).json({ error: 'Forbidden: store scope' });
-        }
-        where.push(eq(sales.storeId, storeId));
-      } else if (allowedStoreIds.length) {
-        where.push(inArray(sales.storeId, allowedStoreIds));
-      }
-      if (dateFrom) where.push(gte(sales.occurredAt, new Date(dateFrom)));
-      if (dateTo) where.push(lte(sales.occurredAt, new Date(dateTo)));
-
-      const salesAggregates = await getSalesAggregateExpressions();
-      const rows = await db.execute(sql`SELECT 
-        date_trunc(${sql.raw(`'${truncUnit}'`)}, occurred_at) as bucket,
-        ${sql.raw(salesAggregates.total)} as revenue,
-        ${sql.raw(salesAggregates.discount)} as discount,
-        ${sql.raw(salesAggregates.tax)} as tax,
-        COUNT(*) as transactions
-        FROM sales
-        ${where.length ? sql`WHERE ${sql.join(where, sql` AND `)}` : sql``}
-        GROUP BY 1
-        ORDER BY 1 ASC`);
-
-      const refundWhere: any[] = [];
-      if (orgId) refundWhere.push(eq(stores.orgId, orgId));
-      if (storeId) {
-        refundWhere.push(eq(returns.storeId, storeId));
-      } else if (allowedStoreIds.length) {
-        refundWhere.push(inArray(returns.storeId, allowedStoreIds));
-      }
-      if (dateFrom) refundWhere.push(gte(returns.occurredAt, new Date(dateFrom)));
-      if (dateTo) refundWhere.push(lte(returns.occurredAt, new Date(dateTo)));
-
-      const refundRows = await db.execute(sql`
-        SELECT 
-          date_trunc(${sql.raw(`'${truncUnit}'`)}, ${returns.occurredAt}) as bucket,
-          COALESCE(SUM(${returns.totalRefund}::numeric), 0) as refund_total,
-          COUNT(*) as refund_count
-        FROM ${returns}
-        JOIN stores ON stores.id = ${returns.storeId}
-        ${refundWhere.length ? sql`WHERE ${sql.join(refundWhere, sql` AND `)}` : sql``}
-        GROUP BY 1
-        ORDER BY 1 ASC
-      `);
-
-      const refundMap = new Map<string, { total: number; count: number }>();
-      for (const r of (refundRows as any).rows) {
-        const key = new Date(r.bucket).toISOString();
-        refundMap.set(key, {
-          total: Number(r.refund_total ?? 0),
-          count: Number(r.refund_count ?? 0),
-        });
+      if (storeId && allowedStoreIds.length && !allowedStoreIds.includes(storeId)) {
+        return res.status(403).json({ error: 'Forbidden: store scope' });
       }
 
       const userId = (req.session as any)?.userId as string | undefined;
@@ -1282,18 +1247,8 @@ export async function registerAnalyticsRoutes(app: Express) {
         return res.status(400).json({ error: 'User email not available for export' });
       }
 
-      let csv = 'date,revenue,discount,tax,transactions,refunds,refund_count,net_revenue\n';
-      for (const r of (rows as any).rows) {
-        const bucketDate = new Date(r.bucket);
-        const key = bucketDate.toISOString();
-        const refund = refundMap.get(key);
-        const refundTotal = refund?.total ?? 0;
-        const refundCount = refund?.count ?? 0;
-        const revenue = Number(r.revenue ?? 0);
-        const netRevenue = revenue - refundTotal;
-        const line = `${key},${r.revenue},${r.discount},${r.tax},${r.transactions},${refundTotal},${refundCount},${netRevenue}\n`;
-        csv += line;
-      }
+      const report = await loadAnalyticsExport({ orgId, allowedStoreIds, storeId, dateFrom, dateTo, interval });
+      const csv = await getReportRenderPool().render({ format: 'csv', report });
 
       const now = new Date();
       const filename = `analytics_export_${now.toISOString().substring(0, 10)}.csv`;
@@ -1317,6 +1272,10 @@ export async function registerAnalyticsRoutes(app: Express) {
 
       res.json({ ok: true });
     } catch (error) {
+      if (error instanceof ReportQueueFullError) {
+        res.setHeader('Retry-After', '5');
+        return res.status(503).json({ error: error.message });
+      }
       logger.error('Failed to email analytics CSV export', {
         error: error instanceof Error ? error.message : String(error),
       });
@@ -327,7 +327,7 @@ export async function registerAuthRoutes(app: Express) {
             verificationUrl,
             subscription?.trialEndDate ? new Date(subscription.trialEndDate) : undefined
           );
-          await sendEmail(verificationEmail);
+          await sendEmail(verificationEmail, { category: 'email_verification' });
         } catch (emailError) {
           logger.error('Failed to send signup verification email', {
             error: emailError instanceof Error ? emailError.message : String(emailError),
@@ -388,7 +388,7 @@ export async function registerAuthRoutes(app: Express) {
           otpCode,
           otpExpiresAt
         );
-        await sendEmail(otpEmail);
+        await sendEmail(otpEmail, { category: 'signup_otp' });
       } catch (otpError) {
         logger.error('Failed to send signup OTP email', {
           error: otpError instanceof Error ? otpError.message : String(otpError),
@@ -495,7 +495,7 @@ export async function registerAuthRoutes(app: Express) {
           otpCode,
           otpExpiresAt
         );
-        await sendEmail(otpEmail);
+        await sendEmail(otpEmail, { category: 'signup_otp' });
       } catch (otpError) {
         logger.error('Failed to send OTP resend email', {
           error: otpError instanceof Error ? otpError.message : String(otpError),
@@ -875,7 +875,7 @@ export async function registerAuthRoutes(app: Express) {
             otpCode,
             otpExpiresAt
           );
-          await sendEmail(otpEmail);
+          await sendEmail(otpEmail, { category: 'signup_otp' });
         } catch (otpError) {
           logger.error('Failed to send login-triggered OTP email', {
             error: otpError instanceof Error ? otpError.message : String(otpError),
@@ -1081,7 +1081,7 @@ export async function registerAuthRoutes(app: Express) {
         // Send password reset email (use template)
         const { generatePasswordResetEmail } = await import('../email');
         const resetEmail = generatePasswordResetEmail(user.email, token, (user as any).firstName || user.email);
-        await sendEmail(resetEmail);
+        await sendEmail(resetEmail, { category: 'password_reset' });
       }
       res.json({ message: 'If an account exists for this email, a password reset link has been sent.' });
     } catch (error) {
@@ -1114,7 +1114,7 @@ export async function registerAuthRoutes(app: Express) {
       // Send success email (use template)
       const { generatePasswordResetSuccessEmail } = await import('../email');
       const successEmail = generatePasswordResetSuccessEmail(user.email, (user as any).firstName || user.email);
-      await sendEmail(successEmail);
+      await sendEmail(successEmail, { category: 'password_reset' });
 
       res.json({ message: 'Password reset successful' });
     } catch (error) {
@@ -11,6 +11,8 @@ import type { CurrencyCode, Money } from '@shared/lib/currency';
 import { transactions, transactionItems, inventoryRevaluationEvents, stores, users, userRoles } from '@shared/schema';
 import { db } from '../db';
 import { logger } from '../lib/logger';
+import { reportContentType } from '../lib/report-render';
+import { renderReportCached, ReportQueueFullError } from '../lib/report-render-pool';
 import { requireAuth } from '../middleware/authz';
 import { requireActiveSubscription } from '../middleware/subscription';
 import { storage } from '../storage';
@@ -122,6 +124,290 @@ export interface ComprehensiveReportData {
     storeName?: string;
 }
 
+async function buildComprehensiveReport(
+    store: { id: string; name: string },
+    storeCurrency: CurrencyCode,
+    startDate: Date,
+    endDate: Date,
+    interval: string,
+): Promise<ComprehensiveReportData> {
+    const storeId = store.id;
+    const truncUnit = interval === 'month' ? 'month' : interval === 'week' ? 'week' : 'day';
+
+    // 1. Get Sales & COGS Aggregates (from transactions + transaction_items)
+    const salesWhere: any[] = [];
+    salesWhere.push(eq(transactions.storeId, storeId));
+    salesWhere.push(eq(transactions.status, 'completed'));
+    salesWhere.push(eq(transactions.kind, 'SALE'));
+    salesWhere.push(gte(transactions.createdAt, startDate));
+    salesWhere.push(lte(transactions.createdAt, endDate));
+
+    const salesRows = await db.execute(sql`
+        SELECT 
+            date_trunc(${sql.raw(`'${truncUnit}'`)}, ${transactions.createdAt}) as bucket,
+            COALESCE(SUM(${transactions.total}::numeric), 0) as revenue,
+            COALESCE(SUM(${transactions.taxAmount}::numeric), 0) as tax,
+            COUNT(*) as transactions,
+            COALESCE(SUM(items_sum.total_cost), 0) as cogs,
+            COALESCE(SUM(items_sum.promo_discount), 0) as promo_loss
+        FROM ${transactions}
+        LEFT JOIN (
+            SELECT transaction_id, SUM(total_cost) as total_cost, SUM(promotion_discount) as promo_discount
+            FROM ${transactionItems}
+            GROUP BY transaction_id
+        ) items_sum ON items_sum.transaction_id = ${transactions.id}
+        WHERE ${sql.join(salesWhere, sql` AND `)}
+        GROUP BY 1
+        ORDER BY 1 ASC
+    `);
+
+    // 2. Get Refund Aggregates
+    const refundWhere: any[] = [];
+    refundWhere.push(eq(transactions.storeId, storeId));
+    refundWhere.push(eq(transactions.status, 'completed'));
+    refundWhere.push(eq(transactions.kind, 'REFUND'));
+    refundWhere.push(gte(transactions.createdAt, startDate));
+    refundWhere.push(lte(transactions.createdAt, endDate));
+
+    const refundRows = await db.execute(sql`
+        SELECT 
+            date_trunc(${sql.raw(`'${truncUnit}'`)}, ${transactions.createdAt}) as bucket,
+            COALESCE(SUM(${transactions.total}::numeric), 0) as refund_total,
+            COALESCE(SUM(${transactions.taxAmount}::numeric), 0) as refund_tax,
+            COALESCE(SUM(items_sum.total_cost), 0) as refund_cogs,
+            COUNT(*) as refund_count
+        FROM ${transactions}
+        LEFT JOIN (
+            SELECT transaction_id, SUM(total_cost) as total_cost
+            FROM ${transactionItems}
+            GROUP BY transaction_id
+        ) items_sum ON items_sum.transaction_id = ${transactions.id}
+        WHERE ${sql.join(refundWhere, sql` AND `)}
+        GROUP BY 1
+        ORDER BY 1 ASC
+    `);
+
+    // 3. Get Stock Removal Loss (from inventory_revaluation_events)
+    const lossWhere: any[] = [];
+    lossWhere.push(eq(inventoryRevaluationEvents.storeId, storeId));
+    lossWhere.push(gte(inventoryRevaluationEvents.occurredAt, startDate));
+    lossWhere.push(lte(inventoryRevaluationEvents.occurredAt, endDate));
+    lossWhere.push(sql`${inventoryRevaluationEvents.source} LIKE 'stock_removal_%'`);
+
+    // Note: Currently assumes metadata contains 'lossAmount'. 
+    // We need to extract it from JSONB.
+    const lossRows = await db.execute(sql`
+        SELECT 
+            date_trunc(${sql.raw(`'${truncUnit}'`)}, ${inventoryRevaluationEvents.occurredAt}) as bucket,
+            COALESCE(SUM(CAST(${inventoryRevaluationEvents.metadata}->>'lossAmount' AS NUMERIC)), 0) as loss_amount,
+            COALESCE(SUM(CAST(${inventoryRevaluationEvents.metadata}->>'refundAmount' AS NUMERIC)), 0) as refund_amount
+        FROM ${inventoryRevaluationEvents}
+        WHERE ${sql.join(lossWhere, sql` AND `)}
+        GROUP BY 1
+        ORDER BY 1 ASC
+    `);
+
+    // Maps for easy lookup
+    const refundMap = new Map<string, { total: number; tax: number; cogs: number; count: number }>();
+    (refundRows.rows as any[]).forEach(r => {
+        refundMap.set(new Date(r.bucket).toISOString(), {
+            total: Number(r.refund_total),
+            tax: Number(r.refund_tax),
+            cogs: Number(r.refund_cogs),
+            count: Number(r.refund_count)
+        });
+    });
+
+    const lossMap = new Map<string, { loss: number; manufacturerRefund: number }>();
+    (lossRows.rows as any[]).forEach(r => {
+        lossMap.set(new Date(r.bucket).toISOString(), {
+            loss: Number(r.loss_amount),
+            manufacturerRefund: Number(r.refund_amount)
+        });
+    });
+
+    // Build Timeseries
+    const timeseries: ComprehensiveReportData['timeseries'] = [];
+    let totalRevenue = 0;
+    let totalTax = 0;
+    let totalTransactions = 0;
+    let totalCogs = 0; // This will continue to be Gross COGS (Sales)
+    let totalRefundCogs = 0; // New: Cost of Returns
+    let totalRefunds = 0; // Will track NET refunds
+    let totalRefundTax = 0;
+    let totalRefundCount = 0;
+    let totalStockLoss = 0;
+    let totalManufacturerRefund = 0;
+    let totalPromotionLoss = 0;
+
+    // Collect all unique dates
+    const allDates = new Set<string>();
+    (salesRows.rows as any[]).forEach(r => allDates.add(new Date(r.bucket).toISOString()));
+    refundMap.forEach((_, k) => allDates.add(k));
+    lossMap.forEach((_, k) => allDates.add(k));
+
+    const sortedDates = Array.from(allDates).sort();
+
+    // Create lookup for sales
+    const salesMap = new Map<string, any>();
+    (salesRows.rows as any[]).forEach(r => salesMap.set(new Date(r.bucket).toISOString(), r));
+
+    for (const dateKey of sortedDates) {
+        const s = salesMap.get(dateKey);
+        const r = refundMap.get(dateKey);
+        const l = lossMap.get(dateKey);
+
+        const revenue = Number(s?.revenue ?? 0);
+        const tax = Number(s?.tax ?? 0);
+        const txns = Number(s?.transactions ?? 0);
+        const cogs = Number(s?.cogs ?? 0);
+
+        const refundTotal = r?.total ?? 0; // Gross
+        const refundTax = r?.tax ?? 0;
+        const refundNet = refundTotal - refundTax;
+
+        const netTax = tax - refundTax; // New
+        const refundCogs = r?.cogs ?? 0; // Cost of Returns
+
+        const refundCount = r?.count ?? 0;
+        const netLossAmount = (l as any)?.loss ?? 0;
+        const manufacturerRefund = (l as any)?.manufacturerRefund ?? 0;
+
+        const netRevenue = (revenue - tax) - refundNet;
+        // Net COGS = Gross COGS (Sales) - Cost of Returns
+        const netCogs = cogs - refundCogs;
+
+        // Promotion loss from promo_discount field
+        const promotionLoss = Number(s?.promo_loss ?? 0);
+
+        // Profit = (Revenue - Tax) - RefundNet - Net COGS - Loss - Promotion Discounts
+        const profit = (revenue - tax) - refundNet - netCogs - netLossAmount - promotionLoss;
+
+        totalRevenue += revenue;
+        totalTax += tax;
+        totalTransactions += txns;
+        totalCogs += cogs;
+        totalRefundCogs += refundCogs;
+        totalRefunds += refundNet;
+        totalRefundTax += refundTax;
+        totalRefundCount += refundCount;
+        totalStockLoss += netLossAmount;
+        totalManufacturerRefund += manufacturerRefund;
+        totalPromotionLoss += promotionLoss;
+
+        timeseries.push({
+            date: dateKey,
+            revenue,
+            discount: 0,
+            tax,
+            netTax, // New
+            transactions: txns,
+            refunds: refundNet,
+            refundTax,
+            refundCount,
+            netRevenue,
+            cogs,        // Gross COGS
+            refundCogs,  // Cost of Returns
+            netCogs,     // New
+            stockLoss: netLossAmount,
+            manufacturerRefund,
+            grossStockLoss: netLossAmount + manufacturerRefund,
+            promotionLoss,
+            profit
+        });
+    }
+
+    // Summary Calculation
+    // totalRefunds is now NET refunds. totalRefundTax is TAX refunds.
+
+    // Net Revenue Use: (Sales - Tax) - (Refunds - TaxRefund) => (Sales - Tax) - NetRefunds
+    const summaryTotalNetRevenue = (totalRevenue - totalTax) - totalRefunds;
+
+    // Profit Calculation (matches loop)
+    const summaryNetSalesExTax = (totalRevenue - totalTax) - totalRefunds;
+    // Use Net COGS for summary profit
+    // But we display Gross COGS in summary properties usually?
+    // Let's ensure the frontend knows we have `refundCogs`.
+    const totalNetCogs = totalCogs - totalRefundCogs;
+    const summaryGrossProfit = summaryNetSalesExTax - totalNetCogs;
+    // Note: Use Gross Profit as simply Net Sales - COGS.
+
+    const summaryNetProfit = summaryGrossProfit - totalStockLoss - totalPromotionLoss;
+    const profitMargin = summaryNetSalesExTax > 0 ? (summaryNetProfit / summaryNetSalesExTax) * 100 : 0;
+    const avgOrderValue = totalTransactions > 0 ? totalRevenue / totalTransactions : 0;
+
+    // 4. Get Top Products
+    const topProducts = [];
+    try {
+        const popularProducts = await storage.getPopularProducts(storeId, 10);
+        for (const item of popularProducts) {
+            const priceAmount = Number(item.product?.price ?? item.product?.salePrice ?? 0);
+            topProducts.push({
+                productId: item.product.id,
+                name: item.product.name,
+                sku: item.product.sku,
+                salesCount: item.salesCount,
+                revenue: toMoney(priceAmount * item.salesCount, storeCurrency),
+            });
+        }
+    } catch (err) {
+        logger.warn('Failed to get popular products for comprehensive report', { error: err });
+    }
+
+    const reportData: ComprehensiveReportData = {
+        period: {
+            start: startDate.toISOString(),
+            end: endDate.toISOString(),
+        },
+        currency: storeCurrency,
+        summary: {
+            totalRevenue: toMoney(totalRevenue, storeCurrency),
+            totalRefunds: toMoney(totalRefunds, storeCurrency), // Displaying NET refunds now? User said "remove tax refund values from refunds". Yes.
+            refundTax: toMoney(totalRefundTax, storeCurrency), // New field
+            netRevenue: toMoney(summaryTotalNetRevenue, storeCurrency),
+            totalDiscount: toMoney(0, storeCurrency), // Placeholder
+            totalTax: toMoney(totalTax, storeCurrency),
+            netTax: toMoney(totalTax - totalRefundTax, storeCurrency), // New
+            transactionCount: totalTransactions,
+            refundCount: totalRefundCount,
+            averageOrderValue: toMoney(avgOrderValue, storeCurrency),
+            cogs: toMoney(totalCogs, storeCurrency),
+            refundCogs: toMoney(totalRefundCogs, storeCurrency),
+            netCogs: toMoney(totalNetCogs, storeCurrency), // New
+            stockLoss: toMoney(totalStockLoss, storeCurrency),
+            manufacturerRefund: toMoney(totalManufacturerRefund, storeCurrency),
+            grossStockLoss: toMoney(totalStockLoss + totalManufacturerRefund, storeCurrency),
+            promotionLoss: toMoney(totalPromotionLoss, storeCurrency), // New
+            grossProfit: toMoney(summaryGrossProfit, storeCurrency),
+            netProfit: toMoney(summaryNetProfit, storeCurrency),
+            profitMargin: roundAmount(profitMargin),
+        },
+        timeseries,
+        topProducts,
+        storeName: store.name,
+    };
+
+    return reportData;
+}
+
+// Fingerprint of the data a comprehensive report covers, used to key cached renders.
+async function getComprehensiveReportWatermark(storeId: string, startDate: Date, endDate: Date): Promise<string> {
+    const result = await db.execute(sql`
+        SELECT
+            (SELECT COUNT(*) || ':' || COALESCE(MAX(${transactions.createdAt})::text, '')
+                FROM ${transactions}
+                WHERE ${transactions.storeId} = ${storeId}
+                  AND ${transactions.createdAt} >= ${startDate}
+                  AND ${transactions.createdAt} <= ${endDate}) as txn_mark,
+            (SELECT COUNT(*) || ':' || COALESCE(MAX(${inventoryRevaluationEvents.occurredAt})::text, '')
+                FROM ${inventoryRevaluationEvents}
+                WHERE ${inventoryRevaluationEvents.storeId} = ${storeId}
+                  AND ${inventoryRevaluationEvents.occurredAt} >= ${startDate}
+                  AND ${inventoryRevaluationEvents.occurredAt} <= ${endDate}) as loss_mark
+    `);
+    const row = ((result as any).rows ?? [])[0] ?? {};
+    return `${row.txn_mark ?? ''}|${row.loss_mark ?? ''}`;
+}
 
 export async function registerComprehensiveReportRoutes(app: Express) {
     const auth = (req: Request, res: Response, next: any) => {
@@ -157,271 +443,65 @@ export async function registerComprehensiveReportRoutes(app: Express) {
             }
 
             const storeCurrency = coerceCurrency(store.currency ?? 'NGN', 'NGN');
-            const endDate = dateTo ? new Date(dateTo) : new Date();
+            // An open-ended range runs to the end of today (UTC), so exports of it share a
+            // cache key for the day; the watermark still changes with every sale
+            const endDate = dateTo ? new Date(dateTo) : new Date(new Date().setUTCHours(23, 59, 59, 999));
             const startDate = dateFrom ? new Date(dateFrom) : new Date(endDate.getTime() - 30 * 24 * 60 * 60 * 1000);
 
             if (Number.isNaN(startDate.getTime()) || Number.isNaN(endDate.getTime())) {
                 return res.status(400).json({ error: 'Invalid date range supplied' });
             }
 
-            const truncUnit = interval === 'month' ? 'month' : interval === 'week' ? 'week' : 'day';
-
-            // 1. Get Sales & COGS Aggregates (from transactions + transaction_items)
-            const salesWhere: any[] = [];
-            salesWhere.push(eq(transactions.storeId, storeId));
-            salesWhere.push(eq(transactions.status, 'completed'));
-            salesWhere.push(eq(transactions.kind, 'SALE'));
-            salesWhere.push(gte(transactions.createdAt, startDate));
-            salesWhere.push(lte(transactions.createdAt, endDate));
-
-            const salesRows = await db.execute(sql`
-                SELECT 
-                    date_trunc(${sql.raw(`'${truncUnit}'`)}, ${transactions.createdAt}) as bucket,
-                    COALESCE(SUM(${transactions.total}::numeric), 0) as revenue,
-                    COALESCE(SUM(${transactions.taxAmount}::numeric), 0) as tax,
-                    COUNT(*) as transactions,
-                    COALESCE(SUM(items_sum.total_cost), 0) as cogs,
-                    COALESCE(SUM(items_sum.promo_discount), 0) as promo_loss
-                FROM ${transactions}
-                LEFT JOIN (
-                    SELECT transaction_id, SUM(total_cost) as total_cost, SUM(promotion_discount) as promo_discount
-                    FROM ${transactionItems}
-                    GROUP BY transaction_id
-                ) items_sum ON items_sum.transaction_id = ${transactions.id}
-                WHERE ${sql.join(salesWhere, sql` AND `)}
-                GROUP BY 1
-                ORDER BY 1 ASC
-            `);
-
-            // 2. Get Refund Aggregates
-            const refundWhere: any[] = [];
-            refundWhere.push(eq(transactions.storeId, storeId));
-            refundWhere.push(eq(transactions.status, 'completed'));
-            refundWhere.push(eq(transactions.kind, 'REFUND'));
-            refundWhere.push(gte(transactions.createdAt, startDate));
-            refundWhere.push(lte(transactions.createdAt, endDate));
-
-            const refundRows = await db.execute(sql`
-                SELECT 
-                    date_trunc(${sql.raw(`'${truncUnit}'`)}, ${transactions.createdAt}) as bucket,
-                    COALESCE(SUM(${transactions.total}::numeric), 0) as refund_total,
-                    COALESCE(SUM(${transactions.taxAmount}::numeric), 0) as refund_tax,
-                    COALESCE(SUM(items_sum.total_cost), 0) as refund_cogs,
-                    COUNT(*) as refund_count
-                FROM ${transactions}
-                LEFT JOIN (
-                    SELECT transaction_id, SUM(total_cost) as total_cost
-                    FROM ${transactionItems}
-                    GROUP BY transaction_id
-                ) items_sum ON items_sum.transaction_id = ${transactions.id}
-                WHERE ${sql.join(refundWhere, sql` AND `)}
-                GROUP BY 1
-                ORDER BY 1 ASC
-            `);
-
-            // 3. Get Stock Removal Loss (from inventory_revaluation_events)
-            const lossWhere: any[] = [];
-            lossWhere.push(eq(inventoryRevaluationEvents.storeId, storeId));
-            lossWhere.push(gte(inventoryRevaluationEvents.occurredAt, startDate));
-            lossWhere.push(lte(inventoryRevaluationEvents.occurredAt, endDate));
-            lossWhere.push(sql`${inventoryRevaluationEvents.source} LIKE 'stock_removal_%'`);
-
-            // Note: Currently assumes metadata contains 'lossAmount'. 
-            // We need to extract it from JSONB.
-            const lossRows = await db.execute(sql`
-                SELECT 
-                    date_trunc(${sql.raw(`'${truncUnit}'`)}, ${inventoryRevaluationEvents.occurredAt}) as bucket,
-                    COALESCE(SUM(CAST(${inventoryRevaluationEvents.metadata}->>'lossAmount' AS NUMERIC)), 0) as loss_amount,
-                    COALESCE(SUM(CAST(${inventoryRevaluationEvents.metadata}->>'refundAmount' AS NUMERIC)), 0) as refund_amount
-                FROM ${inventoryRevaluationEvents}
-                WHERE ${sql.join(lossWhere, sql` AND `)}
-                GROUP BY 1
-                ORDER BY 1 ASC
-            `);
-
-            // Maps for easy lookup
-            const refundMap = new Map<string, { total: number; tax: number; cogs: number; count: number }>();
-            (refundRows.rows as any[]).forEach(r => {
-                refundMap.set(new Date(r.bucket).toISOString(), {
-                    total: Number(r.refund_total),
-                    tax: Number(r.refund_tax),
-                    cogs: Number(r.refund_cogs),
-                    count: Number(r.refund_count)
-                });
-            });
-
-            const lossMap = new Map<string, { loss: number; manufacturerRefund: number }>();
-            (lossRows.rows as any[]).forEach(r => {
-                lossMap.set(new Date(r.bucket).toISOString(), {
-                    loss: Number(r.loss_amount),
-                    manufacturerRefund: Number(r.refund_amount)
+            const format = String((req.query as any)?.format || '').trim().toLowerCase();
+            if (format === 'csv' || format === 'pdf') {
+                const watermark = await getComprehensiveReportWatermark(storeId, startDate, endDate);
+                const { stream, buffer, cached } = await renderReportCached({
+                    orgId: store.orgId,
+                    params: {
+                        report: 'comprehensive',
+                        storeId,
+                        start: startDate.toISOString(),
+                        end: endDate.toISOString(),
+                        interval,
+                    },
+                    watermark,
+                    format,
+                    load: async () => {
+                        const data = await buildComprehensiveReport(store, storeCurrency, startDate, endDate, interval);
+                        return {
+                            kind: 'comprehensive',
+                            storeName: data.storeName,
+                            currency: data.currency,
+                            period: data.period,
+                            summary: data.summary,
+                            timeseries: data.timeseries,
+                        };
+                    },
                 });
-            });
 
-            // Build Timeseries
-            const timeseries: ComprehensiveReportData['timeseries'] = [];
-            let totalRevenue = 0;
-            let totalTax = 0;
-            let totalTransactions = 0;
-            let totalCogs = 0; // This will continue to be Gross COGS (Sales)
-            let totalRefundCogs = 0; // New: Cost of Returns
-            let totalRefunds = 0; // Will track NET refunds
-            let totalRefundTax = 0;
-            let totalRefundCount = 0;
-            let totalStockLoss = 0;
-            let totalManufacturerRefund = 0;
-            let totalPromotionLoss = 0;
-
-            // Collect all unique dates
-            const allDates = new Set<string>();
-            (salesRows.rows as any[]).forEach(r => allDates.add(new Date(r.bucket).toISOString()));
-            refundMap.forEach((_, k) => allDates.add(k));
-            lossMap.forEach((_, k) => allDates.add(k));
-
-            const sortedDates = Array.from(allDates).sort();
-
-            // Create lookup for sales
-            const salesMap = new Map<string, any>();
-            (salesRows.rows as any[]).forEach(r => salesMap.set(new Date(r.bucket).toISOString(), r));
-
-            for (const dateKey of sortedDates) {
-                const s = salesMap.get(dateKey);
-                const r = refundMap.get(dateKey);
-                const l = lossMap.get(dateKey);
-
-                const revenue = Number(s?.revenue ?? 0);
-                const tax = Number(s?.tax ?? 0);
-                const txns = Number(s?.transactions ?? 0);
-                const cogs = Number(s?.cogs ?? 0);
-
-                const refundTotal = r?.total ?? 0; // Gross
-                const refundTax = r?.tax ?? 0;
-                const refundNet = refundTotal - refundTax;
-
-                const netTax = tax - refundTax; // New
-                const refundCogs = r?.cogs ?? 0; // Cost of Returns
-
-                const refundCount = r?.count ?? 0;
-                const netLossAmount = (l as any)?.loss ?? 0;
-                const manufacturerRefund = (l as any)?.manufacturerRefund ?? 0;
-
-                const netRevenue = (revenue - tax) - refundNet;
-                // Net COGS = Gross COGS (Sales) - Cost of Returns
-                const netCogs = cogs - refundCogs;
-
-                // Promotion loss from promo_discount field
-                const promotionLoss = Number(s?.promo_loss ?? 0);
-
-                // Profit = (Revenue - Tax) - RefundNet - Net COGS - Loss - Promotion Discounts
-                const profit = (revenue - tax) - refundNet - netCogs - netLossAmount - promotionLoss;
-
-                totalRevenue += revenue;
-                totalTax += tax;
-                totalTransactions += txns;
-                totalCogs += cogs;
-                totalRefundCogs += refundCogs;
-                totalRefunds += refundNet;
-                totalRefundTax += refundTax;
-                totalRefundCount += refundCount;
-                totalStockLoss += netLossAmount;
-                totalManufacturerRefund += manufacturerRefund;
-                totalPromotionLoss += promotionLoss;
-
-                timeseries.push({
-                    date: dateKey,
-                    revenue,
-                    discount: 0,
-                    tax,
-                    netTax, // New
-                    transactions: txns,
-                    refunds: refundNet,
-                    refundTax,
-                    refundCount,
-                    netRevenue,
-                    cogs,        // Gross COGS
-                    refundCogs,  // Cost of Returns
-                    netCogs,     // New
-                    stockLoss: netLossAmount,
-                    manufacturerRefund,
-                    grossStockLoss: netLossAmount + manufacturerRefund,
-                    promotionLoss,
-                    profit
-                });
-            }
-
-            // Summary Calculation
-            // totalRefunds is now NET refunds. totalRefundTax is TAX refunds.
-
-            // Net Revenue Use: (Sales - Tax) - (Refunds - TaxRefund) => (Sales - Tax) - NetRefunds
-            const summaryTotalNetRevenue = (totalRevenue - totalTax) - totalRefunds;
-
-            // Profit Calculation (matches loop)
-            const summaryNetSalesExTax = (totalRevenue - totalTax) - totalRefunds;
-            // Use Net COGS for summary profit
-            // But we display Gross COGS in summary properties usually?
-            // Let's ensure the frontend knows we have `refundCogs`.
-            const totalNetCogs = totalCogs - totalRefundCogs;
-            const summaryGrossProfit = summaryNetSalesExTax - totalNetCogs;
-            // Note: Use Gross Profit as simply Net Sales - COGS.
-
-            const summaryNetProfit = summaryGrossProfit - totalStockLoss - totalPromotionLoss;
-            const profitMargin = summaryNetSalesExTax > 0 ? (summaryNetProfit / summaryNetSalesExTax) * 100 : 0;
-            const avgOrderValue = totalTransactions > 0 ? totalRevenue / totalTransactions : 0;
-
-            // 4. Get Top Products
-            const topProducts = [];
-            try {
-                const popularProducts = await storage.getPopularProducts(storeId, 10);
-                for (const item of popularProducts) {
-                    const priceAmount = Number(item.product?.price ?? item.product?.salePrice ?? 0);
-                    topProducts.push({
-                        productId: item.product.id,
-                        name: item.product.name,
-                        sku: item.product.sku,
-                        salesCount: item.salesCount,
-                        revenue: toMoney(priceAmount * item.salesCount, storeCurrency),
+                const filename = `sales-report-${startDate.toISOString().substring(0, 10)}-to-${endDate.toISOString().substring(0, 10)}.${format}`;
+                res.setHeader('Content-Type', reportContentType(format));
+                res.setHeader('Content-Disposition', `attachment; filename="${filename}"`);
+                res.setHeader('X-Report-Cache', cached ? 'HIT' : 'MISS');
+                if (stream) {
+                    stream.on('error', (error) => {
+                        logger.error('Failed to stream cached comprehensive report', { error: error.message });
+                        res.destroy(error);
                     });
+                    stream.pipe(res);
+                    return;
                 }
-            } catch (err) {
-                logger.warn('Failed to get popular products for comprehensive report', { error: err });
+                return res.end(buffer);
             }
 
-            const reportData: ComprehensiveReportData = {
-                period: {
-                    start: startDate.toISOString(),
-                    end: endDate.toISOString(),
-                },
-                currency: storeCurrency,
-                summary: {
-                    totalRevenue: toMoney(totalRevenue, storeCurrency),
-                    totalRefunds: toMoney(totalRefunds, storeCurrency), // Displaying NET refunds now? User said "remove tax refund values from refunds". Yes.
-                    refundTax: toMoney(totalRefundTax, storeCurrency), // New field
-                    netRevenue: toMoney(summaryTotalNetRevenue, storeCurrency),
-                    totalDiscount: toMoney(0, storeCurrency), // Placeholder
-                    totalTax: toMoney(totalTax, storeCurrency),
-                    netTax: toMoney(totalTax - totalRefundTax, storeCurrency), // New
-                    transactionCount: totalTransactions,
-                    refundCount: totalRefundCount,
-                    averageOrderValue: toMoney(avgOrderValue, storeCurrency),
-                    cogs: toMoney(totalCogs, storeCurrency),
-                    refundCogs: toMoney(totalRefundCogs, storeCurrency),
-                    netCogs: toMoney(totalNetCogs, storeCurrency), // New
-                    stockLoss: toMoney(totalStockLoss, storeCurrency),
-                    manufacturerRefund: toMoney(totalManufacturerRefund, storeCurrency),
-                    grossStockLoss: toMoney(totalStockLoss + totalManufacturerRefund, storeCurrency),
-                    promotionLoss: toMoney(totalPromotionLoss, storeCurrency), // New
-                    grossProfit: toMoney(summaryGrossProfit, storeCurrency),
-                    netProfit: toMoney(summaryNetProfit, storeCurrency),
-                    profitMargin: roundAmount(profitMargin),
-                },
-                timeseries,
-                topProducts,
-                storeName: store.name,
-            };
-
+            const reportData = await buildComprehensiveReport(store, storeCurrency, startDate, endDate, interval);
             res.json(reportData);
 
         } catch (error) {
+            if (error instanceof ReportQueueFullError) {
+                res.setHeader('Retry-After', '5');
+                return res.status(503).json({ error: error.message });
+            }
             logger.error('Failed to generate comprehensive report', {
                 error: error instanceof Error ? error.message : String(error),
             });
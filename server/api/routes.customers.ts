@@ -1,19 +1,33 @@
 import { parse as csvParse } from 'csv-parse';
-import { and, eq } from 'drizzle-orm';
+import { and, eq, sql } from 'drizzle-orm';
 import type { Express, Request, Response } from 'express';
 import multer from 'multer';
 import { z } from 'zod';
 import { customers, users } from '@shared/schema';
 import { db } from '../db';
+import { CUSTOMER_CHANGES_MAX_PAGE, listCustomerChanges, normalizeCustomerPhone } from '../lib/customer-lookup';
 import { logger } from '../lib/logger';
 import { requireAuth, enforceIpWhitelist, requireRole } from '../middleware/authz';
 import { sensitiveEndpointRateLimit } from '../middleware/security';
+import { resolveStoreAccess } from '../middleware/store-access';
 
 const CreateCustomerSchema = z.object({
   phone: z.string().min(3).max(32),
   name: z.string().max(255).optional().nullable(),
 });
 
+const CustomerChangesQuerySchema = z.object({
+  storeId: z.string().uuid(),
+  cursor: z.string().max(512).optional(),
+  limit: z.coerce.number().int().min(1).max(CUSTOMER_CHANGES_MAX_PAGE).optional(),
+});
+
+// Normalized numbers match on phone_e164; anything else keeps the exact raw match
+function phoneMatch(storeId: string, phone: string) {
+  const e164 = normalizeCustomerPhone(phone);
+  return and(eq(customers.storeId, storeId), e164 ? eq(customers.phoneE164, e164) : eq(customers.phone, phone));
+}
+
 export async function registerCustomerRoutes(app: Express) {
   // GET /customers?phone= - lookup loyalty customer by phone
   app.get('/api/customers', requireAuth, enforceIpWhitelist, async (req: Request, res: Response) => {
@@ -35,7 +49,7 @@ export async function registerCustomerRoutes(app: Express) {
         currentPoints: customers.currentPoints,
         lifetimePoints: customers.lifetimePoints,
         loyaltyNumber: customers.loyaltyNumber,
-      }).from(customers).where(and(eq(customers.storeId, storeId), eq(customers.phone, phone))).limit(1);
+      }).from(customers).where(phoneMatch(storeId, phone)).limit(1);
       
       const customer = rows[0];
       if (customer) {
@@ -57,6 +71,31 @@ export async function registerCustomerRoutes(app: Express) {
     }
   });
 
+  // GET /customers/changes?storeId=&cursor= - customers created or changed since
+  // the cursor, for the till-side customer cache
+  app.get('/api/customers/changes', requireAuth, enforceIpWhitelist, async (req: Request, res: Response) => {
+    const parsed = CustomerChangesQuerySchema.safeParse(req.query);
+    if (!parsed.success) return res.status(400).json({ error: 'Invalid query' });
+    try {
+      const access = await resolveStoreAccess(req, parsed.data.storeId, { allowCashier: true });
+      if ('error' in access) {
+        return res.status(access.error.status).json({ error: access.error.message });
+      }
+      const page = await listCustomerChanges(db, parsed.data.storeId, {
+        cursor: parsed.data.cursor,
+        limit: parsed.data.limit,
+      });
+      res.json(page);
+    } catch (error) {
+      logger.error('Failed to list customer changes', {
+        userId: req.session?.userId,
+        storeId: parsed.data.storeId,
+        error: error instanceof Error ? error.message : String(error)
+      });
+      res.status(500).json({ error: 'Failed to list customer changes' });
+    }
+  });
+
   // POST /customers - create a new loyalty customer
   app.post('/api/customers', requireAuth, enforceIpWhitelist, async (req: Request, res: Response) => {
     const parsed = CreateCustomerSchema.safeParse(req.body);
@@ -65,25 +104,31 @@ export async function registerCustomerRoutes(app: Express) {
       const storeId = String(req.body?.storeId || (req.query as any)?.storeId || '').trim();
       if (!storeId) return res.status(400).json({ error: 'storeId is required' });
 
-      // Check if customer already exists by phone
-      const existing = await db.select().from(customers).where(and(eq(customers.storeId, storeId), eq(customers.phone, parsed.data.phone))).limit(1);
-      if (existing[0]) return res.json(existing[0]);
-
       // Parse name into firstName/lastName
       const nameParts = (parsed.data.name || '').trim().split(' ');
       const firstName = nameParts[0] || 'Customer';
       const lastName = nameParts.slice(1).join(' ') || '';
+      const phoneE164 = normalizeCustomerPhone(parsed.data.phone);
 
-      const [created] = await db.insert(customers).values({
+      // Inserts unless the normalized number is already on file for this store
+      const values = {
         storeId,
         phone: parsed.data.phone,
+        phoneE164,
         firstName,
         lastName,
         currentPoints: 0,
         lifetimePoints: 0,
-      } as typeof customers.$inferInsert).returning();
+      } as typeof customers.$inferInsert;
+      const [created] = phoneE164
+        ? await db.insert(customers).values(values)
+          .onConflictDoNothing({ target: [customers.storeId, customers.phoneE164], where: sql`phone_e164 IS NOT NULL` })
+          .returning()
+        : await db.insert(customers).values(values).returning();
+      if (created) return res.status(201).json(created);
 
-      return res.status(201).json(created);
+      const existing = await db.select().from(customers).where(phoneMatch(storeId, parsed.data.phone)).limit(1);
+      return res.json(existing[0]);
     } catch (error) {
       logger.error('Failed to create customer', {
         userId: req.session?.userId,
@@ -182,7 +227,7 @@ export async function registerCustomerRoutes(app: Express) {
             const byPhone = await db
               .select()
               .from(customers)
-              .where(and(eq(customers.storeId, storeId), eq(customers.phone, record.phone)))
+              .where(phoneMatch(storeId, record.phone))
               .limit(1);
             if (byPhone[0]) {
               existingRow = byPhone[0];
@@ -217,12 +262,13 @@ export async function registerCustomerRoutes(app: Express) {
               }
               if (record.phone && existingRow.phone !== record.phone) {
                 updatePayload.phone = record.phone;
+                updatePayload.phoneE164 = normalizeCustomerPhone(record.phone);
               }
 
               if (Object.keys(updatePayload).length > 0) {
                 await db
                   .update(customers)
-                  .set(updatePayload as any)
+                  .set({ ...updatePayload, updatedAt: new Date() } as any)
                   .where(eq(customers.id, existingRow.id));
               }
 
@@ -234,7 +280,7 @@ export async function registerCustomerRoutes(app: Express) {
               const lastName = nameParts.slice(1).join(' ') || '';
               await db
                 .insert(customers)
-                .values({ storeId, phone: record.phone, email: emailValue ?? null, firstName, lastName, currentPoints: 0, lifetimePoints: 0 } as typeof customers.$inferInsert);
+                .values({ storeId, phone: record.phone, phoneE164: normalizeCustomerPhone(record.phone), email: emailValue ?? null, firstName, lastName, currentPoints: 0, lifetimePoints: 0 } as typeof customers.$inferInsert);
               created += 1;
             }
           } catch (processingError) {
@@ -7,6 +7,13 @@ import path from 'path';
 import { z } from 'zod';
 import { importJobs, products, stores, users, lowStockAlerts, inventory } from '@shared/schema';
 import { db } from '../db';
+import {
+  InventoryListingQuerySchema,
+  buildListingEtag,
+  parseFieldList,
+  projectFields,
+  resolveListingWindow,
+} from '../lib/inventory-listing';
 import { logger, extractLogContext } from '../lib/logger';
 import { securityAuditService } from '../lib/security-audit';
 import { requireAuth, enforceIpWhitelist, requireManagerWithStore, requireRole } from '../middleware/authz';
@@ -462,26 +469,40 @@ export async function registerInventoryRoutes(app: Express) {
       return res.status(access.error.status).json({ error: access.error.message });
     }
 
-    const categoryFilter = typeof req.query?.category === 'string' ? req.query.category.trim() : '';
-    const lowStockFilter = String(req.query?.lowStock ?? '').toLowerCase() === 'true';
-
-    const inventoryItems = await storage.getInventoryByStore(storeId);
-
-    let filtered = inventoryItems;
-    if (categoryFilter) {
-      filtered = filtered.filter((item) => (item.product as any)?.category === categoryFilter);
+    const parsedQuery = InventoryListingQuerySchema.safeParse(req.query ?? {});
+    if (!parsedQuery.success) {
+      return res.status(400).json({ error: 'Invalid query parameters', details: parsedQuery.error.flatten() });
     }
-    if (lowStockFilter) {
-      filtered = filtered.filter((item) => (item.quantity ?? 0) <= (item.minStockLevel ?? 0));
+    const query = parsedQuery.data;
+
+    // The manager screen polls this endpoint; answer unchanged listings from the
+    // store's listing version (one aggregate over the row stamps) without
+    // building the listing
+    const version = await storage.getInventoryListingVersion(storeId);
+    if (version) {
+      res.setHeader('ETag', buildListingEtag(storeId, version, query));
+      res.setHeader('Cache-Control', 'private, no-cache');
+      if (req.fresh) {
+        return res.status(304).end();
+      }
     }
 
-    const currency = filtered[0]?.storeCurrency ?? inventoryItems[0]?.storeCurrency ?? 'USD';
+    const window = resolveListingWindow(query);
+    const listing = await storage.listInventoryByStore(storeId, {
+      category: query.category || undefined,
+      lowStock: query.lowStock,
+      limit: window?.limit,
+      offset: window?.offset,
+    });
+    const fields = parseFieldList(query.fields);
 
     const response = {
       storeId,
-      currency,
-      totalProducts: inventoryItems.length,
-      items: filtered.map((item) => ({
+      currency: listing.storeCurrency ?? listing.items[0]?.storeCurrency ?? 'USD',
+      totalProducts: listing.totalProducts,
+      total: listing.total,
+      ...(window ? { page: window.page, pageSize: window.pageSize } : {}),
+      items: listing.items.map((item) => projectFields({
         id: item.id,
         productId: item.productId,
         quantity: item.quantity,
@@ -504,7 +525,7 @@ export async function registerInventoryRoutes(app: Express) {
             salePrice: (item.product as any)?.salePrice ?? (item.product as any)?.price ?? null,
           }
           : null,
-      })),
+      }, fields)),
     };
 
     return res.json(response);
@@ -1159,18 +1180,15 @@ export async function registerInventoryRoutes(app: Express) {
     }
 
     try {
-      const results = [] as Array<{ productId: string; quantity: number }>;
-      for (const update of sanitizedUpdates) {
-        const costUpdate = buildCostUpdatePayload(update.costPrice, update.salePrice);
-        const updated = await storage.updateInventory(
-          update.productId,
-          storeId,
-          costUpdate
-            ? { quantity: update.quantity, costUpdate, source: 'bulk_update' } as any
-            : ({ quantity: update.quantity } as any),
-        );
-        results.push({ productId: update.productId, quantity: updated.quantity });
-      }
+      const userId = req.session?.userId as string | undefined;
+      const results = await storage.bulkUpdateInventory(
+        storeId,
+        sanitizedUpdates.map((update) => ({
+          ...update,
+          source: buildCostUpdatePayload(update.costPrice, update.salePrice) ? 'bulk_update' : undefined,
+        })),
+        userId,
+      );
       return res.json(results);
     } catch (error) {
       logger.error('Bulk inventory update failed', {
@@ -1217,7 +1235,8 @@ export async function registerInventoryRoutes(app: Express) {
     }
 
     try {
-      const results = await storage.performStockCount(storeId, sanitizedItems);
+      const userId = req.session?.userId as string | undefined;
+      const results = await storage.performStockCount(storeId, sanitizedItems, userId);
       return res.json(results);
     } catch (error) {
       logger.error('Stock count failed', {
@@ -15,6 +15,8 @@ import {
 } from '@shared/schema';
 import { db } from '../db';
 import { logger } from '../lib/logger';
+import { postLoyaltyEntries, postLoyaltyEntriesOrThrow, type LoyaltyEntry } from '../lib/loyalty-ledger';
+import { runInTransaction } from '../lib/tx-executor';
 import { requireAuth, enforceIpWhitelist, requireRole } from '../middleware/authz';
 import { sensitiveEndpointRateLimit } from '../middleware/security';
 
@@ -577,6 +579,26 @@ export async function registerLoyaltyRoutes(app: Express) {
       }
 
       const invalidRows: Array<{ row: any; error: string }> = [];
+      // Point balances move through the ledger in one batch once the rows are written
+      const pointEntries: LoyaltyEntry[] = [];
+      const rowByCustomer = new Map<string, any>();
+      const pendingPoints = new Map<string, number>();
+      const importPoints = (customerId: string, stored: number, target: number, row: any) => {
+        // A customer matched by several rows ends at the last row's points
+        const pending = pendingPoints.get(customerId) ?? 0;
+        const delta = target - stored - pending;
+        if (delta === 0) return;
+        pendingPoints.set(customerId, pending + delta);
+        pointEntries.push({
+          holderKind: 'customer',
+          holderId: customerId,
+          delta,
+          entryType: 'adjust',
+          reason: 'Loyalty CSV import',
+          source: 'loyalty_import',
+        });
+        rowByCustomer.set(customerId, row);
+      };
       let created = 0;
       let updated = 0;
       let skipped = 0;
@@ -663,7 +685,6 @@ export async function registerLoyaltyRoutes(app: Express) {
             if (loyaltyNumber && existing.loyaltyNumber !== loyaltyNumber) updatePayload.loyaltyNumber = loyaltyNumber;
             if (existing.firstName !== firstName) updatePayload.firstName = firstName;
             if (existing.lastName !== lastName) updatePayload.lastName = lastName;
-            if (existing.currentPoints !== currentPoints) updatePayload.currentPoints = currentPoints;
             if (existing.lifetimePoints !== lifetimePoints) updatePayload.lifetimePoints = lifetimePoints;
             if (existing.isActive !== isActiveParsed) updatePayload.isActive = isActiveParsed;
             if (memberSinceParsed && existing.createdAt.toISOString() !== memberSinceParsed.toISOString()) {
@@ -676,6 +697,7 @@ export async function registerLoyaltyRoutes(app: Express) {
                 .set({ ...updatePayload, updatedAt: new Date() } as any)
                 .where(eq(loyaltyCustomers.id, existing.id));
             }
+            importPoints(existing.id, existing.currentPoints ?? 0, currentPoints, raw);
 
             updated += 1;
             continue;
@@ -685,18 +707,19 @@ export async function registerLoyaltyRoutes(app: Express) {
             loyaltyNumber = await generateUniqueLoyaltyNumber();
           }
 
-          await db.insert(loyaltyCustomers).values({
+          const [inserted] = await db.insert(loyaltyCustomers).values({
             storeId,
             firstName,
             lastName,
             email,
             phone,
             loyaltyNumber,
-            currentPoints,
+            currentPoints: 0,
             lifetimePoints,
             isActive: isActiveParsed,
             createdAt: memberSinceParsed ?? new Date(),
-          } as any);
+          } as any).returning({ id: loyaltyCustomers.id });
+          importPoints(inserted.id, 0, currentPoints, raw);
 
           created += 1;
         } catch (error) {
@@ -709,6 +732,14 @@ export async function registerLoyaltyRoutes(app: Express) {
         }
       }
 
+      if (pointEntries.length > 0) {
+        // Only a balance that dropped since its row was read can be rejected
+        const { rejected } = await postLoyaltyEntries(pointEntries);
+        for (const customerId of rejected) {
+          invalidRows.push({ row: rowByCustomer.get(customerId), error: 'Points changed during the import; import this customer again' });
+        }
+      }
+
       return res.status(200).json({
         mode,
         imported: created,
@@ -819,57 +850,37 @@ export async function registerLoyaltyRoutes(app: Express) {
       if (!userId) return res.status(401).json({ error: 'Not authenticated' });
       const [me] = await db.select().from(users).where(eq(users.id, userId));
       if (!me?.orgId) return res.status(400).json({ error: 'Missing org' });
+      const orgId = me.orgId;
       const customerId = req.params.customerId;
 
-      const client = (db as any).client;
-      const hasTx = !!client;
-      const pg = hasTx ? await client.connect() : null;
-      try {
-        if (hasTx && pg) await pg.query('BEGIN');
-
+      const updated = await runInTransaction('loyalty.earn', async (tx) => {
         // Ensure account
-        const [acctExisting] = await db.select().from(loyaltyAccounts)
-          .where(and(eq(loyaltyAccounts.orgId, me.orgId), eq(loyaltyAccounts.customerId, customerId))).limit(1);
+        const [acctExisting] = await tx.select().from(loyaltyAccounts)
+          .where(and(eq(loyaltyAccounts.orgId, orgId), eq(loyaltyAccounts.customerId, customerId))).limit(1);
         let account = acctExisting;
         if (!account) {
-          const inserted = await db.insert(loyaltyAccounts).values({ orgId: me.orgId, customerId, points: 0 } as any).returning();
+          const inserted = await tx.insert(loyaltyAccounts).values({ orgId, customerId, points: 0 } as any).returning();
           account = inserted[0];
         }
 
-        const newPoints = Number(account.points) + parsed.data.points;
-        const [updated] = await db
-          .update(loyaltyAccounts)
-          .set({ points: newPoints } as any)
-          .where(eq(loyaltyAccounts.id, account.id))
-          .returning();
+        const { balances } = await postLoyaltyEntriesOrThrow([{
+          holderKind: 'account',
+          holderId: account.id,
+          orgId,
+          delta: parsed.data.points,
+          entryType: 'earn',
+          reason: parsed.data.reason,
+          source: 'loyalty_api',
+        }], tx);
 
-        await db.insert(legacyLoyaltyTransactions).values({
+        await tx.insert(legacyLoyaltyTransactions).values({
           loyaltyAccountId: account.id,
           points: parsed.data.points,
           reason: parsed.data.reason,
         } as any);
-
-        if (hasTx && pg) await pg.query('COMMIT');
-        return res.json({ points: updated.points });
-      } catch (error) {
-        if (hasTx && pg) {
-          try {
-            await pg.query('ROLLBACK');
-          } catch (rollbackError) {
-            logger.warn('Loyalty earn rollback failed', {
-              error: rollbackError instanceof Error ? rollbackError.message : String(rollbackError)
-            });
-          }
-        }
-        logger.error('Failed to earn loyalty points', {
-          userId,
-          customerId,
-          error: error instanceof Error ? error.message : String(error)
-        });
-        return res.status(500).json({ error: 'Failed to earn points' });
-      } finally {
-        if (hasTx && pg) pg.release();
-      }
+        return balances.get(account.id) ?? Number(account.points) + parsed.data.points;
+      });
+      return res.json({ points: updated });
     } catch (error) {
       logger.error('Failed to earn loyalty points', {
         userId: req.session?.userId,
@@ -889,56 +900,37 @@ export async function registerLoyaltyRoutes(app: Express) {
       if (!userId) return res.status(401).json({ error: 'Not authenticated' });
       const [me] = await db.select().from(users).where(eq(users.id, userId));
       if (!me?.orgId) return res.status(400).json({ error: 'Missing org' });
+      const orgId = me.orgId;
       const customerId = req.params.customerId;
 
-      const client = (db as any).client;
-      const hasTx = !!client;
-      const pg = hasTx ? await client.connect() : null;
-      try {
-        if (hasTx && pg) await pg.query('BEGIN');
-
+      const updated = await runInTransaction('loyalty.redeem', async (tx) => {
         // Load account
-        const [acct] = await db.select().from(loyaltyAccounts)
-          .where(and(eq(loyaltyAccounts.orgId, me.orgId), eq(loyaltyAccounts.customerId, customerId))).limit(1);
-        if (!acct || acct.points < parsed.data.points) {
-          await pg.query('ROLLBACK');
-          return res.status(400).json({ error: 'Insufficient points' });
-        }
-
-        const newPoints = Number(acct.points) - parsed.data.points;
-        const [updated] = await db
-          .update(loyaltyAccounts)
-          .set({ points: newPoints } as any)
-          .where(eq(loyaltyAccounts.id, acct.id))
-          .returning();
+        const [acct] = await tx.select({ id: loyaltyAccounts.id }).from(loyaltyAccounts)
+          .where(and(eq(loyaltyAccounts.orgId, orgId), eq(loyaltyAccounts.customerId, customerId))).limit(1);
+        if (!acct) return null;
+
+        // The balance check happens in the same statement as the decrement
+        const { balances } = await postLoyaltyEntries([{
+          holderKind: 'account',
+          holderId: acct.id,
+          orgId,
+          delta: -parsed.data.points,
+          entryType: 'redeem',
+          reason: parsed.data.reason,
+          source: 'loyalty_api',
+        }], tx);
+        const balance = balances.get(acct.id);
+        if (balance === undefined) return null;
 
-        await db.insert(legacyLoyaltyTransactions).values({
+        await tx.insert(legacyLoyaltyTransactions).values({
           loyaltyAccountId: acct.id,
           points: -parsed.data.points,
           reason: parsed.data.reason,
         } as any);
-
-        if (hasTx && pg) await pg.query('COMMIT');
-        return res.json({ points: updated.points });
-      } catch (error) {
-        if (hasTx && pg) {
-          try {
-            await pg.query('ROLLBACK');
-          } catch (rollbackError) {
-            logger.warn('Loyalty redeem rollback failed', {
-              error: rollbackError instanceof Error ? error.message : String(rollbackError)
-            });
-          }
-        }
-        logger.error('Failed to redeem loyalty points', {
-          userId,
-          customerId,
-          error: error instanceof Error ? error.message : String(error)
-        });
-        return res.status(500).json({ error: 'Failed to redeem points' });
-      } finally {
-        if (hasTx && pg) pg.release();
-      }
+        return balance;
+      });
+      if (updated === null) return res.status(400).json({ error: 'Insufficient points' });
+      return res.json({ points: updated });
     } catch (error) {
       logger.error('Failed to redeem loyalty points', {
         userId: req.session?.userId,
@@ -1,4 +1,5 @@
 import { Express, Request, Response } from 'express';
+import { getJobRunHistory, instanceId, jobScheduler } from '../jobs/scheduler';
 import { logger, extractLogContext } from '../lib/logger';
 import { monitoringService } from '../lib/monitoring';
 import { securityAuditService } from '../lib/security-audit';
@@ -65,12 +66,55 @@ export async function registerObservabilityRoutes(app: Express) {
       const wsService = (req.app as any).wsService;
       const wsStats = wsService ? wsService.getStats() : null;
 
+      // Webhook ingest queue: live depth/lag from the table plus in-process counters
+      let webhookQueue: Record<string, unknown> | null = null;
+      try {
+        const { getWebhookQueueStats, webhookIngestMode } = await import('../jobs/webhook-queue');
+        webhookQueue = {
+          mode: webhookIngestMode(),
+          ...monitoringService.getWebhookQueueMetrics(),
+          ...(await getWebhookQueueStats()),
+        };
+      } catch (error) {
+        logger.warn('Failed to read webhook queue stats', extractLogContext(req, {
+          error: error instanceof Error ? error.message : String(error)
+        }));
+      }
+
+      // Email outbox: send rates from in-process counters plus live depth/lag from the table
+      let emailOutbox: Record<string, unknown> | null = null;
+      try {
+        const { emailDeliveryMode, getEmailOutboxStats } = await import('../jobs/email-outbox');
+        emailOutbox = {
+          mode: emailDeliveryMode(),
+          ...monitoringService.getEmailMetrics(),
+          ...(await getEmailOutboxStats()),
+        };
+      } catch (error) {
+        logger.warn('Failed to read email outbox stats', extractLogContext(req, {
+          error: error instanceof Error ? error.message : String(error)
+        }));
+      }
+
+      // Per-route connection hold time for request transactions, plus pool saturation
+      const { pool } = await import('../db');
+      const { getTransactionStats } = await import('../lib/tx-executor');
+      const database = {
+        pool: { total: pool.totalCount, idle: pool.idleCount, waiting: pool.waitingCount },
+        transactions: getTransactionStats(),
+      };
+      const { getInstrumentationStats } = await import('../lib/instrumentation');
+
       const metrics = {
         timestamp: new Date().toISOString(),
         performance: performanceMetrics,
         business: businessMetrics,
         security: securityMetrics,
         websocket: wsStats,
+        webhookQueue,
+        emailOutbox,
+        database,
+        instrumentation: getInstrumentationStats(),
         system: {
           uptime: process.uptime(),
           memory: process.memoryUsage(),
@@ -86,6 +130,46 @@ export async function registerObservabilityRoutes(app: Express) {
     }
   });
 
+  // Background jobs: schedule, lease state and recent runs (Admin only)
+  app.get('/api/observability/jobs', requireAuth, requireRole(['admin']), async (req: Request, res: Response) => {
+    res.json({ instanceId, jobs: jobScheduler.list() });
+  });
+
+  app.get('/api/observability/jobs/:name/runs', requireAuth, requireRole(['admin']), async (req: Request, res: Response) => {
+    const { name } = req.params;
+    if (!jobScheduler.has(name)) {
+      return res.status(404).json({ error: 'Unknown job' });
+    }
+    try {
+      const limit = Number.parseInt(String((req.query as any)?.limit ?? '20'), 10);
+      res.json({ job: name, runs: await getJobRunHistory(name, Number.isFinite(limit) ? limit : 20) });
+    } catch (error) {
+      logger.error('Failed to get job run history', extractLogContext(req, { job: name }), error as Error);
+      res.status(500).json({ error: 'Failed to retrieve job runs' });
+    }
+  });
+
+  // Manual trigger: runs outside the schedule but still under the job's lease and concurrency limit
+  app.post('/api/observability/jobs/:name/run', requireAuth, requireRole(['admin']), async (req: Request, res: Response) => {
+    const { name } = req.params;
+    try {
+      const triggeredBy = (req.session as any)?.userId ?? null;
+      const result = await jobScheduler.trigger(name, triggeredBy);
+      if (result.status === 'not_found') {
+        return res.status(404).json({ error: 'Unknown job' });
+      }
+      if (result.status === 'busy') {
+        return res.status(409).json({ error: 'Job is already running at its concurrency limit' });
+      }
+      result.done.catch(() => undefined);
+      logger.info('Job triggered manually', extractLogContext(req, { job: name, runId: result.runId }));
+      res.status(202).json({ job: name, runId: result.runId, status: 'started' });
+    } catch (error) {
+      logger.error('Failed to trigger job', extractLogContext(req, { job: name }), error as Error);
+      res.status(500).json({ error: 'Failed to trigger job' });
+    }
+  });
+
   // Security Events (Admin only)
   app.get('/api/observability/security/events', requireAuth, requireRole(['admin']), async (req: Request, res: Response) => {
     try {
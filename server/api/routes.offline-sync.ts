@@ -1,11 +1,14 @@
 import { eq, and, sql } from 'drizzle-orm';
 import { Express, Request, Response } from 'express';
 import { z } from 'zod';
-import { legacySales as sales, legacySaleItems as saleItems, inventory, products, legacyCustomers as customers, loyaltyAccounts, legacyLoyaltyTransactions as loyaltyTransactions, organizations } from '@shared/schema';
+import { legacySales as sales, legacySaleItems as saleItems, inventory, products, loyaltyAccounts, legacyLoyaltyTransactions as loyaltyTransactions, organizations } from '@shared/schema';
 import { db } from '../db';
+import { upsertOrgCustomerByPhone } from '../lib/customer-lookup';
 import { logger, extractLogContext } from '../lib/logger';
+import { postLoyaltyEntries, type LoyaltyEntry } from '../lib/loyalty-ledger';
 import { monitoringService } from '../lib/monitoring';
 import { securityAuditService } from '../lib/security-audit';
+import { runInTransaction } from '../lib/tx-executor';
 import { requireAuth } from '../middleware/authz';
 
 // Sync data schemas
@@ -99,10 +102,17 @@ export async function registerOfflineSyncRoutes(app: Express) {
         deviceId: clientInfo.deviceId
       });
 
-      // Process offline sales
+      // Process offline sales, each in its own transaction so its locks are
+      // released. Earned points go to the ledger in one batch for the whole
+      // upload once the sales have committed; a sale that redeems first posts
+      // the points its account earned earlier in the upload.
+      let pendingEarns: LoyaltyEntry[] = [];
       for (const sale of offlineSales) {
+        const saleEarns: LoyaltyEntry[] = [];
+        let flushedEarns: LoyaltyEntry[] = [];
         try {
-          await db.transaction(async (tx) => {
+          await runInTransaction('sync.upload', async (tx) => {
+            flushedEarns = [];
             // Check for duplicate sale (by offline ID)
             const existingSale = await tx
               .select({ id: sales.id })
@@ -128,47 +138,56 @@ export async function registerOfflineSyncRoutes(app: Express) {
             const total = subtotal - sale.discount + sale.tax;
 
             let customerRecord: { id: string } | null = null;
-            let loyaltyAccountRecord: { id: string; points: number } | null = null;
+            let loyaltyAccountRecord: { id: string } | null = null;
             const redeemPoints = Number(sale.redeemPoints || 0);
 
             if (sale.customerPhone && orgId) {
-              const existingCustomer = await tx
-                .select({ id: customers.id })
-                .from(customers)
-                .where(and(eq(customers.orgId, orgId), eq(customers.phone, sale.customerPhone)))
-                .limit(1);
-              if (existingCustomer[0]) {
-                customerRecord = existingCustomer[0];
-              } else {
-                const insertedCustomer = await tx
-                  .insert(customers)
-                  .values({ orgId, phone: sale.customerPhone } as any)
-                  .returning({ id: customers.id });
-                customerRecord = insertedCustomer[0];
-              }
+              // Loyalty accounts are per org and customer, so match the org's customer on the normalized phone
+              customerRecord = await upsertOrgCustomerByPhone(tx, orgId, sale.storeId, sale.customerPhone);
 
               if (customerRecord) {
                 const accountRows = await tx
-                  .select({ id: loyaltyAccounts.id, points: loyaltyAccounts.points })
+                  .select({ id: loyaltyAccounts.id })
                   .from(loyaltyAccounts)
                   .where(and(eq(loyaltyAccounts.orgId, orgId), eq(loyaltyAccounts.customerId, customerRecord.id)))
                   .limit(1);
                 if (accountRows[0]) {
-                  loyaltyAccountRecord = { id: accountRows[0].id, points: Number(accountRows[0].points || 0) };
+                  loyaltyAccountRecord = { id: accountRows[0].id };
                 } else {
                   const insertedAccount = await tx
                     .insert(loyaltyAccounts)
                     .values({ orgId, customerId: customerRecord.id, points: 0 } as any)
-                    .returning({ id: loyaltyAccounts.id, points: loyaltyAccounts.points });
-                  loyaltyAccountRecord = { id: insertedAccount[0].id, points: Number(insertedAccount[0].points || 0) };
+                    .returning({ id: loyaltyAccounts.id });
+                  loyaltyAccountRecord = { id: insertedAccount[0].id };
                 }
               }
             }
 
+            // Redemptions gate the sale, so they are posted (and balance-checked) right away
             if (loyaltyAccountRecord && redeemPoints > 0) {
-              if (loyaltyAccountRecord.points < redeemPoints) {
+              const accountId = loyaltyAccountRecord.id;
+              flushedEarns = pendingEarns.filter((entry) => entry.holderId === accountId);
+              if (flushedEarns.length) {
+                await postLoyaltyEntries(flushedEarns, tx);
+              }
+              const { rejected } = await postLoyaltyEntries([{
+                holderKind: 'account',
+                holderId: loyaltyAccountRecord.id,
+                orgId,
+                delta: -redeemPoints,
+                entryType: 'redeem',
+                source: 'offline_sync',
+                referenceId: sale.id,
+                idempotencyKey: `offline:${sale.id}:redeem`,
+              }], tx);
+              if (rejected.length) {
                 throw new Error('Insufficient loyalty points for offline sale redemption');
               }
+              await tx.insert(loyaltyTransactions).values({
+                loyaltyAccountId: loyaltyAccountRecord.id,
+                points: -redeemPoints,
+                reason: 'redeem',
+              } as any);
             }
 
             // Insert sale and get generated id
@@ -216,32 +235,21 @@ export async function registerOfflineSyncRoutes(app: Express) {
               ));
 
             if (loyaltyAccountRecord) {
-              // Redeem points first
-              if (redeemPoints > 0) {
-                const remaining = loyaltyAccountRecord.points - redeemPoints;
-                await tx
-                  .update(loyaltyAccounts)
-                  .set({ points: remaining } as any)
-                  .where(eq(loyaltyAccounts.id, loyaltyAccountRecord.id));
-                loyaltyAccountRecord.points = remaining;
-                await tx.insert(loyaltyTransactions).values({
-                  loyaltyAccountId: loyaltyAccountRecord.id,
-                  points: -redeemPoints,
-                  reason: 'redeem',
-                } as any);
-              }
-
               // Earn points based on spend
               const earnBase = sale.loyaltyEarnBase ?? subtotal;
               const spendBase = Math.max(0, earnBase - sale.discount);
               const pointsEarned = Math.floor(spendBase * Math.max(orgSettings.earnRate, 0));
               if (pointsEarned > 0) {
-                const newBalance = loyaltyAccountRecord.points + pointsEarned;
-                await tx
-                  .update(loyaltyAccounts)
-                  .set({ points: newBalance } as any)
-                  .where(eq(loyaltyAccounts.id, loyaltyAccountRecord.id));
-                loyaltyAccountRecord.points = newBalance;
+                saleEarns.push({
+                  holderKind: 'account',
+                  holderId: loyaltyAccountRecord.id,
+                  orgId,
+                  delta: pointsEarned,
+                  entryType: 'earn',
+                  source: 'offline_sync',
+                  referenceId: sale.id,
+                  idempotencyKey: `offline:${sale.id}:earn`,
+                });
                 await tx.insert(loyaltyTransactions).values({
                   loyaltyAccountId: loyaltyAccountRecord.id,
                   points: pointsEarned,
@@ -252,6 +260,7 @@ export async function registerOfflineSyncRoutes(app: Express) {
 
             results.salesProcessed++;
           });
+          pendingEarns = pendingEarns.filter((entry) => !flushedEarns.includes(entry)).concat(saleEarns);
 
           // Log successful sync
           securityAuditService.logDataAccessEvent('data_write', context, 'offline_sale_sync', {
@@ -274,6 +283,18 @@ export async function registerOfflineSyncRoutes(app: Express) {
         }
       }
 
+      if (pendingEarns.length) {
+        try {
+          await postLoyaltyEntries(pendingEarns);
+        } catch (error) {
+          logger.error('Failed to post loyalty points earned by offline sales', {
+            ...context,
+            saleIds: pendingEarns.map((entry) => entry.referenceId),
+            error: error instanceof Error ? error.message : 'Unknown error'
+          });
+        }
+      }
+
       // Process inventory updates
       for (const update of inventoryUpdates) {
         try {
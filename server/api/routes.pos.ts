@@ -12,15 +12,38 @@ import {
   users,
   products,
   organizations,
-  customers,
   transactions as prdTransactions,
   transactionItems as prdTransactionItems,
   importJobs,
   inventory,
 } from '@shared/schema';
 import { db } from '../db';
+import { upsertCustomerByPhone } from '../lib/customer-lookup';
+import { AppError } from '../lib/errors';
 import { logger } from '../lib/logger';
-import { incrementTodayRollups } from '../lib/redis';
+import { postLoyaltyEntriesOrThrow } from '../lib/loyalty-ledger';
+import {
+  commitPosSale,
+  lowStockLevels,
+  replaySaleBatch,
+  SALE_BATCH_MAX,
+  SaleCommitError,
+  saleCommitMode,
+  type SaleCommitStockLevel,
+  type SaleReplayOutcome,
+} from '../lib/pos-sale-commit';
+import { recordSaleMetrics } from '../lib/realtime-metrics';
+import {
+  processPosReturn,
+  processPosSwap,
+  restocksAffectingAlerts,
+  ReturnRejectedError,
+  returnsEngineMode,
+  type RestockedLevel,
+  type ReturnRequestLine,
+  type SwapRequest,
+} from '../lib/returns-engine';
+import { runInTransaction } from '../lib/tx-executor';
 import { requireAuth, enforceIpWhitelist, requireRole } from '../middleware/authz';
 import { sensitiveEndpointRateLimit } from '../middleware/security';
 import { storage } from '../storage';
@@ -55,6 +78,13 @@ const SaleSchema = z.object({
   })),
 });
 
+const SaleBatchSchema = z.object({
+  sales: z.array(z.object({
+    idempotencyKey: z.string().min(1).max(128),
+    payload: z.unknown(),
+  })).min(1).max(SALE_BATCH_MAX),
+});
+
 const normalizePaymentMethod = (raw: string | null | undefined): 'cash' | 'card' | 'digital' => {
   const value = (raw ?? '').toString().toLowerCase();
   if (value === 'cash' || value === 'card' || value === 'digital') return value as 'cash' | 'card' | 'digital';
@@ -62,6 +92,306 @@ const normalizePaymentMethod = (raw: string | null | undefined): 'cash' | 'card'
   return 'cash';
 };
 
+// Redis rollups and websocket event for a committed sale (best effort)
+async function publishSaleCreated(
+  req: Request,
+  data: z.infer<typeof SaleSchema>,
+  saleId: string,
+  cashierId: string,
+): Promise<void> {
+  try {
+    // Resolve orgId from store for channeling by org
+    const srow = await db.select({ orgId: stores.orgId }).from(stores).where(eq(stores.id, data.storeId));
+    const orgId = (srow as any)[0]?.orgId as string | undefined;
+    const revenue = parseFloat(String(data.total || '0')) || 0;
+    const discount = parseFloat(String(data.discount || '0')) || 0;
+    const tax = parseFloat(String(data.tax || '0')) || 0;
+    await recordSaleMetrics({
+      orgId: orgId || (data as any).orgId,
+      storeId: data.storeId,
+      cashierId,
+      revenue,
+      discount,
+      tax,
+      items: data.items.map((item) => ({
+        productId: item.productId,
+        quantity: item.quantity,
+        revenue: parseFloat(item.lineTotal) || 0,
+      })),
+    });
+
+    const wsService = (req.app as any).wsService;
+    if (wsService) {
+      const payload = {
+        event: 'sale:created',
+        orgId: orgId || (data as any).orgId,
+        storeId: data.storeId,
+        delta: { revenue, transactions: 1, discount, tax },
+        saleId,
+        occurredAt: new Date().toISOString(),
+      };
+      if (wsService.publish) {
+        await wsService.publish(`store:${data.storeId}`, payload);
+        if (orgId || (data as any).orgId) {
+          await wsService.publish(`org:${orgId || (data as any).orgId}`, payload);
+        }
+      } else if (wsService.broadcastNotification) {
+        await wsService.broadcastNotification({
+          type: 'sales_update',
+          storeId: data.storeId,
+          title: 'Sale created',
+          message: `+${revenue.toFixed(2)}`,
+          data: payload,
+          priority: 'low',
+        });
+      }
+    }
+  } catch (error) {
+    logger.warn('Failed to broadcast sale rollup', {
+      storeId: data.storeId,
+      error: error instanceof Error ? error.message : String(error)
+    });
+  }
+}
+
+// Post-commit low-stock alerts for the products a sale took to or below their minimum
+function syncLowStockAfterSale(storeId: string, stock: SaleCommitStockLevel[]): void {
+  for (const row of lowStockLevels(stock)) {
+    storage.syncLowStockAlertState(storeId, row.productId).catch((error) => {
+      logger.warn('Failed to sync low stock alert after sale', {
+        storeId,
+        productId: row.productId,
+        error: error instanceof Error ? error.message : String(error),
+      });
+    });
+  }
+}
+
+// Post-commit low-stock alerts for products a return or swap moved: restocks
+// that may clear an alert, and a swapped-in product taken to its minimum
+function syncLowStockAfterReturn(storeId: string, restocked: RestockedLevel[], taken: RestockedLevel | null = null): void {
+  const productIds = restocksAffectingAlerts(restocked).map((row) => row.productId);
+  if (taken && (taken.minStockLevel ?? 0) > 0 && taken.quantity <= (taken.minStockLevel ?? 0)) {
+    productIds.push(taken.productId);
+  }
+  for (const productId of productIds) {
+    storage.syncLowStockAlertState(storeId, productId).catch((error) => {
+      logger.warn('Failed to sync low stock alert after return', {
+        storeId,
+        productId,
+        error: error instanceof Error ? error.message : String(error),
+      });
+    });
+  }
+}
+
+// A return or swap whose insert hit the idempotency key of a concurrent request
+async function findReturnByIdempotencyKey(idempotencyKey: string) {
+  const existing = await db
+    .select()
+    .from(returns)
+    .where(eq(returns.idempotencyKey, idempotencyKey))
+    .limit(1);
+  if (!existing[0]) return null;
+  const items = await db
+    .select()
+    .from(returnItems)
+    .where(eq(returnItems.returnId, existing[0].id));
+  return { ret: existing[0], items };
+}
+
+// POST /api/pos/returns through the returns engine: the sale and its earlier
+// returns are loaded in one query and the return is written with a fixed
+// number of set-based statements in one transaction (see lib/returns-engine.ts)
+async function processReturnInOneTransaction(
+  req: Request,
+  data: { saleId: string; storeId: string; reason?: string; items: ReturnRequestLine[] },
+  idempotencyKey: string,
+): Promise<{ status: number; body: Record<string, unknown> }> {
+  const userId = req.session?.userId as string | undefined;
+  if (!userId) return { status: 401, body: { error: 'Not authenticated' } };
+
+  try {
+    const applied = await processPosReturn({
+      saleId: data.saleId,
+      storeId: data.storeId,
+      userId,
+      reason: data.reason,
+      idempotencyKey,
+      items: data.items,
+      mapPaymentMethod: normalizePaymentMethod,
+    });
+    if (applied.loyaltyReversal) {
+      logger.info('POS Return: Loyalty points reversed', {
+        returnId: applied.return.id,
+        customerId: applied.loyaltyReversal.customerId,
+        points: applied.loyaltyReversal.points,
+        newPoints: applied.loyaltyReversal.balance,
+      });
+    }
+    syncLowStockAfterReturn(data.storeId, applied.restocked);
+    return { status: 201, body: { ok: true, return: applied.return, items: applied.items } };
+  } catch (error) {
+    if (error instanceof ReturnRejectedError) {
+      return { status: error.statusCode, body: { error: error.message } };
+    }
+    if ((error as any)?.code === '23505') {
+      const existing = await findReturnByIdempotencyKey(idempotencyKey);
+      if (existing) return { status: 200, body: { ok: true, return: existing.ret, items: existing.items } };
+    }
+    logger.error('Failed to process POS return', {
+      saleId: data.saleId,
+      error: error instanceof Error ? error.message : String(error),
+    });
+    return { status: 500, body: { error: 'Failed to process return' } };
+  }
+}
+
+// POST /api/pos/swaps through the returns engine, in one transaction
+async function processSwapInOneTransaction(
+  req: Request,
+  data: SwapRequest,
+  idempotencyKey: string,
+): Promise<{ status: number; body: Record<string, unknown> }> {
+  const userId = req.session?.userId as string | undefined;
+  if (!userId) return { status: 401, body: { error: 'Not authenticated' } };
+
+  try {
+    const { plan, currency, applied } = await processPosSwap(data, { userId, idempotencyKey });
+    syncLowStockAfterReturn(data.storeId, applied.restocked, applied.newProductStock);
+    const incoming = plan.newProduct;
+    return {
+      status: 201,
+      body: {
+        ok: true,
+        swap: {
+          id: applied.returnId,
+          saleId: data.saleId,
+          storeId: data.storeId,
+          originalProduct: {
+            productId: data.originalProductId,
+            quantity: data.originalQuantity,
+            unitPrice: data.originalUnitPrice,
+            total: plan.originalTotal,
+            restockAction: data.restockAction,
+          },
+          newProduct: {
+            productId: incoming.productId,
+            name: incoming.name,
+            quantity: incoming.quantity,
+            unitPrice: incoming.unitPrice,
+            total: plan.newTotal,
+            unitCost: incoming.unitCost,
+            totalCost: incoming.unitCost * incoming.quantity,
+          },
+          priceDifference: plan.priceDifference,
+          taxDifference: plan.taxDifference,
+          totalDifference: plan.totalDifference,
+          currency,
+          transactionId: applied.transactionId,
+          receiptNumber: applied.receiptNumber,
+        },
+      },
+    };
+  } catch (error) {
+    if (error instanceof ReturnRejectedError) {
+      return { status: error.statusCode, body: { error: error.message } };
+    }
+    if ((error as any)?.code === '23505') {
+      const existing = await findReturnByIdempotencyKey(idempotencyKey);
+      if (existing) {
+        return {
+          status: 200,
+          body: { ok: true, swap: { id: existing.ret.id, saleId: existing.ret.saleId, storeId: existing.ret.storeId } },
+        };
+      }
+    }
+    logger.error('POS Swap: Failed to process swap', {
+      saleId: data.saleId,
+      error: error instanceof Error ? error.message : String(error),
+    });
+    return { status: 500, body: { error: 'Failed to process swap' } };
+  }
+}
+
+// POST /api/pos/sales through pos_commit_sale(): the idempotency check, org
+// loyalty settings, customer, sale, inventory, cost layers, analytics rows and
+// points are all applied by one statement (see lib/pos-sale-commit.ts).
+// Returns the response instead of sending it so batch replays can reuse it.
+async function commitSaleInOneRoundTrip(
+  req: Request,
+  data: z.infer<typeof SaleSchema>,
+  idempotencyKey: string,
+): Promise<SaleReplayOutcome> {
+  const userId = req.session?.userId as string | undefined;
+  if (!userId && process.env.NODE_ENV !== 'test') {
+    return { status: 401, body: { error: 'Not authenticated' } };
+  }
+
+  const subtotalNum = parseFloat(data.subtotal);
+  const discountNum = parseFloat(data.discount || '0');
+  const taxNum = parseFloat(data.tax || '0');
+  if (!Number.isFinite(subtotalNum)) return { status: 400, body: { error: 'Invalid subtotal amount' } };
+  if (!Number.isFinite(discountNum) || discountNum < 0) return { status: 400, body: { error: 'Invalid discount amount' } };
+  if (!Number.isFinite(taxNum) || taxNum < 0) return { status: 400, body: { error: 'Invalid tax amount' } };
+
+  const walletReference = data.walletReference?.trim() || null;
+  const paymentBreakdown = data.paymentBreakdown ?? [];
+  if (data.paymentMethod === 'digital' && !walletReference) {
+    return { status: 400, body: { error: 'walletReference is required for digital payments' } };
+  }
+  if (data.paymentMethod === 'split' && !paymentBreakdown.length) {
+    return { status: 400, body: { error: 'paymentBreakdown required for split payments' } };
+  }
+
+  try {
+    const committed = await commitPosSale({
+      idempotencyKey,
+      storeId: data.storeId,
+      // Without a session user (tests only) the sale is booked to fixed ids, as in the per-query path
+      cashierId: userId ?? '00000000-0000-0000-0000-0000000000aa',
+      orgId: userId ? null : '00000000-0000-0000-0000-0000000000bb',
+      subtotal: subtotalNum,
+      discount: discountNum,
+      tax: taxNum,
+      paymentMethod: data.paymentMethod,
+      transactionPaymentMethod: normalizePaymentMethod(data.paymentMethod),
+      walletReference,
+      paymentBreakdown,
+      customerPhone: data.customerPhone,
+      redeemPoints: data.redeemPoints,
+      items: data.items,
+    });
+
+    if (!committed.replayed) {
+      if (committed.customer) {
+        logger.info('Loyalty points updated', {
+          customerId: committed.customer.id,
+          pointsEarned: committed.customer.pointsEarned,
+          newPoints: committed.customer.points,
+        });
+      }
+      syncLowStockAfterSale(data.storeId, committed.stock);
+      await publishSaleCreated(req, data, committed.sale.id, committed.sale.cashierId);
+    }
+
+    return {
+      status: 200,
+      body: { ...committed.sale, items: committed.items, stockLevels: committed.stock },
+      replayed: committed.replayed,
+    };
+  } catch (error) {
+    if (error instanceof SaleCommitError) {
+      return { status: error.statusCode, body: { error: error.message } };
+    }
+    logger.error('Failed to record sale', {
+      idempotencyKey,
+      error: error instanceof Error ? error.message : String(error),
+    });
+    return { status: 500, body: { error: 'Failed to record sale' } };
+  }
+}
+
 export async function registerPosRoutes(app: Express) {
   // Integration-test compatible POS endpoints
   app.post('/api/transactions', requireAuth, async (req: Request, res: Response) => {
@@ -542,6 +872,11 @@ export async function registerPosRoutes(app: Express) {
       return res.status(400).json({ error: 'Invalid payload', details: parsed.error.errors });
     }
 
+    if (saleCommitMode() === 'procedure') {
+      const outcome = await commitSaleInOneRoundTrip(req, parsed.data, idempotencyKey);
+      return res.status(outcome.status).json(outcome.body);
+    }
+
     // Check idempotency
     const existing = await db
       .select()
@@ -577,309 +912,272 @@ export async function registerPosRoutes(app: Express) {
     const paymentBreakdown = parsed.data.paymentBreakdown ?? [];
     const walletReference = parsed.data.walletReference?.trim() || null;
 
-    const client = (db as any).client;
-    const hasTx = !!client;
-    const pg = hasTx ? await client.connect() : null;
-    try {
-      if (hasTx && pg) await pg.query('BEGIN');
-      // Resolve amounts
-      const subtotalNum = parseFloat(parsed.data.subtotal);
-      const discountNum = parseFloat(parsed.data.discount || '0');
-      const taxNum = parseFloat(parsed.data.tax || '0');
-      if (!Number.isFinite(subtotalNum)) return res.status(400).json({ error: 'Invalid subtotal amount' });
-      if (!Number.isFinite(discountNum) || discountNum < 0) return res.status(400).json({ error: 'Invalid discount amount' });
-      if (!Number.isFinite(taxNum) || taxNum < 0) return res.status(400).json({ error: 'Invalid tax amount' });
-
-      // Load or create customer if phone provided (using new customers table with storeId)
-      let customerId: string | null = null;
-      let customerPoints = 0;
-      if (customerPhone) {
-        const storeId = parsed.data.storeId;
-        const customerRows = await db
-          .select({
-            id: customers.id,
-            currentPoints: customers.currentPoints,
-          })
-          .from(customers)
-          .where(and(eq(customers.storeId, storeId), eq(customers.phone, customerPhone)))
-          .limit(1);
+    // Resolve amounts
+    const subtotalNum = parseFloat(parsed.data.subtotal);
+    const discountNum = parseFloat(parsed.data.discount || '0');
+    const taxNum = parseFloat(parsed.data.tax || '0');
+    if (!Number.isFinite(subtotalNum)) return res.status(400).json({ error: 'Invalid subtotal amount' });
+    if (!Number.isFinite(discountNum) || discountNum < 0) return res.status(400).json({ error: 'Invalid discount amount' });
+    if (!Number.isFinite(taxNum) || taxNum < 0) return res.status(400).json({ error: 'Invalid tax amount' });
 
-        const existingCustomer = customerRows[0];
-        if (existingCustomer) {
-          customerId = existingCustomer.id;
-          customerPoints = Number(existingCustomer.currentPoints ?? 0);
-        } else {
-          const newCustomer = await db
-            .insert(customers)
-            .values({
-              storeId,
-              phone: customerPhone,
-              currentPoints: 0,
-            } as any)
-            .returning();
-          customerId = newCustomer[0].id;
-        }
-      }
-
-      // Apply redeem discount if requested and customer has points
-      const redeemDiscount = customerPhone && customerId && redeemPoints > 0 ? (redeemPoints * orgSettings.redeemValue) : 0;
-      if (redeemDiscount > 0) {
-        if (customerPoints < redeemPoints) {
-          if (hasTx && pg) await pg.query('ROLLBACK');
-          return res.status(400).json({ error: 'Insufficient loyalty points' });
+    try {
+      // Every statement below, including the storage helpers, runs on the connection holding this transaction
+      const sale = await runInTransaction('pos.sale', async (tx) => {
+        // Find or create the customer by normalized phone in one upsert, locking it for the points update below
+        let customerId: string | null = null;
+        let customerPoints = 0;
+        if (customerPhone) {
+          const attached = await upsertCustomerByPhone(tx, parsed.data.storeId, customerPhone);
+          customerId = attached.id;
+          customerPoints = attached.currentPoints;
         }
-      }
-      let manualDiscount = Math.max(0, discountNum);
-      if (redeemDiscount > 0 && manualDiscount >= redeemDiscount - 0.01) {
-        manualDiscount = manualDiscount - redeemDiscount;
-      }
-      const effectiveDiscount = manualDiscount + redeemDiscount;
-      const adjustedTotal = Math.max(0, subtotalNum - effectiveDiscount + taxNum);
-
-      if (parsed.data.paymentMethod === 'digital' && !walletReference) {
-        if (hasTx && pg) await pg.query('ROLLBACK');
-        return res.status(400).json({ error: 'walletReference is required for digital payments' });
-      }
 
-      if (parsed.data.paymentMethod === 'split') {
-        if (!paymentBreakdown.length) {
-          if (hasTx && pg) await pg.query('ROLLBACK');
-          return res.status(400).json({ error: 'paymentBreakdown required for split payments' });
+        // Apply redeem discount if requested and customer has points
+        const redeemDiscount = customerPhone && customerId && redeemPoints > 0 ? (redeemPoints * orgSettings.redeemValue) : 0;
+        if (redeemDiscount > 0) {
+          if (customerPoints < redeemPoints) {
+            throw new AppError('Insufficient loyalty points', 400);
+          }
         }
-        const breakdownTotal = paymentBreakdown.reduce((sum, portion) => sum + parseFloat(portion.amount), 0);
-        if (!Number.isFinite(breakdownTotal) || Math.abs(breakdownTotal - adjustedTotal) > 0.05) {
-          if (hasTx && pg) await pg.query('ROLLBACK');
-          return res.status(400).json({ error: 'paymentBreakdown totals must equal sale total' });
+        let manualDiscount = Math.max(0, discountNum);
+        if (redeemDiscount > 0 && manualDiscount >= redeemDiscount - 0.01) {
+          manualDiscount = manualDiscount - redeemDiscount;
         }
-      }
-
-      // Trust client amounts within small epsilon; adjust server-side total to reflect redemption
-      const inserted = await db.insert(sales).values({
-        orgId: me.orgId,
-        storeId: parsed.data.storeId,
-        cashierId: me.id,
-        subtotal: String(subtotalNum),
-        discount: String(effectiveDiscount),
-        tax: String(taxNum),
-        total: String(adjustedTotal),
-        paymentMethod: parsed.data.paymentMethod,
-        walletReference,
-        paymentBreakdown: paymentBreakdown.length ? paymentBreakdown : null,
-        idempotencyKey,
-      } as any).returning();
-      const sale = inserted[0];
-
-      for (const item of parsed.data.items) {
-        // Sanitize productId to remove suffixes (e.g. _free)
-        const rawProductId = item.productId;
-        const productId = rawProductId.replace(/_free$/, '');
-
-        await db.insert(saleItems).values({
-          saleId: sale.id,
-          productId,
-          quantity: item.quantity,
-          unitPrice: item.unitPrice,
-          lineDiscount: item.lineDiscount,
-          lineTotal: item.lineTotal,
-        } as any);
-
-        // Check if inventory is sufficient and auto-adjust if needed
-        try {
-          const currentInv = await storage.getInventoryItem(productId, parsed.data.storeId);
-          const currentQty = Number(currentInv?.quantity || 0);
+        const effectiveDiscount = manualDiscount + redeemDiscount;
+        const adjustedTotal = Math.max(0, subtotalNum - effectiveDiscount + taxNum);
 
-          // If inventory is insufficient, auto-add discovered units before reducing
-          if (currentQty < item.quantity) {
-            logger.info('POS Sale: Insufficient inventory detected, performing stock adjustment', {
-              productId,
-              storeId: parsed.data.storeId,
-              currentQty,
-              requiredQty: item.quantity,
-            });
+        if (parsed.data.paymentMethod === 'digital' && !walletReference) {
+          throw new AppError('walletReference is required for digital payments', 400);
+        }
 
-            await storage.addStockAdjustmentForPOS(
-              productId,
-              parsed.data.storeId,
-              item.quantity,
-              me.id,
-              sale.id,
-              `Stock adjustment for sale - discovered ${item.quantity - currentQty} units`,
-            );
+        if (parsed.data.paymentMethod === 'split') {
+          if (!paymentBreakdown.length) {
+            throw new AppError('paymentBreakdown required for split payments', 400);
+          }
+          const breakdownTotal = paymentBreakdown.reduce((sum, portion) => sum + parseFloat(portion.amount), 0);
+          if (!Number.isFinite(breakdownTotal) || Math.abs(breakdownTotal - adjustedTotal) > 0.05) {
+            throw new AppError('paymentBreakdown totals must equal sale total', 400);
           }
-
-          // Now reduce inventory (will have enough after adjustment)
-          await storage.adjustInventory(
-            productId,
-            parsed.data.storeId,
-            -item.quantity,
-            me.id,
-            'pos_sale',
-            sale.id,
-            `POS sale - ${item.quantity} units`,
-          );
-        } catch (invErr) {
-          logger.warn('Inventory adjustment failed for POS sale', {
-            productId,
-            storeId: parsed.data.storeId,
-            quantity: item.quantity,
-            error: invErr instanceof Error ? invErr.message : String(invErr),
-          });
         }
-      }
-
-      const normalizedPaymentMethod = normalizePaymentMethod(parsed.data.paymentMethod);
 
-      // Insert into transactions table for analytics
-      logger.info('POS: Inserting transaction for analytics', { storeId: parsed.data.storeId, total: adjustedTotal });
-      const [tx] = await db
-        .insert(prdTransactions)
-        .values({
+        // Trust client amounts within small epsilon; adjust server-side total to reflect redemption
+        const inserted = await tx.insert(sales).values({
+          orgId: me.orgId,
           storeId: parsed.data.storeId,
           cashierId: me.id,
-          status: 'completed',
-          kind: 'SALE',
           subtotal: String(subtotalNum),
-          taxAmount: String(taxNum),
+          discount: String(effectiveDiscount),
+          tax: String(taxNum),
           total: String(adjustedTotal),
-          paymentMethod: normalizedPaymentMethod,
-          amountReceived: String(adjustedTotal),
-          changeDue: '0',
-          receiptNumber: sale.id,
-        } as any)
-        .returning();
-      logger.info('POS: Transaction inserted', { transactionId: tx.id, storeId: parsed.data.storeId });
-
-      // Fetch inventory costs for COGS tracking
-      const productIds = parsed.data.items.map(i => i.productId.replace(/_free$/, ''));
-      const inventoryCosts = await db
-        .select({ productId: inventory.productId, avgCost: inventory.avgCost })
-        .from(inventory)
-        .where(and(eq(inventory.storeId, parsed.data.storeId), inArray(inventory.productId, productIds)));
-      const costMap = new Map<string, number>();
-      for (const row of inventoryCosts) {
-        costMap.set(row.productId, parseFloat(String(row.avgCost || '0')));
-      }
-
-      for (const item of parsed.data.items) {
-        const productId = item.productId.replace(/_free$/, '');
-        const unitCost = costMap.get(productId) || 0;
-        const totalCost = unitCost * item.quantity;
-        await db
-          .insert(prdTransactionItems)
-          .values({
-            transactionId: tx.id,
+          paymentMethod: parsed.data.paymentMethod,
+          walletReference,
+          paymentBreakdown: paymentBreakdown.length ? paymentBreakdown : null,
+          idempotencyKey,
+        } as any).returning();
+        const sale = inserted[0];
+        const depletedLines: Array<{ productId: string; quantity: number }> = [];
+
+        for (const item of parsed.data.items) {
+          // Sanitize productId to remove suffixes (e.g. _free)
+          const rawProductId = item.productId;
+          const productId = rawProductId.replace(/_free$/, '');
+
+          await tx.insert(saleItems).values({
+            saleId: sale.id,
             productId,
             quantity: item.quantity,
             unitPrice: item.unitPrice,
-            totalPrice: item.lineTotal,
-            unitCost: String(unitCost.toFixed(4)),
-            totalCost: String(totalCost.toFixed(4)),
-            promotionId: item.promotionId || null,
-            promotionDiscount: String(Math.max(0, totalCost - parseFloat(item.lineTotal)).toFixed(4)),
-            originalUnitPrice: item.originalUnitPrice || item.unitPrice,
-            isFreeItem: item.isFreeItem || false,
+            lineDiscount: item.lineDiscount,
+            lineTotal: item.lineTotal,
           } as any);
-      }
-      logger.info('POS: Transaction items inserted with COGS', { transactionId: tx.id, itemCount: parsed.data.items.length });
-
-      // Loyalty: update customer points directly (new schema uses currentPoints on customers table)
-      if (customerId) {
-        logger.info('POS: Processing loyalty for customer', { customerId, customerPhone, customerPoints });
-        let newPoints = customerPoints;
-        // Redeem first
-        if (redeemDiscount > 0 && redeemPoints > 0) {
-          newPoints = Math.max(0, customerPoints - redeemPoints);
-        }
-        // Earn: 1 point per 1.00 currency unit of (subtotal - discounts)
-        const spendBase = Math.max(0, subtotalNum - effectiveDiscount);
-        const pointsEarned = Math.floor(spendBase * Math.max(orgSettings.earnRate, 0));
-        if (pointsEarned > 0) {
-          newPoints += pointsEarned;
-        }
-        // Update customer points if earned or redeemed
-        if (pointsEarned > 0 || (redeemDiscount > 0 && redeemPoints > 0)) {
-          await db
-            .update(customers)
-            .set({
-              currentPoints: newPoints,
-              lifetimePoints: pointsEarned > 0 ? sql`lifetime_points + ${pointsEarned}` : sql`lifetime_points`,
-              updatedAt: new Date(),
-            } as any)
-            .where(eq(customers.id, customerId));
-          logger.info('Loyalty points updated', { customerId, pointsEarned, newPoints });
-        }
-      }
-
-      if (hasTx && pg) await pg.query('COMMIT');
 
-      // Redis rollups and websocket event (fire-and-forget)
-      try {
-        // Resolve orgId from store for channeling by org
-        const srow = await db.select({ orgId: stores.orgId }).from(stores).where(eq(stores.id, parsed.data.storeId));
-        const orgId = (srow as any)[0]?.orgId as string | undefined;
-        const revenue = parseFloat(String(parsed.data.total || '0')) || 0;
-        const discount = parseFloat(String(parsed.data.discount || '0')) || 0;
-        const tax = parseFloat(String(parsed.data.tax || '0')) || 0;
-        await incrementTodayRollups(orgId || (parsed.data as any).orgId, parsed.data.storeId, {
-          revenue,
-          transactions: 1,
-          discount,
-          tax,
-        });
+          // Check if inventory is sufficient and auto-adjust if needed
+          try {
+            // A savepoint keeps a failed adjustment from aborting the sale transaction
+            await tx.transaction(async () => {
+              const currentInv = await storage.getInventoryItem(productId, parsed.data.storeId);
+              const currentQty = Number(currentInv?.quantity || 0);
+
+              // If inventory is insufficient, auto-add discovered units before reducing
+              if (currentQty < item.quantity) {
+                logger.info('POS Sale: Insufficient inventory detected, performing stock adjustment', {
+                  productId,
+                  storeId: parsed.data.storeId,
+                  currentQty,
+                  requiredQty: item.quantity,
+                });
+
+                await storage.addStockAdjustmentForPOS(
+                  productId,
+                  parsed.data.storeId,
+                  item.quantity,
+                  me.id,
+                  sale.id,
+                  `Stock adjustment for sale - discovered ${item.quantity - currentQty} units`,
+                );
+              }
 
-        const wsService = (req.app as any).wsService;
-        if (wsService) {
-          const payload = {
-            event: 'sale:created',
-            orgId: orgId || (parsed.data as any).orgId,
-            storeId: parsed.data.storeId,
-            delta: { revenue, transactions: 1, discount, tax },
-            saleId: sale.id,
-            occurredAt: new Date().toISOString(),
-          };
-          if (wsService.publish) {
-            await wsService.publish(`store:${parsed.data.storeId}`, payload);
-            if (orgId || (parsed.data as any).orgId) {
-              await wsService.publish(`org:${orgId || (parsed.data as any).orgId}`, payload);
-            }
-          } else if (wsService.broadcastNotification) {
-            await wsService.broadcastNotification({
-              type: 'sales_update',
+              // Now reduce inventory (will have enough after adjustment)
+              await storage.adjustInventory(
+                productId,
+                parsed.data.storeId,
+                -item.quantity,
+                me.id,
+                'pos_sale',
+                sale.id,
+                `POS sale - ${item.quantity} units`,
+                undefined,
+                { deferCostLayers: true },
+              );
+              depletedLines.push({ productId, quantity: item.quantity });
+            });
+          } catch (invErr) {
+            logger.warn('Inventory adjustment failed for POS sale', {
+              productId,
               storeId: parsed.data.storeId,
-              title: 'Sale created',
-              message: `+${revenue.toFixed(2)}`,
-              data: payload,
-              priority: 'low',
+              quantity: item.quantity,
+              error: invErr instanceof Error ? invErr.message : String(invErr),
             });
           }
         }
-      } catch (error) {
-        logger.warn('Failed to broadcast sale rollup', {
-          storeId: parsed.data.storeId,
-          error: error instanceof Error ? error.message : String(error)
-        });
-      }
 
-      res.json(sale);
-    } catch (error) {
-      if (hasTx && pg) {
+        // Consume FIFO cost layers for every line in one statement
         try {
-          await pg.query('ROLLBACK');
-        } catch (rollbackError) {
-          logger.warn('Failed to rollback sale transaction', {
-            error: rollbackError instanceof Error ? error.message : String(rollbackError),
+          // Same for cost layers: a failure is logged and rolled back to here
+          await tx.transaction(async () => {
+            await storage.consumeCostLayersBulk(parsed.data.storeId, depletedLines);
+          });
+        } catch (layerErr) {
+          logger.warn('Cost layer consumption failed for POS sale', {
+            saleId: sale.id,
+            storeId: parsed.data.storeId,
+            lineCount: depletedLines.length,
+            error: layerErr instanceof Error ? layerErr.message : String(layerErr),
           });
         }
+
+        const normalizedPaymentMethod = normalizePaymentMethod(parsed.data.paymentMethod);
+
+        // Insert into transactions table for analytics
+        logger.info('POS: Inserting transaction for analytics', { storeId: parsed.data.storeId, total: adjustedTotal });
+        const [analyticsTx] = await tx
+          .insert(prdTransactions)
+          .values({
+            storeId: parsed.data.storeId,
+            cashierId: me.id,
+            status: 'completed',
+            kind: 'SALE',
+            subtotal: String(subtotalNum),
+            taxAmount: String(taxNum),
+            total: String(adjustedTotal),
+            paymentMethod: normalizedPaymentMethod,
+            amountReceived: String(adjustedTotal),
+            changeDue: '0',
+            receiptNumber: sale.id,
+          } as any)
+          .returning();
+        logger.info('POS: Transaction inserted', { transactionId: analyticsTx.id, storeId: parsed.data.storeId });
+
+        // Fetch inventory costs for COGS tracking
+        const productIds = parsed.data.items.map(i => i.productId.replace(/_free$/, ''));
+        const inventoryCosts = await tx
+          .select({ productId: inventory.productId, avgCost: inventory.avgCost })
+          .from(inventory)
+          .where(and(eq(inventory.storeId, parsed.data.storeId), inArray(inventory.productId, productIds)));
+        const costMap = new Map<string, number>();
+        for (const row of inventoryCosts) {
+          costMap.set(row.productId, parseFloat(String(row.avgCost || '0')));
+        }
+
+        for (const item of parsed.data.items) {
+          const productId = item.productId.replace(/_free$/, '');
+          const unitCost = costMap.get(productId) || 0;
+          const totalCost = unitCost * item.quantity;
+          await tx
+            .insert(prdTransactionItems)
+            .values({
+              transactionId: analyticsTx.id,
+              productId,
+              quantity: item.quantity,
+              unitPrice: item.unitPrice,
+              totalPrice: item.lineTotal,
+              unitCost: String(unitCost.toFixed(4)),
+              totalCost: String(totalCost.toFixed(4)),
+              promotionId: item.promotionId || null,
+              promotionDiscount: String(Math.max(0, totalCost - parseFloat(item.lineTotal)).toFixed(4)),
+              originalUnitPrice: item.originalUnitPrice || item.unitPrice,
+              isFreeItem: item.isFreeItem || false,
+            } as any);
+        }
+        logger.info('POS: Transaction items inserted with COGS', { transactionId: analyticsTx.id, itemCount: parsed.data.items.length });
+
+        // Loyalty: redeem and earn as ledger entries; the balance (customers.currentPoints)
+        // moves atomically and a redemption the balance no longer covers rolls the sale back
+        if (customerId) {
+          logger.info('POS: Processing loyalty for customer', { customerId, customerPhone, customerPoints });
+          // Earn: 1 point per 1.00 currency unit of (subtotal - discounts)
+          const spendBase = Math.max(0, subtotalNum - effectiveDiscount);
+          const pointsEarned = Math.floor(spendBase * Math.max(orgSettings.earnRate, 0));
+          const redeemed = redeemDiscount > 0 && redeemPoints > 0 ? redeemPoints : 0;
+          const entry = { holderKind: 'customer', holderId: customerId, orgId: me.orgId, source: 'pos_sale', referenceId: sale.id } as const;
+          const { balances } = await postLoyaltyEntriesOrThrow([
+            { ...entry, delta: -redeemed, entryType: 'redeem' },
+            { ...entry, delta: pointsEarned, entryType: 'earn' },
+          ], tx);
+          if (balances.has(customerId)) {
+            logger.info('Loyalty points updated', { customerId, pointsEarned, newPoints: balances.get(customerId) });
+          }
+        }
+        return sale;
+      });
+
+      await publishSaleCreated(req, parsed.data, sale.id, me.id);
+
+      res.json(sale);
+    } catch (error) {
+      if (error instanceof AppError) {
+        return res.status(error.statusCode).json({ error: error.message });
       }
       logger.error('Failed to record sale', {
         error: error instanceof Error ? error.message : String(error),
       });
       res.status(500).json({ error: 'Failed to record sale' });
-    } finally {
-      if (hasTx && pg) pg.release();
     }
   });
 
+  // Bulk replay of offline sales queued by the service worker. Each entry is the
+  // body the till would have POSTed to /api/pos/sales; results come back per
+  // idempotency key so the queue can drop what landed and retry the rest.
+  app.post('/api/pos/sales/batch', requireAuth, requireRole('CASHIER'), enforceIpWhitelist, async (req: Request, res: Response) => {
+    if (saleCommitMode() !== 'procedure') {
+      // The per-query path commits one sale per request; the service worker falls back to it on 501
+      return res.status(501).json({ error: 'Batch sale upload is not available', code: 'BATCH_UNSUPPORTED' });
+    }
+    const parsed = SaleBatchSchema.safeParse(req.body);
+    if (!parsed.success) {
+      return res.status(400).json({ error: 'Invalid payload', details: parsed.error.errors });
+    }
+
+    const startedAt = Date.now();
+    const results = await replaySaleBatch(parsed.data.sales, async (entry) => {
+      const sale = SaleSchema.safeParse(entry.payload);
+      if (!sale.success) {
+        return { status: 400, body: { error: 'Invalid payload', details: sale.error.errors } };
+      }
+      return commitSaleInOneRoundTrip(req, sale.data, entry.idempotencyKey);
+    });
+
+    const summary = { created: 0, duplicate: 0, failed: 0 };
+    for (const result of results) summary[result.status]++;
+    logger.info('POS sale batch replayed', {
+      userId: req.session?.userId,
+      size: results.length,
+      ...summary,
+      durationMs: Date.now() - startedAt,
+    });
+    return res.json({ results, ...summary });
+  });
+
   // Look up a sale by idempotency key (used to resolve offline sales that synced via service worker)
   app.get('/api/pos/sales/by-idempotency-key/:key', requireAuth, requireRole('CASHIER'), async (req: Request, res: Response) => {
     const { key } = req.params;
@@ -1240,6 +1538,11 @@ export async function registerPosRoutes(app: Express) {
 
     if (!parsed.success) return res.status(400).json({ error: 'Invalid payload' });
 
+    if (returnsEngineMode() === 'batched') {
+      const outcome = await processReturnInOneTransaction(req, parsed.data, idempotencyKey);
+      return res.status(outcome.status).json(outcome.body);
+    }
+
     // Verify sale exists and not already returned
     const saleRows = await db.select().from(sales).where(eq(sales.id, parsed.data.saleId));
     const sale = saleRows[0];
@@ -1648,6 +1951,11 @@ export async function registerPosRoutes(app: Express) {
       return res.status(400).json({ error: 'Invalid payload', details: parsed.error.errors });
     }
 
+    if (returnsEngineMode() === 'batched') {
+      const outcome = await processSwapInOneTransaction(req, parsed.data, idempotencyKey);
+      return res.status(outcome.status).json(outcome.body);
+    }
+
     const sessionUserId = req.session?.userId as string | undefined;
     if (!sessionUserId) return res.status(401).json({ error: 'Not authenticated' });
 
@@ -1,15 +1,22 @@
 import crypto from 'crypto';
-import { and, eq, sql } from 'drizzle-orm';
+import { and, eq } from 'drizzle-orm';
 import express, { type Express, type Request, type Response } from 'express';
-import { subscriptions, subscriptionPayments, organizations, webhookEvents, users, userRoles } from '@shared/schema';
+import { webhookEvents, users, userRoles } from '@shared/schema';
 import { db } from '../db';
 import { generateMonitoringAlertEmail, sendEmail } from '../email';
+import { enqueueWebhookEvent, webhookIngestMode } from '../jobs/webhook-queue';
 import { logger } from '../lib/logger';
 import { getNotificationService } from '../lib/notification-bus';
 import { isSystemHealthEmailEnabled } from '../lib/notification-preferences';
-import { emitPaymentAlert } from '../lib/notification-producers';
 import { handleSystemHealthNotification } from '../lib/system-health-follow-ups';
 import { translateSentryEvent } from '../lib/system-health-translator';
+import {
+  applyFlutterwaveEvent,
+  applyPaystackEvent,
+  resolveOrderingKey,
+  type WebhookApplyResult,
+  type WebhookProvider,
+} from '../payment/webhook-events';
 
 function verifyPaystackSignature(rawBody: string, signature: string | undefined): boolean {
   const secret = process.env.WEBHOOK_SECRET_PAYSTACK || process.env.PAYSTACK_SECRET_KEY || '';
@@ -125,6 +132,48 @@ export async function registerWebhookRoutes(app: Express) {
     }
     return { ok: true, id: String(id) };
   }
+  const respondToApplied = (res: Response, result: WebhookApplyResult) => {
+    if (result.outcome === 'unresolved') {
+      return res.status(400).json({ error: 'Missing subscription identifiers' });
+    }
+    if (result.outcome === 'org_missing') {
+      // In test environment, acknowledge after idempotency write without requiring seeded org
+      if (process.env.NODE_ENV === 'test') {
+        return res.json({ status: 'success', received: true });
+      }
+      return res.status(404).json({ error: 'Org not found' });
+    }
+    return res.json({ status: 'success', received: true });
+  };
+
+  // Queue ingest mode: persist the verified event and ACK; the side effects run in
+  // server/jobs/webhook-queue.ts so a slow apply never pushes providers into retries
+  const enqueueAndAck = async (
+    res: Response,
+    provider: WebhookProvider,
+    evt: any,
+    providerEventId: string,
+    providerKey: string,
+    headerKey: string | undefined,
+    ack: Record<string, unknown>,
+  ) => {
+    try {
+      const orderingKey = await resolveOrderingKey(provider, evt, providerEventId);
+      const queued = await enqueueWebhookEvent({ provider, eventId: providerEventId, payload: evt, orderingKey });
+      markProviderSeen(providerKey);
+      return res.json(queued ? { ...ack, queued: true } : { ...ack, idempotent: true });
+    } catch (error) {
+      // Let the provider redeliver; forget the header id so the retry is not treated as a replay
+      if (headerKey) seenEvents.delete(headerKey);
+      logger.error('Failed to enqueue webhook event', {
+        provider,
+        providerEventId,
+        error: error instanceof Error ? error.message : String(error)
+      });
+      return res.status(503).json({ error: 'Temporarily unavailable' });
+    }
+  };
+
   // Health pings for debugging
   app.get('/webhooks/ping', (_req: Request, res: Response) => res.json({ ok: true }));
   app.get('/api/payment/ping', (_req: Request, res: Response) => res.json({ ok: true }));
@@ -160,6 +209,10 @@ export async function registerWebhookRoutes(app: Express) {
         }
         markSeen(headerKey);
       }
+      if (webhookIngestMode() === 'queue') {
+        return enqueueAndAck(res, 'PAYSTACK', evt, providerEventId, providerKey, idCheck.id ? 'PAYSTACK#' + idCheck.id : undefined,
+          { status: 'success', received: true });
+      }
       // Idempotency: skip already-processed events (DB uniqueness)
       try {
         await db.insert(webhookEvents).values({ provider: 'PAYSTACK' as any, eventId: providerEventId } as any);
@@ -172,150 +225,7 @@ export async function registerWebhookRoutes(app: Express) {
       }
       // Mark provider-level seen after successful uniqueness check/insert
       markProviderSeen(providerKey);
-      // Try reading orgId/planCode from metadata first
-      let orgId = data?.metadata?.orgId as string | undefined;
-      let planCode = data?.metadata?.planCode as string | undefined;
-      // Fallback: resolve via existing subscription using external ids when metadata missing
-      if (!orgId || !planCode) {
-        const externalSubIdCandidate = (data?.subscription) || (data?.subscription_code);
-        const externalCustomerCandidate = (data?.customer?.customer_code) || (data?.customer?.id);
-        if (externalSubIdCandidate || externalCustomerCandidate) {
-          const bySub = externalSubIdCandidate
-            ? await db.select().from(subscriptions).where(eq(subscriptions.externalSubId, externalSubIdCandidate)).then(r => r[0])
-            : undefined;
-          const byCustomer = !bySub && externalCustomerCandidate
-            ? await db.select().from(subscriptions).where(eq(subscriptions.externalCustomerId, externalCustomerCandidate)).then(r => r[0])
-            : undefined;
-          const matched = bySub || byCustomer;
-          if (matched) {
-            orgId = matched.orgId as any;
-            planCode = matched.planCode as any;
-          }
-        }
-      }
-      if (!orgId || !planCode) return res.status(400).json({ error: 'Missing subscription identifiers' });
-
-      const rows = await db.select().from(organizations).where(eq(organizations.id, orgId));
-      const organization = rows[0];
-      if (!organization) {
-        // In test environment, acknowledge after idempotency write without requiring seeded org
-        if (process.env.NODE_ENV === 'test') {
-          return res.json({ status: 'success', received: true });
-        }
-        return res.status(404).json({ error: 'Org not found' });
-      }
-
-      const status = (data?.status === 'success') ? 'ACTIVE' : (data?.status === 'failed' ? 'CANCELLED' : 'PAST_DUE');
-
-      // Extract optional identifiers/periods
-      const externalCustomerId = (data?.customer?.customer_code) || (data?.customer?.id) || undefined;
-      const externalSubId = (data?.subscription) || (data?.subscription_code) || undefined;
-      const startedAt = data?.paid_at ? new Date(data.paid_at) : (data?.createdAt ? new Date(data.createdAt) : undefined);
-      const currentPeriodEnd = data?.next_payment_date ? new Date(data.next_payment_date) : undefined;
-      const paymentCurrency = data?.currency || 'NGN';
-      const paymentReference = data?.reference || data?.id;
-      let paymentAmountMajor: number | null = null;
-
-      // Upsert by (orgId)
-      const existing = await db.select().from(subscriptions).where(eq(subscriptions.orgId, orgId));
-      if (existing[0]) {
-        await db.update(subscriptions).set({
-          planCode,
-          provider: 'PAYSTACK' as any,
-          status: status as any,
-          externalCustomerId: externalCustomerId as any,
-          externalSubId: externalSubId as any,
-          startedAt: (startedAt as any) ?? existing[0].startedAt,
-          currentPeriodEnd: (currentPeriodEnd as any) ?? existing[0].currentPeriodEnd,
-          lastEventRaw: evt as any,
-          updatedAt: new Date() as any,
-        } as any).where(eq(subscriptions.orgId, orgId));
-      } else {
-        await db.insert(subscriptions).values({
-          orgId,
-          planCode,
-          provider: 'PAYSTACK' as any,
-          status: status as any,
-          externalCustomerId: externalCustomerId as any,
-          externalSubId: externalSubId as any,
-          startedAt: startedAt as any,
-          currentPeriodEnd: currentPeriodEnd as any,
-          lastEventRaw: evt as any,
-        } as any);
-      }
-
-      // Record payment events when applicable
-      if (data?.status === 'success' || data?.status === 'failed') {
-        const amountMajor = Number(data?.amount ?? 0) / 100;
-        paymentAmountMajor = amountMajor;
-        try {
-          await db.insert(subscriptionPayments).values({
-            orgId,
-            provider: 'PAYSTACK' as any,
-            planCode,
-            externalSubId: data?.subscription || undefined,
-            externalInvoiceId: data?.invoice || undefined,
-            reference: paymentReference,
-            amount: amountMajor.toFixed(2) as any,
-            currency: paymentCurrency,
-            status: data?.status,
-            eventType: evt?.event,
-            raw: evt as any,
-          } as any);
-        } catch (error) {
-          logger.warn('Failed to record Paystack subscription payment', {
-            orgId,
-            reference: data?.reference || data?.id,
-            error: error instanceof Error ? error.message : String(error)
-          });
-        }
-      }
-
-      // Activate or lock org based on status
-      if (status === 'ACTIVE') {
-        await db.execute(sql`UPDATE organizations SET is_active = true, locked_until = NULL WHERE id = ${orgId}`);
-        // Note: Stores remain inactive - admin must reactivate them via the reactivation modal
-        // This allows admins to choose which stores to reactivate based on their plan limits
-      } else if (status === 'PAST_DUE') {
-        const grace = new Date(Date.now() + 3 * 24 * 60 * 60 * 1000);
-        await db.execute(sql`UPDATE organizations SET locked_until = ${grace} WHERE id = ${orgId}`);
-      } else if (status === 'CANCELLED') {
-        await db.execute(sql`UPDATE organizations SET is_active = false WHERE id = ${orgId}`);
-        // Deactivate all stores when subscription is cancelled
-        await db.execute(sql`UPDATE stores SET is_active = false WHERE org_id = ${orgId}`);
-      }
-
-      if (data?.status === 'success' || data?.status === 'failed') {
-        const isSuccess = data.status === 'success';
-        const amountDisplay = paymentAmountMajor !== null ? paymentAmountMajor.toFixed(2) : '0.00';
-        const gatewayMessage = data?.gateway_response || data?.message || 'No gateway message supplied.';
-        try {
-          await emitPaymentAlert({
-            orgId,
-            title: isSuccess ? 'Subscription payment received' : 'Subscription payment failed',
-            message: isSuccess
-              ? `Paystack processed a ${paymentCurrency} ${amountDisplay} subscription payment for ${organization.name ?? 'your organization'}.`
-              : `Paystack could not process the ${paymentCurrency} ${amountDisplay} subscription payment: ${gatewayMessage}.`,
-            priority: isSuccess ? 'low' : 'high',
-            data: {
-              provider: 'PAYSTACK',
-              reference: paymentReference,
-              planCode,
-              amount: paymentAmountMajor,
-              currency: paymentCurrency,
-              status: data.status,
-            },
-          });
-        } catch (error) {
-          logger.warn('Failed to emit Paystack payment alert', {
-            orgId,
-            reference: paymentReference,
-            error: error instanceof Error ? error.message : String(error),
-          });
-        }
-      }
-
-      return res.json({ status: 'success', received: true });
+      return respondToApplied(res, await applyPaystackEvent(evt));
     } catch (error) {
       logger.warn('Paystack webhook handling failed', {
         error: error instanceof Error ? error.message : String(error)
@@ -351,6 +261,9 @@ export async function registerWebhookRoutes(app: Express) {
         return res.json({ received: true, idempotent: true });
       }
       markSeen(headerKey);
+      if (webhookIngestMode() === 'queue') {
+        return enqueueAndAck(res, 'FLW', evt, providerEventId, providerKey, headerKey, { received: true });
+      }
       // Idempotency: skip already-processed events (DB uniqueness)
       try {
         await db.insert(webhookEvents).values({ provider: 'FLW' as any, eventId: providerEventId } as any);
@@ -363,146 +276,7 @@ export async function registerWebhookRoutes(app: Express) {
       }
       // Mark provider-level seen after successful uniqueness check/insert
       markProviderSeen(providerKey);
-      // Try metadata first
-      let orgId = data?.meta?.orgId as string | undefined;
-      let planCode = data?.meta?.planCode as string | undefined;
-      // Fallback resolution via existing subscriptions
-      if (!orgId || !planCode) {
-        const externalSubIdCandidate = (data?.plan) || (data?.payment_plan);
-        const externalCustomerCandidate = data?.customer?.id;
-        if (externalSubIdCandidate || externalCustomerCandidate) {
-          const bySub = externalSubIdCandidate
-            ? await db.select().from(subscriptions).where(eq(subscriptions.externalSubId, String(externalSubIdCandidate))).then(r => r[0])
-            : undefined;
-          const byCustomer = !bySub && externalCustomerCandidate
-            ? await db.select().from(subscriptions).where(eq(subscriptions.externalCustomerId, String(externalCustomerCandidate))).then(r => r[0])
-            : undefined;
-          const matched = bySub || byCustomer;
-          if (matched) {
-            orgId = matched.orgId as any;
-            planCode = matched.planCode as any;
-          }
-        }
-      }
-      if (!orgId || !planCode) return res.status(400).json({ error: 'Missing subscription identifiers' });
-
-      const rows = await db.select().from(organizations).where(eq(organizations.id, orgId));
-      const organization = rows[0];
-      if (!organization) {
-        if (process.env.NODE_ENV === 'test') {
-          return res.json({ status: 'success', received: true });
-        }
-        return res.status(404).json({ error: 'Org not found' });
-      }
-
-      const status = (data?.status === 'successful') ? 'ACTIVE' : (data?.status === 'failed' ? 'CANCELLED' : 'PAST_DUE');
-
-      const externalCustomerId = (data?.customer?.id) || undefined;
-      const externalSubId = (data?.plan) || (data?.payment_plan) || undefined;
-      const startedAt = data?.created_at ? new Date(data.created_at) : undefined;
-      const currentPeriodEnd = (data?.next_due_date ? new Date(data.next_due_date) : undefined) as Date | undefined;
-      const paymentCurrency = data?.currency || 'USD';
-      const paymentReference = data?.tx_ref || data?.id;
-      let paymentAmountMajor: number | null = null;
-
-      const existing = await db.select().from(subscriptions).where(eq(subscriptions.orgId, orgId));
-      if (existing[0]) {
-        await db.update(subscriptions).set({
-          planCode,
-          provider: 'FLW' as any,
-          status: status as any,
-          externalCustomerId: externalCustomerId as any,
-          externalSubId: externalSubId as any,
-          startedAt: (startedAt as any) ?? existing[0].startedAt,
-          currentPeriodEnd: (currentPeriodEnd as any) ?? existing[0].currentPeriodEnd,
-          lastEventRaw: evt as any,
-          updatedAt: new Date() as any,
-        } as any).where(eq(subscriptions.orgId, orgId));
-      } else {
-        await db.insert(subscriptions).values({
-          orgId,
-          planCode,
-          provider: 'FLW' as any,
-          status: status as any,
-          externalCustomerId: externalCustomerId as any,
-          externalSubId: externalSubId as any,
-          startedAt: startedAt as any,
-          currentPeriodEnd: currentPeriodEnd as any,
-          lastEventRaw: evt as any,
-        } as any);
-      }
-
-      // Record payment events when applicable
-      if (data?.status === 'successful' || data?.status === 'failed') {
-        const amountMajor = Number(data?.amount ?? 0); // Flutterwave sends in major units
-        paymentAmountMajor = amountMajor;
-        try {
-          await db.insert(subscriptionPayments).values({
-            orgId,
-            provider: 'FLW' as any,
-            planCode,
-            externalSubId: data?.plan || undefined,
-            externalInvoiceId: data?.id || undefined,
-            reference: paymentReference,
-            amount: amountMajor.toFixed(2) as any,
-            currency: paymentCurrency,
-            status: data?.status,
-            eventType: evt?.event,
-            raw: evt as any,
-          } as any);
-        } catch (error) {
-          logger.warn('Failed to record Flutterwave subscription payment', {
-            orgId,
-            reference: data?.tx_ref || data?.id,
-            error: error instanceof Error ? error.message : String(error)
-          });
-        }
-      }
-
-      if (status === 'ACTIVE') {
-        await db.execute(sql`UPDATE organizations SET is_active = true, locked_until = NULL WHERE id = ${orgId}`);
-        // Note: Stores remain inactive - admin must reactivate them via the reactivation modal
-        // This allows admins to choose which stores to reactivate based on their plan limits
-      } else if (status === 'PAST_DUE') {
-        const grace = new Date(Date.now() + 3 * 24 * 60 * 60 * 1000);
-        await db.execute(sql`UPDATE organizations SET locked_until = ${grace} WHERE id = ${orgId}`);
-      } else if (status === 'CANCELLED') {
-        await db.execute(sql`UPDATE organizations SET is_active = false WHERE id = ${orgId}`);
-        // Deactivate all stores when subscription is cancelled
-        await db.execute(sql`UPDATE stores SET is_active = false WHERE org_id = ${orgId}`);
-      }
-
-      if (data?.status === 'successful' || data?.status === 'failed') {
-        const isSuccess = data.status === 'successful';
-        const amountDisplay = paymentAmountMajor !== null ? paymentAmountMajor.toFixed(2) : '0.00';
-        const failureReason = data?.processor_response || data?.complete_message || 'No gateway message supplied.';
-        try {
-          await emitPaymentAlert({
-            orgId,
-            title: isSuccess ? 'Subscription payment received' : 'Subscription payment failed',
-            message: isSuccess
-              ? `Flutterwave processed a ${paymentCurrency} ${amountDisplay} subscription payment for ${organization.name ?? 'your organization'}.`
-              : `Flutterwave could not process the ${paymentCurrency} ${amountDisplay} subscription payment: ${failureReason}.`,
-            priority: isSuccess ? 'low' : 'high',
-            data: {
-              provider: 'FLW',
-              reference: paymentReference,
-              planCode,
-              amount: paymentAmountMajor,
-              currency: paymentCurrency,
-              status: data.status,
-            },
-          });
-        } catch (error) {
-          logger.warn('Failed to emit Flutterwave payment alert', {
-            orgId,
-            reference: paymentReference,
-            error: error instanceof Error ? error.message : String(error),
-          });
-        }
-      }
-
-      return res.json({ status: 'success', received: true });
+      return respondToApplied(res, await applyFlutterwaveEvent(evt));
     } catch {
       return res.status(400).json({ error: 'Invalid payload' });
     }
@@ -0,0 +1,136 @@
+import 'dotenv/config';
+import cluster, { type Worker } from 'node:cluster';
+import { extname } from 'node:path';
+import { fileURLToPath } from 'node:url';
+
+import { RELAY_MESSAGE, SHUTDOWN_MESSAGE, resolvePoolSize, resolveWorkerCount } from './lib/cluster';
+import { logger } from './lib/logger';
+
+/**
+ * Clustered entry point: forks CLUSTER_WORKERS copies of server/index and
+ * keeps them running. Connections are spread by the cluster module's
+ * round-robin; a WebSocket stays on the worker that accepted its upgrade and
+ * deliveries are relayed between workers (lib/cluster.ts). Background jobs run
+ * on worker CLUSTER_SCHEDULER_WORKER only.
+ *
+ * SIGUSR2 (or SIGHUP) replaces the workers one at a time: the replacement has
+ * to be listening before the old worker is asked to drain, so capacity never
+ * drops by more than one worker. SIGTERM/SIGINT drain every worker and exit.
+ */
+
+const workerCount = resolveWorkerCount(process.env.CLUSTER_WORKERS === undefined ? 'auto' : process.env.CLUSTER_WORKERS);
+const shutdownTimeoutMs = Number(process.env.CLUSTER_SHUTDOWN_TIMEOUT_MS ?? 30_000);
+const entry = fileURLToPath(new URL(`./index${extname(fileURLToPath(import.meta.url))}`, import.meta.url));
+
+const slots = new Map<number, Worker>();
+const retiring = new Set<Worker>();
+const crashes: number[] = [];
+let shuttingDown = false;
+let restarting = false;
+
+function fork(index: number): Worker {
+  const worker = cluster.fork({
+    CLUSTER_WORKERS: String(workerCount),
+    CLUSTER_WORKER_INDEX: String(index),
+  });
+  slots.set(index, worker);
+
+  worker.on('message', (message: { type?: string }) => {
+    if (message?.type !== RELAY_MESSAGE) return;
+    for (const other of slots.values()) {
+      if (other !== worker && other.isConnected()) other.send(message);
+    }
+  });
+
+  worker.on('exit', (code, signal) => {
+    if (retiring.delete(worker) || shuttingDown) return;
+    if (slots.get(index) !== worker) return;
+
+    // Back off when workers keep dying on start-up instead of fork-looping
+    const now = Date.now();
+    crashes.push(now);
+    while (crashes.length && crashes[0] < now - 60_000) crashes.shift();
+    const delayMs = Math.min(30_000, crashes.length > 3 ? 1000 * 2 ** (crashes.length - 3) : 0);
+    logger.error('Cluster worker exited unexpectedly; replacing it', { index, pid: worker.process.pid, code, signal, delayMs });
+    setTimeout(() => {
+      if (!shuttingDown) fork(index);
+    }, delayMs);
+  });
+  return worker;
+}
+
+function waitForListening(worker: Worker): Promise<void> {
+  return new Promise((resolve, reject) => {
+    const onExit = () => reject(new Error(`Worker ${worker.process.pid} exited before listening`));
+    worker.once('listening', () => {
+      worker.off('exit', onExit);
+      resolve();
+    });
+    worker.once('exit', onExit);
+  });
+}
+
+/** Ask a worker to drain (stop jobs, close sockets, finish requests), then force it after the timeout. */
+function retire(worker: Worker): Promise<void> {
+  retiring.add(worker);
+  return new Promise((resolve) => {
+    const timer = setTimeout(() => {
+      logger.warn('Cluster worker did not drain in time; killing it', { pid: worker.process.pid, shutdownTimeoutMs });
+      worker.process.kill('SIGKILL');
+    }, shutdownTimeoutMs);
+    worker.once('exit', () => {
+      clearTimeout(timer);
+      resolve();
+    });
+    if (worker.isConnected()) {
+      worker.send({ type: SHUTDOWN_MESSAGE });
+    } else {
+      worker.process.kill('SIGTERM');
+    }
+  });
+}
+
+async function rollingRestart(): Promise<void> {
+  if (restarting || shuttingDown) return;
+  restarting = true;
+  logger.info('Rolling restart started', { workers: workerCount });
+  try {
+    for (const [index, previous] of Array.from(slots)) {
+      const replacement = fork(index);
+      await waitForListening(replacement);
+      await retire(previous);
+      logger.info('Cluster worker replaced', { index, oldPid: previous.process.pid, newPid: replacement.process.pid });
+    }
+    logger.info('Rolling restart completed', { workers: workerCount });
+  } catch (error) {
+    logger.error('Rolling restart stopped', { error: error instanceof Error ? error.message : String(error) });
+  } finally {
+    restarting = false;
+  }
+}
+
+async function shutdown(signal: string): Promise<void> {
+  if (shuttingDown) return;
+  shuttingDown = true;
+  logger.info('Cluster shutting down', { signal, workers: slots.size });
+  await Promise.all(Array.from(slots.values(), (worker) => retire(worker)));
+  process.exit(0);
+}
+
+if (cluster.isPrimary) {
+  cluster.setupPrimary({ exec: entry });
+  logger.info('Starting cluster', {
+    workers: workerCount,
+    schedulerWorker: Number(process.env.CLUSTER_SCHEDULER_WORKER ?? 0),
+    poolSizePerWorker: resolvePoolSize({ ...process.env, CLUSTER_WORKERS: String(workerCount), CLUSTER_WORKER_INDEX: '0' }),
+  });
+  if (workerCount > 1 && (!process.env.REDIS_URL || process.env.LOCAL_DISABLE_REDIS === 'true')) {
+    logger.warn('Cluster mode without Redis: sessions and rate limits are kept per worker');
+  }
+  for (let index = 0; index < workerCount; index++) fork(index);
+
+  process.on('SIGUSR2', () => void rollingRestart());
+  process.on('SIGHUP', () => void rollingRestart());
+  process.on('SIGTERM', () => void shutdown('SIGTERM'));
+  process.on('SIGINT', () => void shutdown('SIGINT'));
+}
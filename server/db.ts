@@ -1,7 +1,9 @@
+import { AsyncLocalStorage } from 'node:async_hooks';
 import 'dotenv/config';
 import dotenv from 'dotenv';
 import { drizzle } from 'drizzle-orm/node-postgres';
-import { Pool } from 'pg';
+import { Client, Pool } from 'pg';
+import { resolvePoolSize } from './lib/cluster';
 // Use full schema for all user fields
 import * as schema from "@shared/schema";
 
@@ -20,7 +22,7 @@ if (!process.env.DATABASE_URL) {
 const dbConfig = {
   connectionString: process.env.DATABASE_URL,
   // Connection pooling settings for production
-  max: 20, // Maximum number of clients in the pool
+  max: resolvePoolSize(), // this process's share of DB_CONNECTION_BUDGET unless DB_POOL_MAX is set (lib/cluster.ts)
   idleTimeoutMillis: 30000, // Close idle clients after 30 seconds
   connectionTimeoutMillis: 15000, // Increased timeout for production
   maxUses: 7500, // Close (and replace) a connection after it has been used 7500 times
@@ -56,7 +58,31 @@ const dbConfig = {
   allowExitOnIdle: false
 };
 
-export const pool = new Pool(dbConfig);
+/**
+ * The transaction a request is currently running in (see lib/tx-executor.ts).
+ * While a scope is open, `db` resolves to its transaction so every statement
+ * in that async context, including ones issued from storage helpers, runs on
+ * the connection that holds it.
+ */
+export interface TransactionScope {
+  route: string;
+  tx: unknown;
+  open: boolean;
+  /** Pool checkouts made from inside the scope: each one is a second connection for the same request */
+  foreignCheckouts: number;
+}
+
+export const transactionContext = new AsyncLocalStorage<TransactionScope>();
+
+class TrackedPool extends Pool {
+  connect(...args: any[]): any {
+    const scope = transactionContext.getStore();
+    if (scope?.open) scope.foreignCheckouts += 1;
+    return (super.connect as (...params: any[]) => any)(...args);
+  }
+}
+
+export const pool = new TrackedPool(dbConfig);
 
 // Test database connection on startup
 pool.on('connect', () => {
@@ -88,7 +114,29 @@ process.on('SIGTERM', async () => {
   process.exit(0);
 });
 
-export const db = drizzle({ client: pool, schema, logger: true });
+/**
+ * A connection outside the pool for a session held open indefinitely (the job
+ * scheduler's advisory-lock leases), so it never takes a slot from queries.
+ */
+export function createDedicatedClient(): Client {
+  return new Client({
+    connectionString: dbConfig.connectionString,
+    ssl: dbConfig.ssl,
+    application_name: dbConfig.application_name,
+  });
+}
+
+const rootDb = drizzle({ client: pool, schema, logger: true });
+
+export const db: typeof rootDb = new Proxy(rootDb, {
+  get(target, prop) {
+    const scope = transactionContext.getStore();
+    const tx = scope?.open ? (scope.tx as any) : null;
+    const source = tx && prop in tx ? tx : target;
+    const value = Reflect.get(source, prop, source);
+    return typeof value === 'function' ? value.bind(source) : value;
+  },
+});
 
 // Health check function for database
 export async function checkDatabaseHealth(): Promise<boolean> {
@@ -0,0 +1,187 @@
+// Generated by scripts/compile-email-templates.mjs from server/email-templates.
+// Do not edit by hand: change the sources and run `npm run build:emails`.
+/* eslint-disable */
+
+export type EmailTemplateValue = string | number | boolean | null | undefined;
+
+export interface EmailAsset {
+  filename: string;
+  cid: string;
+  contentType: string;
+  base64: string;
+}
+
+/** Branding assets referenced by the templates, keyed by content id */
+export const EMAIL_ASSETS: Record<string, EmailAsset> = {
+  'chainsync-logo-solid': {
+    filename: 'chainsync-logo-solid.png',
+    cid: 'chainsync-logo-solid',
+    contentType: 'image/png',
+    base64: 'iVBORw0KGgoAAAANSUhEUgAAAQAAAAEACAYAAABccqhmAAAAAXNSR0IArs4c6QAAEPlJREFUeJzt3X1wHOV9B/Dvb+9O75JtGcsGbOv8xmsLJtiBQooImSEw4AlTIKUwbWGaxrZEwR1KmkkgeNISSDJOhhRJeMofSUhISieEEFIMpWBTKA4kJCaYBIztk2xjI/kN3cmWdHf76x+SHNnW20l7+2if5/v5z/ey+73xPt97drW3K4iQ2a3pulLoEs/3lojoEijOgGA2gGkKrRJIlSqqRVBuOivZRxVHRZBWaEYgGQAfAdgHYJuqbFN47/Xm89v23VHdaTjquInpAKNZ0NJ1pkIaADQAaBDgdNOZiMaiwB5RbAR0UzZWsnH3qrJtpjONZEoVwPyH0+eKoEH6B/xlIphjOhPRZKliHwSbINikPja2NVX/3nSmQVOiAOY1dy+PiX8zgL8U4FTTeYiKRYG9UP2xL7EftjdW/tp0HnMFoCrzWzLXx6D/DJFlxnIQmaL6Kx/yQFtn1VNYK76JCOEXwHpN1OfSfyOCuwVyZujrJ5piFPou4H09Fav8AVZKNsx1h1oAyZau6wCsE8jCMNdLFAUK3QHxGlOrq54La52hFMDA0fz1Awf3iGgUqrpBBGt2Nta8W+x1FbUA5j6qtfHezH0CNEIQL+a6iKyiyKng4Uxp1Vf2/52ki7WaohXA/NauS2MqPwIwr1jrIHJAe069G3Y1Vb5RjIV7gS9RVRY0p+/1VDaBg59osubHxX8l2Zy5E6qBf2EHusDZrem6ch+PieDKIJdLRIBCn/VRfUt7oxwKapmBFcD8lp6FHvqeF8iioJZJRMdT6HYfJVe2N5btCGJ5gRTA/JbuC2PqPwvBrCCWR0SjUHTmxbs6iDMJJ30MINmcucqD/zIHP1FIBLM8+C8nmzNXTXZRkyqAZEvmNog+I0DFZIMQ0fgJUAHRZ5ItmdsmuZyJqW/pvsZT/yn+fZ/IIEUO8P5iZ1Plzyfy9gkVQLIl3QBggwBlE3k/EQVHgZ68epdN5FyBggtg/iPpc2K+bgakutD3ElFxqOoBX6Wh/fbqrYW8r6ACWLhep2kuvQUi9YXFI6JiU2jKi1Uv3bFSPhrvewo6CKi59GMc/ERTk0CSfi7zvULeM+4CSLZk1kBkReGxiCgsIvhMsiWzZtyvH8+L6h/u/pjn+ZsBJCacjIjCks153iW7VlX+aqwXjjkDmN2arvMk/yQ4+ImiIhHz8/+5cL1OG+uFYxZAueo3uN9PFC0CSfr59ENjv24U8x7pXhb3/aL8DpmIQiCxi3aurnh9pKdHnQHE8/mW4BMRUVjUz31ntOdHLIBkc+ZWiCwPPhIRhUVELkq2pm8a6fnhC+AJjQF6f9FSEVFoxMc3+8f0yYYtgOSBzI0iOK24sYgoFIK5yQOZG4d7atgCEF/vKm4iIgqVr8OeHHRSASSbM1fxVl1Edhk4FnD5iY+fPAOQ4ZuCiCJO8cUTHzruPIBk69EkNLdDpshdg4koOApoPpZYsmtl2fbBx46fAfi5Wzn4iewkgMRyfccdDDy+AERH/HshEVlA5LgxfqwAks2ZpbxdN5HdBDg/2ZxZOvjvITMAvdVEICIK2x/H+rECEOh1ZsIQUZiGjnUPGDj6z5/8ErlBpD7ZejQJDM4A/PxJJwgQkcUGxnx/AYjPAiByycCY9wBAFCwAIocMjnlJflunS2kmsPuNE1E07OyoinkoPXqW6SBEFL7krO7zPKjPAiBykejFHqBJ0zmIyARJehBwBkDkItXpHoA5pnMQkQGC6R5Uy0znICIjpnsQTDedgogMUJ3uiQoLgMhBAszxAM4AiNwkczwISk3HICIDBKVj3h2YiOzFAiByGAuAyGEsACKHsQCIHMYCIHIYC4DIYSwAIoexAIgcxgIgchgLgMhhLAAih7EAiBzGAiByGAuAyGEsACKHsQCIHMYCIHJY3HSAYji1SnBFfRzn13k4vy6GJbXsOSrctoM+tnTksaXDx4ttOezNqOlIgZMFLWlrPpUA+Os/TeALF5WgIiGm45BFjmQVD27uww/fzsKaAQOLCmDBNMH9DWW4+PSY6Shksc178rj7pR7ssWPY2HEMQAB84woOfiq+i0+P4dufKoMt80srCmDlBSW4cA4HP4Vj2akxrLygxHSMQES+AM6s9bBmecJ0DHLMmuUJnDUz8sMn+gXw2bMTKInZMiGjqCiJCW48K/pfPJEvgEUzIv8RKKJs2PYi/wkWTY/8R6CIsmHbi/QnKI8Dp1aZTkGumlMJVET8VLpIF8DRHPBWhx1/j6Xo+V2n4kjOdIrJiXQBAMA7+/OmI5CjbNj2ol8AB3zTEchRv/mQBWDcL97PYl+GJUDh6uj28d87Iz7/hwUF8FEv8OVNvaZjkGPufqkXXX2mU0xe5AsAAF5qz+PxrVnTMcgRj2/N4n93RX/6D1h0PYC1r/Siq0/x90tLwBMDqRjyCjz62z6se92Cr/4B1vwceND5dR7WfaoMCy04SYOmjh2Hfdz1Pz3Y0mHX8SbrCmDQktr+qwGdN8vDohkehLMCKoDvA9sO5fG7TsVbHXm8f8iugT/I2gIgorFxnkzkMBYAkcNYAEQOYwEQOYwFQOQwFgCRw1gARA5jARA5jAVA5DAWAJHDWABEDmMBEDmMBUDkMBYAkcNYAEQOYwEQOYwFQOQwFgCRw1gARA5jARA5jAVA5DAWAJHDWABEDmMBEDmMBUDkMBYAkcOsuTvwSKaXCs6Y6cHjvQGpAL4C7x3wcbjX7jvnWVkAn14Yx4rFcZxX52FuNSc5NHG70z62fOjjme05PLcjZzpO4Ky6OWhtGfAvl5Xh6kVW9hoZ9uz2HO59uQcHe0wnCY41X4/XLo7j+ZsqOfipaK5eFMdzN1XiqoUx01ECY0UB1JQA91xSgtpy7uhTcc0sF9z3iVJMKzWdJBhWFMC/NpShrtKKj0IRMLvSwz2XlpmOEYjIj5prF8dx7WJO+ylc158ZR8O86O8KRL4AVnDwkyE3n5swHWHSIl8Ac2si/xEoomzY9iL/Cfh3fjLFhm0v8p+gN2/NaQwUMTZse5EvgHf2+6YjkKNs2PYsKIC86QjkKBu2PQsKIPotTNFkw7YX+QJ4IZXD253Rb2KKlrc783ghFf0fB0W+AHpywKoNPeiy/GebNHV09SpWbehBT/THf/QLAAA+yCj+8YUe+MoSoOLytX9b+yBjx7ZmRQEAwEvteVzy/SPY2G5BLdOUtLE9h49/txsvtduzy2nV9QAGXXdGAms/UYKaUv46kCavq1fx1Vf78OS7WdNRAmdlAQyqqxDMLBfUlAqEXUAFUO0f+AeOKjqOWDtE7Lwk2KCOI3b/5xFNljXHAIiocCwAIoexAIgcxgIgchgLgMhhLAAih7EAiBzGAiByGAuAyGEsACKHsQCIHMYCIHIYC4DIYSwAIoexAIgcxgIgchgLgMhhLAAih7EAiBzGAiByGAuAyGEsACKHsQCIHMYCIHIYC4DIYSwAIodZe2uwxTM8nF8Xw3l1HhbP8HhvQCqIKvD+IR9bOnxs6chj+yHfdKSisO7moGfN9LDuilKcfUrMdBSyyO/353HXi734wwG7isCaXYDSGLBmeQmevqGCg58Cd/YpMTx9QwXuXFaCuDWjxqJdgHsvLcXN5yZMxyCLxT3gzuUlmFUhuOflXtNxAmFFl/35vBgHP4Xm5nMTaJhnxywz8gVQUwJ885OlpmOQYx78ZCmmWbDZRb4Arl2SQF1l5D8GRczsSg/XLI7+rDPyI+ecmZH/CBRRNmx7kf8E5/CIPxliw7YX6QIQAGfW8gwfMuOMWkHUt75IF4AC2Ntt1XlMFCH7uhVR3/oiXQAA8M5+u87MouiwYdtjARBNkA3bXuQL4KfvZdGdjfpEjKKmO6v46XtZ0zEmLfIF8GG34oHX+kzHIMc88FofPrTg+FPkCwAAHt+axesf5E3HIEe8sTePx7dG/9sfsKQAAOCLG3vQl49+I9PU1p1VfOHFHtMxAmNNAaQ+Upzz7924///60MvJAAWsNw987bU+nPdoN9q67Pmise6CIABQmRBcdFoMF5/m4eLTYzj7lBhiUT9jg0KV1/6LgGzek8cv9/rYvCdv5cFmKwuAiMbHml0AIiocC4DIYSwAIoexAIgcxgIgchgLgMhhLAAih7EAiBzGAiByGAuAyGEsACKHsQCIHMYCIHIYC4DIYSwAIoexAIgcxgIgchgLgMhhHhS9pkMQkQGKXg/AYdM5iMgE3ecBas9Fzolo3BTY56mABUDkIpHDHpS7AESOOuwBss90CiIyQHHYg8gfTOcgIgMGdgFYAERO0pQHT1OmYxCRASqbPfjcBSByUaqz8i0v1VS1D6ptpsMQUYhU27BWfA8AVLDRdB4iCs/gmO//MZB6LAAilwyM+f4C8GIsACKXDIx5DwBSq8tTPA5A5AjVttTq8hQw5HoACnnKXCIiCsvQsf7HC4JI7MdG0hBRuIaMdRn6eLKla7tAFoafiIjCoKo7U001x8b48ZcEU3ks9EREFCL5/tB/HVcA6se/p4CGG4iIwqCAwot/d+hjxxVA2z+U7wTwfKipiCgciqcHj/4POvmqwIIHQwtEROGR2Elj+6QCSK2u3qjApnASEVEYFNiUaqzYfOLjw98XQIWzACKbjDCmZbgHAWBBc9cbEFlWvEREFAZVvJlqqr5wuOdGvDOQwru3eJGIKDzy5ZGeGbEAUk1VG1Txs+IEIqIwqOJnqaaqDSM9P+q9AbP52O2ApoOPRUTFp+n+MTyyUQtgzx0Vu1XxtWBDEVEYFN5X9txRsXu014x5d+BUvHqdqv4yuFhEVHSqb6RWVz401svGvj34SsnCS9yk0EOBBCOiolLVw9DEjRAZ87T+sQsA/RcMUZXPTT4aERWbCP525+3l47rAz7gKAADamqqfVMX6icciomJTxUM7G2ueHu/rx10AAJDqrLpdVV8rPBYRFZuqvpbqrPqnQt5TUAFgreSyihWAbivofURUZLotq1iBtZIr5F0jngo8mrnNPYsT6Ps1RGom8n4iCtT+rCb+bHdT2fuFvrGwGcCA3U1l7+fFux5AdiLvJ6LAZBWxFRMZ/MAECwAA2hurXlCVz0/0/UQ0eary+eF+5jteE9oFGKq+pfsaT/2fQFA62WUR0TgpehVy3Wjn+Y/HhGcAg9oaK3+hHq5S1cOTXRYRjYd+BMWVkx38QAAzgEHzWtN/Elf8F4B5QS2TiE6g2J2P4dPtq6rfCWJxk54BDNq1uvrtI4JlULwS1DKJaAjFK0c8XBjU4AcCnAEc84TGFnRmvqSC+wSIBb58IscokAfw1dQpVffjs5IPctnBF8CA+a1dl8Z8+QkEs4u1DiIH7MqL/lX76ppXi7HwwHYBTtS+uubVPtVzATSrwi/WeohspApfgdY+Xy8o1uAHijgDGKq+tfsC8f1HRfCxMNZHFGWqeFM973Ntqyt/U+x1hVIAAIC16tXPSt8mwNdFZGZo6yWKCFU9AJEvpTqqHsVaCWXWHF4BDKj9jtbUxNKrIHKHAKeHvX6iqUaBPYD+W1euuvXgHdIV5rpDL4Bj1muiPt99o6jexV0DcpEq3lTIt9rilU9gpRj5XY25Ahhifkv3hZ7mb4HITQKcajoPUbEosBfAf+TVe3xXU+UbpvNMiQIYqr41fYX4eotAVkAwy3QeoklTdCr05754P2pvrHrBdJyhplwBDDX3kZ4liXzf5YA0qOByHjOgKOjfp8cmAJsEumlnY827pjONZEoXwHCSzZmlEP04IAsFOlMVtQBmAJghglpAZwBSbTonWUi1C8AhhRyC4KAAh3zFQRE5COgOqLyeaqr6remYhfh/19zCFo5evl0AAAAASUVORK5CYII=',
+  },
+};
+
+const HTML_ESCAPES: Record<string, string> = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+const esc = (value: EmailTemplateValue): string =>
+  value == null ? '' : String(value).replace(/[&<>"']/g, (ch) => HTML_ESCAPES[ch]);
+const str = (value: EmailTemplateValue): string => (value == null ? '' : String(value));
+
+export interface AccountDeletionTemplateVars {
+  userName: EmailTemplateValue;
+}
+
+export const accountDeletionTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: AccountDeletionTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /></div><div style="padding: 30px; background: #f9f9f9;"><h2 style="color: #333; margin-bottom: 20px;">Account Deleted</h2><p style="color: #666;">Hello ' + esc(v.userName) + ',</p><p style="color: #666;">Your ChainSync account has been deleted. If you did not request this, please contact support immediately.</p><p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p></div></div>',
+  text: (v: AccountDeletionTemplateVars): string =>
+    'Hello ' + str(v.userName) + ',\n\nYour ChainSync account has been deleted. If this was not you, please contact support immediately.\n\nThis is an automated message from ChainSync. Please do not reply to this email.',
+};
+
+export interface EmailVerificationTemplateVars {
+  friendlyName: EmailTemplateValue;
+  trialEndsOn?: EmailTemplateValue;
+  verificationUrl: EmailTemplateValue;
+}
+
+export const emailVerificationTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: EmailVerificationTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #0ea5e9 0%, #2563eb 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /><h1 style="color: white; margin: 0; font-size: 24px;">Verify your account</h1></div><div style="padding: 28px; background: #f9fafb;"><p style="color: #374151; font-size: 16px;">Hello ' + esc(v.friendlyName) + ',</p><p style="color: #4b5563; line-height: 1.6;">Thanks for signing up for ChainSync! Please confirm your email address so we can secure your account and finish setting things up.</p>' + (v.trialEndsOn ? '<p style="color: #666; line-height: 1.6; margin-bottom: 20px;">Your 14-day free trial is already active and will end on <strong>' + esc(v.trialEndsOn) + '</strong>.</p>' : '') + '<div style="text-align: center; margin: 32px 0;"><a href="' + esc(v.verificationUrl) + '" style="background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 6px; display: inline-block; font-weight: bold;">Verify Email</a></div><p style="color: #4b5563; line-height: 1.6;">Or copy and paste this link in your browser:</p><p style="word-break: break-all; color: #6366f1;">' + esc(v.verificationUrl) + '</p><p style="color: #9ca3af; font-size: 12px; line-height: 1.6; margin-top: 32px;">If you didn’t create this account, you can safely ignore this email.</p></div></div>',
+  text: (v: EmailVerificationTemplateVars): string =>
+    'Hello ' + str(v.friendlyName) + ',\n\nThanks for signing up for ChainSync! Confirm your email address to activate your account.\n\n' + (v.trialEndsOn ? 'Your 14-day free trial is active and will end on ' + str(v.trialEndsOn) + '.\n\n' : '') + 'Verify your email: ' + str(v.verificationUrl) + '\n\nIf you didn’t create this account, you can ignore this message.',
+};
+
+export interface PasswordChangeAlertTemplateVars {
+  userName: EmailTemplateValue;
+}
+
+export const passwordChangeAlertTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: PasswordChangeAlertTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /></div><div style="padding: 30px; background: #f9f9f9;"><h2 style="color: #333; margin-bottom: 20px;">Password Changed</h2><p style="color: #666;">Hello ' + esc(v.userName) + ',</p><p style="color: #666;">Your password was recently changed. If you did not perform this action, please reset your password immediately or contact support.</p><p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p></div></div>',
+  text: (v: PasswordChangeAlertTemplateVars): string =>
+    'Hello ' + str(v.userName) + ',\n\nYour password was recently changed. If this was not you, please reset your password or contact support.\n\nThis is an automated message from ChainSync. Please do not reply to this email.',
+};
+
+export interface PasswordResetSuccessTemplateVars {
+  loginUrl: EmailTemplateValue;
+  userName: EmailTemplateValue;
+}
+
+export const passwordResetSuccessTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: PasswordResetSuccessTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /></div><div style="padding: 30px; background: #f9f9f9;"><h2 style="color: #333; margin-bottom: 20px;">Password Successfully Reset</h2><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">Hello ' + esc(v.userName) + ',</p><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">Your ChainSync account password has been successfully reset. You can now log in with your new password.</p><div style="text-align: center; margin: 30px 0;"><a href="' + esc(v.loginUrl) + '" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; display: inline-block; font-weight: bold;">Log In to ChainSync</a></div><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">If you didn\'t reset your password, please contact our support team immediately.</p><hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;"><p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p></div></div>',
+  text: (v: PasswordResetSuccessTemplateVars): string =>
+    'ChainSync - Password Successfully Reset\n\nHello ' + str(v.userName) + ',\n\nYour ChainSync account password has been successfully reset.\nYou can now log in with your new password.\n\nIf you didn\'t reset your password, please contact our support team immediately.\n\nThis is an automated message from ChainSync. Please do not reply to this email.',
+};
+
+export interface PasswordResetTemplateVars {
+  resetUrl: EmailTemplateValue;
+  userName: EmailTemplateValue;
+}
+
+export const passwordResetTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: PasswordResetTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /></div><div style="padding: 30px; background: #f9f9f9;"><h2 style="color: #333; margin-bottom: 20px;">Password Reset Request</h2><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">Hello ' + esc(v.userName) + ',</p><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">We received a request to reset your password for your ChainSync account. If you didn\'t make this request, you can safely ignore this email.</p><div style="text-align: center; margin: 30px 0;"><a href="' + esc(v.resetUrl) + '" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; display: inline-block; font-weight: bold;">Reset Your Password</a></div><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">This link will expire in 24 hours for security reasons.</p><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">If the button above doesn\'t work, you can copy and paste this link into your browser:</p><p style="color: #667eea; word-break: break-all; margin-bottom: 20px;">' + esc(v.resetUrl) + '</p><hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;"><p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p></div></div>',
+  text: (v: PasswordResetTemplateVars): string =>
+    'ChainSync - Password Reset Request\n\nHello ' + str(v.userName) + ',\n\nWe received a request to reset your password for your ChainSync account.\nIf you didn\'t make this request, you can safely ignore this email.\n\nTo reset your password, click the following link:\n' + str(v.resetUrl) + '\n\nThis link will expire in 24 hours for security reasons.\n\nThis is an automated message from ChainSync. Please do not reply to this email.',
+};
+
+export interface PaymentConfirmationTemplateVars {
+  amount: EmailTemplateValue;
+  currency: EmailTemplateValue;
+  reference: EmailTemplateValue;
+  userName: EmailTemplateValue;
+}
+
+export const paymentConfirmationTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: PaymentConfirmationTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /></div><div style="padding: 30px; background: #f9f9f9;"><h2 style="color: #333; margin-bottom: 20px;">Payment Confirmation</h2><p style="color: #666;">Hello ' + esc(v.userName) + ',</p><p style="color: #666;">We have received your payment.</p><table style="width:100%;border-collapse:collapse;margin:20px 0;"><thead><tr><th>Amount</th><th>Currency</th><th>Reference</th></tr></thead><tbody><tr><td style=\'padding:4px 8px;color:#2d7a2d;\'>' + esc(v.amount) + '</td><td style=\'padding:4px 8px;\'>' + esc(v.currency) + '</td><td style=\'padding:4px 8px;color:#888;\'>' + esc(v.reference) + '</td></tr></tbody></table><p style="color: #666;">Thank you for your business!</p><p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p></div></div>',
+  text: (v: PaymentConfirmationTemplateVars): string =>
+    'Hello ' + str(v.userName) + ',\n\nWe have received your payment of ' + str(v.amount) + ' ' + str(v.currency) + '. Reference: ' + str(v.reference) + '.\nThank you for your business!\n\nThis is an automated message from ChainSync. Please do not reply to this email.',
+};
+
+export interface SignupOtpTemplateVars {
+  expiresInMinutes: EmailTemplateValue;
+  friendlyName: EmailTemplateValue;
+  helpEmail: EmailTemplateValue;
+  otpCode: EmailTemplateValue;
+  pluralMinutes?: EmailTemplateValue;
+}
+
+export const signupOtpTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: SignupOtpTemplateVars): string =>
+    '<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="font-family: \'Inter\', Arial, sans-serif; background-color: #f2f6fb; padding: 0; margin: 0;"><tr><td align="center" style="padding: 40px 16px;"><table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="max-width: 600px; background-color: #ffffff; border-radius: 16px; overflow: hidden; box-shadow: 0 12px 40px rgba(33, 150, 243, 0.12);"><tr><td style="background: #2196F3; padding: 32px 24px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="100" height="100" style="display: block; margin: 0 auto 12px;" /><h1 style="color: #ffffff; font-size: 24px; font-weight: 600; margin: 0; letter-spacing: 0.4px;">Confirm Your Signup</h1></td></tr><tr><td style="padding: 32px 40px;"><p style="color: #0F172A; font-size: 18px; font-weight: 600; margin: 0 0 16px;">Hi ' + esc(v.friendlyName) + ',</p><p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0 0 24px;">Welcome to <strong>ChainSync</strong>! Enter the one-time passcode below to finish setting up your workspace and unlock your 14-day free trial.</p><div style="background: #E3F2FD; border-radius: 12px; padding: 24px; text-align: center; margin-bottom: 28px;"><span style="display: inline-block; font-size: 32px; letter-spacing: 12px; font-weight: 700; color: #0F172A;">' + esc(v.otpCode) + '</span><p style="color: #1E3A8A; font-size: 14px; font-weight: 500; margin: 16px 0 0;">This passcode expires in ' + esc(v.expiresInMinutes) + ' minute' + (v.pluralMinutes ? 's' : '') + '.</p></div><p style="color: #475569; font-size: 15px; line-height: 1.6; margin: 0 0 16px;">You can enter this code directly in your browser to finish signing up. For security reasons we ask every user to type it in manually.</p><p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0 0 10px;">Didn’t request this code? Simply ignore this email—it will expire shortly.</p><p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0;">Need help? Reach us anytime at <a href="mailto:' + esc(v.helpEmail) + '" style="color: #2196F3; font-weight: 600; text-decoration: none;">' + esc(v.helpEmail) + '</a>.</p></td></tr><tr><td style="background: #F1F5F9; padding: 20px 24px; text-align: center;"><p style="color: #94A3B8; font-size: 12px; line-height: 1.6; margin: 0;">ChainSync, smarter retail operations.</p></td></tr></table></td></tr></table>',
+  text: (v: SignupOtpTemplateVars): string =>
+    'Hi ' + str(v.friendlyName) + ',\n\nWelcome to ChainSync! Use the one-time passcode below to finish setting up your workspace:\n\n' + str(v.otpCode) + '\n\nThis code expires in ' + str(v.expiresInMinutes) + ' minute' + (v.pluralMinutes ? 's' : '') + '. If you didn’t request this, you can ignore this email.\n\nNeed help? Contact us at ' + str(v.helpEmail) + '.\n\nThe ChainSync Team',
+};
+
+export interface StaffCredentialsTemplateVars {
+  friendlyName: EmailTemplateValue;
+  inviter: EmailTemplateValue;
+  loginUrl: EmailTemplateValue;
+  roleLabel: EmailTemplateValue;
+  staffEmail: EmailTemplateValue;
+  storeName?: EmailTemplateValue;
+  temporaryPassword: EmailTemplateValue;
+}
+
+export const staffCredentialsTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: StaffCredentialsTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #0ea5e9 0%, #2563eb 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /><h1 style="color: white; margin: 0; font-size: 24px;">Staff Access</h1></div><div style="padding: 24px; background: #f9fafb;"><p style="color: #111827; font-size: 16px;">Hello ' + esc(v.friendlyName) + ',</p><p style="color: #374151; line-height: 1.6;">' + esc(v.inviter) + ' has created a ChainSync account for you' + (v.storeName ? ' to help manage <strong>' + esc(v.storeName) + '</strong>' : '') + '.</p><div style="background: #ffffff; border-radius: 8px; padding: 20px; border: 1px solid #e5e7eb; margin: 16px 0;"><h3 style="margin-top: 0; color: #1f2937;">Login Credentials</h3><p style="margin: 8px 0; color: #374151;"><strong>Email:</strong> ' + esc(v.staffEmail) + '</p><p style="margin: 8px 0; color: #374151;"><strong>Temporary Password:</strong> <span style="font-family: \'Courier New\', monospace;">' + esc(v.temporaryPassword) + '</span></p><p style="margin: 8px 0; color: #374151;"><strong>Role:</strong> ' + esc(v.roleLabel) + '</p></div><p style="color: #374151; line-height: 1.6;">For security, please sign in as soon as possible and update your password. You can log in here:</p><div style="text-align: center; margin: 24px 0;"><a href="' + esc(v.loginUrl) + '" style="background: #2563eb; color: #ffffff; padding: 12px 24px; border-radius: 6px; text-decoration: none; font-weight: bold;">Go to ChainSync</a></div><p style="color: #6b7280; font-size: 14px; line-height: 1.6;">If you did not expect this invitation, please contact your administrator immediately.</p><hr style="border: none; border-top: 1px solid #e5e7eb; margin: 24px 0;"><p style="color: #9ca3af; font-size: 12px; text-align: center;">This email was sent automatically by ChainSync. Do not reply.</p></div></div>',
+  text: (v: StaffCredentialsTemplateVars): string =>
+    'Hello ' + str(v.friendlyName) + ',\n\n' + str(v.inviter) + ' created a ChainSync account for you' + (v.storeName ? ' to manage ' + str(v.storeName) : '') + '.\n\nLogin credentials:\n- Email: ' + str(v.staffEmail) + '\n- Temporary Password: ' + str(v.temporaryPassword) + '\n- Role: ' + str(v.roleLabel) + '\n\nPlease sign in at ' + str(v.loginUrl) + ' and change your password immediately.\n\nIf you did not expect this invitation, contact your administrator.',
+};
+
+export interface SubscriptionTierChangeTemplateVars {
+  newTier: EmailTemplateValue;
+  oldTier: EmailTemplateValue;
+  userName: EmailTemplateValue;
+}
+
+export const subscriptionTierChangeTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: SubscriptionTierChangeTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /></div><div style="padding: 30px; background: #f9f9f9;"><h2 style="color: #333; margin-bottom: 20px;">Subscription Tier Changed</h2><p style="color: #666;">Hello ' + esc(v.userName) + ',</p><p style="color: #666;">Your ChainSync subscription tier has changed:</p><table style="width:100%;border-collapse:collapse;margin:20px 0;"><thead><tr><th>Old Tier</th><th>New Tier</th></tr></thead><tbody><tr><td style=\'padding:4px 8px;color:#888;\'>' + esc(v.oldTier) + '</td><td style=\'padding:4px 8px;color:#2d7a2d;\'>' + esc(v.newTier) + '</td></tr></tbody></table><p style="color: #666;">If you did not request this change, please contact support immediately.</p><p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p></div></div>',
+  text: (v: SubscriptionTierChangeTemplateVars): string =>
+    'Hello ' + str(v.userName) + ',\n\nYour ChainSync subscription tier has changed from ' + str(v.oldTier) + ' to ' + str(v.newTier) + '. If you did not request this change, please contact support.\n\nThis is an automated message from ChainSync. Please do not reply to this email.',
+};
+
+export interface TrialPaymentReminderTemplateVars {
+  ctaUrl: EmailTemplateValue;
+  friendlyName: EmailTemplateValue;
+  helpEmail: EmailTemplateValue;
+  organizationName?: EmailTemplateValue;
+  trialEndsOn: EmailTemplateValue;
+  urgencyCopy: EmailTemplateValue;
+}
+
+export const trialPaymentReminderTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: TrialPaymentReminderTemplateVars): string =>
+    '<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="font-family: \'Inter\', Arial, sans-serif; background-color: #f2f6fb; padding: 0; margin: 0;"><tr><td align="center" style="padding: 40px 16px;"><table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="max-width: 600px; background-color: #ffffff; border-radius: 16px; overflow: hidden; box-shadow: 0 12px 40px rgba(33, 150, 243, 0.12);"><tr><td style="background: linear-gradient(135deg, #2196F3 0%, #1976D2 100%); padding: 32px 24px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="100" height="100" style="display: block; margin: 0 auto 16px;" /><h1 style="color: #ffffff; font-size: 24px; font-weight: 600; margin: 0; letter-spacing: 0.4px;">Keep your workspace active</h1></td></tr><tr><td style="padding: 32px 40px;"><p style="color: #0F172A; font-size: 18px; font-weight: 600; margin: 0 0 16px;">Hi ' + esc(v.friendlyName) + ',</p><p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0 0 20px;">' + esc(v.urgencyCopy) + '</p><div style="background: #E3F2FD; border-radius: 12px; padding: 20px; margin-bottom: 24px;"><p style="color: #1E3A8A; font-size: 16px; font-weight: 600; margin: 0 0 8px;">Trial ends on ' + esc(v.trialEndsOn) + '</p><p style="color: #0F172A; font-size: 14px; margin: 0;">Add a payment method now to automatically continue your plan' + (v.organizationName ? ' for <strong>' + esc(v.organizationName) + '</strong>' : '') + '.</p></div><div style="text-align: center; margin: 28px 0;"><a href="' + esc(v.ctaUrl) + '" style="background: #2196F3; color: #ffffff; padding: 14px 36px; border-radius: 999px; text-decoration: none; font-size: 15px; font-weight: 600; display: inline-block; box-shadow: 0 10px 24px rgba(33, 150, 243, 0.3);">Set up automatic billing</a></div><p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0 0 12px;">When your trial ends, we’ll securely charge the saved payment method so you maintain uninterrupted access for your team.</p><p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0;">Need help? Reach us anytime at <a href="mailto:' + esc(v.helpEmail) + '" style="color: #2196F3; font-weight: 600; text-decoration: none;">' + esc(v.helpEmail) + '</a>.</p></td></tr><tr><td style="background: #F1F5F9; padding: 20px 24px; text-align: center;"><p style="color: #94A3B8; font-size: 12px; line-height: 1.6; margin: 0;">ChainSync, smarter retail operations.</p></td></tr></table></td></tr></table>',
+  text: (v: TrialPaymentReminderTemplateVars): string =>
+    'Hi ' + str(v.friendlyName) + ',\n\nYour ChainSync trial ends on ' + str(v.trialEndsOn) + '. Add a payment method now so we can continue your workspace automatically when the trial wraps up.\n\nSet up automatic billing: ' + str(v.ctaUrl) + '\nNeed help? Contact ' + str(v.helpEmail) + '.\n\nThe ChainSync Team',
+};
+
+export interface WelcomeTemplateVars {
+  companyName: EmailTemplateValue;
+  dashboardUrl: EmailTemplateValue;
+  tier: EmailTemplateValue;
+  tierLabel: EmailTemplateValue;
+  userName: EmailTemplateValue;
+}
+
+export const welcomeTemplate = {
+  assets: ['chainsync-logo-solid'],
+  html: (v: WelcomeTemplateVars): string =>
+    '<div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;"><div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;"><img src="cid:chainsync-logo-solid" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" /></div><div style="padding: 30px; background: #f9f9f9;"><h2 style="color: #333; margin-bottom: 20px;">Welcome to ChainSync, ' + esc(v.userName) + '! 🎉</h2><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">Thank you for choosing ChainSync! Your account has been successfully created and activated.</p><div style="background: #e8f4fd; border-left: 4px solid #667eea; padding: 20px; margin: 20px 0; border-radius: 5px;"><h3 style="color: #333; margin-top: 0;">Account Details</h3><p style="color: #666; margin: 5px 0;"><strong>Company:</strong> ' + esc(v.companyName) + '</p><p style="color: #666; margin: 5px 0;"><strong>Subscription Tier:</strong> ' + esc(v.tierLabel) + '</p><p style="color: #666; margin: 5px 0;"><strong>Status:</strong> Active</p></div><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">You can now access all the features included in your ' + esc(v.tier) + ' plan. Here\'s what you can do:</p><ul style="color: #666; line-height: 1.6; margin-bottom: 20px;"><li>Manage your inventory and track stock levels</li><li>Process sales through our POS system</li><li>Generate detailed analytics and reports</li><li>Manage multiple store locations</li><li>Access AI-powered insights and forecasting</li></ul><div style="text-align: center; margin: 30px 0;"><a href="' + esc(v.dashboardUrl) + '" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; display: inline-block; font-weight: bold;">Get Started with ChainSync</a></div><p style="color: #666; line-height: 1.6; margin-bottom: 20px;">If you have any questions or need assistance getting started, our support team is here to help.</p><hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;"><p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p></div></div>',
+  text: (v: WelcomeTemplateVars): string =>
+    'Welcome to ChainSync!\n\nHello ' + str(v.userName) + ',\n\nThank you for choosing ChainSync! Your account has been successfully created and activated.\n\nAccount Details:\n- Company: ' + str(v.companyName) + '\n- Subscription Tier: ' + str(v.tierLabel) + '\n- Status: Active\n\nYou can now access all the features included in your ' + str(v.tier) + ' plan, including:\n- Inventory management and stock tracking\n- POS system for sales processing\n- Analytics and reporting\n- Multi-store management\n- AI-powered insights and forecasting\n\nGet started by visiting: ' + str(v.dashboardUrl) + '\n\nIf you have any questions or need assistance, our support team is here to help.\n\nBest regards,\nThe ChainSync Team',
+};
@@ -1,6 +1,20 @@
-import { readFileSync } from 'node:fs';
-import path from 'node:path';
-import nodemailer from 'nodemailer';
+import nodemailer, { type Transporter } from 'nodemailer';
+import type SMTPPool from 'nodemailer/lib/smtp-pool';
+import {
+  EMAIL_ASSETS,
+  accountDeletionTemplate,
+  emailVerificationTemplate,
+  passwordChangeAlertTemplate,
+  passwordResetSuccessTemplate,
+  passwordResetTemplate,
+  paymentConfirmationTemplate,
+  signupOtpTemplate,
+  staffCredentialsTemplate,
+  subscriptionTierChangeTemplate,
+  trialPaymentReminderTemplate,
+  welcomeTemplate,
+} from './email-templates/compiled';
+import { envNumber } from './lib/env';
 
 // Email configuration - in production, use environment variables
 const resolvedPort = parseInt(process.env.SMTP_PORT || '587', 10);
@@ -18,49 +32,23 @@ const emailConfig = {
   },
 };
 
-// Create transporter
-const transporter = nodemailer.createTransport(emailConfig);
-
-// Logo loading utilities
-const brandingDir = path.join(process.cwd(), 'assets', 'branding');
-
-type LogoAsset = {
-  buffer: Buffer;
-  mimeType: string;
-  dataUri: string;
-};
-
-const getMimeTypeForAsset = (fileName: string, defaultMime: string): string => {
-  const extension = path.extname(fileName).toLowerCase();
-  if (extension === '.png') {
-    return 'image/png';
-  }
-  if (extension === '.svg') {
-    return 'image/svg+xml';
-  }
-  return defaultMime;
-};
+// Pooled transport: up to SMTP_MAX_CONNECTIONS connections stay open and are
+// reused, so the outbox worker does not pay a TCP/TLS/AUTH handshake per message.
+// SMTP_RATE_LIMIT_PER_SECOND caps the send rate for relays that throttle.
+export function createEmailTransport(overrides: Partial<SMTPPool.Options> = {}): Transporter {
+  const rateLimit = envNumber('SMTP_RATE_LIMIT_PER_SECOND', 0);
+  return nodemailer.createTransport({
+    ...emailConfig,
+    pool: true,
+    maxConnections: envNumber('SMTP_MAX_CONNECTIONS', 5),
+    maxMessages: envNumber('SMTP_MAX_MESSAGES', 100),
+    ...(rateLimit ? { rateDelta: 1000, rateLimit } : {}),
+    ...overrides,
+  } as SMTPPool.Options);
+}
 
-const loadLogoAsset = (fileName: string, defaultMime: string, fallback: string): LogoAsset => {
-  try {
-    const fileBuffer = readFileSync(path.join(brandingDir, fileName));
-    const mimeType = getMimeTypeForAsset(fileName, defaultMime);
-    return {
-      buffer: fileBuffer,
-      mimeType,
-      dataUri: `data:${mimeType};base64,${fileBuffer.toString('base64')}`,
-    };
-  } catch (error) {
-    console.warn(`ChainSync logo asset missing (${fileName}). Using fallback.`, error);
-    const fallbackBuffer = Buffer.from(fallback, 'utf-8');
-    const mimeType = 'image/svg+xml';
-    return {
-      buffer: fallbackBuffer,
-      mimeType,
-      dataUri: `data:${mimeType};base64,${fallbackBuffer.toString('base64')}`,
-    };
-  }
-};
+// Create transporter
+const transporter = createEmailTransport();
 
 export interface UserActivityAlertEmailParams {
   to: string;
@@ -403,18 +391,14 @@ export function generateMonitoringAlertEmail(params: MonitoringAlertEmailParams)
   };
 }
 
-const fallbackSolidSvg = `<svg xmlns='http://www.w3.org/2000/svg' width='120' height='60' viewBox='0 0 120 60'><rect width='120' height='60' rx='12' fill='%230f5cc8'/><rect x='24' y='16' width='72' height='6' rx='3' fill='white'/><rect x='24' y='27' width='72' height='6' rx='3' fill='white'/><rect x='24' y='38' width='72' height='6' rx='3' fill='white'/></svg>`;
-const outlineAsset = loadLogoAsset('chainsync-logo-solid.png', 'image/png', fallbackSolidSvg);
-const LOGO_OUTLINE_CID = 'chainsync-logo-solid';
-const LOGO_OUTLINE = `cid:${LOGO_OUTLINE_CID}`;
-const BRANDING_ATTACHMENTS = [
-  {
-    filename: 'chainsync-logo-solid.png',
-    content: outlineAsset.buffer,
-    cid: LOGO_OUTLINE_CID,
-    contentType: outlineAsset.mimeType,
-  },
-];
+// Branding assets are resolved and embedded by scripts/compile-email-templates.mjs
+const LOGO_OUTLINE = `cid:${EMAIL_ASSETS['chainsync-logo-solid'].cid}`;
+const BRANDING_ATTACHMENTS = Object.values(EMAIL_ASSETS).map((asset) => ({
+  filename: asset.filename,
+  content: Buffer.from(asset.base64, 'base64'),
+  cid: asset.cid,
+  contentType: asset.contentType,
+}));
 
 // Lightweight, non-sensitive health state for SMTP transporter
 let emailTransporterStatus = {
@@ -438,82 +422,27 @@ export function generateTrialPaymentReminderEmail(
   billingUrl?: string,
   supportEmail?: string
 ): EmailOptions {
-  const friendlyName = userName?.trim()?.length ? userName.trim() : 'there';
-  const formattedTrialEnd = trialEndsAt.toLocaleDateString(undefined, {
-    year: 'numeric',
-    month: 'long',
-    day: 'numeric',
-  });
   const frontendUrl = process.env.FRONTEND_URL || 'https://app.chainsync.com';
-  const helpEmail = supportEmail || process.env.SUPPORT_EMAIL || 'support@chainsync.com';
-  const ctaUrl = billingUrl || `${frontendUrl}/settings/billing`;
-  const orgLabel = organizationName?.trim()?.length ? ` for <strong>${organizationName.trim()}</strong>` : '';
-  const urgencyCopy = daysRemaining === 3
-    ? 'Only a few days remain in your free trial — set up automatic billing now to avoid any disruption.'
-    : 'You are halfway through your free trial — add a payment method today so your workspace stays active when the trial ends.';
-
-  const html = `
-    <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="font-family: 'Inter', Arial, sans-serif; background-color: #f2f6fb; padding: 0; margin: 0;">
-      <tr>
-        <td align="center" style="padding: 40px 16px;">
-          <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="max-width: 600px; background-color: #ffffff; border-radius: 16px; overflow: hidden; box-shadow: 0 12px 40px rgba(33, 150, 243, 0.12);">
-            <tr>
-              <td style="background: linear-gradient(135deg, #2196F3 0%, #1976D2 100%); padding: 32px 24px; text-align: center;">
-                <img src="${LOGO_OUTLINE}" alt="ChainSync" width="100" height="100" style="display: block; margin: 0 auto 16px;" />
-                <h1 style="color: #ffffff; font-size: 24px; font-weight: 600; margin: 0; letter-spacing: 0.4px;">Keep your workspace active</h1>
-              </td>
-            </tr>
-            <tr>
-              <td style="padding: 32px 40px;">
-                <p style="color: #0F172A; font-size: 18px; font-weight: 600; margin: 0 0 16px;">Hi ${friendlyName},</p>
-                <p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0 0 20px;">
-                  ${urgencyCopy}
-                </p>
-                <div style="background: #E3F2FD; border-radius: 12px; padding: 20px; margin-bottom: 24px;">
-                  <p style="color: #1E3A8A; font-size: 16px; font-weight: 600; margin: 0 0 8px;">Trial ends on ${formattedTrialEnd}</p>
-                  <p style="color: #0F172A; font-size: 14px; margin: 0;">Add a payment method now to automatically continue your plan${orgLabel}.</p>
-                </div>
-                <div style="text-align: center; margin: 28px 0;">
-                  <a href="${ctaUrl}"
-                     style="background: #2196F3; color: #ffffff; padding: 14px 36px; border-radius: 999px; text-decoration: none; font-size: 15px; font-weight: 600; display: inline-block; box-shadow: 0 10px 24px rgba(33, 150, 243, 0.3);">
-                    Set up automatic billing
-                  </a>
-                </div>
-                <p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0 0 12px;">
-                  When your trial ends, we’ll securely charge the saved payment method so you maintain uninterrupted access for your team.
-                </p>
-                <p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0;">
-                  Need help? Reach us anytime at <a href="mailto:${helpEmail}" style="color: #2196F3; font-weight: 600; text-decoration: none;">${helpEmail}</a>.
-                </p>
-              </td>
-            </tr>
-            <tr>
-              <td style="background: #F1F5F9; padding: 20px 24px; text-align: center;">
-                <p style="color: #94A3B8; font-size: 12px; line-height: 1.6; margin: 0;">
-                  ChainSync, smarter retail operations.
-                </p>
-              </td>
-            </tr>
-          </table>
-        </td>
-      </tr>
-    </table>
-  `;
-
-  const text = `Hi ${friendlyName},
-
-Your ChainSync trial ends on ${formattedTrialEnd}. Add a payment method now so we can continue your workspace automatically when the trial wraps up.
-
-Set up automatic billing: ${ctaUrl}
-Need help? Contact ${helpEmail}.
-
-The ChainSync Team`;
+  const vars = {
+    friendlyName: userName?.trim()?.length ? userName.trim() : 'there',
+    organizationName: organizationName?.trim() || undefined,
+    trialEndsOn: trialEndsAt.toLocaleDateString(undefined, {
+      year: 'numeric',
+      month: 'long',
+      day: 'numeric',
+    }),
+    ctaUrl: billingUrl || `${frontendUrl}/settings/billing`,
+    helpEmail: supportEmail || process.env.SUPPORT_EMAIL || 'support@chainsync.com',
+    urgencyCopy: daysRemaining === 3
+      ? 'Only a few days remain in your free trial — set up automatic billing now to avoid any disruption.'
+      : 'You are halfway through your free trial — add a payment method today so your workspace stays active when the trial ends.',
+  };
 
   return {
     to: userEmail,
     subject: `Action needed: add a payment method before your trial ends`,
-    html,
-    text,
+    html: trialPaymentReminderTemplate.html(vars),
+    text: trialPaymentReminderTemplate.text(vars),
   };
 }
 
@@ -536,67 +465,22 @@ export function generateStaffCredentialsEmail(payload: StaffCredentialEmailPaylo
     invitedBy,
   } = payload;
 
-  const friendlyName = staffName?.trim() || 'Team Member';
-  const roleLabel = assignedRole ? assignedRole.charAt(0).toUpperCase() + assignedRole.slice(1) : 'Team Member';
-  const inviter = invitedBy || 'your administrator';
   const frontendUrl = process.env.FRONTEND_URL || 'http://localhost:5173';
-
-  const subject = `Your ChainSync access for ${storeName || 'store'}`;
-
-  const html = `
-    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-      <div style="background: linear-gradient(135deg, #0ea5e9 0%, #2563eb 100%); padding: 20px; text-align: center;">
-        <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        <h1 style="color: white; margin: 0; font-size: 24px;">Staff Access</h1>
-      </div>
-      <div style="padding: 24px; background: #f9fafb;">
-        <p style="color: #111827; font-size: 16px;">Hello ${friendlyName},</p>
-        <p style="color: #374151; line-height: 1.6;">
-          ${inviter} has created a ChainSync account for you${storeName ? ` to help manage <strong>${storeName}</strong>` : ''}.
-        </p>
-        <div style="background: #ffffff; border-radius: 8px; padding: 20px; border: 1px solid #e5e7eb; margin: 16px 0;">
-          <h3 style="margin-top: 0; color: #1f2937;">Login Credentials</h3>
-          <p style="margin: 8px 0; color: #374151;"><strong>Email:</strong> ${staffEmail}</p>
-          <p style="margin: 8px 0; color: #374151;"><strong>Temporary Password:</strong> <span style="font-family: 'Courier New', monospace;">${temporaryPassword}</span></p>
-          <p style="margin: 8px 0; color: #374151;"><strong>Role:</strong> ${roleLabel}</p>
-        </div>
-        <p style="color: #374151; line-height: 1.6;">
-          For security, please sign in as soon as possible and update your password. You can log in here:
-        </p>
-        <div style="text-align: center; margin: 24px 0;">
-          <a href="${frontendUrl}/login" style="background: #2563eb; color: #ffffff; padding: 12px 24px; border-radius: 6px; text-decoration: none; font-weight: bold;">
-            Go to ChainSync
-          </a>
-        </div>
-        <p style="color: #6b7280; font-size: 14px; line-height: 1.6;">
-          If you did not expect this invitation, please contact your administrator immediately.
-        </p>
-        <hr style="border: none; border-top: 1px solid #e5e7eb; margin: 24px 0;">
-        <p style="color: #9ca3af; font-size: 12px; text-align: center;">This email was sent automatically by ChainSync. Do not reply.</p>
-      </div>
-    </div>
-  `;
-
-  const text = `
-Hello ${friendlyName},
-
-${inviter} created a ChainSync account for you${storeName ? ` to manage ${storeName}` : ''}.
-
-Login credentials:
-- Email: ${staffEmail}
-- Temporary Password: ${temporaryPassword}
-- Role: ${roleLabel}
-
-Please sign in at ${frontendUrl}/login and change your password immediately.
-
-If you did not expect this invitation, contact your administrator.
-`;
+  const vars = {
+    friendlyName: staffName?.trim() || 'Team Member',
+    roleLabel: assignedRole ? assignedRole.charAt(0).toUpperCase() + assignedRole.slice(1) : 'Team Member',
+    inviter: invitedBy || 'your administrator',
+    storeName,
+    staffEmail,
+    temporaryPassword,
+    loginUrl: `${frontendUrl}/login`,
+  };
 
   return {
     to: staffEmail,
-    subject,
-    html,
-    text,
+    subject: `Your ChainSync access for ${storeName || 'store'}`,
+    html: staffCredentialsTemplate.html(vars),
+    text: staffCredentialsTemplate.text(vars),
   };
 }
 
@@ -606,61 +490,17 @@ export function generateEmailVerificationEmail(
   verificationUrl: string,
   trialEndDate?: Date
 ): EmailOptions {
-  const friendlyName = userName?.trim().length ? userName.trim() : 'there';
-  const trialMessage = trialEndDate
-    ? `<p style="color: #666; line-height: 1.6; margin-bottom: 20px;">Your 14-day free trial is already active and will end on <strong>${trialEndDate.toLocaleDateString(undefined, { year: 'numeric', month: 'long', day: 'numeric' })}</strong>.</p>`
-    : '';
-
-  const html = `
-    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-      <div style="background: linear-gradient(135deg, #0ea5e9 0%, #2563eb 100%); padding: 20px; text-align: center;">
-        <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        <h1 style="color: white; margin: 0; font-size: 24px;">Verify your account</h1>
-      </div>
-      <div style="padding: 28px; background: #f9fafb;">
-        <p style="color: #374151; font-size: 16px;">Hello ${friendlyName},</p>
-        <p style="color: #4b5563; line-height: 1.6;">
-          Thanks for signing up for ChainSync! Please confirm your email address so we can secure your account and finish setting things up.
-        </p>
-        ${trialMessage}
-        <div style="text-align: center; margin: 32px 0;">
-          <a href="${verificationUrl}"
-             style="background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%);
-                    color: white;
-                    padding: 15px 30px;
-                    text-decoration: none;
-                    border-radius: 6px;
-                    display: inline-block;
-                    font-weight: bold;">
-            Verify Email
-          </a>
-        </div>
-        <p style="color: #4b5563; line-height: 1.6;">
-          Or copy and paste this link in your browser:
-        </p>
-        <p style="word-break: break-all; color: #6366f1;">
-          ${verificationUrl}
-        </p>
-        <p style="color: #9ca3af; font-size: 12px; line-height: 1.6; margin-top: 32px;">
-          If you didn’t create this account, you can safely ignore this email.
-        </p>
-      </div>
-    </div>
-  `;
-
-  const text = `Hello ${friendlyName},
-
-Thanks for signing up for ChainSync! Confirm your email address to activate your account.
-
-${trialEndDate ? `Your 14-day free trial is active and will end on ${trialEndDate.toLocaleDateString()}.\n\n` : ''}Verify your email: ${verificationUrl}
-
-If you didn’t create this account, you can ignore this message.`;
+  const vars = {
+    friendlyName: userName?.trim().length ? userName.trim() : 'there',
+    verificationUrl,
+    trialEndsOn: trialEndDate?.toLocaleDateString(undefined, { year: 'numeric', month: 'long', day: 'numeric' }),
+  };
 
   return {
     to: userEmail,
     subject: 'Confirm your ChainSync email',
-    html,
-    text,
+    html: emailVerificationTemplate.html(vars),
+    text: emailVerificationTemplate.text(vars),
   };
 }
 
@@ -671,76 +511,20 @@ export function generateSignupOtpEmail(
   expiresAt: Date,
   supportEmail?: string
 ): EmailOptions {
-  const friendlyName = userName?.trim().length ? userName.trim() : 'there';
   const expiresInMinutes = Math.max(1, Math.round((expiresAt.getTime() - Date.now()) / 60000));
-
-  const helpEmail = supportEmail || process.env.SUPPORT_EMAIL || 'support@chainsync.com';
-  // Logo is now loaded from assets
-
-  const html = `
-    <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="font-family: 'Inter', Arial, sans-serif; background-color: #f2f6fb; padding: 0; margin: 0;">
-      <tr>
-        <td align="center" style="padding: 40px 16px;">
-          <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="max-width: 600px; background-color: #ffffff; border-radius: 16px; overflow: hidden; box-shadow: 0 12px 40px rgba(33, 150, 243, 0.12);">
-            <tr>
-              <td style="background: #2196F3; padding: 32px 24px; text-align: center;">
-                <img src="${LOGO_OUTLINE}" alt="ChainSync" width="100" height="100" style="display: block; margin: 0 auto 12px;" />
-                <h1 style="color: #ffffff; font-size: 24px; font-weight: 600; margin: 0; letter-spacing: 0.4px;">Confirm Your Signup</h1>
-              </td>
-            </tr>
-            <tr>
-              <td style="padding: 32px 40px;">
-                <p style="color: #0F172A; font-size: 18px; font-weight: 600; margin: 0 0 16px;">Hi ${friendlyName},</p>
-                <p style="color: #475569; font-size: 16px; line-height: 1.6; margin: 0 0 24px;">
-                  Welcome to <strong>ChainSync</strong>! Enter the one-time passcode below to finish setting up your workspace and unlock your 14-day free trial.
-                </p>
-                <div style="background: #E3F2FD; border-radius: 12px; padding: 24px; text-align: center; margin-bottom: 28px;">
-                  <span style="display: inline-block; font-size: 32px; letter-spacing: 12px; font-weight: 700; color: #0F172A;">${otpCode}</span>
-                  <p style="color: #1E3A8A; font-size: 14px; font-weight: 500; margin: 16px 0 0;">
-                    This passcode expires in ${expiresInMinutes} minute${expiresInMinutes === 1 ? '' : 's'}.
-                  </p>
-                </div>
-                <p style="color: #475569; font-size: 15px; line-height: 1.6; margin: 0 0 16px;">
-                  You can enter this code directly in your browser to finish signing up. For security reasons we ask every user to type it in manually.
-                </p>
-                <p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0 0 10px;">
-                  Didn’t request this code? Simply ignore this email—it will expire shortly.
-                </p>
-                <p style="color: #64748B; font-size: 14px; line-height: 1.6; margin: 0;">
-                  Need help? Reach us anytime at <a href="mailto:${helpEmail}" style="color: #2196F3; font-weight: 600; text-decoration: none;">${helpEmail}</a>.
-                </p>
-              </td>
-            </tr>
-            <tr>
-              <td style="background: #F1F5F9; padding: 20px 24px; text-align: center;">
-                <p style="color: #94A3B8; font-size: 12px; line-height: 1.6; margin: 0;">
-                  ChainSync, smarter retail operations.
-                </p>
-              </td>
-            </tr>
-          </table>
-        </td>
-      </tr>
-    </table>
-  `;
-
-  const text = `Hi ${friendlyName},
-
-Welcome to ChainSync! Use the one-time passcode below to finish setting up your workspace:
-
-${otpCode}
-
-This code expires in ${expiresInMinutes} minute${expiresInMinutes === 1 ? '' : 's'}. If you didn’t request this, you can ignore this email.
-
-Need help? Contact us at ${helpEmail}.
-
-The ChainSync Team`;
+  const vars = {
+    friendlyName: userName?.trim().length ? userName.trim() : 'there',
+    otpCode,
+    expiresInMinutes,
+    pluralMinutes: expiresInMinutes !== 1,
+    helpEmail: supportEmail || process.env.SUPPORT_EMAIL || 'support@chainsync.com',
+  };
 
   return {
     to: userEmail,
     subject: 'Your ChainSync verification code',
-    html,
-    text,
+    html: signupOtpTemplate.html(vars),
+    text: signupOtpTemplate.text(vars),
   };
 }
 
@@ -922,25 +706,55 @@ export interface EmailOptions {
   }[];
 }
 
-export async function sendEmail(options: EmailOptions): Promise<boolean> {
+export interface EmailDeliveryOptions {
+  /** Groups send-rate metrics and outbox rows, e.g. "password_reset" */
+  category?: string;
+  /** Bulk runs (reminders, dunning, reports) are delivered after transactional mail */
+  bulk?: boolean;
+}
+
+/**
+ * Send one message now over `transport` (the shared pool by default). Messages
+ * without attachments carry the branding logo loaded at start-up. Throws on
+ * SMTP errors; returns the server's message id.
+ */
+export async function deliverEmail(options: EmailOptions, transport: Transporter = transporter): Promise<string | undefined> {
+  const inlineAttachments = (options.attachments ?? []).length
+    ? options.attachments
+    : BRANDING_ATTACHMENTS;
+
+  const info = await transport.sendMail({
+    from: process.env.SMTP_FROM || emailConfig.auth.user,
+    to: options.to,
+    subject: options.subject,
+    html: options.html,
+    text: options.text,
+    attachments: inlineAttachments,
+  });
+  return info?.messageId;
+}
+
+/**
+ * Queue a message for delivery (jobs/email-outbox.ts) so callers never wait on
+ * SMTP. With EMAIL_DELIVERY_MODE=inline, or when the outbox cannot be written,
+ * the message is sent before returning. Resolves to false only when neither
+ * worked.
+ */
+export async function sendEmail(options: EmailOptions, delivery: EmailDeliveryOptions = {}): Promise<boolean> {
   try {
     if (process.env.NODE_ENV === 'test') {
       return true;
     }
-    const inlineAttachments = (options.attachments ?? []).length
-      ? options.attachments
-      : BRANDING_ATTACHMENTS;
-
-    const mailOptions = {
-      from: process.env.SMTP_FROM || emailConfig.auth.user,
-      to: options.to,
-      subject: options.subject,
-      html: options.html,
-      text: options.text,
-      attachments: inlineAttachments,
-    };
-
-    await transporter.sendMail(mailOptions);
+    const { emailDeliveryMode, enqueueEmail } = await import('./jobs/email-outbox');
+    if (emailDeliveryMode() === 'outbox') {
+      try {
+        await enqueueEmail(options, delivery);
+        return true;
+      } catch (error) {
+        console.warn('[email] Outbox unavailable; sending inline:', error);
+      }
+    }
+    await deliverEmail(options);
     return true;
   } catch (error) {
     console.error('Email sending failed:', error);
@@ -948,6 +762,11 @@ export async function sendEmail(options: EmailOptions): Promise<boolean> {
   }
 }
 
+/** Close pooled SMTP connections (worker shutdown). */
+export function closeEmailTransport(): void {
+  transporter.close();
+}
+
 export async function verifyEmailTransporter(): Promise<boolean> {
   try {
     await transporter.verify();
@@ -962,229 +781,41 @@ export async function verifyEmailTransporter(): Promise<boolean> {
 }
 
 export function generateWelcomeEmail(userEmail: string, userName: string, tier: string, companyName: string): EmailOptions {
+  const vars = {
+    userName,
+    companyName,
+    tier,
+    tierLabel: tier.charAt(0).toUpperCase() + tier.slice(1),
+    dashboardUrl: `${process.env.FRONTEND_URL || 'http://localhost:5173'}/dashboard`,
+  };
   return {
     to: userEmail,
     subject: 'Welcome to ChainSync! Your Account is Ready',
-    html: `
-      <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-          <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        </div>
-        
-        <div style="padding: 30px; background: #f9f9f9;">
-          <h2 style="color: #333; margin-bottom: 20px;">Welcome to ChainSync, ${userName}! 🎉</h2>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            Thank you for choosing ChainSync! Your account has been successfully created and activated.
-          </p>
-          
-          <div style="background: #e8f4fd; border-left: 4px solid #667eea; padding: 20px; margin: 20px 0; border-radius: 5px;">
-            <h3 style="color: #333; margin-top: 0;">Account Details</h3>
-            <p style="color: #666; margin: 5px 0;"><strong>Company:</strong> ${companyName}</p>
-            <p style="color: #666; margin: 5px 0;"><strong>Subscription Tier:</strong> ${tier.charAt(0).toUpperCase() + tier.slice(1)}</p>
-            <p style="color: #666; margin: 5px 0;"><strong>Status:</strong> Active</p>
-          </div>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            You can now access all the features included in your ${tier} plan. Here's what you can do:
-          </p>
-          
-          <ul style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            <li>Manage your inventory and track stock levels</li>
-            <li>Process sales through our POS system</li>
-            <li>Generate detailed analytics and reports</li>
-            <li>Manage multiple store locations</li>
-            <li>Access AI-powered insights and forecasting</li>
-          </ul>
-          
-          <div style="text-align: center; margin: 30px 0;">
-            <a href="${process.env.FRONTEND_URL || 'http://localhost:5173'}/dashboard" 
-               style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                      color: white; 
-                      padding: 15px 30px; 
-                      text-decoration: none; 
-                      border-radius: 5px; 
-                      display: inline-block; 
-                      font-weight: bold;">
-              Get Started with ChainSync
-            </a>
-          </div>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            If you have any questions or need assistance getting started, our support team is here to help.
-          </p>
-          
-          <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-          
-          <p style="color: #999; font-size: 12px; text-align: center;">
-            This is an automated message from ChainSync. Please do not reply to this email.
-          </p>
-        </div>
-      </div>
-    `,
-    text: `
-      Welcome to ChainSync!
-      
-      Hello ${userName},
-      
-      Thank you for choosing ChainSync! Your account has been successfully created and activated.
-      
-      Account Details:
-      - Company: ${companyName}
-      - Subscription Tier: ${tier.charAt(0).toUpperCase() + tier.slice(1)}
-      - Status: Active
-      
-      You can now access all the features included in your ${tier} plan, including:
-      - Inventory management and stock tracking
-      - POS system for sales processing
-      - Analytics and reporting
-      - Multi-store management
-      - AI-powered insights and forecasting
-      
-      Get started by visiting: ${process.env.FRONTEND_URL || 'http://localhost:5173'}/dashboard
-      
-      If you have any questions or need assistance, our support team is here to help.
-      
-      Best regards,
-      The ChainSync Team
-    `
+    html: welcomeTemplate.html(vars),
+    text: welcomeTemplate.text(vars),
   };
 }
 
 export function generatePasswordResetEmail(userEmail: string, resetToken: string, userName: string): EmailOptions {
-  const resetUrl = `${process.env.FRONTEND_URL || 'http://localhost:5173'}/reset-password?token=${resetToken}`;
-  
+  const vars = {
+    userName,
+    resetUrl: `${process.env.FRONTEND_URL || 'http://localhost:5173'}/reset-password?token=${resetToken}`,
+  };
   return {
     to: userEmail,
     subject: 'ChainSync - Password Reset Request',
-    html: `
-      <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-          <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        </div>
-        
-        <div style="padding: 30px; background: #f9f9f9;">
-          <h2 style="color: #333; margin-bottom: 20px;">Password Reset Request</h2>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            Hello ${userName},
-          </p>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            We received a request to reset your password for your ChainSync account. 
-            If you didn't make this request, you can safely ignore this email.
-          </p>
-          
-          <div style="text-align: center; margin: 30px 0;">
-            <a href="${resetUrl}" 
-               style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                      color: white; 
-                      padding: 15px 30px; 
-                      text-decoration: none; 
-                      border-radius: 5px; 
-                      display: inline-block; 
-                      font-weight: bold;">
-              Reset Your Password
-            </a>
-          </div>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            This link will expire in 24 hours for security reasons.
-          </p>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            If the button above doesn't work, you can copy and paste this link into your browser:
-          </p>
-          
-          <p style="color: #667eea; word-break: break-all; margin-bottom: 20px;">
-            ${resetUrl}
-          </p>
-          
-          <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-          
-          <p style="color: #999; font-size: 12px; text-align: center;">
-            This is an automated message from ChainSync. Please do not reply to this email.
-          </p>
-        </div>
-      </div>
-    `,
-    text: `
-      ChainSync - Password Reset Request
-      
-      Hello ${userName},
-      
-      We received a request to reset your password for your ChainSync account. 
-      If you didn't make this request, you can safely ignore this email.
-      
-      To reset your password, click the following link:
-      ${resetUrl}
-      
-      This link will expire in 24 hours for security reasons.
-      
-      This is an automated message from ChainSync. Please do not reply to this email.
-    `
+    html: passwordResetTemplate.html(vars),
+    text: passwordResetTemplate.text(vars),
   };
 }
 
 export function generatePasswordResetSuccessEmail(userEmail: string, userName: string): EmailOptions {
+  const vars = { userName, loginUrl: `${process.env.FRONTEND_URL || 'http://localhost:5173'}/login` };
   return {
     to: userEmail,
     subject: 'ChainSync - Password Successfully Reset',
-    html: `
-      <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-          <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        </div>
-        
-        <div style="padding: 30px; background: #f9f9f9;">
-          <h2 style="color: #333; margin-bottom: 20px;">Password Successfully Reset</h2>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            Hello ${userName},
-          </p>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            Your ChainSync account password has been successfully reset. 
-            You can now log in with your new password.
-          </p>
-          
-          <div style="text-align: center; margin: 30px 0;">
-            <a href="${process.env.FRONTEND_URL || 'http://localhost:5173'}/login" 
-               style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                      color: white; 
-                      padding: 15px 30px; 
-                      text-decoration: none; 
-                      border-radius: 5px; 
-                      display: inline-block; 
-                      font-weight: bold;">
-              Log In to ChainSync
-            </a>
-          </div>
-          
-          <p style="color: #666; line-height: 1.6; margin-bottom: 20px;">
-            If you didn't reset your password, please contact our support team immediately.
-          </p>
-          
-          <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-          
-          <p style="color: #999; font-size: 12px; text-align: center;">
-            This is an automated message from ChainSync. Please do not reply to this email.
-          </p>
-        </div>
-      </div>
-    `,
-    text: `
-      ChainSync - Password Successfully Reset
-      
-      Hello ${userName},
-      
-      Your ChainSync account password has been successfully reset. 
-      You can now log in with your new password.
-      
-      If you didn't reset your password, please contact our support team immediately.
-      
-      This is an automated message from ChainSync. Please do not reply to this email.
-    `
+    html: passwordResetSuccessTemplate.html(vars),
+    text: passwordResetSuccessTemplate.text(vars),
   };
 }
 
@@ -1224,58 +855,22 @@ export function generateProfileUpdateEmail(userEmail: string, oldProfile: any, n
 }
 
 export function generateSubscriptionTierChangeEmail(userEmail: string, userName: string, oldTier: string, newTier: string): EmailOptions {
+  const vars = { userName, oldTier, newTier };
   return {
     to: userEmail,
     subject: 'Your ChainSync Subscription Tier Has Changed',
-    html: `
-      <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-          <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        </div>
-        <div style="padding: 30px; background: #f9f9f9;">
-          <h2 style="color: #333; margin-bottom: 20px;">Subscription Tier Changed</h2>
-          <p style="color: #666;">Hello ${userName},</p>
-          <p style="color: #666;">Your ChainSync subscription tier has changed:</p>
-          <table style="width:100%;border-collapse:collapse;margin:20px 0;">
-            <thead><tr><th>Old Tier</th><th>New Tier</th></tr></thead>
-            <tbody>
-              <tr><td style='padding:4px 8px;color:#888;'>${oldTier}</td><td style='padding:4px 8px;color:#2d7a2d;'>${newTier}</td></tr>
-            </tbody>
-          </table>
-          <p style="color: #666;">If you did not request this change, please contact support immediately.</p>
-          <p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p>
-        </div>
-      </div>
-    `,
-    text: `Hello ${userName},\n\nYour ChainSync subscription tier has changed from ${oldTier} to ${newTier}. If you did not request this change, please contact support.\n\nThis is an automated message from ChainSync. Please do not reply to this email.`
+    html: subscriptionTierChangeTemplate.html(vars),
+    text: subscriptionTierChangeTemplate.text(vars),
   };
 }
 
 export function generatePaymentConfirmationEmail(userEmail: string, userName: string, amount: number, currency: string, reference: string): EmailOptions {
+  const vars = { userName, amount, currency, reference };
   return {
     to: userEmail,
     subject: 'Payment Confirmation - ChainSync',
-    html: `
-      <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-          <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        </div>
-        <div style="padding: 30px; background: #f9f9f9;">
-          <h2 style="color: #333; margin-bottom: 20px;">Payment Confirmation</h2>
-          <p style="color: #666;">Hello ${userName},</p>
-          <p style="color: #666;">We have received your payment.</p>
-          <table style="width:100%;border-collapse:collapse;margin:20px 0;">
-            <thead><tr><th>Amount</th><th>Currency</th><th>Reference</th></tr></thead>
-            <tbody>
-              <tr><td style='padding:4px 8px;color:#2d7a2d;'>${amount}</td><td style='padding:4px 8px;'>${currency}</td><td style='padding:4px 8px;color:#888;'>${reference}</td></tr>
-            </tbody>
-          </table>
-          <p style="color: #666;">Thank you for your business!</p>
-          <p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p>
-        </div>
-      </div>
-    `,
-    text: `Hello ${userName},\n\nWe have received your payment of ${amount} ${currency}. Reference: ${reference}.\nThank you for your business!\n\nThis is an automated message from ChainSync. Please do not reply to this email.`
+    html: paymentConfirmationTemplate.html(vars),
+    text: paymentConfirmationTemplate.text(vars),
   };
 }
 
@@ -1283,20 +878,8 @@ export function generatePasswordChangeAlertEmail(userEmail: string, userName: st
   return {
     to: userEmail,
     subject: 'Password Changed - ChainSync',
-    html: `
-      <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-          <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        </div>
-        <div style="padding: 30px; background: #f9f9f9;">
-          <h2 style="color: #333; margin-bottom: 20px;">Password Changed</h2>
-          <p style="color: #666;">Hello ${userName},</p>
-          <p style="color: #666;">Your password was recently changed. If you did not perform this action, please reset your password immediately or contact support.</p>
-          <p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p>
-        </div>
-      </div>
-    `,
-    text: `Hello ${userName},\n\nYour password was recently changed. If this was not you, please reset your password or contact support.\n\nThis is an automated message from ChainSync. Please do not reply to this email.`
+    html: passwordChangeAlertTemplate.html({ userName }),
+    text: passwordChangeAlertTemplate.text({ userName }),
   };
 }
 
@@ -1304,19 +887,7 @@ export function generateAccountDeletionEmail(userEmail: string, userName: string
   return {
     to: userEmail,
     subject: 'Account Deleted - ChainSync',
-    html: `
-      <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-          <img src="${LOGO_OUTLINE}" alt="ChainSync" width="80" height="80" style="display: block; margin: 0 auto 12px;" />
-        </div>
-        <div style="padding: 30px; background: #f9f9f9;">
-          <h2 style="color: #333; margin-bottom: 20px;">Account Deleted</h2>
-          <p style="color: #666;">Hello ${userName},</p>
-          <p style="color: #666;">Your ChainSync account has been deleted. If you did not request this, please contact support immediately.</p>
-          <p style="color: #999; font-size: 12px; text-align: center;">This is an automated message from ChainSync. Please do not reply to this email.</p>
-        </div>
-      </div>
-    `,
-    text: `Hello ${userName},\n\nYour ChainSync account has been deleted. If this was not you, please contact support immediately.\n\nThis is an automated message from ChainSync. Please do not reply to this email.`
+    html: accountDeletionTemplate.html({ userName }),
+    text: accountDeletionTemplate.text({ userName }),
   };
-}
\ No newline at end of file
+}
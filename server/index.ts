@@ -2,16 +2,21 @@ import 'dotenv/config';
 import express, { type Request, Response, NextFunction } from "express";
 import { loadEnv } from "../shared/env";
 import { registerRoutes } from "./api";
-import { scheduleAbandonedSignupCleanup, scheduleNightlyLowStockAlerts, scheduleAnalyticsReports, scheduleSubscriptionReconciliation, scheduleTrialExpirationBilling, scheduleDunning, scheduleTrialReminders, scheduleStorePerformanceAlerts, scheduleAnalyticsInsightScan, scheduleSubscriptionExpirationCheck } from "./jobs/cleanup";
+import { closeEmailTransport } from "./email";
+import { startWebhookConsumer } from "./jobs/webhook-queue";
+import { registerScheduledJobs } from "./jobs/cleanup";
+import { startEmailOutboxWorker, stopEmailOutboxWorker } from "./jobs/email-outbox";
+import { jobScheduler } from "./jobs/scheduler";
+import { isSchedulerWorker, onClusterShutdown, workerIndex } from "./lib/cluster";
+import { envNumber } from "./lib/env";
 import { sendErrorResponse, isOperationalError } from "./lib/errors";
-import { logger, requestLogger, pinoHttpMiddleware } from "./lib/logger";
-import { monitoringMiddleware } from "./lib/monitoring";
+import { instrumentationMiddleware } from "./lib/instrumentation";
+import { logger } from "./lib/logger";
 import { 
   helmetConfig, 
   corsMiddleware, 
   securityHeaders, 
   ipWhitelistCheck, 
-  securityLogging,
   redirectSecurityCheck
 } from "./middleware/security";
 import { setupVite, serveStatic } from "./vite";
@@ -44,11 +49,13 @@ app.use((req: Request, res: Response, next: NextFunction) => {
   next();
 });
 
+// Metrics, access log and security log from one response hook (lib/instrumentation)
+app.use(instrumentationMiddleware);
+
 // Security middleware (order is important)
 app.use(helmetConfig);
 app.use(securityHeaders);
 app.use(ipWhitelistCheck);
-app.use(securityLogging);
 app.use(redirectSecurityCheck);
 
 // CORS middleware - apply after other security middleware but before routes
@@ -67,11 +74,6 @@ const isWebhookPost = (req: Request) => (
 app.use((req, res, next) => isWebhookPost(req) ? next() : jsonParser(req, res, next));
 app.use((req, res, next) => isWebhookPost(req) ? next() : urlencodedParser(req, res, next));
 
-// Add monitoring and logging middleware
-app.use(monitoringMiddleware);
-app.use(pinoHttpMiddleware);
-app.use(requestLogger);
-
 void (async () => {
   try {
     logger.info('Starting server initialization...', {
@@ -157,23 +159,31 @@ void (async () => {
     
     logger.info('Starting server on port...', { port });
     
-    // Schedule daily cleanup of abandoned signups
-    scheduleAbandonedSignupCleanup();
-    // Schedule nightly low stock alerts generation
-    scheduleNightlyLowStockAlerts();
-    scheduleAnalyticsReports();
-    scheduleStorePerformanceAlerts();
-    scheduleAnalyticsInsightScan();
-    // Schedule daily subscription reconciliation
-    scheduleSubscriptionReconciliation();
-    // Schedule daily trial/renewal billing
-    scheduleTrialExpirationBilling();
-    // Schedule daily dunning notices
-    scheduleDunning();
-    // Schedule trial reminder emails (7 & 3 days)
-    scheduleTrialReminders();
-    // Schedule subscription expiration check
-    scheduleSubscriptionExpirationCheck();
+    // Background jobs: every instance arms the timers, one instance runs each slot (jobs/scheduler.ts)
+    // In cluster mode only the designated worker starts them (lib/cluster.ts)
+    registerScheduledJobs();
+    if (process.env.JOB_SCHEDULER !== 'false' && isSchedulerWorker()) {
+      jobScheduler.start();
+    }
+    // Apply queued payment webhooks in the background (WEBHOOK_INGEST_MODE=queue)
+    startWebhookConsumer();
+    // Deliver queued outbound mail (EMAIL_DELIVERY_MODE=outbox, the default)
+    startEmailOutboxWorker();
+
+    // Rolling restart / shutdown from the cluster primary: stop taking jobs and
+    // sockets, let running jobs and in-flight requests finish, then exit. Jobs
+    // get JOB_SHUTDOWN_TIMEOUT_MS, inside the primary's CLUSTER_SHUTDOWN_TIMEOUT_MS
+    onClusterShutdown(async () => {
+      await jobScheduler.stop(envNumber('JOB_SHUTDOWN_TIMEOUT_MS', 20_000));
+      stopEmailOutboxWorker();
+      closeEmailTransport();
+      (app as any).wsService?.close(1012, 'Server restarting');
+      await new Promise<void>((resolve) => {
+        server.close(() => resolve());
+        server.closeIdleConnections?.();
+      });
+      logger.info('Cluster worker drained', { workerIndex: workerIndex() });
+    });
 
     server.listen({
       port,
@@ -182,7 +192,8 @@ void (async () => {
       logger.info(`Server started successfully`, {
         port,
         environment: app.get("env"),
-        nodeVersion: process.version
+        nodeVersion: process.version,
+        workerIndex: workerIndex()
       });
     });
   } catch (error) {
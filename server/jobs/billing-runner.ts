@@ -0,0 +1,599 @@
+import { and, asc, eq, isNotNull, lte, or, sql } from "drizzle-orm";
+
+import {
+  billingChargeAttempts,
+  billingRuns,
+  organizations,
+  subscriptionPayments,
+  subscriptions,
+  users,
+} from "@shared/schema";
+import { db } from "../db";
+import { createRateLimiter, mapWithConcurrency, type RateLimiter } from "../lib/concurrency";
+import { PRICING_TIERS } from "../lib/constants";
+import { rowsOf } from "../lib/db-rows";
+import { envNumber } from "../lib/env";
+import { logger } from "../lib/logger";
+import type { PaymentChargeResult, PaymentService } from "../payment/service";
+
+/**
+ * Autopay billing run: charges every subscription whose trial or billing period
+ * has ended.
+ *
+ * Charges go out through a bounded worker pool with a token-bucket limit per
+ * provider, so a large run neither serialises on provider latency nor trips
+ * provider throttling. Before a provider is called, the charge is claimed in
+ * billing_charge_attempts under (subscription, billing period) with the
+ * provider reference as idempotency key. Outcomes are settled together with
+ * the payment row and the subscription/org state in one transaction, so a run
+ * that dies mid-way leaves at most "pending" claims; the next run looks those
+ * references up with the provider and either settles them or retries the
+ * charge with the same reference, which providers refuse to charge twice.
+ */
+
+const ONE_DAY_MS = 24 * 60 * 60 * 1000;
+const BILLING_PERIOD_MS = 30 * ONE_DAY_MS;
+
+export type BillingProvider = "PAYSTACK" | "FLW";
+
+export interface DueCharge {
+  subscriptionId: string;
+  orgId: string;
+  orgName: string | null;
+  orgExists: boolean;
+  email: string | null;
+  autopayReference: string | null;
+  provider: BillingProvider;
+  currency: "NGN" | "USD";
+  tierKey: keyof typeof PRICING_TIERS;
+  planCode: string | null;
+  externalSubId: string | null;
+  amountMinor: number;
+  amountMajor: number;
+  billingDueAt: Date;
+}
+
+export interface ChargeClaim {
+  idempotencyKey: string;
+  status: "pending" | "succeeded" | "failed";
+  /** The claim belongs to an earlier run that did not settle it */
+  resumed: boolean;
+}
+
+export interface ChargeOutcome {
+  success: boolean;
+  reference: string;
+  raw?: unknown;
+  message?: string;
+}
+
+export interface BillingRunSummary {
+  runId: string | null;
+  status: "completed" | "failed";
+  subscriptionsDue: number;
+  charged: number;
+  failed: number;
+  missingMethod: number;
+  skipped: number;
+  resumed: number;
+  deferred: number;
+  errors: number;
+  concurrency: number;
+  durationMs: number;
+  errorMessage?: string;
+}
+
+/** Persistence used by a billing run; the Postgres ledger is the default. */
+export interface BillingLedger {
+  startRun(concurrency: number): Promise<string | null>;
+  loadDueCharges(now: Date): Promise<DueCharge[]>;
+  /**
+   * Claim the charge for this billing period. Returns null while another live
+   * run holds the claim.
+   */
+  claimCharge(charge: DueCharge, runId: string | null, proposedKey: string): Promise<ChargeClaim | null>;
+  /** Record the outcome, the payment row and the subscription/org state atomically. */
+  settleCharge(charge: DueCharge, idempotencyKey: string, outcome: ChargeOutcome, recordPayment: boolean): Promise<void>;
+  markMissingMethod(charge: DueCharge): Promise<void>;
+  finishRun(runId: string | null, summary: BillingRunSummary, details: Record<string, unknown>): Promise<void>;
+}
+
+export type BillingPaymentGateway = Pick<
+  PaymentService,
+  "generateReference" | "chargePaystackAuthorization" | "chargeFlutterwaveToken"
+> &
+  Partial<Pick<PaymentService, "fetchPaystackTransaction" | "fetchFlutterwaveTransaction">>;
+
+export interface BillingRunOptions {
+  service: BillingPaymentGateway;
+  ledger?: BillingLedger;
+  now?: Date;
+  /** Charges in flight at once */
+  concurrency?: number;
+  /** Provider requests per second */
+  rateLimits?: Partial<Record<BillingProvider, number>>;
+  /** Retries of a charge the provider answered with 429 */
+  maxThrottleRetries?: number;
+  log?: (label: string, payload: unknown) => void;
+  onRenewed?: (charge: DueCharge, reference: string) => Promise<void>;
+}
+
+function errorMessage(error: unknown): string {
+  return error instanceof Error ? error.message : String(error);
+}
+
+const sleep = (ms: number) => new Promise<void>((resolve) => setTimeout(resolve, ms));
+
+/** Billing periods are identified by the UTC day the charge fell due. */
+export function billingPeriodKey(dueAt: Date): string {
+  return dueAt.toISOString().slice(0, 10);
+}
+
+export function buildDueCharge(
+  subscription: Record<string, any>,
+  organization: Record<string, any> | null | undefined,
+  email: string | null | undefined,
+  now: Date,
+): DueCharge {
+  const tierCandidate = String(subscription.planCode ?? "basic").toLowerCase();
+  const tierKey = (["basic", "pro", "enterprise"].includes(tierCandidate) ? tierCandidate : "basic") as keyof typeof PRICING_TIERS;
+  const tierPricing = PRICING_TIERS[tierKey];
+  const provider = String(subscription.autopayProvider ?? subscription.provider ?? "PAYSTACK").toUpperCase() as BillingProvider;
+  const currency: "NGN" | "USD" = provider === "PAYSTACK" ? "NGN" : "USD";
+  const amountMinor = currency === "NGN" ? tierPricing.ngn : tierPricing.usd;
+  const isTrial = String(subscription.status).toUpperCase() === "TRIAL";
+  const dueRaw = isTrial ? subscription.trialEndDate : subscription.nextBillingDate;
+
+  return {
+    subscriptionId: String(subscription.id),
+    orgId: String(subscription.orgId),
+    orgName: organization?.name ?? null,
+    orgExists: Boolean(organization),
+    email: email ?? null,
+    autopayReference: subscription.autopayEnabled ? subscription.autopayReference ?? null : null,
+    provider,
+    currency,
+    tierKey,
+    planCode: subscription.planCode ?? null,
+    externalSubId: subscription.externalSubId ?? null,
+    amountMinor,
+    amountMajor: amountMinor / 100,
+    billingDueAt: dueRaw ? new Date(dueRaw) : now,
+  };
+}
+
+export class PostgresBillingLedger implements BillingLedger {
+  /** A pending claim younger than this belongs to a run that may still be charging it */
+  constructor(private readonly claimLeaseMs = envNumber("BILLING_CLAIM_LEASE_MINUTES", 10) * 60 * 1000) {}
+
+  async startRun(concurrency: number): Promise<string | null> {
+    const [run] = await db
+      .insert(billingRuns)
+      .values({ status: "running", concurrency } as any)
+      .returning({ id: billingRuns.id });
+    return run?.id ?? null;
+  }
+
+  async loadDueCharges(now: Date): Promise<DueCharge[]> {
+    const rows = await db
+      .select({ subscription: subscriptions, organization: organizations, email: users.email })
+      .from(subscriptions)
+      .leftJoin(organizations, eq(organizations.id, subscriptions.orgId))
+      .leftJoin(users, eq(users.id, subscriptions.userId))
+      .where(
+        and(
+          eq(subscriptions.autopayEnabled, true as any),
+          isNotNull(subscriptions.autopayReference),
+          or(
+            and(
+              eq(subscriptions.status as any, "TRIAL" as any),
+              isNotNull(subscriptions.trialEndDate),
+              lte(subscriptions.trialEndDate as any, now)
+            ),
+            and(
+              eq(subscriptions.status as any, "ACTIVE" as any),
+              isNotNull(subscriptions.nextBillingDate),
+              lte(subscriptions.nextBillingDate as any, now)
+            )
+          )
+        )
+      )
+      .orderBy(asc(subscriptions.id));
+
+    return rows.map((row: any) => buildDueCharge(row.subscription, row.organization, row.email, now));
+  }
+
+  async claimCharge(charge: DueCharge, runId: string | null, proposedKey: string): Promise<ChargeClaim | null> {
+    const leaseCutoff = new Date(Date.now() - this.claimLeaseMs);
+    // Failed attempts start over with a fresh reference; stale pending ones are
+    // handed to this run unchanged so the original reference is reused
+    const result = await db.execute(sql`
+      WITH claim AS (
+        INSERT INTO ${billingChargeAttempts} AS a
+          (subscription_id, org_id, period_key, idempotency_key, provider, amount, currency, status, run_id, attempts)
+        VALUES (
+          ${charge.subscriptionId}, ${charge.orgId}, ${billingPeriodKey(charge.billingDueAt)}, ${proposedKey},
+          ${charge.provider}, ${charge.amountMajor.toFixed(2)}, ${charge.currency}, 'pending', ${runId}, 1
+        )
+        ON CONFLICT (subscription_id, period_key) DO UPDATE SET
+          idempotency_key = CASE WHEN a.status = 'failed' THEN EXCLUDED.idempotency_key ELSE a.idempotency_key END,
+          provider = CASE WHEN a.status = 'failed' THEN EXCLUDED.provider ELSE a.provider END,
+          amount = CASE WHEN a.status = 'failed' THEN EXCLUDED.amount ELSE a.amount END,
+          currency = CASE WHEN a.status = 'failed' THEN EXCLUDED.currency ELSE a.currency END,
+          status = CASE WHEN a.status = 'failed' THEN 'pending' ELSE a.status END,
+          attempts = CASE WHEN a.status = 'succeeded' THEN a.attempts ELSE a.attempts + 1 END,
+          run_id = EXCLUDED.run_id,
+          updated_at = NOW()
+        WHERE a.status <> 'pending' OR a.updated_at < ${leaseCutoff}
+        RETURNING a.idempotency_key, a.status
+      ),
+      marked AS (
+        UPDATE ${subscriptions}
+        SET autopay_last_status = 'pending_charge', updated_at = NOW()
+        WHERE id = ${charge.subscriptionId} AND EXISTS (SELECT 1 FROM claim WHERE status = 'pending')
+      )
+      SELECT idempotency_key, status FROM claim
+    `);
+    const row = rowsOf(result)[0];
+    if (!row) return null;
+    const idempotencyKey = String(row.idempotency_key);
+    return {
+      idempotencyKey,
+      status: row.status as ChargeClaim["status"],
+      resumed: idempotencyKey !== proposedKey,
+    };
+  }
+
+  async settleCharge(charge: DueCharge, idempotencyKey: string, outcome: ChargeOutcome, recordPayment: boolean): Promise<void> {
+    const now = new Date();
+    await db.transaction(async (tx) => {
+      await tx
+        .update(billingChargeAttempts)
+        .set({
+          status: outcome.success ? "succeeded" : "failed",
+          providerReference: sql`COALESCE(${billingChargeAttempts.providerReference}, ${outcome.reference})`,
+          lastError: outcome.success ? null : outcome.message ?? null,
+          updatedAt: now,
+        } as any)
+        .where(eq(billingChargeAttempts.idempotencyKey, idempotencyKey));
+
+      if (recordPayment) {
+        await tx.insert(subscriptionPayments).values({
+          subscriptionId: charge.subscriptionId as any,
+          orgId: charge.orgId as any,
+          provider: charge.provider as any,
+          planCode: (charge.planCode ?? charge.tierKey) as any,
+          externalSubId: charge.externalSubId as any,
+          externalInvoiceId: outcome.reference as any,
+          reference: outcome.reference as any,
+          paymentReference: idempotencyKey as any,
+          amount: charge.amountMajor.toFixed(2) as any,
+          currency: charge.currency,
+          paymentType: "monthly_billing",
+          status: (outcome.success ? "completed" : "failed") as any,
+          eventType: "auto_renew" as any,
+          occurredAt: now as any,
+          raw: (outcome.raw ?? { message: outcome.message }) as any,
+        } as any);
+      }
+
+      if (outcome.success) {
+        await tx
+          .update(subscriptions)
+          .set({
+            status: "ACTIVE" as any,
+            autopayLastStatus: "charged",
+            nextBillingDate: new Date(charge.billingDueAt.getTime() + BILLING_PERIOD_MS),
+            updatedAt: now,
+          } as any)
+          .where(eq(subscriptions.id, charge.subscriptionId as any));
+        await tx
+          .update(organizations)
+          .set({ isActive: true as any, lockedUntil: null } as any)
+          .where(eq(organizations.id, charge.orgId as any));
+      } else {
+        await this.markPastDue(tx, charge, "failed", now);
+      }
+    });
+  }
+
+  async markMissingMethod(charge: DueCharge): Promise<void> {
+    await db.transaction(async (tx) => {
+      await this.markPastDue(tx, charge, "missing_method", new Date());
+    });
+  }
+
+  async finishRun(runId: string | null, summary: BillingRunSummary, details: Record<string, unknown>): Promise<void> {
+    if (!runId) return;
+    await db
+      .update(billingRuns)
+      .set({
+        status: summary.status,
+        subscriptionsDue: summary.subscriptionsDue,
+        charged: summary.charged,
+        failed: summary.failed,
+        missingMethod: summary.missingMethod,
+        skipped: summary.skipped,
+        resumed: summary.resumed,
+        deferred: summary.deferred,
+        durationMs: summary.durationMs,
+        details,
+        errorMessage: summary.errorMessage ?? null,
+        completedAt: new Date(),
+      } as any)
+      .where(eq(billingRuns.id, runId));
+  }
+
+  private async markPastDue(tx: any, charge: DueCharge, reason: "failed" | "missing_method", now: Date) {
+    await tx
+      .update(subscriptions)
+      .set({ status: "PAST_DUE" as any, autopayLastStatus: reason, updatedAt: now } as any)
+      .where(eq(subscriptions.id, charge.subscriptionId as any));
+    await tx
+      .update(organizations)
+      .set({ isActive: false as any, lockedUntil: now } as any)
+      .where(eq(organizations.id, charge.orgId as any));
+  }
+}
+
+/**
+ * Ledger held in memory, for load tests against the fake providers and for
+ * unit tests. Mirrors the claim rules of the Postgres ledger.
+ */
+export class InMemoryBillingLedger implements BillingLedger {
+  readonly attempts = new Map<string, { idempotencyKey: string; status: ChargeClaim["status"]; attempts: number; claimedAt: number }>();
+  readonly payments: Array<{ subscriptionId: string; reference: string; status: "completed" | "failed"; amount: string }> = [];
+  readonly subscriptionStatus = new Map<string, string>();
+  readonly runs: BillingRunSummary[] = [];
+
+  constructor(private charges: DueCharge[] = [], private readonly claimLeaseMs = 0) {}
+
+  setDueCharges(charges: DueCharge[]) {
+    this.charges = charges;
+  }
+
+  async startRun(): Promise<string | null> {
+    return `run-${this.runs.length + 1}`;
+  }
+
+  async loadDueCharges(): Promise<DueCharge[]> {
+    return this.charges.filter((charge) => {
+      const status = this.subscriptionStatus.get(charge.subscriptionId);
+      return status !== "ACTIVE" && status !== "PAST_DUE";
+    });
+  }
+
+  async claimCharge(charge: DueCharge, _runId: string | null, proposedKey: string): Promise<ChargeClaim | null> {
+    const key = `${charge.subscriptionId}:${billingPeriodKey(charge.billingDueAt)}`;
+    const existing = this.attempts.get(key);
+    const now = Date.now();
+    if (!existing) {
+      this.attempts.set(key, { idempotencyKey: proposedKey, status: "pending", attempts: 1, claimedAt: now });
+      return { idempotencyKey: proposedKey, status: "pending", resumed: false };
+    }
+    if (existing.status === "pending" && now - existing.claimedAt < this.claimLeaseMs) {
+      return null;
+    }
+    if (existing.status === "failed") {
+      existing.idempotencyKey = proposedKey;
+      existing.status = "pending";
+    }
+    if (existing.status !== "succeeded") existing.attempts += 1;
+    existing.claimedAt = now;
+    return { idempotencyKey: existing.idempotencyKey, status: existing.status, resumed: existing.idempotencyKey !== proposedKey };
+  }
+
+  async settleCharge(charge: DueCharge, idempotencyKey: string, outcome: ChargeOutcome, recordPayment: boolean): Promise<void> {
+    for (const attempt of this.attempts.values()) {
+      if (attempt.idempotencyKey === idempotencyKey) attempt.status = outcome.success ? "succeeded" : "failed";
+    }
+    if (recordPayment) {
+      this.payments.push({
+        subscriptionId: charge.subscriptionId,
+        reference: outcome.reference,
+        status: outcome.success ? "completed" : "failed",
+        amount: charge.amountMajor.toFixed(2),
+      });
+    }
+    this.subscriptionStatus.set(charge.subscriptionId, outcome.success ? "ACTIVE" : "PAST_DUE");
+  }
+
+  async markMissingMethod(charge: DueCharge): Promise<void> {
+    this.subscriptionStatus.set(charge.subscriptionId, "PAST_DUE");
+  }
+
+  async finishRun(_runId: string | null, summary: BillingRunSummary): Promise<void> {
+    this.runs.push(summary);
+  }
+}
+
+type LookupResult = "succeeded" | "failed" | "not_found" | "unknown";
+
+/** Ask the provider what happened to a reference charged by an earlier run. */
+async function lookupCharge(service: BillingPaymentGateway, provider: BillingProvider, reference: string): Promise<LookupResult> {
+  const fetcher = provider === "PAYSTACK" ? service.fetchPaystackTransaction : service.fetchFlutterwaveTransaction;
+  if (typeof fetcher !== "function") return "unknown";
+  try {
+    const data = await fetcher.call(service, reference);
+    if (!data) return "not_found";
+    const status = String(data.status ?? "").toLowerCase();
+    if (status === "success" || status === "successful") return "succeeded";
+    if (status === "failed" || status === "reversed" || status === "abandoned" || status === "cancelled") return "failed";
+    return "unknown";
+  } catch (error) {
+    const status = (error as any)?.response?.status;
+    const message = String((error as any)?.response?.data?.message ?? "");
+    if (status === 404 || (status === 400 && /not found/i.test(message))) return "not_found";
+    return "unknown";
+  }
+}
+
+export async function runBillingRun(options: BillingRunOptions): Promise<BillingRunSummary> {
+  const startedAt = Date.now();
+  const now = options.now ?? new Date(startedAt);
+  const ledger = options.ledger ?? new PostgresBillingLedger();
+  const { service } = options;
+  const concurrency = Math.max(1, Math.floor(options.concurrency ?? envNumber("BILLING_CONCURRENCY", 8)));
+  const maxThrottleRetries = options.maxThrottleRetries ?? envNumber("BILLING_THROTTLE_RETRIES", 3);
+  const log = options.log ?? (() => undefined);
+  const limiters: Record<BillingProvider, RateLimiter> = {
+    PAYSTACK: createRateLimiter(options.rateLimits?.PAYSTACK ?? envNumber("BILLING_PAYSTACK_RATE_PER_SEC", 10)),
+    FLW: createRateLimiter(options.rateLimits?.FLW ?? envNumber("BILLING_FLW_RATE_PER_SEC", 10)),
+  };
+
+  const summary: BillingRunSummary = {
+    runId: null,
+    status: "completed",
+    subscriptionsDue: 0,
+    charged: 0,
+    failed: 0,
+    missingMethod: 0,
+    skipped: 0,
+    resumed: 0,
+    deferred: 0,
+    errors: 0,
+    concurrency,
+    durationMs: 0,
+  };
+  const failures: Array<{ subscriptionId: string; error: string }> = [];
+  let throttleRetries = 0;
+
+  const charge = async (due: DueCharge, reference: string): Promise<PaymentChargeResult> => {
+    const metadata = { subscriptionId: due.subscriptionId, orgId: due.orgId };
+    for (let attempt = 0; ; attempt += 1) {
+      await limiters[due.provider].acquire();
+      const result = due.provider === "PAYSTACK"
+        ? await service.chargePaystackAuthorization(due.autopayReference!, due.email!, due.amountMinor, due.currency, reference, metadata)
+        : await service.chargeFlutterwaveToken(due.autopayReference!, due.email!, due.amountMajor, due.currency, reference, metadata);
+      if (result.success || result.httpStatus !== 429 || attempt >= maxThrottleRetries) return result;
+      throttleRetries += 1;
+      await sleep(250 * 2 ** attempt);
+    }
+  };
+
+  const settle = async (due: DueCharge, key: string, outcome: ChargeOutcome, recordPayment: boolean) => {
+    await ledger.settleCharge(due, key, outcome, recordPayment);
+    if (outcome.success) {
+      summary.charged += 1;
+      logger.info("Subscription renewed automatically", {
+        subscriptionId: due.subscriptionId,
+        orgId: due.orgId,
+        reference: outcome.reference,
+      });
+      await options.onRenewed?.(due, outcome.reference);
+    } else {
+      summary.failed += 1;
+      logger.warn("Marked subscription past due", {
+        subscriptionId: due.subscriptionId,
+        orgId: due.orgId,
+        reason: "failed",
+      });
+    }
+  };
+
+  const processCharge = async (due: DueCharge): Promise<void> => {
+    if (!due.orgExists) {
+      summary.skipped += 1;
+      logger.warn("Subscription missing organization during billing run", {
+        subscriptionId: due.subscriptionId,
+        orgId: due.orgId,
+      });
+      return;
+    }
+    if (!due.autopayReference || !due.email) {
+      await ledger.markMissingMethod(due);
+      summary.missingMethod += 1;
+      logger.warn("Marked subscription past due", {
+        subscriptionId: due.subscriptionId,
+        orgId: due.orgId,
+        reason: "missing_method",
+      });
+      return;
+    }
+
+    const proposedKey = service.generateReference(due.provider === "PAYSTACK" ? "paystack" : "flutterwave");
+    const claim = await ledger.claimCharge(due, summary.runId, proposedKey);
+    if (!claim) {
+      summary.deferred += 1;
+      return;
+    }
+    const key = claim.idempotencyKey;
+
+    if (claim.status === "succeeded") {
+      // Settled before but the subscription was not advanced; finish without a second payment row
+      summary.resumed += 1;
+      await settle(due, key, { success: true, reference: key }, false);
+      return;
+    }
+
+    if (claim.resumed) {
+      summary.resumed += 1;
+      await limiters[due.provider].acquire();
+      const lookup = await lookupCharge(service, due.provider, key);
+      log("resumed charge lookup", { subscriptionId: due.subscriptionId, reference: key, lookup });
+      if (lookup === "succeeded" || lookup === "failed") {
+        await settle(due, key, { success: lookup === "succeeded", reference: key, message: "Recovered from provider" }, true);
+        return;
+      }
+      if (lookup === "unknown") {
+        // Leave the claim pending; the next run asks again once the lease lapses
+        summary.deferred += 1;
+        return;
+      }
+    }
+
+    let result: PaymentChargeResult;
+    try {
+      result = await charge(due, key);
+    } catch (error) {
+      // The provider may or may not have seen the request, so the claim stays
+      // pending and is reconciled by reference on the next run
+      summary.deferred += 1;
+      logger.error("Autopay charge attempt threw", {
+        subscriptionId: due.subscriptionId,
+        orgId: due.orgId,
+        error: errorMessage(error),
+      });
+      return;
+    }
+
+    await settle(
+      due,
+      key,
+      { success: result.success, reference: result.reference ?? key, raw: result.raw, message: result.message },
+      true,
+    );
+  };
+
+  try {
+    summary.runId = await ledger.startRun(concurrency);
+    const dueCharges = await ledger.loadDueCharges(now);
+    summary.subscriptionsDue = dueCharges.length;
+    log("dueSubscriptions snapshot", dueCharges);
+
+    const results = await mapWithConcurrency(dueCharges, concurrency, processCharge);
+    results.forEach((result, index) => {
+      if (result.status === "rejected") {
+        summary.errors += 1;
+        failures.push({ subscriptionId: dueCharges[index].subscriptionId, error: errorMessage(result.reason) });
+      }
+    });
+    if (failures.length) {
+      logger.error("Billing run finished with errors", { runId: summary.runId, errors: failures.length, sample: failures.slice(0, 5) });
+    }
+  } catch (error) {
+    summary.status = "failed";
+    summary.errorMessage = errorMessage(error);
+    log("trial expiration billing error", { error: summary.errorMessage });
+    logger.error("Trial expiration billing run failed", { error: summary.errorMessage });
+  }
+
+  summary.durationMs = Date.now() - startedAt;
+  try {
+    await ledger.finishRun(summary.runId, summary, { failures: failures.slice(0, 50), throttleRetries });
+  } catch (error) {
+    logger.warn("Failed to record billing run summary", { runId: summary.runId, error: errorMessage(error) });
+  }
+  logger.info("Billing run completed", { ...summary });
+  return summary;
+}
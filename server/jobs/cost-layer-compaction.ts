@@ -0,0 +1,183 @@
+import { sql } from "drizzle-orm";
+
+import { inventoryCostLayers, inventoryCostLayersArchive } from "@shared/schema";
+import { db } from "../db";
+import { rowsOf } from "../lib/db-rows";
+import { envNumber } from "../lib/env";
+import { logger } from "../lib/logger";
+
+const ONE_HOUR_MS = 60 * 60 * 1000;
+
+export interface CostLayerCompactionOptions {
+  /** Zeroed layers untouched for this long are moved to the archive */
+  archiveAfterMs?: number;
+  /** Rows archived per statement */
+  archiveBatchSize?: number;
+  /** (store, product) pairs merged per transaction */
+  mergeBatchSize?: number;
+  /** Upper bound on statements per phase, so one run cannot monopolise the pool */
+  maxBatches?: number;
+}
+
+export interface CostLayerCompactionResult {
+  archivedLayers: number;
+  mergedRuns: number;
+  mergedLayers: number;
+  durationMs: number;
+}
+
+/**
+ * Move depleted layers out of inventory_cost_layers. Sales zero layers instead
+ * of deleting them so the hot path stays a single UPDATE; this keeps the table
+ * (and its partial FIFO index) limited to layers that can still be consumed.
+ */
+async function archiveDepletedLayers(cutoff: Date, batchSize: number, maxBatches: number): Promise<number> {
+  let archived = 0;
+  for (let batch = 0; batch < maxBatches; batch += 1) {
+    const result = await db.execute(sql`
+      WITH victims AS (
+        SELECT id FROM ${inventoryCostLayers}
+        WHERE quantity_remaining <= 0 AND updated_at < ${cutoff}
+        ORDER BY updated_at
+        LIMIT ${batchSize}
+        FOR UPDATE SKIP LOCKED
+      ),
+      moved AS (
+        DELETE FROM ${inventoryCostLayers} l
+        USING victims v
+        WHERE l.id = v.id
+        RETURNING l.id, l.store_id, l.product_id, l.unit_cost, l.source, l.reference_id, l.notes, l.created_at, l.updated_at
+      )
+      INSERT INTO ${inventoryCostLayersArchive}
+        (id, store_id, product_id, unit_cost, source, reference_id, notes, created_at, depleted_at)
+      SELECT id, store_id, product_id, unit_cost, source, reference_id, notes, created_at, updated_at
+      FROM moved
+      ON CONFLICT (id) DO NOTHING
+    `);
+    const count = Number((result as any)?.rowCount ?? 0);
+    archived += count;
+    if (count < batchSize) break;
+  }
+  return archived;
+}
+
+/**
+ * Fold runs of consecutive open layers with the same unit cost into the oldest
+ * layer of the run. FIFO cost is unchanged because the merged units sit at the
+ * same position in the queue at the same price; the folded rows are archived
+ * with merged_into pointing at the surviving layer.
+ */
+async function mergeAdjacentLayers(batchSize: number, maxBatches: number): Promise<{ runs: number; layers: number }> {
+  let runs = 0;
+  let layers = 0;
+  let cursor: { storeId: string; productId: string } | null = null;
+
+  for (let batch = 0; batch < maxBatches; batch += 1) {
+    // A repeated unit cost is necessary for an adjacent pair, so it bounds the scan;
+    // pages are keyed on (store_id, product_id) so pairs with non-adjacent repeats
+    // are not picked up again
+    const after = cursor
+      ? sql`AND (store_id, product_id) > (${cursor.storeId}::uuid, ${cursor.productId}::uuid)`
+      : sql``;
+    const candidates = rowsOf(await db.execute(sql`
+      SELECT store_id, product_id
+      FROM ${inventoryCostLayers}
+      WHERE quantity_remaining > 0 ${after}
+      GROUP BY store_id, product_id
+      HAVING COUNT(*) > COUNT(DISTINCT unit_cost)
+      ORDER BY store_id, product_id
+      LIMIT ${batchSize}
+    `));
+    if (candidates.length === 0) break;
+    const last = candidates[candidates.length - 1];
+    cursor = { storeId: String(last.store_id), productId: String(last.product_id) };
+
+    const pairs = sql.join(
+      candidates.map((row) => sql`(${String(row.store_id)}::uuid, ${String(row.product_id)}::uuid)`),
+      sql`, `,
+    );
+
+    const outcome = await db.transaction(async (tx) => {
+      // Lock the open layers first so concurrent sales wait for the merge
+      await tx.execute(sql`
+        SELECT id FROM ${inventoryCostLayers}
+        WHERE (store_id, product_id) IN (VALUES ${pairs}) AND quantity_remaining > 0
+        FOR UPDATE
+      `);
+      const result = await tx.execute(sql`
+        WITH ordered AS (
+          SELECT
+            id, store_id, product_id, unit_cost, quantity_remaining, created_at,
+            ROW_NUMBER() OVER (PARTITION BY store_id, product_id ORDER BY created_at, id)
+              - ROW_NUMBER() OVER (PARTITION BY store_id, product_id, unit_cost ORDER BY created_at, id) AS run
+          FROM ${inventoryCostLayers}
+          WHERE (store_id, product_id) IN (VALUES ${pairs}) AND quantity_remaining > 0
+        ),
+        runs AS (
+          SELECT
+            store_id, product_id, unit_cost, run,
+            (ARRAY_AGG(id ORDER BY created_at, id))[1] AS keep_id,
+            SUM(quantity_remaining)::int AS total_quantity
+          FROM ordered
+          GROUP BY store_id, product_id, unit_cost, run
+          HAVING COUNT(*) > 1
+        ),
+        folded AS (
+          DELETE FROM ${inventoryCostLayers} l
+          USING ordered o
+          JOIN runs r
+            ON r.store_id = o.store_id AND r.product_id = o.product_id AND r.unit_cost = o.unit_cost AND r.run = o.run
+          WHERE l.id = o.id AND l.id <> r.keep_id
+          RETURNING l.id, l.store_id, l.product_id, l.unit_cost, l.source, l.reference_id, l.notes, l.created_at,
+            l.quantity_remaining, r.keep_id
+        ),
+        kept AS (
+          UPDATE ${inventoryCostLayers} l
+          SET quantity_remaining = r.total_quantity, updated_at = now()
+          FROM runs r
+          WHERE l.id = r.keep_id
+          RETURNING l.id
+        ),
+        archived AS (
+          INSERT INTO ${inventoryCostLayersArchive}
+            (id, store_id, product_id, unit_cost, source, reference_id, notes, created_at, merged_into, merged_quantity)
+          SELECT id, store_id, product_id, unit_cost, source, reference_id, notes, created_at, keep_id, quantity_remaining
+          FROM folded
+          ON CONFLICT (id) DO NOTHING
+          RETURNING id
+        )
+        SELECT
+          (SELECT COUNT(*) FROM kept)::int AS merged_runs,
+          (SELECT COUNT(*) FROM folded)::int AS merged_layers
+      `);
+      const row = rowsOf(result)[0] ?? {};
+      return { runs: Number(row.merged_runs ?? 0), layers: Number(row.merged_layers ?? 0) };
+    });
+
+    runs += outcome.runs;
+    layers += outcome.layers;
+    if (candidates.length < batchSize) break;
+  }
+
+  return { runs, layers };
+}
+
+export async function runCostLayerCompaction(options: CostLayerCompactionOptions = {}): Promise<CostLayerCompactionResult> {
+  const startedAt = Date.now();
+  const archiveAfterMs = options.archiveAfterMs ?? envNumber("COST_LAYER_ARCHIVE_AFTER_HOURS", 24) * ONE_HOUR_MS;
+  const archiveBatchSize = options.archiveBatchSize ?? envNumber("COST_LAYER_COMPACTION_BATCH_SIZE", 5000);
+  const mergeBatchSize = options.mergeBatchSize ?? envNumber("COST_LAYER_MERGE_BATCH_SIZE", 500);
+  const maxBatches = options.maxBatches ?? envNumber("COST_LAYER_COMPACTION_MAX_BATCHES", 200);
+
+  const archivedLayers = await archiveDepletedLayers(new Date(startedAt - archiveAfterMs), archiveBatchSize, maxBatches);
+  const merged = await mergeAdjacentLayers(mergeBatchSize, maxBatches);
+
+  const result: CostLayerCompactionResult = {
+    archivedLayers,
+    mergedRuns: merged.runs,
+    mergedLayers: merged.layers,
+    durationMs: Date.now() - startedAt,
+  };
+  logger.info("Cost layer compaction completed", { ...result });
+  return result;
+}
@@ -0,0 +1,318 @@
+import { sql } from "drizzle-orm";
+
+import { emailOutbox } from "@shared/schema";
+import { db } from "../db";
+import { deliverEmail, type EmailDeliveryOptions, type EmailOptions } from "../email";
+import { mapWithConcurrency } from "../lib/concurrency";
+import { rowsOf } from "../lib/db-rows";
+import { envNumber } from "../lib/env";
+import { logger } from "../lib/logger";
+import { monitoringService } from "../lib/monitoring";
+
+/**
+ * Durable outbound email queue, stored in email_outbox.
+ *
+ * sendEmail() renders the message and inserts it here, so signup, password
+ * reset and the bulk jobs no longer wait on SMTP. This worker delivers it:
+ *   - over the pooled transport in server/email.ts, EMAIL_WORKER_CONCURRENCY
+ *     messages at a time
+ *   - transactional mail first: bulk rows (reminders, dunning, reports) are
+ *     claimed only when no transactional mail is ready
+ *   - failures retry with exponential backoff; permanent SMTP rejections (5xx)
+ *     and messages out of attempts move to "dead"
+ *   - rows stuck in "processing" (crashed worker) are requeued after
+ *     EMAIL_PROCESSING_TIMEOUT_MS, so delivery is at least once
+ *   - the body and attachments (temporary passwords, reset links, reports)
+ *     are cleared once a message is sent or dead; the row keeps only the
+ *     recipient, subject and delivery history until it is pruned
+ * Several app instances can run the worker at once; claims use SKIP LOCKED.
+ */
+
+export type EmailDeliveryMode = "inline" | "outbox";
+
+export const EMAIL_PRIORITY_TRANSACTIONAL = 0;
+export const EMAIL_PRIORITY_BULK = 1;
+
+export interface EmailOutboxBatchResult {
+  claimed: number;
+  sent: number;
+  retried: number;
+  deadLettered: number;
+  requeued: number;
+}
+
+export interface EmailOutboxStats {
+  queued: number;
+  retrying: number;
+  processing: number;
+  dead: number;
+  /** Age of the oldest message waiting to be sent */
+  lagMs: number;
+}
+
+interface StoredAttachment {
+  filename: string;
+  content: string;
+  contentType?: string;
+  cid?: string;
+}
+
+/** EMAIL_DELIVERY_MODE=inline sends from the caller, as before the outbox existed. */
+export function emailDeliveryMode(): EmailDeliveryMode {
+  return String(process.env.EMAIL_DELIVERY_MODE ?? "outbox").toLowerCase() === "inline" ? "inline" : "outbox";
+}
+
+/** Backoff before attempt `attempts + 1`: base * 2^(attempts - 1), capped. */
+export function emailRetryDelayMs(attempts: number, baseMs: number, maxMs: number): number {
+  return Math.min(maxMs, baseMs * 2 ** Math.max(0, attempts - 1));
+}
+
+/** SMTP 5xx replies (unknown mailbox, rejected content) will not succeed on retry. */
+export function isPermanentEmailFailure(error: unknown): boolean {
+  const code = Number((error as any)?.responseCode);
+  return Number.isFinite(code) && code >= 500 && code < 600;
+}
+
+function serializeAttachments(options: EmailOptions): StoredAttachment[] | null {
+  if (!options.attachments?.length) return null;
+  return options.attachments.map((attachment) => ({
+    filename: attachment.filename,
+    content: Buffer.isBuffer(attachment.content)
+      ? attachment.content.toString("base64")
+      : Buffer.from(attachment.content, "utf-8").toString("base64"),
+    contentType: attachment.contentType,
+    cid: attachment.cid,
+  }));
+}
+
+function toEmailOptions(row: any): EmailOptions {
+  const attachments = Array.isArray(row.attachments) ? (row.attachments as StoredAttachment[]) : [];
+  return {
+    to: String(row.to_address),
+    subject: String(row.subject),
+    html: String(row.html),
+    text: row.text_body ?? undefined,
+    attachments: attachments.length
+      ? attachments.map((attachment) => ({
+          filename: attachment.filename,
+          content: Buffer.from(attachment.content, "base64"),
+          contentType: attachment.contentType,
+          cid: attachment.cid,
+        }))
+      : undefined,
+  };
+}
+
+/** Persist a rendered message for the worker. */
+export async function enqueueEmail(options: EmailOptions, delivery: EmailDeliveryOptions = {}): Promise<string> {
+  const category = delivery.category ?? "general";
+  const [row] = await db
+    .insert(emailOutbox)
+    .values({
+      category,
+      priority: delivery.bulk ? EMAIL_PRIORITY_BULK : EMAIL_PRIORITY_TRANSACTIONAL,
+      toAddress: options.to,
+      subject: options.subject,
+      html: options.html,
+      textBody: options.text ?? null,
+      attachments: serializeAttachments(options) as any,
+    } as any)
+    .returning({ id: emailOutbox.id });
+  monitoringService.recordEmailEvent("enqueued", category);
+  wakeEmailWorker();
+  return row.id;
+}
+
+async function requeueStuckEmails(timeoutMs: number): Promise<number> {
+  const result = await db.execute(sql`
+    UPDATE ${emailOutbox}
+    SET status = 'retry', next_attempt_at = NOW(), locked_at = NULL,
+        last_error = COALESCE(last_error, 'processing timed out')
+    WHERE status = 'processing' AND locked_at < ${new Date(Date.now() - timeoutMs)}
+  `);
+  return Number((result as any)?.rowCount ?? 0);
+}
+
+async function claimReadyEmails(limit: number): Promise<any[]> {
+  const result = await db.execute(sql`
+    WITH ready AS (
+      SELECT id
+      FROM ${emailOutbox}
+      WHERE status IN ('queued', 'retry') AND next_attempt_at <= NOW()
+      ORDER BY priority, next_attempt_at
+      LIMIT ${limit}
+      FOR UPDATE SKIP LOCKED
+    )
+    UPDATE ${emailOutbox} o
+    SET status = 'processing', attempts = o.attempts + 1, locked_at = NOW()
+    FROM ready
+    WHERE o.id = ready.id
+    RETURNING o.id, o.category, o.to_address, o.subject, o.html, o.text_body, o.attachments, o.attempts
+  `);
+  return rowsOf(result);
+}
+
+// A finished message no longer needs its content
+const CLEAR_BODY = sql`html = '', text_body = NULL, attachments = NULL`;
+
+async function markSent(id: string, messageId: string | undefined) {
+  await db.execute(sql`
+    UPDATE ${emailOutbox}
+    SET status = 'sent', sent_at = NOW(), locked_at = NULL, last_error = NULL, message_id = ${messageId ?? null},
+        ${CLEAR_BODY}
+    WHERE id = ${id}
+  `);
+}
+
+async function markFailed(id: string, error: string, dead: boolean, retryAt: Date) {
+  await db.execute(sql`
+    UPDATE ${emailOutbox}
+    SET status = ${dead ? "dead" : "retry"}, next_attempt_at = ${retryAt}, locked_at = NULL, last_error = ${error}
+        ${dead ? sql`, ${CLEAR_BODY}` : sql``}
+    WHERE id = ${id}
+  `);
+}
+
+/** Claim and deliver one batch of ready messages. */
+export async function processEmailOutboxOnce(
+  options: { batchSize?: number; concurrency?: number; deliver?: typeof deliverEmail } = {},
+): Promise<EmailOutboxBatchResult> {
+  const batchSize = options.batchSize ?? envNumber("EMAIL_WORKER_BATCH_SIZE", 50);
+  const concurrency = options.concurrency ?? envNumber("EMAIL_WORKER_CONCURRENCY", 5);
+  const deliver = options.deliver ?? deliverEmail;
+  const maxAttempts = envNumber("EMAIL_MAX_ATTEMPTS", 6);
+  const retryBaseMs = envNumber("EMAIL_RETRY_BASE_MS", 30_000);
+  const retryMaxMs = envNumber("EMAIL_RETRY_MAX_MS", 60 * 60_000);
+
+  const outcome: EmailOutboxBatchResult = { claimed: 0, sent: 0, retried: 0, deadLettered: 0, requeued: 0 };
+  outcome.requeued = await requeueStuckEmails(envNumber("EMAIL_PROCESSING_TIMEOUT_MS", 10 * 60_000));
+
+  const rows = await claimReadyEmails(batchSize);
+  outcome.claimed = rows.length;
+
+  await mapWithConcurrency(rows, concurrency, async (row) => {
+    const category = String(row.category ?? "general");
+    const attempts = Number(row.attempts ?? 1);
+    const startedAt = Date.now();
+    try {
+      const messageId = await deliver(toEmailOptions(row));
+      await markSent(row.id, messageId);
+      outcome.sent += 1;
+      monitoringService.recordEmailEvent("sent", category, Date.now() - startedAt);
+      return;
+    } catch (caught) {
+      const error = caught instanceof Error ? caught.message : String(caught);
+      const dead = attempts >= maxAttempts || isPermanentEmailFailure(caught);
+      await markFailed(row.id, error, dead, new Date(Date.now() + emailRetryDelayMs(attempts, retryBaseMs, retryMaxMs)));
+      if (dead) {
+        outcome.deadLettered += 1;
+        monitoringService.recordEmailEvent("dead_lettered", category);
+        logger.error("Email moved to dead letter", { emailId: row.id, category, attempts, error });
+      } else {
+        outcome.retried += 1;
+        monitoringService.recordEmailEvent("retried", category);
+        logger.warn("Email delivery failed; will retry", { emailId: row.id, category, attempts, error });
+      }
+    }
+  });
+
+  return outcome;
+}
+
+export async function getEmailOutboxStats(): Promise<EmailOutboxStats> {
+  const row = rowsOf(await db.execute(sql`
+    SELECT
+      COUNT(*) FILTER (WHERE status = 'queued')::int AS queued,
+      COUNT(*) FILTER (WHERE status = 'retry')::int AS retrying,
+      COUNT(*) FILTER (WHERE status = 'processing')::int AS processing,
+      COUNT(*) FILTER (WHERE status = 'dead')::int AS dead,
+      COALESCE(EXTRACT(EPOCH FROM (NOW() - MIN(created_at) FILTER (WHERE status IN ('queued', 'retry')))) * 1000, 0)::bigint AS lag_ms
+    FROM ${emailOutbox}
+    WHERE status IN ('queued', 'retry', 'processing', 'dead')
+  `))[0] ?? {};
+  return {
+    queued: Number(row.queued ?? 0),
+    retrying: Number(row.retrying ?? 0),
+    processing: Number(row.processing ?? 0),
+    dead: Number(row.dead ?? 0),
+    lagMs: Number(row.lag_ms ?? 0),
+  };
+}
+
+/** Delete sent messages after EMAIL_OUTBOX_RETENTION_DAYS and dead ones after EMAIL_OUTBOX_DEAD_RETENTION_DAYS. */
+export async function pruneEmailOutbox(): Promise<number> {
+  const dayMs = 24 * 60 * 60 * 1000;
+  const sentBefore = new Date(Date.now() - envNumber("EMAIL_OUTBOX_RETENTION_DAYS", 7) * dayMs);
+  const deadBefore = new Date(Date.now() - envNumber("EMAIL_OUTBOX_DEAD_RETENTION_DAYS", 30) * dayMs);
+  const result = await db.execute(sql`
+    DELETE FROM ${emailOutbox}
+    WHERE (status = 'sent' AND created_at < ${sentBefore})
+       OR (status = 'dead' AND created_at < ${deadBefore})
+  `);
+  return Number((result as any)?.rowCount ?? 0);
+}
+
+let workerTimer: NodeJS.Timeout | null = null;
+let draining = false;
+let wakeRequested = false;
+let lastStatsAt = 0;
+
+async function drain(): Promise<void> {
+  if (draining) {
+    wakeRequested = true;
+    return;
+  }
+  draining = true;
+  try {
+    do {
+      wakeRequested = false;
+      const batchSize = envNumber("EMAIL_WORKER_BATCH_SIZE", 50);
+      const result = await processEmailOutboxOnce({ batchSize });
+      // A full batch usually means more is ready
+      if (result.claimed >= batchSize) wakeRequested = true;
+    } while (wakeRequested);
+
+    const statsIntervalMs = envNumber("EMAIL_OUTBOX_STATS_INTERVAL_MS", 30_000);
+    if (Date.now() - lastStatsAt >= statsIntervalMs) {
+      lastStatsAt = Date.now();
+      const stats = await getEmailOutboxStats();
+      monitoringService.recordEmailQueueLag(stats.lagMs, stats.queued + stats.retrying);
+    }
+  } catch (error) {
+    logger.error("Email outbox poll failed", {
+      error: error instanceof Error ? error.message : String(error),
+    });
+  } finally {
+    draining = false;
+  }
+}
+
+/** Poke the in-process worker after an enqueue so mail does not wait for the next poll. */
+export function wakeEmailWorker(): void {
+  if (!workerTimer) return;
+  setImmediate(() => {
+    void drain();
+  });
+}
+
+export function startEmailOutboxWorker(): void {
+  if (emailDeliveryMode() !== "outbox" || process.env.NODE_ENV === "test") {
+    logger.info("Email outbox worker disabled; mail is sent inline");
+    return;
+  }
+  if (workerTimer) return;
+  const pollMs = envNumber("EMAIL_WORKER_POLL_MS", 2_000);
+  logger.info("Starting email outbox worker", { pollMs });
+  workerTimer = setInterval(() => {
+    void drain();
+  }, pollMs);
+  workerTimer.unref?.();
+  void drain();
+}
+
+export function stopEmailOutboxWorker(): void {
+  if (workerTimer) {
+    clearInterval(workerTimer);
+    workerTimer = null;
+  }
+}
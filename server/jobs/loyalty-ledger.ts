@@ -0,0 +1,82 @@
+import { sql, type SQL } from "drizzle-orm";
+
+import { db } from "../db";
+import { rowsOf } from "../lib/db-rows";
+import { envNumber } from "../lib/env";
+import { logger } from "../lib/logger";
+import type { LoyaltyHolderKind } from "../lib/loyalty-ledger";
+
+export interface LoyaltyDrift {
+  holderKind: LoyaltyHolderKind;
+  holderId: string;
+  /** Balance column minus ledger sum before the correction */
+  drift: number;
+}
+
+export interface LoyaltyReconcileResult {
+  drifted: LoyaltyDrift[];
+  durationMs: number;
+}
+
+const HOLDERS: Record<LoyaltyHolderKind, { from: SQL; balance: SQL; orgId: SQL }> = {
+  account: { from: sql.raw("loyalty_accounts h"), balance: sql.raw("h.points"), orgId: sql.raw("h.org_id") },
+  customer: {
+    from: sql.raw("customers h LEFT JOIN stores st ON st.id = h.store_id"),
+    balance: sql.raw("h.current_points"),
+    orgId: sql.raw("st.org_id"),
+  },
+};
+
+/**
+ * Compare each balance column with the sum of its ledger entries and append a
+ * reconciliation entry for any difference. Ledger writers move both in one
+ * statement, so drift only comes from writes that bypass the ledger (direct
+ * SQL, balances restored from a backup); those balances are kept and the
+ * ledger absorbs the difference, which is logged. Single statement per
+ * holder kind, so the comparison reads one consistent snapshot.
+ */
+export async function reconcileLoyaltyBalances(kind: LoyaltyHolderKind, limit: number): Promise<LoyaltyDrift[]> {
+  const holder = HOLDERS[kind];
+  const result = await db.execute(sql`
+    WITH sums AS (
+      SELECT holder_id, SUM(delta)::bigint AS total
+      FROM loyalty_ledger
+      WHERE holder_kind = ${kind}
+      GROUP BY holder_id
+    ),
+    drift AS (
+      SELECT h.id AS holder_id, ${holder.orgId} AS org_id,
+             (COALESCE(${holder.balance}, 0) - COALESCE(s.total, 0))::int AS delta
+      FROM ${holder.from}
+      LEFT JOIN sums s ON s.holder_id = h.id
+      WHERE COALESCE(${holder.balance}, 0) <> COALESCE(s.total, 0)
+      LIMIT ${limit}
+    )
+    INSERT INTO loyalty_ledger (holder_kind, holder_id, org_id, delta, entry_type, reason, source)
+    SELECT ${kind}, holder_id, org_id, delta, 'reconciliation', 'Balance changed outside the ledger', 'reconciliation'
+    FROM drift
+    RETURNING holder_id, delta
+  `);
+  return rowsOf(result).map((row) => ({ holderKind: kind, holderId: String(row.holder_id), drift: Number(row.delta) }));
+}
+
+export async function runLoyaltyLedgerReconciliation(): Promise<LoyaltyReconcileResult> {
+  const startedAt = Date.now();
+  const limit = envNumber("LOYALTY_LEDGER_RECONCILE_LIMIT", 5000);
+  const drifted: LoyaltyDrift[] = [];
+  for (const kind of ["account", "customer"] as const) {
+    drifted.push(...(await reconcileLoyaltyBalances(kind, limit)));
+  }
+
+  const summary = { drifted, durationMs: Date.now() - startedAt };
+  if (drifted.length) {
+    logger.warn("Loyalty balances drifted from the ledger and were reconciled", {
+      count: drifted.length,
+      sample: drifted.slice(0, 20),
+      durationMs: summary.durationMs,
+    });
+  } else {
+    logger.info("Loyalty ledger reconciled", { durationMs: summary.durationMs });
+  }
+  return summary;
+}
@@ -0,0 +1,261 @@
+import { sql } from "drizzle-orm";
+
+import { db } from "../db";
+import { mapWithConcurrency } from "../lib/concurrency";
+import { rowsOf } from "../lib/db-rows";
+import { envNumber } from "../lib/env";
+import { logger } from "../lib/logger";
+import {
+  basketBucket,
+  emptyTotals,
+  reconcileMetricsDay,
+  type MetricsCorrection,
+  type MetricsDaySnapshot,
+} from "../lib/realtime-metrics";
+import { getRedisClient } from "../lib/redis";
+
+const HOUR_MS = 60 * 60 * 1000;
+const DAY_MS = 24 * HOUR_MS;
+// Sales reach Redis after they commit, so an hour is only reconciled once it has been closed this long
+const SETTLE_MS = 5 * 60 * 1000;
+const UUID_PATTERN = "^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$";
+
+export interface RealtimeMetricsReconcileOptions {
+  now?: Date;
+  /** Days reconciled, counting back from today (UTC) */
+  days?: number;
+  concurrency?: number;
+}
+
+export interface RealtimeMetricsReconcileResult {
+  storesChecked: number;
+  orgsChecked: number;
+  corrected: MetricsCorrection[];
+  durationMs: number;
+}
+
+function jsonRows(value: unknown): any[] {
+  const parsed = typeof value === "string" ? JSON.parse(value) : value;
+  return Array.isArray(parsed) ? parsed : [];
+}
+
+function utcDayStart(date: Date): Date {
+  return new Date(Date.UTC(date.getUTCFullYear(), date.getUTCMonth(), date.getUTCDate()));
+}
+
+/** Start of the earliest hour that may still receive sales; everything before it is reconciled. */
+export function reconcileCutoff(now: Date): Date {
+  return new Date(Math.floor((now.getTime() - SETTLE_MS) / HOUR_MS) * HOUR_MS);
+}
+
+/**
+ * Completed sales of one store-day from Postgres in the shape the Redis layer
+ * keeps: hourly totals, product units/revenue, cashiers and basket sizes, all
+ * in one round trip. Discounts come from the POS sale behind each receipt.
+ * Sales created from `through` on are left out.
+ */
+export async function loadStoreDaySnapshot(storeId: string, day: Date, through?: Date): Promise<MetricsDaySnapshot> {
+  const start = utcDayStart(day);
+  const end = new Date(Math.min(start.getTime() + DAY_MS, through?.getTime() ?? Infinity));
+  const result = await db.execute(sql`
+    WITH txn AS (
+      SELECT t.id, t.cashier_id, t.total::numeric AS total, t.tax_amount::numeric AS tax,
+             COALESCE(s.discount, 0)::numeric AS discount,
+             to_char(date_trunc('hour', t.created_at), 'YYYY-MM-DD"T"HH24') AS hour
+      FROM transactions t
+      LEFT JOIN sales s
+        ON s.id = CASE WHEN t.receipt_number ~ ${UUID_PATTERN} THEN t.receipt_number::uuid END
+      WHERE t.store_id = ${storeId}
+        AND t.kind = 'SALE'
+        AND t.status = 'completed'
+        AND t.created_at >= ${start}
+        AND t.created_at < ${end}
+    ),
+    lines AS (
+      SELECT ti.transaction_id, ti.product_id, ti.quantity, ti.total_price::numeric AS revenue
+      FROM transaction_items ti
+      JOIN txn ON txn.id = ti.transaction_id
+    ),
+    baskets AS (
+      SELECT txn.id, COALESCE(SUM(l.quantity), 0)::int AS units
+      FROM txn
+      LEFT JOIN lines l ON l.transaction_id = txn.id
+      GROUP BY txn.id
+    )
+    SELECT
+      (SELECT COALESCE(json_agg(h), '[]'::json) FROM (
+        SELECT txn.hour, SUM(txn.total) AS revenue, COUNT(*) AS transactions,
+               SUM(txn.discount) AS discount, SUM(txn.tax) AS tax, SUM(b.units) AS units
+        FROM txn JOIN baskets b ON b.id = txn.id
+        GROUP BY txn.hour
+      ) h) AS hourly,
+      (SELECT COALESCE(json_agg(p), '[]'::json) FROM (
+        SELECT product_id, SUM(quantity) AS units, SUM(revenue) AS revenue
+        FROM lines GROUP BY product_id
+      ) p) AS products,
+      (SELECT COALESCE(json_agg(c), '[]'::json) FROM (
+        SELECT cashier_id, SUM(total) AS revenue, COUNT(*) AS transactions
+        FROM txn GROUP BY cashier_id
+      ) c) AS cashiers,
+      (SELECT COALESCE(json_agg(k), '[]'::json) FROM (
+        SELECT units, COUNT(*) AS count FROM baskets GROUP BY units
+      ) k) AS baskets
+  `);
+  const row = rowsOf(result)[0] ?? {};
+
+  const snapshot: MetricsDaySnapshot = {
+    through: end,
+    hourly: new Map(),
+    productUnits: new Map(),
+    productRevenue: new Map(),
+    cashiers: new Map(),
+    basket: {},
+  };
+  for (const hour of jsonRows(row.hourly)) {
+    snapshot.hourly.set(String(hour.hour), {
+      revenue: Number(hour.revenue ?? 0),
+      transactions: Number(hour.transactions ?? 0),
+      discount: Number(hour.discount ?? 0),
+      tax: Number(hour.tax ?? 0),
+      units: Number(hour.units ?? 0),
+    });
+  }
+  for (const product of jsonRows(row.products)) {
+    snapshot.productUnits.set(String(product.product_id), Number(product.units ?? 0));
+    snapshot.productRevenue.set(String(product.product_id), Number(product.revenue ?? 0));
+  }
+  for (const cashier of jsonRows(row.cashiers)) {
+    snapshot.cashiers.set(String(cashier.cashier_id), {
+      revenue: Number(cashier.revenue ?? 0),
+      transactions: Number(cashier.transactions ?? 0),
+    });
+  }
+  for (const basket of jsonRows(row.baskets)) {
+    const bucket = basketBucket(Number(basket.units ?? 0));
+    snapshot.basket[bucket] = (snapshot.basket[bucket] ?? 0) + Number(basket.count ?? 0);
+  }
+  return snapshot;
+}
+
+/** Org-level snapshot: the sum of its stores'. */
+export function mergeSnapshots(snapshots: readonly MetricsDaySnapshot[]): MetricsDaySnapshot {
+  const merged: MetricsDaySnapshot = {
+    through: new Date(Math.min(...snapshots.map((snapshot) => snapshot.through.getTime()))),
+    hourly: new Map(),
+    productUnits: new Map(),
+    productRevenue: new Map(),
+    cashiers: new Map(),
+    basket: {},
+  };
+  for (const snapshot of snapshots) {
+    for (const [hour, totals] of snapshot.hourly) {
+      const target = merged.hourly.get(hour) ?? emptyTotals();
+      target.revenue += totals.revenue;
+      target.transactions += totals.transactions;
+      target.discount += totals.discount;
+      target.tax += totals.tax;
+      target.units += totals.units;
+      merged.hourly.set(hour, target);
+    }
+    for (const [productId, units] of snapshot.productUnits) {
+      merged.productUnits.set(productId, (merged.productUnits.get(productId) ?? 0) + units);
+    }
+    for (const [productId, revenue] of snapshot.productRevenue) {
+      merged.productRevenue.set(productId, (merged.productRevenue.get(productId) ?? 0) + revenue);
+    }
+    for (const [cashierId, stats] of snapshot.cashiers) {
+      const target = merged.cashiers.get(cashierId) ?? { revenue: 0, transactions: 0 };
+      target.revenue += stats.revenue;
+      target.transactions += stats.transactions;
+      merged.cashiers.set(cashierId, target);
+    }
+    for (const [bucket, count] of Object.entries(snapshot.basket)) {
+      merged.basket[bucket] = (merged.basket[bucket] ?? 0) + count;
+    }
+  }
+  return merged;
+}
+
+/**
+ * Reconcile the Redis real-time metrics with Postgres for every store (and
+ * its org) that sold something on the reconciled days. Stores are loaded and
+ * corrected with bounded concurrency; orgs are corrected from the merged store
+ * snapshots, so each store-day is read from the database once. Only sales
+ * before reconcileCutoff(now) are compared, so the hour still being recorded
+ * is not undercounted by sales made while the stores load.
+ */
+export async function runRealtimeMetricsReconciliation(
+  options: RealtimeMetricsReconcileOptions = {},
+): Promise<RealtimeMetricsReconcileResult | null> {
+  const client = getRedisClient();
+  if (!client) return null;
+
+  const startedAt = Date.now();
+  const now = options.now ?? new Date();
+  const days = Math.max(1, options.days ?? 2);
+  const concurrency = options.concurrency ?? envNumber("REALTIME_METRICS_RECONCILE_CONCURRENCY", 4);
+  const cutoff = reconcileCutoff(now);
+  const corrected: MetricsCorrection[] = [];
+  let storesChecked = 0;
+  let orgsChecked = 0;
+
+  for (let offset = 0; offset < days; offset += 1) {
+    const day = utcDayStart(new Date(now.getTime() - offset * DAY_MS));
+    const storeRows = rowsOf(await db.execute(sql`
+      SELECT DISTINCT t.store_id, st.org_id
+      FROM transactions t
+      JOIN stores st ON st.id = t.store_id
+      WHERE t.kind = 'SALE'
+        AND t.status = 'completed'
+        AND t.created_at >= ${day}
+        AND t.created_at < ${new Date(Math.min(day.getTime() + DAY_MS, cutoff.getTime()))}
+    `));
+
+    const settled = await mapWithConcurrency(storeRows, concurrency, async (row: any) => {
+      const storeId = String(row.store_id);
+      const snapshot = await loadStoreDaySnapshot(storeId, day, cutoff);
+      const correction = await reconcileMetricsDay("store", storeId, day, snapshot, client);
+      return { orgId: row.org_id ? String(row.org_id) : null, snapshot, correction };
+    });
+
+    // An org is only corrected when all of its stores loaded; a partial sum would undercount it
+    const failedOrgs = new Set<string>();
+    const byOrg = new Map<string, MetricsDaySnapshot[]>();
+    settled.forEach((result, index) => {
+      const orgId = storeRows[index]?.org_id ? String(storeRows[index].org_id) : null;
+      if (result.status === "rejected") {
+        if (orgId) failedOrgs.add(orgId);
+        logger.warn("Real-time metrics reconciliation failed for store", {
+          storeId: storeRows[index]?.store_id,
+          error: result.reason instanceof Error ? result.reason.message : String(result.reason),
+        });
+        return;
+      }
+      storesChecked += 1;
+      const entry = result.value;
+      if (entry.correction?.corrections) corrected.push(entry.correction);
+      if (!entry.orgId) return;
+      const list = byOrg.get(entry.orgId) ?? [];
+      list.push(entry.snapshot);
+      byOrg.set(entry.orgId, list);
+    });
+    for (const [orgId, orgSnapshots] of byOrg) {
+      if (failedOrgs.has(orgId)) continue;
+      const correction = await reconcileMetricsDay("org", orgId, day, mergeSnapshots(orgSnapshots), client);
+      orgsChecked += 1;
+      if (correction?.corrections) corrected.push(correction);
+    }
+  }
+
+  const summary = { storesChecked, orgsChecked, corrected, durationMs: Date.now() - startedAt };
+  if (corrected.length) {
+    logger.warn("Real-time metrics drifted from the database and were corrected", {
+      storesChecked,
+      orgsChecked,
+      corrected: corrected.map(({ scope, id, day, revenueDrift, transactionDrift }) => ({ scope, id, day, revenueDrift, transactionDrift })),
+    });
+  } else {
+    logger.info("Real-time metrics reconciled", { storesChecked, orgsChecked, durationMs: summary.durationMs });
+  }
+  return summary;
+}
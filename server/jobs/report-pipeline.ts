@@ -0,0 +1,343 @@
+import { eq, inArray, sql } from "drizzle-orm";
+
+import { reportRuns, scheduledReports, users } from "@shared/schema";
+import { db } from "../db";
+import { sendEmail } from "../email";
+import { mapWithConcurrency } from "../lib/concurrency";
+import { logger } from "../lib/logger";
+
+const ONE_DAY_MS = 24 * 60 * 60 * 1000;
+const CSV_HEADER = "date,revenue,discount,tax,transactions\n";
+
+type TruncUnit = "day" | "week" | "month";
+
+export interface DueSchedule {
+  id: string;
+  orgId: string | null;
+  storeId: string | null;
+  userId: string | null;
+  windowDays: number;
+  truncUnit: TruncUnit;
+}
+
+interface StoreBucket {
+  storeId: string;
+  bucket: string;
+  revenue: number;
+  discount: number;
+  tax: number;
+  transactions: number;
+}
+
+interface ReportGroup {
+  key: string;
+  orgId: string | null;
+  windowDays: number;
+  truncUnit: TruncUnit;
+  schedules: DueSchedule[];
+  buckets: StoreBucket[];
+}
+
+export interface ReportPipelineSummary {
+  runId: string | null;
+  schedulesDue: number;
+  groupsComputed: number;
+  reportsSent: number;
+  reportsSkipped: number;
+  reportsFailed: number;
+  aggregateMs: number;
+  deliveryMs: number;
+  durationMs: number;
+}
+
+export function isScheduleDue(schedule: { lastRunAt?: Date | string | null; interval?: string | null }, now: Date): boolean {
+  if (!schedule.lastRunAt) return true;
+  const lastRunAt = new Date(schedule.lastRunAt);
+  const diffDays = (now.getTime() - lastRunAt.getTime()) / ONE_DAY_MS;
+  const interval = String(schedule.interval || "daily").toLowerCase();
+  if (interval === "daily") return diffDays >= 1;
+  if (interval === "weekly") return diffDays >= 7;
+  if (interval === "monthly") return diffDays >= 28;
+  return false;
+}
+
+export function toDueSchedule(schedule: any): DueSchedule {
+  const params = (schedule.params || {}) as any;
+  const windowKey = String(params.window || "last_7_days").toLowerCase();
+  const bucketInterval = String(params.interval || "day").toLowerCase();
+  return {
+    id: schedule.id,
+    orgId: schedule.orgId ?? null,
+    storeId: schedule.storeId ?? null,
+    userId: schedule.userId ?? null,
+    windowDays: windowKey === "last_30_days" ? 30 : 7,
+    truncUnit: bucketInterval === "month" ? "month" : bucketInterval === "week" ? "week" : "day",
+  };
+}
+
+/**
+ * Schedules that share an org and period read the same rows, so they are
+ * grouped and the aggregate query runs once per group instead of per schedule.
+ */
+export function groupDueSchedules(schedules: DueSchedule[]): ReportGroup[] {
+  const groups = new Map<string, ReportGroup>();
+  for (const schedule of schedules) {
+    const key = `${schedule.orgId ?? "*"}|${schedule.windowDays}|${schedule.truncUnit}`;
+    let group = groups.get(key);
+    if (!group) {
+      group = {
+        key,
+        orgId: schedule.orgId,
+        windowDays: schedule.windowDays,
+        truncUnit: schedule.truncUnit,
+        schedules: [],
+        buckets: [],
+      };
+      groups.set(key, group);
+    }
+    group.schedules.push(schedule);
+  }
+  return Array.from(groups.values());
+}
+
+/**
+ * Build the CSV for one schedule from its group's per-store buckets. Org-wide
+ * schedules sum every store's bucket; store schedules filter to their store.
+ */
+export function buildScheduleCsv(schedule: DueSchedule, buckets: StoreBucket[]): string {
+  const byBucket = new Map<string, { revenue: number; discount: number; tax: number; transactions: number }>();
+  for (const row of buckets) {
+    if (schedule.storeId && row.storeId !== schedule.storeId) continue;
+    const existing = byBucket.get(row.bucket) ?? { revenue: 0, discount: 0, tax: 0, transactions: 0 };
+    existing.revenue += row.revenue;
+    existing.discount += row.discount;
+    existing.tax += row.tax;
+    existing.transactions += row.transactions;
+    byBucket.set(row.bucket, existing);
+  }
+
+  let csv = CSV_HEADER;
+  for (const bucket of Array.from(byBucket.keys()).sort()) {
+    const r = byBucket.get(bucket)!;
+    csv += `${bucket},${r.revenue},${r.discount},${r.tax},${r.transactions}\n`;
+  }
+  return csv;
+}
+
+async function computeGroupAggregates(group: ReportGroup, now: Date): Promise<void> {
+  const dateFrom = new Date(now.getTime() - group.windowDays * ONE_DAY_MS);
+  const where: any[] = [];
+  if (group.orgId) where.push(sql`org_id = ${group.orgId}`);
+  // Only pull stores that some schedule in the group needs, unless one of them is org-wide
+  const storeIds = Array.from(new Set(group.schedules.map((s) => s.storeId).filter(Boolean))) as string[];
+  const needsAllStores = group.schedules.some((s) => !s.storeId);
+  if (!needsAllStores && storeIds.length) {
+    where.push(sql`store_id IN (${sql.join(storeIds.map((id) => sql`${id}`), sql`, `)})`);
+  }
+  where.push(sql`occurred_at >= ${dateFrom}`);
+  where.push(sql`occurred_at <= ${now}`);
+
+  const rows = await db.execute(sql`SELECT
+          store_id,
+          date_trunc(${sql.raw(`'${group.truncUnit}'`)}, occurred_at) as bucket,
+          SUM(total::numeric) as revenue,
+          SUM(discount::numeric) as discount,
+          SUM(tax::numeric) as tax,
+          COUNT(*) as transactions
+          FROM sales
+          WHERE ${sql.join(where, sql` AND `)}
+          GROUP BY 1, 2
+          ORDER BY 2 ASC`);
+
+  group.buckets = ((rows as any).rows as any[]).map((r) => ({
+    storeId: String(r.store_id),
+    bucket: new Date(r.bucket).toISOString(),
+    revenue: Number(r.revenue ?? 0),
+    discount: Number(r.discount ?? 0),
+    tax: Number(r.tax ?? 0),
+    transactions: Number(r.transactions ?? 0),
+  }));
+}
+
+async function recordRunStart(): Promise<string | null> {
+  try {
+    const [row] = await db.insert(reportRuns).values({ status: "running" } as any).returning({ id: reportRuns.id });
+    return row?.id ?? null;
+  } catch (error) {
+    logger.warn("Failed to record report pipeline run start", {
+      error: error instanceof Error ? error.message : String(error),
+    });
+    return null;
+  }
+}
+
+async function recordRunEnd(runId: string | null, summary: ReportPipelineSummary, details: unknown, errorMessage?: string) {
+  if (!runId) return;
+  try {
+    await db
+      .update(reportRuns)
+      .set({
+        status: errorMessage ? "failed" : "completed",
+        schedulesDue: summary.schedulesDue,
+        groupsComputed: summary.groupsComputed,
+        reportsSent: summary.reportsSent,
+        reportsSkipped: summary.reportsSkipped,
+        reportsFailed: summary.reportsFailed,
+        aggregateMs: summary.aggregateMs,
+        deliveryMs: summary.deliveryMs,
+        durationMs: summary.durationMs,
+        details: details as any,
+        errorMessage: errorMessage ?? null,
+        completedAt: new Date(),
+      } as any)
+      .where(eq(reportRuns.id, runId));
+  } catch (error) {
+    logger.warn("Failed to record report pipeline run completion", {
+      runId,
+      error: error instanceof Error ? error.message : String(error),
+    });
+  }
+}
+
+/**
+ * Generate and deliver every due scheduled report: group by org and period,
+ * aggregate once per group, then render and send with bounded parallelism.
+ */
+export async function runScheduledReportPipeline(now = new Date()): Promise<ReportPipelineSummary> {
+  const startedAt = Date.now();
+  const concurrency = Number(process.env.REPORT_PIPELINE_CONCURRENCY ?? 8);
+  const summary: ReportPipelineSummary = {
+    runId: null,
+    schedulesDue: 0,
+    groupsComputed: 0,
+    reportsSent: 0,
+    reportsSkipped: 0,
+    reportsFailed: 0,
+    aggregateMs: 0,
+    deliveryMs: 0,
+    durationMs: 0,
+  };
+  const groupTimings: Array<{ key: string; schedules: number; rows: number; ms: number; error?: string }> = [];
+
+  const schedules = await db
+    .select()
+    .from(scheduledReports)
+    .where(eq(scheduledReports.isActive as any, true as any));
+
+  const due = (schedules as any[]).filter((s) => isScheduleDue(s, now)).map(toDueSchedule);
+  summary.schedulesDue = due.length;
+  if (!due.length) {
+    summary.durationMs = Date.now() - startedAt;
+    return summary;
+  }
+
+  summary.runId = await recordRunStart();
+  try {
+    const groups = groupDueSchedules(due);
+
+    const aggregateStart = Date.now();
+    const aggregateResults = await mapWithConcurrency(groups, concurrency, async (group) => {
+      const groupStart = Date.now();
+      await computeGroupAggregates(group, now);
+      groupTimings.push({ key: group.key, schedules: group.schedules.length, rows: group.buckets.length, ms: Date.now() - groupStart });
+    });
+    aggregateResults.forEach((result, index) => {
+      if (result.status === "rejected") {
+        const group = groups[index];
+        const message = result.reason instanceof Error ? result.reason.message : String(result.reason);
+        groupTimings.push({ key: group.key, schedules: group.schedules.length, rows: 0, ms: 0, error: message });
+        logger.error("Scheduled report group aggregation failed", { group: group.key, error: message });
+      }
+    });
+    summary.aggregateMs = Date.now() - aggregateStart;
+    summary.groupsComputed = aggregateResults.filter((r) => r.status === "fulfilled").length;
+
+    const readyGroups = groups.filter((_, index) => aggregateResults[index].status === "fulfilled");
+    const userIds = Array.from(new Set(readyGroups.flatMap((g) => g.schedules.map((s) => s.userId)).filter(Boolean))) as string[];
+    const recipients = new Map<string, string>();
+    if (userIds.length) {
+      const userRows = await db
+        .select({ id: users.id, email: users.email })
+        .from(users)
+        .where(inArray(users.id, userIds));
+      for (const row of userRows) {
+        if (row.email) recipients.set(row.id, row.email);
+      }
+    }
+
+    const deliveryStart = Date.now();
+    const filename = `analytics_scheduled_${now.toISOString().substring(0, 10)}.csv`;
+    const tasks = readyGroups.flatMap((group) => group.schedules.map((schedule) => ({ group, schedule })));
+    const deliveries = await mapWithConcurrency(tasks, concurrency, async ({ group, schedule }) => {
+      const csv = buildScheduleCsv(schedule, group.buckets);
+      if (csv === CSV_HEADER) return "skipped" as const;
+
+      const toEmail = schedule.userId ? recipients.get(schedule.userId) : undefined;
+      if (!toEmail) {
+        logger.warn("Scheduled report has no valid recipient email", { scheduleId: schedule.id });
+        return "skipped" as const;
+      }
+
+      const sent = await sendEmail({
+        to: toEmail,
+        subject: "Your scheduled ChainSync analytics report",
+        html: `<p>Your scheduled analytics CSV report is attached as <strong>${filename}</strong>.</p>`,
+        text: `Your scheduled analytics CSV report is attached as ${filename}.`,
+        attachments: [
+          {
+            filename,
+            content: csv,
+            contentType: "text/csv",
+          },
+        ],
+      }, { category: "scheduled_report", bulk: true });
+      if (!sent) {
+        throw new Error(`Failed to send scheduled analytics report email to ${toEmail}`);
+      }
+      return "sent" as const;
+    });
+    summary.deliveryMs = Date.now() - deliveryStart;
+
+    const sentIds: string[] = [];
+    deliveries.forEach((result, index) => {
+      const { schedule } = tasks[index];
+      if (result.status === "rejected") {
+        summary.reportsFailed += 1;
+        logger.error("Error sending scheduled analytics report email", {
+          scheduleId: schedule.id,
+          error: result.reason instanceof Error ? result.reason.message : String(result.reason),
+        });
+      } else if (result.value === "sent") {
+        summary.reportsSent += 1;
+        sentIds.push(schedule.id);
+      } else {
+        summary.reportsSkipped += 1;
+      }
+    });
+    summary.reportsFailed += due.length - tasks.length;
+
+    if (sentIds.length) {
+      try {
+        await db
+          .update(scheduledReports as any)
+          .set({ lastRunAt: now as any })
+          .where(inArray(scheduledReports.id as any, sentIds as any));
+      } catch (error) {
+        logger.warn("Failed to update lastRunAt for scheduled reports", {
+          count: sentIds.length,
+          error: error instanceof Error ? error.message : String(error),
+        });
+      }
+    }
+
+    summary.durationMs = Date.now() - startedAt;
+    await recordRunEnd(summary.runId, summary, { groups: groupTimings });
+    logger.info("Scheduled report pipeline completed", { ...summary });
+    return summary;
+  } catch (error) {
+    summary.durationMs = Date.now() - startedAt;
+    const message = error instanceof Error ? error.message : String(error);
+    await recordRunEnd(summary.runId, summary, { groups: groupTimings }, message);
+    throw error;
+  }
+}
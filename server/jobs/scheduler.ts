@@ -0,0 +1,530 @@
+import { sql } from "drizzle-orm";
+import { hostname } from "node:os";
+import type { Client } from "pg";
+
+import { createDedicatedClient, db } from "../db";
+import { rowsOf } from "../lib/db-rows";
+import { logger } from "../lib/logger";
+
+/**
+ * Job scheduler for multi-instance deployments (migration 0044).
+ *
+ * Every instance arms the same timers, but a scheduled slot runs once:
+ * - the instance first takes a lease, a Postgres advisory lock on one of the
+ *   job's `concurrency` slots, held for the run on the instance's lease
+ *   connection, which is outside the pool the jobs themselves use (a crashed
+ *   instance drops its connection and with it the lease);
+ * - it then claims the slot with an INSERT into job_runs that is unique on
+ *   (job_name, scheduled_for); instances that lose either race skip.
+ * The job_runs row becomes the run history: status, duration, rows touched.
+ */
+
+export interface JobRunOutcome {
+  rowsTouched?: number | null;
+  details?: Record<string, unknown>;
+}
+
+/** A job may return an outcome, a bare rows-touched count, or nothing. */
+export type JobRunResult = JobRunOutcome | number | null | void;
+
+export interface JobDefinition {
+  name: string;
+  /** Five-field cron expression evaluated in UTC, or "@every <n>[s|m|h]" aligned to the epoch */
+  schedule: string;
+  /** Random delay (ms) added to each scheduled run so instances do not stampede */
+  jitterMs?: number;
+  /** Runs allowed at the same time across all instances (default 1) */
+  concurrency?: number;
+  enabled?: boolean;
+  run: () => Promise<JobRunResult>;
+}
+
+export type JobTrigger = "schedule" | "manual";
+
+export interface JobRunSummary {
+  runId: number | null;
+  trigger: JobTrigger;
+  status: "succeeded" | "failed";
+  scheduledFor: string | null;
+  startedAt: string;
+  durationMs: number;
+  rowsTouched: number | null;
+  error?: string;
+}
+
+export interface JobStatus {
+  name: string;
+  schedule: string;
+  concurrency: number;
+  enabled: boolean;
+  nextRunAt: string | null;
+  running: number;
+  runs: number;
+  failures: number;
+  skipped: number;
+  lastRun: JobRunSummary | null;
+}
+
+export type TriggerResult =
+  | { status: "started"; runId: number | null; done: Promise<JobRunSummary> }
+  | { status: "busy" }
+  | { status: "not_found" };
+
+interface CronSpec {
+  minutes: Set<number>;
+  hours: Set<number>;
+  days: Set<number>;
+  months: Set<number>;
+  weekdays: Set<number>;
+  anyDay: boolean;
+  anyWeekday: boolean;
+}
+
+type ParsedSchedule = { kind: "cron"; spec: CronSpec } | { kind: "every"; intervalMs: number };
+
+interface JobState {
+  definition: JobDefinition;
+  parsed: ParsedSchedule;
+  timer: NodeJS.Timeout | null;
+  nextRunAt: Date | null;
+  running: number;
+  runs: number;
+  failures: number;
+  skipped: number;
+  lastRun: JobRunSummary | null;
+}
+
+interface Lease {
+  slot: number;
+}
+
+const MAX_TIMER_MS = 2 ** 31 - 1;
+const CRON_FIELDS: Array<[number, number]> = [[0, 59], [0, 23], [1, 31], [1, 12], [0, 7]];
+
+export const instanceId = `${hostname()}:${process.pid}`;
+
+function parseCronField(field: string, [min, max]: [number, number]): Set<number> {
+  const values = new Set<number>();
+  for (const part of field.split(",")) {
+    const [range, stepText] = part.split("/");
+    const step = stepText === undefined ? 1 : Number(stepText);
+    let [from, to] = range === "*" ? [min, max] : range.split("-").map(Number);
+    if (to === undefined) to = stepText === undefined ? from : max;
+    if (![from, to, step].every(Number.isInteger) || step < 1 || from < min || to > max || from > to) {
+      throw new Error(`Invalid cron field "${field}"`);
+    }
+    for (let value = from; value <= to; value += step) values.add(value);
+  }
+  return values;
+}
+
+export function parseSchedule(schedule: string): ParsedSchedule {
+  const trimmed = schedule.trim();
+  const every = /^@every\s+(\d+)\s*(ms|s|m|h)?$/i.exec(trimmed);
+  if (every) {
+    const unit = { ms: 1, s: 1000, m: 60_000, h: 3_600_000 }[(every[2] ?? "ms").toLowerCase() as "ms" | "s" | "m" | "h"];
+    const intervalMs = Number(every[1]) * unit;
+    if (intervalMs <= 0) throw new Error(`Invalid interval "${schedule}"`);
+    return { kind: "every", intervalMs };
+  }
+
+  const fields = trimmed.split(/\s+/);
+  if (fields.length !== 5) throw new Error(`Cron expression must have 5 fields: "${schedule}"`);
+  const [minutes, hours, days, months, weekdays] = fields.map((field, index) => parseCronField(field, CRON_FIELDS[index]));
+  if (weekdays.delete(7)) weekdays.add(0);
+  return {
+    kind: "cron",
+    spec: { minutes, hours, days, months, weekdays, anyDay: fields[2] === "*", anyWeekday: fields[4] === "*" },
+  };
+}
+
+function dayMatches(spec: CronSpec, date: Date): boolean {
+  const day = spec.days.has(date.getUTCDate());
+  const weekday = spec.weekdays.has(date.getUTCDay());
+  // Standard cron: when both day fields are restricted, either may match
+  if (!spec.anyDay && !spec.anyWeekday) return day || weekday;
+  return day && weekday;
+}
+
+/** First slot strictly after `from`. */
+export function nextSlot(parsed: ParsedSchedule, from: Date): Date {
+  if (parsed.kind === "every") {
+    return new Date((Math.floor(from.getTime() / parsed.intervalMs) + 1) * parsed.intervalMs);
+  }
+
+  const { spec } = parsed;
+  let t = new Date(Math.floor(from.getTime() / 60_000) * 60_000 + 60_000);
+  // Skips whole months/days/hours at a time, so even a yearly schedule takes a few hundred steps
+  for (let step = 0; step < 100_000; step++) {
+    const year = t.getUTCFullYear();
+    const month = t.getUTCMonth();
+    const date = t.getUTCDate();
+    const hour = t.getUTCHours();
+    if (!spec.months.has(month + 1)) {
+      t = new Date(Date.UTC(year, month + 1, 1));
+    } else if (!dayMatches(spec, t)) {
+      t = new Date(Date.UTC(year, month, date + 1));
+    } else if (!spec.hours.has(hour)) {
+      t = new Date(Date.UTC(year, month, date, hour + 1));
+    } else if (!spec.minutes.has(t.getUTCMinutes())) {
+      t = new Date(t.getTime() + 60_000);
+    } else {
+      return t;
+    }
+  }
+  throw new Error("Cron expression never matches");
+}
+
+/** Daily at `hourUtc`, the shape the existing *_HOUR_UTC settings describe. */
+export function dailyAt(hourUtc: number): string {
+  const hour = Number.isInteger(hourUtc) && hourUtc >= 0 && hourUtc <= 23 ? hourUtc : 0;
+  return `0 ${hour} * * *`;
+}
+
+function normalizeOutcome(result: JobRunResult): JobRunOutcome {
+  if (typeof result === "number") return { rowsTouched: result };
+  return result ?? {};
+}
+
+let leaseConnection: Promise<Client> | null = null;
+// Advisory locks are re-entrant within a session, so slots this instance holds are tracked here
+const heldSlots = new Set<string>();
+
+function leaseKey(name: string, slot: number): string {
+  return `${name}:${slot}`;
+}
+
+/** The instance's lease connection, reopened after it drops (taking its locks with it). */
+function leaseClient(): Promise<Client> {
+  if (!leaseConnection) {
+    const client = createDedicatedClient();
+    const connecting = client.connect().then(() => client);
+    const reset = () => {
+      if (leaseConnection === connecting) leaseConnection = null;
+    };
+    client.on("error", (error) => {
+      logger.warn("Job lease connection failed; its leases are released", { error: error.message });
+      reset();
+    });
+    client.on("end", reset);
+    connecting.catch(reset);
+    leaseConnection = connecting;
+  }
+  return leaseConnection;
+}
+
+async function acquireLease(name: string, concurrency: number): Promise<Lease | null> {
+  const client = await leaseClient();
+  for (let slot = 0; slot < concurrency; slot++) {
+    const key = leaseKey(name, slot);
+    if (heldSlots.has(key)) continue;
+    heldSlots.add(key);
+    try {
+      const result = await client.query("SELECT pg_try_advisory_lock(hashtext($1), $2) AS locked", [`job:${name}`, slot]);
+      if (result.rows[0]?.locked) return { slot };
+    } catch (error) {
+      heldSlots.delete(key);
+      throw error;
+    }
+    heldSlots.delete(key);
+  }
+  return null;
+}
+
+async function releaseLease(name: string, lease: Lease): Promise<void> {
+  const connection = leaseConnection;
+  try {
+    if (connection) {
+      const client = await connection;
+      await client.query("SELECT pg_advisory_unlock(hashtext($1), $2)", [`job:${name}`, lease.slot]);
+    }
+  } catch (error) {
+    // Closing the connection drops the lock with it, rather than leaving the slot taken
+    logger.warn("Could not release job lease; closing the lease connection", {
+      job: name,
+      error: error instanceof Error ? error.message : String(error),
+    });
+    if (leaseConnection === connection) leaseConnection = null;
+    void connection?.then((client) => client.end()).catch(() => undefined);
+  } finally {
+    heldSlots.delete(leaseKey(name, lease.slot));
+  }
+}
+
+/**
+ * Insert the job_runs row. For scheduled runs the insert is also the slot
+ * claim: `undefined` means another instance already ran this slot. A history
+ * failure (e.g. migration not applied) returns null and the run goes ahead.
+ */
+async function claimRun(name: string, trigger: JobTrigger, scheduledFor: Date | null, triggeredBy: string | null): Promise<number | null | undefined> {
+  try {
+    const result = await db.execute(sql`
+      INSERT INTO job_runs (job_name, trigger, scheduled_for, instance_id, triggered_by)
+      VALUES (${name}, ${trigger}, ${scheduledFor ? scheduledFor.toISOString() : null}::timestamptz, ${instanceId}, ${triggeredBy})
+      ON CONFLICT (job_name, scheduled_for) WHERE scheduled_for IS NOT NULL DO NOTHING
+      RETURNING id
+    `);
+    const row = rowsOf(result)[0];
+    return row ? Number(row.id) : undefined;
+  } catch (error) {
+    logger.warn("Could not record job run; running without history", {
+      job: name,
+      error: error instanceof Error ? error.message : String(error),
+    });
+    return null;
+  }
+}
+
+async function finishRun(runId: number | null, summary: JobRunSummary, details: Record<string, unknown> | undefined): Promise<void> {
+  if (runId === null) return;
+  try {
+    await db.execute(sql`
+      UPDATE job_runs
+      SET status = ${summary.status}, finished_at = now(), duration_ms = ${summary.durationMs},
+          rows_touched = ${summary.rowsTouched}, error = ${summary.error ?? null},
+          details = ${details ? JSON.stringify(details) : null}::jsonb
+      WHERE id = ${runId}
+    `);
+  } catch (error) {
+    logger.warn("Could not record job run outcome", {
+      runId,
+      error: error instanceof Error ? error.message : String(error),
+    });
+  }
+}
+
+export class JobScheduler {
+  private readonly jobs = new Map<string, JobState>();
+  private started = false;
+  private draining = false;
+  // Executions from the trigger to the end of the run, and the job_runs rows of the runs in progress
+  private readonly inFlight = new Set<Promise<unknown>>();
+  private readonly activeRuns = new Map<number, string>();
+
+  register(definition: JobDefinition): void {
+    if (this.jobs.has(definition.name)) {
+      throw new Error(`Job "${definition.name}" is already registered`);
+    }
+    const state: JobState = {
+      definition,
+      parsed: parseSchedule(definition.schedule),
+      timer: null,
+      nextRunAt: null,
+      running: 0,
+      runs: 0,
+      failures: 0,
+      skipped: 0,
+      lastRun: null,
+    };
+    this.jobs.set(definition.name, state);
+    if (this.started) this.arm(state);
+  }
+
+  start(): void {
+    if (this.started) return;
+    this.started = true;
+    this.draining = false;
+    for (const state of this.jobs.values()) this.arm(state);
+    logger.info("Job scheduler started", {
+      instanceId,
+      jobs: Array.from(this.jobs.values()).map((state) => ({
+        name: state.definition.name,
+        enabled: state.definition.enabled !== false,
+        nextRunAt: state.nextRunAt?.toISOString() ?? null,
+      })),
+    });
+  }
+
+  /**
+   * Disarm the timers and refuse new runs, then wait up to `drainTimeoutMs`
+   * for the runs in progress. Resolves false if some were still running; their
+   * job_runs rows are marked failed rather than left 'running' when the
+   * process exits under them.
+   */
+  async stop(drainTimeoutMs = 30_000): Promise<boolean> {
+    this.started = false;
+    this.draining = true;
+    for (const state of this.jobs.values()) {
+      if (state.timer) clearTimeout(state.timer);
+      state.timer = null;
+      state.nextRunAt = null;
+    }
+
+    let timeout: NodeJS.Timeout | undefined;
+    const timedOut = new Promise<boolean>((resolve) => {
+      timeout = setTimeout(() => resolve(false), drainTimeoutMs);
+      timeout.unref?.();
+    });
+    const drained = (async () => {
+      while (this.inFlight.size) await Promise.all(this.inFlight);
+      return true;
+    })();
+    const finished = await Promise.race([drained, timedOut]);
+    clearTimeout(timeout);
+    if (!finished) await this.abandonRuns();
+    return finished;
+  }
+
+  /** Run a job now, outside its schedule. Resolves once the lease is held; `done` settles with the run. */
+  async trigger(name: string, triggeredBy: string | null = null): Promise<TriggerResult> {
+    const state = this.jobs.get(name);
+    if (!state) return { status: "not_found" };
+    return this.execute(state, "manual", null, triggeredBy);
+  }
+
+  list(): JobStatus[] {
+    return Array.from(this.jobs.values(), (state) => ({
+      name: state.definition.name,
+      schedule: state.definition.schedule,
+      concurrency: state.definition.concurrency ?? 1,
+      enabled: state.definition.enabled !== false,
+      nextRunAt: state.nextRunAt?.toISOString() ?? null,
+      running: state.running,
+      runs: state.runs,
+      failures: state.failures,
+      skipped: state.skipped,
+      lastRun: state.lastRun,
+    }));
+  }
+
+  has(name: string): boolean {
+    return this.jobs.has(name);
+  }
+
+  private arm(state: JobState, after = new Date()): void {
+    if (!this.started || state.definition.enabled === false) return;
+    const slot = nextSlot(state.parsed, after);
+    const jitter = state.definition.jitterMs ? Math.floor(Math.random() * state.definition.jitterMs) : 0;
+    state.nextRunAt = slot;
+    this.wait(state, slot, slot.getTime() + jitter);
+  }
+
+  private wait(state: JobState, slot: Date, fireAt: number): void {
+    const delay = Math.max(0, fireAt - Date.now());
+    state.timer = setTimeout(() => {
+      state.timer = null;
+      if (fireAt - Date.now() > 0) {
+        // setTimeout caps at ~24.8 days; keep waiting for far-off slots
+        this.wait(state, slot, fireAt);
+        return;
+      }
+      this.arm(state, slot);
+      void this.execute(state, "schedule", slot, null).then((result) => {
+        if (result.status === "busy") state.skipped += 1;
+      });
+    }, Math.min(delay, MAX_TIMER_MS));
+    state.timer.unref?.();
+  }
+
+  private async abandonRuns(): Promise<void> {
+    const runs = Array.from(this.activeRuns, ([runId, job]) => ({ runId, job }));
+    logger.warn("Job scheduler stopped with runs still in progress", { runs });
+    if (!runs.length) return;
+    try {
+      await db.execute(sql`
+        UPDATE job_runs
+        SET status = 'failed', finished_at = now(), error = 'Interrupted by shutdown'
+        WHERE id IN (${sql.join(runs.map(({ runId }) => sql`${runId}`), sql`, `)}) AND status = 'running'
+      `);
+    } catch (error) {
+      logger.warn("Could not record interrupted job runs", {
+        runs,
+        error: error instanceof Error ? error.message : String(error),
+      });
+    }
+  }
+
+  /** Tracks the execution until its run (if it starts one) settles, so stop() can wait for it. */
+  private execute(state: JobState, trigger: JobTrigger, scheduledFor: Date | null, triggeredBy: string | null): Promise<TriggerResult> {
+    const result = this.claimAndRun(state, trigger, scheduledFor, triggeredBy);
+    const settled = result
+      .then((outcome) => (outcome.status === "started" ? outcome.done : outcome))
+      .catch(() => undefined)
+      .finally(() => this.inFlight.delete(settled));
+    this.inFlight.add(settled);
+    return result;
+  }
+
+  private async claimAndRun(state: JobState, trigger: JobTrigger, scheduledFor: Date | null, triggeredBy: string | null): Promise<TriggerResult> {
+    const { name } = state.definition;
+    const concurrency = Math.max(1, state.definition.concurrency ?? 1);
+    if (this.draining || state.running >= concurrency) return { status: "busy" };
+
+    state.running += 1;
+    let lease: Lease | null = null;
+    try {
+      lease = await acquireLease(name, concurrency);
+    } catch (error) {
+      logger.error("Could not acquire job lease", { job: name, error: error instanceof Error ? error.message : String(error) });
+    }
+    if (!lease || this.draining) {
+      state.running -= 1;
+      if (lease) await releaseLease(name, lease);
+      return { status: "busy" };
+    }
+
+    const runId = await claimRun(name, trigger, scheduledFor, triggeredBy);
+    if (runId === undefined) {
+      // Another instance already ran this slot
+      state.running -= 1;
+      await releaseLease(name, lease);
+      return { status: "busy" };
+    }
+
+    const held = lease;
+    if (runId !== null) this.activeRuns.set(runId, name);
+    const done = this.runLeased(state, trigger, scheduledFor, runId).finally(async () => {
+      state.running -= 1;
+      if (runId !== null) this.activeRuns.delete(runId);
+      await releaseLease(name, held);
+    });
+    return { status: "started", runId, done };
+  }
+
+  private async runLeased(state: JobState, trigger: JobTrigger, scheduledFor: Date | null, runId: number | null): Promise<JobRunSummary> {
+    const { name } = state.definition;
+    const startedAt = Date.now();
+    let outcome: JobRunOutcome = {};
+    let failure: unknown = null;
+    try {
+      outcome = normalizeOutcome(await state.definition.run());
+    } catch (error) {
+      failure = error;
+    }
+
+    const summary: JobRunSummary = {
+      runId,
+      trigger,
+      status: failure ? "failed" : "succeeded",
+      scheduledFor: scheduledFor?.toISOString() ?? null,
+      startedAt: new Date(startedAt).toISOString(),
+      durationMs: Date.now() - startedAt,
+      rowsTouched: outcome.rowsTouched ?? null,
+      ...(failure ? { error: failure instanceof Error ? failure.message : String(failure) } : {}),
+    };
+    state.runs += 1;
+    state.lastRun = summary;
+    if (failure) {
+      state.failures += 1;
+      logger.error(`Scheduled job ${name} failed`, { job: name, runId, trigger, durationMs: summary.durationMs }, failure instanceof Error ? failure : undefined);
+    } else {
+      logger.info(`Scheduled job ${name} completed`, { job: name, runId, trigger, durationMs: summary.durationMs, rowsTouched: summary.rowsTouched });
+    }
+    await finishRun(runId, summary, outcome.details);
+    return summary;
+  }
+}
+
+export const jobScheduler = new JobScheduler();
+
+/** Most recent runs of a job, newest first. */
+export async function getJobRunHistory(name: string, limit = 20): Promise<any[]> {
+  const result = await db.execute(sql`
+    SELECT id, trigger, scheduled_for, status, instance_id, triggered_by, started_at, finished_at, duration_ms, rows_touched, error, details
+    FROM job_runs
+    WHERE job_name = ${name}
+    ORDER BY started_at DESC
+    LIMIT ${Math.min(Math.max(1, limit), 200)}
+  `);
+  return rowsOf(result);
+}
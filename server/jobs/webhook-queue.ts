@@ -0,0 +1,321 @@
+import { sql } from "drizzle-orm";
+
+import { webhookEvents } from "@shared/schema";
+import { db } from "../db";
+import { mapWithConcurrency } from "../lib/concurrency";
+import { rowsOf } from "../lib/db-rows";
+import { envNumber } from "../lib/env";
+import { logger } from "../lib/logger";
+import { monitoringService } from "../lib/monitoring";
+import { applyWebhookEvent, type WebhookProvider } from "../payment/webhook-events";
+
+/**
+ * Durable ingest queue for payment webhooks, stored in webhook_events.
+ *
+ * With WEBHOOK_INGEST_MODE=queue the webhook routes verify the signature,
+ * dedupe and persist the raw event with a single insert, then ACK. This
+ * consumer applies the events in the background:
+ *   - events sharing an ordering key (the subscription's org) are applied
+ *     strictly in arrival order: only the oldest unfinished event of a key is
+ *     ever claimed, so a retrying event holds back the ones behind it
+ *   - failures retry with exponential backoff and move to "dead" after
+ *     WEBHOOK_MAX_ATTEMPTS, which releases the key
+ *   - a claim is a lease: locked_at is renewed while the consumer holds the
+ *     event, so only events whose lease lapsed for
+ *     WEBHOOK_PROCESSING_TIMEOUT_MS (crashed consumer) are requeued, never a
+ *     slow one still being applied. Completion is fenced on the claim's
+ *     attempt number, so a consumer that lost its lease does not overwrite
+ *     the outcome of the one that reclaimed the event
+ * Several app instances can consume at once; claims use SKIP LOCKED.
+ */
+
+export type WebhookIngestMode = "inline" | "queue";
+
+export interface WebhookQueueBatchResult {
+  claimed: number;
+  processed: number;
+  retried: number;
+  deadLettered: number;
+  requeued: number;
+}
+
+export interface WebhookQueueStats {
+  queued: number;
+  retrying: number;
+  processing: number;
+  dead: number;
+  /** Age of the oldest event waiting to be applied */
+  lagMs: number;
+}
+
+export function webhookIngestMode(): WebhookIngestMode {
+  return String(process.env.WEBHOOK_INGEST_MODE ?? "inline").toLowerCase() === "queue" ? "queue" : "inline";
+}
+
+/** Backoff before attempt `attempts + 1`: base * 2^(attempts - 1), capped. */
+export function webhookRetryDelayMs(attempts: number, baseMs: number, maxMs: number): number {
+  return Math.min(maxMs, baseMs * 2 ** Math.max(0, attempts - 1));
+}
+
+/**
+ * Persist a verified event. Returns false when the event id was already
+ * recorded, which makes the insert the idempotency check as well.
+ */
+export async function enqueueWebhookEvent(input: {
+  provider: WebhookProvider;
+  eventId: string;
+  payload: unknown;
+  orderingKey: string;
+}): Promise<boolean> {
+  const inserted = await db
+    .insert(webhookEvents)
+    .values({
+      provider: input.provider,
+      eventId: input.eventId,
+      status: "queued",
+      payload: input.payload as any,
+      orderingKey: input.orderingKey,
+      nextAttemptAt: new Date(),
+    } as any)
+    .onConflictDoNothing({ target: webhookEvents.eventId })
+    .returning({ id: webhookEvents.id });
+  if (inserted.length === 0) return false;
+  monitoringService.recordWebhookQueueEvent("enqueued", input.provider);
+  wakeWebhookConsumer();
+  return true;
+}
+
+/** Requeue events whose lease was not renewed for `timeoutMs`. */
+async function requeueStuckEvents(timeoutMs: number): Promise<number> {
+  const result = await db.execute(sql`
+    UPDATE ${webhookEvents}
+    SET status = 'retry', next_attempt_at = NOW(), locked_at = NULL,
+        last_error = COALESCE(last_error, 'processing timed out')
+    WHERE status = 'processing' AND locked_at < ${new Date(Date.now() - timeoutMs)}
+  `);
+  return Number((result as any)?.rowCount ?? 0);
+}
+
+/** Claim the head event of up to `limit` ordering keys that are ready to run. */
+async function claimReadyEvents(limit: number): Promise<any[]> {
+  const result = await db.execute(sql`
+    WITH ready AS (
+      SELECT e.id
+      FROM ${webhookEvents} e
+      WHERE e.status IN ('queued', 'retry')
+        AND e.next_attempt_at <= NOW()
+        AND NOT EXISTS (
+          SELECT 1 FROM ${webhookEvents} p
+          WHERE p.ordering_key = e.ordering_key
+            AND p.status IN ('queued', 'processing', 'retry')
+            AND (p.created_at, p.id) < (e.created_at, e.id)
+        )
+      ORDER BY e.next_attempt_at, e.created_at
+      LIMIT ${limit}
+      FOR UPDATE SKIP LOCKED
+    )
+    UPDATE ${webhookEvents} w
+    SET status = 'processing', attempts = w.attempts + 1, locked_at = NOW()
+    FROM ready
+    WHERE w.id = ready.id
+    RETURNING w.id, w.provider, w.event_id, w.payload, w.attempts, w.ordering_key, w.created_at
+  `);
+  return rowsOf(result);
+}
+
+/** Extend the leases of claimed events (id -> claim attempt) this consumer has not finished. */
+async function renewLeases(held: Map<string, number>): Promise<void> {
+  if (!held.size) return;
+  const claims = sql.join(
+    Array.from(held, ([id, attempts]) => sql`(${id}::uuid, ${attempts}::int)`),
+    sql`, `,
+  );
+  await db.execute(sql`
+    UPDATE ${webhookEvents} w
+    SET locked_at = NOW()
+    FROM (VALUES ${claims}) AS h (id, attempts)
+    WHERE w.id = h.id AND w.attempts = h.attempts AND w.status = 'processing'
+  `);
+}
+
+// Both only touch the event while it is still under this claim
+async function completeEvent(id: string, attempts: number): Promise<boolean> {
+  const result = await db.execute(sql`
+    UPDATE ${webhookEvents}
+    SET status = 'processed', processed_at = NOW(), locked_at = NULL, last_error = NULL
+    WHERE id = ${id} AND status = 'processing' AND attempts = ${attempts}
+  `);
+  return Number((result as any)?.rowCount ?? 0) > 0;
+}
+
+async function failEvent(id: string, attempts: number, error: string, dead: boolean, retryAt: Date): Promise<boolean> {
+  const result = await db.execute(sql`
+    UPDATE ${webhookEvents}
+    SET status = ${dead ? "dead" : "retry"}, next_attempt_at = ${retryAt}, locked_at = NULL, last_error = ${error}
+    WHERE id = ${id} AND status = 'processing' AND attempts = ${attempts}
+  `);
+  return Number((result as any)?.rowCount ?? 0) > 0;
+}
+
+/** Claim and apply one batch of ready events. */
+export async function processWebhookQueueOnce(options: { batchSize?: number; concurrency?: number } = {}): Promise<WebhookQueueBatchResult> {
+  const batchSize = options.batchSize ?? envNumber("WEBHOOK_CONSUMER_BATCH_SIZE", 50);
+  const concurrency = options.concurrency ?? envNumber("WEBHOOK_CONSUMER_CONCURRENCY", 4);
+  const maxAttempts = envNumber("WEBHOOK_MAX_ATTEMPTS", 8);
+  const retryBaseMs = envNumber("WEBHOOK_RETRY_BASE_MS", 5_000);
+  const retryMaxMs = envNumber("WEBHOOK_RETRY_MAX_MS", 15 * 60_000);
+  const processingTimeoutMs = envNumber("WEBHOOK_PROCESSING_TIMEOUT_MS", 5 * 60_000);
+
+  const outcome: WebhookQueueBatchResult = { claimed: 0, processed: 0, retried: 0, deadLettered: 0, requeued: 0 };
+  outcome.requeued = await requeueStuckEvents(processingTimeoutMs);
+
+  const events = await claimReadyEvents(batchSize);
+  outcome.claimed = events.length;
+
+  // Events waiting for a concurrency slot are held too, so the whole batch is renewed
+  const held = new Map<string, number>(events.map((event) => [String(event.id), Number(event.attempts ?? 1)]));
+  const renewal = setInterval(() => {
+    renewLeases(held).catch((error) => {
+      logger.warn("Could not renew webhook event leases", {
+        events: held.size,
+        error: error instanceof Error ? error.message : String(error),
+      });
+    });
+  }, Math.max(1_000, Math.floor(processingTimeoutMs / 3)));
+  renewal.unref?.();
+
+  try {
+    await mapWithConcurrency(events, concurrency, (event) => applyClaimedEvent(event, held, outcome, { maxAttempts, retryBaseMs, retryMaxMs }));
+  } finally {
+    clearInterval(renewal);
+  }
+
+  return outcome;
+}
+
+async function applyClaimedEvent(
+  event: any,
+  held: Map<string, number>,
+  outcome: WebhookQueueBatchResult,
+  retry: { maxAttempts: number; retryBaseMs: number; retryMaxMs: number },
+): Promise<void> {
+  const provider = String(event.provider) as WebhookProvider;
+  const attempts = Number(event.attempts ?? 1);
+  let error: string | null = null;
+  try {
+    const applied = await applyWebhookEvent(provider, event.payload);
+    // The subscription or org may be created by an event still in flight elsewhere
+    if (applied.outcome === "unresolved") error = "Missing subscription identifiers";
+    if (applied.outcome === "org_missing") error = `Org not found: ${applied.orgId}`;
+  } catch (caught) {
+    error = caught instanceof Error ? caught.message : String(caught);
+  }
+
+  const dead = attempts >= retry.maxAttempts;
+  const stillHeld = error
+    ? await failEvent(event.id, attempts, error, dead, new Date(Date.now() + webhookRetryDelayMs(attempts, retry.retryBaseMs, retry.retryMaxMs)))
+    : await completeEvent(event.id, attempts);
+  held.delete(String(event.id));
+  if (!stillHeld) {
+    logger.warn("Webhook event lease was lost before its outcome was recorded", { eventId: event.event_id, provider, attempts, error });
+    return;
+  }
+
+  if (!error) {
+    outcome.processed += 1;
+    monitoringService.recordWebhookQueueEvent("processed", provider);
+  } else if (dead) {
+    outcome.deadLettered += 1;
+    monitoringService.recordWebhookQueueEvent("dead_lettered", provider);
+    logger.error("Webhook event moved to dead letter", { eventId: event.event_id, provider, attempts, error });
+  } else {
+    outcome.retried += 1;
+    monitoringService.recordWebhookQueueEvent("retried", provider);
+    logger.warn("Webhook event processing failed; will retry", { eventId: event.event_id, provider, attempts, error });
+  }
+}
+
+export async function getWebhookQueueStats(): Promise<WebhookQueueStats> {
+  const row = rowsOf(await db.execute(sql`
+    SELECT
+      COUNT(*) FILTER (WHERE status = 'queued')::int AS queued,
+      COUNT(*) FILTER (WHERE status = 'retry')::int AS retrying,
+      COUNT(*) FILTER (WHERE status = 'processing')::int AS processing,
+      COUNT(*) FILTER (WHERE status = 'dead')::int AS dead,
+      COALESCE(EXTRACT(EPOCH FROM (NOW() - MIN(created_at) FILTER (WHERE status IN ('queued', 'retry')))) * 1000, 0)::bigint AS lag_ms
+    FROM ${webhookEvents}
+    WHERE status IN ('queued', 'retry', 'processing', 'dead')
+  `))[0] ?? {};
+  return {
+    queued: Number(row.queued ?? 0),
+    retrying: Number(row.retrying ?? 0),
+    processing: Number(row.processing ?? 0),
+    dead: Number(row.dead ?? 0),
+    lagMs: Number(row.lag_ms ?? 0),
+  };
+}
+
+let consumerTimer: NodeJS.Timeout | null = null;
+let draining = false;
+let wakeRequested = false;
+let lastStatsAt = 0;
+
+async function drain(): Promise<void> {
+  if (draining) {
+    wakeRequested = true;
+    return;
+  }
+  draining = true;
+  try {
+    do {
+      wakeRequested = false;
+      const batchSize = envNumber("WEBHOOK_CONSUMER_BATCH_SIZE", 50);
+      const result = await processWebhookQueueOnce({ batchSize });
+      // A full batch usually means more is ready
+      if (result.claimed >= batchSize) wakeRequested = true;
+    } while (wakeRequested);
+
+    const statsIntervalMs = envNumber("WEBHOOK_QUEUE_STATS_INTERVAL_MS", 30_000);
+    if (Date.now() - lastStatsAt >= statsIntervalMs) {
+      lastStatsAt = Date.now();
+      const stats = await getWebhookQueueStats();
+      monitoringService.recordWebhookQueueLag(stats.lagMs, stats.queued + stats.retrying);
+    }
+  } catch (error) {
+    logger.error("Webhook queue consumer poll failed", {
+      error: error instanceof Error ? error.message : String(error),
+    });
+  } finally {
+    draining = false;
+  }
+}
+
+/** Poke the in-process consumer after an enqueue so events do not wait for the next poll. */
+export function wakeWebhookConsumer(): void {
+  if (!consumerTimer) return;
+  setImmediate(() => {
+    void drain();
+  });
+}
+
+export function startWebhookConsumer(): void {
+  if (webhookIngestMode() !== "queue") {
+    logger.info("Webhook ingest queue disabled; webhooks are processed inline");
+    return;
+  }
+  if (consumerTimer) return;
+  const pollMs = envNumber("WEBHOOK_CONSUMER_POLL_MS", 1_000);
+  logger.info("Starting webhook queue consumer", { pollMs });
+  consumerTimer = setInterval(() => {
+    void drain();
+  }, pollMs);
+  consumerTimer.unref?.();
+  void drain();
+}
+
+export function stopWebhookConsumer(): void {
+  if (consumerTimer) {
+    clearInterval(consumerTimer);
+    consumerTimer = null;
+  }
+}
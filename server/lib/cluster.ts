@@ -0,0 +1,103 @@
+import cluster from 'node:cluster';
+import { availableParallelism } from 'node:os';
+
+import type { DeliveryTarget, NotificationService, WebSocketMessage } from '../websocket/notification-service';
+
+/**
+ * Cluster mode helpers shared by the primary (server/cluster.ts) and the
+ * workers (server/index.ts). The primary forks CLUSTER_WORKERS copies of the
+ * server and passes each its slot in CLUSTER_WORKER_INDEX; a worker that is
+ * not started by the primary behaves exactly like the single-process server.
+ */
+
+export const RELAY_MESSAGE = 'ws:relay';
+export const SHUTDOWN_MESSAGE = 'cluster:shutdown';
+
+export interface RelayMessage {
+  type: typeof RELAY_MESSAGE;
+  origin: number;
+  target: DeliveryTarget;
+  message: WebSocketMessage;
+}
+
+const DEFAULT_CONNECTION_BUDGET = 20;
+const MIN_POOL_SIZE = 2;
+
+function positiveInt(value: string | undefined): number | null {
+  const parsed = Number.parseInt(String(value ?? ''), 10);
+  return Number.isFinite(parsed) && parsed > 0 ? parsed : null;
+}
+
+/** CLUSTER_WORKERS: a number, or "auto" for one worker per core. */
+export function resolveWorkerCount(value = process.env.CLUSTER_WORKERS, cores = availableParallelism()): number {
+  if (String(value ?? '').trim().toLowerCase() === 'auto') return Math.max(1, cores);
+  return positiveInt(value) ?? 1;
+}
+
+export function isClusterWorker(): boolean {
+  return cluster.isWorker && process.env.CLUSTER_WORKER_INDEX !== undefined;
+}
+
+export function workerIndex(): number | null {
+  return isClusterWorker() ? Number(process.env.CLUSTER_WORKER_INDEX) : null;
+}
+
+function schedulerWorkerIndex(env: NodeJS.ProcessEnv): number {
+  const designated = Number.parseInt(env.CLUSTER_SCHEDULER_WORKER ?? '0', 10);
+  return Number.isFinite(designated) ? designated : 0;
+}
+
+/** Background jobs run on one worker (CLUSTER_SCHEDULER_WORKER, default 0); a single process always runs them. */
+export function isSchedulerWorker(): boolean {
+  const index = workerIndex();
+  if (index === null) return true;
+  return index === schedulerWorkerIndex(process.env);
+}
+
+/**
+ * Connections this process may open. DB_POOL_MAX wins when set; otherwise
+ * DB_CONNECTION_BUDGET (connections for the whole deployment) is split across
+ * DB_INSTANCES hosts and their cluster workers. The process that runs
+ * background jobs holds their leases on one connection outside the pool
+ * (jobs/scheduler.ts), so its pool is one smaller than its share.
+ */
+export function resolvePoolSize(env: NodeJS.ProcessEnv = process.env): number {
+  const explicit = positiveInt(env.DB_POOL_MAX);
+  if (explicit) return explicit;
+  const budget = positiveInt(env.DB_CONNECTION_BUDGET) ?? DEFAULT_CONNECTION_BUDGET;
+  const instances = positiveInt(env.DB_INSTANCES) ?? 1;
+  const clustered = env.CLUSTER_WORKER_INDEX !== undefined;
+  const workers = clustered ? positiveInt(env.CLUSTER_WORKERS) ?? 1 : 1;
+  const share = Math.floor(budget / (instances * workers));
+  const leaseConnection = !clustered || Number(env.CLUSTER_WORKER_INDEX) === schedulerWorkerIndex(env) ? 1 : 0;
+  return Math.max(MIN_POOL_SIZE, share - leaseConnection);
+}
+
+/**
+ * Fan WebSocket deliveries out to the other workers. A socket stays on the
+ * worker that accepted its upgrade, so a notification raised on worker A for
+ * a user connected to worker B is relayed through the primary.
+ */
+export function installNotificationRelay(service: NotificationService): void {
+  if (!isClusterWorker() || !process.send) return;
+  service.setRelay((target, message) => {
+    const relay: RelayMessage = { type: RELAY_MESSAGE, origin: process.pid, target, message };
+    process.send?.(relay);
+  });
+  process.on('message', (raw: unknown) => {
+    const relay = raw as RelayMessage;
+    if (relay?.type === RELAY_MESSAGE && relay.origin !== process.pid) {
+      service.deliverLocal(relay.target, relay.message);
+    }
+  });
+}
+
+/** Run `handler` when the primary retires this worker (rolling restart or shutdown). */
+export function onClusterShutdown(handler: () => Promise<void> | void): void {
+  if (!isClusterWorker()) return;
+  process.on('message', (raw: unknown) => {
+    if ((raw as { type?: string })?.type === SHUTDOWN_MESSAGE) {
+      void Promise.resolve(handler()).finally(() => process.exit(0));
+    }
+  });
+}
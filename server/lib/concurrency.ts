@@ -0,0 +1,78 @@
+/**
+ * Small helpers for running async work with bounded parallelism.
+ */
+
+export type SettledResult<R> =
+  | { status: 'fulfilled'; value: R }
+  | { status: 'rejected'; reason: unknown };
+
+/**
+ * Map `items` through `fn` with at most `limit` calls in flight. Results keep
+ * input order; a rejection is captured per item instead of aborting the batch.
+ */
+export async function mapWithConcurrency<T, R>(
+  items: readonly T[],
+  limit: number,
+  fn: (item: T, index: number) => Promise<R>,
+): Promise<SettledResult<R>[]> {
+  const results: SettledResult<R>[] = new Array(items.length);
+  const workerCount = Math.max(1, Math.min(Math.floor(limit) || 1, items.length));
+  let cursor = 0;
+
+  const worker = async () => {
+    while (cursor < items.length) {
+      const index = cursor++;
+      try {
+        results[index] = { status: 'fulfilled', value: await fn(items[index], index) };
+      } catch (reason) {
+        results[index] = { status: 'rejected', reason };
+      }
+    }
+  };
+
+  await Promise.all(Array.from({ length: workerCount }, worker));
+  return results;
+}
+
+export interface RateLimiter {
+  /** Resolves once a token is available; callers queue in FIFO order. */
+  acquire(): Promise<void>;
+}
+
+const sleep = (ms: number) => new Promise<void>((resolve) => setTimeout(resolve, ms));
+
+/**
+ * Token bucket allowing `ratePerSecond` acquisitions per second on average and
+ * bursts of up to `burst`. A non-positive or non-finite rate disables limiting.
+ */
+export function createRateLimiter(ratePerSecond: number, burst?: number): RateLimiter {
+  if (!Number.isFinite(ratePerSecond) || ratePerSecond <= 0) {
+    return { acquire: async () => undefined };
+  }
+  const capacity = Math.max(1, Math.floor(burst ?? Math.ceil(ratePerSecond)));
+  let tokens = capacity;
+  let refilledAt = Date.now();
+  let tail: Promise<void> = Promise.resolve();
+
+  const refill = () => {
+    const now = Date.now();
+    tokens = Math.min(capacity, tokens + ((now - refilledAt) / 1000) * ratePerSecond);
+    refilledAt = now;
+  };
+
+  return {
+    acquire() {
+      // Chained so waiters are served in arrival order and never race for a token
+      const turn = tail.then(async () => {
+        refill();
+        if (tokens < 1) {
+          await sleep(Math.ceil(((1 - tokens) / ratePerSecond) * 1000));
+          refill();
+        }
+        tokens -= 1;
+      });
+      tail = turn;
+      return turn;
+    },
+  };
+}
@@ -0,0 +1,120 @@
+import { sql, type SQL } from "drizzle-orm";
+import { inventoryCostLayers } from "@shared/schema";
+import { rowsOf } from "./db-rows";
+
+/**
+ * Set-based FIFO consumption for inventory cost layers.
+ *
+ * A sale used to walk every layer of every line in JavaScript and issue one
+ * DELETE/UPDATE per layer. fifoConsumptionQuery instead consumes all lines of a
+ * sale in a single statement. The product's open layers are read and locked in
+ * FIFO order from the partial inventory_cost_layers_open_fifo_idx index, so the
+ * cost grows with the layers that can still be consumed rather than the
+ * product's layer history. Each layer's share comes from a running-sum window
+ * and the touched layers are zeroed or shrunk in the same round trip. Zeroed
+ * layers are archived later by the compaction job.
+ *
+ * All open layers are locked, not just the first `qty`: a LIMIT picks its rows
+ * before locking them, so when a concurrent sale depleted one of them (or the
+ * compaction job folded it away) the walk came up short and the rest was costed
+ * at the fallback price. Locking the whole open set and then taking layers up
+ * to the running total sees the committed quantities of every layer.
+ */
+
+export interface CostLayerDemand {
+  productId: string;
+  quantity: number;
+}
+
+export interface CostLayerConsumption {
+  productId: string;
+  consumedQuantity: number;
+  consumedCost: number;
+}
+
+/**
+ * Merge repeated products and drop non-positive quantities, preserving the
+ * order in which products first appear.
+ */
+export function aggregateDemands(lines: readonly CostLayerDemand[]): CostLayerDemand[] {
+  const totals = new Map<string, number>();
+  for (const line of lines) {
+    const quantity = Math.trunc(Number(line.quantity));
+    if (!line.productId || !Number.isFinite(quantity) || quantity <= 0) continue;
+    totals.set(line.productId, (totals.get(line.productId) ?? 0) + quantity);
+  }
+  return Array.from(totals, ([productId, quantity]) => ({ productId, quantity }));
+}
+
+/**
+ * Build the single-statement FIFO consumption for `demands` in one store.
+ * Returns one row per product that had open layers:
+ * (product_id, consumed_quantity, consumed_cost). Any shortfall against the
+ * requested quantity is left for the caller to cost at its fallback price.
+ *
+ * `table` is overridable so the benchmark can run against a scratch copy.
+ */
+export function fifoConsumptionQuery(
+  storeId: string,
+  demands: readonly CostLayerDemand[],
+  table: SQL = sql`${inventoryCostLayers}`,
+): SQL {
+  const requested = sql.join(
+    demands.map((demand) => sql`(${demand.productId}::uuid, ${demand.quantity}::int)`),
+    sql`, `,
+  );
+
+  return sql`
+    WITH req(product_id, qty) AS (VALUES ${requested}),
+    locked AS (
+      SELECT l.id, l.product_id, l.quantity_remaining, l.unit_cost, l.created_at
+      FROM req r
+      CROSS JOIN LATERAL (
+        SELECT c.id, c.product_id, c.quantity_remaining, c.unit_cost, c.created_at
+        FROM ${table} c
+        WHERE c.store_id = ${storeId}::uuid AND c.product_id = r.product_id AND c.quantity_remaining > 0
+        ORDER BY c.created_at, c.id
+        FOR UPDATE
+      ) l
+    ),
+    open_layers AS (
+      SELECT
+        id,
+        product_id,
+        quantity_remaining,
+        unit_cost,
+        SUM(quantity_remaining) OVER (
+          PARTITION BY product_id ORDER BY created_at, id
+          ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+        ) - quantity_remaining AS qty_before
+      FROM locked
+    ),
+    take AS (
+      SELECT o.id, o.product_id, o.unit_cost, LEAST(o.quantity_remaining, r.qty - o.qty_before) AS take_qty
+      FROM open_layers o
+      JOIN req r ON r.product_id = o.product_id
+      WHERE o.qty_before < r.qty
+    ),
+    consumed AS (
+      UPDATE ${table} l
+      SET quantity_remaining = l.quantity_remaining - t.take_qty, updated_at = now()
+      FROM take t
+      WHERE l.id = t.id
+      RETURNING t.product_id, t.take_qty, t.unit_cost
+    )
+    SELECT
+      product_id,
+      SUM(take_qty)::int AS consumed_quantity,
+      SUM(take_qty * unit_cost) AS consumed_cost
+    FROM consumed
+    GROUP BY product_id
+  `;
+}
+
+export function parseConsumptionRows(result: unknown): CostLayerConsumption[] {
+  return rowsOf(result).map((row) => ({
+    productId: String(row.product_id),
+    consumedQuantity: Number(row.consumed_quantity ?? 0) || 0,
+    consumedCost: Number(row.consumed_cost ?? 0) || 0,
+  }));
+}
@@ -1,9 +1,26 @@
 /**
  * Server-side currency helpers.
- * These are stubs and should be replaced with actual rate fetching and caching logic.
+ *
+ * Analytics converts through a shared CurrencyRateService:
+ *   - the current rates are an in-memory snapshot, refreshed in the background
+ *     from the configured source (CURRENCY_RATES_FILE, else the env defaults)
+ *   - the rates served each day are persisted to currency_rates, so a past
+ *     period is converted with the rates of that day rather than today's
+ *   - conversions resolve a rate once per source currency and apply it to a
+ *     whole array of values (convertMoneyValues)
+ * Org base currencies are cached separately (OrgBaseCurrencyCache).
  */
-import { convertMoney, normalizeMoney } from "@shared/lib/currency";
+import { promises as fs } from "node:fs";
+import path from "node:path";
+
+import { sql } from "drizzle-orm";
+
+import { currencyRates } from "@shared/schema";
+import { convertMoney, getSupportedCurrencies, normalizeMoney } from "@shared/lib/currency";
 import type { CurrencyCode, CurrencyRates, Money } from "@shared/lib/currency";
+import { db } from "../db";
+import { envNumber } from "./env";
+import { logger } from "./logger";
 
 export interface CurrencyRateProvider {
   getRates(): Promise<CurrencyRates | null>;
@@ -30,6 +47,448 @@ export function getDefaultRates(): CurrencyRates {
   } as CurrencyRates;
 }
 
+const roundCents = (amount: number): number => Math.round((amount + Number.EPSILON) * 100) / 100;
+
+/** UTC calendar day (YYYY-MM-DD) of a date. */
+export function rateDay(date: Date | string | number): string {
+  return new Date(date).toISOString().slice(0, 10);
+}
+
+function isSupportedCurrency(code: string): code is CurrencyCode {
+  return getSupportedCurrencies().includes(code as CurrencyCode);
+}
+
+/**
+ * Full rate matrix from quotes against one base currency, where
+ * `quotes[X]` is the number of X per 1 `base`.
+ */
+export function ratesFromQuotes(base: CurrencyCode, quotes: Partial<Record<CurrencyCode, number>>): CurrencyRates {
+  const perBase: Partial<Record<CurrencyCode, number>> = { ...quotes, [base]: 1 };
+  const rates = {} as CurrencyRates;
+  for (const from of getSupportedCurrencies()) {
+    rates[from] = {} as Record<CurrencyCode, number>;
+    for (const to of getSupportedCurrencies()) {
+      const fromPerBase = perBase[from];
+      const toPerBase = perBase[to];
+      if (typeof fromPerBase === "number" && fromPerBase > 0 && typeof toPerBase === "number" && Number.isFinite(toPerBase)) {
+        rates[from][to] = toPerBase / fromPerBase;
+      }
+    }
+  }
+  return rates;
+}
+
+/**
+ * Reads rates from a JSON file such as `{ "base": "USD", "rates": { "NGN": 1600 } }`,
+ * so deployments without network access still use explicit rates. The file is
+ * parsed again only when its mtime changes.
+ */
+export class FileCurrencyRateProvider implements CurrencyRateProvider {
+  private cached: { mtimeMs: number; rates: CurrencyRates } | null = null;
+
+  constructor(private readonly filePath: string) {}
+
+  get sourceName(): string {
+    return `file:${path.basename(this.filePath)}`;
+  }
+
+  async getRates(): Promise<CurrencyRates> {
+    const stat = await fs.stat(this.filePath);
+    if (this.cached && this.cached.mtimeMs === stat.mtimeMs) {
+      return this.cached.rates;
+    }
+    const parsed = JSON.parse(await fs.readFile(this.filePath, "utf8"));
+    const base = String(parsed?.base ?? "").toUpperCase();
+    if (!isSupportedCurrency(base)) {
+      throw new Error(`Unsupported base currency in ${this.filePath}: ${base || "(missing)"}`);
+    }
+    const quotes: Partial<Record<CurrencyCode, number>> = {};
+    for (const [code, value] of Object.entries(parsed?.rates ?? {})) {
+      const upper = code.toUpperCase();
+      const rate = Number(value);
+      if (isSupportedCurrency(upper) && Number.isFinite(rate) && rate > 0) {
+        quotes[upper] = rate;
+      }
+    }
+    const rates = ratesFromQuotes(base, quotes);
+    this.cached = { mtimeMs: stat.mtimeMs, rates };
+    return rates;
+  }
+}
+
+/**
+ * Converts every value to `targetCurrency`, rounded to cents like
+ * `convertAmount`. The rate for each source currency is resolved once per call
+ * instead of once per value; values with no usable rate keep their currency.
+ */
+export function convertMoneyValues(values: Money[], targetCurrency: CurrencyCode, rates: CurrencyRates, baseCurrency?: CurrencyCode): Money[] {
+  const rateBySource = new Map<CurrencyCode, number | null>();
+  return values.map((value) => {
+    if (value.currency === targetCurrency) {
+      return { amount: roundCents(value.amount), currency: targetCurrency };
+    }
+    let rate = rateBySource.get(value.currency);
+    if (rate === undefined) {
+      const probe = convertMoney({ amount: 1, currency: value.currency, rates, baseCurrency }, targetCurrency);
+      rate = probe.currency === targetCurrency && typeof probe.usedRate === "number" ? probe.usedRate : null;
+      rateBySource.set(value.currency, rate);
+    }
+    if (rate === null) {
+      return { amount: roundCents(value.amount), currency: value.currency };
+    }
+    return { amount: roundCents(value.amount * rate), currency: targetCurrency };
+  });
+}
+
+export interface RateHistoryRow {
+  day: string;
+  baseCurrency: string;
+  quoteCurrency: string;
+  rate: number;
+}
+
+export interface CurrencyRateHistoryStore {
+  /** Rows for days in [fromDay, toDay] plus the latest row of each pair before fromDay. */
+  loadRange(fromDay: string, toDay: string): Promise<RateHistoryRow[]>;
+  saveDay(day: string, rates: CurrencyRates, source: string): Promise<void>;
+}
+
+function rowsFromRates(day: string, rates: CurrencyRates): RateHistoryRow[] {
+  const rows: RateHistoryRow[] = [];
+  for (const [baseCurrency, quotes] of Object.entries(rates)) {
+    for (const [quoteCurrency, rate] of Object.entries(quotes ?? {})) {
+      if (baseCurrency === quoteCurrency || typeof rate !== "number" || !Number.isFinite(rate)) continue;
+      rows.push({ day, baseCurrency, quoteCurrency, rate });
+    }
+  }
+  return rows;
+}
+
+export class PostgresCurrencyRateHistoryStore implements CurrencyRateHistoryStore {
+  async loadRange(fromDay: string, toDay: string): Promise<RateHistoryRow[]> {
+    const result = await db.execute(sql`
+      SELECT day::text AS day, base_currency, quote_currency, rate
+      FROM ${currencyRates}
+      WHERE day BETWEEN ${fromDay}::date AND ${toDay}::date
+      UNION ALL
+      SELECT day, base_currency, quote_currency, rate FROM (
+        SELECT DISTINCT ON (base_currency, quote_currency) day::text AS day, base_currency, quote_currency, rate
+        FROM ${currencyRates}
+        WHERE day < ${fromDay}::date
+        ORDER BY base_currency, quote_currency, day DESC
+      ) prior
+    `);
+    return ((result as any).rows ?? []).map((row: any) => ({
+      day: String(row.day),
+      baseCurrency: String(row.base_currency),
+      quoteCurrency: String(row.quote_currency),
+      rate: Number(row.rate),
+    }));
+  }
+
+  async saveDay(day: string, rates: CurrencyRates, source: string): Promise<void> {
+    const rows = rowsFromRates(day, rates);
+    if (!rows.length) return;
+    await db
+      .insert(currencyRates)
+      .values(rows.map((row) => ({ ...row, rate: String(row.rate), source })) as any)
+      .onConflictDoUpdate({
+        target: [currencyRates.day, currencyRates.baseCurrency, currencyRates.quoteCurrency],
+        set: { rate: sql`excluded.rate`, source: sql`excluded.source`, updatedAt: sql`now()` },
+      });
+  }
+}
+
+export class InMemoryCurrencyRateHistoryStore implements CurrencyRateHistoryStore {
+  readonly rows = new Map<string, RateHistoryRow>();
+
+  async loadRange(fromDay: string, toDay: string): Promise<RateHistoryRow[]> {
+    const inRange: RateHistoryRow[] = [];
+    const prior = new Map<string, RateHistoryRow>();
+    for (const row of this.rows.values()) {
+      if (row.day >= fromDay && row.day <= toDay) {
+        inRange.push(row);
+      } else if (row.day < fromDay) {
+        const pair = `${row.baseCurrency}:${row.quoteCurrency}`;
+        const existing = prior.get(pair);
+        if (!existing || existing.day < row.day) prior.set(pair, row);
+      }
+    }
+    return [...inRange, ...prior.values()];
+  }
+
+  async saveDay(day: string, rates: CurrencyRates): Promise<void> {
+    for (const row of rowsFromRates(day, rates)) {
+      this.rows.set(`${day}:${row.baseCurrency}:${row.quoteCurrency}`, row);
+    }
+  }
+}
+
+export interface RateSnapshot {
+  rates: CurrencyRates;
+  source: string;
+  /** UTC day the snapshot was fetched */
+  day: string;
+  fetchedAt: number;
+}
+
+export interface CurrencyRateServiceOptions {
+  source: CurrencyRateProvider;
+  sourceName?: string;
+  history?: CurrencyRateHistoryStore | null;
+  refreshIntervalMs?: number;
+  /** Past days kept in memory once resolved */
+  maxCachedDays?: number;
+  now?: () => number;
+}
+
+export class CurrencyRateService implements CurrencyRateProvider {
+  private snapshot: RateSnapshot | null = null;
+  private refreshing: Promise<RateSnapshot> | null = null;
+  private timer: NodeJS.Timeout | null = null;
+  private lastPersisted: string | null = null;
+  private readonly pastDays = new Map<string, CurrencyRates>();
+  private readonly source: CurrencyRateProvider;
+  private readonly sourceName: string;
+  private readonly history: CurrencyRateHistoryStore | null;
+  private readonly refreshIntervalMs: number;
+  private readonly maxCachedDays: number;
+  private readonly now: () => number;
+
+  constructor(options: CurrencyRateServiceOptions) {
+    this.source = options.source;
+    this.sourceName = options.sourceName ?? "static";
+    this.history = options.history ?? null;
+    this.refreshIntervalMs = options.refreshIntervalMs ?? envNumber("CURRENCY_RATES_REFRESH_MS", 15 * 60_000);
+    this.maxCachedDays = options.maxCachedDays ?? 1_000;
+    this.now = options.now ?? Date.now;
+  }
+
+  /** Refresh the snapshot on an interval; reads never wait on the source once it is loaded. */
+  start(): void {
+    if (this.timer) return;
+    this.timer = setInterval(() => {
+      void this.refresh();
+    }, this.refreshIntervalMs);
+    this.timer.unref?.();
+  }
+
+  stop(): void {
+    if (this.timer) clearInterval(this.timer);
+    this.timer = null;
+  }
+
+  getSnapshot(): RateSnapshot | null {
+    return this.snapshot;
+  }
+
+  async getRates(): Promise<CurrencyRates> {
+    return (await this.current()).rates;
+  }
+
+  /** Single-flight reload from the source; keeps the previous rates on failure. */
+  refresh(): Promise<RateSnapshot> {
+    if (!this.refreshing) {
+      this.refreshing = this.load().finally(() => {
+        this.refreshing = null;
+      });
+    }
+    return this.refreshing;
+  }
+
+  private async current(): Promise<RateSnapshot> {
+    return this.snapshot ?? this.refresh();
+  }
+
+  private async load(): Promise<RateSnapshot> {
+    const fetchedAt = this.now();
+    const day = rateDay(fetchedAt);
+    try {
+      const rates = await this.source.getRates();
+      if (!rates) throw new Error("Rate source returned no rates");
+      this.snapshot = { rates, source: this.sourceName, day, fetchedAt };
+      await this.persist(this.snapshot);
+    } catch (error) {
+      logger.warn("Currency rate refresh failed; keeping previous rates", {
+        source: this.sourceName,
+        error: error instanceof Error ? error.message : String(error),
+      });
+      if (!this.snapshot) {
+        this.snapshot = { rates: getDefaultRates(), source: "default", day, fetchedAt };
+      }
+    }
+    return this.snapshot;
+  }
+
+  private async persist(snapshot: RateSnapshot): Promise<void> {
+    if (!this.history) return;
+    const key = `${snapshot.day}:${JSON.stringify(snapshot.rates)}`;
+    if (key === this.lastPersisted) return;
+    try {
+      await this.history.saveDay(snapshot.day, snapshot.rates, snapshot.source);
+      this.lastPersisted = key;
+    } catch (error) {
+      logger.warn("Failed to persist daily currency rates", {
+        day: snapshot.day,
+        error: error instanceof Error ? error.message : String(error),
+      });
+    }
+  }
+
+  /** Rates to convert values dated `date`; the live snapshot when no date is given. */
+  async getRatesForDate(date?: Date | string | null): Promise<CurrencyRates> {
+    if (!date || Number.isNaN(new Date(date).getTime())) return this.getRates();
+    const day = rateDay(date);
+    return (await this.getRatesForDays([day])).get(day)!;
+  }
+
+  /**
+   * Rates for each UTC day. The current day (and later) uses the live
+   * snapshot; a past day uses the rates persisted for it, or for the latest
+   * earlier day. All uncached days are loaded with one query.
+   */
+  async getRatesForDays(days: Iterable<string>): Promise<Map<string, CurrencyRates>> {
+    const current = await this.current();
+    const result = new Map<string, CurrencyRates>();
+    const missing: string[] = [];
+    for (const day of new Set(days)) {
+      const cached = this.pastDays.get(day);
+      if (!this.history || day >= current.day) {
+        result.set(day, current.rates);
+      } else if (cached) {
+        result.set(day, cached);
+      } else {
+        missing.push(day);
+      }
+    }
+    if (!missing.length || !this.history) return result;
+
+    missing.sort();
+    let rows: RateHistoryRow[];
+    try {
+      rows = await this.history.loadRange(missing[0], missing[missing.length - 1]);
+    } catch (error) {
+      logger.warn("Failed to load historical currency rates; using current rates", {
+        fromDay: missing[0],
+        toDay: missing[missing.length - 1],
+        error: error instanceof Error ? error.message : String(error),
+      });
+      for (const day of missing) result.set(day, current.rates);
+      return result;
+    }
+
+    rows.sort((a, b) => (a.day < b.day ? -1 : a.day > b.day ? 1 : 0));
+    // Walk the days in order, carrying forward the latest rate of each pair
+    const carried = new Map<string, RateHistoryRow>();
+    let index = 0;
+    for (const day of missing) {
+      while (index < rows.length && rows[index].day <= day) {
+        carried.set(`${rows[index].baseCurrency}:${rows[index].quoteCurrency}`, rows[index]);
+        index += 1;
+      }
+      const rates = carried.size ? this.ratesFromRows(carried.values(), current.rates) : current.rates;
+      this.rememberDay(day, rates);
+      result.set(day, rates);
+    }
+    return result;
+  }
+
+  private ratesFromRows(rows: Iterable<RateHistoryRow>, fallback: CurrencyRates): CurrencyRates {
+    const rates = {} as CurrencyRates;
+    for (const code of getSupportedCurrencies()) {
+      // Pairs never persisted fall back to the current rate
+      rates[code] = { ...(fallback[code] ?? {}), [code]: 1 } as Record<CurrencyCode, number>;
+    }
+    for (const row of rows) {
+      if (isSupportedCurrency(row.baseCurrency) && isSupportedCurrency(row.quoteCurrency)) {
+        rates[row.baseCurrency][row.quoteCurrency] = row.rate;
+      }
+    }
+    return rates;
+  }
+
+  private rememberDay(day: string, rates: CurrencyRates): void {
+    if (this.pastDays.size >= this.maxCachedDays) {
+      const oldest = this.pastDays.keys().next().value;
+      if (oldest !== undefined) this.pastDays.delete(oldest);
+    }
+    this.pastDays.set(day, rates);
+  }
+}
+
+/**
+ * TTL cache of org base currencies with single-flight loads, so concurrent
+ * dashboard requests for one org share a lookup.
+ */
+export class OrgBaseCurrencyCache {
+  private readonly entries = new Map<string, { currency: CurrencyCode; expiresAt: number }>();
+  private readonly inflight = new Map<string, Promise<CurrencyCode>>();
+
+  constructor(
+    private readonly ttlMs = envNumber("CURRENCY_ORG_CACHE_TTL_MS", 5 * 60_000),
+    private readonly maxEntries = 10_000,
+    private readonly now: () => number = Date.now,
+  ) {}
+
+  async get(orgId: string, load: () => Promise<CurrencyCode>): Promise<CurrencyCode> {
+    const entry = this.entries.get(orgId);
+    if (entry && entry.expiresAt > this.now()) {
+      return entry.currency;
+    }
+    const pending = this.inflight.get(orgId);
+    if (pending) return pending;
+
+    const promise = load()
+      .then((currency) => {
+        this.entries.delete(orgId);
+        if (this.entries.size >= this.maxEntries) {
+          const oldest = this.entries.keys().next().value;
+          if (oldest !== undefined) this.entries.delete(oldest);
+        }
+        this.entries.set(orgId, { currency, expiresAt: this.now() + this.ttlMs });
+        return currency;
+      })
+      .finally(() => {
+        this.inflight.delete(orgId);
+      });
+    this.inflight.set(orgId, promise);
+    return promise;
+  }
+
+  invalidate(orgId?: string): void {
+    if (orgId) {
+      this.entries.delete(orgId);
+    } else {
+      this.entries.clear();
+    }
+  }
+}
+
+let sharedRateService: CurrencyRateService | null = null;
+let sharedOrgCache: OrgBaseCurrencyCache | null = null;
+
+export function getCurrencyRateService(): CurrencyRateService {
+  if (!sharedRateService) {
+    const file = process.env.CURRENCY_RATES_FILE?.trim();
+    const fileProvider = file ? new FileCurrencyRateProvider(path.resolve(file)) : null;
+    const persist = process.env.NODE_ENV !== "test" && process.env.CURRENCY_RATES_PERSIST !== "false";
+    sharedRateService = new CurrencyRateService({
+      source: fileProvider ?? new StaticCurrencyRateProvider(getDefaultRates()),
+      sourceName: fileProvider?.sourceName ?? "env-default",
+      history: persist ? new PostgresCurrencyRateHistoryStore() : null,
+    });
+    sharedRateService.start();
+  }
+  return sharedRateService;
+}
+
+export function getOrgBaseCurrencyCache(): OrgBaseCurrencyCache {
+  if (!sharedOrgCache) {
+    sharedOrgCache = new OrgBaseCurrencyCache();
+  }
+  return sharedOrgCache;
+}
+
 export interface ConvertAmountInput extends Money {
   targetCurrency: CurrencyCode;
   orgId: string;
@@ -51,7 +510,7 @@ export async function convertAmount(input: ConvertAmountInput): Promise<Money> {
   }
 
   const conversion = convertMoney({ ...money, rates, baseCurrency }, targetCurrency);
-  const rounded = Math.round((conversion.amount + Number.EPSILON) * 100) / 100;
+  const rounded = roundCents(conversion.amount);
   return { amount: rounded, currency: conversion.currency };
 }
 
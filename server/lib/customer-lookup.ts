@@ -0,0 +1,220 @@
+import { sql, type SQL } from "drizzle-orm";
+import { normalizePhoneE164, DEFAULT_PHONE_COUNTRY_CODE } from "@shared/lib/phone";
+import { rowsOf } from "./db-rows";
+
+/**
+ * Customer lookup by phone for the till.
+ *
+ * Customers are matched on customers.phone_e164 (migration 0046), so the
+ * spacing and prefix a cashier types no longer create duplicates. The sale
+ * path finds or creates its customer with one upsert instead of a select
+ * followed by an insert, and tills keep a local copy of the store's customers
+ * current through the change feed (GET /api/customers/changes).
+ */
+
+/** PHONE_DEFAULT_COUNTRY_CODE: country code for numbers typed without one (default 234). */
+export function phoneDefaultCountryCode(env: NodeJS.ProcessEnv = process.env): string {
+  const configured = String(env.PHONE_DEFAULT_COUNTRY_CODE ?? "").replace(/\D/g, "");
+  return configured || DEFAULT_PHONE_COUNTRY_CODE;
+}
+
+export function normalizeCustomerPhone(raw: string | null | undefined): string | null {
+  return normalizePhoneE164(raw, phoneDefaultCountryCode());
+}
+
+type Executor = { execute: (query: SQL) => Promise<unknown> };
+
+export interface AttachedCustomer {
+  id: string;
+  currentPoints: number;
+  created: boolean;
+}
+
+/**
+ * Find or create the store's customer for a phone number and lock the row for
+ * the rest of the transaction. Numbers that cannot be normalized fall back to
+ * an exact match on the raw value, as before.
+ */
+export async function upsertCustomerByPhone(
+  executor: Executor,
+  storeId: string,
+  phone: string,
+): Promise<AttachedCustomer> {
+  const raw = phone.trim();
+  const e164 = normalizeCustomerPhone(raw);
+  if (e164) {
+    const result = await executor.execute(sql`
+      INSERT INTO customers (store_id, phone, phone_e164, current_points)
+      VALUES (${storeId}::uuid, ${raw}, ${e164}, 0)
+      ON CONFLICT (store_id, phone_e164) WHERE phone_e164 IS NOT NULL
+      DO UPDATE SET phone_e164 = EXCLUDED.phone_e164
+      RETURNING id, COALESCE(current_points, 0) AS current_points, (xmax = 0) AS created
+    `);
+    return toAttached(rowsOf(result)[0]);
+  }
+
+  const existing = rowsOf(await executor.execute(sql`
+    SELECT id, COALESCE(current_points, 0) AS current_points, false AS created
+    FROM customers
+    WHERE store_id = ${storeId}::uuid AND phone = ${raw}
+    LIMIT 1
+    FOR UPDATE
+  `))[0];
+  if (existing) return toAttached(existing);
+
+  const result = await executor.execute(sql`
+    INSERT INTO customers (store_id, phone, current_points)
+    VALUES (${storeId}::uuid, ${raw}, 0)
+    RETURNING id, current_points, true AS created
+  `);
+  return toAttached(rowsOf(result)[0]);
+}
+
+/**
+ * Find or create the org's customer for a phone number, for the offline sync
+ * path whose loyalty accounts are keyed by org and customer. A customer the
+ * org already has in any store is reused, matched on the normalized number or
+ * the exact raw one. Otherwise one is created in `storeId` with org_id set,
+ * adopting a store customer with that number that has no org yet. An advisory
+ * lock on the org and number keeps two tills from creating it twice.
+ */
+export async function upsertOrgCustomerByPhone(
+  executor: Executor,
+  orgId: string,
+  storeId: string,
+  phone: string,
+): Promise<AttachedCustomer> {
+  const raw = phone.trim();
+  const e164 = normalizeCustomerPhone(raw);
+  await executor.execute(sql`SELECT pg_advisory_xact_lock(hashtext(${`customer:${orgId}:${e164 ?? raw}`}))`);
+
+  const existing = rowsOf(await executor.execute(sql`
+    SELECT id, COALESCE(current_points, 0) AS current_points, false AS created
+    FROM customers
+    WHERE org_id = ${orgId}::uuid
+      AND (${e164 ? sql`phone_e164 = ${e164} OR ` : sql``}phone = ${raw})
+    ORDER BY ${e164 ? sql`(phone_e164 = ${e164}) DESC NULLS LAST, ` : sql``}created_at, id
+    LIMIT 1
+    FOR UPDATE
+  `))[0];
+  if (existing) return toAttached(existing);
+
+  const result = await executor.execute(sql`
+    INSERT INTO customers (org_id, store_id, phone, phone_e164, current_points)
+    VALUES (${orgId}::uuid, ${storeId}::uuid, ${raw}, ${e164}, 0)
+    ON CONFLICT (store_id, phone_e164) WHERE phone_e164 IS NOT NULL
+    DO UPDATE SET org_id = COALESCE(customers.org_id, EXCLUDED.org_id)
+    RETURNING id, COALESCE(current_points, 0) AS current_points, (xmax = 0) AS created
+  `);
+  return toAttached(rowsOf(result)[0]);
+}
+
+function toAttached(row: any): AttachedCustomer {
+  if (!row?.id) {
+    throw new Error("Customer upsert returned no row");
+  }
+  return {
+    id: String(row.id),
+    currentPoints: Number(row.current_points ?? 0),
+    created: row.created === true || row.created === "t",
+  };
+}
+
+/**
+ * Change feed for the till-side customer cache. Rows come back in
+ * (updated_at, id) order, served by customers_store_updated_idx; the cursor is
+ * the position of the last row, so a till that polls with it only receives
+ * customers created or changed since. updated_at is stamped when a
+ * transaction starts, so rows from the last few seconds are left for the next
+ * poll rather than letting a slower transaction commit behind the cursor.
+ */
+
+export const CUSTOMER_CHANGES_MAX_PAGE = 1000;
+const CHANGES_SETTLE_SECONDS = 5;
+const DEFAULT_CHANGES_PAGE = 500;
+
+export interface CustomerChangeCursor {
+  updatedAt: string;
+  id: string;
+}
+
+export function encodeCustomerCursor(cursor: CustomerChangeCursor): string {
+  return Buffer.from(`${cursor.updatedAt}|${cursor.id}`, "utf8").toString("base64url");
+}
+
+/** Returns null for a missing or malformed cursor, which restarts the feed from the beginning. */
+export function decodeCustomerCursor(raw: string | null | undefined): CustomerChangeCursor | null {
+  if (!raw) return null;
+  const decoded = Buffer.from(raw, "base64url").toString("utf8");
+  const [updatedAt, id] = decoded.split("|");
+  if (!updatedAt || !id || Number.isNaN(Date.parse(updatedAt))) return null;
+  return { updatedAt, id };
+}
+
+export interface CustomerChange {
+  id: string;
+  phone: string | null;
+  phoneE164: string | null;
+  name: string | null;
+  email: string | null;
+  loyaltyNumber: string | null;
+  currentPoints: number;
+  isActive: boolean;
+  updatedAt: string;
+}
+
+export interface CustomerChangePage {
+  customers: CustomerChange[];
+  cursor: string | null;
+  hasMore: boolean;
+  defaultCountryCode: string;
+}
+
+export async function listCustomerChanges(
+  executor: Executor,
+  storeId: string,
+  options: { cursor?: string | null; limit?: number } = {},
+): Promise<CustomerChangePage> {
+  const limit = Math.min(Math.max(Math.trunc(options.limit ?? DEFAULT_CHANGES_PAGE), 1), CUSTOMER_CHANGES_MAX_PAGE);
+  const since = decodeCustomerCursor(options.cursor);
+  const after = since
+    ? sql`AND (c.updated_at, c.id) > (${since.updatedAt}::timestamp, ${since.id}::uuid)`
+    : sql``;
+
+  const rows = rowsOf(await executor.execute(sql`
+    SELECT c.id, c.phone, c.phone_e164, c.first_name, c.last_name, c.email, c.loyalty_number,
+           COALESCE(c.current_points, 0) AS current_points,
+           COALESCE(c.is_active, true) AS is_active,
+           to_char(c.updated_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS updated_at
+    FROM customers c
+    WHERE c.store_id = ${storeId}::uuid
+      AND c.updated_at < now() - make_interval(secs => ${CHANGES_SETTLE_SECONDS})
+      ${after}
+    ORDER BY c.updated_at, c.id
+    LIMIT ${limit + 1}
+  `));
+
+  const page = rows.slice(0, limit).map((row): CustomerChange => {
+    const name = [row.first_name, row.last_name].map((part) => String(part ?? "").trim()).filter(Boolean).join(" ");
+    return {
+      id: String(row.id),
+      phone: row.phone ?? null,
+      phoneE164: row.phone_e164 ?? null,
+      name: name || null,
+      email: row.email ?? null,
+      loyaltyNumber: row.loyalty_number ?? null,
+      currentPoints: Number(row.current_points ?? 0),
+      isActive: row.is_active !== false && row.is_active !== "f",
+      updatedAt: String(row.updated_at),
+    };
+  });
+  const last = page[page.length - 1];
+
+  return {
+    customers: page,
+    // An empty page keeps the caller's position
+    cursor: last ? encodeCustomerCursor({ updatedAt: last.updatedAt, id: last.id }) : options.cursor ?? null,
+    hasMore: rows.length > limit,
+    defaultCountryCode: phoneDefaultCountryCode(),
+  };
+}
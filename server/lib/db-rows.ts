@@ -0,0 +1,4 @@
+/** Rows of a `db.execute` / `executor.execute` result, whichever shape the driver returned. */
+export function rowsOf(result: unknown): any[] {
+  return Array.isArray((result as any)?.rows) ? (result as any).rows : Array.isArray(result) ? (result as any[]) : [];
+}
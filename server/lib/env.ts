@@ -0,0 +1,5 @@
+/** A positive number from the environment, or `fallback` when the variable is unset or not one. */
+export function envNumber(name: string, fallback: number): number {
+  const value = Number(process.env[name]);
+  return Number.isFinite(value) && value > 0 ? value : fallback;
+}
@@ -0,0 +1,243 @@
+import type { NextFunction, Request, Response } from 'express';
+import { performance } from 'node:perf_hooks';
+import { logger, type LogContext } from './logger';
+import { monitoringService } from './monitoring';
+import { performanceMonitor } from './performance';
+
+/**
+ * Single-pass request instrumentation. One `finish` listener per request
+ * builds a RequestRecord and fans it out to the metrics (monitoringService,
+ * performanceMonitor), the access log and the security log, replacing the
+ * separate monitoring, pino-http, request-logger and security-logging
+ * middlewares that each hooked the response and re-read the request.
+ *
+ * Health checks and static assets take a fast path: a counter increment and
+ * `next()`, with no listener, timer or record allocated.
+ */
+
+export interface RequestRecord {
+  method: string;
+  path: string;
+  statusCode: number;
+  durationMs: number;
+  /** Epoch milliseconds when the response finished */
+  timestamp: number;
+  requestId?: string;
+  ipAddress?: string;
+  userAgent?: string;
+  referer?: string;
+  userId?: string;
+  orgId?: string;
+  storeId?: string;
+}
+
+export interface InstrumentationStats {
+  fastPath: number;
+  recorded: number;
+  logged: number;
+  sampledOut: number;
+  securityEvents: number;
+  avgHookUs: number;
+  maxHookUs: number;
+}
+
+interface SamplingRule {
+  prefix: string;
+  rate: number;
+}
+
+interface SamplingConfig {
+  key: string;
+  rules: SamplingRule[];
+  defaultRate: number;
+  slowMs: number;
+}
+
+const FAST_PATHS = new Set(['/healthz', '/api/observability/health', '/api/sync/health', '/favicon.ico', '/robots.txt']);
+const STATIC_PREFIXES = ['/assets/', '/@vite/', '/@fs/', '/@react-refresh', '/src/', '/node_modules/'];
+const STATIC_EXTENSIONS = [
+  '.js', '.mjs', '.css', '.map', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico',
+  '.woff', '.woff2', '.ttf', '.webmanifest', '.json',
+];
+
+const stats = { fastPath: 0, recorded: 0, logged: 0, sampledOut: 0, securityEvents: 0, hookUsTotal: 0, maxHookUs: 0 };
+let sampling: SamplingConfig | null = null;
+
+function parseRate(value: string | undefined, fallback: number): number {
+  const rate = Number(value);
+  return value !== undefined && value.trim() !== '' && Number.isFinite(rate) ? Math.min(1, Math.max(0, rate)) : fallback;
+}
+
+/**
+ * REQUEST_LOG_SAMPLING is a comma-separated list of `prefix=rate` pairs, the
+ * longest matching prefix wins; anything else uses REQUEST_LOG_SAMPLE_RATE.
+ * Parsed once and re-parsed only when the variables change.
+ */
+function samplingConfig(): SamplingConfig {
+  const key = `${process.env.REQUEST_LOG_SAMPLING ?? ''}|${process.env.REQUEST_LOG_SAMPLE_RATE ?? ''}|${process.env.REQUEST_SLOW_MS ?? ''}`;
+  if (sampling?.key === key) return sampling;
+
+  const rules = String(process.env.REQUEST_LOG_SAMPLING ?? '')
+    .split(',')
+    .map((pair) => pair.trim())
+    .filter(Boolean)
+    .flatMap((pair) => {
+      const separator = pair.lastIndexOf('=');
+      if (separator <= 0) return [];
+      return [{ prefix: pair.slice(0, separator).trim(), rate: parseRate(pair.slice(separator + 1), 1) }];
+    })
+    .sort((a, b) => b.prefix.length - a.prefix.length);
+  const slowMs = Number(process.env.REQUEST_SLOW_MS);
+
+  sampling = {
+    key,
+    rules,
+    defaultRate: parseRate(process.env.REQUEST_LOG_SAMPLE_RATE, 1),
+    slowMs: Number.isFinite(slowMs) && slowMs > 0 ? slowMs : 1000,
+  };
+  return sampling;
+}
+
+export function sampleRateFor(path: string): number {
+  const config = samplingConfig();
+  for (const rule of config.rules) {
+    if (path.startsWith(rule.prefix)) return rule.rate;
+  }
+  return config.defaultRate;
+}
+
+/** Health checks and static assets; checked against the raw URL without allocating. */
+export function isFastPath(url: string): boolean {
+  if (url.indexOf('?') !== -1) return false;
+  if (FAST_PATHS.has(url)) return true;
+  for (const prefix of STATIC_PREFIXES) {
+    if (url.startsWith(prefix)) return true;
+  }
+  if (url.startsWith('/api/')) return false;
+  for (const extension of STATIC_EXTENSIONS) {
+    if (url.endsWith(extension)) return true;
+  }
+  return false;
+}
+
+function pathOf(req: Request): string {
+  const url = req.originalUrl || req.url;
+  const query = url.indexOf('?');
+  return query === -1 ? url : url.slice(0, query);
+}
+
+export function buildRequestRecord(req: Request, res: Response, durationMs: number): RequestRecord {
+  const session = req.session as any;
+  const user = session?.user;
+  return {
+    method: req.method,
+    path: pathOf(req),
+    statusCode: res.statusCode,
+    durationMs: Math.round(durationMs * 100) / 100,
+    timestamp: Date.now(),
+    requestId: (req as any).requestId,
+    ipAddress: req.ip || req.socket?.remoteAddress,
+    userAgent: req.headers['user-agent'],
+    referer: req.headers.referer,
+    userId: user?.id ?? session?.userId,
+    orgId: user?.orgId ?? session?.orgId ?? (req as any).orgId,
+    storeId: user?.storeId ?? session?.storeId,
+  };
+}
+
+function writeAccessLog(record: RequestRecord): void {
+  const config = samplingConfig();
+  const always = record.statusCode >= 400 || record.durationMs >= config.slowMs;
+  if (!always && Math.random() >= sampleRateFor(record.path)) {
+    stats.sampledOut += 1;
+    return;
+  }
+
+  stats.logged += 1;
+  const context: LogContext = { ...record, duration: record.durationMs };
+  const message = `HTTP ${record.method} ${record.path} - ${record.statusCode}`;
+  if (record.statusCode >= 400) {
+    logger.error(message, context);
+  } else if (record.durationMs >= config.slowMs) {
+    logger.warn(message, { ...context, slow: true });
+  } else {
+    logger.info(message, context);
+  }
+}
+
+function writeSecurityLog(record: RequestRecord): void {
+  const { statusCode } = record;
+  if (statusCode !== 401 && statusCode !== 403 && statusCode !== 429) return;
+  stats.securityEvents += 1;
+  logger.logSecurityEvent(statusCode === 429 ? 'rate_limit_exceeded' : 'unauthorized_access', {
+    method: record.method,
+    path: record.path,
+    statusCode,
+    ipAddress: record.ipAddress,
+    userAgent: record.userAgent,
+    referer: record.referer,
+    userId: record.userId,
+    requestId: record.requestId,
+  });
+}
+
+/** Feed one finished request to every sink. Exported for tests and for callers that time requests themselves. */
+export function recordRequest(record: RequestRecord): void {
+  stats.recorded += 1;
+  monitoringService.recordHttpSample(record.method, record.path, record.statusCode, record.durationMs, record.timestamp);
+  performanceMonitor.recordMetric({
+    endpoint: record.path,
+    method: record.method,
+    responseTime: record.durationMs,
+    timestamp: new Date(record.timestamp),
+    statusCode: record.statusCode,
+    userAgent: record.userAgent,
+  });
+  writeAccessLog(record);
+  writeSecurityLog(record);
+}
+
+export const instrumentationMiddleware = (req: Request, res: Response, next: NextFunction): void => {
+  if (isFastPath(req.url)) {
+    stats.fastPath += 1;
+    next();
+    return;
+  }
+
+  const start = performance.now();
+  res.once('finish', () => {
+    const hookStart = performance.now();
+    try {
+      recordRequest(buildRequestRecord(req, res, hookStart - start));
+    } catch (error) {
+      logger.warn('Request instrumentation failed', { error: error instanceof Error ? error.message : String(error) });
+    }
+    const hookUs = (performance.now() - hookStart) * 1000;
+    stats.hookUsTotal += hookUs;
+    if (hookUs > stats.maxHookUs) stats.maxHookUs = hookUs;
+  });
+  next();
+};
+
+export function getInstrumentationStats(): InstrumentationStats {
+  return {
+    fastPath: stats.fastPath,
+    recorded: stats.recorded,
+    logged: stats.logged,
+    sampledOut: stats.sampledOut,
+    securityEvents: stats.securityEvents,
+    avgHookUs: stats.recorded ? Math.round((stats.hookUsTotal / stats.recorded) * 10) / 10 : 0,
+    maxHookUs: Math.round(stats.maxHookUs * 10) / 10,
+  };
+}
+
+export function resetInstrumentationStats(): void {
+  stats.fastPath = 0;
+  stats.recorded = 0;
+  stats.logged = 0;
+  stats.sampledOut = 0;
+  stats.securityEvents = 0;
+  stats.hookUsTotal = 0;
+  stats.maxHookUs = 0;
+  sampling = null;
+}
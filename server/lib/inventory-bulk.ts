@@ -0,0 +1,288 @@
+/**
+ * Pure planning helpers for set-based inventory mutations.
+ *
+ * storage.bulkUpdateInventory loads every affected inventory row and cost layer
+ * once, runs the updates through planBulkInventoryUpdates in memory, and then
+ * writes the resulting plan with a handful of multi-row statements inside one
+ * transaction. The arithmetic here mirrors storage.updateInventory so bulk and
+ * single-row updates stay interchangeable.
+ */
+
+export interface BulkInventoryUpdate {
+  productId: string;
+  quantity: number;
+  costPrice?: number;
+  salePrice?: number;
+  /** Movement/revaluation source; defaults the same way updateInventory does */
+  source?: string;
+  notes?: string;
+}
+
+export type BulkInventoryUpdateResult =
+  | { productId: string; success: true; quantityBefore: number; quantity: number; variance: number }
+  | { productId: string; success: false; error: string };
+
+export interface InventoryState {
+  exists: boolean;
+  quantity: number;
+  avgCost: number;
+  totalCostValue: number;
+  minStockLevel: number;
+  lastRestocked: Date | null;
+}
+
+export interface ProductPricingState {
+  orgId: string | null;
+  cost: number | null;
+  salePrice: number | null;
+}
+
+export interface CostLayerState {
+  /** null for layers created by this batch */
+  id: string | null;
+  quantityRemaining: number;
+  originalQuantity: number;
+  unitCost: number;
+  source?: string;
+  notes?: string | null;
+}
+
+export interface PlannedMovement {
+  productId: string;
+  quantityBefore: number;
+  quantityAfter: number;
+  source: string;
+  notes: string;
+  avgCost: number;
+  totalCostValue: number;
+}
+
+export interface PlannedRevaluation {
+  productId: string;
+  source: string;
+  quantityBefore: number;
+  quantityAfter: number;
+  quantityDelta: number;
+  avgCost: number;
+  deltaValue: number;
+}
+
+export interface PlannedPriceChange {
+  productId: string;
+  orgId: string | null;
+  source?: string;
+  oldCost: number | null;
+  newCost: number | null;
+  oldSalePrice: number | null;
+  newSalePrice: number | null;
+}
+
+export interface BulkInventoryPlan {
+  results: BulkInventoryUpdateResult[];
+  /** Final state per touched product */
+  inventory: Map<string, InventoryState>;
+  movements: PlannedMovement[];
+  revaluations: PlannedRevaluation[];
+  priceChanges: PlannedPriceChange[];
+  /** Final pricing per product whose cost or sale price was set */
+  pricing: Map<string, ProductPricingState>;
+  layers: Map<string, CostLayerState[]>;
+}
+
+// Sources whose revaluation is recorded elsewhere, as in updateInventory
+const UNTRACKED_REVALUATION_SOURCES = new Set(['pos_sale', 'pos_void', 'csv_import_overwrite']);
+
+/**
+ * Weighted-average cost after moving from `quantityBefore` to `nextQuantity`.
+ */
+export function computeInventoryCostState(params: {
+  quantityBefore: number;
+  avgCostBefore: number;
+  totalCostBefore: number;
+  nextQuantity: number;
+  costOverride?: number;
+}): { avgCost: number; totalCostValue: number } {
+  const { quantityBefore, avgCostBefore, totalCostBefore, nextQuantity, costOverride } = params;
+  if (nextQuantity <= 0) {
+    return { avgCost: 0, totalCostValue: 0 };
+  }
+
+  const hasCostOverride = typeof costOverride === 'number';
+  const quantityDelta = nextQuantity - quantityBefore;
+  let nextTotalValue = totalCostBefore;
+
+  if (quantityDelta > 0) {
+    const unitCost = hasCostOverride ? (costOverride as number) : avgCostBefore;
+    nextTotalValue += unitCost * quantityDelta;
+  } else if (quantityDelta < 0) {
+    const unitsRemoved = Math.min(Math.abs(quantityDelta), quantityBefore);
+    nextTotalValue -= avgCostBefore * unitsRemoved;
+    if (nextTotalValue < 0) {
+      nextTotalValue = 0;
+    }
+  }
+
+  if (hasCostOverride && quantityDelta <= 0) {
+    nextTotalValue = (costOverride as number) * nextQuantity;
+  }
+
+  const avgCost = nextTotalValue > 0 ? nextTotalValue / nextQuantity : 0;
+  return { avgCost, totalCostValue: nextTotalValue };
+}
+
+/**
+ * Consume `quantity` units FIFO from `layers` (already ordered oldest first),
+ * mutating quantityRemaining in place. Returns the units no layer could cover.
+ */
+export function consumeLayersInPlace(layers: CostLayerState[], quantity: number): number {
+  let remaining = quantity;
+  for (const layer of layers) {
+    if (remaining <= 0) break;
+    if (layer.quantityRemaining <= 0) continue;
+    const useQty = Math.min(layer.quantityRemaining, remaining);
+    layer.quantityRemaining -= useQty;
+    remaining -= useQty;
+  }
+  return remaining;
+}
+
+/**
+ * Apply updates in order against preloaded state. Rows are independent except
+ * for repeats of the same product, which compose like sequential calls.
+ */
+export function planBulkInventoryUpdates(
+  updates: BulkInventoryUpdate[],
+  state: {
+    inventory: Map<string, InventoryState>;
+    products: Map<string, ProductPricingState>;
+    layers: Map<string, CostLayerState[]>;
+  },
+): BulkInventoryPlan {
+  const plan: BulkInventoryPlan = {
+    results: [],
+    inventory: new Map(),
+    movements: [],
+    revaluations: [],
+    priceChanges: [],
+    pricing: new Map(),
+    layers: state.layers,
+  };
+
+  for (const update of updates) {
+    const product = plan.pricing.get(update.productId) ?? state.products.get(update.productId);
+    if (!product) {
+      plan.results.push({ productId: update.productId, success: false, error: 'Product not found' });
+      continue;
+    }
+
+    const current = plan.inventory.get(update.productId) ?? state.inventory.get(update.productId) ?? {
+      exists: false,
+      quantity: 0,
+      avgCost: 0,
+      totalCostValue: 0,
+      minStockLevel: 0,
+      lastRestocked: null,
+    };
+
+    const quantityBefore = current.quantity;
+    const nextQuantity = update.quantity;
+    const quantityDelta = nextQuantity - quantityBefore;
+    const { avgCost, totalCostValue } = computeInventoryCostState({
+      quantityBefore,
+      avgCostBefore: current.avgCost,
+      totalCostBefore: current.totalCostValue,
+      nextQuantity,
+      costOverride: update.costPrice,
+    });
+
+    plan.inventory.set(update.productId, {
+      ...current,
+      exists: true,
+      quantity: nextQuantity,
+      avgCost,
+      totalCostValue,
+      lastRestocked: quantityDelta > 0 ? new Date() : current.lastRestocked,
+    });
+
+    if (quantityDelta !== 0) {
+      const source = update.source || 'inventory';
+      plan.movements.push({
+        productId: update.productId,
+        quantityBefore,
+        quantityAfter: nextQuantity,
+        source,
+        notes: update.notes
+          ?? (source === 'csv_import_overwrite' ? `Overwrite import: ${quantityBefore} → ${nextQuantity}` : 'Manual inventory update'),
+        avgCost,
+        totalCostValue,
+      });
+
+      const layers = plan.layers.get(update.productId) ?? [];
+      if (quantityDelta > 0 && typeof update.costPrice === 'number') {
+        layers.push({
+          id: null,
+          quantityRemaining: quantityDelta,
+          originalQuantity: 0,
+          unitCost: update.costPrice,
+          source,
+        });
+      } else if (quantityDelta < 0) {
+        consumeLayersInPlace(layers, -quantityDelta);
+      }
+      plan.layers.set(update.productId, layers);
+
+      const revaluationSource = update.source || 'manual_update';
+      const deltaValue = quantityDelta * avgCost;
+      if (
+        !UNTRACKED_REVALUATION_SOURCES.has(revaluationSource)
+        && !revaluationSource.startsWith('stock_removal_')
+        && deltaValue !== 0
+      ) {
+        plan.revaluations.push({
+          productId: update.productId,
+          source: revaluationSource,
+          quantityBefore,
+          quantityAfter: nextQuantity,
+          quantityDelta,
+          avgCost,
+          deltaValue,
+        });
+      }
+    }
+
+    if (typeof update.costPrice === 'number' || typeof update.salePrice === 'number') {
+      plan.priceChanges.push({
+        productId: update.productId,
+        orgId: product.orgId,
+        source: update.source,
+        oldCost: product.cost,
+        newCost: typeof update.costPrice === 'number' ? update.costPrice : null,
+        oldSalePrice: product.salePrice,
+        newSalePrice: typeof update.salePrice === 'number' ? update.salePrice : null,
+      });
+      plan.pricing.set(update.productId, {
+        orgId: product.orgId,
+        cost: typeof update.costPrice === 'number' ? update.costPrice : product.cost,
+        salePrice: typeof update.salePrice === 'number' ? update.salePrice : product.salePrice,
+      });
+    }
+
+    plan.results.push({
+      productId: update.productId,
+      success: true,
+      quantityBefore,
+      quantity: nextQuantity,
+      variance: quantityDelta,
+    });
+  }
+
+  return plan;
+}
+
+export function chunk<T>(items: readonly T[], size: number): T[][] {
+  const chunks: T[][] = [];
+  for (let i = 0; i < items.length; i += size) {
+    chunks.push(items.slice(i, i + size));
+  }
+  return chunks;
+}
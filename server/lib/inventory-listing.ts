@@ -0,0 +1,93 @@
+import { createHash } from 'node:crypto';
+import { z } from 'zod';
+
+/**
+ * Query parsing, field projection and ETag helpers for the store inventory
+ * listing (GET /api/stores/:storeId/inventory).
+ */
+
+export const INVENTORY_LISTING_MAX_PAGE_SIZE = 500;
+const DEFAULT_PAGE_SIZE = 100;
+
+export const InventoryListingQuerySchema = z.object({
+  category: z.string().trim().max(255).optional(),
+  lowStock: z
+    .union([z.string(), z.boolean()])
+    .optional()
+    .transform((value) => value === true || String(value ?? '').toLowerCase() === 'true'),
+  page: z.coerce.number().int().min(1).optional(),
+  pageSize: z.coerce.number().int().min(1).max(INVENTORY_LISTING_MAX_PAGE_SIZE).optional(),
+  // Comma-separated item fields, with product.* for nested product fields
+  fields: z.string().trim().max(1000).optional(),
+});
+
+export type InventoryListingQuery = z.infer<typeof InventoryListingQuerySchema>;
+
+export interface InventoryListingWindow {
+  page: number;
+  pageSize: number;
+  limit: number;
+  offset: number;
+}
+
+/** Pagination is opt-in: without page/pageSize the whole listing is returned. */
+export function resolveListingWindow(query: Pick<InventoryListingQuery, 'page' | 'pageSize'>): InventoryListingWindow | null {
+  if (query.page === undefined && query.pageSize === undefined) {
+    return null;
+  }
+  const page = query.page ?? 1;
+  const pageSize = query.pageSize ?? DEFAULT_PAGE_SIZE;
+  return { page, pageSize, limit: pageSize, offset: (page - 1) * pageSize };
+}
+
+export function parseFieldList(raw: string | undefined): string[] | null {
+  if (!raw) return null;
+  const fields = Array.from(new Set(raw.split(',').map((field) => field.trim()).filter(Boolean)));
+  return fields.length ? fields : null;
+}
+
+/**
+ * Keep only the requested fields of a listing item. `product` selects the whole
+ * nested product; `product.name` selects a single nested field. Unknown fields
+ * are ignored.
+ */
+export function projectFields(item: Record<string, any>, fields: string[] | null): Record<string, any> {
+  if (!fields) return item;
+  const projected: Record<string, any> = {};
+  for (const field of fields) {
+    const [head, nested] = field.split('.', 2);
+    if (!(head in item)) continue;
+    if (!nested) {
+      projected[head] = item[head];
+      continue;
+    }
+    const parent = item[head];
+    if (parent == null || typeof parent !== 'object') {
+      projected[head] ??= parent ?? null;
+      continue;
+    }
+    if (!(nested in parent)) continue;
+    const target = projected[head] && typeof projected[head] === 'object' ? projected[head] : {};
+    target[nested] = parent[nested];
+    projected[head] = target;
+  }
+  return projected;
+}
+
+/**
+ * Weak validator for one listing response: the store's listing version plus
+ * everything in the query that shapes the body.
+ */
+export function buildListingEtag(storeId: string, version: string, query: InventoryListingQuery): string {
+  const shape = [
+    storeId,
+    version,
+    query.category ?? '',
+    query.lowStock ? '1' : '0',
+    query.page ?? '',
+    query.pageSize ?? '',
+    (parseFieldList(query.fields) ?? []).join(','),
+  ].join('|');
+  const digest = createHash('sha1').update(shape).digest('base64url');
+  return `W/"inv-${digest}"`;
+}
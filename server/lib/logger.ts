@@ -1,7 +1,6 @@
 import * as Sentry from '@sentry/node';
 import { Request, Response } from 'express';
 import pino, { Logger as PinoLogger } from 'pino';
-import pinoHttp from 'pino-http';
 // Use CommonJS __filename for compatibility with Jest/ts-jest
 // import { createRequire } from 'module';
 const createRequire = typeof require !== 'undefined' ? require : undefined;
@@ -289,31 +288,6 @@ class Logger {
 
 export const logger = new Logger();
 
-// Pino HTTP middleware (optional for direct req.log usage)
-export const pinoHttpMiddleware = pinoHttp({
-  logger: (logger as any).pino,
-  redact: {
-    paths: ['req.headers.authorization', 'req.headers.cookie', 'res.headers["set-cookie"]', 'req.body.password'],
-    remove: true,
-  },
-  customProps: (req) => ({
-    requestId: (req as any).requestId,
-    userId: (req as any).session?.user?.id || (req as any).session?.userId,
-  }),
-});
-
-// Middleware for request logging
-export const requestLogger = (req: Request, res: Response, next: () => void): void => {
-  const start = Date.now();
-  
-  res.on('finish', () => {
-    const duration = Date.now() - start;
-    logger.logRequest(req, res, duration);
-  });
-
-  next();
-};
-
 // Utility function to extract context from request
 export const extractLogContext = (req: Request, additionalContext?: Partial<LogContext>): LogContext => {
   const session = req.session as any;
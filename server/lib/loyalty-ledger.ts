@@ -0,0 +1,177 @@
+import { sql, type SQL } from "drizzle-orm";
+
+import { db } from "../db";
+import { rowsOf } from "./db-rows";
+import { AppError } from "./errors";
+
+/**
+ * Loyalty ledger (migration 0043). Every balance change is an append-only
+ * loyalty_ledger row, and the holder's balance column is moved by the same
+ * statement with an atomic increment, so concurrent tills never read-modify-
+ * write a balance. A holder is a loyalty account (loyalty_accounts.points) or
+ * a POS customer (customers.current_points).
+ */
+
+export type LoyaltyHolderKind = "account" | "customer";
+export type LoyaltyEntryType = "earn" | "redeem" | "adjust" | "reversal" | "reconciliation";
+
+export interface LoyaltyEntry {
+  holderKind: LoyaltyHolderKind;
+  holderId: string;
+  orgId?: string | null;
+  /** Points added (positive) or removed (negative) */
+  delta: number;
+  entryType: LoyaltyEntryType;
+  reason?: string;
+  /** Flow that produced the entry, e.g. pos_sale, loyalty_api, offline_sync */
+  source: string;
+  referenceId?: string | null;
+  /** Entries already in the ledger under the same holder and key are skipped */
+  idempotencyKey?: string | null;
+}
+
+export interface LoyaltyPostResult {
+  /** New balance per holder id whose entries were applied */
+  balances: Map<string, number>;
+  /** Holders whose debits exceeded their balance (or that do not exist); nothing was written for them */
+  rejected: string[];
+}
+
+export class InsufficientPointsError extends AppError {
+  constructor(public readonly holderIds: string[]) {
+    super("Insufficient loyalty points", 400, "INSUFFICIENT_POINTS");
+  }
+}
+
+type Executor = { execute: (query: SQL) => Promise<unknown> };
+
+const HOLDER_TABLES: Record<LoyaltyHolderKind, { table: SQL; balance: SQL; lifetime: SQL | null }> = {
+  account: { table: sql.raw("loyalty_accounts"), balance: sql.raw("points"), lifetime: null },
+  customer: { table: sql.raw("customers"), balance: sql.raw("current_points"), lifetime: sql.raw("lifetime_points") },
+};
+
+/**
+ * One statement per holder kind: skip entries whose idempotency key is
+ * already recorded, lock the holders in id order, and for each holder whose
+ * debits are covered by its locked balance append the entries and apply their
+ * net delta. The append runs first with ON CONFLICT DO NOTHING on the
+ * idempotency index and the balance moves by what was actually appended:
+ * `fresh` reads the ledger before the lock, so a duplicate posted concurrently
+ * only shows up as a conflict once its transaction commits, and is then
+ * skipped instead of failing with a unique violation.
+ */
+export function buildLedgerPostQuery(kind: LoyaltyHolderKind, entries: readonly LoyaltyEntry[]): SQL {
+  const target = HOLDER_TABLES[kind];
+  const values = sql.join(
+    entries.map((entry, index) => sql`(
+      ${entry.holderId}::uuid, ${entry.orgId ?? null}::uuid, ${Math.trunc(entry.delta)}::int,
+      ${entry.entryType}::text, ${(entry.reason ?? entry.entryType).slice(0, 255)}::text, ${entry.source}::text,
+      ${entry.referenceId ?? null}::text, ${entry.idempotencyKey ?? null}::text, ${index}::int
+    )`),
+    sql`, `,
+  );
+  const lifetime = target.lifetime
+    ? sql`, ${target.lifetime} = h.${target.lifetime} + m.earned, updated_at = now()`
+    : sql``;
+
+  return sql`
+    WITH input (holder_id, org_id, delta, entry_type, reason, source, reference_id, idempotency_key, ord) AS (
+      VALUES ${values}
+    ),
+    fresh AS (
+      SELECT i.* FROM input i
+      WHERE i.idempotency_key IS NULL OR NOT EXISTS (
+        SELECT 1 FROM loyalty_ledger l
+        WHERE l.holder_kind = ${kind} AND l.holder_id = i.holder_id AND l.idempotency_key = i.idempotency_key
+      )
+    ),
+    totals AS (
+      SELECT holder_id, COALESCE(SUM(delta) FILTER (WHERE delta < 0), 0)::int AS debits
+      FROM fresh
+      GROUP BY holder_id
+    ),
+    locked AS MATERIALIZED (
+      SELECT h.id, h.${target.balance} AS balance FROM ${target.table} h
+      WHERE h.id IN (SELECT holder_id FROM totals)
+      ORDER BY h.id
+      FOR UPDATE
+    ),
+    covered AS (
+      SELECT k.id, k.balance FROM locked k
+      JOIN totals t ON t.holder_id = k.id
+      WHERE k.balance + t.debits >= 0
+    ),
+    logged AS (
+      INSERT INTO loyalty_ledger (holder_kind, holder_id, org_id, delta, entry_type, reason, source, reference_id, idempotency_key)
+      SELECT ${kind}, f.holder_id, f.org_id, f.delta, f.entry_type, f.reason, f.source, f.reference_id, f.idempotency_key
+      FROM fresh f
+      JOIN covered c ON c.id = f.holder_id
+      ORDER BY f.ord
+      ON CONFLICT (holder_kind, holder_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+      RETURNING holder_id, delta, entry_type
+    ),
+    moved AS (
+      SELECT holder_id,
+             SUM(delta)::int AS delta,
+             COALESCE(SUM(delta) FILTER (WHERE entry_type = 'earn' AND delta > 0), 0)::int AS earned
+      FROM logged
+      GROUP BY holder_id
+    ),
+    applied AS (
+      UPDATE ${target.table} h
+      SET ${target.balance} = h.${target.balance} + m.delta${lifetime}
+      FROM moved m
+      WHERE h.id = m.holder_id
+      RETURNING h.id AS holder_id, h.${target.balance} AS balance
+    )
+    SELECT t.holder_id, COALESCE(a.balance, c.balance) AS balance
+    FROM totals t
+    LEFT JOIN covered c ON c.id = t.holder_id
+    LEFT JOIN applied a ON a.holder_id = t.holder_id
+  `;
+}
+
+/**
+ * Post entries for any number of holders, batched into one statement per
+ * holder kind. Entries with a zero delta are dropped. Holders whose entries
+ * were all replays (idempotency key already recorded) appear in neither
+ * `balances` nor `rejected`, unless the replay raced the original post, in
+ * which case the holder's current balance is returned.
+ */
+export async function postLoyaltyEntries(
+  entries: readonly LoyaltyEntry[],
+  executor: Executor = db,
+): Promise<LoyaltyPostResult> {
+  const result: LoyaltyPostResult = { balances: new Map(), rejected: [] };
+  const byKind = new Map<LoyaltyHolderKind, LoyaltyEntry[]>();
+  for (const entry of entries) {
+    if (!Number.isFinite(entry.delta) || Math.trunc(entry.delta) === 0) continue;
+    const list = byKind.get(entry.holderKind) ?? [];
+    list.push(entry);
+    byKind.set(entry.holderKind, list);
+  }
+
+  for (const [kind, list] of byKind) {
+    const rows = rowsOf(await executor.execute(buildLedgerPostQuery(kind, list)));
+    for (const row of rows) {
+      if (row.balance === null || row.balance === undefined) {
+        result.rejected.push(String(row.holder_id));
+      } else {
+        result.balances.set(String(row.holder_id), Number(row.balance));
+      }
+    }
+  }
+  return result;
+}
+
+/** Like postLoyaltyEntries, but any rejected holder throws (rolling back the caller's transaction). */
+export async function postLoyaltyEntriesOrThrow(
+  entries: readonly LoyaltyEntry[],
+  executor: Executor = db,
+): Promise<LoyaltyPostResult> {
+  const result = await postLoyaltyEntries(entries, executor);
+  if (result.rejected.length) {
+    throw new InsufficientPointsError(result.rejected);
+  }
+  return result;
+}
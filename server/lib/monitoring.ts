@@ -98,7 +98,18 @@ class MonitoringService {
       'signup_staged_total',
       'captcha_failures_total',
       'csrf_failures_total',
-      'db_health_timeouts_total'
+      'db_health_timeouts_total',
+      // Webhook ingest queue
+      'webhook_queue_events_total',
+      'webhook_queue_dead_letters_total',
+      'webhook_queue_lag_ms',
+      'webhook_queue_depth',
+      // Email outbox
+      'email_events_total',
+      'email_send_duration_ms',
+      'email_dead_letters_total',
+      'email_queue_lag_ms',
+      'email_queue_depth'
     ];
 
     metricNames.forEach(name => {
@@ -106,11 +117,11 @@ class MonitoringService {
     });
   }
 
-  private addMetric(name: string, value: number, tags: Record<string, string> = {}): void {
+  private addMetric(name: string, value: number, tags: Record<string, string> = {}, timestamp?: string): void {
     const metricData: MetricData = {
       name,
       value,
-      timestamp: new Date().toISOString(),
+      timestamp: timestamp ?? new Date().toISOString(),
       tags
     };
 
@@ -157,18 +168,24 @@ class MonitoringService {
 
   // HTTP Request Monitoring
   recordHttpRequest(req: Request, res: Response, duration: number): void {
+    this.recordHttpSample(req.method, req.path, res.statusCode, duration);
+  }
+
+  /** Same as recordHttpRequest, from values already read off the request (see lib/instrumentation). */
+  recordHttpSample(method: string, path: string, statusCode: number, duration: number, finishedAt: number = Date.now()): void {
     const tags: Record<string, string> = {
-      method: req.method,
-      path: req.path,
-      status_code: res.statusCode.toString(),
-      status_class: Math.floor(res.statusCode / 100).toString() + 'xx'
+      method,
+      path,
+      status_code: statusCode.toString(),
+      status_class: Math.floor(statusCode / 100).toString() + 'xx'
     };
+    const timestamp = new Date(finishedAt).toISOString();
 
-    this.addMetric('http_requests_total', 1, tags);
-    this.addMetric('http_requests_duration', duration, tags);
+    this.addMetric('http_requests_total', 1, tags, timestamp);
+    this.addMetric('http_requests_duration', duration, tags, timestamp);
 
-    if (res.statusCode >= 400) {
-      this.addMetric('http_requests_errors', 1, tags);
+    if (statusCode >= 400) {
+      this.addMetric('http_requests_errors', 1, tags, timestamp);
     }
 
     // Store response time for percentile calculations
@@ -287,6 +304,93 @@ class MonitoringService {
     }
   }
 
+  // Webhook Ingest Queue Monitoring
+  recordWebhookQueueEvent(event: 'enqueued' | 'processed' | 'retried' | 'dead_lettered', provider: string): void {
+    const tags: Record<string, string> = { event, provider };
+    this.addMetric('webhook_queue_events_total', 1, tags);
+    if (event === 'dead_lettered') {
+      this.addMetric('webhook_queue_dead_letters_total', 1, tags);
+      this.alertIfSpike('webhook_queue_dead_letters_total', 'ALERT_THRESHOLD_WEBHOOK_DEAD_LETTERS_PER_MINUTE', 5, { provider });
+    }
+  }
+
+  recordWebhookQueueLag(lagMs: number, depth: number): void {
+    this.addMetric('webhook_queue_lag_ms', lagMs);
+    this.addMetric('webhook_queue_depth', depth);
+    const threshold = Number(process.env.ALERT_THRESHOLD_WEBHOOK_QUEUE_LAG_MS) || 5 * 60_000;
+    if (lagMs >= threshold) {
+      logger.warn('Webhook queue lag above threshold', { lagMs, depth, threshold });
+    }
+  }
+
+  getWebhookQueueMetrics(): { lagMs: number; depth: number; processedLastHour: number; deadLettersLastHour: number } {
+    const latest = (name: string) => {
+      const samples = this.metrics.get(name) || [];
+      return samples.length ? samples[samples.length - 1].value : 0;
+    };
+    const hourAgo = Date.now() - 60 * 60 * 1000;
+    const processedLastHour = (this.metrics.get('webhook_queue_events_total') || [])
+      .filter(m => m.tags.event === 'processed' && new Date(m.timestamp).getTime() > hourAgo).length;
+    return {
+      lagMs: latest('webhook_queue_lag_ms'),
+      depth: latest('webhook_queue_depth'),
+      processedLastHour,
+      deadLettersLastHour: this.getRecentCount('webhook_queue_dead_letters_total', 60 * 60 * 1000),
+    };
+  }
+
+  // Email Outbox Monitoring
+  recordEmailEvent(event: 'enqueued' | 'sent' | 'retried' | 'dead_lettered', category: string, durationMs?: number): void {
+    const tags: Record<string, string> = { event, category };
+    this.addMetric('email_events_total', 1, tags);
+    if (event === 'sent' && durationMs !== undefined) {
+      this.addMetric('email_send_duration_ms', durationMs, { category });
+    }
+    if (event === 'dead_lettered') {
+      this.addMetric('email_dead_letters_total', 1, tags);
+      this.alertIfSpike('email_dead_letters_total', 'ALERT_THRESHOLD_EMAIL_DEAD_LETTERS_PER_MINUTE', 5, { category });
+    }
+  }
+
+  recordEmailQueueLag(lagMs: number, depth: number): void {
+    this.addMetric('email_queue_lag_ms', lagMs);
+    this.addMetric('email_queue_depth', depth);
+    const threshold = Number(process.env.ALERT_THRESHOLD_EMAIL_QUEUE_LAG_MS) || 10 * 60_000;
+    if (lagMs >= threshold) {
+      logger.warn('Email outbox lag above threshold', { lagMs, depth, threshold });
+    }
+  }
+
+  getEmailMetrics(): {
+    sentLastMinute: number;
+    sentLastHour: number;
+    retriedLastHour: number;
+    deadLettersLastHour: number;
+    avgSendMs: number;
+    lagMs: number;
+    depth: number;
+  } {
+    const now = Date.now();
+    const events = this.metrics.get('email_events_total') || [];
+    const countSince = (event: string, windowMs: number) =>
+      events.filter(m => m.tags.event === event && new Date(m.timestamp).getTime() > now - windowMs).length;
+    const durations = (this.metrics.get('email_send_duration_ms') || [])
+      .filter(m => new Date(m.timestamp).getTime() > now - 60 * 60 * 1000);
+    const latest = (name: string) => {
+      const samples = this.metrics.get(name) || [];
+      return samples.length ? samples[samples.length - 1].value : 0;
+    };
+    return {
+      sentLastMinute: countSince('sent', 60 * 1000),
+      sentLastHour: countSince('sent', 60 * 60 * 1000),
+      retriedLastHour: countSince('retried', 60 * 60 * 1000),
+      deadLettersLastHour: this.getRecentCount('email_dead_letters_total', 60 * 60 * 1000),
+      avgSendMs: durations.length ? Math.round(durations.reduce((sum, m) => sum + m.value, 0) / durations.length) : 0,
+      lagMs: latest('email_queue_lag_ms'),
+      depth: latest('email_queue_depth'),
+    };
+  }
+
   // Security Monitoring
   recordSecurityEvent(event: 'ip_blocked' | 'unauthorized_access' | 'suspicious_activity', context?: LogContext): void {
     const tags: Record<string, string> = {
@@ -390,15 +494,3 @@ export const monitoringService = new MonitoringService();
 // Export the functions that are being imported in routes.ts
 export const getPerformanceMetrics = () => monitoringService.getPerformanceMetrics();
 export const clearPerformanceMetrics = () => monitoringService.clearMetrics();
-
-// Middleware for automatic request monitoring
-export const monitoringMiddleware = (req: Request, res: Response, next: () => void): void => {
-  const start = Date.now();
-  
-  res.on('finish', () => {
-    const duration = Date.now() - start;
-    monitoringService.recordHttpRequest(req, res, duration);
-  });
-
-  next();
-}; 
\ No newline at end of file
@@ -1,6 +1,6 @@
-import { Request, Response, NextFunction } from 'express';
+import { Request, Response } from 'express';
 
-interface PerformanceMetrics {
+export interface PerformanceMetrics {
   endpoint: string;
   method: string;
   responseTime: number;
@@ -18,7 +18,7 @@ class PerformanceMonitor {
     
     // Keep only the last maxMetrics entries
     if (this.metrics.length > this.maxMetrics) {
-      this.metrics = this.metrics.slice(-this.maxMetrics);
+      this.metrics.shift();
     }
   }
 
@@ -64,29 +64,6 @@ class PerformanceMonitor {
 
 export const performanceMonitor = new PerformanceMonitor();
 
-// Middleware to track API performance
-export const performanceMiddleware = (req: Request, res: Response, next: NextFunction): void => {
-  const startTime = Date.now();
-  const originalSend = res.send;
-
-  res.send = function(data: any): Response {
-    const responseTime = Date.now() - startTime;
-    
-    performanceMonitor.recordMetric({
-      endpoint: req.path,
-      method: req.method,
-      responseTime,
-      timestamp: new Date(),
-      statusCode: res.statusCode,
-      userAgent: req.get('User-Agent'),
-    });
-
-    return originalSend.call(this, data);
-  };
-
-  next();
-};
-
 // Database query performance tracking
 export const trackQueryPerformance = <T>(queryName: string, queryFn: () => Promise<T>): Promise<T> => {
   const startTime = Date.now();
@@ -0,0 +1,280 @@
+import { sql } from "drizzle-orm";
+import { db } from "../db";
+import { mapWithConcurrency } from "./concurrency";
+import { normalizeCustomerPhone } from "./customer-lookup";
+import { rowsOf } from "./db-rows";
+import { AppError } from "./errors";
+
+/**
+ * Single round-trip commit for POS sales.
+ *
+ * POST /api/pos/sales used to await one query per line item, inventory read,
+ * adjustment, stock movement, cost layer and loyalty update, so a 30-line
+ * basket over a 20 ms link spent most of its commit time on the network.
+ * commitPosSale sends the whole cart to the pos_commit_sale() function
+ * (migrations/0042_pos_commit_sale.sql) as one JSON payload and gets back the
+ * sale, its items and the updated stock levels. Idempotent replays, loyalty
+ * redemption and earning, stock discovery and FIFO consumption all happen
+ * inside the function.
+ */
+
+export type SaleCommitMode = "procedure" | "legacy";
+
+/**
+ * POS_SALE_COMMIT selects the path explicitly. Otherwise the procedure is
+ * used everywhere except NODE_ENV=test, whose databases are built from
+ * hand-written schemas that do not have the function.
+ */
+export function saleCommitMode(env: NodeJS.ProcessEnv = process.env): SaleCommitMode {
+  const configured = String(env.POS_SALE_COMMIT || "").trim().toLowerCase();
+  if (configured === "procedure" || configured === "legacy") {
+    return configured;
+  }
+  return env.NODE_ENV === "test" ? "legacy" : "procedure";
+}
+
+export interface SaleCommitLine {
+  productId: string;
+  quantity: number;
+  unitPrice: string;
+  lineDiscount?: string | null;
+  lineTotal: string;
+  promotionId?: string | null;
+  originalUnitPrice?: string | null;
+  isFreeItem?: boolean | null;
+}
+
+export interface SaleCommitInput {
+  idempotencyKey: string;
+  storeId: string;
+  cashierId: string;
+  /** Only set when there is no session user to resolve the org from (tests). */
+  orgId?: string | null;
+  subtotal: number;
+  discount: number;
+  tax: number;
+  paymentMethod: string;
+  /** The sale's payment method mapped onto the transactions enum. */
+  transactionPaymentMethod: "cash" | "card" | "digital";
+  walletReference?: string | null;
+  paymentBreakdown?: Array<{ method: string; amount: string; reference?: string }> | null;
+  customerPhone?: string | null;
+  redeemPoints?: number;
+  items: SaleCommitLine[];
+}
+
+export interface SaleCommitStockLevel {
+  productId: string;
+  quantity: number;
+  minStockLevel: number | null;
+  avgCost: string;
+}
+
+export interface SaleCommitResult {
+  replayed: boolean;
+  sale: Record<string, any> & { id: string };
+  items: Array<Record<string, any>>;
+  stock: SaleCommitStockLevel[];
+  customer: { id: string; points: number; pointsEarned: number } | null;
+}
+
+const COMMIT_ERRORS: Record<string, { status: number; message: string }> = {
+  idempotency_key_required: { status: 400, message: "Idempotency-Key required" },
+  missing_org: { status: 400, message: "Missing org" },
+  insufficient_points: { status: 400, message: "Insufficient loyalty points" },
+  split_total_mismatch: { status: 400, message: "paymentBreakdown totals must equal sale total" },
+};
+
+export class SaleCommitError extends AppError {
+  constructor(code: string) {
+    const known = COMMIT_ERRORS[code];
+    super(known?.message ?? `Sale rejected: ${code}`, known?.status ?? 400, code);
+  }
+}
+
+/** Map a `pos_commit_sale:<code>` exception from the function to a SaleCommitError. */
+export function toSaleCommitError(error: unknown): SaleCommitError | null {
+  const message = error instanceof Error ? error.message : String(error ?? "");
+  const match = /pos_commit_sale:([a-z_]+)/.exec(message);
+  return match ? new SaleCommitError(match[1]) : null;
+}
+
+/**
+ * Build the JSON payload for pos_commit_sale. Line product ids lose their
+ * client-side suffixes (e.g. `_free`), as in the per-query path.
+ */
+export function buildSaleCommitPayload(input: SaleCommitInput): Record<string, unknown> {
+  const breakdown = input.paymentBreakdown ?? [];
+  return {
+    idempotency_key: input.idempotencyKey,
+    store_id: input.storeId,
+    cashier_id: input.cashierId,
+    org_id: input.orgId ?? null,
+    subtotal: input.subtotal,
+    discount: input.discount,
+    tax: input.tax,
+    payment_method: input.paymentMethod,
+    transaction_payment_method: input.transactionPaymentMethod,
+    wallet_reference: input.walletReference || null,
+    payment_breakdown: breakdown.length ? breakdown : null,
+    customer_phone: input.customerPhone?.trim() || null,
+    customer_phone_e164: normalizeCustomerPhone(input.customerPhone),
+    redeem_points: Math.max(0, Math.trunc(Number(input.redeemPoints || 0))),
+    items: input.items.map((item) => ({
+      product_id: item.productId.replace(/_free$/, ""),
+      quantity: item.quantity,
+      unit_price: item.unitPrice,
+      line_discount: item.lineDiscount ?? "0",
+      line_total: item.lineTotal,
+      promotion_id: item.promotionId || null,
+      original_unit_price: item.originalUnitPrice || null,
+      is_free_item: Boolean(item.isFreeItem),
+    })),
+  };
+}
+
+export function parseSaleCommitResult(result: unknown): SaleCommitResult {
+  const raw = rowsOf(result)[0]?.result;
+  const body = typeof raw === "string" ? JSON.parse(raw) : raw;
+  if (!body?.sale?.id) {
+    throw new Error("pos_commit_sale returned no sale");
+  }
+  const sale = { ...body.sale, occurredAt: body.sale.occurredAt ? new Date(body.sale.occurredAt) : null };
+  return {
+    replayed: Boolean(body.replayed),
+    sale,
+    items: Array.isArray(body.items) ? body.items : [],
+    stock: (Array.isArray(body.stock) ? body.stock : []).map((row: any) => ({
+      productId: String(row.productId),
+      quantity: Number(row.quantity ?? 0),
+      minStockLevel: row.minStockLevel == null ? null : Number(row.minStockLevel),
+      avgCost: String(row.avgCost ?? "0"),
+    })),
+    customer: body.customer
+      ? {
+          id: String(body.customer.id),
+          points: Number(body.customer.points ?? 0),
+          pointsEarned: Number(body.customer.pointsEarned ?? 0),
+        }
+      : null,
+  };
+}
+
+/**
+ * Stock levels at or below their minimum after the sale. Sales only lower
+ * stock, so these are the only products whose low-stock alert can change.
+ */
+export function lowStockLevels(stock: readonly SaleCommitStockLevel[]): SaleCommitStockLevel[] {
+  return stock.filter((row) => (row.minStockLevel ?? 0) > 0 && row.quantity <= (row.minStockLevel ?? 0));
+}
+
+export async function commitPosSale(
+  input: SaleCommitInput,
+  executor: { execute: (query: any) => Promise<unknown> } = db,
+): Promise<SaleCommitResult> {
+  const payload = buildSaleCommitPayload(input);
+  try {
+    const result = await executor.execute(sql`SELECT pos_commit_sale(${JSON.stringify(payload)}::jsonb) AS result`);
+    return parseSaleCommitResult(result);
+  } catch (error) {
+    throw toSaleCommitError(error) ?? error;
+  }
+}
+
+/**
+ * Bulk replay for POST /api/pos/sales/batch. A till that was offline for an
+ * afternoon used to replay its queue one request per sale; the service worker
+ * now sends chunks of up to SALE_BATCH_MAX sales and gets a result per
+ * idempotency key back.
+ */
+
+export const SALE_BATCH_MAX = 50;
+
+/** POS_SALE_BATCH_CONCURRENCY: stores from one batch whose sales are committed at the same time (default 4). */
+export function saleBatchConcurrency(env: NodeJS.ProcessEnv = process.env): number {
+  const parsed = Number.parseInt(String(env.POS_SALE_BATCH_CONCURRENCY ?? ""), 10);
+  return Number.isFinite(parsed) && parsed > 0 ? Math.min(parsed, SALE_BATCH_MAX) : 4;
+}
+
+export interface SaleBatchEntry {
+  idempotencyKey: string;
+  payload: unknown;
+}
+
+/** What POST /api/pos/sales would have answered for one sale. */
+export interface SaleReplayOutcome {
+  status: number;
+  body: Record<string, unknown>;
+  replayed?: boolean;
+}
+
+export type SaleBatchItemStatus = "created" | "duplicate" | "failed";
+
+export interface SaleBatchItemResult {
+  idempotencyKey: string;
+  status: SaleBatchItemStatus;
+  httpStatus: number;
+  sale?: Record<string, unknown>;
+  error?: string;
+}
+
+function toBatchItemResult(idempotencyKey: string, outcome: SaleReplayOutcome): SaleBatchItemResult {
+  if (outcome.status >= 200 && outcome.status < 300) {
+    return { idempotencyKey, status: outcome.replayed ? "duplicate" : "created", httpStatus: outcome.status, sale: outcome.body };
+  }
+  // Same rule as the single-sale replay: 409 means the sale is already recorded
+  if (outcome.status === 409) {
+    return { idempotencyKey, status: "duplicate", httpStatus: 409 };
+  }
+  return {
+    idempotencyKey,
+    status: "failed",
+    httpStatus: outcome.status,
+    error: String(outcome.body?.error ?? `HTTP ${outcome.status}`),
+  };
+}
+
+/** The store a queued sale belongs to; its sales are committed in queue order. */
+export function saleBatchStore(entry: SaleBatchEntry): string {
+  const storeId = (entry.payload as { storeId?: unknown } | null)?.storeId;
+  return typeof storeId === "string" ? storeId : "";
+}
+
+/**
+ * Commit every sale in a batch on its own, so one rejected sale never holds
+ * back or rolls back the others. A store's sales are committed one after
+ * another in the order the till queued them (a sale may redeem points an
+ * earlier one earned, or sell stock an earlier one received); up to
+ * `concurrency` stores run at the same time. A key repeated within the batch
+ * is committed once and reported for each occurrence. Results keep the order
+ * of `entries`.
+ */
+export async function replaySaleBatch(
+  entries: readonly SaleBatchEntry[],
+  commit: (entry: SaleBatchEntry) => Promise<SaleReplayOutcome>,
+  concurrency = saleBatchConcurrency(),
+): Promise<SaleBatchItemResult[]> {
+  const byStore = new Map<string, SaleBatchEntry[]>();
+  const seen = new Set<string>();
+  for (const entry of entries) {
+    if (seen.has(entry.idempotencyKey)) continue;
+    seen.add(entry.idempotencyKey);
+    const store = saleBatchStore(entry);
+    const queue = byStore.get(store) ?? [];
+    queue.push(entry);
+    byStore.set(store, queue);
+  }
+
+  const byKey = new Map<string, SaleBatchItemResult>();
+  await mapWithConcurrency(Array.from(byStore.values()), concurrency, async (queue) => {
+    for (const entry of queue) {
+      const key = entry.idempotencyKey;
+      try {
+        byKey.set(key, toBatchItemResult(key, await commit(entry)));
+      } catch {
+        byKey.set(key, { idempotencyKey: key, status: "failed", httpStatus: 500, error: "Failed to record sale" });
+      }
+    }
+  });
+  return entries.map((entry) => byKey.get(entry.idempotencyKey)!);
+}
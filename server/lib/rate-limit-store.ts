@@ -0,0 +1,266 @@
+import type { ClientRateLimitInfo, Options, Store } from 'express-rate-limit';
+
+import { logger } from './logger';
+import { getRedisClient } from './redis';
+
+/**
+ * Sliding-window stores for express-rate-limit.
+ *
+ * Each key keeps a counter for the current fixed window and the previous one;
+ * the hit count is `current + previous * (share of the previous window still
+ * inside the sliding window)`. That avoids the burst-at-boundary of fixed
+ * windows at the cost of two integers per key.
+ *
+ * With REDIS_URL set, counters live in Redis so every instance enforces the
+ * same limit. An increment is one EVALSHA round trip (INCR + PEXPIRE + GET of
+ * the previous window). While Redis is not connected or a command fails, the
+ * store answers from its in-memory fallback rather than adding latency to the
+ * request.
+ */
+
+const KEY_PREFIX = 'chainsync:rl';
+
+type Clock = () => number;
+
+function windowState(now: number, windowMs: number) {
+  const index = Math.floor(now / windowMs);
+  const elapsed = (now - index * windowMs) / windowMs;
+  return { index, previousWeight: 1 - elapsed, resetTime: new Date((index + 1) * windowMs) };
+}
+
+export function slidingWindowHits(current: number, previous: number, previousWeight: number): number {
+  return current + Math.floor(previous * previousWeight);
+}
+
+interface MemoryEntry {
+  index: number;
+  current: number;
+  previous: number;
+}
+
+/**
+ * Process-local sliding window. Entries older than two windows are swept, and
+ * the key count is capped so a scan across many IPs cannot grow it unbounded.
+ */
+export class SlidingWindowMemoryStore implements Store {
+  windowMs = 60_000;
+  localKeys = true;
+  private entries = new Map<string, MemoryEntry>();
+  private sweepTimer: NodeJS.Timeout | null = null;
+
+  constructor(
+    private readonly maxKeys = Number(process.env.RATE_LIMIT_MEMORY_MAX_KEYS || 100_000),
+    private readonly now: Clock = Date.now,
+  ) {}
+
+  init(options: Options): void {
+    this.windowMs = options.windowMs;
+    if (!this.sweepTimer) {
+      this.sweepTimer = setInterval(() => this.sweep(), Math.max(1_000, this.windowMs));
+      this.sweepTimer.unref?.();
+    }
+  }
+
+  private entry(key: string, index: number): MemoryEntry {
+    let entry = this.entries.get(key);
+    if (!entry) {
+      if (this.entries.size >= this.maxKeys) {
+        // Map iteration order is insertion order; drop the oldest key
+        const oldest = this.entries.keys().next().value;
+        if (oldest !== undefined) this.entries.delete(oldest);
+      }
+      entry = { index, current: 0, previous: 0 };
+      this.entries.set(key, entry);
+      return entry;
+    }
+    if (entry.index !== index) {
+      entry.previous = entry.index === index - 1 ? entry.current : 0;
+      entry.current = 0;
+      entry.index = index;
+    }
+    return entry;
+  }
+
+  async get(key: string): Promise<ClientRateLimitInfo | undefined> {
+    if (!this.entries.has(key)) return undefined;
+    const { index, previousWeight, resetTime } = windowState(this.now(), this.windowMs);
+    const entry = this.entry(key, index);
+    return { totalHits: slidingWindowHits(entry.current, entry.previous, previousWeight), resetTime };
+  }
+
+  async increment(key: string): Promise<ClientRateLimitInfo> {
+    const { index, previousWeight, resetTime } = windowState(this.now(), this.windowMs);
+    const entry = this.entry(key, index);
+    entry.current += 1;
+    return { totalHits: slidingWindowHits(entry.current, entry.previous, previousWeight), resetTime };
+  }
+
+  async decrement(key: string): Promise<void> {
+    const entry = this.entries.get(key);
+    if (entry && entry.current > 0) entry.current -= 1;
+  }
+
+  async resetKey(key: string): Promise<void> {
+    this.entries.delete(key);
+  }
+
+  async resetAll(): Promise<void> {
+    this.entries.clear();
+  }
+
+  async shutdown(): Promise<void> {
+    if (this.sweepTimer) clearInterval(this.sweepTimer);
+    this.sweepTimer = null;
+  }
+
+  get size(): number {
+    return this.entries.size;
+  }
+
+  sweep(): void {
+    const index = Math.floor(this.now() / this.windowMs);
+    for (const [key, entry] of this.entries) {
+      if (entry.index < index - 1) this.entries.delete(key);
+    }
+  }
+}
+
+// KEYS[1] current window, KEYS[2] previous window, ARGV[1] expiry (ms)
+const INCREMENT_SCRIPT = `
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+return {current, previous}
+`;
+
+const DECREMENT_SCRIPT = `
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current > 0 then redis.call('DECR', KEYS[1]) end
+return 0
+`;
+
+const scriptShas = new Map<string, string>();
+
+export class RedisSlidingWindowStore implements Store {
+  windowMs = 60_000;
+  prefix: string;
+  private lastWarnAt = 0;
+
+  constructor(
+    name: string,
+    private readonly fallback: SlidingWindowMemoryStore = new SlidingWindowMemoryStore(),
+    private readonly now: Clock = Date.now,
+  ) {
+    this.prefix = `${KEY_PREFIX}:${name}:`;
+  }
+
+  init(options: Options): void {
+    this.windowMs = options.windowMs;
+    this.fallback.init(options);
+  }
+
+  private keys(key: string, index: number): [string, string] {
+    // Hash tag keeps both windows of a key in one cluster slot
+    const base = `${this.prefix}{${key}}`;
+    return [`${base}:${index}`, `${base}:${index - 1}`];
+  }
+
+  private readyClient() {
+    const client = getRedisClient();
+    // node-redis queues commands while disconnected; answer locally instead of waiting
+    return client && client.isReady ? client : null;
+  }
+
+  private warn(operation: string, error: unknown) {
+    const now = Date.now();
+    if (now - this.lastWarnAt < 60_000) return;
+    this.lastWarnAt = now;
+    logger.warn('Rate limit store falling back to memory', {
+      operation,
+      prefix: this.prefix,
+      error: error instanceof Error ? error.message : String(error),
+    });
+  }
+
+  private async runScript(client: NonNullable<ReturnType<typeof getRedisClient>>, script: string, keys: string[], args: string[]) {
+    let sha = scriptShas.get(script);
+    if (!sha) {
+      sha = await client.scriptLoad(script);
+      scriptShas.set(script, sha);
+    }
+    try {
+      return await client.evalSha(sha, { keys, arguments: args });
+    } catch (error) {
+      if (!String((error as Error)?.message ?? '').includes('NOSCRIPT')) throw error;
+      // Script cache was flushed (restart/failover)
+      scriptShas.delete(script);
+      return client.eval(script, { keys, arguments: args });
+    }
+  }
+
+  async get(key: string): Promise<ClientRateLimitInfo | undefined> {
+    const client = this.readyClient();
+    if (!client) return this.fallback.get(key);
+    const { index, previousWeight, resetTime } = windowState(this.now(), this.windowMs);
+    try {
+      const [currentRaw, previousRaw] = await client.mGet(this.keys(key, index));
+      if (currentRaw == null && previousRaw == null) return undefined;
+      return { totalHits: slidingWindowHits(Number(currentRaw ?? 0), Number(previousRaw ?? 0), previousWeight), resetTime };
+    } catch (error) {
+      this.warn('get', error);
+      return this.fallback.get(key);
+    }
+  }
+
+  async increment(key: string): Promise<ClientRateLimitInfo> {
+    const client = this.readyClient();
+    if (!client) return this.fallback.increment(key);
+    const { index, previousWeight, resetTime } = windowState(this.now(), this.windowMs);
+    try {
+      const reply = (await this.runScript(client, INCREMENT_SCRIPT, this.keys(key, index), [String(this.windowMs * 2)])) as unknown as [number, number];
+      return { totalHits: slidingWindowHits(Number(reply[0]), Number(reply[1]), previousWeight), resetTime };
+    } catch (error) {
+      this.warn('increment', error);
+      return this.fallback.increment(key);
+    }
+  }
+
+  async decrement(key: string): Promise<void> {
+    const client = this.readyClient();
+    if (!client) return this.fallback.decrement(key);
+    const { index } = windowState(this.now(), this.windowMs);
+    try {
+      await this.runScript(client, DECREMENT_SCRIPT, [this.keys(key, index)[0]], []);
+    } catch (error) {
+      this.warn('decrement', error);
+      await this.fallback.decrement(key);
+    }
+  }
+
+  async resetKey(key: string): Promise<void> {
+    await this.fallback.resetKey(key);
+    const client = this.readyClient();
+    if (!client) return;
+    const { index } = windowState(this.now(), this.windowMs);
+    try {
+      await client.del(this.keys(key, index));
+    } catch (error) {
+      this.warn('resetKey', error);
+    }
+  }
+
+  async shutdown(): Promise<void> {
+    await this.fallback.shutdown();
+  }
+}
+
+/**
+ * Store for one rate limiter. express-rate-limit requires a separate store per
+ * limiter, so `name` namespaces the keys.
+ */
+export function createRateLimitStore(name: string): Store {
+  if (process.env.REDIS_URL && process.env.LOCAL_DISABLE_REDIS !== 'true') {
+    return new RedisSlidingWindowStore(name);
+  }
+  return new SlidingWindowMemoryStore();
+}
@@ -0,0 +1,518 @@
+import type { RedisClientType } from "redis";
+import { getRedisClient, queueTodayRollups } from "./redis";
+
+/**
+ * Real-time sales metrics kept in Redis for the live dashboard.
+ *
+ * Every committed sale adds to hourly and daily buckets for its store and its
+ * org: totals (revenue, transactions, discount, tax, units), per-product units
+ * and revenue, per-cashier revenue and transaction counts, and a basket-size
+ * histogram. Keys carry a `{store:<id>}` / `{org:<id>}` hash tag so a scope's
+ * keys share a cluster slot while different stores spread across shards, and
+ * every key expires on its own (hourly buckets after two days, daily ones
+ * after eight), so nothing needs to be swept.
+ *
+ * Reads for any number of stores go out as one pipeline. The rolling windows
+ * (last 24 hours, last 7 days) are sums over the buckets. The database stays
+ * the source of truth: reconcileMetricsDay (jobs/realtime-metrics.ts) applies
+ * the difference between Postgres and Redis for hours that have closed as
+ * increments, which rebuilds buckets lost with a Redis restart without
+ * touching the hour still being recorded.
+ */
+
+const KEY_PREFIX = "chainsync:rt";
+const HOUR_MS = 60 * 60 * 1000;
+const DAY_MS = 24 * HOUR_MS;
+const HOURLY_TTL_SECONDS = 48 * 60 * 60;
+const DAILY_TTL_SECONDS = 8 * 24 * 60 * 60;
+export const HOURLY_WINDOW = 24;
+export const DAILY_WINDOW = 7;
+
+/** Upper bounds (in units) of the basket-size histogram buckets; larger baskets go to "+Inf". */
+export const BASKET_BUCKETS = [1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 100] as const;
+
+const TOTAL_FIELDS = ["revenue", "transactions", "discount", "tax", "units"] as const;
+
+export type MetricsScope = "store" | "org";
+type RedisMulti = ReturnType<RedisClientType["multi"]>;
+
+export interface MetricTotals {
+  revenue: number;
+  transactions: number;
+  discount: number;
+  tax: number;
+  units: number;
+}
+
+export interface SaleMetricsInput {
+  orgId?: string | null;
+  storeId: string;
+  cashierId?: string | null;
+  revenue: number;
+  discount?: number;
+  tax?: number;
+  items: Array<{ productId: string; quantity: number; revenue?: number }>;
+  occurredAt?: Date;
+}
+
+export interface RankedEntry {
+  id: string;
+  value: number;
+}
+
+export interface CashierMetrics {
+  cashierId: string;
+  revenue: number;
+  transactions: number;
+}
+
+export interface BasketSummary {
+  histogram: Record<string, number>;
+  count: number;
+  p50: number | null;
+  p90: number | null;
+  p99: number | null;
+}
+
+export interface LiveMetrics {
+  scope: MetricsScope;
+  id: string;
+  today: MetricTotals;
+  last24h: MetricTotals;
+  last7d: MetricTotals;
+  hourly: Array<MetricTotals & { hour: string }>;
+  daily: Array<MetricTotals & { day: string }>;
+  topProductsByRevenue: RankedEntry[];
+  topProductsByUnits: RankedEntry[];
+  cashiers: CashierMetrics[];
+  basketToday: BasketSummary;
+  basket7d: BasketSummary;
+}
+
+function pad(value: number): string {
+  return String(value).padStart(2, "0");
+}
+
+/** UTC day bucket, e.g. 2026-10-18 */
+export function metricsDayKey(date: Date): string {
+  return `${date.getUTCFullYear()}-${pad(date.getUTCMonth() + 1)}-${pad(date.getUTCDate())}`;
+}
+
+/** UTC hour bucket, e.g. 2026-10-18T09 */
+export function metricsHourKey(date: Date): string {
+  return `${metricsDayKey(date)}T${pad(date.getUTCHours())}`;
+}
+
+function scopeKey(scope: MetricsScope, id: string): string {
+  return `${KEY_PREFIX}:{${scope}:${id}}`;
+}
+
+export function metricsKeys(scope: MetricsScope, id: string, date: Date) {
+  const base = scopeKey(scope, id);
+  const day = metricsDayKey(date);
+  return {
+    hour: `${base}:h:${metricsHourKey(date)}`,
+    day: `${base}:d:${day}`,
+    productUnits: `${base}:d:${day}:pu`,
+    productRevenue: `${base}:d:${day}:pr`,
+    cashiers: `${base}:d:${day}:cs`,
+    basket: `${base}:d:${day}:bk`,
+  };
+}
+
+export function basketBucket(units: number): string {
+  for (const bound of BASKET_BUCKETS) {
+    if (units <= bound) return String(bound);
+  }
+  return "+Inf";
+}
+
+/**
+ * Percentile of a bucketed histogram, reported as the upper bound of the
+ * bucket that contains it ("+Inf" buckets report the largest finite bound).
+ */
+export function histogramPercentile(histogram: Record<string, number>, percentile: number): number | null {
+  const total = Object.values(histogram).reduce((sum, count) => sum + Math.max(0, count), 0);
+  if (total <= 0) return null;
+  const rank = Math.ceil((percentile / 100) * total);
+  let seen = 0;
+  for (const bound of [...BASKET_BUCKETS.map(String), "+Inf"]) {
+    seen += Math.max(0, histogram[bound] ?? 0);
+    if (seen >= rank) {
+      return bound === "+Inf" ? BASKET_BUCKETS[BASKET_BUCKETS.length - 1] : Number(bound);
+    }
+  }
+  return BASKET_BUCKETS[BASKET_BUCKETS.length - 1];
+}
+
+function summarizeBasket(histogram: Record<string, number>): BasketSummary {
+  return {
+    histogram,
+    count: Object.values(histogram).reduce((sum, count) => sum + count, 0),
+    p50: histogramPercentile(histogram, 50),
+    p90: histogramPercentile(histogram, 90),
+    p99: histogramPercentile(histogram, 99),
+  };
+}
+
+export function emptyTotals(): MetricTotals {
+  return { revenue: 0, transactions: 0, discount: 0, tax: 0, units: 0 };
+}
+
+function addTotals(target: MetricTotals, source: MetricTotals): MetricTotals {
+  for (const field of TOTAL_FIELDS) target[field] += source[field];
+  return target;
+}
+
+function roundMoney(value: number): number {
+  return Math.round(value * 100) / 100;
+}
+
+function parseTotals(raw: unknown): MetricTotals {
+  const hash = (raw && typeof raw === "object" ? raw : {}) as Record<string, string>;
+  return {
+    revenue: Number(hash.revenue ?? 0) || 0,
+    transactions: Number(hash.transactions ?? 0) || 0,
+    discount: Number(hash.discount ?? 0) || 0,
+    tax: Number(hash.tax ?? 0) || 0,
+    units: Number(hash.units ?? 0) || 0,
+  };
+}
+
+function parseCounts(raw: unknown): Record<string, number> {
+  const hash = (raw && typeof raw === "object" ? raw : {}) as Record<string, string>;
+  const counts: Record<string, number> = {};
+  for (const [field, value] of Object.entries(hash)) {
+    const count = Number(value);
+    if (Number.isFinite(count) && count !== 0) counts[field] = count;
+  }
+  return counts;
+}
+
+// zRangeWithScores replies are [{ value, score }]; untransformed pipelines return a flat list
+function parseRanked(raw: unknown): RankedEntry[] {
+  if (!Array.isArray(raw)) return [];
+  if (raw.length && typeof raw[0] === "object" && raw[0] !== null) {
+    return (raw as Array<{ value: string; score: number }>).map((entry) => ({ id: String(entry.value), value: Number(entry.score) }));
+  }
+  const entries: RankedEntry[] = [];
+  for (let i = 0; i + 1 < raw.length; i += 2) {
+    entries.push({ id: String(raw[i]), value: Number(raw[i + 1]) });
+  }
+  return entries;
+}
+
+function parseCashiers(raw: unknown): CashierMetrics[] {
+  const byCashier = new Map<string, CashierMetrics>();
+  for (const [field, value] of Object.entries(parseCounts(raw))) {
+    const separator = field.lastIndexOf("|");
+    if (separator <= 0) continue;
+    const cashierId = field.slice(0, separator);
+    const metric = field.slice(separator + 1);
+    const entry = byCashier.get(cashierId) ?? { cashierId, revenue: 0, transactions: 0 };
+    if (metric === "revenue") entry.revenue = roundMoney(value);
+    if (metric === "transactions") entry.transactions = value;
+    byCashier.set(cashierId, entry);
+  }
+  return Array.from(byCashier.values()).sort((a, b) => b.revenue - a.revenue);
+}
+
+/** Line revenue defaults to a share of the sale total proportional to units. */
+function lineRevenue(input: SaleMetricsInput, units: number) {
+  return input.items.map((item) => ({
+    productId: item.productId.replace(/_free$/, ""),
+    quantity: Math.max(0, Math.trunc(Number(item.quantity) || 0)),
+    revenue: Number.isFinite(item.revenue) ? Number(item.revenue) : units > 0 ? (input.revenue * (Number(item.quantity) || 0)) / units : 0,
+  }));
+}
+
+function queueScopeIncrements(
+  pipeline: RedisMulti,
+  scope: MetricsScope,
+  id: string,
+  input: SaleMetricsInput,
+  date: Date,
+): void {
+  const keys = metricsKeys(scope, id, date);
+  const units = input.items.reduce((sum, item) => sum + Math.max(0, Math.trunc(Number(item.quantity) || 0)), 0);
+
+  for (const key of [keys.hour, keys.day]) {
+    pipeline.hIncrByFloat(key, "revenue", input.revenue);
+    pipeline.hIncrBy(key, "transactions", 1);
+    if (input.discount) pipeline.hIncrByFloat(key, "discount", input.discount);
+    if (input.tax) pipeline.hIncrByFloat(key, "tax", input.tax);
+    if (units) pipeline.hIncrBy(key, "units", units);
+  }
+  pipeline.expire(keys.hour, HOURLY_TTL_SECONDS);
+  pipeline.expire(keys.day, DAILY_TTL_SECONDS);
+
+  for (const line of lineRevenue(input, units)) {
+    if (!line.productId || line.quantity <= 0) continue;
+    pipeline.zIncrBy(keys.productUnits, line.quantity, line.productId);
+    if (line.revenue) pipeline.zIncrBy(keys.productRevenue, line.revenue, line.productId);
+  }
+  pipeline.expire(keys.productUnits, DAILY_TTL_SECONDS);
+  pipeline.expire(keys.productRevenue, DAILY_TTL_SECONDS);
+
+  if (input.cashierId) {
+    pipeline.hIncrByFloat(keys.cashiers, `${input.cashierId}|revenue`, input.revenue);
+    pipeline.hIncrBy(keys.cashiers, `${input.cashierId}|transactions`, 1);
+    pipeline.expire(keys.cashiers, DAILY_TTL_SECONDS);
+  }
+
+  pipeline.hIncrBy(keys.basket, basketBucket(units), 1);
+  pipeline.expire(keys.basket, DAILY_TTL_SECONDS);
+}
+
+/**
+ * Record one committed sale for its store and org in a single MULTI,
+ * together with the legacy per-day rollups read by getTodayRollupFor*.
+ */
+export async function recordSaleMetrics(
+  input: SaleMetricsInput,
+  client: RedisClientType | null = getRedisClient(),
+): Promise<void> {
+  if (!client) return;
+  const date = input.occurredAt ?? new Date();
+  const pipeline = client.multi();
+  queueScopeIncrements(pipeline, "store", input.storeId, input, date);
+  if (input.orgId) {
+    queueScopeIncrements(pipeline, "org", input.orgId, input, date);
+    queueTodayRollups(
+      pipeline,
+      input.orgId,
+      input.storeId,
+      { revenue: input.revenue, transactions: 1, discount: input.discount, tax: input.tax },
+      date,
+    );
+  }
+  await pipeline.exec();
+}
+
+/** Queue the reads for one scope and return the decoder for its slice of the replies. */
+function queueScopeReads(pipeline: RedisMulti, scope: MetricsScope, id: string, now: Date, topN: number) {
+  const hours: Date[] = [];
+  for (let i = HOURLY_WINDOW - 1; i >= 0; i -= 1) hours.push(new Date(now.getTime() - i * HOUR_MS));
+  const days: Date[] = [];
+  for (let i = DAILY_WINDOW - 1; i >= 0; i -= 1) days.push(new Date(now.getTime() - i * DAY_MS));
+  const todayKeys = metricsKeys(scope, id, now);
+
+  for (const hour of hours) pipeline.hGetAll(metricsKeys(scope, id, hour).hour);
+  for (const day of days) pipeline.hGetAll(metricsKeys(scope, id, day).day);
+  for (const day of days) pipeline.hGetAll(metricsKeys(scope, id, day).basket);
+  pipeline.zRangeWithScores(todayKeys.productRevenue, 0, topN - 1, { REV: true });
+  pipeline.zRangeWithScores(todayKeys.productUnits, 0, topN - 1, { REV: true });
+  pipeline.hGetAll(todayKeys.cashiers);
+  const commandCount = hours.length + days.length * 2 + 3;
+
+  const decode = (replies: unknown[]): LiveMetrics => {
+    let cursor = 0;
+    const hourly = hours.map((hour) => ({ hour: `${metricsHourKey(hour)}:00Z`, ...parseTotals(replies[cursor++]) }));
+    const daily = days.map((day) => ({ day: metricsDayKey(day), ...parseTotals(replies[cursor++]) }));
+    const baskets = days.map(() => parseCounts(replies[cursor++]));
+    const topProductsByRevenue = parseRanked(replies[cursor++]).map((entry) => ({ ...entry, value: roundMoney(entry.value) }));
+    const topProductsByUnits = parseRanked(replies[cursor++]);
+    const cashiers = parseCashiers(replies[cursor++]);
+
+    const basket7d: Record<string, number> = {};
+    for (const histogram of baskets) {
+      for (const [bucket, count] of Object.entries(histogram)) basket7d[bucket] = (basket7d[bucket] ?? 0) + count;
+    }
+    const finish = (totals: MetricTotals) => ({ ...totals, revenue: roundMoney(totals.revenue), discount: roundMoney(totals.discount), tax: roundMoney(totals.tax) });
+
+    return {
+      scope,
+      id,
+      today: finish(daily[daily.length - 1]),
+      last24h: finish(hourly.reduce((sum, point) => addTotals(sum, point), emptyTotals())),
+      last7d: finish(daily.reduce((sum, point) => addTotals(sum, point), emptyTotals())),
+      hourly,
+      daily,
+      topProductsByRevenue,
+      topProductsByUnits,
+      cashiers,
+      basketToday: summarizeBasket(baskets[baskets.length - 1]),
+      basket7d: summarizeBasket(basket7d),
+    };
+  };
+
+  return { commandCount, decode };
+}
+
+/**
+ * Live metrics for an org and any number of its stores, fetched in one
+ * pipelined round trip. Returns null when Redis is not configured.
+ */
+export async function readLiveMetrics(
+  options: { orgId?: string | null; storeIds: readonly string[]; now?: Date; topN?: number },
+  client: RedisClientType | null = getRedisClient(),
+): Promise<{ org: LiveMetrics | null; stores: LiveMetrics[] } | null> {
+  if (!client) return null;
+  const now = options.now ?? new Date();
+  const topN = Math.max(1, options.topN ?? 10);
+  const pipeline = client.multi();
+  const readers: Array<ReturnType<typeof queueScopeReads>> = [];
+  if (options.orgId) readers.push(queueScopeReads(pipeline, "org", options.orgId, now, topN));
+  for (const storeId of options.storeIds) readers.push(queueScopeReads(pipeline, "store", storeId, now, topN));
+
+  const replies = (await pipeline.execAsPipeline()) as unknown[];
+  const results: LiveMetrics[] = [];
+  let offset = 0;
+  for (const reader of readers) {
+    results.push(reader.decode(replies.slice(offset, offset + reader.commandCount)));
+    offset += reader.commandCount;
+  }
+  return {
+    org: options.orgId ? results.shift() ?? null : null,
+    stores: results,
+  };
+}
+
+/** Database view of one store-day, as loaded by the reconciliation job. */
+export interface MetricsDaySnapshot {
+  /** Sales created before this instant are included; the hours from here on are still open */
+  through: Date;
+  hourly: Map<string, MetricTotals>;
+  productUnits: Map<string, number>;
+  productRevenue: Map<string, number>;
+  cashiers: Map<string, { revenue: number; transactions: number }>;
+  basket: Record<string, number>;
+}
+
+export interface MetricsCorrection {
+  scope: MetricsScope;
+  id: string;
+  day: string;
+  revenueDrift: number;
+  transactionDrift: number;
+  corrections: number;
+}
+
+const MONEY_TOLERANCE = 0.005;
+
+function drift(expected: number, actual: number, money: boolean): number {
+  const delta = expected - actual;
+  return Math.abs(delta) < (money ? MONEY_TOLERANCE : 0.5) ? 0 : delta;
+}
+
+/**
+ * Bring one scope-day in Redis in line with `snapshot` (hour keys in
+ * metricsHourKey form), for the hours that closed by `snapshot.through`.
+ * Buckets of the open hours are left as they are, and the day total expects
+ * them as recorded; the product, cashier and basket counters are not kept per
+ * hour, so they are only reconciled once the whole day has closed. The current
+ * values are read in one MULTI, so a sale recorded meanwhile is in all of them
+ * or none, and the differences are applied as increments in a second. Returns
+ * what had drifted.
+ */
+export async function reconcileMetricsDay(
+  scope: MetricsScope,
+  id: string,
+  day: Date,
+  snapshot: MetricsDaySnapshot,
+  client: RedisClientType | null = getRedisClient(),
+): Promise<MetricsCorrection | null> {
+  if (!client) return null;
+  const dayStart = Date.UTC(day.getUTCFullYear(), day.getUTCMonth(), day.getUTCDate());
+  const hours = Array.from({ length: 24 }, (_, h) => new Date(dayStart + h * HOUR_MS));
+  const keys = metricsKeys(scope, id, hours[0]);
+  const through = Math.min(snapshot.through.getTime(), dayStart + DAY_MS);
+  const hourClosed = (hour: Date) => hour.getTime() + HOUR_MS <= through;
+  const dayClosed = through >= dayStart + DAY_MS;
+
+  const read = client.multi();
+  for (const hour of hours) read.hGetAll(metricsKeys(scope, id, hour).hour);
+  read.hGetAll(keys.day);
+  read.zRangeWithScores(keys.productUnits, 0, -1);
+  read.zRangeWithScores(keys.productRevenue, 0, -1);
+  read.hGetAll(keys.cashiers);
+  read.hGetAll(keys.basket);
+  const replies = (await read.exec()) as unknown[];
+
+  const write = client.multi();
+  let corrections = 0;
+  const applyTotals = (key: string, expected: MetricTotals, actual: MetricTotals, ttl: number) => {
+    let touched = false;
+    for (const field of TOTAL_FIELDS) {
+      const money = field === "revenue" || field === "discount" || field === "tax";
+      const delta = drift(expected[field], actual[field], money);
+      if (!delta) continue;
+      if (money) write.hIncrByFloat(key, field, delta);
+      else write.hIncrBy(key, field, Math.round(delta));
+      corrections += 1;
+      touched = true;
+    }
+    if (touched) write.expire(key, ttl);
+  };
+
+  const expectedDay = emptyTotals();
+  const nowMs = Date.now();
+  hours.forEach((hour, index) => {
+    const actual = parseTotals(replies[index]);
+    if (!hourClosed(hour)) {
+      addTotals(expectedDay, actual);
+      return;
+    }
+    const expected = snapshot.hourly.get(metricsHourKey(hour)) ?? emptyTotals();
+    addTotals(expectedDay, expected);
+    // Hourly buckets past their TTL are not worth recreating
+    if (nowMs - hour.getTime() < HOURLY_TTL_SECONDS * 1000) {
+      applyTotals(metricsKeys(scope, id, hour).hour, expected, actual, HOURLY_TTL_SECONDS);
+    }
+  });
+  const actualDay = parseTotals(replies[24]);
+  applyTotals(keys.day, expectedDay, actualDay, DAILY_TTL_SECONDS);
+
+  const applyRanked = (key: string, expected: Map<string, number>, raw: unknown, money: boolean) => {
+    const actual = new Map(parseRanked(raw).map((entry) => [entry.id, entry.value]));
+    let touched = false;
+    for (const member of new Set([...expected.keys(), ...actual.keys()])) {
+      const delta = drift(expected.get(member) ?? 0, actual.get(member) ?? 0, money);
+      if (!delta) continue;
+      write.zIncrBy(key, delta, member);
+      corrections += 1;
+      touched = true;
+    }
+    if (touched) write.expire(key, DAILY_TTL_SECONDS);
+  };
+  if (dayClosed) {
+    applyRanked(keys.productUnits, snapshot.productUnits, replies[25], false);
+    applyRanked(keys.productRevenue, snapshot.productRevenue, replies[26], true);
+  }
+
+  const expectedCashiers: Record<string, number> = {};
+  for (const [cashierId, stats] of snapshot.cashiers) {
+    expectedCashiers[`${cashierId}|revenue`] = stats.revenue;
+    expectedCashiers[`${cashierId}|transactions`] = stats.transactions;
+  }
+  const applyCounts = (key: string, expected: Record<string, number>, raw: unknown) => {
+    const actual = parseCounts(raw);
+    let touched = false;
+    for (const field of new Set([...Object.keys(expected), ...Object.keys(actual)])) {
+      const money = field.endsWith("|revenue");
+      const delta = drift(expected[field] ?? 0, actual[field] ?? 0, money);
+      if (!delta) continue;
+      if (money) write.hIncrByFloat(key, field, delta);
+      else write.hIncrBy(key, field, Math.round(delta));
+      corrections += 1;
+      touched = true;
+    }
+    if (touched) write.expire(key, DAILY_TTL_SECONDS);
+  };
+  if (dayClosed) {
+    applyCounts(keys.cashiers, expectedCashiers, replies[27]);
+    applyCounts(keys.basket, snapshot.basket, replies[28]);
+  }
+
+  if (corrections > 0) {
+    await write.exec();
+  }
+  return {
+    scope,
+    id,
+    day: metricsDayKey(hours[0]),
+    revenueDrift: roundMoney(drift(expectedDay.revenue, actualDay.revenue, true)),
+    transactionDrift: drift(expectedDay.transactions, actualDay.transactions, false),
+    corrections,
+  };
+}
@@ -36,13 +36,13 @@ export interface SaleDelta {
   tax?: number;
 }
 
-export async function incrementTodayRollups(orgId: string, storeId: string, delta: SaleDelta): Promise<void> {
-  const c = getRedisClient();
-  if (!c) return;
-  const dateKey = formatDateKey();
+type RedisMulti = ReturnType<RedisClientType['multi']>;
+
+/** Queue the per-day org/store rollup increments on an existing MULTI or pipeline. */
+export function queueTodayRollups(pipeline: RedisMulti, orgId: string, storeId: string, delta: SaleDelta, date = new Date()): void {
+  const dateKey = formatDateKey(date);
   const orgKey = `chainsync:rollup:org:${orgId}:date:${dateKey}`;
   const storeKey = `chainsync:rollup:store:${storeId}:date:${dateKey}`;
-  const pipeline = c.multi();
   pipeline.hIncrByFloat(orgKey, 'revenue', delta.revenue);
   pipeline.hIncrBy(orgKey, 'transactions', delta.transactions);
   if (delta.discount != null) pipeline.hIncrByFloat(orgKey, 'discount', delta.discount);
@@ -54,7 +54,13 @@ export async function incrementTodayRollups(orgId: string, storeId: string, delt
   if (delta.discount != null) pipeline.hIncrByFloat(storeKey, 'discount', delta.discount);
   if (delta.tax != null) pipeline.hIncrByFloat(storeKey, 'tax', delta.tax);
   pipeline.expire(storeKey, 60 * 60 * 48);
+}
 
+export async function incrementTodayRollups(orgId: string, storeId: string, delta: SaleDelta): Promise<void> {
+  const c = getRedisClient();
+  if (!c) return;
+  const pipeline = c.multi();
+  queueTodayRollups(pipeline, orgId, storeId, delta);
   await pipeline.exec();
 }
 
@@ -0,0 +1,420 @@
+/**
+ * Worker-thread pool for PDF/CSV report rendering plus an on-disk cache of
+ * rendered documents.
+ *
+ * PDFKit layout is CPU bound and used to run inside the request handler,
+ * stalling every other request on the instance. Jobs are now queued onto a
+ * small pool of worker threads; once the queue reaches its depth limit new
+ * jobs are rejected with a 503 so callers can retry instead of piling up.
+ */
+import { createHash } from 'node:crypto';
+import { createReadStream } from 'node:fs';
+import { mkdir, readdir, rename, stat, unlink, writeFile } from 'node:fs/promises';
+import os from 'node:os';
+import path from 'node:path';
+import type { Readable } from 'node:stream';
+import { Worker } from 'node:worker_threads';
+import PDFDocument from 'pdfkit';
+
+import { envNumber } from './env';
+import { AppError } from './errors';
+import { logger } from './logger';
+import { renderReportDocument, type ReportFormat, type ReportRenderJob } from './report-render';
+
+const DEFAULT_POOL_SIZE = Math.max(1, Math.min(4, os.cpus().length - 1));
+const DEFAULT_QUEUE_DEPTH = 32;
+const DEFAULT_JOB_TIMEOUT_MS = 30_000;
+const DEFAULT_CACHE_TTL_MS = 24 * 60 * 60 * 1000;
+const DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024;
+const CACHE_SWEEP_INTERVAL_MS = 10 * 60 * 1000;
+
+export class ReportQueueFullError extends AppError {
+  constructor(message: string = 'Report rendering queue is full, please retry shortly') {
+    super(message, 503, 'REPORT_QUEUE_FULL');
+  }
+}
+
+// The worker evaluates the renderer's own source so there is a single
+// implementation for inline and pooled rendering. `__name` covers the helper
+// esbuild/tsx inject when keepNames is enabled.
+function buildWorkerSource(): string {
+  return `
+const { parentPort } = require('node:worker_threads');
+const PDFDocument = require('pdfkit');
+const __name = (fn) => fn;
+const render = (${renderReportDocument.toString()});
+parentPort.on('message', async (message) => {
+  try {
+    const buffer = await render(PDFDocument, message.job);
+    parentPort.postMessage({ id: message.id, ok: true, buffer });
+  } catch (error) {
+    parentPort.postMessage({ id: message.id, ok: false, error: error && error.message ? error.message : String(error) });
+  }
+});
+`;
+}
+
+interface PendingJob {
+  id: number;
+  job: ReportRenderJob;
+  resolve: (buffer: Buffer) => void;
+  reject: (error: Error) => void;
+  enqueuedAt: number;
+}
+
+interface PoolWorker {
+  worker: Worker;
+  current: PendingJob | null;
+  timer: NodeJS.Timeout | null;
+}
+
+export interface ReportRenderPoolOptions {
+  size?: number;
+  maxQueueDepth?: number;
+  jobTimeoutMs?: number;
+}
+
+export interface ReportRenderPoolStats {
+  size: number;
+  busy: number;
+  queued: number;
+  maxQueueDepth: number;
+  completed: number;
+  failed: number;
+  rejected: number;
+  inline: boolean;
+}
+
+export class ReportRenderPool {
+  private readonly size: number;
+  private readonly maxQueueDepth: number;
+  private readonly jobTimeoutMs: number;
+  private readonly workers: PoolWorker[] = [];
+  private readonly queue: PendingJob[] = [];
+  private nextId = 1;
+  private inline = false;
+  private closed = false;
+  private completed = 0;
+  private failed = 0;
+  private rejected = 0;
+
+  constructor(options: ReportRenderPoolOptions = {}) {
+    this.size = Math.max(1, options.size ?? DEFAULT_POOL_SIZE);
+    this.maxQueueDepth = Math.max(0, options.maxQueueDepth ?? DEFAULT_QUEUE_DEPTH);
+    this.jobTimeoutMs = options.jobTimeoutMs ?? DEFAULT_JOB_TIMEOUT_MS;
+  }
+
+  render(job: ReportRenderJob): Promise<Buffer> {
+    if (this.closed) {
+      return Promise.reject(new Error('Report render pool is closed'));
+    }
+    if (this.inline) {
+      return renderReportDocument(PDFDocument, job);
+    }
+
+    this.ensureWorkers();
+    if (this.inline) {
+      return renderReportDocument(PDFDocument, job);
+    }
+
+    const busy = this.workers.filter((w) => w.current).length;
+    if (busy >= this.workers.length && this.queue.length >= this.maxQueueDepth) {
+      this.rejected += 1;
+      return Promise.reject(new ReportQueueFullError());
+    }
+
+    return new Promise<Buffer>((resolve, reject) => {
+      this.queue.push({ id: this.nextId++, job, resolve, reject, enqueuedAt: Date.now() });
+      this.drain();
+    });
+  }
+
+  getStats(): ReportRenderPoolStats {
+    return {
+      size: this.workers.length,
+      busy: this.workers.filter((w) => w.current).length,
+      queued: this.queue.length,
+      maxQueueDepth: this.maxQueueDepth,
+      completed: this.completed,
+      failed: this.failed,
+      rejected: this.rejected,
+      inline: this.inline,
+    };
+  }
+
+  async close(): Promise<void> {
+    this.closed = true;
+    for (const pending of this.queue.splice(0)) {
+      pending.reject(new Error('Report render pool is closed'));
+    }
+    await Promise.all(this.workers.splice(0).map(({ worker }) => worker.terminate()));
+  }
+
+  private ensureWorkers(): void {
+    if (this.workers.length >= this.size) return;
+    const source = buildWorkerSource();
+    try {
+      while (this.workers.length < this.size) {
+        this.workers.push(this.spawn(source));
+      }
+    } catch (error) {
+      // Fall back to in-process rendering rather than failing every export.
+      logger.warn('Report render workers unavailable, rendering inline', {
+        error: error instanceof Error ? error.message : String(error),
+      });
+      this.inline = true;
+    }
+  }
+
+  private spawn(source: string): PoolWorker {
+    const worker = new Worker(source, { eval: true });
+    const entry: PoolWorker = { worker, current: null, timer: null };
+    worker.unref();
+
+    worker.on('message', (message: { id: number; ok: boolean; buffer?: Uint8Array; error?: string }) => {
+      const pending = entry.current;
+      if (!pending || pending.id !== message.id) return;
+      this.finish(entry);
+      if (message.ok && message.buffer) {
+        this.completed += 1;
+        pending.resolve(Buffer.from(message.buffer.buffer, message.buffer.byteOffset, message.buffer.byteLength));
+      } else {
+        this.failed += 1;
+        pending.reject(new Error(message.error || 'Report rendering failed'));
+      }
+      this.drain();
+    });
+
+    worker.on('error', (error) => {
+      logger.error('Report render worker crashed', { error: error.message });
+      this.replace(entry, error);
+    });
+
+    worker.on('exit', (code) => {
+      if (this.closed || code === 0) return;
+      this.replace(entry, new Error(`Report render worker exited with code ${code}`));
+    });
+
+    return entry;
+  }
+
+  private replace(entry: PoolWorker, error: Error): void {
+    const index = this.workers.indexOf(entry);
+    if (index === -1) return;
+    const pending = entry.current;
+    this.finish(entry);
+    this.workers.splice(index, 1);
+    void entry.worker.terminate().catch(() => {});
+    if (pending) {
+      this.failed += 1;
+      pending.reject(error);
+    }
+    if (!this.closed) {
+      this.ensureWorkers();
+      this.drain();
+    }
+  }
+
+  private finish(entry: PoolWorker): void {
+    if (entry.timer) clearTimeout(entry.timer);
+    entry.timer = null;
+    entry.current = null;
+  }
+
+  private drain(): void {
+    for (const entry of this.workers) {
+      if (entry.current) continue;
+      const next = this.queue.shift();
+      if (!next) return;
+      entry.current = next;
+      entry.timer = setTimeout(() => {
+        this.replace(entry, new Error(`Report rendering timed out after ${this.jobTimeoutMs}ms`));
+      }, this.jobTimeoutMs);
+      entry.worker.postMessage({ id: next.id, job: next.job });
+    }
+  }
+}
+
+let sharedPool: ReportRenderPool | null = null;
+
+export function getReportRenderPool(): ReportRenderPool {
+  if (!sharedPool) {
+    sharedPool = new ReportRenderPool({
+      size: process.env.REPORT_RENDER_WORKERS ? Number(process.env.REPORT_RENDER_WORKERS) : undefined,
+      maxQueueDepth: process.env.REPORT_RENDER_QUEUE_DEPTH ? Number(process.env.REPORT_RENDER_QUEUE_DEPTH) : undefined,
+    });
+  }
+  return sharedPool;
+}
+
+export interface ReportCacheKeyInput {
+  orgId?: string | null;
+  params: Record<string, unknown>;
+  watermark: string;
+  format: ReportFormat;
+}
+
+export function buildReportCacheKey(input: ReportCacheKeyInput): string {
+  const sortedParams = Object.keys(input.params)
+    .sort()
+    .reduce<Record<string, unknown>>((acc, key) => {
+      const value = input.params[key];
+      if (value !== undefined) acc[key] = value;
+      return acc;
+    }, {});
+  return createHash('sha256')
+    .update(JSON.stringify([input.orgId ?? 'none', sortedParams, input.watermark, input.format]))
+    .digest('hex');
+}
+
+/**
+ * Rendered documents keyed by (org, report params, data watermark). A new sale
+ * or refund moves the watermark, so stale entries are simply never hit again.
+ * Writes sweep the directory in the background, at most every few minutes or
+ * after a quarter of `maxBytes` has been written: entries past the TTL are
+ * removed, then the oldest until the cache fits in `maxBytes`.
+ */
+export class ReportDiskCache {
+  private readonly dir: string;
+  private readonly ttlMs: number;
+  private readonly maxBytes: number;
+  private hits = 0;
+  private misses = 0;
+  private lastSweepAt = 0;
+  private bytesSinceSweep = 0;
+  private sweeping: Promise<number> | null = null;
+
+  constructor(dir: string, ttlMs: number = DEFAULT_CACHE_TTL_MS, maxBytes: number = DEFAULT_CACHE_MAX_BYTES) {
+    this.dir = dir;
+    this.ttlMs = ttlMs;
+    this.maxBytes = maxBytes;
+  }
+
+  private filePath(key: string, format: ReportFormat): string {
+    return path.join(this.dir, `${key}.${format}`);
+  }
+
+  async open(key: string, format: ReportFormat): Promise<Readable | null> {
+    const file = this.filePath(key, format);
+    try {
+      const info = await stat(file);
+      if (Date.now() - info.mtimeMs > this.ttlMs) {
+        this.misses += 1;
+        await unlink(file).catch(() => {});
+        return null;
+      }
+      this.hits += 1;
+      return createReadStream(file);
+    } catch {
+      this.misses += 1;
+      return null;
+    }
+  }
+
+  async put(key: string, format: ReportFormat, buffer: Buffer): Promise<void> {
+    const file = this.filePath(key, format);
+    const tmp = `${file}.${process.pid}.tmp`;
+    try {
+      await mkdir(this.dir, { recursive: true });
+      await writeFile(tmp, buffer);
+      await rename(tmp, file);
+    } catch (error) {
+      logger.warn('Failed to write report cache entry', {
+        key,
+        error: error instanceof Error ? error.message : String(error),
+      });
+      await unlink(tmp).catch(() => {});
+      return;
+    }
+    this.sweepAfterWrite(buffer.length);
+  }
+
+  private sweepAfterWrite(bytes: number): void {
+    this.bytesSinceSweep += bytes;
+    const now = Date.now();
+    if (this.sweeping) return;
+    if (now - this.lastSweepAt < CACHE_SWEEP_INTERVAL_MS && this.bytesSinceSweep < this.maxBytes / 4) return;
+    this.lastSweepAt = now;
+    this.bytesSinceSweep = 0;
+    void this.sweep();
+  }
+
+  /** Remove expired entries, then the oldest until the cache fits; resolves to the number removed. */
+  async sweep(): Promise<number> {
+    const run = (this.sweeping ?? Promise.resolve(0)).then(() => this.removeStale());
+    this.sweeping = run;
+    try {
+      return await run;
+    } finally {
+      if (this.sweeping === run) this.sweeping = null;
+    }
+  }
+
+  private async removeStale(): Promise<number> {
+    let removed = 0;
+    try {
+      const now = Date.now();
+      const kept: Array<{ file: string; size: number; mtimeMs: number }> = [];
+      for (const name of await readdir(this.dir)) {
+        const file = path.join(this.dir, name);
+        const info = await stat(file).catch(() => null);
+        if (!info) continue;
+        if (now - info.mtimeMs > this.ttlMs) {
+          await unlink(file).catch(() => {});
+          removed += 1;
+        } else {
+          kept.push({ file, size: info.size, mtimeMs: info.mtimeMs });
+        }
+      }
+
+      let total = kept.reduce((sum, entry) => sum + entry.size, 0);
+      kept.sort((a, b) => a.mtimeMs - b.mtimeMs);
+      for (const entry of kept) {
+        if (total <= this.maxBytes) break;
+        await unlink(entry.file).catch(() => {});
+        total -= entry.size;
+        removed += 1;
+      }
+    } catch {
+      // Cache directory not created yet
+    }
+    return removed;
+  }
+
+  getStats(): { hits: number; misses: number } {
+    return { hits: this.hits, misses: this.misses };
+  }
+}
+
+let sharedCache: ReportDiskCache | null = null;
+
+export function getReportDiskCache(): ReportDiskCache {
+  if (!sharedCache) {
+    const dir = process.env.REPORT_CACHE_DIR || path.join(os.tmpdir(), 'chainsync-report-cache');
+    const ttlMs = process.env.REPORT_CACHE_TTL_MS ? Number(process.env.REPORT_CACHE_TTL_MS) : DEFAULT_CACHE_TTL_MS;
+    sharedCache = new ReportDiskCache(dir, ttlMs, envNumber('REPORT_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES));
+  }
+  return sharedCache;
+}
+
+export interface RenderReportCachedInput extends ReportCacheKeyInput {
+  load: () => Promise<ReportRenderJob['report']>;
+}
+
+/**
+ * Serve a rendered report from the disk cache, or load the report data,
+ * render it on the worker pool and populate the cache.
+ */
+export async function renderReportCached(input: RenderReportCachedInput): Promise<{ stream: Readable | null; buffer: Buffer | null; cached: boolean }> {
+  const cache = getReportDiskCache();
+  const key = buildReportCacheKey(input);
+  const hit = await cache.open(key, input.format);
+  if (hit) {
+    return { stream: hit, buffer: null, cached: true };
+  }
+
+  const report = await input.load();
+  const buffer = await getReportRenderPool().render({ format: input.format, report });
+  await cache.put(key, input.format, buffer);
+  return { stream: null, buffer, cached: false };
+}
@@ -0,0 +1,180 @@
+/**
+ * Report document renderers shared by the analytics export routes and the
+ * report render worker pool.
+ *
+ * `renderReportDocument` is serialized into worker threads with
+ * `Function.prototype.toString()`, so it must stay self-contained: it may only
+ * reference its arguments and JS/Node globals (Buffer, Promise, Number...).
+ */
+
+export type ReportFormat = 'csv' | 'pdf';
+
+export interface AnalyticsExportRow {
+  bucket: string;
+  revenue: number;
+  discount: number;
+  tax: number;
+  transactions: number;
+  refundTotal: number;
+  refundCount: number;
+}
+
+export interface AnalyticsExportReport {
+  kind: 'analytics_timeseries';
+  interval: string;
+  dateFrom?: string;
+  dateTo?: string;
+  storeId?: string;
+  rows: AnalyticsExportRow[];
+}
+
+export interface ComprehensiveExportReport {
+  kind: 'comprehensive';
+  storeName?: string;
+  currency: string;
+  period: { start: string; end: string };
+  summary: Record<string, { amount: number; currency: string } | number | undefined>;
+  timeseries: Array<Record<string, number | string | undefined>>;
+}
+
+export type ReportDocument = AnalyticsExportReport | ComprehensiveExportReport;
+
+export interface ReportRenderJob {
+  format: ReportFormat;
+  report: ReportDocument;
+}
+
+/**
+ * Render a report to a Buffer. `PDFDocumentCtor` is injected (rather than
+ * imported) so the same function body can run inside a worker thread.
+ */
+export async function renderReportDocument(PDFDocumentCtor: any, job: ReportRenderJob): Promise<Buffer> {
+  const report = job.report;
+
+  const csvCell = (value: unknown): string => {
+    const text = value === null || value === undefined ? '' : String(value);
+    return /[",\n]/.test(text) ? `"${text.replace(/"/g, '""')}"` : text;
+  };
+
+  if (report.kind === 'analytics_timeseries') {
+    if (job.format === 'csv') {
+      const lines = ['date,revenue,discount,tax,transactions,refunds,refund_count,net_revenue'];
+      for (const r of report.rows) {
+        const netRevenue = Number(r.revenue ?? 0) - Number(r.refundTotal ?? 0);
+        lines.push(`${r.bucket},${r.revenue},${r.discount},${r.tax},${r.transactions},${r.refundTotal},${r.refundCount},${netRevenue}`);
+      }
+      return Buffer.from(lines.join('\n') + '\n', 'utf8');
+    }
+
+    return new Promise<Buffer>((resolve, reject) => {
+      const doc = new PDFDocumentCtor({ size: 'A4', margin: 50 });
+      const chunks: Buffer[] = [];
+      doc.on('data', (chunk: Buffer) => chunks.push(chunk));
+      doc.on('end', () => resolve(Buffer.concat(chunks)));
+      doc.on('error', reject);
+
+      doc.fontSize(18).text('Sales Analytics Report', { align: 'center' });
+      doc.moveDown();
+      doc.fontSize(10).text(`Interval: ${report.interval}`);
+      doc.fontSize(10).text(`Date range: ${report.dateFrom || 'N/A'} to ${report.dateTo || 'N/A'}`);
+      if (report.storeId) doc.fontSize(10).text(`Store: ${report.storeId}`);
+      doc.moveDown();
+
+      // Table header
+      doc.fontSize(12).text('Date', 50, doc.y, { continued: true });
+      doc.text('Revenue', 130, doc.y, { continued: true });
+      doc.text('Refunds', 210, doc.y, { continued: true });
+      doc.text('Net', 290, doc.y, { continued: true });
+      doc.text('Discount', 370, doc.y, { continued: true });
+      doc.text('Tax', 450, doc.y, { continued: true });
+      doc.text('Transactions', 510);
+      doc.moveDown(0.5);
+      doc.moveTo(50, doc.y).lineTo(550, doc.y).stroke();
+
+      for (const r of report.rows) {
+        const netRevenue = Number(r.revenue ?? 0) - Number(r.refundTotal ?? 0);
+        doc.fontSize(10).text(String(r.bucket).substring(0, 10), 50, doc.y, { continued: true });
+        doc.text(String(r.revenue), 130, doc.y, { continued: true });
+        doc.text(String(r.refundTotal), 210, doc.y, { continued: true });
+        doc.text(String(netRevenue), 290, doc.y, { continued: true });
+        doc.text(String(r.discount), 370, doc.y, { continued: true });
+        doc.text(String(r.tax), 450, doc.y, { continued: true });
+        doc.text(String(r.transactions), 510);
+      }
+
+      doc.end();
+    });
+  }
+
+  const columns = [
+    'date',
+    'revenue',
+    'tax',
+    'transactions',
+    'refunds',
+    'refundTax',
+    'refundCount',
+    'netRevenue',
+    'cogs',
+    'refundCogs',
+    'netCogs',
+    'stockLoss',
+    'manufacturerRefund',
+    'promotionLoss',
+    'profit',
+  ];
+
+  if (job.format === 'csv') {
+    const lines = [columns.join(',')];
+    for (const point of report.timeseries) {
+      lines.push(columns.map((column) => csvCell(point[column] ?? (column === 'date' ? '' : 0))).join(','));
+    }
+    return Buffer.from(lines.join('\n') + '\n', 'utf8');
+  }
+
+  return new Promise<Buffer>((resolve, reject) => {
+    const doc = new PDFDocumentCtor({ size: 'A4', margin: 50 });
+    const chunks: Buffer[] = [];
+    doc.on('data', (chunk: Buffer) => chunks.push(chunk));
+    doc.on('end', () => resolve(Buffer.concat(chunks)));
+    doc.on('error', reject);
+
+    doc.fontSize(18).text('Comprehensive Sales Report', { align: 'center' });
+    doc.moveDown();
+    if (report.storeName) doc.fontSize(10).text(`Store: ${report.storeName}`);
+    doc.fontSize(10).text(`Period: ${report.period.start.substring(0, 10)} to ${report.period.end.substring(0, 10)}`);
+    doc.fontSize(10).text(`Currency: ${report.currency}`);
+    doc.moveDown();
+
+    doc.fontSize(12).text('Summary');
+    doc.moveDown(0.25);
+    for (const [label, value] of Object.entries(report.summary)) {
+      if (value === undefined) continue;
+      const display = typeof value === 'number' ? String(value) : `${value.amount} ${value.currency}`;
+      doc.fontSize(10).text(`${label}: ${display}`);
+    }
+    doc.moveDown();
+
+    doc.fontSize(12).text('Date', 50, doc.y, { continued: true });
+    doc.text('Revenue', 150, doc.y, { continued: true });
+    doc.text('Refunds', 250, doc.y, { continued: true });
+    doc.text('Net COGS', 350, doc.y, { continued: true });
+    doc.text('Profit', 450);
+    doc.moveDown(0.5);
+    doc.moveTo(50, doc.y).lineTo(550, doc.y).stroke();
+
+    for (const point of report.timeseries) {
+      doc.fontSize(10).text(String(point.date ?? '').substring(0, 10), 50, doc.y, { continued: true });
+      doc.text(String(point.revenue ?? 0), 150, doc.y, { continued: true });
+      doc.text(String(point.refunds ?? 0), 250, doc.y, { continued: true });
+      doc.text(String(point.netCogs ?? 0), 350, doc.y, { continued: true });
+      doc.text(String(point.profit ?? 0), 450);
+    }
+
+    doc.end();
+  });
+}
+
+export function reportContentType(format: ReportFormat): string {
+  return format === 'pdf' ? 'application/pdf' : 'text/csv';
+}
@@ -0,0 +1,1134 @@
+import { sql, type SQL } from "drizzle-orm";
+import { fifoConsumptionQuery } from "./cost-layers";
+import { rowsOf } from "./db-rows";
+import { AppError } from "./errors";
+import { logger } from "./logger";
+import { postLoyaltyEntries } from "./loyalty-ledger";
+import { runInTransaction } from "./tx-executor";
+
+/**
+ * Set-based returns and swaps for the POS.
+ *
+ * POST /api/pos/returns used to read the sale, its items, every return_items
+ * row in the database and the inventory row of each line separately, then
+ * restock, re-create cost layers and write transaction items one line at a
+ * time on connections outside any transaction. A wholesale receipt of a few
+ * hundred lines took seconds and kept its inventory rows locked throughout.
+ *
+ * The engine loads the sale, its lines, the quantities and amounts already
+ * returned, the origin transaction and the loyalty points earned on it in one
+ * statement that locks the sale row. Refundable quantities and amounts are
+ * computed in memory (planReturn), and the writes go out as a fixed number of
+ * set-based statements in one transaction whatever the size of the receipt:
+ * the return and its items, restocks with their stock movements and cost
+ * layers (or discard losses), the refund transaction with its items, and the
+ * loyalty reversal.
+ */
+
+export type ReturnsEngineMode = "batched" | "legacy";
+
+/**
+ * POS_RETURNS_ENGINE selects the path explicitly. Otherwise the batched
+ * engine is used everywhere except NODE_ENV=test, whose routes run against
+ * the in-memory storage and mocked db.
+ */
+export function returnsEngineMode(env: NodeJS.ProcessEnv = process.env): ReturnsEngineMode {
+  const configured = String(env.POS_RETURNS_ENGINE || "").trim().toLowerCase();
+  if (configured === "batched" || configured === "legacy") {
+    return configured;
+  }
+  return env.NODE_ENV === "test" ? "legacy" : "batched";
+}
+
+const RETURN_ERRORS: Record<string, { status: number; message: string }> = {
+  sale_not_found: { status: 404, message: "Sale not found" },
+  sale_already_returned: { status: 409, message: "Sale already returned" },
+  store_mismatch: { status: 400, message: "Store mismatch for sale" },
+  sale_has_no_items: { status: 400, message: "Sale has no items to return" },
+  item_not_in_sale: { status: 400, message: "Return item does not match sale items" },
+  quantity_exceeds_remaining: { status: 400, message: "Return quantity exceeds remaining sale quantity" },
+  new_product_not_found: { status: 404, message: "New product not found" },
+};
+
+export class ReturnRejectedError extends AppError {
+  constructor(code: string) {
+    const known = RETURN_ERRORS[code];
+    super(known?.message ?? `Return rejected: ${code}`, known?.status ?? 400, code);
+  }
+}
+
+type Executor = { execute: (query: SQL) => Promise<unknown> };
+
+const UUID_PATTERN = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
+
+function jsonOf<T>(value: unknown, fallback: T): T {
+  if (value === null || value === undefined) return fallback;
+  return (typeof value === "string" ? JSON.parse(value) : value) as T;
+}
+
+function round2(value: number): string {
+  return value.toFixed(2);
+}
+
+export interface ReturnSaleLine {
+  id: string;
+  productId: string;
+  quantity: number;
+  lineTotal: number;
+  /** Units of this line already taken back by earlier returns and swaps */
+  returnedQuantity: number;
+  /** Current inventory average cost of the product */
+  avgCost: number;
+}
+
+export interface ReturnContext {
+  saleId: string;
+  orgId: string;
+  storeId: string;
+  subtotal: number;
+  discount: number;
+  tax: number;
+  paymentMethod: string;
+  status: string;
+  currency: string;
+  lines: ReturnSaleLine[];
+  /** Product refunds (excluding tax) already paid out on this sale */
+  refundedAmount: number;
+  originTransaction: { id: string; kind: string } | null;
+  /** Points the sale earned and how many earlier returns took back */
+  loyalty: { customerId: string; earned: number; reversed: number; balance: number } | null;
+  /** Only loaded for swaps */
+  originItem: { id: string; quantity: number; unitPrice: number; unitCost: number } | null;
+  newProduct: { id: string; name: string; quantity: number; avgCost: number } | null;
+}
+
+export interface LoadReturnOptions {
+  swap?: { originalProductId: string; newProductId: string };
+}
+
+/**
+ * Everything a return or swap needs, in one statement. The sale row is locked
+ * so concurrent returns of the same receipt are serialized and the remaining
+ * quantities computed from this snapshot stay valid until commit. Returns null
+ * when the sale does not exist.
+ */
+export function loadReturnContextQuery(saleId: string, options: LoadReturnOptions = {}): SQL {
+  const swap = options.swap;
+  const swapColumns = swap
+    ? sql`, origin_item.item AS origin_item, new_product.product AS new_product`
+    : sql``;
+  const swapJoins = swap
+    ? sql`
+      LEFT JOIN LATERAL (
+        SELECT jsonb_build_object(
+                 'id', ti.id, 'quantity', ti.quantity, 'unitPrice', ti.unit_price, 'unitCost', ti.unit_cost
+               ) AS item
+        FROM transaction_items ti
+        WHERE ti.transaction_id = tx.id AND ti.product_id = ${swap.originalProductId}::uuid
+        LIMIT 1
+      ) origin_item ON true
+      LEFT JOIN LATERAL (
+        SELECT jsonb_build_object(
+                 'id', p.id, 'name', p.name, 'quantity', COALESCE(i.quantity, 0), 'avgCost', COALESCE(i.avg_cost, 0)
+               ) AS product
+        FROM products p
+        LEFT JOIN inventory i ON i.store_id = s.store_id AND i.product_id = p.id
+        WHERE p.id = ${swap.newProductId}::uuid
+      ) new_product ON true`
+    : sql``;
+
+  return sql`
+    SELECT s.id, s.org_id, s.store_id, s.subtotal, s.discount, s.tax, s.payment_method, s.status,
+           COALESCE(st.currency, 'USD') AS currency,
+           COALESCE((
+             SELECT jsonb_agg(jsonb_build_object(
+                      'id', si.id,
+                      'productId', si.product_id,
+                      'quantity', si.quantity,
+                      'lineTotal', si.line_total,
+                      'returnedQuantity', COALESCE(done.quantity, 0),
+                      'avgCost', COALESCE(i.avg_cost, 0)
+                    ) ORDER BY si.id)
+             FROM sale_items si
+             LEFT JOIN (
+               SELECT ri.sale_item_id, SUM(ri.quantity)::integer AS quantity
+               FROM returns r
+               JOIN return_items ri ON ri.return_id = r.id
+               WHERE r.sale_id = s.id
+               GROUP BY ri.sale_item_id
+             ) done ON done.sale_item_id = si.id
+             LEFT JOIN inventory i ON i.store_id = s.store_id AND i.product_id = si.product_id
+             WHERE si.sale_id = s.id
+           ), '[]'::jsonb) AS lines,
+           (
+             SELECT COALESCE(SUM(ri.refund_amount), 0)
+             FROM returns r
+             JOIN return_items ri ON ri.return_id = r.id
+             WHERE r.sale_id = s.id AND ri.refund_type IN ('FULL', 'PARTIAL')
+           ) AS refunded_amount,
+           tx.id AS origin_transaction_id, tx.kind AS origin_transaction_kind,
+           points.customer_id, points.earned, points.reversed, c.current_points
+           ${swapColumns}
+    FROM sales s
+    LEFT JOIN stores st ON st.id = s.store_id
+    LEFT JOIN LATERAL (
+      SELECT t.id, t.kind FROM transactions t
+      WHERE t.store_id = s.store_id AND t.receipt_number = s.id::text
+      LIMIT 1
+    ) tx ON true
+    LEFT JOIN LATERAL (
+      SELECT l.holder_id AS customer_id,
+             COALESCE(SUM(l.delta) FILTER (WHERE l.source = 'pos_sale' AND l.entry_type = 'earn'), 0)::integer AS earned,
+             COALESCE(-SUM(l.delta) FILTER (WHERE l.source = 'pos_return' AND l.entry_type = 'reversal'), 0)::integer AS reversed
+      FROM loyalty_ledger l
+      WHERE l.holder_kind = 'customer' AND l.reference_id = s.id::text AND l.source IN ('pos_sale', 'pos_return')
+      GROUP BY l.holder_id
+      LIMIT 1
+    ) points ON true
+    LEFT JOIN customers c ON c.id = points.customer_id
+    ${swapJoins}
+    WHERE s.id = ${saleId}::uuid
+    FOR UPDATE OF s
+  `;
+}
+
+export function parseReturnContext(result: unknown): ReturnContext | null {
+  const row = rowsOf(result)[0];
+  if (!row?.id) return null;
+
+  const lines = jsonOf<any[]>(row.lines, []).map((line): ReturnSaleLine => ({
+    id: String(line.id),
+    productId: String(line.productId),
+    quantity: Number(line.quantity ?? 0),
+    lineTotal: Number(line.lineTotal ?? 0),
+    returnedQuantity: Number(line.returnedQuantity ?? 0),
+    avgCost: Number(line.avgCost ?? 0),
+  }));
+  const originItem = jsonOf<any>(row.origin_item, null);
+  const newProduct = jsonOf<any>(row.new_product, null);
+
+  return {
+    saleId: String(row.id),
+    orgId: String(row.org_id),
+    storeId: String(row.store_id),
+    subtotal: Number(row.subtotal ?? 0),
+    discount: Number(row.discount ?? 0),
+    tax: Number(row.tax ?? 0),
+    paymentMethod: String(row.payment_method ?? ""),
+    status: String(row.status ?? "COMPLETED"),
+    currency: String(row.currency ?? "USD"),
+    lines,
+    refundedAmount: Number(row.refunded_amount ?? 0),
+    originTransaction: row.origin_transaction_id
+      ? { id: String(row.origin_transaction_id), kind: String(row.origin_transaction_kind ?? "SALE") }
+      : null,
+    loyalty: row.customer_id
+      ? {
+          customerId: String(row.customer_id),
+          earned: Number(row.earned ?? 0),
+          reversed: Number(row.reversed ?? 0),
+          balance: Number(row.current_points ?? 0),
+        }
+      : null,
+    originItem: originItem?.id
+      ? {
+          id: String(originItem.id),
+          quantity: Number(originItem.quantity ?? 0),
+          unitPrice: Number(originItem.unitPrice ?? 0),
+          unitCost: Number(originItem.unitCost ?? 0),
+        }
+      : null,
+    newProduct: newProduct?.id
+      ? {
+          id: String(newProduct.id),
+          name: String(newProduct.name ?? ""),
+          quantity: Number(newProduct.quantity ?? 0),
+          avgCost: Number(newProduct.avgCost ?? 0),
+        }
+      : null,
+  };
+}
+
+export async function loadReturnContext(
+  executor: Executor,
+  saleId: string,
+  options: LoadReturnOptions = {},
+): Promise<ReturnContext | null> {
+  // Sale ids are uuids; anything else cannot match and would fail the cast
+  if (!UUID_PATTERN.test(saleId)) return null;
+  return parseReturnContext(await executor.execute(loadReturnContextQuery(saleId, options)));
+}
+
+export type RestockAction = "RESTOCK" | "DISCARD";
+export type ReturnRefundType = "NONE" | "FULL" | "PARTIAL";
+
+export interface ReturnRequestLine {
+  saleItemId?: string;
+  productId: string;
+  quantity: number;
+  restockAction: RestockAction;
+  refundType: ReturnRefundType;
+  refundAmount?: string;
+  notes?: string;
+}
+
+export interface PlannedReturnLine {
+  saleItemId: string;
+  productId: string;
+  quantity: number;
+  restockAction: RestockAction;
+  refundType: ReturnRefundType | "SWAP";
+  refundAmount: number;
+  taxRefundAmount: number;
+  /** Average cost used for discard losses and the refund's COGS */
+  unitCost: number;
+  /** Quantity of the sale line, for the discard audit trail */
+  originalQuantity: number;
+  notes?: string;
+}
+
+export interface ReturnPlan {
+  lines: PlannedReturnLine[];
+  productRefund: number;
+  taxRefund: number;
+  totalRefund: number;
+  refundType: ReturnRefundType;
+  loyaltyReversal: { customerId: string; points: number } | null;
+}
+
+function findSaleLine(
+  context: ReturnContext,
+  remaining: Map<string, number>,
+  item: { saleItemId?: string; productId: string; quantity: number },
+): ReturnSaleLine {
+  if (item.saleItemId) {
+    const line = context.lines.find((candidate) => candidate.id === item.saleItemId);
+    if (!line) throw new ReturnRejectedError("item_not_in_sale");
+    return line;
+  }
+  // Without a line id, take the first line of the product that still covers the quantity
+  const candidates = context.lines.filter((candidate) => candidate.productId === item.productId);
+  if (!candidates.length) throw new ReturnRejectedError("item_not_in_sale");
+  return candidates.find((candidate) => (remaining.get(candidate.id) ?? 0) >= item.quantity) ?? candidates[0];
+}
+
+function remainingQuantities(context: ReturnContext): Map<string, number> {
+  return new Map(context.lines.map((line) => [line.id, line.quantity - line.returnedQuantity]));
+}
+
+/**
+ * Points to take back so that what the customer keeps matches what they kept
+ * paying for: the earned points scaled by the share of the sale refunded so
+ * far, less what earlier returns already reversed, and never more than the
+ * current balance.
+ */
+export function loyaltyReversalPoints(context: ReturnContext, productRefund: number): number {
+  const loyalty = context.loyalty;
+  const spendBase = context.subtotal - context.discount;
+  if (!loyalty || loyalty.earned <= 0 || spendBase <= 0 || productRefund <= 0) return 0;
+  const refundedShare = Math.min(1, (context.refundedAmount + productRefund) / spendBase);
+  const due = Math.floor(loyalty.earned * refundedShare + 1e-9) - loyalty.reversed;
+  return Math.max(0, Math.min(due, loyalty.balance));
+}
+
+/**
+ * Validate a return against the loaded sale and price it. Amounts follow the
+ * per-line path: each unit is refunded at its share of the line total, tax at
+ * the sale's effective rate, and partial refunds are capped at the full value.
+ */
+export function planReturn(
+  context: ReturnContext | null,
+  storeId: string,
+  items: readonly ReturnRequestLine[],
+): ReturnPlan {
+  if (!context) throw new ReturnRejectedError("sale_not_found");
+  if (context.status === "RETURNED") throw new ReturnRejectedError("sale_already_returned");
+  if (context.storeId !== storeId) throw new ReturnRejectedError("store_mismatch");
+  if (!context.lines.length) throw new ReturnRejectedError("sale_has_no_items");
+
+  const taxRate = context.subtotal > 0 ? context.tax / context.subtotal : 0;
+  const remaining = remainingQuantities(context);
+  const lines: PlannedReturnLine[] = [];
+
+  for (const item of items) {
+    const saleLine = findSaleLine(context, remaining, item);
+    const available = remaining.get(saleLine.id) ?? 0;
+    if (item.quantity > available) throw new ReturnRejectedError("quantity_exceeds_remaining");
+    remaining.set(saleLine.id, available - item.quantity);
+
+    const unitValue = saleLine.quantity ? saleLine.lineTotal / saleLine.quantity : saleLine.lineTotal;
+    const baseRefund = unitValue * item.quantity;
+    const requested = Number.parseFloat(item.refundAmount ?? "0");
+    let refundAmount = 0;
+    if (item.refundType === "FULL") {
+      refundAmount = baseRefund;
+    } else if (item.refundType === "PARTIAL" && Number.isFinite(requested) && requested >= 0) {
+      refundAmount = Math.min(requested, baseRefund);
+    }
+    // Full tax for FULL refunds, the same share of it for PARTIAL ones
+    const ratio = baseRefund > 0 ? refundAmount / baseRefund : 0;
+    const taxRefundAmount = item.refundType === "NONE" ? 0 : baseRefund * taxRate * (item.refundType === "FULL" ? 1 : ratio);
+
+    lines.push({
+      saleItemId: saleLine.id,
+      productId: saleLine.productId,
+      quantity: item.quantity,
+      restockAction: item.restockAction,
+      refundType: item.refundType,
+      refundAmount,
+      taxRefundAmount,
+      unitCost: saleLine.avgCost,
+      originalQuantity: saleLine.quantity,
+      notes: item.notes || undefined,
+    });
+  }
+
+  const productRefund = lines.reduce((sum, line) => sum + line.refundAmount, 0);
+  const taxRefund = lines.reduce((sum, line) => sum + line.taxRefundAmount, 0);
+  const totalRefund = productRefund + taxRefund;
+  let refundType: ReturnRefundType = "NONE";
+  if (totalRefund > 0) {
+    refundType = lines.every((line) => line.refundType === "FULL") ? "FULL" : "PARTIAL";
+  }
+
+  const points = loyaltyReversalPoints(context, productRefund);
+  return {
+    lines,
+    productRefund,
+    taxRefund,
+    totalRefund,
+    refundType,
+    loyaltyReversal: points > 0 && context.loyalty ? { customerId: context.loyalty.customerId, points } : null,
+  };
+}
+
+interface ReturnRecordInput {
+  storeId: string;
+  userId: string;
+  reason?: string | null;
+  refundType: string;
+  totalRefund: number;
+  idempotencyKey: string;
+  markSaleReturned: boolean;
+}
+
+export interface ReturnRecord {
+  return: Record<string, any> & { id: string };
+  items: Array<Record<string, any>>;
+}
+
+const RETURN_JSON = sql`jsonb_build_object(
+  'id', r.id, 'saleId', r.sale_id, 'storeId', r.store_id, 'reason', r.reason,
+  'processedBy', r.processed_by, 'refundType', r.refund_type, 'totalRefund', r.total_refund::text,
+  'currency', r.currency, 'idempotencyKey', r.idempotency_key, 'occurredAt', r.occurred_at
+)`;
+
+const RETURN_ITEM_JSON = sql`jsonb_build_object(
+  'id', ri.id, 'returnId', ri.return_id, 'saleItemId', ri.sale_item_id, 'productId', ri.product_id,
+  'quantity', ri.quantity, 'restockAction', ri.restock_action, 'refundType', ri.refund_type,
+  'refundAmount', ri.refund_amount::text, 'currency', ri.currency, 'notes', ri.notes
+)`;
+
+/** The return, all of its items and (for returns) the sale's RETURNED status in one statement. */
+export function returnRecordQuery(context: ReturnContext, input: ReturnRecordInput, lines: readonly PlannedReturnLine[]): SQL {
+  const items = lines.map((line) => ({
+    sale_item_id: line.saleItemId,
+    product_id: line.productId,
+    quantity: line.quantity,
+    restock_action: line.restockAction,
+    refund_type: line.refundType,
+    refund_amount: round2(line.refundAmount),
+    notes: line.notes ?? null,
+  }));
+  const marked = input.markSaleReturned
+    ? sql`marked AS (UPDATE sales SET status = 'RETURNED' WHERE id = ${context.saleId}::uuid RETURNING id),`
+    : sql``;
+
+  return sql`
+    WITH ${marked}
+    inserted AS (
+      INSERT INTO returns (sale_id, store_id, reason, processed_by, refund_type, total_refund, currency, idempotency_key)
+      VALUES (
+        ${context.saleId}::uuid, ${input.storeId}::uuid, ${input.reason ?? null}, ${input.userId}::uuid,
+        ${input.refundType}, ${round2(input.totalRefund)}::numeric, ${context.currency}, ${input.idempotencyKey}
+      )
+      RETURNING *
+    ),
+    inserted_items AS (
+      INSERT INTO return_items (return_id, sale_item_id, product_id, quantity, restock_action, refund_type, refund_amount, currency, notes)
+      SELECT r.id, l.sale_item_id, l.product_id, l.quantity, l.restock_action, l.refund_type, l.refund_amount, r.currency, l.notes
+      FROM inserted r
+      CROSS JOIN jsonb_to_recordset(${JSON.stringify(items)}::jsonb)
+        AS l(sale_item_id UUID, product_id UUID, quantity INTEGER, restock_action TEXT, refund_type TEXT, refund_amount NUMERIC, notes TEXT)
+      RETURNING *
+    )
+    SELECT (SELECT ${RETURN_JSON} FROM inserted r) AS return,
+           COALESCE((SELECT jsonb_agg(${RETURN_ITEM_JSON}) FROM inserted_items ri), '[]'::jsonb) AS items
+  `;
+}
+
+function parseReturnRecord(result: unknown): ReturnRecord {
+  const row = rowsOf(result)[0];
+  const record = jsonOf<any>(row?.return, null);
+  if (!record?.id) {
+    throw new Error("Return insert returned no row");
+  }
+  return { return: record, items: jsonOf<any[]>(row.items, []) };
+}
+
+interface StockLabels {
+  /** stock_movements / inventory_cost_layers source for restocked units */
+  source: string;
+  /** format() template for the restock movement note, %s is the quantity */
+  restockNote: string;
+  layerNote: string;
+  discardNote: string;
+  /** Swaps log restocks as revaluation events, returns do not (see storage.adjustInventory) */
+  revalueRestock: boolean;
+}
+
+export interface RestockedLevel {
+  productId: string;
+  quantityBefore: number;
+  quantity: number;
+  minStockLevel: number | null;
+}
+
+/**
+ * Restocks and discard losses for every returned line in one statement.
+ * Restocked products are upserted into inventory in product order (so
+ * concurrent returns lock hot rows in the same order), and their movements and
+ * cost layers at the current average cost are written from the same rows.
+ * Discarded units were already sold, so they only record the loss.
+ */
+export function returnStockQuery(
+  storeId: string,
+  userId: string,
+  referenceId: string,
+  lines: readonly PlannedReturnLine[],
+  labels: StockLabels,
+): SQL {
+  const payload = lines.map((line) => ({
+    product_id: line.productId,
+    quantity: line.quantity,
+    restock_action: line.restockAction,
+    unit_cost: line.unitCost,
+    original_quantity: line.originalQuantity,
+    notes: line.notes ?? null,
+  }));
+  const revalued = labels.revalueRestock
+    ? sql`
+    revalued AS (
+      INSERT INTO inventory_revaluation_events (
+        store_id, product_id, source, reference_id, quantity_before, quantity_after,
+        avg_cost_after, delta_value, metadata, occurred_at
+      )
+      SELECT ${storeId}::uuid, x.product_id, ${labels.source}, ${referenceId}::uuid, x.quantity - r.qty, x.quantity,
+             x.avg_cost, r.qty * x.avg_cost,
+             jsonb_build_object('quantityChange', r.qty, 'notes', format(${labels.restockNote}::text, r.qty), 'userId', ${userId}::text),
+             now()
+      FROM restock r
+      JOIN restocked x ON x.product_id = r.product_id
+      WHERE x.avg_cost <> 0
+      RETURNING 1
+    ),`
+    : sql``;
+
+  return sql`
+    WITH lines AS (
+      SELECT * FROM jsonb_to_recordset(${JSON.stringify(payload)}::jsonb)
+        AS l(product_id UUID, quantity INTEGER, restock_action TEXT, unit_cost NUMERIC, original_quantity INTEGER, notes TEXT)
+    ),
+    restock AS (
+      SELECT product_id, SUM(quantity)::integer AS qty
+      FROM lines
+      WHERE restock_action = 'RESTOCK'
+      GROUP BY product_id
+    ),
+    restocked AS (
+      INSERT INTO inventory (store_id, product_id, quantity, last_restocked, updated_at)
+      SELECT ${storeId}::uuid, r.product_id, r.qty, now(), now()
+      FROM restock r
+      ORDER BY r.product_id
+      ON CONFLICT (store_id, product_id) DO UPDATE
+      SET quantity = inventory.quantity + EXCLUDED.quantity,
+          total_cost_value = GREATEST(inventory.quantity + EXCLUDED.quantity, 0) * inventory.avg_cost,
+          last_restocked = now(),
+          updated_at = now()
+      RETURNING product_id, quantity, avg_cost, min_stock_level
+    ),
+    movements AS (
+      INSERT INTO stock_movements (
+        store_id, product_id, quantity_before, quantity_after, delta, action_type,
+        source, reference_id, user_id, notes, metadata, occurred_at, created_at
+      )
+      SELECT ${storeId}::uuid, x.product_id, x.quantity - r.qty, x.quantity, r.qty, 'adjustment',
+             ${labels.source}, ${referenceId}::uuid, ${userId}::uuid, format(${labels.restockNote}::text, r.qty),
+             jsonb_build_object('quantityChange', r.qty, 'avgCost', x.avg_cost), now(), now()
+      FROM restock r
+      JOIN restocked x ON x.product_id = r.product_id
+      UNION ALL
+      SELECT ${storeId}::uuid, l.product_id, l.original_quantity, l.original_quantity - l.quantity, -l.quantity, 'discard_loss',
+             'discard_damaged', ${referenceId}::uuid, ${userId}::uuid, COALESCE(l.notes, ${labels.discardNote}),
+             jsonb_build_object(
+               'reason', 'damaged', 'quantityDiscarded', l.quantity, 'unitCost', l.unit_cost,
+               'lossAmount', l.quantity * l.unit_cost,
+               'saleContext', jsonb_build_object('originalQtySold', l.original_quantity, 'remainingGoodQty', l.original_quantity - l.quantity)
+             ),
+             now(), now()
+      FROM lines l
+      WHERE l.restock_action = 'DISCARD'
+      RETURNING 1
+    ),
+    losses AS (
+      INSERT INTO inventory_revaluation_events (
+        store_id, product_id, user_id, source, reference_id, quantity_before, quantity_after,
+        revalued_quantity, delta_value, metadata, occurred_at
+      )
+      SELECT ${storeId}::uuid, l.product_id, ${userId}::uuid, 'stock_removal_damaged', ${referenceId}::uuid,
+             l.original_quantity, l.original_quantity - l.quantity, l.quantity, round(-(l.quantity * l.unit_cost), 4),
+             jsonb_build_object(
+               'reason', 'damaged', 'refundType', 'none', 'refundAmount', 0,
+               'lossAmount', l.quantity * l.unit_cost, 'costOfRemovedItems', l.quantity * l.unit_cost,
+               'isDiscardFromReturn', true,
+               'saleContext', jsonb_build_object('originalQtySold', l.original_quantity, 'remainingGoodQty', l.original_quantity - l.quantity)
+             ),
+             now()
+      FROM lines l
+      WHERE l.restock_action = 'DISCARD'
+      RETURNING 1
+    ),
+    ${revalued}
+    layers AS (
+      INSERT INTO inventory_cost_layers (store_id, product_id, quantity_remaining, unit_cost, source, reference_id, notes)
+      SELECT ${storeId}::uuid, x.product_id, r.qty, x.avg_cost, ${labels.source}, ${referenceId}::uuid, ${labels.layerNote}
+      FROM restock r
+      JOIN restocked x ON x.product_id = r.product_id
+      WHERE x.avg_cost > 0
+      RETURNING 1
+    )
+    SELECT x.product_id, x.quantity - r.qty AS quantity_before, x.quantity, x.min_stock_level
+    FROM restocked x
+    JOIN restock r ON r.product_id = x.product_id
+  `;
+}
+
+function parseRestocked(result: unknown): RestockedLevel[] {
+  return rowsOf(result).map((row) => ({
+    productId: String(row.product_id),
+    quantityBefore: Number(row.quantity_before ?? 0),
+    quantity: Number(row.quantity ?? 0),
+    minStockLevel: row.min_stock_level == null ? null : Number(row.min_stock_level),
+  }));
+}
+
+/**
+ * Restocks can only clear a low-stock alert, and only for products that were
+ * at or below their minimum before the units came back.
+ */
+export function restocksAffectingAlerts(levels: readonly RestockedLevel[]): RestockedLevel[] {
+  return levels.filter((row) => (row.minStockLevel ?? 0) > 0 && row.quantityBefore <= (row.minStockLevel ?? 0));
+}
+
+/** The REFUND transaction and one item per returned line, for refund analytics and COGS. */
+export function refundTransactionQuery(
+  context: ReturnContext,
+  plan: ReturnPlan,
+  meta: { storeId: string; userId: string; returnId: string; paymentMethod: string },
+): SQL {
+  const items = plan.lines.map((line) => ({
+    product_id: line.productId,
+    quantity: line.quantity,
+    unit_price: (line.refundAmount / line.quantity || 0).toFixed(4),
+    total_price: round2(line.refundAmount),
+    unit_cost: line.unitCost.toFixed(4),
+    total_cost: (line.unitCost * line.quantity).toFixed(4),
+  }));
+
+  return sql`
+    WITH refund AS (
+      INSERT INTO transactions (
+        store_id, cashier_id, status, kind, subtotal, tax_amount, total,
+        payment_method, amount_received, change_due, receipt_number, origin_transaction_id
+      )
+      VALUES (
+        ${meta.storeId}::uuid, ${meta.userId}::uuid, 'completed', 'REFUND',
+        ${round2(plan.productRefund)}::numeric, ${round2(plan.taxRefund)}::numeric, ${round2(plan.totalRefund)}::numeric,
+        ${meta.paymentMethod}::payment_method, 0, 0, ${meta.returnId}, ${context.originTransaction?.id ?? null}::uuid
+      )
+      RETURNING id
+    ),
+    refund_items AS (
+      INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, total_price, unit_cost, total_cost)
+      SELECT refund.id, l.product_id, l.quantity, l.unit_price, l.total_price, l.unit_cost, l.total_cost
+      FROM refund
+      CROSS JOIN jsonb_to_recordset(${JSON.stringify(items)}::jsonb)
+        AS l(product_id UUID, quantity INTEGER, unit_price NUMERIC, total_price NUMERIC, unit_cost NUMERIC, total_cost NUMERIC)
+      RETURNING 1
+    )
+    SELECT refund.id FROM refund
+  `;
+}
+
+export interface ReturnApplyMeta {
+  storeId: string;
+  userId: string;
+  reason?: string | null;
+  idempotencyKey: string;
+  /** The sale's payment method mapped onto the transactions enum */
+  refundPaymentMethod: "cash" | "card" | "digital";
+}
+
+export interface AppliedReturn extends ReturnRecord {
+  restocked: RestockedLevel[];
+  refundTransactionId: string | null;
+  loyaltyReversal: { customerId: string; points: number; balance: number | null } | null;
+}
+
+/**
+ * Write a planned return. Four statements (five with a loyalty reversal)
+ * whatever the number of lines; run it inside the transaction that loaded the
+ * context so the sale row stays locked.
+ */
+export async function applyReturn(
+  executor: Executor,
+  context: ReturnContext,
+  plan: ReturnPlan,
+  meta: ReturnApplyMeta,
+): Promise<AppliedReturn> {
+  const record = parseReturnRecord(await executor.execute(returnRecordQuery(context, {
+    storeId: meta.storeId,
+    userId: meta.userId,
+    reason: meta.reason,
+    refundType: plan.refundType,
+    totalRefund: plan.totalRefund,
+    idempotencyKey: meta.idempotencyKey,
+    markSaleReturned: true,
+  }, plan.lines)));
+  const returnId = record.return.id;
+
+  const restocked = parseRestocked(await executor.execute(returnStockQuery(meta.storeId, meta.userId, returnId, plan.lines, {
+    source: "pos_return",
+    restockNote: "POS return - %s units restocked",
+    layerNote: `Restocked from return ${returnId}`,
+    discardNote: "Discarded during return - product not sellable",
+    revalueRestock: false,
+  })));
+
+  const refund = rowsOf(await executor.execute(refundTransactionQuery(context, plan, {
+    storeId: meta.storeId,
+    userId: meta.userId,
+    returnId,
+    paymentMethod: meta.refundPaymentMethod,
+  })))[0];
+
+  let loyaltyReversal: AppliedReturn["loyaltyReversal"] = null;
+  if (plan.loyaltyReversal) {
+    const { customerId, points } = plan.loyaltyReversal;
+    const { balances, rejected } = await postLoyaltyEntries([{
+      holderKind: "customer",
+      holderId: customerId,
+      orgId: context.orgId,
+      delta: -points,
+      entryType: "reversal",
+      reason: "Points reversed for returned items",
+      source: "pos_return",
+      referenceId: context.saleId,
+      idempotencyKey: `pos_return:${returnId}`,
+    }], executor);
+    if (rejected.length) {
+      // The balance was spent between loading and posting; the refund still goes through
+      logger.warn("POS return: loyalty reversal exceeded the customer balance", { returnId, customerId, points });
+    } else {
+      loyaltyReversal = { customerId, points, balance: balances.get(customerId) ?? null };
+    }
+  }
+
+  return {
+    ...record,
+    restocked,
+    refundTransactionId: refund?.id ? String(refund.id) : null,
+    loyaltyReversal,
+  };
+}
+
+export interface PosReturnInput {
+  saleId: string;
+  storeId: string;
+  userId: string;
+  reason?: string | null;
+  idempotencyKey: string;
+  items: ReturnRequestLine[];
+  /** Maps the sale's payment method onto the transactions enum once it is loaded */
+  mapPaymentMethod: (raw: string) => "cash" | "card" | "digital";
+}
+
+/** Load, plan and apply a return in one transaction. Rejections throw ReturnRejectedError. */
+export async function processPosReturn(input: PosReturnInput): Promise<AppliedReturn> {
+  return runInTransaction("pos.return", async (tx) => {
+    const context = await loadReturnContext(tx, input.saleId);
+    const plan = planReturn(context, input.storeId, input.items);
+    return applyReturn(tx, context!, plan, {
+      storeId: input.storeId,
+      userId: input.userId,
+      reason: input.reason,
+      idempotencyKey: input.idempotencyKey,
+      refundPaymentMethod: input.mapPaymentMethod(context!.paymentMethod),
+    });
+  });
+}
+
+/**
+ * Swaps go through the same load and return writes: the returned units are
+ * recorded as a SWAP return (without marking the sale returned), and the
+ * swapped-in product, the origin transaction and the cash difference follow
+ * in the same transaction.
+ */
+
+export interface SwapRequest {
+  saleId: string;
+  storeId: string;
+  originalSaleItemId: string;
+  originalProductId: string;
+  originalQuantity: number;
+  originalUnitPrice: number;
+  /** Only the first product is swapped in, as before */
+  newProducts: Array<{ productId: string; quantity: number; unitPrice: number }>;
+  restockAction: RestockAction;
+  paymentMethod: "CASH" | "CARD" | "DIGITAL";
+  notes?: string;
+}
+
+export interface SwapPlan {
+  returnLine: PlannedReturnLine;
+  newProduct: { productId: string; name: string; quantity: number; unitPrice: number; onHand: number; unitCost: number };
+  originalTotal: number;
+  newTotal: number;
+  priceDifference: number;
+  taxDifference: number;
+  totalDifference: number;
+  taxRate: number;
+}
+
+export function planSwap(context: ReturnContext | null, request: SwapRequest): SwapPlan {
+  if (!context) throw new ReturnRejectedError("sale_not_found");
+  if (context.storeId !== request.storeId) throw new ReturnRejectedError("store_mismatch");
+  const saleLine = context.lines.find((line) => line.id === request.originalSaleItemId);
+  if (!saleLine) throw new ReturnRejectedError("item_not_in_sale");
+  if (request.originalQuantity > saleLine.quantity - saleLine.returnedQuantity) {
+    throw new ReturnRejectedError("quantity_exceeds_remaining");
+  }
+  if (!context.newProduct) throw new ReturnRejectedError("new_product_not_found");
+
+  const incoming = request.newProducts[0];
+  const taxRate = context.subtotal > 0 ? context.tax / context.subtotal : 0;
+  const originalTotal = request.originalUnitPrice * request.originalQuantity;
+  const newTotal = incoming.unitPrice * incoming.quantity;
+  const priceDifference = newTotal - originalTotal;
+  const taxDifference = priceDifference * taxRate;
+  const totalDifference = priceDifference + taxDifference;
+
+  return {
+    returnLine: {
+      saleItemId: saleLine.id,
+      productId: request.originalProductId,
+      quantity: request.originalQuantity,
+      restockAction: request.restockAction,
+      refundType: "SWAP",
+      refundAmount: Math.abs(totalDifference),
+      taxRefundAmount: 0,
+      unitCost: saleLine.avgCost,
+      originalQuantity: context.originItem?.quantity || request.originalQuantity,
+      notes: request.notes || `Swapped for product ${context.newProduct.name}`,
+    },
+    newProduct: {
+      productId: incoming.productId,
+      name: context.newProduct.name,
+      quantity: incoming.quantity,
+      unitPrice: incoming.unitPrice,
+      onHand: context.newProduct.quantity,
+      unitCost: context.newProduct.avgCost,
+    },
+    originalTotal,
+    newTotal,
+    priceDifference,
+    taxDifference,
+    totalDifference,
+    taxRate,
+  };
+}
+
+/**
+ * Take the swapped-in units out of stock, topping up first when the books show
+ * fewer than the customer is holding (the same discovery pos_commit_sale does),
+ * with movements, revaluation events and the discovery cost layer.
+ */
+export function swapOutStockQuery(storeId: string, userId: string, referenceId: string, productId: string, quantity: number): SQL {
+  return sql`
+    WITH locked AS (
+      SELECT i.id, i.product_id, i.quantity AS quantity_before, i.avg_cost,
+             GREATEST(${quantity}::integer - i.quantity, 0) AS discovered
+      FROM inventory i
+      WHERE i.store_id = ${storeId}::uuid AND i.product_id = ${productId}::uuid
+      FOR UPDATE
+    ),
+    adjusted AS (
+      UPDATE inventory i
+      SET quantity = l.quantity_before + l.discovered - ${quantity}::integer,
+          total_cost_value = (l.quantity_before + l.discovered - ${quantity}::integer) * i.avg_cost,
+          last_restocked = CASE WHEN l.discovered > 0 THEN now() ELSE i.last_restocked END,
+          updated_at = now()
+      FROM locked l
+      WHERE i.id = l.id
+      RETURNING l.product_id, l.quantity_before, l.avg_cost, l.discovered, i.quantity, i.min_stock_level
+    ),
+    costed AS (
+      SELECT a.*, CASE WHEN a.avg_cost > 0 THEN a.avg_cost ELSE GREATEST(COALESCE(p.cost, 0), 0) END AS fallback_cost
+      FROM adjusted a
+      LEFT JOIN products p ON p.id = a.product_id
+    ),
+    movements AS (
+      INSERT INTO stock_movements (
+        store_id, product_id, quantity_before, quantity_after, delta, action_type,
+        source, reference_id, user_id, notes, metadata, occurred_at, created_at
+      )
+      SELECT ${storeId}::uuid, c.product_id, c.quantity_before, c.quantity_before + c.discovered, c.discovered, 'adjustment',
+             'pos_stock_discovery', ${referenceId}::uuid, ${userId}::uuid,
+             format('Stock adjustment for swap - discovered %s units', c.discovered),
+             jsonb_build_object('quantityChange', c.discovered, 'avgCost', c.avg_cost), now(), now()
+      FROM costed c
+      WHERE c.discovered > 0
+      UNION ALL
+      SELECT ${storeId}::uuid, c.product_id, c.quantity_before + c.discovered, c.quantity, -${quantity}::integer, 'adjustment',
+             'pos_swap_out', ${referenceId}::uuid, ${userId}::uuid,
+             format('Product swap - %s units out', ${quantity}::integer),
+             jsonb_build_object('quantityChange', -${quantity}::integer, 'avgCost', c.avg_cost), now(), now()
+      FROM costed c
+      RETURNING 1
+    ),
+    revaluations AS (
+      INSERT INTO inventory_revaluation_events (
+        store_id, product_id, source, reference_id, quantity_before, quantity_after,
+        avg_cost_after, delta_value, metadata, occurred_at
+      )
+      SELECT ${storeId}::uuid, c.product_id, e.source, ${referenceId}::uuid, e.quantity_before, e.quantity_after,
+             c.avg_cost, e.change * c.avg_cost,
+             jsonb_build_object('quantityChange', e.change, 'notes', e.notes, 'userId', ${userId}::text),
+             now()
+      FROM costed c
+      CROSS JOIN LATERAL (VALUES
+        ('pos_stock_discovery', c.quantity_before, c.quantity_before + c.discovered, c.discovered,
+         format('Stock adjustment for swap - discovered %s units', c.discovered)),
+        ('pos_swap_out', c.quantity_before + c.discovered, c.quantity, -${quantity}::integer,
+         format('Product swap - %s units out', ${quantity}::integer))
+      ) AS e(source, quantity_before, quantity_after, change, notes)
+      WHERE c.avg_cost <> 0 AND e.change <> 0
+      RETURNING 1
+    ),
+    layers AS (
+      INSERT INTO inventory_cost_layers (store_id, product_id, quantity_remaining, unit_cost, source, reference_id, notes)
+      SELECT ${storeId}::uuid, c.product_id, c.discovered, c.fallback_cost, 'pos_stock_discovery', ${referenceId}::uuid,
+             'Discovered inventory - cost based on last recorded price'
+      FROM costed c
+      WHERE c.discovered > 0 AND c.fallback_cost > 0
+      RETURNING 1
+    )
+    SELECT product_id, quantity, min_stock_level FROM costed
+  `;
+}
+
+/**
+ * Point the sale's analytics row at the swapped-in product: shrink or replace
+ * the original transaction item and move the totals by the difference. Without
+ * an origin transaction a corrected SALE transaction is created instead.
+ */
+export function swapTransactionQuery(
+  context: ReturnContext,
+  plan: SwapPlan,
+  meta: { storeId: string; userId: string; paymentMethod: string },
+): SQL {
+  const incoming = plan.newProduct;
+  const newCost = incoming.unitCost * incoming.quantity;
+  const origin = context.originTransaction?.kind === "SALE" ? context.originTransaction : null;
+  const item = context.originItem;
+
+  if (!origin || !item) {
+    const tax = plan.newTotal * plan.taxRate;
+    return sql`
+      WITH corrected AS (
+        INSERT INTO transactions (
+          store_id, cashier_id, status, kind, subtotal, tax_amount, total,
+          payment_method, amount_received, change_due, receipt_number
+        )
+        VALUES (
+          ${meta.storeId}::uuid, ${meta.userId}::uuid, 'completed', 'SALE',
+          ${round2(plan.newTotal)}::numeric, ${round2(tax)}::numeric, ${round2(plan.newTotal + tax)}::numeric,
+          ${meta.paymentMethod}::payment_method, ${round2(plan.newTotal + tax)}::numeric, 0, ${context.saleId}
+        )
+        RETURNING id
+      ),
+      corrected_item AS (
+        INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, total_price, unit_cost, total_cost)
+        SELECT corrected.id, ${incoming.productId}::uuid, ${incoming.quantity}::integer, ${incoming.unitPrice.toFixed(4)}::numeric,
+               ${round2(plan.newTotal)}::numeric, ${incoming.unitCost.toFixed(4)}::numeric, ${newCost.toFixed(4)}::numeric
+        FROM corrected
+        RETURNING 1
+      )
+      SELECT corrected.id, false AS rewritten FROM corrected
+    `;
+  }
+
+  const remaining = item.quantity - plan.returnLine.quantity;
+  const itemChange = remaining > 0
+    ? sql`
+      shrunk AS (
+        UPDATE transaction_items
+        SET quantity = ${remaining}::integer,
+            total_price = ${round2(item.unitPrice * remaining)}::numeric,
+            total_cost = ${(item.unitCost * remaining).toFixed(4)}::numeric
+        WHERE id = ${item.id}::uuid
+        RETURNING 1
+      ),
+      added AS (
+        INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, total_price, unit_cost, total_cost)
+        VALUES (${origin.id}::uuid, ${incoming.productId}::uuid, ${incoming.quantity}::integer, ${incoming.unitPrice.toFixed(4)}::numeric,
+                ${round2(plan.newTotal)}::numeric, ${incoming.unitCost.toFixed(4)}::numeric, ${newCost.toFixed(4)}::numeric)
+        RETURNING 1
+      ),`
+    : sql`
+      replaced AS (
+        UPDATE transaction_items
+        SET product_id = ${incoming.productId}::uuid,
+            quantity = ${incoming.quantity}::integer,
+            unit_price = ${incoming.unitPrice.toFixed(4)}::numeric,
+            total_price = ${round2(plan.newTotal)}::numeric,
+            unit_cost = ${incoming.unitCost.toFixed(4)}::numeric,
+            total_cost = ${newCost.toFixed(4)}::numeric
+        WHERE id = ${item.id}::uuid
+        RETURNING 1
+      ),`;
+
+  return sql`
+    WITH ${itemChange}
+    totals AS (
+      UPDATE transactions
+      SET subtotal = subtotal + ${plan.priceDifference.toFixed(2)}::numeric,
+          tax_amount = tax_amount + ${plan.taxDifference.toFixed(2)}::numeric,
+          total = total + ${plan.totalDifference.toFixed(2)}::numeric,
+          amount_received = total + ${plan.totalDifference.toFixed(2)}::numeric
+      WHERE id = ${origin.id}::uuid
+      RETURNING id
+    )
+    SELECT id, true AS rewritten FROM totals
+  `;
+}
+
+/** SWAP_REFUND / SWAP_CHARGE: the cash drawer side of a price difference, not a P&L event. */
+export function swapCashQuery(
+  plan: SwapPlan,
+  meta: { storeId: string; userId: string; paymentMethod: string; returnId: string },
+): SQL | null {
+  if (plan.priceDifference === 0) return null;
+  const refund = plan.priceDifference < 0;
+  const suffix = meta.returnId.slice(-8);
+  const amount = Math.abs(plan.totalDifference);
+  return sql`
+    INSERT INTO transactions (
+      store_id, cashier_id, status, kind, subtotal, tax_amount, total,
+      payment_method, amount_received, change_due, receipt_number
+    )
+    VALUES (
+      ${meta.storeId}::uuid, ${meta.userId}::uuid, 'completed', ${refund ? "SWAP_REFUND" : "SWAP_CHARGE"}::transaction_kind,
+      ${round2(Math.abs(plan.priceDifference))}::numeric, ${round2(Math.abs(plan.taxDifference))}::numeric, ${round2(amount)}::numeric,
+      ${meta.paymentMethod}::payment_method, ${refund ? "0" : round2(amount)}::numeric, ${refund ? round2(amount) : "0"}::numeric,
+      ${refund ? `SWAP-REFUND-${suffix}` : `SWAP-CHARGE-${suffix}`}
+    )
+  `;
+}
+
+export interface AppliedSwap {
+  returnId: string;
+  transactionId: string | null;
+  receiptNumber: string;
+  restocked: RestockedLevel[];
+  /** Stock level of the swapped-in product after the swap */
+  newProductStock: RestockedLevel | null;
+}
+
+export async function applySwap(
+  executor: Executor,
+  context: ReturnContext,
+  plan: SwapPlan,
+  meta: { storeId: string; userId: string; idempotencyKey: string; reason?: string | null; paymentMethod: "cash" | "card" | "digital" },
+): Promise<AppliedSwap> {
+  const record = parseReturnRecord(await executor.execute(returnRecordQuery(context, {
+    storeId: meta.storeId,
+    userId: meta.userId,
+    reason: meta.reason || "Product swap",
+    refundType: "SWAP",
+    totalRefund: Math.abs(plan.totalDifference),
+    idempotencyKey: meta.idempotencyKey,
+    markSaleReturned: false,
+  }, [plan.returnLine])));
+  const returnId = record.return.id;
+
+  const restocked = parseRestocked(await executor.execute(returnStockQuery(meta.storeId, meta.userId, returnId, [plan.returnLine], {
+    source: "pos_swap_return",
+    restockNote: "Product swap - %s units restocked",
+    layerNote: `Restocked from swap ${returnId}`,
+    discardNote: "Discarded during swap - product not sellable",
+    revalueRestock: true,
+  })));
+
+  const incoming = plan.newProduct;
+  await executor.execute(sql`
+    INSERT INTO inventory (store_id, product_id, quantity)
+    VALUES (${meta.storeId}::uuid, ${incoming.productId}::uuid, 0)
+    ON CONFLICT (store_id, product_id) DO NOTHING
+  `);
+  const outRow = rowsOf(await executor.execute(
+    swapOutStockQuery(meta.storeId, meta.userId, returnId, incoming.productId, incoming.quantity),
+  ))[0];
+  await executor.execute(fifoConsumptionQuery(meta.storeId, [{ productId: incoming.productId, quantity: incoming.quantity }]));
+
+  const txRow = rowsOf(await executor.execute(swapTransactionQuery(context, plan, meta)))[0];
+  const cash = swapCashQuery(plan, { ...meta, returnId });
+  if (cash) await executor.execute(cash);
+
+  const rewritten = txRow?.rewritten === true || txRow?.rewritten === "t";
+  return {
+    returnId,
+    transactionId: txRow?.id ? String(txRow.id) : null,
+    receiptNumber: rewritten ? `SWAP-${returnId.slice(-8)}` : context.saleId,
+    restocked,
+    newProductStock: outRow
+      ? {
+          productId: String(outRow.product_id),
+          quantityBefore: Number(outRow.quantity ?? 0) + incoming.quantity,
+          quantity: Number(outRow.quantity ?? 0),
+          minStockLevel: outRow.min_stock_level == null ? null : Number(outRow.min_stock_level),
+        }
+      : null,
+  };
+}
+
+/** Load, plan and apply a swap in one transaction. Rejections throw ReturnRejectedError. */
+export async function processPosSwap(
+  request: SwapRequest,
+  meta: { userId: string; idempotencyKey: string },
+): Promise<{ plan: SwapPlan; currency: string; applied: AppliedSwap }> {
+  return runInTransaction("pos.swap", async (tx) => {
+    const context = await loadReturnContext(tx, request.saleId, {
+      swap: { originalProductId: request.originalProductId, newProductId: request.newProducts[0].productId },
+    });
+    const plan = planSwap(context, request);
+    const applied = await applySwap(tx, context!, plan, {
+      storeId: request.storeId,
+      userId: meta.userId,
+      idempotencyKey: meta.idempotencyKey,
+      reason: request.notes,
+      paymentMethod: request.paymentMethod.toLowerCase() as "cash" | "card" | "digital",
+    });
+    return { plan, currency: context!.currency, applied };
+  });
+}
@@ -0,0 +1,156 @@
+import { db, transactionContext, type TransactionScope } from "../db";
+import { envNumber } from "./env";
+import { logger } from "./logger";
+
+/** The drizzle handle bound to the connection holding a transaction. */
+export type TransactionExecutor = Parameters<Parameters<typeof db.transaction>[0]>[0];
+
+export interface RouteHoldStats {
+  route: string;
+  transactions: number;
+  failures: number;
+  /** Connection checkouts made alongside the transaction (should stay 0) */
+  doubleCheckouts: number;
+  nested: number;
+  avgHoldMs: number;
+  p95HoldMs: number;
+  maxHoldMs: number;
+}
+
+export interface OpenTransaction {
+  route: string;
+  heldMs: number;
+}
+
+export interface TransactionStats {
+  routes: RouteHoldStats[];
+  open: OpenTransaction[];
+  slowHolds: number;
+}
+
+const HOLD_SAMPLE_SIZE = 256;
+
+interface RouteAccumulator {
+  transactions: number;
+  failures: number;
+  doubleCheckouts: number;
+  nested: number;
+  totalHoldMs: number;
+  maxHoldMs: number;
+  samples: number[];
+  cursor: number;
+}
+
+const routeStats = new Map<string, RouteAccumulator>();
+const openScopes = new Map<TransactionScope, number>();
+let slowHolds = 0;
+
+function accumulatorFor(route: string): RouteAccumulator {
+  let stats = routeStats.get(route);
+  if (!stats) {
+    stats = { transactions: 0, failures: 0, doubleCheckouts: 0, nested: 0, totalHoldMs: 0, maxHoldMs: 0, samples: [], cursor: 0 };
+    routeStats.set(route, stats);
+  }
+  return stats;
+}
+
+function recordHold(route: string, heldMs: number, failed: boolean, foreignCheckouts: number): void {
+  const stats = accumulatorFor(route);
+  stats.transactions += 1;
+  if (failed) stats.failures += 1;
+  stats.doubleCheckouts += foreignCheckouts;
+  stats.totalHoldMs += heldMs;
+  stats.maxHoldMs = Math.max(stats.maxHoldMs, heldMs);
+  if (stats.samples.length < HOLD_SAMPLE_SIZE) {
+    stats.samples.push(heldMs);
+  } else {
+    stats.samples[stats.cursor] = heldMs;
+    stats.cursor = (stats.cursor + 1) % HOLD_SAMPLE_SIZE;
+  }
+}
+
+function percentile(samples: readonly number[], p: number): number {
+  if (samples.length === 0) return 0;
+  const sorted = [...samples].sort((a, b) => a - b);
+  return sorted[Math.min(sorted.length - 1, Math.ceil((p / 100) * sorted.length) - 1)];
+}
+
+/**
+ * Run `fn` in a transaction on a single pooled connection. The transaction is
+ * published on `transactionContext`, so `db` (and any storage helper using
+ * it) resolves to the same connection until `fn` settles; afterwards work
+ * spawned from inside falls back to the pool instead of a released client.
+ *
+ * A call made while another scope is open becomes a savepoint on the outer
+ * connection rather than a second checkout. Direct pool checkouts from inside
+ * a scope are counted as double checkouts, and a scope held for longer than
+ * TX_HOLD_WARN_MS is reported while still open, which is how leaks surface.
+ */
+export async function runInTransaction<T>(route: string, fn: (tx: TransactionExecutor) => Promise<T>): Promise<T> {
+  const outer = transactionContext.getStore();
+  if (outer?.open) {
+    accumulatorFor(outer.route).nested += 1;
+    return (outer.tx as TransactionExecutor).transaction(fn);
+  }
+
+  const warnAfterMs = envNumber("TX_HOLD_WARN_MS", 5_000);
+  const startedAt = Date.now();
+  let scope: TransactionScope | null = null;
+  let failed = false;
+
+  const timer = setTimeout(() => {
+    slowHolds += 1;
+    logger.warn("Database transaction held longer than expected", {
+      route,
+      heldMs: Date.now() - startedAt,
+      thresholdMs: warnAfterMs,
+    });
+  }, warnAfterMs);
+  timer.unref?.();
+
+  try {
+    return await db.transaction(async (tx) => {
+      scope = { route, tx, open: true, foreignCheckouts: 0 };
+      openScopes.set(scope, startedAt);
+      const active = scope;
+      try {
+        return await transactionContext.run(active, () => fn(tx));
+      } finally {
+        active.open = false;
+      }
+    });
+  } catch (error) {
+    failed = true;
+    throw error;
+  } finally {
+    clearTimeout(timer);
+    const closed = scope as TransactionScope | null;
+    if (closed) openScopes.delete(closed);
+    const foreignCheckouts = closed?.foreignCheckouts ?? 0;
+    recordHold(route, Date.now() - startedAt, failed, foreignCheckouts);
+    if (foreignCheckouts > 0) {
+      logger.warn("Database connection checked out while a transaction was held", { route, foreignCheckouts });
+    }
+  }
+}
+
+export function getTransactionStats(now = Date.now()): TransactionStats {
+  const routes = Array.from(routeStats, ([route, stats]) => ({
+    route,
+    transactions: stats.transactions,
+    failures: stats.failures,
+    doubleCheckouts: stats.doubleCheckouts,
+    nested: stats.nested,
+    avgHoldMs: stats.transactions ? Math.round((stats.totalHoldMs / stats.transactions) * 100) / 100 : 0,
+    p95HoldMs: percentile(stats.samples, 95),
+    maxHoldMs: stats.maxHoldMs,
+  })).sort((a, b) => b.avgHoldMs * b.transactions - a.avgHoldMs * a.transactions);
+  const open = Array.from(openScopes, ([scope, startedAt]) => ({ route: scope.route, heldMs: now - startedAt }))
+    .sort((a, b) => b.heldMs - a.heldMs);
+  return { routes, open, slowHolds };
+}
+
+export function resetTransactionStats(): void {
+  routeStats.clear();
+  slowHolds = 0;
+}
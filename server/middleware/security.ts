@@ -6,6 +6,7 @@ import rateLimit, { ipKeyGenerator } from "express-rate-limit";
 import helmet from "helmet";
 import { loadEnv, parseCorsOrigins } from "../../shared/env";
 import { logger } from "../lib/logger";
+import { createRateLimitStore } from "../lib/rate-limit-store";
 const deriveRateLimitKey = (req: Request) => ipKeyGenerator(req.ip ?? "unknown");
 // Determine environment early for conditional security config
 const isDev = process.env.NODE_ENV !== 'production';
@@ -73,6 +74,8 @@ const shouldSkipRateLimit = (req: Request): boolean => {
 
 // Global rate limiting (configurable via env)
 export const globalRateLimit = rateLimit({
+  // Shared across instances via Redis when REDIS_URL is set
+  store: createRateLimitStore('global'),
   windowMs: Number(process.env.RATE_LIMIT_GLOBAL_WINDOW_MS || 15 * 60 * 1000),
   max: Number(process.env.RATE_LIMIT_GLOBAL_MAX || 500), // Increased from 200 for POS workloads
   message: {
@@ -104,6 +107,7 @@ export const globalRateLimit = rateLimit({
 
 // Auth-specific rate limiting (configurable)
 export const authRateLimit = rateLimit({
+  store: createRateLimitStore('auth'),
   windowMs: Number(process.env.RATE_LIMIT_AUTH_WINDOW_MS || 10 * 60 * 1000),
   max: Number(process.env.RATE_LIMIT_AUTH_MAX || 10),
   message: {
@@ -135,6 +139,7 @@ export const authRateLimit = rateLimit({
 
 // Sensitive endpoints rate limiting (configurable)
 export const sensitiveEndpointRateLimit = rateLimit({
+  store: createRateLimitStore('sensitive'),
   windowMs: Number(process.env.RATE_LIMIT_SENSITIVE_WINDOW_MS || 60 * 1000),
   max: Number(process.env.RATE_LIMIT_SENSITIVE_MAX || 5),
   message: {
@@ -166,6 +171,7 @@ export const sensitiveEndpointRateLimit = rateLimit({
 
 // Payment-specific rate limiting (configurable)
 export const paymentRateLimit = rateLimit({
+  store: createRateLimitStore('payment'),
   windowMs: Number(process.env.RATE_LIMIT_PAYMENT_WINDOW_MS || 60 * 1000),
   max: Number(process.env.RATE_LIMIT_PAYMENT_MAX || 3),
   message: {
@@ -293,6 +299,19 @@ export const csrfProtection = (req: Request, res: Response, next: NextFunction)
       return next();
     }
   }
+  // Batched replay of the same queue: every entry carries its own idempotency key
+  if (req.method === 'POST' && (req.path === '/pos/sales/batch' || originalUrl === '/api/pos/sales/batch')) {
+    const idempotencyKey = req.get('Idempotency-Key');
+    if (idempotencyKey && idempotencyKey.length > 0) {
+      logger.debug('Bypassing CSRF for POS sale batch with idempotency key', {
+        idempotencyKey,
+        ip: req.ip,
+        path: req.path,
+        originalUrl,
+      });
+      return next();
+    }
+  }
   if (req.method === 'POST' && (req.path === '/pos/returns' || originalUrl === '/api/pos/returns')) {
     const idempotencyKey = req.get('Idempotency-Key');
     if (idempotencyKey && idempotencyKey.length > 0) {
@@ -523,35 +542,6 @@ export const ipWhitelistCheck = (req: Request, res: Response, next: NextFunction
   next();
 };
 
-// Request logging for security monitoring
-export const securityLogging = (req: Request, res: Response, next: NextFunction) => {
-  const startTime = Date.now();
-  
-  // Log request details for security monitoring
-  logger.info('Incoming request', {
-    method: req.method,
-    path: req.path,
-    ip: req.ip,
-    userAgent: req.get('User-Agent'),
-    referer: req.get('Referer'),
-    timestamp: new Date().toISOString()
-  });
-  
-  // Log response details
-  res.on('finish', () => {
-    const duration = Date.now() - startTime;
-    logger.info('Request completed', {
-      method: req.method,
-      path: req.path,
-      statusCode: res.statusCode,
-      duration,
-      ip: req.ip
-    });
-  });
-  
-  next();
-};
-
 // Middleware to detect and log suspicious redirect URLs
 export const redirectSecurityCheck = (req: Request, res: Response, next: NextFunction) => {
   const redirectUrl = req.query.redirect || req.query.returnTo || req.query.next;
@@ -0,0 +1,227 @@
+import { createServer, type IncomingMessage, type ServerResponse } from 'node:http';
+import type { AddressInfo } from 'node:net';
+
+/**
+ * In-process stand-in for the Paystack and Flutterwave endpoints used by
+ * autopay billing, so billing runs can be exercised and load-tested offline:
+ *
+ *   const fake = await startFakePaymentProviders({ latencyMs: 150, ratePerSecond: 20 });
+ *   const service = new PaymentService(fake.baseUrls);
+ *
+ * Implemented routes:
+ *   POST /paystack/transaction/charge_authorization
+ *   GET  /paystack/transaction/verify/:reference
+ *   POST /flutterwave/tokenized-charges
+ *   GET  /flutterwave/transactions/verify_by_reference?tx_ref=
+ *
+ * Like the real providers, a reference can only be charged once; a repeated
+ * reference is rejected and the original transaction stays queryable through
+ * the verify routes. Requests above `ratePerSecond` (per provider) get a 429.
+ */
+
+export interface FakePaymentProviderOptions {
+  /** Added to every response */
+  latencyMs?: number;
+  /** Extra uniformly distributed latency on top of latencyMs */
+  jitterMs?: number;
+  /** Share of charges (0..1) declined by the issuer */
+  declineRate?: number;
+  /** Per-provider request budget per second; 0 disables throttling */
+  ratePerSecond?: number;
+  /** Deterministic PRNG seed for declines and jitter */
+  seed?: number;
+}
+
+export interface FakePaymentProviderStats {
+  requests: number;
+  charges: number;
+  declined: number;
+  duplicates: number;
+  throttled: number;
+  verifies: number;
+  maxInFlight: number;
+}
+
+export interface FakePaymentProviders {
+  url: string;
+  baseUrls: { paystackBaseUrl: string; flutterwaveBaseUrl: string };
+  stats: FakePaymentProviderStats;
+  /** References charged so far with the resulting status */
+  transactions: Map<string, { provider: 'paystack' | 'flutterwave'; status: 'success' | 'failed'; amount: number; currency: string }>;
+  close(): Promise<void>;
+}
+
+function mulberry32(seed: number) {
+  let state = seed >>> 0;
+  return () => {
+    state = (state + 0x6d2b79f5) >>> 0;
+    let t = state;
+    t = Math.imul(t ^ (t >>> 15), t | 1);
+    t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+async function readJson(req: IncomingMessage): Promise<any> {
+  const chunks: Buffer[] = [];
+  for await (const chunk of req) chunks.push(chunk as Buffer);
+  if (chunks.length === 0) return {};
+  try {
+    return JSON.parse(Buffer.concat(chunks).toString('utf8'));
+  } catch {
+    return {};
+  }
+}
+
+function send(res: ServerResponse, status: number, body: unknown) {
+  res.writeHead(status, { 'Content-Type': 'application/json' });
+  res.end(JSON.stringify(body));
+}
+
+export async function startFakePaymentProviders(options: FakePaymentProviderOptions = {}): Promise<FakePaymentProviders> {
+  const latencyMs = Math.max(0, options.latencyMs ?? 0);
+  const jitterMs = Math.max(0, options.jitterMs ?? 0);
+  const declineRate = Math.min(1, Math.max(0, options.declineRate ?? 0));
+  const ratePerSecond = Math.max(0, options.ratePerSecond ?? 0);
+  const random = mulberry32(options.seed ?? 1);
+
+  const stats: FakePaymentProviderStats = {
+    requests: 0,
+    charges: 0,
+    declined: 0,
+    duplicates: 0,
+    throttled: 0,
+    verifies: 0,
+    maxInFlight: 0,
+  };
+  const transactions: FakePaymentProviders['transactions'] = new Map();
+  const windows = new Map<string, { second: number; count: number }>();
+  let inFlight = 0;
+
+  const throttled = (provider: string) => {
+    if (ratePerSecond <= 0) return false;
+    const second = Math.floor(Date.now() / 1000);
+    const window = windows.get(provider);
+    if (!window || window.second !== second) {
+      windows.set(provider, { second, count: 1 });
+      return false;
+    }
+    window.count += 1;
+    return window.count > ratePerSecond;
+  };
+
+  const charge = (provider: 'paystack' | 'flutterwave', reference: string, amount: number, currency: string) => {
+    const existing = transactions.get(reference);
+    if (existing) {
+      stats.duplicates += 1;
+      return null;
+    }
+    const status = random() < declineRate ? 'failed' : 'success';
+    transactions.set(reference, { provider, status, amount, currency });
+    stats.charges += 1;
+    if (status === 'failed') stats.declined += 1;
+    return status;
+  };
+
+  const handle = async (req: IncomingMessage, res: ServerResponse) => {
+    const url = new URL(req.url ?? '/', 'http://localhost');
+    const [, provider] = url.pathname.split('/');
+    const delay = latencyMs + (jitterMs ? random() * jitterMs : 0);
+    if (delay > 0) await new Promise((resolve) => setTimeout(resolve, delay));
+
+    if ((provider === 'paystack' || provider === 'flutterwave') && throttled(provider)) {
+      stats.throttled += 1;
+      return send(res, 429, { status: false, message: 'Too many requests' });
+    }
+
+    if (req.method === 'POST' && url.pathname === '/paystack/transaction/charge_authorization') {
+      const body = await readJson(req);
+      const reference = String(body.reference ?? '');
+      if (!reference || !body.authorization_code) {
+        return send(res, 400, { status: false, message: 'Invalid authorization or reference' });
+      }
+      const status = charge('paystack', reference, Number(body.amount ?? 0), String(body.currency ?? 'NGN'));
+      if (!status) return send(res, 400, { status: false, message: 'Duplicate Transaction Reference' });
+      return send(res, 200, {
+        status: true,
+        message: 'Charge attempted',
+        data: {
+          reference,
+          status,
+          amount: Number(body.amount ?? 0),
+          currency: body.currency,
+          gateway_response: status === 'success' ? 'Approved' : 'Declined',
+        },
+      });
+    }
+
+    if (req.method === 'GET' && url.pathname.startsWith('/paystack/transaction/verify/')) {
+      stats.verifies += 1;
+      const reference = decodeURIComponent(url.pathname.slice('/paystack/transaction/verify/'.length));
+      const tx = transactions.get(reference);
+      if (!tx) return send(res, 404, { status: false, message: 'Transaction reference not found' });
+      return send(res, 200, { status: true, data: { reference, status: tx.status, amount: tx.amount, currency: tx.currency } });
+    }
+
+    if (req.method === 'POST' && url.pathname === '/flutterwave/tokenized-charges') {
+      const body = await readJson(req);
+      const reference = String(body.tx_ref ?? '');
+      if (!reference || !body.token) {
+        return send(res, 400, { status: 'error', message: 'Invalid token or tx_ref' });
+      }
+      const status = charge('flutterwave', reference, Number(body.amount ?? 0), String(body.currency ?? 'USD'));
+      if (!status) return send(res, 400, { status: 'error', message: 'Duplicate transaction reference' });
+      return send(res, 200, {
+        status: 'success',
+        message: 'Charge successful',
+        data: {
+          tx_ref: reference,
+          flw_ref: `FLW-MOCK-${reference}`,
+          status: status === 'success' ? 'successful' : 'failed',
+          amount: Number(body.amount ?? 0),
+          currency: body.currency,
+        },
+      });
+    }
+
+    if (req.method === 'GET' && url.pathname === '/flutterwave/transactions/verify_by_reference') {
+      stats.verifies += 1;
+      const reference = url.searchParams.get('tx_ref') ?? '';
+      const tx = transactions.get(reference);
+      if (!tx) return send(res, 404, { status: 'error', message: 'No transaction was found for this id' });
+      return send(res, 200, {
+        status: 'success',
+        data: { tx_ref: reference, status: tx.status === 'success' ? 'successful' : 'failed', amount: tx.amount, currency: tx.currency },
+      });
+    }
+
+    return send(res, 404, { status: false, message: 'Not found' });
+  };
+
+  const server = createServer((req, res) => {
+    stats.requests += 1;
+    inFlight += 1;
+    stats.maxInFlight = Math.max(stats.maxInFlight, inFlight);
+    res.on('close', () => {
+      inFlight -= 1;
+    });
+    handle(req, res).catch((error) => {
+      send(res, 500, { status: false, message: error instanceof Error ? error.message : String(error) });
+    });
+  });
+
+  await new Promise<void>((resolve) => server.listen(0, '127.0.0.1', resolve));
+  const { port } = server.address() as AddressInfo;
+  const url = `http://127.0.0.1:${port}`;
+
+  return {
+    url,
+    baseUrls: { paystackBaseUrl: `${url}/paystack`, flutterwaveBaseUrl: `${url}/flutterwave` },
+    stats,
+    transactions,
+    close: () =>
+      new Promise<void>((resolve, reject) => {
+        server.close((error) => (error ? reject(error) : resolve()));
+      }),
+  };
+}
@@ -26,11 +26,13 @@ export interface PaymentResponse {
   };
 }
 
-interface PaymentChargeResult {
+export interface PaymentChargeResult {
   success: boolean;
   reference?: string;
   raw?: any;
   message?: string;
+  // HTTP status of a rejected request, so callers can tell throttling (429) from declines
+  httpStatus?: number;
 }
 
 interface PaymentRefundResult {
@@ -53,12 +55,16 @@ export interface AutopayDetails {
 export class PaymentService {
   private paystackSecretKey: string;
   private flutterwaveSecretKey: string;
-  private paystackBaseUrl = 'https://api.paystack.co';
-  private flutterwaveBaseUrl = 'https://api.flutterwave.com/v3';
+  private paystackBaseUrl: string;
+  private flutterwaveBaseUrl: string;
 
-  constructor() {
+  // Base URLs are overridable so billing runs can be load-tested against
+  // server/payment/fake-provider-server.ts
+  constructor(options: { paystackBaseUrl?: string; flutterwaveBaseUrl?: string } = {}) {
     this.paystackSecretKey = process.env.PAYSTACK_SECRET_KEY || '';
     this.flutterwaveSecretKey = process.env.FLUTTERWAVE_SECRET_KEY || '';
+    this.paystackBaseUrl = (options.paystackBaseUrl || process.env.PAYSTACK_BASE_URL || 'https://api.paystack.co').replace(/\/+$/, '');
+    this.flutterwaveBaseUrl = (options.flutterwaveBaseUrl || process.env.FLUTTERWAVE_BASE_URL || 'https://api.flutterwave.com/v3').replace(/\/+$/, '');
     
     // Log the keys for debugging (without exposing full keys)
     console.log('PaymentService initialization:', {
@@ -660,6 +666,7 @@ export class PaymentService {
         reference,
         raw: axiosError.response?.data,
         message: responseData?.message || axiosError.message,
+        httpStatus: axiosError.response?.status,
       };
     }
   }
@@ -710,6 +717,7 @@ export class PaymentService {
         reference,
         raw: axiosError.response?.data,
         message: responseData?.message || axiosError.message,
+        httpStatus: axiosError.response?.status,
       };
     }
   }
@@ -0,0 +1,311 @@
+import { eq, sql } from 'drizzle-orm';
+import { subscriptions, subscriptionPayments, organizations } from '@shared/schema';
+import { db } from '../db';
+import { logger } from '../lib/logger';
+import { emitPaymentAlert } from '../lib/notification-producers';
+
+/**
+ * Subscription and payment side effects of verified Paystack and Flutterwave
+ * webhook events. Used inline by the webhook routes and by the background
+ * consumer in server/jobs/webhook-queue.ts when WEBHOOK_INGEST_MODE=queue.
+ */
+
+export type WebhookProvider = 'PAYSTACK' | 'FLW';
+
+export type WebhookApplyResult =
+  | { outcome: 'applied'; orgId: string }
+  | { outcome: 'unresolved' }
+  | { outcome: 'org_missing'; orgId: string };
+
+interface SubscriptionIdentifiers {
+  orgId?: string;
+  planCode?: string;
+  externalSubId?: string;
+  externalCustomerId?: string;
+}
+
+function paystackIdentifiers(data: any): SubscriptionIdentifiers {
+  return {
+    orgId: data?.metadata?.orgId as string | undefined,
+    planCode: data?.metadata?.planCode as string | undefined,
+    externalSubId: (data?.subscription) || (data?.subscription_code) || undefined,
+    externalCustomerId: (data?.customer?.customer_code) || (data?.customer?.id) || undefined,
+  };
+}
+
+function flutterwaveIdentifiers(data: any): SubscriptionIdentifiers {
+  const externalSubId = (data?.plan) || (data?.payment_plan);
+  const externalCustomerId = data?.customer?.id;
+  return {
+    orgId: data?.meta?.orgId as string | undefined,
+    planCode: data?.meta?.planCode as string | undefined,
+    externalSubId: externalSubId ? String(externalSubId) : undefined,
+    externalCustomerId: externalCustomerId ? String(externalCustomerId) : undefined,
+  };
+}
+
+function identifiersFor(provider: WebhookProvider, evt: any): SubscriptionIdentifiers {
+  return provider === 'PAYSTACK' ? paystackIdentifiers(evt?.data) : flutterwaveIdentifiers(evt?.data);
+}
+
+async function findSubscriptionByExternalIds(ids: SubscriptionIdentifiers) {
+  const bySub = ids.externalSubId
+    ? await db.select().from(subscriptions).where(eq(subscriptions.externalSubId, ids.externalSubId)).then(r => r[0])
+    : undefined;
+  const byCustomer = !bySub && ids.externalCustomerId
+    ? await db.select().from(subscriptions).where(eq(subscriptions.externalCustomerId, ids.externalCustomerId)).then(r => r[0])
+    : undefined;
+  return bySub || byCustomer;
+}
+
+/** Read orgId/planCode from metadata, falling back to the subscription matched by external ids. */
+async function resolveSubscriptionTarget(ids: SubscriptionIdentifiers): Promise<{ orgId?: string; planCode?: string }> {
+  let { orgId, planCode } = ids;
+  if ((!orgId || !planCode) && (ids.externalSubId || ids.externalCustomerId)) {
+    const matched = await findSubscriptionByExternalIds(ids);
+    if (matched) {
+      orgId = matched.orgId as any;
+      planCode = matched.planCode as any;
+    }
+  }
+  return { orgId, planCode };
+}
+
+/**
+ * Key that serialises queued events of the same subscription. Subscriptions are
+ * upserted per org, so events resolve to their org where possible.
+ */
+export async function resolveOrderingKey(provider: WebhookProvider, evt: any, providerEventId: string): Promise<string> {
+  const ids = identifiersFor(provider, evt);
+  if (ids.orgId) return `org:${ids.orgId}`;
+  if (ids.externalSubId || ids.externalCustomerId) {
+    const matched = await findSubscriptionByExternalIds(ids);
+    if (matched?.orgId) return `org:${matched.orgId}`;
+    return ids.externalSubId ? `sub:${provider}:${ids.externalSubId}` : `customer:${provider}:${ids.externalCustomerId}`;
+  }
+  return `event:${provider}:${providerEventId}`;
+}
+
+async function upsertSubscription(
+  provider: WebhookProvider,
+  orgId: string,
+  planCode: string,
+  status: string,
+  evt: any,
+  fields: { externalCustomerId?: string; externalSubId?: string; startedAt?: Date; currentPeriodEnd?: Date },
+) {
+  // Upsert by (orgId)
+  const existing = await db.select().from(subscriptions).where(eq(subscriptions.orgId, orgId));
+  if (existing[0]) {
+    await db.update(subscriptions).set({
+      planCode,
+      provider: provider as any,
+      status: status as any,
+      externalCustomerId: fields.externalCustomerId as any,
+      externalSubId: fields.externalSubId as any,
+      startedAt: (fields.startedAt as any) ?? existing[0].startedAt,
+      currentPeriodEnd: (fields.currentPeriodEnd as any) ?? existing[0].currentPeriodEnd,
+      lastEventRaw: evt as any,
+      updatedAt: new Date() as any,
+    } as any).where(eq(subscriptions.orgId, orgId));
+  } else {
+    await db.insert(subscriptions).values({
+      orgId,
+      planCode,
+      provider: provider as any,
+      status: status as any,
+      externalCustomerId: fields.externalCustomerId as any,
+      externalSubId: fields.externalSubId as any,
+      startedAt: fields.startedAt as any,
+      currentPeriodEnd: fields.currentPeriodEnd as any,
+      lastEventRaw: evt as any,
+    } as any);
+  }
+}
+
+async function applyOrganizationStatus(orgId: string, status: string) {
+  if (status === 'ACTIVE') {
+    await db.execute(sql`UPDATE organizations SET is_active = true, locked_until = NULL WHERE id = ${orgId}`);
+    // Note: Stores remain inactive - admin must reactivate them via the reactivation modal
+    // This allows admins to choose which stores to reactivate based on their plan limits
+  } else if (status === 'PAST_DUE') {
+    const grace = new Date(Date.now() + 3 * 24 * 60 * 60 * 1000);
+    await db.execute(sql`UPDATE organizations SET locked_until = ${grace} WHERE id = ${orgId}`);
+  } else if (status === 'CANCELLED') {
+    await db.execute(sql`UPDATE organizations SET is_active = false WHERE id = ${orgId}`);
+    // Deactivate all stores when subscription is cancelled
+    await db.execute(sql`UPDATE stores SET is_active = false WHERE org_id = ${orgId}`);
+  }
+}
+
+export async function applyPaystackEvent(evt: any): Promise<WebhookApplyResult> {
+  const { data } = evt;
+  const { orgId, planCode } = await resolveSubscriptionTarget(paystackIdentifiers(data));
+  if (!orgId || !planCode) return { outcome: 'unresolved' };
+
+  const rows = await db.select().from(organizations).where(eq(organizations.id, orgId));
+  const organization = rows[0];
+  if (!organization) return { outcome: 'org_missing', orgId };
+
+  const status = (data?.status === 'success') ? 'ACTIVE' : (data?.status === 'failed' ? 'CANCELLED' : 'PAST_DUE');
+
+  // Extract optional identifiers/periods
+  const externalCustomerId = (data?.customer?.customer_code) || (data?.customer?.id) || undefined;
+  const externalSubId = (data?.subscription) || (data?.subscription_code) || undefined;
+  const startedAt = data?.paid_at ? new Date(data.paid_at) : (data?.createdAt ? new Date(data.createdAt) : undefined);
+  const currentPeriodEnd = data?.next_payment_date ? new Date(data.next_payment_date) : undefined;
+  const paymentCurrency = data?.currency || 'NGN';
+  const paymentReference = data?.reference || data?.id;
+  let paymentAmountMajor: number | null = null;
+
+  await upsertSubscription('PAYSTACK', orgId, planCode, status, evt, { externalCustomerId, externalSubId, startedAt, currentPeriodEnd });
+
+  // Record payment events when applicable
+  if (data?.status === 'success' || data?.status === 'failed') {
+    const amountMajor = Number(data?.amount ?? 0) / 100;
+    paymentAmountMajor = amountMajor;
+    try {
+      await db.insert(subscriptionPayments).values({
+        orgId,
+        provider: 'PAYSTACK' as any,
+        planCode,
+        externalSubId: data?.subscription || undefined,
+        externalInvoiceId: data?.invoice || undefined,
+        reference: paymentReference,
+        amount: amountMajor.toFixed(2) as any,
+        currency: paymentCurrency,
+        status: data?.status,
+        eventType: evt?.event,
+        raw: evt as any,
+      } as any);
+    } catch (error) {
+      logger.warn('Failed to record Paystack subscription payment', {
+        orgId,
+        reference: data?.reference || data?.id,
+        error: error instanceof Error ? error.message : String(error)
+      });
+    }
+  }
+
+  // Activate or lock org based on status
+  await applyOrganizationStatus(orgId, status);
+
+  if (data?.status === 'success' || data?.status === 'failed') {
+    const isSuccess = data.status === 'success';
+    const amountDisplay = paymentAmountMajor !== null ? paymentAmountMajor.toFixed(2) : '0.00';
+    const gatewayMessage = data?.gateway_response || data?.message || 'No gateway message supplied.';
+    try {
+      await emitPaymentAlert({
+        orgId,
+        title: isSuccess ? 'Subscription payment received' : 'Subscription payment failed',
+        message: isSuccess
+          ? `Paystack processed a ${paymentCurrency} ${amountDisplay} subscription payment for ${organization.name ?? 'your organization'}.`
+          : `Paystack could not process the ${paymentCurrency} ${amountDisplay} subscription payment: ${gatewayMessage}.`,
+        priority: isSuccess ? 'low' : 'high',
+        data: {
+          provider: 'PAYSTACK',
+          reference: paymentReference,
+          planCode,
+          amount: paymentAmountMajor,
+          currency: paymentCurrency,
+          status: data.status,
+        },
+      });
+    } catch (error) {
+      logger.warn('Failed to emit Paystack payment alert', {
+        orgId,
+        reference: paymentReference,
+        error: error instanceof Error ? error.message : String(error),
+      });
+    }
+  }
+
+  return { outcome: 'applied', orgId };
+}
+
+export async function applyFlutterwaveEvent(evt: any): Promise<WebhookApplyResult> {
+  const data = evt?.data;
+  const { orgId, planCode } = await resolveSubscriptionTarget(flutterwaveIdentifiers(data));
+  if (!orgId || !planCode) return { outcome: 'unresolved' };
+
+  const rows = await db.select().from(organizations).where(eq(organizations.id, orgId));
+  const organization = rows[0];
+  if (!organization) return { outcome: 'org_missing', orgId };
+
+  const status = (data?.status === 'successful') ? 'ACTIVE' : (data?.status === 'failed' ? 'CANCELLED' : 'PAST_DUE');
+
+  const externalCustomerId = (data?.customer?.id) || undefined;
+  const externalSubId = (data?.plan) || (data?.payment_plan) || undefined;
+  const startedAt = data?.created_at ? new Date(data.created_at) : undefined;
+  const currentPeriodEnd = (data?.next_due_date ? new Date(data.next_due_date) : undefined) as Date | undefined;
+  const paymentCurrency = data?.currency || 'USD';
+  const paymentReference = data?.tx_ref || data?.id;
+  let paymentAmountMajor: number | null = null;
+
+  await upsertSubscription('FLW', orgId, planCode, status, evt, { externalCustomerId, externalSubId, startedAt, currentPeriodEnd });
+
+  // Record payment events when applicable
+  if (data?.status === 'successful' || data?.status === 'failed') {
+    const amountMajor = Number(data?.amount ?? 0); // Flutterwave sends in major units
+    paymentAmountMajor = amountMajor;
+    try {
+      await db.insert(subscriptionPayments).values({
+        orgId,
+        provider: 'FLW' as any,
+        planCode,
+        externalSubId: data?.plan || undefined,
+        externalInvoiceId: data?.id || undefined,
+        reference: paymentReference,
+        amount: amountMajor.toFixed(2) as any,
+        currency: paymentCurrency,
+        status: data?.status,
+        eventType: evt?.event,
+        raw: evt as any,
+      } as any);
+    } catch (error) {
+      logger.warn('Failed to record Flutterwave subscription payment', {
+        orgId,
+        reference: data?.tx_ref || data?.id,
+        error: error instanceof Error ? error.message : String(error)
+      });
+    }
+  }
+
+  await applyOrganizationStatus(orgId, status);
+
+  if (data?.status === 'successful' || data?.status === 'failed') {
+    const isSuccess = data.status === 'successful';
+    const amountDisplay = paymentAmountMajor !== null ? paymentAmountMajor.toFixed(2) : '0.00';
+    const failureReason = data?.processor_response || data?.complete_message || 'No gateway message supplied.';
+    try {
+      await emitPaymentAlert({
+        orgId,
+        title: isSuccess ? 'Subscription payment received' : 'Subscription payment failed',
+        message: isSuccess
+          ? `Flutterwave processed a ${paymentCurrency} ${amountDisplay} subscription payment for ${organization.name ?? 'your organization'}.`
+          : `Flutterwave could not process the ${paymentCurrency} ${amountDisplay} subscription payment: ${failureReason}.`,
+        priority: isSuccess ? 'low' : 'high',
+        data: {
+          provider: 'FLW',
+          reference: paymentReference,
+          planCode,
+          amount: paymentAmountMajor,
+          currency: paymentCurrency,
+          status: data.status,
+        },
+      });
+    } catch (error) {
+      logger.warn('Failed to emit Flutterwave payment alert', {
+        orgId,
+        reference: paymentReference,
+        error: error instanceof Error ? error.message : String(error),
+      });
+    }
+  }
+
+  return { outcome: 'applied', orgId };
+}
+
+export function applyWebhookEvent(provider: WebhookProvider, evt: any): Promise<WebhookApplyResult> {
+  return provider === 'PAYSTACK' ? applyPaystackEvent(evt) : applyFlutterwaveEvent(evt);
+}
@@ -1,5 +1,5 @@
 import crypto from "crypto";
-import { and, asc, desc, eq, gte, inArray, isNotNull, lte, lt, or, sql } from 'drizzle-orm';
+import { and, asc, desc, eq, gt, gte, inArray, isNotNull, lte, lt, or, sql, type SQL } from 'drizzle-orm';
 import type { QueryResult } from "pg";
 import { z } from "zod";
 import {
@@ -62,9 +62,68 @@ import type {
 } from '@shared/types/alerts';
 import { AuthService } from "./auth";
 import { db } from "./db";
+import {
+  aggregateDemands,
+  fifoConsumptionQuery,
+  parseConsumptionRows,
+  type CostLayerConsumption,
+} from "./lib/cost-layers";
+import { normalizeCustomerPhone } from "./lib/customer-lookup";
+import {
+  chunk,
+  planBulkInventoryUpdates,
+  computeInventoryCostState,
+  type BulkInventoryUpdate,
+  type BulkInventoryUpdateResult,
+  type CostLayerState,
+  type InventoryState,
+  type ProductPricingState,
+} from "./lib/inventory-bulk";
 import { logger } from "./lib/logger";
+import { postLoyaltyEntriesOrThrow } from "./lib/loyalty-ledger";
 import { getNotificationService } from "./lib/notification-bus";
 
+// Store inventory listing: inventory joined by key to its product, store and
+// the trigger-maintained cost-layer totals (migration 0038)
+const INVENTORY_LISTING_COLUMNS = sql`
+  inv.id,
+  inv.store_id AS "storeId",
+  inv.product_id AS "productId",
+  inv.quantity,
+  inv.min_stock_level AS "minStockLevel",
+  inv.max_stock_level AS "maxStockLevel",
+  inv.reorder_level AS "reorderLevel",
+  inv.avg_cost AS "avgCost",
+  inv.total_cost_value AS "totalCostValue",
+  inv.created_at AS "createdAt",
+  inv.updated_at AS "updatedAt",
+  COALESCE(layer_totals.total_quantity, 0) AS "layerQuantity",
+  COALESCE(layer_totals.total_value, 0) AS "layerValue",
+  prod.id AS "product.id",
+  prod.name AS "product.name",
+  prod.sku AS "product.sku",
+  prod.barcode AS "product.barcode",
+  prod.description AS "product.description",
+  prod.price AS "product.price",
+  prod.cost AS "product.cost",
+  prod.cost_price AS "product.costPrice",
+  prod.sale_price AS "product.salePrice",
+  prod.vat_rate AS "product.vatRate",
+  prod.category AS "product.category",
+  prod.brand AS "product.brand",
+  prod.is_active AS "product.isActive",
+  stores.currency AS "storeCurrency"
+`;
+
+const INVENTORY_LISTING_FROM = sql`
+  FROM inventory inv
+  JOIN products prod ON inv.product_id = prod.id
+  JOIN stores ON inv.store_id = stores.id
+  LEFT JOIN inventory_layer_totals layer_totals
+    ON layer_totals.store_id = inv.store_id
+    AND layer_totals.product_id = inv.product_id
+`;
+
 const parseNumeric = (value: any, fallback = 0): number => {
   if (value == null) {
     return fallback;
@@ -115,6 +174,10 @@ const toOptionalDecimalString = (value?: number | null, digits = 4): string | nu
 const toCurrencyString = (value: number, digits = 2): string =>
   Number.isFinite(value) ? value.toFixed(digits) : (0).toFixed(digits);
 
+// Rows per multi-row statement in bulk writes; keeps each statement well under
+// Postgres' 65535 bind-parameter limit
+const BULK_WRITE_CHUNK = 1000;
+
 type AlertQueryOptions = {
   performanceLimit?: number;
   performanceAlerts?: StorePerformanceAlertSummary[];
@@ -230,6 +293,22 @@ export type CostLayerSummary = {
   newestLayerCost: number | null;
 };
 
+export type InventoryListingOptions = {
+  category?: string;
+  lowStock?: boolean;
+  limit?: number;
+  offset?: number;
+};
+
+export type InventoryListingPage = {
+  items: Array<Inventory & { product: Product | null; formattedPrice: number; storeCurrency: string }>;
+  /** Rows matching the filters, across all pages */
+  total: number;
+  /** All inventory rows of the store, unfiltered */
+  totalProducts: number;
+  storeCurrency: string | null;
+};
+
 // Stock removal options for loss/refund tracking
 export type StockRemovalReason =
   | 'expired'
@@ -430,6 +509,8 @@ export interface IStorage {
 
   // Inventory operations
   getInventoryByStore(storeId: string): Promise<Inventory[]>;
+  listInventoryByStore(storeId: string, options?: InventoryListingOptions): Promise<InventoryListingPage>;
+  getInventoryListingVersion(storeId: string): Promise<string | null>;
   getInventoryItem(productId: string, storeId: string): Promise<Inventory | undefined>;
   getOrganizationInventorySummary(orgId: string): Promise<OrganizationInventorySummary>;
   getOrganizationAlertsOverview(orgId: string, options?: AlertQueryOptions): Promise<AlertsOverviewResponse>;
@@ -442,7 +523,8 @@ export interface IStorage {
     inventory: InventoryUpdatePayload & { costUpdate?: CostUpdateInput; source?: string; referenceId?: string },
     userId?: string,
   ): Promise<Inventory>;
-  adjustInventory(productId: string, storeId: string, quantityChange: number, userId?: string, source?: string, referenceId?: string, notes?: string, metadata?: Record<string, unknown>): Promise<Inventory>;
+  bulkUpdateInventory(storeId: string, updates: BulkInventoryUpdate[], userId?: string): Promise<BulkInventoryUpdateResult[]>;
+  adjustInventory(productId: string, storeId: string, quantityChange: number, userId?: string, source?: string, referenceId?: string, notes?: string, metadata?: Record<string, unknown>, options?: { deferCostLayers?: boolean }): Promise<Inventory>;
   deleteInventory(productId: string, storeId: string, userId?: string, reason?: string): Promise<void>;
   removeStock(productId: string, storeId: string, quantity: number, options: StockRemovalOptions, userId?: string): Promise<{ inventory: Inventory; lossAmount: number; refundAmount: number }>;
   // Records a loss for items already out of inventory (e.g., discarded during return/swap)
@@ -450,6 +532,8 @@ export interface IStorage {
   // saleContext provides meaningful before/after for display: originalQtySold → remainingGoodQty
   recordDiscardLoss(productId: string, storeId: string, quantity: number, unitCost: number, options: { reason: string; notes?: string; referenceId?: string; saleContext?: { originalQtySold: number; remainingGoodQty: number } }, userId?: string): Promise<{ lossAmount: number }>;
   getCostLayers(productId: string, storeId: string): Promise<CostLayerSummary>;
+  // Consumes FIFO layers for several products in one statement; returns cost per product
+  consumeCostLayersBulk(storeId: string, lines: Array<{ productId: string; quantity: number }>, context?: { inventory?: Map<string, Inventory | null> }): Promise<Map<string, number>>;
   analyzeMargin(productId: string, storeId: string, proposedSalePrice: number): Promise<MarginAnalysis>;
   getLowStockItems(storeId: string): Promise<Inventory[]>;
   syncLowStockAlertState(storeId: string, productId: string): Promise<void>;
@@ -629,7 +713,11 @@ export class DatabaseStorage implements IStorage {
           createdAt: inventoryCostLayers.createdAt,
         })
         .from(inventoryCostLayers)
-        .where(and(eq(inventoryCostLayers.storeId, storeId), eq(inventoryCostLayers.productId, productId)))
+        .where(and(
+          eq(inventoryCostLayers.storeId, storeId),
+          eq(inventoryCostLayers.productId, productId),
+          gt(inventoryCostLayers.quantityRemaining, 0),
+        ))
         .orderBy(asc(inventoryCostLayers.createdAt), asc(inventoryCostLayers.id));
 
       for (const row of rows) {
@@ -661,61 +749,38 @@ export class DatabaseStorage implements IStorage {
       return 0;
     }
 
+    if (!this.isTestEnv) {
+      const costs = await this.consumeCostLayersBulk(
+        storeId,
+        [{ productId, quantity }],
+        context?.inventory ? { inventory: new Map([[productId, context.inventory]]) } : undefined,
+      );
+      return costs.get(productId) ?? 0;
+    }
+
     let remaining = quantity;
     let totalCost = 0;
-
-    if (this.isTestEnv) {
-      const key = `${storeId}:${productId}`;
-      const layers = this.mem.inventoryCostLayers.get(key) || [];
-      const ordered = this.sortLayersByCreatedAt(layers);
-      for (const layer of ordered) {
-        if (remaining <= 0) break;
-        const available = parseNumeric((layer as any).quantityRemaining, parseNumeric((layer as any).quantity, 0));
-        if (available <= 0) continue;
-        const useQty = Math.min(available, remaining);
-        const layerCost = parseNumeric((layer as any).unitCost, 0);
-        totalCost += useQty * layerCost;
-        remaining -= useQty;
-        const idx = layers.findIndex((entry: any) => entry.id === (layer as any).id);
-        if (idx >= 0) {
-          if (useQty === available) {
-            layers.splice(idx, 1);
-          } else {
-            layers[idx] = { ...layers[idx], quantityRemaining: available - useQty };
-          }
-        }
-      }
-      this.mem.inventoryCostLayers.set(key, layers);
-    } else {
-      const rows = await db
-        .select({
-          id: inventoryCostLayers.id,
-          quantityRemaining: inventoryCostLayers.quantityRemaining,
-          unitCost: inventoryCostLayers.unitCost,
-          createdAt: inventoryCostLayers.createdAt,
-        })
-        .from(inventoryCostLayers)
-        .where(and(eq(inventoryCostLayers.storeId, storeId), eq(inventoryCostLayers.productId, productId)))
-        .orderBy(asc(inventoryCostLayers.createdAt), asc(inventoryCostLayers.id));
-
-      for (const row of rows) {
-        if (remaining <= 0) break;
-        const available = parseNumeric(row.quantityRemaining, 0);
-        if (available <= 0) continue;
-        const useQty = Math.min(available, remaining);
-        const layerCost = parseNumeric(row.unitCost, 0);
-        totalCost += useQty * layerCost;
-        remaining -= useQty;
+    const key = `${storeId}:${productId}`;
+    const layers = this.mem.inventoryCostLayers.get(key) || [];
+    const ordered = this.sortLayersByCreatedAt(layers);
+    for (const layer of ordered) {
+      if (remaining <= 0) break;
+      const available = parseNumeric((layer as any).quantityRemaining, parseNumeric((layer as any).quantity, 0));
+      if (available <= 0) continue;
+      const useQty = Math.min(available, remaining);
+      const layerCost = parseNumeric((layer as any).unitCost, 0);
+      totalCost += useQty * layerCost;
+      remaining -= useQty;
+      const idx = layers.findIndex((entry: any) => entry.id === (layer as any).id);
+      if (idx >= 0) {
         if (useQty === available) {
-          await db.delete(inventoryCostLayers).where(eq(inventoryCostLayers.id, row.id));
+          layers.splice(idx, 1);
         } else {
-          await db
-            .update(inventoryCostLayers)
-            .set({ quantityRemaining: available - useQty } as any)
-            .where(eq(inventoryCostLayers.id, row.id));
+          layers[idx] = { ...layers[idx], quantityRemaining: available - useQty };
         }
       }
     }
+    this.mem.inventoryCostLayers.set(key, layers);
 
     if (remaining > 0) {
       const fallback = await this.getFallbackCost(storeId, productId, context?.inventory ?? null);
@@ -725,6 +790,55 @@ export class DatabaseStorage implements IStorage {
     return totalCost;
   }
 
+  /**
+   * Consume FIFO cost layers for every line of a sale at once.
+   * Returns the cost of goods per product: the layer cost of the units covered by
+   * open layers plus the fallback cost for any shortfall. In Postgres this is one
+   * statement per BULK_WRITE_CHUNK products (see lib/cost-layers.ts); depleted
+   * layers are zeroed and left for the compaction job to archive.
+   */
+  async consumeCostLayersBulk(
+    storeId: string,
+    lines: Array<{ productId: string; quantity: number }>,
+    context?: { inventory?: Map<string, Inventory | null> },
+  ): Promise<Map<string, number>> {
+    const demands = aggregateDemands(lines);
+    const costs = new Map<string, number>();
+    if (demands.length === 0) {
+      return costs;
+    }
+
+    if (this.isTestEnv) {
+      for (const demand of demands) {
+        const cost = await this.consumeCostLayers(storeId, demand.productId, demand.quantity, {
+          inventory: context?.inventory?.get(demand.productId) ?? null,
+        });
+        costs.set(demand.productId, cost);
+      }
+      return costs;
+    }
+
+    const consumed = new Map<string, CostLayerConsumption>();
+    for (const batch of chunk(demands, BULK_WRITE_CHUNK)) {
+      const result = await db.execute(fifoConsumptionQuery(storeId, batch));
+      for (const row of parseConsumptionRows(result)) {
+        consumed.set(row.productId, row);
+      }
+    }
+
+    for (const demand of demands) {
+      const row = consumed.get(demand.productId);
+      let totalCost = row?.consumedCost ?? 0;
+      const shortfall = demand.quantity - (row?.consumedQuantity ?? 0);
+      if (shortfall > 0) {
+        const fallback = await this.getFallbackCost(storeId, demand.productId, context?.inventory?.get(demand.productId) ?? null);
+        totalCost += shortfall * fallback;
+      }
+      costs.set(demand.productId, totalCost);
+    }
+    return costs;
+  }
+
   /**
    * Restore cost layers for returned/restocked items.
    * Creates a new cost layer entry at the specified unit cost.
@@ -1584,6 +1698,14 @@ export class DatabaseStorage implements IStorage {
   }
 
   async searchProducts(query: string): Promise<Product[]> {
+    if (this.isTestEnv) {
+      const needle = query.toLowerCase();
+      const fields = ['name', 'description', 'category', 'brand', 'sku', 'barcode'];
+      return Array.from(this.mem.products.values())
+        .filter((p: any) => p.isActive !== false && fields.some((field) => String(p[field] ?? '').toLowerCase().includes(needle)))
+        .sort((a: any, b: any) => new Date(b.createdAt).getTime() - new Date(a.createdAt).getTime())
+        .slice(0, 50) as any;
+    }
     const searchTerm = `%${query.toLowerCase()}%`;
 
     return await db
@@ -1684,88 +1806,148 @@ export class DatabaseStorage implements IStorage {
     }
 
     const result = await db.execute(sql`
-      SELECT
-        inv.id,
-        inv.store_id AS "storeId",
-        inv.product_id AS "productId",
-        inv.quantity,
-        inv.min_stock_level AS "minStockLevel",
-        inv.max_stock_level AS "maxStockLevel",
-        inv.reorder_level AS "reorderLevel",
-        inv.avg_cost AS "avgCost",
-        inv.total_cost_value AS "totalCostValue",
-        inv.created_at AS "createdAt",
-        inv.updated_at AS "updatedAt",
-        COALESCE(layer_totals.total_quantity, 0) AS "layerQuantity",
-        COALESCE(layer_totals.total_value, 0) AS "layerValue",
-        prod.id AS "product.id",
-        prod.name AS "product.name",
-        prod.sku AS "product.sku",
-        prod.barcode AS "product.barcode",
-        prod.description AS "product.description",
-        prod.price AS "product.price",
-        prod.cost AS "product.cost",
-        prod.cost_price AS "product.costPrice",
-        prod.sale_price AS "product.salePrice",
-        prod.vat_rate AS "product.vatRate",
-        prod.category AS "product.category",
-        prod.brand AS "product.brand",
-        prod.is_active AS "product.isActive",
-        stores.currency AS "storeCurrency"
-      FROM inventory inv
-      JOIN products prod ON inv.product_id = prod.id
-      JOIN stores ON inv.store_id = stores.id
-      LEFT JOIN (
-        SELECT
-          store_id,
-          product_id,
-          SUM(quantity_remaining)::numeric AS total_quantity,
-          SUM(quantity_remaining * unit_cost)::numeric AS total_value
-        FROM inventory_cost_layers
-        GROUP BY store_id, product_id
-      ) AS layer_totals
-        ON layer_totals.store_id = inv.store_id
-        AND layer_totals.product_id = inv.product_id
+      SELECT ${INVENTORY_LISTING_COLUMNS}
+      ${INVENTORY_LISTING_FROM}
       WHERE inv.store_id = ${storeId}
     `);
 
     const rows = Array.isArray((result as any).rows) ? (result as any).rows : (result as any);
+    return rows.map((row: Record<string, any>) => this.mapInventoryListingRow(row));
+  }
 
-    return rows.map((row: Record<string, any>) => {
-      const product: Record<string, any> = {};
-      for (const [key, value] of Object.entries(row)) {
-        if (!key.startsWith('product.')) continue;
-        const prop = key.slice('product.'.length);
-        product[prop] = value;
-      }
-
-      const layerQuantity = parseNumeric(row.layerQuantity, 0);
-      const layerValue = parseNumeric(row.layerValue, 0);
-      let avgCost = parseNumeric(row.avgCost, 0);
-      let totalCostValue = parseNumeric(row.totalCostValue, 0);
-
-      if (layerQuantity > 0 && layerValue > 0) {
-        avgCost = layerValue / layerQuantity;
-        totalCostValue = layerValue;
-      }
+  /**
+   * Filtered, optionally paginated store inventory for the listing endpoint.
+   * Rows come back ordered by product name so pages are stable.
+   */
+  async listInventoryByStore(storeId: string, options: InventoryListingOptions = {}): Promise<InventoryListingPage> {
+    const limit = options.limit !== undefined ? Math.max(0, Math.floor(options.limit)) : undefined;
+    const offset = Math.max(0, Math.floor(options.offset ?? 0));
 
+    if (this.isTestEnv) {
+      const all = await this.getInventoryByStore(storeId);
+      const matched = all.filter((item) => {
+        if (options.category && (item.product as any)?.category !== options.category) return false;
+        if (options.lowStock && (item.quantity ?? 0) > (item.minStockLevel ?? 0)) return false;
+        return true;
+      });
       return {
-        id: row.id,
-        storeId: row.storeId,
-        productId: row.productId,
-        quantity: Number(row.quantity ?? 0),
-        minStockLevel: row.minStockLevel != null ? Number(row.minStockLevel) : null,
-        maxStockLevel: row.maxStockLevel != null ? Number(row.maxStockLevel) : null,
-        reorderLevel: row.reorderLevel != null ? Number(row.reorderLevel) : null,
-        createdAt: row.createdAt,
-        updatedAt: row.updatedAt,
-        product: Object.keys(product).length ? product : null,
-        avgCost,
-        totalCostValue,
-        formattedPrice: parseFloat(String(product?.price ?? '0')),
-        storeCurrency: row.storeCurrency ?? 'USD',
+        items: limit !== undefined ? matched.slice(offset, offset + limit) : matched.slice(offset),
+        total: matched.length,
+        totalProducts: all.length,
+        storeCurrency: all[0]?.storeCurrency ?? null,
       };
-    });
+    }
+
+    const filters: SQL[] = [];
+    if (options.category) {
+      filters.push(sql`prod.category = ${options.category}`);
+    }
+    if (options.lowStock) {
+      filters.push(sql`COALESCE(inv.quantity, 0) <= COALESCE(inv.min_stock_level, 0)`);
+    }
+    const matchFilter = filters.length ? sql.join(filters, sql` AND `) : sql`TRUE`;
+
+    const [pageResult, countResult, storeResult] = await Promise.all([
+      db.execute(sql`
+        SELECT ${INVENTORY_LISTING_COLUMNS}
+        ${INVENTORY_LISTING_FROM}
+        WHERE inv.store_id = ${storeId} AND ${matchFilter}
+        ORDER BY prod.name ASC, inv.id ASC
+        ${limit !== undefined ? sql`LIMIT ${limit}` : sql``}
+        OFFSET ${offset}
+      `),
+      db.execute(sql`
+        SELECT
+          COUNT(*)::int AS "totalProducts",
+          (COUNT(*) FILTER (WHERE ${matchFilter}))::int AS "total"
+        FROM inventory inv
+        JOIN products prod ON inv.product_id = prod.id
+        WHERE inv.store_id = ${storeId}
+      `),
+      db.select({ currency: stores.currency }).from(stores).where(eq(stores.id, storeId)).limit(1),
+    ]);
+
+    const rows = Array.isArray((pageResult as any).rows) ? (pageResult as any).rows : (pageResult as any);
+    const counts = (Array.isArray((countResult as any).rows) ? (countResult as any).rows : (countResult as any))[0] ?? {};
+    return {
+      items: rows.map((row: Record<string, any>) => this.mapInventoryListingRow(row)),
+      total: Number(counts.total ?? 0),
+      totalProducts: Number(counts.totalProducts ?? 0),
+      storeCurrency: storeResult[0]?.currency ?? null,
+    };
+  }
+
+  /**
+   * Opaque version of a store's inventory listing: the count and stamp sums of
+   * its inventory rows, their products and their cost-layer totals. Every write
+   * to those rows takes a new stamp from a sequence (see migration 0048), so the
+   * version changes with any of them without a lock shared by the store's
+   * writers. Returns null in the in-memory test mode.
+   */
+  async getInventoryListingVersion(storeId: string): Promise<string | null> {
+    if (this.isTestEnv) {
+      return null;
+    }
+    const result = await db.execute(sql`
+      SELECT
+        s.currency,
+        stocked.rows,
+        stocked.inventory_stamps,
+        stocked.product_stamps,
+        (SELECT COALESCE(SUM(t.listing_stamp), 0) FROM inventory_layer_totals t WHERE t.store_id = s.id) AS layer_stamps
+      FROM stores s
+      CROSS JOIN LATERAL (
+        SELECT
+          COUNT(*) AS rows,
+          COALESCE(SUM(inv.listing_stamp), 0) AS inventory_stamps,
+          COALESCE(SUM(prod.listing_stamp), 0) AS product_stamps
+        FROM inventory inv
+        JOIN products prod ON inv.product_id = prod.id
+        WHERE inv.store_id = s.id
+      ) stocked
+      WHERE s.id = ${storeId}
+    `);
+    const row = (Array.isArray((result as any).rows) ? (result as any).rows : (result as any))[0];
+    if (!row) {
+      return null;
+    }
+    return [row.rows, row.inventory_stamps, row.product_stamps, row.layer_stamps, row.currency ?? ''].join(':');
+  }
+
+  private mapInventoryListingRow(row: Record<string, any>) {
+    const product: Record<string, any> = {};
+    for (const [key, value] of Object.entries(row)) {
+      if (!key.startsWith('product.')) continue;
+      const prop = key.slice('product.'.length);
+      product[prop] = value;
+    }
+
+    const layerQuantity = parseNumeric(row.layerQuantity, 0);
+    const layerValue = parseNumeric(row.layerValue, 0);
+    let avgCost = parseNumeric(row.avgCost, 0);
+    let totalCostValue = parseNumeric(row.totalCostValue, 0);
+
+    if (layerQuantity > 0 && layerValue > 0) {
+      avgCost = layerValue / layerQuantity;
+      totalCostValue = layerValue;
+    }
+
+    return {
+      id: row.id,
+      storeId: row.storeId,
+      productId: row.productId,
+      quantity: Number(row.quantity ?? 0),
+      minStockLevel: row.minStockLevel != null ? Number(row.minStockLevel) : null,
+      maxStockLevel: row.maxStockLevel != null ? Number(row.maxStockLevel) : null,
+      reorderLevel: row.reorderLevel != null ? Number(row.reorderLevel) : null,
+      createdAt: row.createdAt,
+      updatedAt: row.updatedAt,
+      product: Object.keys(product).length ? product : null,
+      avgCost,
+      totalCostValue,
+      formattedPrice: parseFloat(String(product?.price ?? '0')),
+      storeCurrency: row.storeCurrency ?? 'USD',
+    } as any;
   }
 
   private createEmptyAlertBreakdown(): InventoryAlertBreakdown {
@@ -2480,34 +2662,13 @@ export class DatabaseStorage implements IStorage {
     const restockTimestamp = quantityDelta > 0 ? new Date() : null;
     const previousRestock = (current as any)?.lastRestocked ?? null;
     const nextLastRestocked = restockTimestamp ?? previousRestock;
-    const computeNextCostState = (): { avgCost: number; totalCostValue: number } => {
-      if (nextQuantity <= 0) {
-        return { avgCost: 0, totalCostValue: 0 };
-      }
-
-      const hasCostOverride = typeof nextCostUpdate?.cost === 'number';
-      let nextTotalValue = totalCostBefore;
-
-      if (quantityDelta > 0) {
-        const unitCost = hasCostOverride ? (nextCostUpdate!.cost as number) : avgCostBefore;
-        nextTotalValue += unitCost * quantityDelta;
-      } else if (quantityDelta < 0) {
-        const unitsRemoved = Math.min(Math.abs(quantityDelta), quantityBefore);
-        nextTotalValue -= avgCostBefore * unitsRemoved;
-        if (nextTotalValue < 0) {
-          nextTotalValue = 0;
-        }
-      }
-
-      if (hasCostOverride && quantityDelta <= 0) {
-        nextTotalValue = (nextCostUpdate!.cost as number) * nextQuantity;
-      }
-
-      const avgCost = nextTotalValue > 0 ? nextTotalValue / nextQuantity : 0;
-      return { avgCost, totalCostValue: nextTotalValue };
-    };
-
-    const { avgCost, totalCostValue } = computeNextCostState();
+    const { avgCost, totalCostValue } = computeInventoryCostState({
+      quantityBefore,
+      avgCostBefore,
+      totalCostBefore,
+      nextQuantity,
+      costOverride: nextCostUpdate?.cost,
+    });
 
     const persistCostLayer = async (quantityDelta: number) => {
       if (quantityDelta <= 0 || !nextCostUpdate || typeof nextCostUpdate.cost !== 'number') {
@@ -2663,6 +2824,7 @@ export class DatabaseStorage implements IStorage {
     referenceId?: string,
     notes?: string,
     costUpdate?: CostUpdateInput,
+    options?: { deferCostLayers?: boolean },
   ): Promise<Inventory> {
     const current = this.isTestEnv
       ? this.mem.inventory.get(`${storeId}:${productId}`) || { quantity: 0, avgCost: 0, totalCostValue: 0 }
@@ -2742,7 +2904,9 @@ export class DatabaseStorage implements IStorage {
       metadata: { quantityChange, avgCost: nextAvgCost },
     } as StockMovementLogParams);
 
-    if (quantityChange < 0) {
+    // Callers that adjust several lines at once (POS sales) defer the FIFO
+    // consumption and settle it afterwards with consumeCostLayersBulk
+    if (quantityChange < 0 && !options?.deferCostLayers) {
       await this.consumeCostLayers(storeId, productId, Math.abs(quantityChange), { inventory: current as Inventory });
     }
 
@@ -3223,7 +3387,11 @@ export class DatabaseStorage implements IStorage {
       const rows = await db
         .select()
         .from(inventoryCostLayers)
-        .where(and(eq(inventoryCostLayers.storeId, storeId), eq(inventoryCostLayers.productId, productId)))
+        .where(and(
+          eq(inventoryCostLayers.storeId, storeId),
+          eq(inventoryCostLayers.productId, productId),
+          gt(inventoryCostLayers.quantityRemaining, 0),
+        ))
         .orderBy(asc(inventoryCostLayers.createdAt), asc(inventoryCostLayers.id));
 
       layers = rows.map((row) => ({
@@ -3647,23 +3815,280 @@ export class DatabaseStorage implements IStorage {
   }
 
   // Enhanced Inventory Management Methods
-  async bulkUpdateInventory(storeId: string, updates: any[]): Promise<any[]> {
-    const results = [];
 
-    for (const update of updates) {
-      try {
-        const result = await this.updateInventory(
-          update.productId,
-          storeId,
-          { quantity: update.quantity }
-        );
-        results.push({ success: true, data: result });
-      } catch (error) {
-        results.push({ success: false, error: error instanceof Error ? error.message : "Unknown error" });
+  /**
+   * Apply many absolute quantity updates for one store in a single transaction.
+   * State is loaded once, planned in memory, and written with multi-row
+   * statements; rows that fail validation are reported without aborting the rest.
+   */
+  async bulkUpdateInventory(
+    storeId: string,
+    updates: BulkInventoryUpdate[],
+    userId?: string,
+  ): Promise<BulkInventoryUpdateResult[]> {
+    if (updates.length === 0) {
+      return [];
+    }
+
+    if (this.isTestEnv) {
+      const results: BulkInventoryUpdateResult[] = [];
+      for (const update of updates) {
+        try {
+          const before = parseNumeric(this.mem.inventory.get(`${storeId}:${update.productId}`)?.quantity, 0);
+          const costUpdate = typeof update.costPrice === 'number' || typeof update.salePrice === 'number'
+            ? { cost: update.costPrice, salePrice: update.salePrice }
+            : undefined;
+          const updated = await this.updateInventory(
+            update.productId,
+            storeId,
+            { quantity: update.quantity, costUpdate, source: update.source },
+            userId,
+          );
+          const quantity = parseNumeric(updated.quantity, 0);
+          results.push({ productId: update.productId, success: true, quantityBefore: before, quantity, variance: quantity - before });
+        } catch (error) {
+          results.push({ productId: update.productId, success: false, error: error instanceof Error ? error.message : 'Unknown error' });
+        }
       }
+      return results;
     }
 
-    return results;
+    const productIds = Array.from(new Set(updates.map((update) => update.productId)));
+    const now = new Date();
+
+    const plan = await db.transaction(async (tx) => {
+      const [store] = await tx.select({ orgId: stores.orgId }).from(stores).where(eq(stores.id, storeId)).limit(1);
+      if (!store) {
+        throw new Error('Store not found');
+      }
+
+      const productRows = await tx
+        .select({ id: products.id, orgId: products.orgId, cost: products.cost, salePrice: products.salePrice })
+        .from(products)
+        .where(inArray(products.id, productIds));
+      const productState = new Map<string, ProductPricingState>();
+      for (const row of productRows) {
+        // Products from another organization are treated as unknown
+        if (row.orgId && store.orgId && row.orgId !== store.orgId) continue;
+        productState.set(row.id, {
+          orgId: row.orgId ?? null,
+          cost: parseNullableNumeric(row.cost),
+          salePrice: parseNullableNumeric(row.salePrice),
+        });
+      }
+
+      // Lock the affected rows so concurrent sales cannot interleave with the plan
+      const inventoryRows = await tx
+        .select()
+        .from(inventory)
+        .where(and(eq(inventory.storeId, storeId), inArray(inventory.productId, productIds)))
+        .for('update');
+      const inventoryState = new Map<string, InventoryState>();
+      for (const row of inventoryRows) {
+        const quantity = parseNumeric(row.quantity, 0);
+        const avgCost = parseNumeric((row as any).avgCost, 0);
+        inventoryState.set(row.productId, {
+          exists: true,
+          quantity,
+          avgCost,
+          totalCostValue: parseNumeric((row as any).totalCostValue, quantity * avgCost),
+          minStockLevel: parseNumeric(row.minStockLevel, 0),
+          lastRestocked: toDateOrNull((row as any).lastRestocked),
+        });
+      }
+
+      const layerRows = await tx
+        .select({
+          id: inventoryCostLayers.id,
+          productId: inventoryCostLayers.productId,
+          quantityRemaining: inventoryCostLayers.quantityRemaining,
+          unitCost: inventoryCostLayers.unitCost,
+        })
+        .from(inventoryCostLayers)
+        .where(and(
+          eq(inventoryCostLayers.storeId, storeId),
+          inArray(inventoryCostLayers.productId, productIds),
+          gt(inventoryCostLayers.quantityRemaining, 0),
+        ))
+        .orderBy(asc(inventoryCostLayers.createdAt), asc(inventoryCostLayers.id))
+        .for('update');
+      const layerState = new Map<string, CostLayerState[]>();
+      for (const row of layerRows) {
+        const quantityRemaining = parseNumeric(row.quantityRemaining, 0);
+        const layers = layerState.get(row.productId) ?? [];
+        layers.push({ id: row.id, quantityRemaining, originalQuantity: quantityRemaining, unitCost: parseNumeric(row.unitCost, 0) });
+        layerState.set(row.productId, layers);
+      }
+
+      const planned = planBulkInventoryUpdates(updates, {
+        inventory: inventoryState,
+        products: productState,
+        layers: layerState,
+      });
+
+      const inventoryValues = Array.from(planned.inventory.entries()).map(([productId, state]) => ({
+        storeId,
+        productId,
+        quantity: state.quantity,
+        avgCost: toDecimalString(state.avgCost, 4),
+        totalCostValue: toDecimalString(state.totalCostValue, 4),
+        lastCostUpdate: now,
+        updatedAt: now,
+        lastRestocked: state.lastRestocked,
+      }));
+      for (const batch of chunk(inventoryValues, BULK_WRITE_CHUNK)) {
+        await tx
+          .insert(inventory)
+          .values(batch as any[])
+          .onConflictDoUpdate({
+            target: [inventory.storeId, inventory.productId],
+            set: {
+              quantity: sql`excluded.quantity`,
+              avgCost: sql`excluded.avg_cost`,
+              totalCostValue: sql`excluded.total_cost_value`,
+              lastCostUpdate: sql`excluded.last_cost_update`,
+              updatedAt: sql`excluded.updated_at`,
+              lastRestocked: sql`excluded.last_restocked`,
+            } as any,
+          });
+      }
+
+      const movementValues = planned.movements.map((movement) => ({
+        storeId,
+        productId: movement.productId,
+        quantityBefore: movement.quantityBefore,
+        quantityAfter: movement.quantityAfter,
+        delta: movement.quantityAfter - movement.quantityBefore,
+        actionType: 'update',
+        source: movement.source,
+        userId,
+        notes: movement.notes,
+        metadata: { avgCost: movement.avgCost, totalCostValue: movement.totalCostValue },
+        occurredAt: now,
+        createdAt: now,
+      }));
+      for (const batch of chunk(movementValues, BULK_WRITE_CHUNK)) {
+        await tx.insert(stockMovements).values(batch as any[]);
+      }
+
+      // Cost layers: insert new ones and shrink consumed ones; exhausted layers are
+      // zeroed like the FIFO sale path and archived later by the compaction job
+      const newLayers: Array<typeof inventoryCostLayers.$inferInsert> = [];
+      const shrunkLayers: Array<{ id: string; quantityRemaining: number }> = [];
+      for (const [productId, layers] of planned.layers) {
+        for (const layer of layers) {
+          if (layer.id === null) {
+            if (layer.quantityRemaining > 0) {
+              newLayers.push({
+                storeId,
+                productId,
+                quantityRemaining: layer.quantityRemaining,
+                unitCost: toDecimalString(layer.unitCost, 4),
+                source: layer.source || 'inventory',
+              } as typeof inventoryCostLayers.$inferInsert);
+            }
+          } else if (layer.quantityRemaining !== layer.originalQuantity) {
+            shrunkLayers.push({ id: layer.id, quantityRemaining: Math.max(layer.quantityRemaining, 0) });
+          }
+        }
+      }
+      for (const batch of chunk(newLayers, BULK_WRITE_CHUNK)) {
+        await tx.insert(inventoryCostLayers).values(batch);
+      }
+      for (const batch of chunk(shrunkLayers, BULK_WRITE_CHUNK)) {
+        await tx.execute(sql`
+          UPDATE ${inventoryCostLayers} AS l
+          SET quantity_remaining = v.quantity_remaining, updated_at = ${now}
+          FROM (VALUES ${sql.join(batch.map((layer) => sql`(${layer.id}::uuid, ${layer.quantityRemaining}::int)`), sql`, `)})
+            AS v(id, quantity_remaining)
+          WHERE l.id = v.id
+        `);
+      }
+
+      const revaluationValues = planned.revaluations.map((event) => ({
+        storeId,
+        productId: event.productId,
+        source: event.source,
+        referenceId: null,
+        quantityBefore: event.quantityBefore,
+        quantityAfter: event.quantityAfter,
+        avgCostAfter: toOptionalDecimalString(event.avgCost, 4),
+        deltaValue: toOptionalDecimalString(event.deltaValue, 4),
+        metadata: {
+          quantityDelta: event.quantityDelta,
+          notes: `Inventory updated from ${event.quantityBefore} to ${event.quantityAfter}`,
+          userId,
+        },
+        occurredAt: now,
+      }));
+      for (const batch of chunk(revaluationValues, BULK_WRITE_CHUNK)) {
+        await tx.insert(inventoryRevaluationEvents).values(batch as InsertInventoryRevaluationEvent[]);
+      }
+
+      const pricingRows = Array.from(planned.pricing.entries());
+      for (const batch of chunk(pricingRows, BULK_WRITE_CHUNK)) {
+        // cost/cost_price/sale_price mirror updateProductPricingIfNeeded
+        await tx.execute(sql`
+          UPDATE ${products} AS p
+          SET
+            cost = COALESCE(v.cost, p.cost),
+            cost_price = COALESCE(v.cost_price, p.cost_price),
+            sale_price = COALESCE(v.sale_price, p.sale_price),
+            updated_at = ${now}
+          FROM (VALUES ${sql.join(batch.map(([productId, pricing]) => sql`(
+            ${productId}::uuid,
+            ${pricing.cost == null ? null : toCurrencyString(pricing.cost, 2)}::numeric,
+            ${pricing.cost == null ? null : pricing.cost.toFixed(4)}::varchar,
+            ${pricing.salePrice == null ? null : pricing.salePrice.toFixed(4)}::varchar
+          )`), sql`, `)}) AS v(id, cost, cost_price, sale_price)
+          WHERE p.id = v.id
+        `);
+      }
+
+      const priceChangeValues = planned.priceChanges.map((change) => ({
+        storeId,
+        productId: change.productId,
+        userId: userId ?? null,
+        orgId: change.orgId,
+        source: change.source ?? null,
+        referenceId: null,
+        oldCost: change.oldCost != null ? toOptionalDecimalString(change.oldCost, 4) : null,
+        newCost: toOptionalDecimalString(change.newCost, 4),
+        oldSalePrice: change.oldSalePrice != null ? toOptionalDecimalString(change.oldSalePrice, 4) : null,
+        newSalePrice: toOptionalDecimalString(change.newSalePrice, 4),
+        metadata: null,
+        occurredAt: now,
+      }));
+      for (const batch of chunk(priceChangeValues, BULK_WRITE_CHUNK)) {
+        await tx.insert(priceChangeEvents).values(batch as InsertPriceChangeEvent[]);
+      }
+
+      return planned;
+    });
+
+    if (plan.pricing.size > 0) {
+      cache.delete('product_categories');
+      cache.delete('product_brands');
+    }
+
+    // Alerts only need attention for products that are low now or already have an open alert
+    const openAlerts = await db
+      .select({ productId: lowStockAlerts.productId })
+      .from(lowStockAlerts)
+      .where(and(
+        eq(lowStockAlerts.storeId, storeId),
+        eq(lowStockAlerts.isResolved, false),
+        inArray(lowStockAlerts.productId, productIds),
+      ));
+    const alerted = new Set(openAlerts.map((row) => row.productId));
+    for (const [productId, state] of plan.inventory) {
+      const isLow = state.minStockLevel > 0 && state.quantity <= state.minStockLevel;
+      if (isLow || alerted.has(productId)) {
+        await this.syncLowStockAlertState(storeId, productId);
+      }
+    }
+
+    return plan.results;
   }
 
   async getStockMovements(_storeId: string): Promise<any[]> {
@@ -3694,35 +4119,26 @@ export class DatabaseStorage implements IStorage {
     ];
   }
 
-  async performStockCount(storeId: string, items: any[]): Promise<any[]> {
-    const results = [];
-
-    for (const item of items) {
-      try {
-        const currentInventory = await this.getInventoryItem(item.productId, storeId);
-        const variance = item.countedQuantity - (currentInventory?.quantity || 0);
-
-        await this.updateInventory(item.productId, storeId, {
-          quantity: item.countedQuantity,
-        });
+  async performStockCount(
+    storeId: string,
+    items: Array<{ productId: string; countedQuantity: number; notes?: string }>,
+    userId?: string,
+  ): Promise<any[]> {
+    const results = await this.bulkUpdateInventory(
+      storeId,
+      items.map((item) => ({ productId: item.productId, quantity: item.countedQuantity, notes: item.notes })),
+      userId,
+    );
 
-        results.push({
-          productId: item.productId,
-          previousQuantity: currentInventory?.quantity || 0,
-          countedQuantity: item.countedQuantity,
-          variance,
-          success: true,
-        });
-      } catch (error) {
-        results.push({
-          productId: item.productId,
-          success: false,
-          error: error instanceof Error ? error.message : "Unknown error",
-        });
+    return results.map((result, index) => result.success
+      ? {
+        productId: result.productId,
+        previousQuantity: result.quantityBefore,
+        countedQuantity: items[index].countedQuantity,
+        variance: result.variance,
+        success: true,
       }
-    }
-
-    return results;
+      : result);
   }
 
   // Enhanced User Management Methods
@@ -4084,7 +4500,8 @@ export class DatabaseStorage implements IStorage {
   }
 
   async createLoyaltyCustomer(customer: InsertCustomer): Promise<Customer> {
-    const [newCustomer] = await db.insert(customers).values(customer as unknown as typeof customers.$inferInsert).returning();
+    const values = { ...customer, phoneE164: normalizeCustomerPhone(customer.phone) };
+    const [newCustomer] = await db.insert(customers).values(values as unknown as typeof customers.$inferInsert).returning();
     return newCustomer;
   }
 
@@ -4119,7 +4536,11 @@ export class DatabaseStorage implements IStorage {
   async updateLoyaltyCustomer(id: string, customer: Partial<InsertCustomer>): Promise<Customer> {
     const [updatedCustomer] = await db
       .update(customers)
-      .set({ ...customer, updatedAt: new Date() } as any)
+      .set({
+        ...customer,
+        ...(customer.phone !== undefined ? { phoneE164: normalizeCustomerPhone(customer.phone) } : {}),
+        updatedAt: new Date(),
+      } as any)
       .where(eq(customers.id, id))
       .returning();
     return updatedCustomer;
@@ -4233,18 +4654,21 @@ export class DatabaseStorage implements IStorage {
     return customer;
   }
 
-  async adjustLoyaltyPoints(customerId: string, points: number, _reason: string): Promise<any> {
-    void _reason;
+  async adjustLoyaltyPoints(customerId: string, points: number, reason: string): Promise<any> {
     const customer = await this.getLoyaltyCustomer(customerId);
     if (!customer) throw new Error("Customer not found");
 
-    const newPoints = customer.currentPoints + points;
-    const newLifetimePoints = customer.lifetimePoints + Math.max(0, points);
-
-    const updatedCustomer = await this.updateLoyaltyCustomer(customerId, {
-      currentPoints: newPoints,
-      lifetimePoints: newLifetimePoints,
-    });
+    // The balance moves through the ledger with an atomic increment; a debit
+    // larger than the balance throws InsufficientPointsError
+    const { balances } = await postLoyaltyEntriesOrThrow([{
+      holderKind: "customer",
+      holderId: customerId,
+      delta: points,
+      entryType: points > 0 ? "earn" : "redeem",
+      reason: reason || "Manual adjustment",
+      source: "loyalty_adjust",
+    }]);
+    const pointsAfter = balances.get(customerId) ?? customer.currentPoints + points;
 
     // Create loyalty transaction record
     await this.createLoyaltyTransaction({
@@ -4252,13 +4676,13 @@ export class DatabaseStorage implements IStorage {
       transactionId: "refund-transaction-id", // In real app, link to actual transaction
       pointsEarned: Math.max(0, points),
       pointsRedeemed: Math.max(0, -points),
-      pointsBefore: customer.currentPoints,
-      pointsAfter: newPoints,
+      pointsBefore: pointsAfter - points,
+      pointsAfter,
       tierBefore: customer.tierId,
       tierAfter: customer.tierId, // Would recalculate based on new points
     });
 
-    return updatedCustomer;
+    return this.getLoyaltyCustomer(customerId);
   }
 
   async getLoyaltyReports(storeId: string): Promise<any> {
@@ -4391,10 +4815,14 @@ export class DatabaseStorage implements IStorage {
   async exportProducts(_storeId: string, format: string): Promise<any> {
     void _storeId;
     // Only export active products
-    const productData = await db.select()
-      .from(products)
-      .where(eq(products.isActive, true))
-      .orderBy(asc(products.name));
+    const productData = this.isTestEnv
+      ? (Array.from(this.mem.products.values()) as Product[])
+        .filter((p) => p.isActive !== false)
+        .sort((a, b) => String(a.name).localeCompare(String(b.name)))
+      : await db.select()
+        .from(products)
+        .where(eq(products.isActive, true))
+        .orderBy(asc(products.name));
 
     if (format === "csv") {
       const csvHeader = "Name,Barcode,Description,Price,Cost,Category,Brand,Active\n";
@@ -4408,23 +4836,35 @@ export class DatabaseStorage implements IStorage {
   }
 
   async exportTransactions(storeId: string, startDate: Date, endDate: Date, format: string): Promise<any> {
-    const transactionData = await db.select({
-      id: transactions.id,
-      date: transactions.createdAt,
-      total: transactions.total,
-      paymentMethod: transactions.paymentMethod,
-      status: transactions.status,
-      cashierId: transactions.cashierId,
-    })
-      .from(transactions)
-      .where(
-        and(
-          eq(transactions.storeId, storeId),
-          gte(transactions.createdAt, startDate),
-          lte(transactions.createdAt, endDate)
+    const transactionData = this.isTestEnv
+      ? Array.from(this.mem.transactions.values())
+        .filter((t: any) => t.storeId === storeId && t.createdAt >= startDate && t.createdAt <= endDate)
+        .sort((a: any, b: any) => b.createdAt.getTime() - a.createdAt.getTime())
+        .map((t: any) => ({
+          id: t.id,
+          date: t.createdAt as Date | null,
+          total: t.total,
+          paymentMethod: t.paymentMethod,
+          status: t.status,
+          cashierId: t.cashierId,
+        }))
+      : await db.select({
+        id: transactions.id,
+        date: transactions.createdAt,
+        total: transactions.total,
+        paymentMethod: transactions.paymentMethod,
+        status: transactions.status,
+        cashierId: transactions.cashierId,
+      })
+        .from(transactions)
+        .where(
+          and(
+            eq(transactions.storeId, storeId),
+            gte(transactions.createdAt, startDate),
+            lte(transactions.createdAt, endDate)
+          )
         )
-      )
-      .orderBy(desc(transactions.createdAt));
+        .orderBy(desc(transactions.createdAt));
 
     if (format === "csv") {
       const csvHeader = "Transaction ID,Date,Total,Payment Method,Status,Cashier ID\n";
@@ -4455,19 +4895,35 @@ export class DatabaseStorage implements IStorage {
   }
 
   async exportInventory(storeId: string, format: string): Promise<any> {
-    const inventoryData = await db.select({
-      productId: inventory.productId,
-      productName: products.name,
-      barcode: products.barcode,
-      sku: products.sku,
-      quantity: inventory.quantity,
-      minStockLevel: inventory.minStockLevel,
-      lastUpdated: inventory.updatedAt,
-    })
-      .from(inventory)
-      .innerJoin(products, eq(inventory.productId, products.id))
-      .where(eq(inventory.storeId, storeId))
-      .orderBy(asc(products.name));
+    const inventoryData = this.isTestEnv
+      ? Array.from(this.mem.inventory.values())
+        .filter((inv: any) => inv.storeId === storeId && this.mem.products.has(inv.productId))
+        .map((inv: any) => {
+          const product = this.mem.products.get(inv.productId);
+          return {
+            productId: inv.productId,
+            productName: product.name as string,
+            barcode: product.barcode as string | null,
+            sku: product.sku as string | null,
+            quantity: inv.quantity as number,
+            minStockLevel: inv.minStockLevel as number | null,
+            lastUpdated: inv.updatedAt as Date | null,
+          };
+        })
+        .sort((a, b) => String(a.productName).localeCompare(String(b.productName)))
+      : await db.select({
+        productId: inventory.productId,
+        productName: products.name,
+        barcode: products.barcode,
+        sku: products.sku,
+        quantity: inventory.quantity,
+        minStockLevel: inventory.minStockLevel,
+        lastUpdated: inventory.updatedAt,
+      })
+        .from(inventory)
+        .innerJoin(products, eq(inventory.productId, products.id))
+        .where(eq(inventory.storeId, storeId))
+        .orderBy(asc(products.name));
 
     if (format === "csv") {
       const csvHeader = "Product ID,Product Name,Barcode,SKU,Quantity,Min Stock Level,Last Updated\n";
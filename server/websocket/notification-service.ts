@@ -34,11 +34,18 @@ export interface AuthenticatedConnection {
   subscriptions: Set<string>;
 }
 
+/** Who a message is for: channel subscribers, or every socket of a user or store. */
+export type DeliveryTarget = { channels: string[] } | { userId: string } | { storeId: string };
+
+/** Forwards a delivery to the other processes holding sockets (see lib/cluster.ts). */
+export type DeliveryRelay = (target: DeliveryTarget, message: WebSocketMessage) => void;
+
 export class NotificationService {
   private wss: WebSocketServer;
   private connections: Map<string, AuthenticatedConnection> = new Map();
   private channels: Map<string, Set<string>> = new Map(); // channel -> connectionIds
   private config: any;
+  private relay: DeliveryRelay | null = null;
 
   constructor(server: Server) {
     // Load Phase 8 configuration
@@ -375,19 +382,7 @@ export class NotificationService {
         timestamp: Date.now()
       };
 
-      let deliveredCount = 0;
-      channels.forEach(channel => {
-        const subscribers = this.channels.get(channel);
-        if (subscribers) {
-          subscribers.forEach(connectionId => {
-            const connection = this.connections.get(connectionId);
-            if (connection && connection.ws.readyState === WebSocket.OPEN) {
-              this.sendMessage(connection.ws, message);
-              deliveredCount++;
-            }
-          });
-        }
-      });
+      const deliveredCount = this.deliver({ channels: Array.from(channels) }, message);
 
       logger.info('Notification broadcasted', {
         notificationId: notification[0].id,
@@ -406,25 +401,15 @@ export class NotificationService {
 
   // Lightweight channel publish for app-domain events
   public async publish(channel: string, payload: any) {
-    const subscribers = this.channels.get(channel);
-    if (!subscribers) return;
     const message: WebSocketMessage = {
       type: 'event',
       data: payload,
       timestamp: Date.now()
     };
-    subscribers.forEach(connectionId => {
-      const connection = this.connections.get(connectionId);
-      if (connection && connection.ws.readyState === WebSocket.OPEN) {
-        this.sendMessage(connection.ws, message);
-      }
-    });
+    this.deliver({ channels: [channel] }, message);
   }
 
   public async sendToUser(userId: string, event: NotificationEvent) {
-    const userConnections = Array.from(this.connections.values())
-      .filter(conn => conn.userId === userId);
-
     const message: WebSocketMessage = {
       type: 'notification',
       data: {
@@ -440,19 +425,11 @@ export class NotificationService {
       timestamp: Date.now()
     };
 
-    userConnections.forEach(connection => {
-      if (connection.ws.readyState === WebSocket.OPEN) {
-        this.sendMessage(connection.ws, message);
-      }
-    });
-
-    logger.info('Notification sent to user', { userId, connections: userConnections.length });
+    const delivered = this.deliver({ userId }, message);
+    logger.info('Notification sent to user', { userId, connections: delivered });
   }
 
   public async sendToStore(storeId: string, event: NotificationEvent) {
-    const storeConnections = Array.from(this.connections.values())
-      .filter(conn => conn.storeId === storeId);
-
     const message: WebSocketMessage = {
       type: 'notification',
       data: {
@@ -466,13 +443,49 @@ export class NotificationService {
       timestamp: Date.now()
     };
 
-    storeConnections.forEach(connection => {
-      if (connection.ws.readyState === WebSocket.OPEN) {
-        this.sendMessage(connection.ws, message);
+    const delivered = this.deliver({ storeId }, message);
+    logger.info('Notification sent to store', { storeId, connections: delivered });
+  }
+
+  public setRelay(relay: DeliveryRelay | null) {
+    this.relay = relay;
+  }
+
+  /**
+   * Send to the matching sockets held by this process, serializing the
+   * message once. Returns the number of sockets written to.
+   */
+  public deliverLocal(target: DeliveryTarget, message: WebSocketMessage): number {
+    const connectionIds = new Set<string>();
+    if ('channels' in target) {
+      for (const channel of target.channels) {
+        this.channels.get(channel)?.forEach(connectionId => connectionIds.add(connectionId));
+      }
+    } else {
+      this.connections.forEach((connection, connectionId) => {
+        const matches = 'userId' in target ? connection.userId === target.userId : connection.storeId === target.storeId;
+        if (matches) connectionIds.add(connectionId);
+      });
+    }
+
+    let delivered = 0;
+    let payload: string | null = null;
+    connectionIds.forEach(connectionId => {
+      const connection = this.connections.get(connectionId);
+      if (connection && connection.ws.readyState === WebSocket.OPEN) {
+        payload ??= JSON.stringify(message);
+        connection.ws.send(payload);
+        delivered++;
       }
     });
+    return delivered;
+  }
 
-    logger.info('Notification sent to store', { storeId, connections: storeConnections.length });
+  // Local sockets plus, in cluster mode, the sockets held by the other workers
+  private deliver(target: DeliveryTarget, message: WebSocketMessage): number {
+    const delivered = this.deliverLocal(target, message);
+    this.relay?.(target, message);
+    return delivered;
   }
 
   private sendMessage(ws: WebSocket, message: WebSocketMessage) {
@@ -598,8 +611,10 @@ export class NotificationService {
     }));
   }
 
-  public close() {
-    this.wss.close();
+  public close(code = 1001, reason = 'Server shutting down') {
+    // Clients reconnect on close, landing on whichever worker accepts them
+    this.connections.forEach(connection => connection.ws.close(code, reason));
+    this.wss?.close();
     logger.info('WebSocket notification service stopped');
   }
 } 
\ No newline at end of file
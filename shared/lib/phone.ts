@@ -0,0 +1,38 @@
+/**
+ * Phone normalization shared by the server (customers.phone_e164, written on
+ * every insert/update) and the POS client (local customer cache lookups), so
+ * "0801 234 5678", "+234 801-234-5678" and "2348012345678" resolve to the same
+ * customer. normalize_phone_e164() in migration 0046 mirrors this for the
+ * backfill and for payloads from clients that predate the column.
+ */
+
+export const DEFAULT_PHONE_COUNTRY_CODE = "234";
+
+/**
+ * Returns the E.164 form (`+<country code><number>`) or null when the input
+ * cannot be a phone number. Numbers without an international prefix are
+ * treated as national: a leading trunk 0 is replaced by the default country
+ * code, and anything of ten digits or fewer gets it prepended.
+ */
+export function normalizePhoneE164(
+  raw: string | null | undefined,
+  defaultCountryCode: string = DEFAULT_PHONE_COUNTRY_CODE,
+): string | null {
+  if (!raw) return null;
+  const trimmed = raw.trim();
+  let digits = trimmed.replace(/\D/g, "");
+  if (!digits) return null;
+
+  const countryCode = defaultCountryCode.replace(/\D/g, "") || DEFAULT_PHONE_COUNTRY_CODE;
+  if (trimmed.startsWith("+")) {
+    // Already international
+  } else if (digits.startsWith("00")) {
+    digits = digits.slice(2);
+  } else if (digits.startsWith("0")) {
+    digits = countryCode + digits.slice(1);
+  } else if (digits.length <= 10) {
+    digits = countryCode + digits;
+  }
+
+  return digits.length >= 8 && digits.length <= 15 ? `+${digits}` : null;
+}
@@ -13,6 +13,8 @@ import {
   jsonb,
   uniqueIndex,
   date,
+  bigserial,
+  smallint,
 } from "drizzle-orm/pg-core";
 import { createInsertSchema } from "drizzle-zod";
 import { z } from "zod";
@@ -228,6 +230,41 @@ export const inventoryCostLayers = pgTable("inventory_cost_layers", {
   updatedAt: timestamp("updated_at", { withTimezone: true }).defaultNow(),
 }, (table) => ({
   storeProductIdx: index("inventory_cost_layers_store_product_idx").on(table.storeId, table.productId, table.createdAt),
+  // FIFO consumption only ever walks layers that still hold stock
+  openFifoIdx: index("inventory_cost_layers_open_fifo_idx")
+    .on(table.storeId, table.productId, table.createdAt, table.id)
+    .where(sql`quantity_remaining > 0`),
+}));
+
+// Depleted layers moved out of the hot table by the cost-layer compaction job
+export const inventoryCostLayersArchive = pgTable("inventory_cost_layers_archive", {
+  id: uuid("id").primaryKey(),
+  storeId: uuid("store_id").notNull(),
+  productId: uuid("product_id").notNull(),
+  unitCost: decimal("unit_cost", { precision: 12, scale: 4 }).notNull(),
+  source: varchar("source", { length: 64 }),
+  referenceId: uuid("reference_id"),
+  notes: text("notes"),
+  createdAt: timestamp("created_at", { withTimezone: true }),
+  depletedAt: timestamp("depleted_at", { withTimezone: true }),
+  mergedInto: uuid("merged_into"),
+  mergedQuantity: integer("merged_quantity").notNull().default(0),
+  archivedAt: timestamp("archived_at", { withTimezone: true }).defaultNow(),
+}, (table) => ({
+  storeProductIdx: index("inventory_cost_layers_archive_store_product_idx").on(table.storeId, table.productId, table.createdAt),
+}));
+
+// Running SUM(quantity_remaining) / SUM(quantity_remaining * unit_cost) over the
+// open cost layers of each (store, product). Maintained by statement triggers on
+// inventory_cost_layers (migration 0038) in the same transaction as the layer write.
+export const inventoryLayerTotals = pgTable("inventory_layer_totals", {
+  storeId: uuid("store_id").notNull().references(() => stores.id, { onDelete: "cascade" }),
+  productId: uuid("product_id").notNull().references(() => products.id, { onDelete: "cascade" }),
+  totalQuantity: integer("total_quantity").notNull().default(0),
+  totalValue: decimal("total_value", { precision: 18, scale: 4 }).notNull().default("0"),
+  updatedAt: timestamp("updated_at", { withTimezone: true }).defaultNow(),
+}, (table) => ({
+  storeProductUnique: uniqueIndex("inventory_layer_totals_store_product_unique").on(table.storeId, table.productId),
 }));
 
 export const priceChangeEvents = pgTable("price_change_events", {
@@ -265,8 +302,11 @@ export const inventoryRevaluationEvents = pgTable("inventory_revaluation_events"
   deltaValue: decimal("delta_value", { precision: 14, scale: 4 }),
   metadata: jsonb("metadata"),
   occurredAt: timestamp("occurred_at", { withTimezone: true }).notNull().defaultNow(),
+  // When the row was written, for the incremental AI insight scan
+  recordedAt: timestamp("recorded_at", { withTimezone: true }).notNull().defaultNow(),
 }, (table) => ({
   storeProductIdx: index("inventory_revaluation_events_store_product_idx").on(table.storeId, table.productId, table.occurredAt),
+  storeRecordedIdx: index("inventory_revaluation_events_store_recorded_idx").on(table.storeId, table.recordedAt),
 }));
 
 export const importJobs = pgTable("import_jobs", {
@@ -309,10 +349,13 @@ export const transactions = pgTable("transactions", {
   importBatchId: uuid("import_batch_id"),
   createdAt: timestamp("created_at").defaultNow(),
   completedAt: timestamp("completed_at"),
+  // Insert or last update time (trigger), for the incremental AI insight scan
+  changedAt: timestamp("changed_at", { withTimezone: true }).notNull().defaultNow(),
 }, (table) => ({
   storeIdIdx: index("transactions_store_id_idx").on(table.storeId),
   cashierIdIdx: index("transactions_cashier_id_idx").on(table.cashierId),
   createdAtIdx: index("transactions_created_at_idx").on(table.createdAt),
+  storeChangedIdx: index("transactions_store_changed_idx").on(table.storeId, table.changedAt),
 }));
 
 // Promotions tables
@@ -448,6 +491,7 @@ export const legacyReturns = pgTable("returns", {
   occurredAt: timestamp("occurred_at", { withTimezone: true }).defaultNow(),
 }, (table) => ({
   idempotencyKeyUnique: uniqueIndex("returns_idempotency_unique").on(table.idempotencyKey),
+  saleIdx: index("returns_sale_id_idx").on(table.saleId),
 }));
 
 export const legacyReturnItems = pgTable("return_items", {
@@ -600,8 +644,11 @@ export const stockMovements = pgTable("stock_movements", {
   metadata: jsonb("metadata"),
   occurredAt: timestamp("occurred_at", { withTimezone: true }).defaultNow(),
   createdAt: timestamp("created_at", { withTimezone: true }).defaultNow(),
+  // When the row was written; created_at follows occurred_at for back-dated movements
+  recordedAt: timestamp("recorded_at", { withTimezone: true }).notNull().defaultNow(),
 }, (table) => ({
   storeOccurredIdx: index("stock_movements_store_occurred_idx").on(table.storeId, table.occurredAt),
+  storeRecordedIdx: index("stock_movements_store_recorded_idx").on(table.storeId, table.recordedAt),
   productStoreIdx: index("stock_movements_product_store_idx").on(table.productId, table.storeId),
 }));
 
@@ -640,6 +687,8 @@ export const customers = pgTable("customers", {
   lastName: varchar("last_name", { length: 255 }).notNull(),
   email: varchar("email", { length: 255 }),
   phone: varchar("phone", { length: 50 }),
+  // E.164 form of phone (shared/lib/phone.ts), written with every phone change
+  phoneE164: varchar("phone_e164", { length: 16 }),
   loyaltyNumber: varchar("loyalty_number", { length: 255 }).unique(),
   currentPoints: integer("current_points").notNull().default(0),
   lifetimePoints: integer("lifetime_points").notNull().default(0),
@@ -649,6 +698,10 @@ export const customers = pgTable("customers", {
   updatedAt: timestamp("updated_at").defaultNow(),
 }, (table) => ({
   storeIdIdx: index("customers_store_id_idx").on(table.storeId),
+  storePhoneE164Unique: uniqueIndex("customers_store_phone_e164_uidx")
+    .on(table.storeId, table.phoneE164)
+    .where(sql`phone_e164 IS NOT NULL`),
+  storeUpdatedIdx: index("customers_store_updated_idx").on(table.storeId, table.updatedAt, table.id),
 }));
 
 export const loyaltyTransactions = pgTable("loyalty_transactions", {
@@ -1192,6 +1245,163 @@ export const scheduledReports = pgTable("scheduled_reports", {
   userIdx: index("scheduled_reports_user_id_idx").on(table.userId),
 }));
 
+// One row per scheduled report pipeline run, with stage timings
+export const reportRuns = pgTable("report_runs", {
+  id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
+  status: varchar("status", { length: 16 }).notNull().default("running"),
+  schedulesDue: integer("schedules_due").notNull().default(0),
+  groupsComputed: integer("groups_computed").notNull().default(0),
+  reportsSent: integer("reports_sent").notNull().default(0),
+  reportsSkipped: integer("reports_skipped").notNull().default(0),
+  reportsFailed: integer("reports_failed").notNull().default(0),
+  aggregateMs: integer("aggregate_ms"),
+  deliveryMs: integer("delivery_ms"),
+  durationMs: integer("duration_ms"),
+  details: jsonb("details"),
+  errorMessage: text("error_message"),
+  startedAt: timestamp("started_at", { withTimezone: true }).notNull().defaultNow(),
+  completedAt: timestamp("completed_at", { withTimezone: true }),
+}, (table) => ({
+  startedAtIdx: index("report_runs_started_at_idx").on(table.startedAt),
+}));
+
+// One row per nightly autopay billing run (server/jobs/billing-runner.ts)
+export const billingRuns = pgTable("billing_runs", {
+  id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
+  status: varchar("status", { length: 32 }).notNull().default("running"),
+  subscriptionsDue: integer("subscriptions_due").notNull().default(0),
+  charged: integer("charged").notNull().default(0),
+  failed: integer("failed").notNull().default(0),
+  missingMethod: integer("missing_method").notNull().default(0),
+  skipped: integer("skipped").notNull().default(0),
+  resumed: integer("resumed").notNull().default(0),
+  deferred: integer("deferred").notNull().default(0),
+  concurrency: integer("concurrency"),
+  durationMs: integer("duration_ms"),
+  details: jsonb("details"),
+  errorMessage: text("error_message"),
+  startedAt: timestamp("started_at", { withTimezone: true }).notNull().defaultNow(),
+  completedAt: timestamp("completed_at", { withTimezone: true }),
+}, (table) => ({
+  startedAtIdx: index("billing_runs_started_at_idx").on(table.startedAt),
+}));
+
+// Idempotency ledger for autopay charges: one attempt per subscription and billing
+// period, claimed before the provider is called so a crashed run resumes with the
+// same provider reference instead of charging twice
+export const billingChargeAttempts = pgTable("billing_charge_attempts", {
+  id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
+  subscriptionId: uuid("subscription_id").notNull().references(() => subscriptions.id, { onDelete: "cascade" }),
+  orgId: uuid("org_id"),
+  periodKey: varchar("period_key", { length: 32 }).notNull(),
+  idempotencyKey: varchar("idempotency_key", { length: 255 }).notNull(),
+  provider: varchar("provider", { length: 16 }).notNull(),
+  amount: decimal("amount", { precision: 10, scale: 2 }).notNull(),
+  currency: varchar("currency", { length: 3 }).notNull(),
+  status: varchar("status", { length: 16 }).notNull().default("pending"),
+  runId: uuid("run_id"),
+  attempts: integer("attempts").notNull().default(0),
+  providerReference: varchar("provider_reference", { length: 255 }),
+  lastError: text("last_error"),
+  createdAt: timestamp("created_at", { withTimezone: true }).defaultNow(),
+  updatedAt: timestamp("updated_at", { withTimezone: true }).defaultNow(),
+}, (table) => ({
+  subscriptionPeriodUnique: uniqueIndex("billing_charge_attempts_subscription_period_unique").on(table.subscriptionId, table.periodKey),
+  idempotencyKeyUnique: uniqueIndex("billing_charge_attempts_idempotency_key_unique").on(table.idempotencyKey),
+}));
+
+// Daily FX rates used by analytics currency normalization, so a past period is
+// always converted with the rates that applied on that day
+export const currencyRates = pgTable("currency_rates", {
+  day: date("day").notNull(),
+  baseCurrency: varchar("base_currency", { length: 3 }).notNull(),
+  quoteCurrency: varchar("quote_currency", { length: 3 }).notNull(),
+  rate: decimal("rate", { precision: 24, scale: 12 }).notNull(),
+  source: varchar("source", { length: 64 }),
+  updatedAt: timestamp("updated_at", { withTimezone: true }).defaultNow(),
+}, (table) => ({
+  pk: uniqueIndex("currency_rates_pk").on(table.day, table.baseCurrency, table.quoteCurrency),
+}));
+
+// Append-only loyalty point ledger (server/lib/loyalty-ledger.ts); the holder's
+// balance column (loyalty_accounts.points or customers.current_points) is its
+// materialized sum
+export const loyaltyLedger = pgTable("loyalty_ledger", {
+  id: bigserial("id", { mode: "number" }).primaryKey(),
+  holderKind: varchar("holder_kind", { length: 16 }).notNull(),
+  holderId: uuid("holder_id").notNull(),
+  orgId: uuid("org_id"),
+  delta: integer("delta").notNull(),
+  entryType: varchar("entry_type", { length: 16 }).notNull(),
+  reason: varchar("reason", { length: 255 }).notNull(),
+  source: varchar("source", { length: 32 }).notNull(),
+  referenceId: varchar("reference_id", { length: 255 }),
+  idempotencyKey: varchar("idempotency_key", { length: 255 }),
+  createdAt: timestamp("created_at", { withTimezone: true }).notNull().defaultNow(),
+}, (table) => ({
+  holderIdx: index("loyalty_ledger_holder_idx").on(table.holderKind, table.holderId, table.id),
+  idempotencyUnique: uniqueIndex("loyalty_ledger_idempotency_unique")
+    .on(table.holderKind, table.holderId, table.idempotencyKey)
+    .where(sql`idempotency_key IS NOT NULL`),
+  referenceIdx: index("loyalty_ledger_reference_idx")
+    .on(table.referenceId, table.source)
+    .where(sql`reference_id IS NOT NULL`),
+}));
+
+// Scheduled job runs (server/jobs/scheduler.ts); scheduled_for is the claimed
+// slot, unique per job so only one instance runs it
+export const jobRuns = pgTable("job_runs", {
+  id: bigserial("id", { mode: "number" }).primaryKey(),
+  jobName: varchar("job_name", { length: 64 }).notNull(),
+  trigger: varchar("trigger", { length: 16 }).notNull(),
+  scheduledFor: timestamp("scheduled_for", { withTimezone: true }),
+  status: varchar("status", { length: 16 }).notNull().default("running"),
+  instanceId: varchar("instance_id", { length: 128 }).notNull(),
+  triggeredBy: varchar("triggered_by", { length: 255 }),
+  startedAt: timestamp("started_at", { withTimezone: true }).notNull().defaultNow(),
+  finishedAt: timestamp("finished_at", { withTimezone: true }),
+  durationMs: integer("duration_ms"),
+  rowsTouched: integer("rows_touched"),
+  error: text("error"),
+  details: jsonb("details"),
+}, (table) => ({
+  slotUnique: uniqueIndex("job_runs_slot_unique")
+    .on(table.jobName, table.scheduledFor)
+    .where(sql`scheduled_for IS NOT NULL`),
+  jobStartedIdx: index("job_runs_job_started_idx").on(table.jobName, table.startedAt),
+}));
+
+// Outbound email queue (server/jobs/email-outbox.ts); priority 0 is
+// transactional mail, 1 is bulk
+export const emailOutbox = pgTable("email_outbox", {
+  id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
+  category: varchar("category", { length: 64 }).notNull().default("general"),
+  priority: smallint("priority").notNull().default(0),
+  toAddress: text("to_address").notNull(),
+  subject: text("subject").notNull(),
+  html: text("html").notNull(),
+  textBody: text("text_body"),
+  attachments: jsonb("attachments"),
+  status: varchar("status", { length: 16 }).notNull().default("queued"), // queued, processing, retry, sent, dead
+  attempts: integer("attempts").notNull().default(0),
+  nextAttemptAt: timestamp("next_attempt_at", { withTimezone: true }).notNull().defaultNow(),
+  lockedAt: timestamp("locked_at", { withTimezone: true }),
+  lastError: text("last_error"),
+  messageId: text("message_id"),
+  sentAt: timestamp("sent_at", { withTimezone: true }),
+  createdAt: timestamp("created_at", { withTimezone: true }).notNull().defaultNow(),
+}, (table) => ({
+  readyIdx: index("email_outbox_ready_idx")
+    .on(table.priority, table.nextAttemptAt)
+    .where(sql`status IN ('queued', 'retry')`),
+  processingIdx: index("email_outbox_processing_idx")
+    .on(table.lockedAt)
+    .where(sql`status = 'processing'`),
+  finishedIdx: index("email_outbox_finished_idx")
+    .on(table.createdAt)
+    .where(sql`status IN ('sent', 'dead')`),
+}));
+
 // Password Reset Tokens table
 export const passwordResetTokens = pgTable("password_reset_tokens", {
   id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
@@ -1295,14 +1505,34 @@ export const userSessions = pgTable("user_sessions", {
 }));
 
 // Webhook events idempotency table
+// Webhook idempotency registry, doubling as the ingest queue when
+// WEBHOOK_INGEST_MODE=queue (server/jobs/webhook-queue.ts). Events handled inline
+// are recorded as "processed" without a payload.
 export const webhookEvents = pgTable("webhook_events", {
   id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
   provider: varchar("provider", { length: 32 }).notNull(),
   eventId: varchar("event_id", { length: 255 }).notNull().unique(),
+  status: varchar("status", { length: 16 }).notNull().default("processed"), // queued, processing, retry, processed, dead
+  payload: jsonb("payload"),
+  orderingKey: varchar("ordering_key", { length: 255 }),
+  attempts: integer("attempts").notNull().default(0),
+  nextAttemptAt: timestamp("next_attempt_at", { withTimezone: true }),
+  lockedAt: timestamp("locked_at", { withTimezone: true }),
+  lastError: text("last_error"),
+  processedAt: timestamp("processed_at", { withTimezone: true }),
   createdAt: timestamp("created_at").defaultNow(),
 }, (table) => ({
   providerIdx: index("webhook_events_provider_idx").on(table.provider),
   eventIdIdx: index("webhook_events_event_id_idx").on(table.eventId),
+  pendingIdx: index("webhook_events_pending_idx")
+    .on(table.orderingKey, table.createdAt)
+    .where(sql`status IN ('queued', 'processing', 'retry')`),
+  readyIdx: index("webhook_events_ready_idx")
+    .on(table.nextAttemptAt)
+    .where(sql`status IN ('queued', 'retry')`),
+  deadIdx: index("webhook_events_dead_idx")
+    .on(table.createdAt)
+    .where(sql`status = 'dead'`),
 }));
 
 // Stock alerts table used by nightly low stock scanner
@@ -1360,15 +1590,21 @@ export const aiInsights = pgTable("ai_insights", {
 export const aiBatchRuns = pgTable("ai_batch_runs", {
   id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
   orgId: uuid("org_id").notNull().references(() => organizations.id, { onDelete: "cascade" }),
-  status: varchar("status", { length: 16 }).notNull().default("pending"),
+  status: varchar("status", { length: 32 }).notNull().default("pending"),
   storesProcessed: integer("stores_processed").notNull().default(0),
   insightsGenerated: integer("insights_generated").notNull().default(0),
   startedAt: timestamp("started_at", { withTimezone: true }),
   completedAt: timestamp("completed_at", { withTimezone: true }),
   errorMessage: text("error_message"),
+  // Per-store incremental runs: everything up to watermarkAt is folded into the daily stats
+  storeId: uuid("store_id").references(() => stores.id, { onDelete: "cascade" }),
+  watermarkAt: timestamp("watermark_at", { withTimezone: true }),
+  rowsProcessed: integer("rows_processed").notNull().default(0),
+  durationMs: integer("duration_ms"),
   createdAt: timestamp("created_at", { withTimezone: true }).defaultNow(),
 }, (table) => ({
   orgIdx: index("ai_batch_runs_org_idx").on(table.orgId, table.createdAt),
+  storeWatermarkIdx: index("ai_batch_runs_store_watermark_idx").on(table.storeId, table.completedAt),
 }));
 
 export const aiProductProfitability = pgTable("ai_product_profitability", {
@@ -1400,6 +1636,40 @@ export const aiProductProfitability = pgTable("ai_product_profitability", {
   uniqueProduct: uniqueIndex("ai_product_profitability_unique").on(table.storeId, table.productId, table.periodDays),
 }));
 
+// Per-day rollups the insight batch folds new activity into, so each scan only
+// rescans the days that changed since its watermark
+export const aiProductDailyStats = pgTable("ai_product_daily_stats", {
+  storeId: uuid("store_id").notNull().references(() => stores.id, { onDelete: "cascade" }),
+  productId: uuid("product_id").notNull().references(() => products.id, { onDelete: "cascade" }),
+  day: date("day").notNull(),
+  unitsSold: integer("units_sold").notNull().default(0),
+  salesSubtotal: decimal("sales_subtotal", { precision: 14, scale: 2 }).notNull().default("0"),
+  salesTax: decimal("sales_tax", { precision: 14, scale: 4 }).notNull().default("0"),
+  cogs: decimal("cogs", { precision: 14, scale: 4 }).notNull().default("0"),
+  promotionLoss: decimal("promotion_loss", { precision: 14, scale: 2 }).notNull().default("0"),
+  unitsRefunded: integer("units_refunded").notNull().default(0),
+  refundSubtotal: decimal("refund_subtotal", { precision: 14, scale: 2 }).notNull().default("0"),
+  refundTax: decimal("refund_tax", { precision: 14, scale: 4 }).notNull().default("0"),
+  refundCogs: decimal("refund_cogs", { precision: 14, scale: 4 }).notNull().default("0"),
+  stockLoss: decimal("stock_loss", { precision: 14, scale: 2 }).notNull().default("0"),
+}, (table) => ({
+  pk: uniqueIndex("ai_product_daily_stats_pk").on(table.storeId, table.productId, table.day),
+  storeDayIdx: index("ai_product_daily_stats_store_day_idx").on(table.storeId, table.day),
+}));
+
+export const aiRemovalDailyStats = pgTable("ai_removal_daily_stats", {
+  storeId: uuid("store_id").notNull().references(() => stores.id, { onDelete: "cascade" }),
+  productId: uuid("product_id").notNull().references(() => products.id, { onDelete: "cascade" }),
+  day: date("day").notNull(),
+  reason: varchar("reason", { length: 64 }).notNull(),
+  occurrences: integer("occurrences").notNull().default(0),
+  unitsLost: integer("units_lost").notNull().default(0),
+  lossValue: decimal("loss_value", { precision: 14, scale: 2 }).notNull().default("0"),
+}, (table) => ({
+  pk: uniqueIndex("ai_removal_daily_stats_pk").on(table.storeId, table.productId, table.day, table.reason),
+  storeDayIdx: index("ai_removal_daily_stats_store_day_idx").on(table.storeId, table.day),
+}));
+
 // AI Types
 export type AiInsight = typeof aiInsights.$inferSelect;
 export type InsertAiInsight = typeof aiInsights.$inferInsert;
@@ -74,6 +74,8 @@ describeIfSupported('Loyalty earn/redeem integration', () => {
       create table if not exists loyalty_accounts (id uuid primary key default gen_random_uuid(), org_id uuid not null, customer_id uuid not null, points int default 0, tier varchar(64));
       create unique index if not exists loyalty_accounts_customer_unique on loyalty_accounts(customer_id);
       create table if not exists loyalty_transactions (id uuid primary key default gen_random_uuid(), loyalty_account_id uuid not null, points int not null, reason varchar(255), created_at timestamp default now());
+      create table if not exists loyalty_ledger (id bigserial primary key, holder_kind varchar(16) not null, holder_id uuid not null, org_id uuid, delta int not null, entry_type varchar(16) not null, reason varchar(255) not null, source varchar(32) not null, reference_id varchar(255), idempotency_key varchar(255), created_at timestamptz not null default now());
+      create unique index if not exists loyalty_ledger_idempotency_unique on loyalty_ledger(holder_kind, holder_id, idempotency_key) where idempotency_key is not null;
       create table if not exists sales (id uuid primary key default gen_random_uuid(), org_id uuid not null, store_id uuid not null, cashier_id uuid not null, subtotal numeric, discount numeric, tax numeric, total numeric, payment_method text, status text default 'COMPLETED', occurred_at timestamp default now(), idempotency_key varchar(128) unique);
       create table if not exists sale_items (id uuid primary key default gen_random_uuid(), sale_id uuid not null, product_id uuid not null, quantity int, unit_price numeric, line_discount numeric, line_total numeric);
     `);
@@ -114,10 +114,15 @@ describeIfSupported('POS sales + offline sync contracts', () => {
       create table if not exists customers (
         id uuid primary key default gen_random_uuid(),
         org_id uuid not null,
+        store_id uuid,
         phone varchar(32) not null,
-        name text
+        phone_e164 varchar(16),
+        name text,
+        current_points int default 0,
+        created_at timestamptz default now()
       );
       create unique index if not exists customers_org_phone_unique on customers(org_id, phone);
+      create unique index if not exists customers_store_phone_e164_uidx on customers(store_id, phone_e164) where phone_e164 is not null;
       create table if not exists loyalty_accounts (
         id uuid primary key default gen_random_uuid(),
         org_id uuid not null,
@@ -131,6 +136,21 @@ describeIfSupported('POS sales + offline sync contracts', () => {
         points int not null,
         reason varchar(255)
       );
+      create table if not exists loyalty_ledger (
+        id bigserial primary key,
+        holder_kind varchar(16) not null,
+        holder_id uuid not null,
+        org_id uuid,
+        delta int not null,
+        entry_type varchar(16) not null,
+        reason varchar(255) not null,
+        source varchar(32) not null,
+        reference_id varchar(255),
+        idempotency_key varchar(255),
+        created_at timestamptz not null default now()
+      );
+      create unique index if not exists loyalty_ledger_idempotency_unique
+        on loyalty_ledger(holder_kind, holder_id, idempotency_key) where idempotency_key is not null;
       create table if not exists sales (
         id uuid primary key default gen_random_uuid(),
         org_id uuid not null,
@@ -230,6 +250,7 @@ describeIfSupported('POS sales + offline sync contracts', () => {
     await pgClient.query('delete from sales');
     await pgClient.query('delete from returns');
     await pgClient.query('delete from loyalty_transactions');
+    await pgClient.query('delete from loyalty_ledger');
     await pgClient.query('delete from loyalty_accounts');
     await pgClient.query('delete from customers');
     await pgClient.query(
@@ -336,4 +357,82 @@ describeIfSupported('POS sales + offline sync contracts', () => {
     );
     expect(Number(inventoryRow.rows[0].quantity)).toBe(97);
   });
+
+  it('redeems an existing org customer balance through /api/sync/upload', async () => {
+    const customer = await pgClient.query(
+      `insert into customers(org_id, store_id, phone, phone_e164)
+        values ($1, $2, '+2348030000001', '+2348030000001')
+        returning id`,
+      [TEST_ORG_ID, STORE_ID]
+    );
+    const customerId = customer.rows[0].id;
+    await pgClient.query(
+      'insert into loyalty_accounts(org_id, customer_id, points) values ($1, $2, 500)',
+      [TEST_ORG_ID, customerId]
+    );
+
+    const offlineSale = {
+      id: `offline-redeem-${Date.now()}`,
+      storeId: STORE_ID,
+      productId: PRODUCT_ID,
+      quantity: 2,
+      salePrice: 25,
+      discount: 0,
+      tax: 0,
+      paymentMethod: 'cash',
+      offlineTimestamp: new Date().toISOString(),
+      customerPhone: '0803 000 0001',
+      redeemPoints: 200,
+    };
+
+    const res = await request(server)
+      .post('/api/sync/upload')
+      .send({ sales: [offlineSale], inventoryUpdates: [], clientInfo: { deviceId: TEST_DEVICE_ID, version: '1.0.0' } })
+      .expect(200);
+    expect(res.body.results.salesErrors).toEqual([]);
+    expect(res.body.results.salesProcessed).toBe(1);
+
+    const customers = await pgClient.query('select id from customers where org_id = $1', [TEST_ORG_ID]);
+    expect(customers.rows.map((row) => row.id)).toEqual([customerId]);
+
+    const account = await pgClient.query('select points from loyalty_accounts where customer_id = $1', [customerId]);
+    expect(Number(account.rows[0].points)).toBe(500 - 200 + 50);
+  });
+
+  it('lets a later sale in the same upload redeem points an earlier one earned', async () => {
+    const base = {
+      storeId: STORE_ID,
+      productId: PRODUCT_ID,
+      quantity: 2,
+      salePrice: 25,
+      discount: 0,
+      tax: 0,
+      paymentMethod: 'cash',
+      offlineTimestamp: new Date().toISOString(),
+      customerPhone: '0803 000 0002',
+    };
+    const sales = [
+      { ...base, id: `offline-earn-${Date.now()}` },
+      { ...base, id: `offline-spend-${Date.now()}`, redeemPoints: 40 },
+    ];
+
+    const res = await request(server)
+      .post('/api/sync/upload')
+      .send({ sales, inventoryUpdates: [], clientInfo: { deviceId: TEST_DEVICE_ID, version: '1.0.0' } })
+      .expect(200);
+    expect(res.body.results.salesErrors).toEqual([]);
+    expect(res.body.results.salesProcessed).toBe(2);
+
+    const account = await pgClient.query(
+      `select la.id, la.points from loyalty_accounts la
+        join customers c on c.id = la.customer_id
+        where c.phone_e164 = '+2348030000002'`
+    );
+    expect(Number(account.rows[0].points)).toBe(50 - 40 + 50);
+    const ledger = await pgClient.query(
+      'select count(*)::int as entries from loyalty_ledger where holder_id = $1',
+      [account.rows[0].id]
+    );
+    expect(ledger.rows[0].entries).toBe(3);
+  });
 });
@@ -0,0 +1,64 @@
+import type { ChatCompletionMessageParam } from 'openai/resources/chat/completions';
+import { describe, expect, it } from 'vitest';
+
+import { InMemoryConversationStore, trimConversation } from '../../server/ai/conversation-store';
+
+const system: ChatCompletionMessageParam = { role: 'system', content: 'You are a helpful advisor.' };
+
+function turn(i: number): ChatCompletionMessageParam[] {
+  return [
+    { role: 'user', content: `question ${i}` },
+    { role: 'assistant', content: `answer ${i}` },
+  ];
+}
+
+describe('trimConversation', () => {
+  it('keeps the system prompt and the most recent turns within the message budget', () => {
+    const messages = [system, ...turn(1), ...turn(2), ...turn(3)];
+    const trimmed = trimConversation(messages, { maxMessages: 5, maxBytes: 1e6, maxTokens: 1e6 });
+    expect(trimmed[0]).toBe(system);
+    expect(trimmed.slice(1).map((m) => m.content)).toEqual(['question 2', 'answer 2', 'question 3', 'answer 3']);
+  });
+
+  it('never starts the retained history with an orphaned tool result', () => {
+    const messages: ChatCompletionMessageParam[] = [
+      system,
+      { role: 'user', content: 'how did we do yesterday?' },
+      { role: 'assistant', content: null, tool_calls: [{ id: 't1', type: 'function', function: { name: 'getInsights', arguments: '{}' } }] },
+      { role: 'tool', tool_call_id: 't1', content: '{"insights":[]}' },
+      { role: 'assistant', content: 'No alerts.' },
+      ...turn(2),
+    ];
+    const trimmed = trimConversation(messages, { maxMessages: 4, maxBytes: 1e6, maxTokens: 1e6 });
+    expect(trimmed.map((m) => m.role)).toEqual(['system', 'user', 'assistant']);
+  });
+
+  it('drops old turns once the token budget is exceeded', () => {
+    const long = 'x'.repeat(400);
+    const messages = [system, { role: 'user', content: long }, { role: 'assistant', content: long }, ...turn(2)] as ChatCompletionMessageParam[];
+    const trimmed = trimConversation(messages, { maxMessages: 100, maxBytes: 1e6, maxTokens: 100 });
+    expect(trimmed.slice(1).map((m) => m.content)).toEqual(['question 2', 'answer 2']);
+  });
+});
+
+describe('InMemoryConversationStore', () => {
+  it('evicts the least recently used conversation beyond capacity', async () => {
+    const store = new InMemoryConversationStore(2, 60_000);
+    await store.set('a', [system]);
+    await store.set('b', [system]);
+    await store.get('a');
+    await store.set('c', [system]);
+
+    expect(store.size()).toBe(2);
+    expect(await store.get('b')).toEqual([]);
+    expect(await store.get('a')).toEqual([system]);
+  });
+
+  it('expires idle conversations', async () => {
+    let now = 0;
+    const store = new InMemoryConversationStore(10, 1000, () => now);
+    await store.set('a', [system]);
+    now = 1500;
+    expect(await store.get('a')).toEqual([]);
+  });
+});
@@ -0,0 +1,51 @@
+import { describe, expect, it, vi } from 'vitest';
+
+vi.mock('../../server/db', () => ({ db: {} }));
+
+import { AiResponseCache, TtlCache, stableStringify } from '../../server/ai/ai-response-cache';
+
+describe('TtlCache', () => {
+  it('expires entries after the TTL and evicts the least recently used', () => {
+    let now = 0;
+    const cache = new TtlCache<number>(100, 2, () => now);
+    cache.set('a', 1);
+    cache.set('b', 2);
+    expect(cache.get('a')).toBe(1);
+    cache.set('c', 3);
+    expect(cache.get('b')).toBeUndefined();
+    now = 150;
+    expect(cache.get('a')).toBeUndefined();
+    expect(cache.getCounters()).toMatchObject({ hits: 1, misses: 2 });
+  });
+});
+
+describe('AiResponseCache', () => {
+  it('keys tool results on arguments regardless of property order', () => {
+    expect(stableStringify({ b: 1, a: [1, { d: 2, c: 3 }] })).toBe(stableStringify({ a: [1, { c: 3, d: 2 }], b: 1 }));
+  });
+
+  it('reuses tool results until the store watermark moves', async () => {
+    let watermark = 'txn-1';
+    const cache = new AiResponseCache({ watermarkTtlMs: 0, resolveWatermark: async () => watermark });
+    const compute = vi.fn(async () => ({ rows: 3 }));
+
+    await cache.getOrComputeTool('store-1', 'getTopProducts', { type: 'top', limit: 5 }, compute);
+    await cache.getOrComputeTool('store-1', 'getTopProducts', { limit: 5, type: 'top' }, compute);
+    expect(compute).toHaveBeenCalledTimes(1);
+
+    watermark = 'txn-2';
+    await cache.getOrComputeTool('store-1', 'getTopProducts', { type: 'top', limit: 5 }, compute);
+    expect(compute).toHaveBeenCalledTimes(2);
+    expect(cache.getStats().tools).toMatchObject({ hits: 1, misses: 2 });
+  });
+
+  it('only caches whole responses when the exact-prompt cache is enabled', async () => {
+    const disabled = new AiResponseCache({ resolveWatermark: async () => 'w' });
+    expect(await disabled.responseKey('store-1', { messages: [] })).toBeNull();
+
+    const enabled = new AiResponseCache({ responseCacheEnabled: true, resolveWatermark: async () => 'w' });
+    const key = await enabled.responseKey('store-1', { messages: [{ role: 'user', content: 'hi' }] });
+    enabled.setResponse(key, 'hello');
+    expect(enabled.getResponse(key)).toBe('hello');
+  });
+});
@@ -0,0 +1,121 @@
+import { describe, expect, it, vi } from 'vitest';
+
+import { InMemoryBillingLedger, buildDueCharge, runBillingRun } from '../../server/jobs/billing-runner';
+import { createRateLimiter } from '../../server/lib/concurrency';
+
+const now = new Date('2026-03-01T06:00:00Z');
+
+function dueCharge(i: number, overrides: Record<string, unknown> = {}) {
+  return buildDueCharge(
+    {
+      id: `sub-${i}`,
+      orgId: `org-${i}`,
+      status: 'TRIAL',
+      planCode: 'basic',
+      provider: 'PAYSTACK',
+      autopayEnabled: true,
+      autopayReference: `AUTH_${i}`,
+      trialEndDate: new Date(now.getTime() - 60_000),
+      ...overrides,
+    },
+    { name: `Org ${i}` },
+    `owner${i}@example.com`,
+    now,
+  );
+}
+
+function fakeService() {
+  let inFlight = 0;
+  let seq = 0;
+  const service = {
+    maxInFlight: 0,
+    generateReference: vi.fn((provider: string) => `${provider.toUpperCase()}_REF_${++seq}`),
+    chargePaystackAuthorization: vi.fn(async (_auth: string, _email: string, _amount: number, _currency: string, reference?: string) => {
+      inFlight += 1;
+      service.maxInFlight = Math.max(service.maxInFlight, inFlight);
+      await new Promise((resolve) => setTimeout(resolve, 5));
+      inFlight -= 1;
+      return { success: true, reference };
+    }),
+    chargeFlutterwaveToken: vi.fn(async (_token: string, _email: string, _amount: number, _currency: string, reference?: string) => ({
+      success: true,
+      reference,
+    })),
+    fetchPaystackTransaction: vi.fn(),
+    fetchFlutterwaveTransaction: vi.fn(),
+  };
+  return service;
+}
+
+describe('createRateLimiter', () => {
+  it('spaces acquisitions beyond the burst at the configured rate', async () => {
+    const limiter = createRateLimiter(50, 1);
+    const started = Date.now();
+    await Promise.all([limiter.acquire(), limiter.acquire(), limiter.acquire()]);
+    expect(Date.now() - started).toBeGreaterThanOrEqual(35);
+  });
+});
+
+describe('runBillingRun', () => {
+  it('charges every due subscription once with bounded concurrency', async () => {
+    const service = fakeService();
+    const ledger = new InMemoryBillingLedger(Array.from({ length: 12 }, (_, i) => dueCharge(i)));
+
+    const summary = await runBillingRun({ service: service as any, ledger, now, concurrency: 4, rateLimits: { PAYSTACK: 0 } });
+
+    expect(summary).toMatchObject({ subscriptionsDue: 12, charged: 12, failed: 0, errors: 0 });
+    expect(service.chargePaystackAuthorization).toHaveBeenCalledTimes(12);
+    expect(service.maxInFlight).toBeLessThanOrEqual(4);
+    expect(service.maxInFlight).toBeGreaterThan(1);
+    expect(ledger.payments).toHaveLength(12);
+    expect(ledger.payments[0]).toMatchObject({ status: 'completed', amount: '30000.00' });
+  });
+
+  it('settles a charge left pending by a crashed run from the provider instead of re-charging', async () => {
+    const service = fakeService();
+    const charge = dueCharge(1);
+    const ledger = new InMemoryBillingLedger([charge]);
+    ledger.attempts.set('sub-1:2026-03-01', { idempotencyKey: 'PAYSTACK_OLD', status: 'pending', attempts: 1, claimedAt: 0 });
+    service.fetchPaystackTransaction.mockResolvedValue({ reference: 'PAYSTACK_OLD', status: 'success' });
+
+    const summary = await runBillingRun({ service: service as any, ledger, now, rateLimits: { PAYSTACK: 0 } });
+
+    expect(summary).toMatchObject({ charged: 1, resumed: 1 });
+    expect(service.fetchPaystackTransaction).toHaveBeenCalledWith('PAYSTACK_OLD');
+    expect(service.chargePaystackAuthorization).not.toHaveBeenCalled();
+    expect(ledger.payments).toEqual([expect.objectContaining({ reference: 'PAYSTACK_OLD', status: 'completed' })]);
+  });
+
+  it('retries a pending reference the provider never saw with the same key', async () => {
+    const service = fakeService();
+    const ledger = new InMemoryBillingLedger([dueCharge(1)]);
+    ledger.attempts.set('sub-1:2026-03-01', { idempotencyKey: 'PAYSTACK_OLD', status: 'pending', attempts: 1, claimedAt: 0 });
+    service.fetchPaystackTransaction.mockRejectedValue({ response: { status: 404 } });
+
+    await runBillingRun({ service: service as any, ledger, now, rateLimits: { PAYSTACK: 0 } });
+
+    expect(service.chargePaystackAuthorization).toHaveBeenCalledTimes(1);
+    expect(service.chargePaystackAuthorization.mock.calls[0][4]).toBe('PAYSTACK_OLD');
+  });
+
+  it('retries provider throttling and marks subscriptions without a payment method past due', async () => {
+    const service = fakeService();
+    service.chargePaystackAuthorization
+      .mockResolvedValueOnce({ success: false, httpStatus: 429, reference: 'x' } as any)
+      .mockResolvedValueOnce({ success: true, reference: 'PAID' } as any);
+    const ledger = new InMemoryBillingLedger([dueCharge(1), dueCharge(2, { autopayReference: null })]);
+
+    const summary = await runBillingRun({
+      service: service as any,
+      ledger,
+      now,
+      concurrency: 1,
+      maxThrottleRetries: 1,
+      rateLimits: { PAYSTACK: 0 },
+    });
+
+    expect(summary).toMatchObject({ charged: 1, missingMethod: 1, failed: 0 });
+    expect(service.chargePaystackAuthorization).toHaveBeenCalledTimes(2);
+    expect(ledger.subscriptionStatus.get('sub-2')).toBe('PAST_DUE');
+  });
+});
@@ -0,0 +1,30 @@
+import { describe, expect, it } from 'vitest';
+
+import { isSchedulerWorker, resolvePoolSize, resolveWorkerCount } from '../../server/lib/cluster';
+
+describe('cluster sizing', () => {
+  it('resolves the worker count from CLUSTER_WORKERS', () => {
+    expect(resolveWorkerCount('auto', 8)).toBe(8);
+    expect(resolveWorkerCount('3', 8)).toBe(3);
+    expect(resolveWorkerCount(undefined, 8)).toBe(1);
+    expect(resolveWorkerCount('zero', 8)).toBe(1);
+  });
+
+  it('splits the connection budget across hosts and workers', () => {
+    expect(resolvePoolSize({ DB_CONNECTION_BUDGET: '160', DB_INSTANCES: '2', CLUSTER_WORKERS: '8', CLUSTER_WORKER_INDEX: '3' })).toBe(10);
+    // Workers only divide the budget when they were forked by the primary
+    expect(resolvePoolSize({ DB_CONNECTION_BUDGET: '160', CLUSTER_WORKERS: '8' })).toBe(159);
+    expect(resolvePoolSize({ DB_CONNECTION_BUDGET: '10', CLUSTER_WORKERS: '8', CLUSTER_WORKER_INDEX: '0' })).toBe(2);
+    expect(resolvePoolSize({ DB_POOL_MAX: '7', DB_CONNECTION_BUDGET: '160', CLUSTER_WORKERS: '8', CLUSTER_WORKER_INDEX: '0' })).toBe(7);
+  });
+
+  it('keeps the job lease connection out of the scheduler process pool', () => {
+    expect(resolvePoolSize({})).toBe(19);
+    expect(resolvePoolSize({ DB_CONNECTION_BUDGET: '160', DB_INSTANCES: '2', CLUSTER_WORKERS: '8', CLUSTER_WORKER_INDEX: '0' })).toBe(9);
+    expect(resolvePoolSize({ DB_CONNECTION_BUDGET: '160', DB_INSTANCES: '2', CLUSTER_WORKERS: '8', CLUSTER_WORKER_INDEX: '3', CLUSTER_SCHEDULER_WORKER: '3' })).toBe(9);
+  });
+
+  it('runs schedulers in a single process', () => {
+    expect(isSchedulerWorker()).toBe(true);
+  });
+});
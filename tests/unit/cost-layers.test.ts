@@ -0,0 +1,39 @@
+import { sql } from 'drizzle-orm';
+import { PgDialect } from 'drizzle-orm/pg-core';
+import { describe, expect, it } from 'vitest';
+
+import { aggregateDemands, fifoConsumptionQuery, parseConsumptionRows } from '../../server/lib/cost-layers';
+
+describe('aggregateDemands', () => {
+  it('merges repeated products and drops empty lines in first-seen order', () => {
+    expect(aggregateDemands([
+      { productId: 'p2', quantity: 2 },
+      { productId: 'p1', quantity: 1 },
+      { productId: 'p2', quantity: 3 },
+      { productId: 'p3', quantity: 0 },
+      { productId: '', quantity: 4 },
+    ])).toEqual([
+      { productId: 'p2', quantity: 5 },
+      { productId: 'p1', quantity: 1 },
+    ]);
+  });
+});
+
+describe('parseConsumptionRows', () => {
+  it('reads node-postgres results and coerces numeric strings', () => {
+    expect(parseConsumptionRows({ rows: [{ product_id: 'p1', consumed_quantity: 4, consumed_cost: '10.5000' }] }))
+      .toEqual([{ productId: 'p1', consumedQuantity: 4, consumedCost: 10.5 }]);
+    expect(parseConsumptionRows(undefined)).toEqual([]);
+  });
+});
+
+describe('fifoConsumptionQuery', () => {
+  it('locks every open layer in FIFO order instead of a LIMITed head', () => {
+    const { sql: text, params } = new PgDialect().sqlToQuery(
+      fifoConsumptionQuery('store-1', [{ productId: 'p1', quantity: 3 }], sql.raw('scratch_layers')),
+    );
+    expect(text).toMatch(/ORDER BY c\.created_at, c\.id\s+FOR UPDATE/);
+    expect(text).not.toContain('LIMIT');
+    expect(params).toEqual(['p1', 3, 'store-1']);
+  });
+});
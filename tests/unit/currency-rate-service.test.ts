@@ -0,0 +1,124 @@
+import { mkdtempSync, rmSync, writeFileSync } from 'node:fs';
+import { tmpdir } from 'node:os';
+import path from 'node:path';
+import { describe, expect, it, vi } from 'vitest';
+
+vi.mock('../../server/db', () => ({ db: {} }));
+
+import type { CurrencyRates } from '@shared/lib/currency';
+import {
+  convertMoneyValues,
+  CurrencyRateService,
+  FileCurrencyRateProvider,
+  InMemoryCurrencyRateHistoryStore,
+  OrgBaseCurrencyCache,
+  ratesFromQuotes,
+} from '../../server/lib/currency';
+
+const DAY = 86_400_000;
+const rates = ratesFromQuotes('USD', { NGN: 1600 });
+
+describe('currency rate helpers', () => {
+  it('derives the full matrix from base quotes', () => {
+    expect(rates.USD.NGN).toBe(1600);
+    expect(rates.NGN.USD).toBeCloseTo(1 / 1600, 12);
+    expect(rates.NGN.NGN).toBe(1);
+  });
+
+  it('converts arrays of values and rounds each to cents', () => {
+    const result = convertMoneyValues(
+      [
+        { amount: 1.006, currency: 'USD' },
+        { amount: 3200, currency: 'NGN' },
+        { amount: 10.123, currency: 'USD' },
+      ],
+      'USD',
+      rates,
+    );
+    expect(result).toEqual([
+      { amount: 1.01, currency: 'USD' },
+      { amount: 2, currency: 'USD' },
+      { amount: 10.12, currency: 'USD' },
+    ]);
+  });
+
+  it('keeps the currency of values without a usable rate', () => {
+    const partial = { NGN: { NGN: 1 }, USD: { USD: 1 } } as CurrencyRates;
+    expect(convertMoneyValues([{ amount: 5, currency: 'NGN' }], 'USD', partial)).toEqual([{ amount: 5, currency: 'NGN' }]);
+  });
+
+  it('reads a file source and only re-parses it when it changes', async () => {
+    const dir = mkdtempSync(path.join(tmpdir(), 'rates-'));
+    const file = path.join(dir, 'rates.json');
+    try {
+      writeFileSync(file, JSON.stringify({ base: 'usd', rates: { ngn: 1500, EUR: 0.9 } }));
+      const provider = new FileCurrencyRateProvider(file);
+      const first = await provider.getRates();
+      expect(first.USD.NGN).toBe(1500);
+      expect(await provider.getRates()).toBe(first);
+    } finally {
+      rmSync(dir, { recursive: true, force: true });
+    }
+  });
+});
+
+describe('CurrencyRateService', () => {
+  it('serves the snapshot, refreshes single-flight and keeps rates when the source fails', async () => {
+    const getRates = vi.fn().mockResolvedValueOnce(rates).mockRejectedValueOnce(new Error('offline'));
+    const service = new CurrencyRateService({ source: { getRates }, now: () => Date.UTC(2026, 0, 10) });
+
+    const [a, b] = await Promise.all([service.getRates(), service.getRates()]);
+    expect(a).toBe(rates);
+    expect(b).toBe(rates);
+    expect(getRates).toHaveBeenCalledTimes(1);
+
+    await service.refresh();
+    expect(await service.getRates()).toBe(rates);
+    expect(service.getSnapshot()?.day).toBe('2026-01-10');
+  });
+
+  it('persists daily rates and converts past days with the latest rates on or before them', async () => {
+    const history = new InMemoryCurrencyRateHistoryStore();
+    await history.saveDay('2026-01-01', ratesFromQuotes('USD', { NGN: 1400 }));
+    await history.saveDay('2026-01-05', ratesFromQuotes('USD', { NGN: 1500 }));
+    const loadRange = vi.spyOn(history, 'loadRange');
+
+    let now = Date.UTC(2026, 0, 10);
+    const service = new CurrencyRateService({ source: { getRates: async () => rates }, history, now: () => now });
+
+    const byDay = await service.getRatesForDays(['2025-12-31', '2026-01-03', '2026-01-06', '2026-01-10']);
+    expect(byDay.get('2025-12-31')?.USD.NGN).toBe(1600);
+    expect(byDay.get('2026-01-03')?.USD.NGN).toBe(1400);
+    expect(byDay.get('2026-01-06')?.USD.NGN).toBe(1500);
+    expect(byDay.get('2026-01-10')?.USD.NGN).toBe(1600);
+    expect(loadRange).toHaveBeenCalledTimes(1);
+    expect(history.rows.has('2026-01-10:USD:NGN')).toBe(true);
+
+    await service.getRatesForDate(new Date(Date.UTC(2026, 0, 3, 15)));
+    expect(loadRange).toHaveBeenCalledTimes(1);
+
+    now += DAY;
+    await service.refresh();
+    expect((await service.getRatesForDate(new Date(Date.UTC(2026, 0, 10)))).USD.NGN).toBe(1600);
+  });
+});
+
+describe('OrgBaseCurrencyCache', () => {
+  it('shares concurrent loads and expires entries', async () => {
+    let now = 0;
+    const cache = new OrgBaseCurrencyCache(1_000, 10, () => now);
+    const load = vi.fn().mockResolvedValue('USD');
+
+    await Promise.all([cache.get('org-1', load), cache.get('org-1', load)]);
+    await cache.get('org-1', load);
+    expect(load).toHaveBeenCalledTimes(1);
+
+    now = 2_000;
+    await cache.get('org-1', load);
+    expect(load).toHaveBeenCalledTimes(2);
+
+    cache.invalidate('org-1');
+    await cache.get('org-1', load);
+    expect(load).toHaveBeenCalledTimes(3);
+  });
+});
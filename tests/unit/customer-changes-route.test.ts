@@ -0,0 +1,89 @@
+import express from 'express';
+import request from 'supertest';
+import { beforeEach, describe, expect, it, vi } from 'vitest';
+
+const STORE_ID = '00000000-0000-0000-0000-000000000001';
+const ORG_ID = '00000000-0000-0000-0000-0000000000a1';
+
+const state = vi.hoisted(() => ({
+  user: null as Record<string, unknown> | null,
+  execute: null as any,
+}));
+
+vi.mock('../../server/db', async () => {
+  const { stores } = await import('@shared/schema');
+  return {
+    db: {
+      // resolveStoreAccess reads the user with select().from().where() and the
+      // store with select().from().where().limit()
+      select: () => ({
+        from: (table: unknown) => ({
+          where: () => {
+            const rows = table === stores ? [{ id: STORE_ID, orgId: ORG_ID, name: 'Main', isActive: true }] : [state.user];
+            return Object.assign(Promise.resolve(rows), { limit: async () => rows });
+          },
+        }),
+      }),
+      execute: (...args: unknown[]) => state.execute(...args),
+    },
+  };
+});
+vi.mock('../../server/storage', () => ({
+  storage: { getUserStorePermissions: async () => [] },
+}));
+vi.mock('../../server/middleware/authz', () => ({
+  requireAuth: (_req: any, _res: any, next: any) => next(),
+  enforceIpWhitelist: (_req: any, _res: any, next: any) => next(),
+  requireRole: () => (_req: any, _res: any, next: any) => next(),
+}));
+
+import { registerCustomerRoutes } from '../../server/api/routes.customers';
+
+async function buildApp() {
+  const app = express();
+  app.use((req: any, _res, next) => {
+    req.session = { userId: state.user?.id };
+    next();
+  });
+  await registerCustomerRoutes(app);
+  return app;
+}
+
+const cashier = (overrides: Record<string, unknown>) => ({
+  id: 'u-1',
+  orgId: ORG_ID,
+  isAdmin: false,
+  role: 'cashier',
+  storeId: STORE_ID,
+  firstName: null,
+  lastName: null,
+  email: 'cashier@example.com',
+  ...overrides,
+});
+
+describe('GET /api/customers/changes', () => {
+  beforeEach(() => {
+    state.execute = vi.fn().mockResolvedValue({ rows: [] });
+  });
+
+  it('serves the store the cashier is assigned to', async () => {
+    state.user = cashier({});
+    const app = await buildApp();
+
+    await request(app).get('/api/customers/changes').query({ storeId: STORE_ID }).expect(200);
+    expect(state.execute).toHaveBeenCalledTimes(1);
+  });
+
+  it('refuses users of another store or org without reading customers', async () => {
+    const app = await buildApp();
+
+    for (const user of [
+      cashier({ storeId: '00000000-0000-0000-0000-000000000002' }),
+      cashier({ orgId: '00000000-0000-0000-0000-0000000000b2' }),
+    ]) {
+      state.user = user;
+      await request(app).get('/api/customers/changes').query({ storeId: STORE_ID }).expect(403);
+    }
+    expect(state.execute).not.toHaveBeenCalled();
+  });
+});
@@ -0,0 +1,156 @@
+import { PgDialect } from 'drizzle-orm/pg-core';
+import { afterEach, describe, expect, it, vi } from 'vitest';
+
+vi.mock('../../server/db', () => ({ db: {} }));
+
+import { normalizePhoneE164 } from '@shared/lib/phone';
+import {
+  decodeCustomerCursor,
+  encodeCustomerCursor,
+  listCustomerChanges,
+  phoneDefaultCountryCode,
+  upsertCustomerByPhone,
+  upsertOrgCustomerByPhone,
+} from '../../server/lib/customer-lookup';
+
+const STORE_ID = '00000000-0000-0000-0000-000000000001';
+const ORG_ID = '00000000-0000-0000-0000-0000000000a1';
+const dialect = new PgDialect();
+
+describe('normalizePhoneE164', () => {
+  it('maps the ways a cashier types one number to the same E.164 form', () => {
+    for (const typed of ['0801 234 5678', '+234 801-234-5678', '2348012345678', '002348012345678', '8012345678']) {
+      expect(normalizePhoneE164(typed)).toBe('+2348012345678');
+    }
+    expect(normalizePhoneE164('(415) 555-0100', '1')).toBe('+14155550100');
+  });
+
+  it('rejects input that cannot be a phone number', () => {
+    expect(normalizePhoneE164(null)).toBeNull();
+    expect(normalizePhoneE164('  ')).toBeNull();
+    expect(normalizePhoneE164('0803')).toBeNull();
+    expect(normalizePhoneE164('+1234567890123456')).toBeNull();
+  });
+});
+
+describe('phoneDefaultCountryCode', () => {
+  it('reads PHONE_DEFAULT_COUNTRY_CODE and falls back to 234', () => {
+    expect(phoneDefaultCountryCode({} as NodeJS.ProcessEnv)).toBe('234');
+    expect(phoneDefaultCountryCode({ PHONE_DEFAULT_COUNTRY_CODE: '+44' } as NodeJS.ProcessEnv)).toBe('44');
+  });
+});
+
+describe('upsertCustomerByPhone', () => {
+  it('finds or creates the customer with one upsert on the normalized number', async () => {
+    const execute = vi.fn().mockResolvedValue({ rows: [{ id: 'c-1', current_points: 40, created: false }] });
+
+    const customer = await upsertCustomerByPhone({ execute }, STORE_ID, ' 0801 234 5678 ');
+
+    expect(execute).toHaveBeenCalledTimes(1);
+    const { sql: text, params } = dialect.sqlToQuery(execute.mock.calls[0][0]);
+    expect(text).toContain('ON CONFLICT (store_id, phone_e164) WHERE phone_e164 IS NOT NULL');
+    expect(text).toContain('RETURNING id');
+    expect(params).toEqual([STORE_ID, '0801 234 5678', '+2348012345678']);
+    expect(customer).toEqual({ id: 'c-1', currentPoints: 40, created: false });
+  });
+
+  it('keeps the raw exact match for numbers that do not normalize', async () => {
+    const execute = vi.fn()
+      .mockResolvedValueOnce({ rows: [] })
+      .mockResolvedValueOnce({ rows: [{ id: 'c-2', current_points: 0, created: true }] });
+
+    const customer = await upsertCustomerByPhone({ execute }, STORE_ID, '0803');
+
+    expect(execute).toHaveBeenCalledTimes(2);
+    expect(dialect.sqlToQuery(execute.mock.calls[0][0]).sql).toContain('FOR UPDATE');
+    expect(customer).toEqual({ id: 'c-2', currentPoints: 0, created: true });
+  });
+});
+
+describe('upsertOrgCustomerByPhone', () => {
+  it('reuses the org customer matched on the normalized number', async () => {
+    const execute = vi.fn()
+      .mockResolvedValueOnce({ rows: [] })
+      .mockResolvedValueOnce({ rows: [{ id: 'c-9', current_points: 0, created: false }] });
+
+    const customer = await upsertOrgCustomerByPhone({ execute }, ORG_ID, STORE_ID, '0801 234 5678');
+
+    expect(execute).toHaveBeenCalledTimes(2);
+    const { sql: text, params } = dialect.sqlToQuery(execute.mock.calls[1][0]);
+    expect(text).toContain('WHERE org_id = $1::uuid');
+    expect(text).toContain('FOR UPDATE');
+    expect(params.slice(0, 2)).toEqual([ORG_ID, '+2348012345678']);
+    expect(customer).toEqual({ id: 'c-9', currentPoints: 0, created: false });
+  });
+
+  it('creates the customer with its org when the org has none', async () => {
+    const execute = vi.fn()
+      .mockResolvedValueOnce({ rows: [] })
+      .mockResolvedValueOnce({ rows: [] })
+      .mockResolvedValueOnce({ rows: [{ id: 'c-10', current_points: 0, created: true }] });
+
+    const customer = await upsertOrgCustomerByPhone({ execute }, ORG_ID, STORE_ID, '+234 801-234-5678');
+
+    const { sql: text, params } = dialect.sqlToQuery(execute.mock.calls[2][0]);
+    expect(text).toContain('INSERT INTO customers (org_id, store_id, phone, phone_e164, current_points)');
+    expect(params).toEqual([ORG_ID, STORE_ID, '+234 801-234-5678', '+2348012345678']);
+    expect(customer.created).toBe(true);
+  });
+});
+
+describe('listCustomerChanges', () => {
+  afterEach(() => {
+    delete process.env.PHONE_DEFAULT_COUNTRY_CODE;
+  });
+
+  const row = (id: string, updatedAt: string) => ({
+    id,
+    phone: '0801 234 5678',
+    phone_e164: '+2348012345678',
+    first_name: 'Ada',
+    last_name: '',
+    email: null,
+    loyalty_number: null,
+    current_points: '12',
+    is_active: true,
+    updated_at: updatedAt,
+  });
+
+  it('round-trips cursors and ignores malformed ones', () => {
+    const cursor = { updatedAt: '2026-10-18T10:00:00.123456', id: 'c-1' };
+    expect(decodeCustomerCursor(encodeCustomerCursor(cursor))).toEqual(cursor);
+    expect(decodeCustomerCursor('not-a-cursor')).toBeNull();
+    expect(decodeCustomerCursor(undefined)).toBeNull();
+  });
+
+  it('returns one page after the cursor and where to continue from', async () => {
+    process.env.PHONE_DEFAULT_COUNTRY_CODE = '234';
+    const execute = vi.fn().mockResolvedValue({
+      rows: [row('c-1', '2026-10-18T10:00:00.000001'), row('c-2', '2026-10-18T10:00:01.000000')],
+    });
+    const since = encodeCustomerCursor({ updatedAt: '2026-10-18T09:00:00.000000', id: 'c-0' });
+
+    const page = await listCustomerChanges({ execute }, STORE_ID, { cursor: since, limit: 1 });
+
+    const { sql: text, params } = dialect.sqlToQuery(execute.mock.calls[0][0]);
+    expect(text).toContain('(c.updated_at, c.id) >');
+    expect(text).toContain('ORDER BY c.updated_at, c.id');
+    expect(params).toContain('c-0');
+    expect(params).toContain(2);
+    expect(page.hasMore).toBe(true);
+    expect(page.customers).toEqual([
+      expect.objectContaining({ id: 'c-1', name: 'Ada', phoneE164: '+2348012345678', currentPoints: 12, isActive: true }),
+    ]);
+    expect(decodeCustomerCursor(page.cursor)).toEqual({ updatedAt: '2026-10-18T10:00:00.000001', id: 'c-1' });
+    expect(page.defaultCountryCode).toBe('234');
+  });
+
+  it('keeps the caller cursor when nothing changed', async () => {
+    const execute = vi.fn().mockResolvedValue({ rows: [] });
+    const since = encodeCustomerCursor({ updatedAt: '2026-10-18T09:00:00.000000', id: 'c-0' });
+
+    const page = await listCustomerChanges({ execute }, STORE_ID, { cursor: since });
+
+    expect(page).toMatchObject({ customers: [], cursor: since, hasMore: false });
+  });
+});
@@ -0,0 +1,115 @@
+// @vitest-environment node
+import { PgDialect } from 'drizzle-orm/pg-core';
+import { afterEach, beforeEach, describe, expect, it, vi } from 'vitest';
+
+const fake = vi.hoisted(() => {
+  const inserted: any[] = [];
+  const execute = vi.fn();
+  const insert = vi.fn(() => ({
+    values: (values: any) => {
+      inserted.push(values);
+      return { returning: async () => [{ id: `m-${inserted.length}` }] };
+    },
+  }));
+  return { inserted, db: { execute, insert } };
+});
+
+vi.mock('../../server/db', () => ({ db: fake.db }));
+
+import { createEmailTransport, deliverEmail } from '../../server/email';
+import {
+  EMAIL_PRIORITY_BULK,
+  emailRetryDelayMs,
+  enqueueEmail,
+  isPermanentEmailFailure,
+  processEmailOutboxOnce,
+} from '../../server/jobs/email-outbox';
+import { startSmtpSink, type SmtpSink } from '../utils/smtp-sink';
+
+const claimedRow = (values: any, id: string, attempts = 1) => ({
+  id,
+  category: values.category,
+  to_address: values.toAddress,
+  subject: values.subject,
+  html: values.html,
+  text_body: values.textBody,
+  attachments: values.attachments,
+  attempts,
+});
+
+describe('email outbox helpers', () => {
+  it('backs off exponentially and treats 5xx replies as permanent', () => {
+    expect(emailRetryDelayMs(1, 30_000, 3_600_000)).toBe(30_000);
+    expect(emailRetryDelayMs(4, 30_000, 3_600_000)).toBe(240_000);
+    expect(emailRetryDelayMs(20, 30_000, 3_600_000)).toBe(3_600_000);
+    expect(isPermanentEmailFailure({ responseCode: 550 })).toBe(true);
+    expect(isPermanentEmailFailure({ responseCode: 421 })).toBe(false);
+    expect(isPermanentEmailFailure(new Error('ECONNRESET'))).toBe(false);
+  });
+});
+
+describe('processEmailOutboxOnce over a pooled transport', () => {
+  let sink: SmtpSink;
+  let transport: ReturnType<typeof createEmailTransport>;
+
+  beforeEach(async () => {
+    fake.inserted.length = 0;
+    fake.db.execute.mockReset();
+    sink = await startSmtpSink();
+    transport = createEmailTransport({
+      host: sink.host,
+      port: sink.port,
+      secure: false,
+      ignoreTLS: true,
+      auth: undefined,
+      maxConnections: 2,
+    });
+  });
+
+  afterEach(async () => {
+    transport.close();
+    await sink.close();
+  });
+
+  it('delivers claimed mail, keeps attachments intact and dead-letters rejected recipients', async () => {
+    sink.rejectRecipient('gone@example.com');
+    await enqueueEmail(
+      { to: 'owner@example.com', subject: 'Weekly report', html: '<p>Attached</p>', attachments: [{ filename: 'r.csv', content: 'a,b\n1,2', contentType: 'text/csv' }] },
+      { category: 'scheduled_report', bulk: true },
+    );
+    for (let i = 0; i < 4; i++) {
+      await enqueueEmail({ to: `user${i}@example.com`, subject: `Code ${i}`, html: `<p>${i}</p>` }, { category: 'signup_otp' });
+    }
+    await enqueueEmail({ to: 'gone@example.com', subject: 'Reset', html: '<p>reset</p>' }, { category: 'password_reset' });
+    expect(fake.inserted[0]).toMatchObject({ priority: EMAIL_PRIORITY_BULK, attachments: [{ filename: 'r.csv' }] });
+
+    fake.db.execute
+      .mockResolvedValueOnce({ rowCount: 0 }) // requeue stuck
+      .mockResolvedValueOnce({ rows: fake.inserted.map((values, index) => claimedRow(values, `m-${index + 1}`)) })
+      .mockResolvedValue({ rowCount: 1 });
+
+    const result = await processEmailOutboxOnce({
+      batchSize: 10,
+      concurrency: 4,
+      deliver: (options) => deliverEmail(options, transport),
+    });
+
+    expect(result).toEqual({ claimed: 6, sent: 5, retried: 0, deadLettered: 1, requeued: 0 });
+    expect(sink.messages).toHaveLength(5);
+    // Four sends in flight, two pooled connections
+    expect(sink.connections).toBeLessThanOrEqual(2);
+
+    const report = sink.messages.find((message) => message.to.includes('owner@example.com'))!;
+    expect(report.data).toContain('filename=r.csv');
+    expect(report.data).not.toContain('chainsync-logo-solid');
+    const otp = sink.messages.find((message) => message.to.includes('user0@example.com'))!;
+    expect(otp.data).toContain('Content-ID: <chainsync-logo-solid>');
+
+    // Sent and dead-lettered rows drop the rendered body and attachments
+    const finished = fake.db.execute.mock.calls.slice(2).map(([query]) => new PgDialect().sqlToQuery(query).sql);
+    expect(finished).toHaveLength(6);
+    for (const text of finished) {
+      expect(text).toContain("html = '', text_body = NULL, attachments = NULL");
+    }
+  });
+});
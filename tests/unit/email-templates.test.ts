@@ -0,0 +1,102 @@
+// @vitest-environment node
+import { readFileSync } from 'node:fs';
+import { describe, expect, it } from 'vitest';
+
+import {
+  OUTPUT_FILE,
+  compileAll,
+  compileTemplate,
+  minifyHtml,
+} from '../../scripts/compile-email-templates.mjs';
+import { EMAIL_ASSETS, staffCredentialsTemplate } from '../../server/email-templates/compiled';
+
+const partials: Record<string, string> = {
+  header: '<div class="logo">\n  <img src="{{cid:logo.png}}" />\n</div>\n',
+};
+
+const compile = (html: string, text?: string) =>
+  compileTemplate({
+    name: 'sample-notice',
+    html,
+    text,
+    loadPartial: (name: string) => {
+      if (!(name in partials)) throw new Error(`missing partial ${name}`);
+      return partials[name];
+    },
+    resolveAsset: (filename: string) => ({ cid: filename.replace(/\.\w+$/, '') }),
+  });
+
+const render = (expression: string, vars: Record<string, unknown>) => {
+  const esc = (value: unknown) =>
+    value == null ? '' : String(value).replace(/[&<>"']/g, (ch) => `&#${ch.charCodeAt(0)};`);
+  const str = (value: unknown) => (value == null ? '' : String(value));
+  return new Function('v', 'esc', 'str', `return ${expression};`)(vars, esc, str) as string;
+};
+
+describe('email template compiler', () => {
+  it('drops layout whitespace and comments but keeps inline spacing', () => {
+    const html = `
+      <!-- Variables: name -->
+      <div>
+        <p style="a;
+                  b;">
+          <strong>Email:</strong> {{ email }}
+        </p>
+      </div>
+    `;
+    expect(minifyHtml(html)).toBe('<div><p style="a; b;"><strong>Email:</strong> {{ email }}</p></div>');
+  });
+
+  it('expands partials, resolves assets and compiles conditionals into concatenation', () => {
+    const template = compile(
+      '{{> header}}\n<p>Hello {{ name }}{{#if store}} at <b>{{ store }}</b>{{/if}}.</p>',
+      'Hello {{ name }}{{#if store}} at {{ store }}{{/if}}.\n',
+    );
+
+    expect(template.exportName).toBe('sampleNoticeTemplate');
+    expect(template.assets).toEqual(['logo']);
+    expect(template.variables).toEqual(['name', 'store']);
+    expect([...template.optional]).toEqual(['store']);
+    expect(template.htmlExpr).not.toContain('{{');
+
+    expect(render(template.htmlExpr, { name: '<Ada>', store: 'Main & Co' })).toBe(
+      '<div class="logo"><img src="cid:logo" /></div><p>Hello &#60;Ada&#62; at <b>Main &#38; Co</b>.</p>',
+    );
+    expect(render(template.htmlExpr, { name: 'Ada' })).toContain('<p>Hello Ada.</p>');
+    expect(render(template.textExpr!, { name: '<Ada>', store: 'Main' })).toBe('Hello <Ada> at Main.');
+  });
+
+  it('rejects unknown tags and unbalanced sections', () => {
+    expect(() => compile('<p>{{ first-name }}</p>')).toThrow(/unsupported tag/);
+    expect(() => compile('<p>{{#if name}}open</p>')).toThrow(/never closed/);
+    expect(() => compile('{{> footer}}')).toThrow(/missing partial footer/);
+  });
+
+  it('keeps the committed module in sync with the template sources', () => {
+    const { source, templates } = compileAll();
+    expect(templates.length).toBeGreaterThan(0);
+    expect(readFileSync(OUTPUT_FILE, 'utf-8')).toBe(source);
+  });
+});
+
+describe('compiled email templates', () => {
+  it('escapes variables and references the embedded logo by content id', () => {
+    const vars = {
+      friendlyName: 'Sam <script>',
+      inviter: 'Alex',
+      staffEmail: 'sam@example.com',
+      temporaryPassword: 'p&ss"word',
+      roleLabel: 'Cashier',
+      loginUrl: 'https://app.example.com/login',
+    };
+    const html = staffCredentialsTemplate.html(vars);
+
+    expect(html).toContain('Hello Sam &lt;script&gt;,');
+    expect(html).toContain('p&amp;ss&quot;word');
+    expect(html).not.toContain('to help manage');
+    expect(html).toContain('src="cid:chainsync-logo-solid"');
+    expect(staffCredentialsTemplate.assets).toEqual(['chainsync-logo-solid']);
+    expect(EMAIL_ASSETS['chainsync-logo-solid'].contentType).toBe('image/png');
+    expect(staffCredentialsTemplate.text({ ...vars, storeName: 'Main' })).toContain('to manage Main.');
+  });
+});
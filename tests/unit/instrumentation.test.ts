@@ -0,0 +1,87 @@
+import { EventEmitter } from 'node:events';
+import { afterEach, beforeEach, describe, expect, it, vi } from 'vitest';
+
+const sinks = vi.hoisted(() => ({
+  logger: { info: vi.fn(), warn: vi.fn(), error: vi.fn(), logSecurityEvent: vi.fn() },
+  monitoringService: { recordHttpSample: vi.fn() },
+  performanceMonitor: { recordMetric: vi.fn() },
+}));
+
+vi.mock('../../server/lib/logger', () => ({ logger: sinks.logger }));
+vi.mock('../../server/lib/monitoring', () => ({ monitoringService: sinks.monitoringService }));
+vi.mock('../../server/lib/performance', () => ({ performanceMonitor: sinks.performanceMonitor }));
+
+import {
+  getInstrumentationStats,
+  instrumentationMiddleware,
+  isFastPath,
+  resetInstrumentationStats,
+  sampleRateFor,
+} from '../../server/lib/instrumentation';
+
+function request(url: string, statusCode = 200) {
+  const req: any = {
+    method: 'GET',
+    url,
+    originalUrl: url,
+    ip: '10.0.0.1',
+    headers: { 'user-agent': 'vitest' },
+    session: { user: { id: 'u-1', orgId: 'o-1', storeId: 's-1' } },
+    requestId: 'req-1',
+  };
+  const res: any = Object.assign(new EventEmitter(), { statusCode });
+  const next = vi.fn();
+  instrumentationMiddleware(req, res, next);
+  return { res, next };
+}
+
+describe('instrumentationMiddleware', () => {
+  beforeEach(() => {
+    resetInstrumentationStats();
+    vi.clearAllMocks();
+  });
+
+  afterEach(() => {
+    delete process.env.REQUEST_LOG_SAMPLING;
+    delete process.env.REQUEST_LOG_SAMPLE_RATE;
+  });
+
+  it('skips health checks and static assets without hooking the response', () => {
+    for (const url of ['/healthz', '/assets/index-abc.js', '/logo.svg']) {
+      const { res, next } = request(url);
+      expect(next).toHaveBeenCalledTimes(1);
+      expect(res.listenerCount('finish')).toBe(0);
+    }
+    expect(isFastPath('/api/products.json')).toBe(false);
+    expect(isFastPath('/healthz?verbose=1')).toBe(false);
+    expect(getInstrumentationStats()).toMatchObject({ fastPath: 3, recorded: 0 });
+  });
+
+  it('feeds metrics, the access log and the security log from one finish hook', () => {
+    const { res } = request('/api/customers?phone=123', 401);
+    expect(res.listenerCount('finish')).toBe(1);
+    res.emit('finish');
+
+    expect(sinks.monitoringService.recordHttpSample).toHaveBeenCalledWith('GET', '/api/customers', 401, expect.any(Number), expect.any(Number));
+    expect(sinks.performanceMonitor.recordMetric).toHaveBeenCalledWith(expect.objectContaining({ endpoint: '/api/customers', statusCode: 401 }));
+    expect(sinks.logger.error).toHaveBeenCalledWith('HTTP GET /api/customers - 401', expect.objectContaining({ requestId: 'req-1', userId: 'u-1', orgId: 'o-1' }));
+    expect(sinks.logger.logSecurityEvent).toHaveBeenCalledWith('unauthorized_access', expect.objectContaining({ ipAddress: '10.0.0.1' }));
+    expect(getInstrumentationStats()).toMatchObject({ recorded: 1, logged: 1, securityEvents: 1 });
+  });
+
+  it('samples successful access logs per route but keeps the metrics', () => {
+    process.env.REQUEST_LOG_SAMPLE_RATE = '1';
+    process.env.REQUEST_LOG_SAMPLING = '/api/pos=0.5,/api/pos/sync=0';
+    expect(sampleRateFor('/api/pos/sync/upload')).toBe(0);
+    expect(sampleRateFor('/api/pos/sales')).toBe(0.5);
+    expect(sampleRateFor('/api/stores')).toBe(1);
+
+    request('/api/pos/sync/status').res.emit('finish');
+    request('/api/pos/sync/status', 500).res.emit('finish');
+
+    expect(sinks.monitoringService.recordHttpSample).toHaveBeenCalledTimes(2);
+    expect(sinks.logger.info).not.toHaveBeenCalled();
+    expect(sinks.logger.error).toHaveBeenCalledTimes(1);
+    expect(getInstrumentationStats()).toMatchObject({ recorded: 2, logged: 1, sampledOut: 1 });
+  });
+});
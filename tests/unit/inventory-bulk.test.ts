@@ -0,0 +1,85 @@
+import { describe, expect, it } from 'vitest';
+
+import {
+  chunk,
+  computeInventoryCostState,
+  planBulkInventoryUpdates,
+  type CostLayerState,
+  type InventoryState,
+} from '../../server/lib/inventory-bulk';
+
+const stock = (quantity: number, avgCost: number): InventoryState => ({
+  exists: true,
+  quantity,
+  avgCost,
+  totalCostValue: quantity * avgCost,
+  minStockLevel: 0,
+  lastRestocked: null,
+});
+
+describe('computeInventoryCostState', () => {
+  it('blends the override cost into the average when stock is added', () => {
+    const next = computeInventoryCostState({ quantityBefore: 10, avgCostBefore: 2, totalCostBefore: 20, nextQuantity: 20, costOverride: 4 });
+    expect(next).toEqual({ avgCost: 3, totalCostValue: 60 });
+  });
+
+  it('keeps the average when stock is removed and zeroes it when empty', () => {
+    expect(computeInventoryCostState({ quantityBefore: 10, avgCostBefore: 2, totalCostBefore: 20, nextQuantity: 4 }))
+      .toEqual({ avgCost: 2, totalCostValue: 8 });
+    expect(computeInventoryCostState({ quantityBefore: 10, avgCostBefore: 2, totalCostBefore: 20, nextQuantity: 0 }))
+      .toEqual({ avgCost: 0, totalCostValue: 0 });
+  });
+});
+
+describe('planBulkInventoryUpdates', () => {
+  it('plans movements, FIFO layer consumption and per-row results in one pass', () => {
+    const layers: CostLayerState[] = [
+      { id: 'l1', quantityRemaining: 3, originalQuantity: 3, unitCost: 1 },
+      { id: 'l2', quantityRemaining: 7, originalQuantity: 7, unitCost: 2 },
+    ];
+    const plan = planBulkInventoryUpdates(
+      [
+        { productId: 'p1', quantity: 5 },
+        { productId: 'missing', quantity: 1 },
+        { productId: 'p2', quantity: 8, costPrice: 3 },
+      ],
+      {
+        inventory: new Map([['p1', stock(10, 2)], ['p2', stock(2, 3)]]),
+        products: new Map([
+          ['p1', { orgId: 'o', cost: 2, salePrice: 5 }],
+          ['p2', { orgId: 'o', cost: 3, salePrice: 6 }],
+        ]),
+        layers: new Map([['p1', layers]]),
+      },
+    );
+
+    expect(plan.results).toEqual([
+      { productId: 'p1', success: true, quantityBefore: 10, quantity: 5, variance: -5 },
+      { productId: 'missing', success: false, error: 'Product not found' },
+      { productId: 'p2', success: true, quantityBefore: 2, quantity: 8, variance: 6 },
+    ]);
+    expect(layers.map((layer) => layer.quantityRemaining)).toEqual([0, 5]);
+    expect(plan.layers.get('p2')).toEqual([expect.objectContaining({ id: null, quantityRemaining: 6, unitCost: 3 })]);
+    expect(plan.movements.map((m) => [m.productId, m.quantityBefore, m.quantityAfter])).toEqual([['p1', 10, 5], ['p2', 2, 8]]);
+    expect(plan.priceChanges).toEqual([expect.objectContaining({ productId: 'p2', oldCost: 3, newCost: 3 })]);
+  });
+
+  it('composes repeated rows for the same product like sequential updates', () => {
+    const plan = planBulkInventoryUpdates(
+      [{ productId: 'p1', quantity: 12 }, { productId: 'p1', quantity: 7 }],
+      {
+        inventory: new Map([['p1', stock(10, 2)]]),
+        products: new Map([['p1', { orgId: null, cost: null, salePrice: null }]]),
+        layers: new Map(),
+      },
+    );
+    expect(plan.movements.map((m) => [m.quantityBefore, m.quantityAfter])).toEqual([[10, 12], [12, 7]]);
+    expect(plan.inventory.get('p1')?.quantity).toBe(7);
+  });
+});
+
+describe('chunk', () => {
+  it('splits into fixed-size batches', () => {
+    expect(chunk([1, 2, 3, 4, 5], 2)).toEqual([[1, 2], [3, 4], [5]]);
+  });
+});
@@ -0,0 +1,45 @@
+import { describe, expect, it } from 'vitest';
+
+import {
+  InventoryListingQuerySchema,
+  buildListingEtag,
+  parseFieldList,
+  projectFields,
+  resolveListingWindow,
+} from '../../server/lib/inventory-listing';
+
+describe('inventory listing query', () => {
+  it('only paginates when page or pageSize is given', () => {
+    expect(resolveListingWindow({})).toBeNull();
+    expect(resolveListingWindow({ page: 3 })).toEqual({ page: 3, pageSize: 100, limit: 100, offset: 200 });
+    expect(resolveListingWindow({ pageSize: 25 })).toEqual({ page: 1, pageSize: 25, limit: 25, offset: 0 });
+  });
+
+  it('rejects page sizes above the cap', () => {
+    expect(InventoryListingQuerySchema.safeParse({ pageSize: '501' }).success).toBe(false);
+    expect(InventoryListingQuerySchema.parse({ lowStock: 'TRUE', page: '2' })).toMatchObject({ lowStock: true, page: 2 });
+  });
+});
+
+describe('projectFields', () => {
+  const item = { id: 'i1', productId: 'p1', quantity: 4, product: { id: 'p1', name: 'Tea', sku: 'T-1' } };
+
+  it('keeps requested top-level and nested product fields', () => {
+    expect(projectFields(item, parseFieldList('productId, quantity,product.name,missing'))).toEqual({
+      productId: 'p1',
+      quantity: 4,
+      product: { name: 'Tea' },
+    });
+    expect(projectFields(item, parseFieldList(''))).toBe(item);
+  });
+});
+
+describe('buildListingEtag', () => {
+  it('changes with the listing version and with the query shape', () => {
+    const base = buildListingEtag('s1', '7:USD', { lowStock: false });
+    expect(base).toMatch(/^W\/"inv-/);
+    expect(buildListingEtag('s1', '7:USD', { lowStock: false })).toBe(base);
+    expect(buildListingEtag('s1', '8:USD', { lowStock: false })).not.toBe(base);
+    expect(buildListingEtag('s1', '7:USD', { lowStock: false, page: 2 })).not.toBe(base);
+  });
+});
@@ -0,0 +1,143 @@
+import { PgDialect } from 'drizzle-orm/pg-core';
+import { afterEach, beforeEach, describe, expect, it, vi } from 'vitest';
+
+const fake = vi.hoisted(() => {
+  const state = { locked: true, claimed: true };
+  const client = {
+    query: vi.fn(async (text: string, _params?: unknown[]) => (text.includes('pg_try_advisory_lock') ? { rows: [{ locked: state.locked }] } : { rows: [] })),
+    connect: vi.fn(async () => undefined),
+    on: vi.fn(),
+    end: vi.fn(async () => undefined),
+  };
+  const execute = vi.fn(async () => ({ rows: state.claimed ? [{ id: 7 }] : [] }));
+  return { state, client, db: { execute }, createDedicatedClient: vi.fn(() => client) };
+});
+
+vi.mock('../../server/db', () => ({ db: fake.db, createDedicatedClient: fake.createDedicatedClient }));
+
+import { JobScheduler, nextSlot, parseSchedule } from '../../server/jobs/scheduler';
+
+const at = (iso: string) => new Date(iso);
+
+describe('schedule parsing', () => {
+  it('finds the next cron slot in UTC', () => {
+    expect(nextSlot(parseSchedule('0 2 * * *'), at('2026-10-18T03:00:00Z'))).toEqual(at('2026-10-19T02:00:00Z'));
+    expect(nextSlot(parseSchedule('*/15 * * * *'), at('2026-10-18T10:07:30Z'))).toEqual(at('2026-10-18T10:15:00Z'));
+    // 2026-10-18 is a Sunday
+    expect(nextSlot(parseSchedule('30 9 * * 1-5'), at('2026-10-18T12:00:00Z'))).toEqual(at('2026-10-19T09:30:00Z'));
+    expect(nextSlot(parseSchedule('0 0 1 1 *'), at('2026-10-18T00:00:00Z'))).toEqual(at('2027-01-01T00:00:00Z'));
+  });
+
+  it('aligns interval schedules to the epoch so every instance picks the same slot', () => {
+    expect(nextSlot(parseSchedule('@every 15m'), at('2026-10-18T10:07:30Z'))).toEqual(at('2026-10-18T10:15:00Z'));
+    expect(() => parseSchedule('0 25 * * *')).toThrow();
+    expect(() => parseSchedule('every day')).toThrow();
+  });
+});
+
+describe('JobScheduler', () => {
+  beforeEach(() => {
+    fake.state.locked = true;
+    fake.state.claimed = true;
+    vi.clearAllMocks();
+  });
+
+  afterEach(() => {
+    vi.useRealTimers();
+  });
+
+  it('runs a manual trigger under the lease and records duration and rows touched', async () => {
+    const scheduler = new JobScheduler();
+    scheduler.register({ name: 'low-stock-alerts', schedule: '0 2 * * *', run: async () => 12 });
+
+    const result = await scheduler.trigger('low-stock-alerts', 'user-1');
+    expect(result.status).toBe('started');
+    const summary = await (result as Extract<typeof result, { status: 'started' }>).done;
+
+    expect(summary).toMatchObject({ runId: 7, trigger: 'manual', status: 'succeeded', rowsTouched: 12 });
+    expect(fake.db.execute).toHaveBeenCalledTimes(2);
+    expect(fake.client.query).toHaveBeenLastCalledWith(expect.stringContaining('pg_advisory_unlock'), ['job:low-stock-alerts', 0]);
+    expect(scheduler.list()[0]).toMatchObject({ runs: 1, failures: 0, running: 0 });
+  });
+
+  it('reports busy when another instance holds every concurrency slot', async () => {
+    fake.state.locked = false;
+    const run = vi.fn();
+    const scheduler = new JobScheduler();
+    scheduler.register({ name: 'dunning', schedule: '0 5 * * *', concurrency: 2, run });
+
+    await expect(scheduler.trigger('dunning')).resolves.toEqual({ status: 'busy' });
+    expect(fake.client.query).toHaveBeenCalledTimes(2);
+    expect(run).not.toHaveBeenCalled();
+    await expect(scheduler.trigger('missing')).resolves.toEqual({ status: 'not_found' });
+  });
+
+  it('holds every lease on one connection and skips slots this instance already holds', async () => {
+    const pending: Array<() => void> = [];
+    const run = vi.fn(() => new Promise<void>((resolve) => { pending.push(resolve); }));
+    const scheduler = new JobScheduler();
+    scheduler.register({ name: 'report-render', schedule: '0 3 * * *', concurrency: 2, run });
+
+    const first = await scheduler.trigger('report-render');
+    const second = await scheduler.trigger('report-render');
+    expect([first.status, second.status]).toEqual(['started', 'started']);
+    // Advisory locks are re-entrant on a session, so slot 0 is not asked for twice
+    const tried = fake.client.query.mock.calls.filter(([text]) => text.includes('pg_try_advisory_lock'));
+    expect(tried.map(([, params]) => params)).toEqual([['job:report-render', 0], ['job:report-render', 1]]);
+    expect(fake.createDedicatedClient.mock.calls.length).toBeLessThanOrEqual(1);
+
+    pending.forEach((resolve) => resolve());
+    await Promise.all([first, second].map((result) => (result as Extract<typeof result, { status: 'started' }>).done));
+  });
+
+  it('runs a scheduled slot once and skips slots another instance already claimed', async () => {
+    vi.useFakeTimers();
+    vi.setSystemTime(at('2026-10-18T10:14:00Z'));
+    const run = vi.fn(async () => ({ rowsTouched: 1 }));
+    const scheduler = new JobScheduler();
+    scheduler.register({ name: 'loyalty-ledger-reconciliation', schedule: '@every 15m', run });
+    scheduler.start();
+    expect(scheduler.list()[0].nextRunAt).toBe('2026-10-18T10:15:00.000Z');
+
+    await vi.advanceTimersByTimeAsync(60_000);
+    expect(run).toHaveBeenCalledTimes(1);
+    expect(scheduler.list()[0].nextRunAt).toBe('2026-10-18T10:30:00.000Z');
+
+    fake.state.claimed = false;
+    await vi.advanceTimersByTimeAsync(15 * 60_000);
+    expect(run).toHaveBeenCalledTimes(1);
+    expect(scheduler.list()[0].skipped).toBe(1);
+    scheduler.stop();
+  });
+
+  it('waits for runs in progress on stop and refuses new ones', async () => {
+    let finish: () => void = () => undefined;
+    const scheduler = new JobScheduler();
+    scheduler.register({ name: 'nightly-export', schedule: '0 1 * * *', run: () => new Promise<void>((resolve) => { finish = resolve; }) });
+
+    const result = await scheduler.trigger('nightly-export');
+    expect(result.status).toBe('started');
+    let stopped: boolean | undefined;
+    const stopping = scheduler.stop(5_000).then((value) => { stopped = value; });
+    await expect(scheduler.trigger('nightly-export')).resolves.toEqual({ status: 'busy' });
+    await Promise.resolve();
+    expect(stopped).toBeUndefined();
+
+    finish();
+    await stopping;
+    expect(stopped).toBe(true);
+    expect(scheduler.list()[0]).toMatchObject({ runs: 1, running: 0 });
+  });
+
+  it('marks runs still going at the drain timeout as failed', async () => {
+    const scheduler = new JobScheduler();
+    scheduler.register({ name: 'slow-rollup', schedule: '0 4 * * *', run: () => new Promise<void>(() => undefined) });
+    await scheduler.trigger('slow-rollup');
+
+    await expect(scheduler.stop(10)).resolves.toBe(false);
+    const [interrupted] = fake.db.execute.mock.calls.at(-1) as unknown as [unknown];
+    const query = new PgDialect().sqlToQuery(interrupted as any);
+    expect(query.sql).toContain("SET status = 'failed'");
+    expect(query.params).toEqual([7]);
+  });
+});
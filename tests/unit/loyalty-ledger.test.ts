@@ -0,0 +1,75 @@
+import { PgDialect } from 'drizzle-orm/pg-core';
+import { describe, expect, it, vi } from 'vitest';
+
+vi.mock('../../server/db', () => ({ db: {} }));
+
+import {
+  buildLedgerPostQuery,
+  InsufficientPointsError,
+  postLoyaltyEntries,
+  postLoyaltyEntriesOrThrow,
+  type LoyaltyEntry,
+} from '../../server/lib/loyalty-ledger';
+
+const entry = (overrides: Partial<LoyaltyEntry>): LoyaltyEntry => ({
+  holderKind: 'customer',
+  holderId: 'c-1',
+  delta: 10,
+  entryType: 'earn',
+  source: 'pos_sale',
+  ...overrides,
+});
+
+describe('buildLedgerPostQuery', () => {
+  it('appends the covered entries and increments the balance by what was appended', () => {
+    const { sql: text, params } = new PgDialect().sqlToQuery(buildLedgerPostQuery('customer', [
+      entry({ delta: -5, entryType: 'redeem', idempotencyKey: 'sale-1:redeem' }),
+      entry({ delta: 12 }),
+    ]));
+
+    expect(text).toContain('FOR UPDATE');
+    expect(text).toContain('k.balance + t.debits >= 0');
+    expect(text).toContain('INSERT INTO loyalty_ledger');
+    // A duplicate committed while this post waited on the lock is skipped, and the balance moves by what was logged
+    expect(text).toContain('ON CONFLICT (holder_kind, holder_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING');
+    expect(text).toContain('SET current_points = h.current_points + m.delta, lifetime_points = h.lifetime_points + m.earned');
+    expect(text).toMatch(/logged AS \([\s\S]*applied AS \(/);
+    expect(params).toContain('sale-1:redeem');
+
+    const accountQuery = new PgDialect().sqlToQuery(buildLedgerPostQuery('account', [entry({ holderKind: 'account' })])).sql;
+    expect(accountQuery).toContain('UPDATE loyalty_accounts h');
+    expect(accountQuery).not.toContain('lifetime_points');
+  });
+});
+
+describe('postLoyaltyEntries', () => {
+  it('batches one statement per holder kind and splits applied from rejected holders', async () => {
+    const execute = vi.fn()
+      .mockResolvedValueOnce({ rows: [{ holder_id: 'c-1', balance: 25 }, { holder_id: 'c-2', balance: null }] })
+      .mockResolvedValueOnce({ rows: [{ holder_id: 'a-1', balance: '7' }] });
+
+    const result = await postLoyaltyEntries([
+      entry({ holderId: 'c-1' }),
+      entry({ holderId: 'c-2', delta: -50, entryType: 'redeem' }),
+      entry({ holderId: 'c-3', delta: 0 }),
+      entry({ holderKind: 'account', holderId: 'a-1', delta: 7 }),
+    ], { execute });
+
+    expect(execute).toHaveBeenCalledTimes(2);
+    expect(result.balances).toEqual(new Map([['c-1', 25], ['a-1', 7]]));
+    expect(result.rejected).toEqual(['c-2']);
+  });
+
+  it('skips the round trip when nothing moves', async () => {
+    const execute = vi.fn();
+    await expect(postLoyaltyEntries([entry({ delta: 0 })], { execute })).resolves.toEqual({ balances: new Map(), rejected: [] });
+    expect(execute).not.toHaveBeenCalled();
+  });
+
+  it('throws a 400 when a redemption is not covered', async () => {
+    const execute = vi.fn().mockResolvedValue({ rows: [{ holder_id: 'c-1', balance: null }] });
+    const posting = postLoyaltyEntriesOrThrow([entry({ delta: -100, entryType: 'redeem' })], { execute });
+    await expect(posting).rejects.toBeInstanceOf(InsufficientPointsError);
+    await expect(posting).rejects.toMatchObject({ statusCode: 400, holderIds: ['c-1'] });
+  });
+});
@@ -0,0 +1,66 @@
+import express from 'express';
+import request from 'supertest';
+import { describe, expect, it, vi } from 'vitest';
+
+const ORG_ID = '00000000-0000-0000-0000-0000000000a1';
+
+const state = vi.hoisted(() => ({
+  currency: 'NGN',
+  updates: [] as Array<Record<string, unknown>>,
+}));
+
+vi.mock('../../server/db', () => ({
+  db: {
+    select: () => ({
+      from: () => ({
+        where: async () => [{ id: 'u-1', orgId: ORG_ID, isAdmin: true }],
+      }),
+    }),
+    update: () => ({
+      set: (values: Record<string, unknown>) => ({
+        where: () => ({
+          returning: async () => {
+            state.updates.push(values);
+            state.currency = String(values.currency);
+            return [{ id: ORG_ID, currency: state.currency }];
+          },
+        }),
+      }),
+    }),
+  },
+}));
+vi.mock('../../server/storage', () => ({ storage: {} }));
+vi.mock('../../server/payment/service', () => ({ PaymentService: class {} }));
+vi.mock('../../server/middleware/authz', () => ({
+  requireAuth: (_req: any, _res: any, next: any) => next(),
+  enforceIpWhitelist: (_req: any, _res: any, next: any) => next(),
+  requireRole: () => (_req: any, _res: any, next: any) => next(),
+}));
+
+import { registerAdminRoutes } from '../../server/api/routes.admin';
+import { getOrgBaseCurrencyCache } from '../../server/lib/currency';
+
+describe('PATCH /api/admin/org/currency', () => {
+  it('stores the currency and drops the cached base currency for the org', async () => {
+    const app = express();
+    app.use(express.json());
+    app.use((req: any, _res, next) => {
+      req.session = { userId: 'u-1' };
+      next();
+    });
+    await registerAdminRoutes(app);
+
+    const cache = getOrgBaseCurrencyCache();
+    const load = vi.fn(async () => state.currency as 'NGN' | 'USD');
+    await expect(cache.get(ORG_ID, load)).resolves.toBe('NGN');
+
+    const res = await request(app).patch('/api/admin/org/currency').send({ currency: 'usd' }).expect(200);
+    expect(res.body.org).toEqual({ id: ORG_ID, currency: 'USD' });
+    expect(state.updates).toEqual([{ currency: 'USD' }]);
+
+    await expect(cache.get(ORG_ID, load)).resolves.toBe('USD');
+    expect(load).toHaveBeenCalledTimes(2);
+
+    await request(app).patch('/api/admin/org/currency').send({ currency: 'EUR' }).expect(400);
+  });
+});
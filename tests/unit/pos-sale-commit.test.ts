@@ -0,0 +1,178 @@
+import { describe, expect, it, vi } from 'vitest';
+
+vi.mock('../../server/db', () => ({ db: {} }));
+
+import {
+  buildSaleCommitPayload,
+  commitPosSale,
+  lowStockLevels,
+  parseSaleCommitResult,
+  replaySaleBatch,
+  SaleCommitError,
+  saleCommitMode,
+  type SaleCommitInput,
+} from '../../server/lib/pos-sale-commit';
+
+const input: SaleCommitInput = {
+  idempotencyKey: 'key-1',
+  storeId: '00000000-0000-0000-0000-000000000001',
+  cashierId: '00000000-0000-0000-0000-0000000000aa',
+  subtotal: 30,
+  discount: 0,
+  tax: 1.5,
+  paymentMethod: 'split',
+  transactionPaymentMethod: 'cash',
+  paymentBreakdown: [],
+  customerPhone: ' 0803 ',
+  redeemPoints: 5,
+  items: [
+    { productId: 'p-1', quantity: 2, unitPrice: '10.00', lineTotal: '20.00' },
+    { productId: 'p-1_free', quantity: 1, unitPrice: '0', lineDiscount: '10.00', lineTotal: '0', isFreeItem: true },
+  ],
+};
+
+const committed = {
+  replayed: false,
+  sale: { id: 'sale-1', total: '31.50', occurredAt: '2026-10-18T10:00:00.000+00:00' },
+  items: [{ id: 'si-1', productId: 'p-1', quantity: 2 }],
+  stock: [
+    { productId: 'p-1', quantity: 2, minStockLevel: 5, avgCost: '4.0000' },
+    { productId: 'p-2', quantity: 9, minStockLevel: 5, avgCost: '1.0000' },
+    { productId: 'p-3', quantity: 0, minStockLevel: 0, avgCost: '1.0000' },
+  ],
+  customer: { id: 'c-1', points: 31, pointsEarned: 30 },
+};
+
+describe('saleCommitMode', () => {
+  it('defaults to the procedure outside tests and honours POS_SALE_COMMIT', () => {
+    expect(saleCommitMode({ NODE_ENV: 'production' } as NodeJS.ProcessEnv)).toBe('procedure');
+    expect(saleCommitMode({ NODE_ENV: 'test' } as NodeJS.ProcessEnv)).toBe('legacy');
+    expect(saleCommitMode({ NODE_ENV: 'test', POS_SALE_COMMIT: 'Procedure' } as NodeJS.ProcessEnv)).toBe('procedure');
+    expect(saleCommitMode({ NODE_ENV: 'production', POS_SALE_COMMIT: 'legacy' } as NodeJS.ProcessEnv)).toBe('legacy');
+  });
+});
+
+describe('buildSaleCommitPayload', () => {
+  it('sends the whole cart with normalized product ids and optional fields', () => {
+    const payload = buildSaleCommitPayload(input) as any;
+    expect(payload).toMatchObject({
+      idempotency_key: 'key-1',
+      org_id: null,
+      customer_phone: '0803',
+      customer_phone_e164: null,
+      redeem_points: 5,
+      payment_breakdown: null,
+      wallet_reference: null,
+    });
+    expect(payload.items.map((item: any) => [item.product_id, item.quantity, item.line_discount, item.is_free_item])).toEqual([
+      ['p-1', 2, '0', false],
+      ['p-1', 1, '10.00', true],
+    ]);
+  });
+
+  it('sends the normalized customer phone for the upsert', () => {
+    const payload = buildSaleCommitPayload({ ...input, customerPhone: '0801 234 5678' }) as any;
+    expect(payload.customer_phone).toBe('0801 234 5678');
+    expect(payload.customer_phone_e164).toBe('+2348012345678');
+  });
+});
+
+describe('commitPosSale', () => {
+  it('runs a single statement and parses the sale, items and stock levels', async () => {
+    const execute = vi.fn().mockResolvedValue({ rows: [{ result: committed }] });
+    const result = await commitPosSale(input, { execute });
+
+    expect(execute).toHaveBeenCalledTimes(1);
+    expect(result.sale.id).toBe('sale-1');
+    expect(result.sale.occurredAt).toBeInstanceOf(Date);
+    expect(result.items).toHaveLength(1);
+    expect(result.customer).toEqual({ id: 'c-1', points: 31, pointsEarned: 30 });
+    expect(lowStockLevels(result.stock).map((row) => row.productId)).toEqual(['p-1']);
+  });
+
+  it('maps function rejections to client errors and rethrows anything else', async () => {
+    const rejected = commitPosSale(input, {
+      execute: vi.fn().mockRejectedValue(new Error('pos_commit_sale:insufficient_points')),
+    });
+    await expect(rejected).rejects.toBeInstanceOf(SaleCommitError);
+    await expect(rejected).rejects.toMatchObject({ statusCode: 400, message: 'Insufficient loyalty points' });
+
+    const broken = commitPosSale(input, { execute: vi.fn().mockRejectedValue(new Error('connection reset')) });
+    await expect(broken).rejects.toThrow('connection reset');
+  });
+
+  it('accepts a JSON string result and rejects an empty one', () => {
+    expect(parseSaleCommitResult({ rows: [{ result: JSON.stringify({ ...committed, replayed: true }) }] }).replayed).toBe(true);
+    expect(() => parseSaleCommitResult({ rows: [] })).toThrow('no sale');
+  });
+});
+
+describe('replaySaleBatch', () => {
+  it('reports each key as created, duplicate or failed in request order', async () => {
+    const commit = vi.fn(async ({ idempotencyKey }: { idempotencyKey: string }) => {
+      if (idempotencyKey === 'k-2') return { status: 200, body: { id: 'sale-2' }, replayed: true };
+      if (idempotencyKey === 'k-3') return { status: 409, body: { error: 'exists' } };
+      if (idempotencyKey === 'k-4') return { status: 400, body: { error: 'Insufficient loyalty points' } };
+      if (idempotencyKey === 'k-5') throw new Error('connection reset');
+      return { status: 200, body: { id: 'sale-1' } };
+    });
+
+    const results = await replaySaleBatch(
+      ['k-1', 'k-2', 'k-3', 'k-4', 'k-5', 'k-1'].map((idempotencyKey) => ({ idempotencyKey, payload: {} })),
+      commit,
+      2,
+    );
+
+    expect(commit).toHaveBeenCalledTimes(5);
+    expect(results.map((result) => [result.idempotencyKey, result.status, result.httpStatus])).toEqual([
+      ['k-1', 'created', 200],
+      ['k-2', 'duplicate', 200],
+      ['k-3', 'duplicate', 409],
+      ['k-4', 'failed', 400],
+      ['k-5', 'failed', 500],
+      ['k-1', 'created', 200],
+    ]);
+    expect(results[0].sale).toEqual({ id: 'sale-1' });
+    expect(results[3].error).toBe('Insufficient loyalty points');
+  });
+
+  it('keeps at most `concurrency` stores in flight', async () => {
+    let inFlight = 0;
+    let peak = 0;
+    const commit = async () => {
+      inFlight++;
+      peak = Math.max(peak, inFlight);
+      await new Promise((resolve) => setTimeout(resolve, 1));
+      inFlight--;
+      return { status: 200, body: {} };
+    };
+    await replaySaleBatch(
+      Array.from({ length: 10 }, (_, i) => ({ idempotencyKey: `k-${i}`, payload: { storeId: `store-${i % 5}` } })),
+      commit,
+      3,
+    );
+    expect(peak).toBe(3);
+  });
+
+  it("commits one store's sales one at a time in queue order", async () => {
+    const started: string[] = [];
+    let inFlight = 0;
+    let peak = 0;
+    const commit = async ({ idempotencyKey }: { idempotencyKey: string }) => {
+      started.push(idempotencyKey);
+      inFlight++;
+      peak = Math.max(peak, inFlight);
+      // Later sales finish sooner, which would reorder them if they overlapped
+      await new Promise((resolve) => setTimeout(resolve, 10 - started.length));
+      inFlight--;
+      return { status: 200, body: {} };
+    };
+    await replaySaleBatch(
+      Array.from({ length: 6 }, (_, i) => ({ idempotencyKey: `k-${i}`, payload: { storeId: 'store-1' } })),
+      commit,
+      4,
+    );
+    expect(peak).toBe(1);
+    expect(started).toEqual(['k-0', 'k-1', 'k-2', 'k-3', 'k-4', 'k-5']);
+  });
+});
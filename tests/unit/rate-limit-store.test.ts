@@ -0,0 +1,70 @@
+import type { Options } from 'express-rate-limit';
+import { afterEach, describe, expect, it } from 'vitest';
+
+import { SlidingWindowMemoryStore, slidingWindowHits } from '../../server/lib/rate-limit-store';
+
+describe('SlidingWindowMemoryStore', () => {
+  let clock = 0;
+  let store: SlidingWindowMemoryStore;
+
+  const create = (maxKeys = 100) => {
+    store = new SlidingWindowMemoryStore(maxKeys, () => clock);
+    store.init({ windowMs: 1000 } as Options);
+    return store;
+  };
+
+  afterEach(async () => {
+    await store?.shutdown();
+  });
+
+  it('counts hits within the current window', async () => {
+    clock = 10_000;
+    create();
+    await store.increment('ip');
+    const info = await store.increment('ip');
+    expect(info.totalHits).toBe(2);
+    expect(info.resetTime?.getTime()).toBe(11_000);
+  });
+
+  it('weights the previous window by how much of it is still in the sliding window', async () => {
+    clock = 10_000;
+    create();
+    for (let i = 0; i < 10; i++) await store.increment('ip');
+    clock = 11_250; // 75% of the previous window still counts
+    expect((await store.increment('ip')).totalHits).toBe(1 + 7);
+    clock = 12_900; // two windows later the old hits are gone
+    expect((await store.increment('ip')).totalHits).toBe(1 + 0);
+  });
+
+  it('supports decrement, reset and caps the number of tracked keys', async () => {
+    clock = 0;
+    create(2);
+    await store.increment('a');
+    await store.increment('a');
+    await store.decrement('a');
+    expect((await store.get('a'))?.totalHits).toBe(1);
+    await store.resetKey('a');
+    expect(await store.get('a')).toBeUndefined();
+
+    await store.increment('x');
+    await store.increment('y');
+    await store.increment('z');
+    expect(store.size).toBe(2);
+    expect(await store.get('x')).toBeUndefined();
+  });
+
+  it('sweeps keys idle for more than a window', async () => {
+    clock = 0;
+    create();
+    await store.increment('old');
+    clock = 5_000;
+    store.sweep();
+    expect(store.size).toBe(0);
+  });
+});
+
+describe('slidingWindowHits', () => {
+  it('rounds the weighted previous count down', () => {
+    expect(slidingWindowHits(3, 5, 0.5)).toBe(5);
+  });
+});
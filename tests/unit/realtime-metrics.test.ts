@@ -0,0 +1,179 @@
+import { describe, expect, it } from 'vitest';
+
+import {
+  basketBucket,
+  histogramPercentile,
+  metricsHourKey,
+  readLiveMetrics,
+  reconcileMetricsDay,
+  recordSaleMetrics,
+  type MetricsDaySnapshot,
+} from '../../server/lib/realtime-metrics';
+
+// Just enough of node-redis for MULTI/pipeline hash and sorted-set commands
+function createFakeRedis() {
+  const hashes = new Map<string, Map<string, number>>();
+  const zsets = new Map<string, Map<string, number>>();
+  const ttls = new Map<string, number>();
+  let execs = 0;
+
+  const hashOf = (key: string) => hashes.get(key) ?? hashes.set(key, new Map()).get(key)!;
+  const zsetOf = (key: string) => zsets.get(key) ?? zsets.set(key, new Map()).get(key)!;
+
+  const multi = () => {
+    const ops: Array<() => unknown> = [];
+    const chain: any = {
+      hIncrByFloat: (key: string, field: string, by: number) => chain.push(() => {
+        const hash = hashOf(key);
+        hash.set(field, (hash.get(field) ?? 0) + by);
+        return String(hash.get(field));
+      }),
+      hIncrBy: (key: string, field: string, by: number) => chain.hIncrByFloat(key, field, by),
+      zIncrBy: (key: string, by: number, member: string) => chain.push(() => {
+        const zset = zsetOf(key);
+        zset.set(member, (zset.get(member) ?? 0) + by);
+        return zset.get(member);
+      }),
+      expire: (key: string, seconds: number) => chain.push(() => ttls.set(key, seconds) && 1),
+      hGetAll: (key: string) => chain.push(() =>
+        Object.fromEntries(Array.from(hashes.get(key) ?? [], ([field, value]) => [field, String(value)]))),
+      zRangeWithScores: (key: string, start: number, stop: number, options?: { REV?: boolean }) => chain.push(() => {
+        const entries = Array.from(zsets.get(key) ?? [], ([value, score]) => ({ value, score }));
+        entries.sort((a, b) => (options?.REV ? b.score - a.score : a.score - b.score));
+        return entries.slice(start, stop < 0 ? undefined : stop + 1);
+      }),
+      push: (op: () => unknown) => {
+        ops.push(op);
+        return chain;
+      },
+      exec: async () => {
+        execs += 1;
+        return ops.map((op) => op());
+      },
+      execAsPipeline: async () => chain.exec(),
+    };
+    return chain;
+  };
+
+  return { client: { multi } as any, hashes, zsets, ttls, roundTrips: () => execs };
+}
+
+const now = new Date(Date.UTC(2026, 9, 18, 14, 30));
+const sale = (overrides: Partial<Parameters<typeof recordSaleMetrics>[0]> = {}) => ({
+  orgId: 'org-1',
+  storeId: 'store-1',
+  cashierId: 'cashier-1',
+  revenue: 30,
+  discount: 2,
+  tax: 1.5,
+  items: [
+    { productId: 'milk', quantity: 2, revenue: 20 },
+    { productId: 'bread', quantity: 1, revenue: 10 },
+  ],
+  occurredAt: now,
+  ...overrides,
+});
+
+describe('basket histogram helpers', () => {
+  it('buckets basket sizes and reads percentiles from the bucket bounds', () => {
+    expect(basketBucket(1)).toBe('1');
+    expect(basketBucket(6)).toBe('7');
+    expect(basketBucket(500)).toBe('+Inf');
+    expect(histogramPercentile({ '1': 5, '3': 4, '10': 1 }, 50)).toBe(1);
+    expect(histogramPercentile({ '1': 5, '3': 4, '10': 1 }, 90)).toBe(3);
+    expect(histogramPercentile({ '1': 5, '3': 4, '10': 1 }, 99)).toBe(10);
+    expect(histogramPercentile({}, 50)).toBeNull();
+  });
+});
+
+describe('recordSaleMetrics / readLiveMetrics', () => {
+  it('records store and org counters in one round trip and reads several stores in another', async () => {
+    const redis = createFakeRedis();
+    await recordSaleMetrics(sale(), redis.client);
+    await recordSaleMetrics(sale({ storeId: 'store-2', cashierId: 'cashier-2', revenue: 5, items: [{ productId: 'milk', quantity: 1, revenue: 5 }] }), redis.client);
+    await recordSaleMetrics(sale({ occurredAt: new Date(now.getTime() - 3 * 86_400_000) }), redis.client);
+    expect(redis.roundTrips()).toBe(3);
+    expect(Array.from(redis.ttls.values()).every((ttl) => ttl > 0)).toBe(true);
+
+    const live = await readLiveMetrics({ orgId: 'org-1', storeIds: ['store-1', 'store-2'], now, topN: 5 }, redis.client);
+    expect(redis.roundTrips()).toBe(4);
+
+    const [store1, store2] = live!.stores;
+    expect(store1.today).toMatchObject({ revenue: 30, transactions: 1, discount: 2, tax: 1.5, units: 3 });
+    expect(store1.last7d).toMatchObject({ revenue: 60, transactions: 2 });
+    expect(store1.last24h.transactions).toBe(1);
+    expect(store1.hourly[store1.hourly.length - 1].hour).toBe(`${metricsHourKey(now)}:00Z`);
+    expect(store1.topProductsByRevenue).toEqual([{ id: 'milk', value: 20 }, { id: 'bread', value: 10 }]);
+    expect(store1.cashiers).toEqual([{ cashierId: 'cashier-1', revenue: 30, transactions: 1 }]);
+    expect(store1.basketToday).toMatchObject({ count: 1, p50: 3 });
+    expect(store1.basket7d.count).toBe(2);
+    expect(store2.today).toMatchObject({ revenue: 5, units: 1 });
+
+    expect(live!.org?.today).toMatchObject({ revenue: 35, transactions: 2, units: 4 });
+    expect(live!.org?.topProductsByUnits[0]).toEqual({ id: 'milk', value: 3 });
+  });
+
+  it('does nothing without a Redis client', async () => {
+    await expect(recordSaleMetrics(sale(), null)).resolves.toBeUndefined();
+    await expect(readLiveMetrics({ storeIds: ['store-1'] }, null)).resolves.toBeNull();
+  });
+});
+
+describe('reconcileMetricsDay', () => {
+  it('applies the database difference as increments and is a no-op once in line', async () => {
+    const redis = createFakeRedis();
+    const day = new Date(Date.now() - 60 * 60 * 1000);
+    await recordSaleMetrics(sale({ occurredAt: day, items: [{ productId: 'milk', quantity: 2, revenue: 30 }] }), redis.client);
+
+    const snapshot: MetricsDaySnapshot = {
+      through: new Date(Date.UTC(day.getUTCFullYear(), day.getUTCMonth(), day.getUTCDate() + 1)),
+      hourly: new Map([[metricsHourKey(day), { revenue: 45, transactions: 2, discount: 2, tax: 1.5, units: 3 }]]),
+      productUnits: new Map([['milk', 2], ['eggs', 1]]),
+      productRevenue: new Map([['milk', 30], ['eggs', 15]]),
+      cashiers: new Map([['cashier-1', { revenue: 45, transactions: 2 }]]),
+      basket: { '1': 1, '2': 1 },
+    };
+
+    const first = await reconcileMetricsDay('store', 'store-1', day, snapshot, redis.client);
+    expect(first).toMatchObject({ revenueDrift: 15, transactionDrift: 1 });
+    expect(first!.corrections).toBeGreaterThan(0);
+
+    const live = await readLiveMetrics({ storeIds: ['store-1'], now: day }, redis.client);
+    expect(live!.stores[0].today).toMatchObject({ revenue: 45, transactions: 2, units: 3 });
+    expect(live!.stores[0].topProductsByRevenue).toEqual([{ id: 'milk', value: 30 }, { id: 'eggs', value: 15 }]);
+    expect(live!.stores[0].basketToday.histogram).toEqual({ '1': 1, '2': 1 });
+
+    const second = await reconcileMetricsDay('store', 'store-1', day, snapshot, redis.client);
+    expect(second).toMatchObject({ corrections: 0, revenueDrift: 0, transactionDrift: 0 });
+  });
+
+  it('leaves the open hour alone and keeps its sales in the day total', async () => {
+    const redis = createFakeRedis();
+    const closedHour = new Date(Date.now() - 2 * 60 * 60 * 1000);
+    const openHour = new Date(Date.now());
+    const through = new Date(Math.floor(openHour.getTime() / 3_600_000) * 3_600_000);
+    await recordSaleMetrics(sale({ occurredAt: closedHour }), redis.client);
+    // Recorded while the snapshot was loading: not in it, and must not be subtracted
+    await recordSaleMetrics(sale({ occurredAt: openHour, revenue: 12 }), redis.client);
+
+    const snapshot: MetricsDaySnapshot = {
+      through,
+      hourly: new Map([[metricsHourKey(closedHour), { revenue: 40, transactions: 1, discount: 2, tax: 1.5, units: 3 }]]),
+      productUnits: new Map(),
+      productRevenue: new Map(),
+      cashiers: new Map(),
+      basket: {},
+    };
+
+    const correction = await reconcileMetricsDay('store', 'store-1', openHour, snapshot, redis.client);
+    const sameDay = closedHour.getUTCDate() === openHour.getUTCDate();
+    expect(correction).toMatchObject({ revenueDrift: sameDay ? 10 : 0, transactionDrift: 0 });
+
+    const live = await readLiveMetrics({ storeIds: ['store-1'], now: openHour }, redis.client);
+    const hourly = live!.stores[0].hourly;
+    expect(hourly[hourly.length - 1]).toMatchObject({ revenue: 12, transactions: 1 });
+    expect(live!.stores[0].today.revenue).toBe(sameDay ? 52 : 12);
+    // Product counters are not kept per hour, so the open day's are not touched
+    expect(live!.stores[0].topProductsByRevenue.map((entry) => entry.id)).toContain('milk');
+  });
+});
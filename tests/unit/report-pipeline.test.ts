@@ -0,0 +1,35 @@
+import { describe, expect, it } from 'vitest';
+
+import { buildScheduleCsv, groupDueSchedules, isScheduleDue, toDueSchedule } from '../../server/jobs/report-pipeline';
+
+const now = new Date('2024-03-10T07:00:00.000Z');
+
+describe('scheduled report pipeline', () => {
+  it('treats never-run schedules as due and respects interval spacing', () => {
+    expect(isScheduleDue({ lastRunAt: null, interval: 'weekly' }, now)).toBe(true);
+    expect(isScheduleDue({ lastRunAt: '2024-03-09T07:00:00.000Z', interval: 'daily' }, now)).toBe(true);
+    expect(isScheduleDue({ lastRunAt: '2024-03-09T07:00:00.000Z', interval: 'weekly' }, now)).toBe(false);
+  });
+
+  it('groups schedules that share an org and period', () => {
+    const groups = groupDueSchedules([
+      toDueSchedule({ id: 's1', orgId: 'org-1', storeId: 'store-a', params: { window: 'last_7_days' } }),
+      toDueSchedule({ id: 's2', orgId: 'org-1', storeId: 'store-b', params: {} }),
+      toDueSchedule({ id: 's3', orgId: 'org-1', storeId: null, params: { window: 'last_30_days' } }),
+      toDueSchedule({ id: 's4', orgId: 'org-2', storeId: null, params: {} }),
+    ]);
+    expect(groups.map((g) => g.schedules.map((s) => s.id))).toEqual([['s1', 's2'], ['s3'], ['s4']]);
+  });
+
+  it('builds per-store and org-wide CSVs from shared buckets', () => {
+    const buckets = [
+      { storeId: 'store-a', bucket: '2024-03-08T00:00:00.000Z', revenue: 100, discount: 0, tax: 5, transactions: 2 },
+      { storeId: 'store-b', bucket: '2024-03-08T00:00:00.000Z', revenue: 50, discount: 1, tax: 2, transactions: 1 },
+    ];
+    const storeCsv = buildScheduleCsv(toDueSchedule({ id: 's1', orgId: 'org-1', storeId: 'store-b' }), buckets);
+    const orgCsv = buildScheduleCsv(toDueSchedule({ id: 's2', orgId: 'org-1', storeId: null }), buckets);
+
+    expect(storeCsv.trim().split('\n')[1]).toBe('2024-03-08T00:00:00.000Z,50,1,2,1');
+    expect(orgCsv.trim().split('\n')[1]).toBe('2024-03-08T00:00:00.000Z,150,1,7,3');
+  });
+});
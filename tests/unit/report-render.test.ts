@@ -0,0 +1,103 @@
+import { mkdtemp, readdir, rm, utimes } from 'node:fs/promises';
+import os from 'node:os';
+import path from 'node:path';
+import { afterEach, beforeEach, describe, expect, it } from 'vitest';
+
+import { renderReportDocument } from '../../server/lib/report-render';
+import { buildReportCacheKey, ReportDiskCache } from '../../server/lib/report-render-pool';
+
+async function readAll(stream: NodeJS.ReadableStream): Promise<string> {
+  const chunks: Buffer[] = [];
+  for await (const chunk of stream) chunks.push(Buffer.from(chunk as Buffer));
+  return Buffer.concat(chunks).toString('utf8');
+}
+
+describe('report rendering', () => {
+  it('renders analytics timeseries CSV with net revenue', async () => {
+    const buffer = await renderReportDocument(null, {
+      format: 'csv',
+      report: {
+        kind: 'analytics_timeseries',
+        interval: 'day',
+        rows: [
+          { bucket: '2024-01-01T00:00:00.000Z', revenue: 105, discount: 0, tax: 5, transactions: 1, refundTotal: 5, refundCount: 1 },
+        ],
+      },
+    });
+    expect(buffer.toString('utf8')).toBe(
+      'date,revenue,discount,tax,transactions,refunds,refund_count,net_revenue\n' +
+      '2024-01-01T00:00:00.000Z,105,0,5,1,5,1,100\n'
+    );
+  });
+
+  it('renders comprehensive CSV with zero defaults for missing columns', async () => {
+    const buffer = await renderReportDocument(null, {
+      format: 'csv',
+      report: {
+        kind: 'comprehensive',
+        currency: 'NGN',
+        period: { start: '2024-01-01T00:00:00.000Z', end: '2024-01-31T00:00:00.000Z' },
+        summary: {},
+        timeseries: [{ date: '2024-01-02T00:00:00.000Z', revenue: 200, profit: 50 }],
+      },
+    });
+    const [header, row] = buffer.toString('utf8').trim().split('\n');
+    expect(header.split(',')[0]).toBe('date');
+    expect(row.startsWith('2024-01-02T00:00:00.000Z,200,0,0')).toBe(true);
+    expect(row.endsWith(',50')).toBe(true);
+  });
+});
+
+describe('report cache key', () => {
+  it('ignores param ordering and undefined values', () => {
+    const a = buildReportCacheKey({ orgId: 'org', params: { a: 1, b: 'x', c: undefined }, watermark: 'w1', format: 'csv' });
+    const b = buildReportCacheKey({ orgId: 'org', params: { b: 'x', a: 1 }, watermark: 'w1', format: 'csv' });
+    expect(a).toBe(b);
+  });
+
+  it('changes when the data watermark moves', () => {
+    const a = buildReportCacheKey({ orgId: 'org', params: { a: 1 }, watermark: 'w1', format: 'pdf' });
+    const b = buildReportCacheKey({ orgId: 'org', params: { a: 1 }, watermark: 'w2', format: 'pdf' });
+    expect(a).not.toBe(b);
+  });
+});
+
+describe('ReportDiskCache', () => {
+  let dir: string;
+
+  beforeEach(async () => {
+    dir = await mkdtemp(path.join(os.tmpdir(), 'report-cache-'));
+  });
+
+  afterEach(async () => {
+    await rm(dir, { recursive: true, force: true });
+  });
+
+  it('serves stored renders from disk and counts hits and misses', async () => {
+    const cache = new ReportDiskCache(dir);
+    expect(await cache.open('key', 'csv')).toBeNull();
+
+    await cache.put('key', 'csv', Buffer.from('a,b\n1,2\n'));
+    const stream = await cache.open('key', 'csv');
+    expect(stream).not.toBeNull();
+    expect(await readAll(stream!)).toBe('a,b\n1,2\n');
+    expect(cache.getStats()).toEqual({ hits: 1, misses: 1 });
+  });
+
+  it('treats entries older than the TTL as misses', async () => {
+    const cache = new ReportDiskCache(dir, -1);
+    await cache.put('key', 'pdf', Buffer.from('%PDF'));
+    expect(await cache.open('key', 'pdf')).toBeNull();
+  });
+
+  it('sweeps the oldest entries once the cache outgrows its byte budget', async () => {
+    const cache = new ReportDiskCache(dir, 60_000, 10);
+    for (const [key, ageMs] of [['a', 3000], ['b', 2000], ['c', 1000]] as const) {
+      await cache.put(key, 'csv', Buffer.from('12345'));
+      const writtenAt = new Date(Date.now() - ageMs);
+      await utimes(path.join(dir, `${key}.csv`), writtenAt, writtenAt);
+    }
+    await cache.sweep();
+    expect((await readdir(dir)).sort()).toEqual(['b.csv', 'c.csv']);
+  });
+});
@@ -0,0 +1,228 @@
+import { PgDialect } from 'drizzle-orm/pg-core';
+import { describe, expect, it, vi } from 'vitest';
+
+vi.mock('../../server/db', () => ({ db: {} }));
+
+import {
+  applyReturn,
+  loyaltyReversalPoints,
+  parseReturnContext,
+  planReturn,
+  planSwap,
+  restocksAffectingAlerts,
+  ReturnRejectedError,
+  returnsEngineMode,
+  type ReturnContext,
+} from '../../server/lib/returns-engine';
+
+const STORE_ID = '00000000-0000-0000-0000-000000000001';
+const SALE_ID = '00000000-0000-0000-0000-0000000000a1';
+const USER_ID = '00000000-0000-0000-0000-0000000000b1';
+const dialect = new PgDialect();
+
+function saleContext(overrides: Partial<ReturnContext> = {}): ReturnContext {
+  return {
+    saleId: SALE_ID,
+    orgId: 'org-1',
+    storeId: STORE_ID,
+    subtotal: 300,
+    discount: 0,
+    tax: 30,
+    paymentMethod: 'card',
+    status: 'COMPLETED',
+    currency: 'NGN',
+    lines: [
+      { id: 'line-1', productId: 'p-1', quantity: 4, lineTotal: 200, returnedQuantity: 1, avgCost: 20 },
+      { id: 'line-2', productId: 'p-2', quantity: 2, lineTotal: 100, returnedQuantity: 0, avgCost: 0 },
+    ],
+    refundedAmount: 0,
+    originTransaction: { id: 'tx-1', kind: 'SALE' },
+    loyalty: null,
+    originItem: null,
+    newProduct: null,
+    ...overrides,
+  };
+}
+
+function rejection(run: () => unknown): ReturnRejectedError {
+  try {
+    run();
+  } catch (error) {
+    return error as ReturnRejectedError;
+  }
+  throw new Error('expected a rejection');
+}
+
+describe('returnsEngineMode', () => {
+  it('defaults to batched, or legacy under NODE_ENV=test', () => {
+    expect(returnsEngineMode({ NODE_ENV: 'production' } as NodeJS.ProcessEnv)).toBe('batched');
+    expect(returnsEngineMode({ NODE_ENV: 'test' } as NodeJS.ProcessEnv)).toBe('legacy');
+    expect(returnsEngineMode({ NODE_ENV: 'test', POS_RETURNS_ENGINE: 'Batched' } as NodeJS.ProcessEnv)).toBe('batched');
+  });
+});
+
+describe('parseReturnContext', () => {
+  it('reads the sale, its lines and the loyalty summary from the one row', () => {
+    const context = parseReturnContext({
+      rows: [{
+        id: SALE_ID,
+        org_id: 'org-1',
+        store_id: STORE_ID,
+        subtotal: '300.00',
+        discount: '0.00',
+        tax: '30.00',
+        payment_method: 'cash',
+        status: 'COMPLETED',
+        currency: 'NGN',
+        lines: JSON.stringify([{ id: 'line-1', productId: 'p-1', quantity: 4, lineTotal: '200.00', returnedQuantity: 1, avgCost: '20.0000' }]),
+        refunded_amount: '50.00',
+        origin_transaction_id: 'tx-1',
+        origin_transaction_kind: 'SALE',
+        customer_id: 'c-1',
+        earned: 300,
+        reversed: 0,
+        current_points: 120,
+      }],
+    });
+
+    expect(context?.lines).toEqual([
+      { id: 'line-1', productId: 'p-1', quantity: 4, lineTotal: 200, returnedQuantity: 1, avgCost: 20 },
+    ]);
+    expect(context?.refundedAmount).toBe(50);
+    expect(context?.loyalty).toEqual({ customerId: 'c-1', earned: 300, reversed: 0, balance: 120 });
+    expect(parseReturnContext({ rows: [] })).toBeNull();
+  });
+});
+
+describe('planReturn', () => {
+  it('prices lines from the sale and refunds tax at its effective rate', () => {
+    const plan = planReturn(saleContext(), STORE_ID, [
+      { saleItemId: 'line-1', productId: 'p-1', quantity: 2, restockAction: 'RESTOCK', refundType: 'FULL' },
+      { productId: 'p-2', quantity: 1, restockAction: 'DISCARD', refundType: 'PARTIAL', refundAmount: '80' },
+    ]);
+
+    expect(plan.lines.map((line) => [line.refundAmount, line.taxRefundAmount])).toEqual([[100, 10], [50, 5]]);
+    expect(plan.productRefund).toBe(150);
+    expect(plan.totalRefund).toBeCloseTo(165);
+    expect(plan.refundType).toBe('PARTIAL');
+    expect(plan.lines[0]).toMatchObject({ unitCost: 20, originalQuantity: 4 });
+  });
+
+  it('only allows what earlier returns left on each line', () => {
+    const error = rejection(() => planReturn(saleContext(), STORE_ID, [
+      { saleItemId: 'line-1', productId: 'p-1', quantity: 2, restockAction: 'RESTOCK', refundType: 'FULL' },
+      { saleItemId: 'line-1', productId: 'p-1', quantity: 2, restockAction: 'RESTOCK', refundType: 'FULL' },
+    ]));
+
+    expect(error).toBeInstanceOf(ReturnRejectedError);
+    expect(error.statusCode).toBe(400);
+    expect(error.message).toBe('Return quantity exceeds remaining sale quantity');
+  });
+
+  it('rejects with the per-line path statuses', () => {
+    const item = { productId: 'p-1', quantity: 1, restockAction: 'RESTOCK' as const, refundType: 'NONE' as const };
+    expect(rejection(() => planReturn(null, STORE_ID, [item])).statusCode).toBe(404);
+    expect(rejection(() => planReturn(saleContext({ status: 'RETURNED' }), STORE_ID, [item])).statusCode).toBe(409);
+    expect(rejection(() => planReturn(saleContext(), 'other-store', [item])).message).toBe('Store mismatch for sale');
+    expect(rejection(() => planReturn(saleContext(), STORE_ID, [{ ...item, productId: 'p-9' }])).message)
+      .toBe('Return item does not match sale items');
+  });
+
+  it('takes back earned points in proportion to the refund, capped by the balance', () => {
+    const loyalty = { customerId: 'c-1', earned: 300, reversed: 0, balance: 500 };
+    expect(loyaltyReversalPoints(saleContext({ loyalty }), 150)).toBe(150);
+    expect(loyaltyReversalPoints(saleContext({ loyalty: { ...loyalty, reversed: 100 } }), 150)).toBe(50);
+    expect(loyaltyReversalPoints(saleContext({ loyalty: { ...loyalty, balance: 40 } }), 150)).toBe(40);
+    expect(loyaltyReversalPoints(saleContext(), 150)).toBe(0);
+
+    const plan = planReturn(saleContext({ loyalty }), STORE_ID, [
+      { saleItemId: 'line-2', productId: 'p-2', quantity: 2, restockAction: 'RESTOCK', refundType: 'FULL' },
+    ]);
+    expect(plan.loyaltyReversal).toEqual({ customerId: 'c-1', points: 100 });
+  });
+});
+
+describe('applyReturn', () => {
+  it('writes a large receipt with the same handful of statements', async () => {
+    const lines = Array.from({ length: 500 }, (_, i) => ({
+      id: `line-${i}`,
+      productId: `p-${i}`,
+      quantity: 3,
+      lineTotal: 30,
+      returnedQuantity: 0,
+      avgCost: 4,
+    }));
+    const context = saleContext({
+      subtotal: 15000,
+      tax: 0,
+      lines,
+      loyalty: { customerId: 'c-1', earned: 15000, reversed: 0, balance: 15000 },
+    });
+    const plan = planReturn(context, STORE_ID, lines.map((line) => ({
+      saleItemId: line.id,
+      productId: line.productId,
+      quantity: 3,
+      restockAction: 'RESTOCK' as const,
+      refundType: 'FULL' as const,
+    })));
+    const execute = vi.fn()
+      .mockResolvedValueOnce({ rows: [{ return: { id: 'ret-1', totalRefund: '15000.00' }, items: [{ id: 'ri-1' }] }] })
+      .mockResolvedValueOnce({ rows: [{ product_id: 'p-0', quantity_before: 2, quantity: 5, min_stock_level: 10 }] })
+      .mockResolvedValueOnce({ rows: [{ id: 'refund-tx' }] })
+      .mockResolvedValueOnce({ rows: [{ holder_id: 'c-1', balance: 0, logged: 1 }] });
+
+    const applied = await applyReturn({ execute }, context, plan, {
+      storeId: STORE_ID,
+      userId: USER_ID,
+      idempotencyKey: 'key-1',
+      refundPaymentMethod: 'card',
+    });
+
+    expect(execute).toHaveBeenCalledTimes(4);
+    const [record, stock, refund, ledger] = execute.mock.calls.map(([query]) => dialect.sqlToQuery(query));
+    expect(record.sql).toContain("UPDATE sales SET status = 'RETURNED'");
+    expect(record.sql).toContain('INSERT INTO return_items');
+    expect(stock.sql).toContain('ON CONFLICT (store_id, product_id) DO UPDATE');
+    expect(stock.sql).toContain('INSERT INTO inventory_cost_layers');
+    expect(stock.params).toContain('pos_return');
+    expect(stock.params).toContain('Restocked from return ret-1');
+    expect(refund.sql).toContain("'REFUND'");
+    expect(ledger.params).toContain('reversal');
+    expect(ledger.params).toContain('pos_return:ret-1');
+
+    expect(applied.return.id).toBe('ret-1');
+    expect(applied.refundTransactionId).toBe('refund-tx');
+    expect(applied.loyaltyReversal).toEqual({ customerId: 'c-1', points: 15000, balance: 0 });
+    expect(restocksAffectingAlerts(applied.restocked).map((row) => row.productId)).toEqual(['p-0']);
+  });
+});
+
+describe('planSwap', () => {
+  const request = {
+    saleId: SALE_ID,
+    storeId: STORE_ID,
+    originalSaleItemId: 'line-1',
+    originalProductId: 'p-1',
+    originalQuantity: 2,
+    originalUnitPrice: 50,
+    newProducts: [{ productId: 'p-3', quantity: 1, unitPrice: 120 }],
+    restockAction: 'RESTOCK' as const,
+    paymentMethod: 'CASH' as const,
+  };
+
+  it('prices the difference with tax at the sale rate', () => {
+    const plan = planSwap(saleContext({ newProduct: { id: 'p-3', name: 'Kettle', quantity: 0, avgCost: 70 } }), request);
+
+    expect(plan.priceDifference).toBe(20);
+    expect(plan.taxDifference).toBeCloseTo(2);
+    expect(plan.returnLine).toMatchObject({ refundType: 'SWAP', quantity: 2, notes: 'Swapped for product Kettle' });
+    expect(plan.newProduct).toMatchObject({ name: 'Kettle', unitCost: 70 });
+  });
+
+  it('rejects swapping more than is left on the line', () => {
+    const context = saleContext({ newProduct: { id: 'p-3', name: 'Kettle', quantity: 0, avgCost: 70 } });
+    expect(rejection(() => planSwap(context, { ...request, originalQuantity: 4 })).message)
+      .toBe('Return quantity exceeds remaining sale quantity');
+    expect(rejection(() => planSwap(saleContext(), request)).statusCode).toBe(404);
+  });
+});
@@ -0,0 +1,46 @@
+import { beforeAll, describe, expect, it } from 'vitest';
+
+import { DatabaseStorage } from '../../server/storage';
+
+const storage = new DatabaseStorage();
+
+describe('in-memory product search and exports', () => {
+  let storeId: string;
+
+  beforeAll(async () => {
+    const store = await storage.createStore({ name: 'Export store', currency: 'NGN' } as any);
+    storeId = store.id;
+    const milk = await storage.createProduct({ name: 'Zebra Milk', sku: 'EXP-MILK', barcode: 'EXP-001', price: '500.00', category: 'dairy', isActive: true } as any);
+    const bread = await storage.createProduct({ name: 'Apple Bread', sku: 'EXP-BREAD', barcode: 'EXP-002', price: '300.00', category: 'bakery', isActive: true } as any);
+    await storage.createProduct({ name: 'Retired Milk', sku: 'EXP-OLD', price: '100.00', category: 'dairy', isActive: false } as any);
+    await storage.createInventory({ productId: milk.id, storeId, quantity: 4, minStockLevel: 1 } as any, undefined, { recordMovement: false });
+    await storage.createInventory({ productId: bread.id, storeId, quantity: 9, minStockLevel: 1 } as any, undefined, { recordMovement: false });
+    await storage.createTransaction({ storeId, cashierId: 'c1', subtotal: '500', taxAmount: '0', total: '500', paymentMethod: 'cash', status: 'completed' } as any);
+  });
+
+  it('searches active products across name, sku and category', async () => {
+    expect((await storage.searchProducts('milk')).map((p) => p.sku)).toEqual(['EXP-MILK']);
+    expect((await storage.searchProducts('exp-bread')).map((p) => p.name)).toEqual(['Apple Bread']);
+    expect(await storage.searchProducts('DAIRY')).toHaveLength(1);
+  });
+
+  it('exports products and inventory sorted by name', async () => {
+    const productCsv: string = await storage.exportProducts(storeId, 'csv');
+    const productNames = productCsv.split('\n').slice(1).map((line) => line.split(',')[0]);
+    expect(productNames.filter((name) => name.includes('Milk') || name.includes('Bread'))).toEqual(['"Apple Bread"', '"Zebra Milk"']);
+
+    const inventoryRows = await storage.exportInventory(storeId, 'json');
+    expect(inventoryRows.map((row: any) => [row.productName, row.quantity])).toEqual([
+      ['Apple Bread', 9],
+      ['Zebra Milk', 4],
+    ]);
+  });
+
+  it('exports transactions within the date range', async () => {
+    const now = Date.now();
+    const rows = await storage.exportTransactions(storeId, new Date(now - 60_000), new Date(now + 60_000), 'json');
+    expect(rows).toHaveLength(1);
+    expect(rows[0]).toMatchObject({ total: '500', paymentMethod: 'cash', status: 'completed' });
+    expect(await storage.exportTransactions(storeId, new Date(now + 60_000), new Date(now + 120_000), 'json')).toHaveLength(0);
+  });
+});
@@ -0,0 +1,95 @@
+import { AsyncLocalStorage } from 'node:async_hooks';
+import { afterEach, beforeEach, describe, expect, it, vi } from 'vitest';
+
+const fake = vi.hoisted(() => {
+  const savepoints: string[] = [];
+  const makeTx = (name: string): any => ({
+    name,
+    transaction: vi.fn(async (fn: (tx: any) => Promise<unknown>) => {
+      savepoints.push(name);
+      return fn(makeTx(`${name}.savepoint`));
+    }),
+  });
+  const db = {
+    transaction: vi.fn(async (fn: (tx: any) => Promise<unknown>) => fn(makeTx('tx'))),
+  };
+  return { db, savepoints };
+});
+
+vi.mock('../../server/db', () => ({
+  db: fake.db,
+  transactionContext: new AsyncLocalStorage(),
+}));
+
+import { transactionContext } from '../../server/db';
+import { getTransactionStats, resetTransactionStats, runInTransaction } from '../../server/lib/tx-executor';
+
+const statsFor = (route: string) => getTransactionStats().routes.find((entry) => entry.route === route);
+
+describe('runInTransaction', () => {
+  beforeEach(() => {
+    resetTransactionStats();
+    fake.savepoints.length = 0;
+    fake.db.transaction.mockClear();
+  });
+
+  afterEach(() => {
+    vi.useRealTimers();
+    delete process.env.TX_HOLD_WARN_MS;
+  });
+
+  it('publishes the transaction for the callback and closes the scope afterwards', async () => {
+    let scope: any;
+    const result = await runInTransaction('pos.sale', async (tx: any) => {
+      scope = transactionContext.getStore();
+      expect(scope).toMatchObject({ route: 'pos.sale', open: true, tx });
+      return tx.name;
+    });
+
+    expect(result).toBe('tx');
+    expect(scope.open).toBe(false);
+    expect(statsFor('pos.sale')).toMatchObject({ transactions: 1, failures: 0, doubleCheckouts: 0 });
+    expect(getTransactionStats().open).toEqual([]);
+  });
+
+  it('turns a nested call into a savepoint instead of a second checkout', async () => {
+    await runInTransaction('loyalty.earn', async () => {
+      const inner = await runInTransaction('loyalty.earn.inner', async (tx: any) => tx.name);
+      expect(inner).toBe('tx.savepoint');
+    });
+
+    expect(fake.db.transaction).toHaveBeenCalledTimes(1);
+    expect(fake.savepoints).toEqual(['tx']);
+    expect(statsFor('loyalty.earn')).toMatchObject({ transactions: 1, nested: 1 });
+    expect(statsFor('loyalty.earn.inner')).toBeUndefined();
+  });
+
+  it('counts pool checkouts made while the transaction is held and rethrows failures', async () => {
+    const failing = runInTransaction('loyalty.redeem', async () => {
+      // What TrackedPool.connect records when something bypasses the transaction
+      transactionContext.getStore()!.foreignCheckouts += 2;
+      throw new Error('boom');
+    });
+
+    await expect(failing).rejects.toThrow('boom');
+    expect(statsFor('loyalty.redeem')).toMatchObject({ transactions: 1, failures: 1, doubleCheckouts: 2 });
+  });
+
+  it('reports transactions held past TX_HOLD_WARN_MS while they are still open', async () => {
+    vi.useFakeTimers();
+    process.env.TX_HOLD_WARN_MS = '50';
+    let release!: () => void;
+    const held = runInTransaction('pos.sale', () => new Promise<void>((resolve) => { release = resolve; }));
+
+    await vi.advanceTimersByTimeAsync(60);
+    const stats = getTransactionStats();
+    expect(stats.slowHolds).toBe(1);
+    expect(stats.open).toEqual([{ route: 'pos.sale', heldMs: expect.any(Number) }]);
+    expect(stats.open[0].heldMs).toBeGreaterThanOrEqual(50);
+
+    release();
+    await held;
+    expect(getTransactionStats().open).toEqual([]);
+    expect(statsFor('pos.sale')!.maxHoldMs).toBeGreaterThanOrEqual(50);
+  });
+});
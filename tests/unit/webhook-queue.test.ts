@@ -0,0 +1,88 @@
+import { PgDialect } from 'drizzle-orm/pg-core';
+import { beforeEach, describe, expect, it, vi } from 'vitest';
+
+const { execute, applyWebhookEvent } = vi.hoisted(() => ({
+  execute: vi.fn(),
+  applyWebhookEvent: vi.fn(),
+}));
+
+vi.mock('../../server/db', () => ({ db: { execute } }));
+vi.mock('../../server/payment/webhook-events', () => ({ applyWebhookEvent }));
+
+import { processWebhookQueueOnce, webhookIngestMode, webhookRetryDelayMs } from '../../server/jobs/webhook-queue';
+
+describe('webhook queue helpers', () => {
+  it('backs off exponentially up to the cap', () => {
+    expect(webhookRetryDelayMs(1, 1000, 10_000)).toBe(1000);
+    expect(webhookRetryDelayMs(3, 1000, 10_000)).toBe(4000);
+    expect(webhookRetryDelayMs(10, 1000, 10_000)).toBe(10_000);
+  });
+
+  it('only enables queue ingest when asked', () => {
+    const previous = process.env.WEBHOOK_INGEST_MODE;
+    delete process.env.WEBHOOK_INGEST_MODE;
+    expect(webhookIngestMode()).toBe('inline');
+    process.env.WEBHOOK_INGEST_MODE = 'QUEUE';
+    expect(webhookIngestMode()).toBe('queue');
+    process.env.WEBHOOK_INGEST_MODE = previous;
+  });
+});
+
+describe('processWebhookQueueOnce', () => {
+  beforeEach(() => {
+    execute.mockReset();
+    applyWebhookEvent.mockReset();
+  });
+
+  it('completes applied events, retries failures and dead-letters exhausted ones', async () => {
+    execute
+      .mockResolvedValueOnce({ rowCount: 0 }) // requeue stuck
+      .mockResolvedValueOnce({
+        rows: [
+          { id: 'e1', provider: 'PAYSTACK', event_id: 'charge.success:1', payload: { n: 1 }, attempts: 1 },
+          { id: 'e2', provider: 'FLW', event_id: 'charge.completed:2', payload: { n: 2 }, attempts: 2 },
+          { id: 'e3', provider: 'FLW', event_id: 'charge.completed:3', payload: { n: 3 }, attempts: 8 },
+        ],
+      })
+      .mockResolvedValue({ rowCount: 1 });
+    applyWebhookEvent
+      .mockResolvedValueOnce({ outcome: 'applied', orgId: 'org-1' })
+      .mockResolvedValueOnce({ outcome: 'unresolved' })
+      .mockRejectedValueOnce(new Error('db down'));
+
+    const result = await processWebhookQueueOnce({ batchSize: 10, concurrency: 1 });
+
+    expect(result).toEqual({ claimed: 3, processed: 1, retried: 1, deadLettered: 1, requeued: 0 });
+    expect(applyWebhookEvent).toHaveBeenNthCalledWith(1, 'PAYSTACK', { n: 1 });
+    // stuck requeue + claim + one status update per event
+    expect(execute).toHaveBeenCalledTimes(5);
+  });
+
+  it('renews the leases of a slow batch and leaves events reclaimed by another consumer alone', async () => {
+    vi.useFakeTimers();
+    process.env.WEBHOOK_PROCESSING_TIMEOUT_MS = '3000';
+    let finish: () => void = () => undefined;
+    execute
+      .mockResolvedValueOnce({ rowCount: 0 }) // requeue stuck
+      .mockResolvedValueOnce({ rows: [{ id: 'e1', provider: 'PAYSTACK', event_id: 'charge.success:1', payload: {}, attempts: 3 }] })
+      .mockResolvedValueOnce({ rowCount: 1 }) // lease renewal
+      .mockResolvedValueOnce({ rowCount: 0 }); // completion: the event is no longer under this claim
+    applyWebhookEvent.mockImplementationOnce(() => new Promise((resolve) => { finish = () => resolve({ outcome: 'applied' }); }));
+
+    try {
+      const processing = processWebhookQueueOnce({ batchSize: 10, concurrency: 1 });
+      await vi.advanceTimersByTimeAsync(1_000);
+      const renewal = new PgDialect().sqlToQuery(execute.mock.calls[2][0]);
+      expect(renewal.sql).toContain('SET locked_at = NOW()');
+      expect(renewal.params).toEqual(['e1', 3]);
+
+      finish();
+      await expect(processing).resolves.toEqual({ claimed: 1, processed: 0, retried: 0, deadLettered: 0, requeued: 0 });
+      const completion = new PgDialect().sqlToQuery(execute.mock.calls[3][0]);
+      expect(completion.sql).toContain("status = 'processing' AND attempts = ");
+    } finally {
+      delete process.env.WEBHOOK_PROCESSING_TIMEOUT_MS;
+      vi.useRealTimers();
+    }
+  });
+});
@@ -0,0 +1,148 @@
+import { createServer, type AddressInfo, type Socket } from 'node:net';
+
+/**
+ * Minimal local SMTP server for tests. It accepts every message (unless a
+ * recipient is set up to be rejected) and keeps it in memory, so mail code can
+ * be exercised end to end over a real nodemailer transport without network
+ * access or a third-party relay. No TLS and no AUTH are advertised.
+ */
+
+export interface SinkMessage {
+  from: string;
+  to: string[];
+  /** Raw message as received, dot-unstuffed */
+  data: string;
+  receivedAt: number;
+}
+
+export interface SmtpSink {
+  host: string;
+  port: number;
+  messages: SinkMessage[];
+  /** Connections opened since start; a pooled transport should keep this low */
+  connections: number;
+  /** Answer RCPT TO for `address` with `reply` (e.g. a 550) instead of accepting it */
+  rejectRecipient(address: string, reply?: string): void;
+  waitForMessages(count: number, timeoutMs?: number): Promise<SinkMessage[]>;
+  close(): Promise<void>;
+}
+
+const addressOf = (line: string) => (/<([^>]*)>/.exec(line)?.[1] ?? '').toLowerCase();
+
+export async function startSmtpSink(options: { host?: string; port?: number } = {}): Promise<SmtpSink> {
+  const host = options.host ?? '127.0.0.1';
+  const messages: SinkMessage[] = [];
+  const rejected = new Map<string, string>();
+  const sockets = new Set<Socket>();
+  const waiters: Array<() => void> = [];
+
+  const server = createServer((socket) => {
+    sink.connections += 1;
+    sockets.add(socket);
+    socket.on('close', () => sockets.delete(socket));
+    socket.on('error', () => socket.destroy());
+
+    let buffer = '';
+    let inData = false;
+    let from = '';
+    let to: string[] = [];
+    let dataLines: string[] = [];
+    const reply = (text: string) => socket.write(`${text}\r\n`);
+
+    const handleCommand = (line: string) => {
+      const verb = line.slice(0, 4).toUpperCase();
+      if (verb === 'EHLO') return reply('250-smtp-sink\r\n250-8BITMIME\r\n250 SIZE 52428800');
+      if (verb === 'HELO') return reply('250 smtp-sink');
+      if (verb === 'MAIL') {
+        from = addressOf(line);
+        to = [];
+        return reply('250 OK');
+      }
+      if (verb === 'RCPT') {
+        const address = addressOf(line);
+        const rejection = rejected.get(address);
+        if (rejection) return reply(rejection);
+        to.push(address);
+        return reply('250 OK');
+      }
+      if (verb === 'DATA') {
+        inData = true;
+        dataLines = [];
+        return reply('354 End data with <CR><LF>.<CR><LF>');
+      }
+      if (verb === 'RSET') {
+        from = '';
+        to = [];
+        return reply('250 OK');
+      }
+      if (verb === 'NOOP') return reply('250 OK');
+      if (verb === 'QUIT') {
+        reply('221 Bye');
+        return socket.end();
+      }
+      return reply('502 Command not implemented');
+    };
+
+    const handleDataLine = (line: string) => {
+      if (line !== '.') {
+        dataLines.push(line.startsWith('..') ? line.slice(1) : line);
+        return;
+      }
+      inData = false;
+      messages.push({ from, to, data: dataLines.join('\r\n'), receivedAt: Date.now() });
+      reply(`250 OK queued as sink-${messages.length}`);
+      waiters.splice(0).forEach((wake) => wake());
+    };
+
+    socket.on('data', (chunk) => {
+      buffer += chunk.toString('utf-8');
+      let index = buffer.indexOf('\r\n');
+      while (index !== -1) {
+        const line = buffer.slice(0, index);
+        buffer = buffer.slice(index + 2);
+        if (inData) handleDataLine(line);
+        else handleCommand(line);
+        index = buffer.indexOf('\r\n');
+      }
+    });
+
+    reply('220 smtp-sink ESMTP ready');
+  });
+
+  await new Promise<void>((resolve, reject) => {
+    server.once('error', reject);
+    server.listen(options.port ?? 0, host, () => resolve());
+  });
+
+  const sink: SmtpSink = {
+    host,
+    port: (server.address() as AddressInfo).port,
+    messages,
+    connections: 0,
+    rejectRecipient(address, text = '550 5.1.1 Mailbox unavailable') {
+      rejected.set(address.toLowerCase(), text);
+    },
+    async waitForMessages(count, timeoutMs = 5_000) {
+      const deadline = Date.now() + timeoutMs;
+      while (messages.length < count) {
+        const remaining = deadline - Date.now();
+        if (remaining <= 0) {
+          throw new Error(`SMTP sink received ${messages.length} of ${count} messages`);
+        }
+        await new Promise<void>((resolve) => {
+          const timer = setTimeout(resolve, remaining);
+          waiters.push(() => {
+            clearTimeout(timer);
+            resolve();
+          });
+        });
+      }
+      return messages.slice(0, count);
+    },
+    close() {
+      sockets.forEach((socket) => socket.destroy());
+      return new Promise<void>((resolve) => server.close(() => resolve()));
+    },
+  };
+  return sink;
+}